@@ -3,8 +3,12 @@ Módulo de autenticación para Fluxion AI
 Maneja login, verificación de tokens JWT y validación de usuarios
 PostgreSQL only - DuckDB removido (Dic 2025)
 """
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -56,6 +60,10 @@ SECRET_KEY = "fluxion-ai-secret-key-change-in-production-2024"  # Cambiar en pro
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 480  # 8 horas
 
+# Cache de usuarios resueltos en verify_token (por proceso)
+USER_CACHE_TTL_SECONDS = float(os.getenv('USER_CACHE_TTL_SECONDS', '60'))
+USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', '1000'))
+
 # Contexto para hashear contraseñas
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -192,6 +200,85 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# =====================================================================================
+# CACHE DE USUARIOS (verify_token)
+# =====================================================================================
+# verify_token se ejecuta en cada request autenticado. Para no pagar un round
+# trip a la BD (usuarios JOIN roles + usuarios_tiendas) en cada llamada, los
+# usuarios resueltos se guardan en un cache LRU con TTL por username.
+#
+# Los endpoints que modifican usuarios (update_user, update_user_role,
+# change_user_password, delete_user) llaman invalidate_user_cache(). Con varios
+# workers de uvicorn cada proceso tiene su propio cache: en los demás workers
+# el cambio se ve a más tardar en USER_CACHE_TTL_SECONDS.
+
+_user_cache: "OrderedDict[str, Tuple[float, UsuarioConRol]]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+_user_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _get_cached_user(username: str) -> Optional[UsuarioConRol]:
+    with _user_cache_lock:
+        entry = _user_cache.get(username)
+        if entry is None:
+            _user_cache_stats['misses'] += 1
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del _user_cache[username]
+            _user_cache_stats['misses'] += 1
+            return None
+        _user_cache.move_to_end(username)
+        _user_cache_stats['hits'] += 1
+        return user
+
+
+def _set_cached_user(user: UsuarioConRol) -> None:
+    if USER_CACHE_TTL_SECONDS <= 0 or USER_CACHE_MAX_SIZE <= 0:
+        return
+    with _user_cache_lock:
+        _user_cache[user.username] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+        _user_cache.move_to_end(user.username)
+        while len(_user_cache) > USER_CACHE_MAX_SIZE:
+            _user_cache.popitem(last=False)
+
+
+def invalidate_user_cache(username: Optional[str] = None, user_id: Optional[str] = None) -> int:
+    """
+    Elimina usuarios del cache de verify_token.
+
+    Args:
+        username: Invalida ese username.
+        user_id: Invalida el usuario con ese id (cualquier username).
+        Sin argumentos: vacía todo el cache.
+
+    Returns: cantidad de entradas eliminadas
+    """
+    with _user_cache_lock:
+        if username is None and user_id is None:
+            keys = list(_user_cache)
+        else:
+            keys = [
+                key for key, (_, user) in _user_cache.items()
+                if key == username or (user_id is not None and user.id == user_id)
+            ]
+        for key in keys:
+            del _user_cache[key]
+        _user_cache_stats['invalidations'] += len(keys)
+    return len(keys)
+
+
+def get_user_cache_stats() -> dict:
+    """Métricas del cache de usuarios (por proceso)"""
+    with _user_cache_lock:
+        return {
+            'size': len(_user_cache),
+            'max_size': USER_CACHE_MAX_SIZE,
+            'ttl_seconds': USER_CACHE_TTL_SECONDS,
+            **_user_cache_stats,
+        }
+
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UsuarioConRol:
     """Verifica un token JWT y retorna el usuario con rol"""
     credentials_exception = HTTPException(
@@ -211,6 +298,10 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
     except JWTError:
         raise credentials_exception
 
+    cached_user = _get_cached_user(username)
+    if cached_user is not None:
+        return cached_user
+
     try:
         with get_db_connection(read_only=True) as conn:
             cursor = conn.cursor()
@@ -239,7 +330,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
 
             cursor.close()
 
-            return UsuarioConRol(
+            user = UsuarioConRol(
                 id=row[0],
                 username=row[1],
                 nombre_completo=row[2],
@@ -250,6 +341,10 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
                 rol_nivel_acceso=row[7] or 1,
                 tiendas_asignadas=tiendas_asignadas
             )
+            _set_cached_user(user)
+            return user
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error en verify_token: {e}")
         raise credentials_exception
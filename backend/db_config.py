@@ -26,6 +26,18 @@ POSTGRES_DSN = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST
 # Connection string PostgreSQL PRIMARY (for writes - always uses primary)
 POSTGRES_DSN_PRIMARY = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST_PRIMARY}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
+# Connection pool (db_pool.PostgresConnectionPool) - one pool for replica, one for primary
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))  # Per pool, per worker process
+DB_POOL_PRIMARY_MAX_SIZE = int(os.getenv('DB_POOL_PRIMARY_MAX_SIZE', str(DB_POOL_MAX_SIZE)))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '30'))  # Seconds waiting for a free connection
+DB_POOL_MAX_IDLE_SECONDS = float(os.getenv('DB_POOL_MAX_IDLE_SECONDS', '300'))  # Idle connections above min are closed
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '30'))  # SELECT 1 if idle longer than this
+
+# Dedicated thread pool where async endpoints run blocking psycopg2 work (db_manager.db_offload)
+DB_EXECUTOR_MAX_WORKERS = int(os.getenv('DB_EXECUTOR_MAX_WORKERS', str(DB_POOL_MAX_SIZE + DB_POOL_PRIMARY_MAX_SIZE)))
+
 # DB_MODE always postgresql (no more DuckDB)
 DB_MODE = "postgresql"
 
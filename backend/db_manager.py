@@ -5,12 +5,21 @@ PostgreSQL Only - DuckDB eliminado completamente
 Supports Read Replica architecture:
 - get_postgres_connection(): Reads (uses replica in prod)
 - get_postgres_connection_primary(): Writes (always uses primary)
+
+Connections come from per-process pools (see db_pool.py), one for the
+replica and one for the primary. Set DB_POOL_ENABLED=false to fall back
+to connect-per-request.
 """
 
 import psycopg2
 import psycopg2.extras
+import asyncio
+import contextvars
+import functools
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from fastapi import HTTPException
 from typing import Any, Dict, List, Optional
@@ -19,7 +28,16 @@ import logging
 from db_config import (
     POSTGRES_DSN,
     POSTGRES_DSN_PRIMARY,
+    DB_POOL_ENABLED,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_PRIMARY_MAX_SIZE,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_POOL_MAX_IDLE_SECONDS,
+    DB_POOL_HEALTH_CHECK_AFTER,
+    DB_EXECUTOR_MAX_WORKERS,
 )
+from db_pool import PostgresConnectionPool
 
 # Retry config for read replica conflicts
 REPLICA_CONFLICT_MAX_RETRIES = int(os.getenv('REPLICA_CONFLICT_MAX_RETRIES', '2'))
@@ -38,6 +56,94 @@ def _is_replica_conflict(error: Exception) -> bool:
     return "conflict with recovery" in error_str or "canceling statement due to conflict" in error_str
 
 
+# =============================================================================
+# CONNECTION POOLS
+# =============================================================================
+
+_pools: Dict[str, PostgresConnectionPool] = {}
+_pools_pid: Optional[int] = None
+_pools_lock = threading.Lock()
+
+
+def _get_pool(role: str) -> PostgresConnectionPool:
+    """
+    Retorna el pool ('replica' o 'primary') del proceso actual, creándolo
+    en el primer uso. Si el proceso fue forkeado (uvicorn workers), los
+    pools heredados se abandonan sin cerrarlos: sus sockets pertenecen
+    al proceso padre.
+    """
+    global _pools_pid
+    pid = os.getpid()
+    pool = _pools.get(role) if _pools_pid == pid else None
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        if _pools_pid != pid:
+            _pools.clear()
+            _pools_pid = pid
+        pool = _pools.get(role)
+        if pool is None:
+            pool = PostgresConnectionPool(
+                POSTGRES_DSN_PRIMARY if role == 'primary' else POSTGRES_DSN,
+                name=role,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_PRIMARY_MAX_SIZE if role == 'primary' else DB_POOL_MAX_SIZE,
+                acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+                max_idle_seconds=DB_POOL_MAX_IDLE_SECONDS,
+                health_check_after=DB_POOL_HEALTH_CHECK_AFTER,
+            )
+            _pools[role] = pool
+            logger.info(f"🔌 Pool PostgreSQL '{role}' creado (max {pool.max_size} conexiones)")
+        return pool
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Métricas de checkout / espera de los pools del proceso actual."""
+    if not DB_POOL_ENABLED:
+        return {"enabled": False, "pools": {}}
+    pools = dict(_pools) if _pools_pid == os.getpid() else {}
+    return {
+        "enabled": True,
+        "pid": os.getpid(),
+        "pools": {role: pool.stats() for role, pool in pools.items()},
+    }
+
+
+def close_pools() -> None:
+    """Cierra las conexiones ociosas de todos los pools (shutdown)."""
+    if _db_executor is not None and _db_executor_pid == os.getpid():
+        _db_executor.shutdown(wait=False)
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
+@contextmanager
+def _pooled_connection(role: str, dsn: str):
+    """Checkout de una conexión del pool (o conexión directa si está deshabilitado)."""
+    if not DB_POOL_ENABLED:
+        conn = psycopg2.connect(dsn)
+        try:
+            conn.autocommit = False
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    pool = _get_pool(role)
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken or conn.closed)
+
+
 # =============================================================================
 # POSTGRESQL CONNECTIONS
 # =============================================================================
@@ -48,22 +154,20 @@ def get_postgres_connection():
     Context manager para conexiones PostgreSQL (READ - uses replica in prod).
     On replica conflict errors, logs a warning with fallback guidance.
     """
-    conn = None
     try:
-        conn = psycopg2.connect(POSTGRES_DSN)
-        conn.autocommit = False
-        yield conn
+        with _pooled_connection('replica', POSTGRES_DSN) as conn:
+            try:
+                yield conn
+            except psycopg2.Error:
+                if not conn.closed:
+                    conn.rollback()
+                raise
     except psycopg2.Error as e:
-        if conn:
-            conn.rollback()
         if _is_replica_conflict(e):
             logger.warning(f"⚠️ Read replica conflict detected: {e}. "
                            f"Consider increasing max_standby_streaming_delay in RDS parameter group.")
         logger.error(f"PostgreSQL connection error: {e}")
         raise HTTPException(status_code=500, detail=f"Error conectando a PostgreSQL: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @contextmanager
@@ -73,19 +177,17 @@ def get_postgres_connection_primary():
     Always connects to PRIMARY database, never to replica.
     Use this for INSERT, UPDATE, DELETE, CREATE operations.
     """
-    conn = None
     try:
-        conn = psycopg2.connect(POSTGRES_DSN_PRIMARY)
-        conn.autocommit = False
-        yield conn
+        with _pooled_connection('primary', POSTGRES_DSN_PRIMARY) as conn:
+            try:
+                yield conn
+            except psycopg2.Error:
+                if not conn.closed:
+                    conn.rollback()
+                raise
     except psycopg2.Error as e:
         logger.error(f"PostgreSQL PRIMARY connection error: {e}")
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error conectando a PostgreSQL PRIMARY: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 # =============================================================================
@@ -229,6 +331,78 @@ def execute_query_dict(sql: str, params: Optional[tuple] = None) -> List[Dict[st
         return [dict(row) for row in results]
 
 
+# =============================================================================
+# ASYNC ACCESS (non-blocking for the event loop)
+# =============================================================================
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+_db_executor_pid: Optional[int] = None
+_db_executor_lock = threading.Lock()
+
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    """Thread pool dedicado a trabajo psycopg2 bloqueante (uno por proceso)."""
+    global _db_executor, _db_executor_pid
+    pid = os.getpid()
+    if _db_executor is None or _db_executor_pid != pid:
+        with _db_executor_lock:
+            if _db_executor is None or _db_executor_pid != pid:
+                _db_executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_MAX_WORKERS,
+                    thread_name_prefix="db-worker",
+                )
+                _db_executor_pid = pid
+    return _db_executor
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """
+    Ejecuta una función bloqueante (queries psycopg2, post-procesamiento)
+    en el executor de DB sin bloquear el event loop de uvicorn.
+
+    Propaga contextvars (Sentry, tenant) al thread worker.
+
+    Usage:
+        rows = await run_in_db_executor(execute_query_dict, sql, params)
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(_get_db_executor(), call)
+
+
+def db_offload(func):
+    """
+    Decorator que convierte un endpoint síncrono (psycopg2 bloqueante) en
+    un endpoint async que corre en el executor de DB.
+
+    A diferencia de un `def` plano (threadpool genérico de Starlette), el
+    executor está dimensionado según los pools de conexiones, de modo que
+    las queries pesadas no compiten con los health checks ni con el loop.
+
+    Usage:
+        @router.get("/stock")
+        @db_offload
+        def get_stock(...):
+            with get_db_connection() as conn:
+                ...
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_db_executor(func, *args, **kwargs)
+    return wrapper
+
+
+async def execute_query_async(sql: str, params: Optional[tuple] = None) -> List[tuple]:
+    """Versión async de execute_query (corre en el executor de DB)."""
+    return await run_in_db_executor(execute_query, sql, params)
+
+
+async def execute_query_dict_async(sql: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
+    """Versión async de execute_query_dict (corre en el executor de DB)."""
+    return await run_in_db_executor(execute_query_dict, sql, params)
+
+
 # =============================================================================
 # COMPATIBILITY FUNCTIONS (Always return True/False for PostgreSQL)
 # =============================================================================
@@ -266,6 +440,12 @@ __all__ = [
     'retry_on_replica_conflict',
     'execute_query',
     'execute_query_dict',
+    'get_pool_stats',
+    'close_pools',
+    'run_in_db_executor',
+    'db_offload',
+    'execute_query_async',
+    'execute_query_dict_async',
     'is_postgres_mode',
     'is_duckdb_mode',
     'get_db_mode',
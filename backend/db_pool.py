@@ -0,0 +1,293 @@
+"""
+Connection Pool para Fluxion AI
+Pool de conexiones PostgreSQL thread-safe usado por db_manager.
+
+Reemplaza el patrón connect-per-request (TCP + auth en cada request):
+- Tamaño acotado (min/max) con espera acotada cuando el pool está lleno
+- Health check (SELECT 1) de conexiones que llevan tiempo ociosas
+- Reaping de conexiones ociosas por encima del mínimo
+- Métricas de checkout y tiempo de espera (ver stats())
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """No se obtuvo conexión del pool dentro de acquire_timeout."""
+
+
+class PostgresConnectionPool:
+    """
+    Pool de conexiones psycopg2 acotado y thread-safe.
+
+    A diferencia de psycopg2.pool.ThreadedConnectionPool (que lanza error
+    inmediatamente al agotarse), getconn() espera hasta acquire_timeout
+    a que otro request devuelva una conexión.
+
+    Usage:
+        pool = PostgresConnectionPool(POSTGRES_DSN, name="replica", max_size=10)
+        conn = pool.getconn()
+        try:
+            ...
+        finally:
+            pool.putconn(conn)
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        name: str = "default",
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 30.0,
+        max_idle_seconds: float = 300.0,
+        health_check_after: float = 30.0,
+        connect: Callable[[str], Any] = psycopg2.connect,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size debe ser >= 1")
+        if min_size < 0 or min_size > max_size:
+            raise ValueError("min_size debe estar entre 0 y max_size")
+
+        self.dsn = dsn
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_after = health_check_after
+        self._connect = connect
+
+        self._cond = threading.Condition(threading.Lock())
+        # LIFO: (conn, last_used_monotonic). Las más recientes al final.
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._size = 0
+        self._closed = False
+
+        # Métricas
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._reaped = 0
+        self._health_check_failures = 0
+
+    # -------------------------------------------------------------------------
+    # Checkout / return
+    # -------------------------------------------------------------------------
+
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        Obtiene una conexión del pool.
+
+        Reutiliza una conexión ociosa si existe (validándola si lleva más de
+        health_check_after segundos sin uso), crea una nueva si el pool no
+        está lleno, o espera a que se libere una.
+
+        Raises:
+            PoolTimeoutError: si no hay conexión disponible tras `timeout`.
+            psycopg2.Error: si falla la creación de una conexión nueva.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            candidate = None
+            create = False
+
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError(f"Pool '{self.name}' cerrado")
+
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Pool '{self.name}' agotado: {self.max_size} conexiones en uso "
+                            f"tras esperar {timeout:.1f}s"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    candidate, last_used = self._idle.pop()
+                    needs_check = time.monotonic() - last_used >= self.health_check_after
+                else:
+                    needs_check = False
+                    create = True
+                # Reservar el slot antes de soltar el lock (crear/validar es I/O)
+                self._in_use += 1
+                if create:
+                    self._size += 1
+
+            if create:
+                try:
+                    candidate = self._connect(self.dsn)
+                except Exception:
+                    with self._cond:
+                        self._in_use -= 1
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            elif candidate.closed or (needs_check and not self._is_healthy(candidate)):
+                self._discard_checked_out(candidate)
+                continue
+
+            candidate.autocommit = False
+            self._record_checkout(time.monotonic() - start, waited)
+            return candidate
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """
+        Devuelve una conexión al pool.
+
+        Hace rollback de cualquier transacción abierta para que el siguiente
+        request reciba una sesión limpia. Conexiones rotas (o con
+        discard=True) se cierran en lugar de reutilizarse.
+        """
+        if not discard and not conn.closed:
+            try:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed or self._closed:
+            self._discard_checked_out(conn)
+            return
+
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        self.reap_idle()
+
+    # -------------------------------------------------------------------------
+    # Mantenimiento
+    # -------------------------------------------------------------------------
+
+    def reap_idle(self) -> int:
+        """
+        Cierra conexiones ociosas por más de max_idle_seconds, respetando
+        min_size. Se invoca en cada putconn(); también puede llamarse
+        periódicamente. Retorna el número de conexiones cerradas.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            # Las más antiguas están al inicio de la lista (LIFO)
+            while (
+                self._idle
+                and self._size > self.min_size
+                and now - self._idle[0][1] >= self.max_idle_seconds
+            ):
+                conn, _ = self._idle.pop(0)
+                self._size -= 1
+                self._reaped += 1
+                expired.append(conn)
+
+        for conn in expired:
+            self._close_quietly(conn)
+        if expired:
+            logger.debug(f"🧹 Pool '{self.name}': {len(expired)} conexiones ociosas cerradas")
+        return len(expired)
+
+    def closeall(self) -> None:
+        """Cierra todas las conexiones ociosas y rechaza nuevos checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._size -= len(idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot de métricas del pool (para /api/health/db-pool y logs)."""
+        with self._cond:
+            return {
+                "name": self.name,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 2),
+                "wait_time_avg_ms": round(
+                    self._wait_time_total * 1000 / self._checkouts, 3
+                ) if self._checkouts else 0.0,
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 2),
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "reaped": self._reaped,
+                "health_check_failures": self._health_check_failures,
+            }
+
+    # -------------------------------------------------------------------------
+    # Internos
+    # -------------------------------------------------------------------------
+
+    def _record_checkout(self, wait_time: float, waited: bool) -> None:
+        with self._cond:
+            self._checkouts += 1
+            self._wait_time_total += wait_time
+            if wait_time > self._wait_time_max:
+                self._wait_time_max = wait_time
+            if waited:
+                self._waits += 1
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"⚠️ Pool '{self.name}': conexión ociosa inválida, descartando ({e})")
+            with self._cond:
+                self._health_check_failures += 1
+            return False
+
+    def _discard_checked_out(self, conn) -> None:
+        self._close_quietly(conn)
+        with self._cond:
+            self._in_use -= 1
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
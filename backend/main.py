@@ -52,7 +52,8 @@ from auth import (
     require_super_admin,
     require_gerente_general_or_above,
     require_gerente_or_above,
-    get_current_user
+    get_current_user,
+    invalidate_user_cache
 )
 
 # Importar ETL Scheduler
@@ -114,6 +115,9 @@ async def startup_event():
     logger.info("⚠️  VentasETLScheduler DISABLED - Use manual ETL sync endpoints or increase RAM to 8GB")
     logger.info("ℹ️  Cache refresh triggered by ETL processes after inventory sync")
 
+    # Caches SWR (summary-regional, resumen de ventas): refresco en segundo plano
+    iniciar_refresco_automatico()
+
 # Configurar CORS para el frontend
 app.add_middleware(
     CORSMiddleware,
@@ -158,25 +162,11 @@ app.include_router(etl_history_router)
 # ============================================================================
 # CACHE CONFIGURATION
 # ============================================================================
-# Simple TTL cache for expensive queries
-# Format: {"data": [...], "timestamp": float}
-_ventas_summary_cache: Dict[str, Any] = {}
+# /api/ventas/summary se sirve desde el cache SWR compartido
+# (services/cache_swr.py): TTL de 5 minutos o nueva bi_data_version tras un ETL
+VENTAS_SUMMARY_CACHE = 'ventas.summary'
 VENTAS_SUMMARY_CACHE_TTL = 300  # 5 minutes in seconds
 
-def get_cached_ventas_summary() -> Optional[List[Any]]:
-    """Returns cached data if valid, None otherwise"""
-    if "data" in _ventas_summary_cache:
-        if time.time() - _ventas_summary_cache.get("timestamp", 0) < VENTAS_SUMMARY_CACHE_TTL:
-            logger.info("📦 Ventas summary served from cache")
-            return _ventas_summary_cache["data"]
-    return None
-
-def set_ventas_summary_cache(data: List[Any]) -> None:
-    """Store data in cache with current timestamp"""
-    _ventas_summary_cache["data"] = data
-    _ventas_summary_cache["timestamp"] = time.time()
-    logger.info("💾 Ventas summary cached for 5 minutes")
-
 # Global Exception Handler con CORS
 @app.middleware("http")
 async def cors_exception_handler(request: Request, call_next):
@@ -274,7 +264,13 @@ async def add_security_headers(request: Request, call_next):
     return response
 
 # Importar utilidades de base de datos
-from db_manager import get_db_connection, get_db_connection_write, execute_query_dict, get_postgres_connection
+from db_manager import get_db_connection, get_db_connection_write, execute_query_dict, get_postgres_connection, get_pool_stats, close_pools, db_offload
+from services.compute_executor import close_compute_executor
+from services.demanda_snapshot import get_snapshot_stats
+from services.export_stream import generar_csv, iterar_filas_conexion, respuesta_descarga
+from services.stock_snapshot import STOCK_SNAPSHOT_MAX_PAGE_SIZE, FiltrosStock, get_stock_snapshot_stats, invalidar_snapshot_stock, obtener_snapshot_stock
+from services.bi_cache import get_bi_cache_stats
+from services.cache_swr import get_swr_cache_stats, iniciar_refresco_automatico, obtener_cache_swr, registrar_cache_swr
 # from database import DB_PATH  # DEPRECADO: ya no usamos DuckDB
 
 # Modelos Pydantic
@@ -365,6 +361,7 @@ class PaginationMetadata(BaseModel):
     anomalias: Optional[int] = 0  # Sin stock pero con ventas
     dormidos: Optional[int] = 0  # Con stock pero sin ventas 14d
     activos: Optional[int] = 0  # Con stock y ventas
+    next_cursor: Optional[str] = None  # Cursor para pedir la página siguiente (keyset)
 
 class PaginatedStockResponse(BaseModel):
     data: List[StockResponse]
@@ -927,6 +924,37 @@ async def health_check():
         "database": "PostgreSQL"
     }
 
+@app.get("/api/health/db-pool", tags=["Health"])
+async def get_db_pool_health():
+    """Métricas del pool de conexiones PostgreSQL del worker que atiende el request"""
+    return get_pool_stats()
+
+@app.get("/api/health/demanda-snapshot", tags=["Health"])
+async def get_demanda_snapshot_health():
+    """Métricas del cache de snapshots de demanda (ventas) del worker que atiende el request"""
+    return get_snapshot_stats()
+
+@app.get("/api/health/stock-snapshot", tags=["Health"])
+async def get_stock_snapshot_health():
+    """Métricas del cache de snapshots de /api/stock del worker que atiende el request"""
+    return get_stock_snapshot_stats()
+
+@app.get("/api/health/bi-cache", tags=["Health"])
+async def get_bi_cache_health():
+    """Métricas del cache de respuestas de BI del worker que atiende el request"""
+    return get_bi_cache_stats()
+
+@app.get("/api/health/swr-cache", tags=["Health"])
+async def get_swr_cache_health():
+    """Métricas de los caches SWR compartidos (summary-regional, resumen de ventas) del worker"""
+    return get_swr_cache_stats()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cerrar conexiones ociosas del pool y procesos de cómputo al apagar el worker"""
+    close_pools()
+    close_compute_executor()
+
 @app.get("/maintenance-status", tags=["Health"])
 async def get_maintenance_status():
     """
@@ -991,7 +1019,8 @@ async def test_sentry():
 # =====================================================================================
 
 @app.post("/api/auth/login", response_model=TokenResponse, tags=["Autenticación"])
-async def login(request: LoginRequest):
+@db_offload
+def login(request: LoginRequest):
     """
     Endpoint de login
     Recibe username y password, retorna JWT token
@@ -1038,7 +1067,8 @@ async def logout():
     return {"message": "Logout exitoso"}
 
 @app.post("/api/auth/register", response_model=Usuario, tags=["Autenticación"])
-async def register(request: CreateUserRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
+@db_offload
+def register(request: CreateUserRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
     """
     Crea un nuevo usuario - SOLO SUPER ADMIN
     Solo super admin puede crear nuevos usuarios
@@ -1088,7 +1118,8 @@ class UpdateUserRequest(BaseModel):
     activo: Optional[bool] = None
 
 @app.get("/api/auth/users", response_model=List[UsuarioAdmin], tags=["Administración Usuarios"])
-async def list_users(current_user: UsuarioConRol = Depends(require_super_admin)):
+@db_offload
+def list_users(current_user: UsuarioConRol = Depends(require_super_admin)):
     """Lista todos los usuarios del sistema - SOLO SUPER ADMIN"""
     try:
         with get_db_connection() as conn:
@@ -1122,7 +1153,8 @@ async def list_users(current_user: UsuarioConRol = Depends(require_super_admin))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/auth/users/{user_id}", response_model=UsuarioAdmin, tags=["Administración Usuarios"])
-async def update_user(user_id: str, request: UpdateUserRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
+@db_offload
+def update_user(user_id: str, request: UpdateUserRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
     """Actualiza datos de un usuario - SOLO SUPER ADMIN"""
     try:
         with get_db_connection_write() as conn:
@@ -1155,6 +1187,7 @@ async def update_user(user_id: str, request: UpdateUserRequest, current_user: Us
                     WHERE id = %s
                 """, params)
                 conn.commit()
+                invalidate_user_cache(user_id=user_id)
 
             # Retornar usuario actualizado
             cursor.execute("""
@@ -1182,7 +1215,8 @@ async def update_user(user_id: str, request: UpdateUserRequest, current_user: Us
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/auth/users/{user_id}/password", tags=["Administración Usuarios"])
-async def change_user_password(user_id: str, request: ChangePasswordRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
+@db_offload
+def change_user_password(user_id: str, request: ChangePasswordRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
     """Cambia la contraseña de un usuario - SOLO SUPER ADMIN"""
     from auth import get_password_hash
 
@@ -1208,6 +1242,7 @@ async def change_user_password(user_id: str, request: ChangePasswordRequest, cur
             """, (password_hash, user_id))
             conn.commit()
             cursor.close()
+            invalidate_user_cache(username=target_username, user_id=user_id)
 
             logger.info(f"Contraseña de '{target_username}' cambiada por '{current_user.username}'")
 
@@ -1219,7 +1254,8 @@ async def change_user_password(user_id: str, request: ChangePasswordRequest, cur
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/auth/users/{user_id}/role", tags=["Administración Usuarios"])
-async def update_user_role(user_id: str, request: UpdateRoleRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
+@db_offload
+def update_user_role(user_id: str, request: UpdateRoleRequest, current_user: UsuarioConRol = Depends(require_super_admin)):
     """Actualiza el rol y tiendas asignadas de un usuario - SOLO SUPER ADMIN"""
     try:
         with get_db_connection_write() as conn:
@@ -1254,6 +1290,7 @@ async def update_user_role(user_id: str, request: UpdateRoleRequest, current_use
 
             conn.commit()
             cursor.close()
+            invalidate_user_cache(username=target_username, user_id=user_id)
 
             logger.info(f"Rol de '{target_username}' actualizado a '{request.rol_id}' por '{current_user.username}'")
 
@@ -1265,7 +1302,8 @@ async def update_user_role(user_id: str, request: UpdateRoleRequest, current_use
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/auth/users/{user_id}", tags=["Administración Usuarios"])
-async def delete_user(user_id: str, current_user: UsuarioConRol = Depends(require_super_admin)):
+@db_offload
+def delete_user(user_id: str, current_user: UsuarioConRol = Depends(require_super_admin)):
     """Elimina un usuario (soft delete - lo desactiva) - SOLO SUPER ADMIN"""
     try:
         # No permitir auto-eliminación
@@ -1292,6 +1330,7 @@ async def delete_user(user_id: str, current_user: UsuarioConRol = Depends(requir
             """, (user_id,))
             conn.commit()
             cursor.close()
+            invalidate_user_cache(username=target_username, user_id=user_id)
 
             logger.info(f"Usuario '{target_username}' eliminado por '{current_user.username}'")
 
@@ -1357,7 +1396,8 @@ class OportunidadesCediResponse(BaseModel):
 
 
 @app.get("/api/inventario/oportunidades-cedi", response_model=List[OportunidadesCediResponse], tags=["Análisis Distribución"])
-async def get_oportunidades_cedi(
+@db_offload
+def get_oportunidades_cedi(
     region: Optional[str] = None,
     umbral_stock: int = 5,  # Stock <= este valor se considera "sin stock"
     min_stock_cedi: int = 10,  # Mínimo stock en CEDI para considerar (en unidades)
@@ -1565,7 +1605,8 @@ class ExpansionCatalogoResponse(BaseModel):
 
 
 @app.get("/api/inventario/expansion-catalogo", response_model=List[ExpansionCatalogoResponse], tags=["Análisis Distribución"])
-async def get_expansion_catalogo(
+@db_offload
+def get_expansion_catalogo(
     region: Optional[str] = None,
     cobertura_min: float = 10,  # Mínimo % de cobertura (para excluir productos muy nuevos)
     cobertura_max: float = 50,  # Máximo % de cobertura (objetivo: expandir estos)
@@ -1706,7 +1747,8 @@ async def get_expansion_catalogo(
 
 
 @app.get("/api/productos", response_model=List[ProductoResponse], tags=["Productos"])
-async def get_productos(categoria: Optional[str] = None, activo: bool = True):
+@db_offload
+def get_productos(categoria: Optional[str] = None, activo: bool = True):
     """Obtiene todos los productos"""
     try:
         # PostgreSQL v2.0: usar execute_query_dict para compatibilidad
@@ -1747,7 +1789,8 @@ async def get_productos(categoria: Optional[str] = None, activo: bool = True):
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.get("/api/categorias", tags=["Productos"])
-async def get_categorias():
+@db_offload
+def get_categorias():
     """
     Obtiene todas las categorías de productos
     """
@@ -1773,7 +1816,8 @@ async def get_categorias():
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.get("/api/marcas", tags=["Productos"])
-async def get_marcas():
+@db_offload
+def get_marcas():
     """
     Obtiene todas las marcas de productos
     """
@@ -1960,7 +2004,8 @@ def calculate_ventas_semanales_metricas(semanas: List[Dict]) -> Dict[str, Any]:
 # =====================================================================================
 
 @app.get("/api/productos/matriz-abc-xyz", tags=["Productos"])
-async def get_matriz_abc_xyz(ubicacion_id: Optional[str] = None):
+@db_offload
+def get_matriz_abc_xyz(ubicacion_id: Optional[str] = None):
     """
     Retorna clasificación ABC-XYZ.
 
@@ -2382,7 +2427,8 @@ async def get_matriz_abc_xyz(ubicacion_id: Optional[str] = None):
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.get("/api/productos/lista-por-matriz", tags=["Productos"])
-async def get_productos_por_matriz(
+@db_offload
+def get_productos_por_matriz(
     matriz: Optional[str] = None,
     ubicacion_id: Optional[str] = None,
     limit: int = 100,
@@ -3025,7 +3071,8 @@ async def _get_productos_analisis_resumen_slow(clasificacion_abc: Optional[str]
 
 
 @app.get("/api/productos/{codigo}/detalle-tiendas", tags=["Productos"])
-async def get_producto_detalle_tiendas(codigo: str):
+@db_offload
+def get_producto_detalle_tiendas(codigo: str):
     """
     Detalle de stock y ventas por tienda para un producto específico.
     """
@@ -3095,7 +3142,8 @@ async def get_producto_detalle_tiendas(codigo: str):
 
 
 @app.get("/api/productos/{codigo}/detalle-completo", tags=["Productos"])
-async def get_producto_detalle_completo(codigo: str):
+@db_offload
+def get_producto_detalle_completo(codigo: str):
     """
     Vista 360° de un producto: info básica, clasificación ABC global,
     inventarios por tienda.
@@ -3166,15 +3214,22 @@ async def get_producto_detalle_completo(codigo: str):
             }]
 
             # 3. Inventarios por ubicación (TODAS las ubicaciones, no solo las que tienen stock)
+            # Carga delta: filas sin cambios conservan su fecha; el último snapshot confirmado está en inventario_cargas
             cursor.execute("""
                 SELECT
                     u.id as ubicacion_id,
                     u.nombre as ubicacion_nombre,
                     u.tipo as tipo_ubicacion,
                     COALESCE(i.cantidad, 0) as cantidad,
-                    i.fecha_actualizacion
+                    GREATEST(i.fecha_actualizacion, ult.fecha_snapshot)
                 FROM ubicaciones u
                 LEFT JOIN inventario_actual i ON i.ubicacion_id = u.id AND i.producto_id = %s
+                LEFT JOIN LATERAL (
+                    SELECT MAX(c.fecha_snapshot) AS fecha_snapshot
+                    FROM inventario_cargas c
+                    WHERE c.ubicacion_id = i.ubicacion_id
+                      AND c.almacen_codigo = i.almacen_codigo
+                ) ult ON TRUE
                 ORDER BY u.tipo, u.nombre
             """, (codigo,))
 
@@ -3225,7 +3280,8 @@ async def get_producto_detalle_completo(codigo: str):
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.get("/api/productos/{codigo}/ventas-semanales", tags=["Productos"])
-async def get_ventas_semanales(codigo: str, ubicacion_id: Optional[str] = None):
+@db_offload
+def get_ventas_semanales(codigo: str, ubicacion_id: Optional[str] = None):
     """
     Obtiene serie temporal de ventas semanales para un producto.
 
@@ -3348,7 +3404,8 @@ async def get_ventas_semanales(codigo: str, ubicacion_id: Optional[str] = None):
 
 
 @app.get("/api/productos/{codigo}/ventas-por-tienda", tags=["Productos"])
-async def get_ventas_por_tienda(codigo: str, periodo: str = "1w"):
+@db_offload
+def get_ventas_por_tienda(codigo: str, periodo: str = "1w"):
     """
     Obtiene ventas por tienda para un producto en un período específico.
 
@@ -3435,7 +3492,8 @@ async def get_ventas_por_tienda(codigo: str, periodo: str = "1w"):
 
 
 @app.get("/api/productos/{codigo}/historico-clasificacion", tags=["Productos"])
-async def get_historico_clasificacion(codigo: str, ubicacion_id: Optional[str] = None):
+@db_offload
+def get_historico_clasificacion(codigo: str, ubicacion_id: Optional[str] = None):
     """
     Obtiene el histórico de clasificación ABC-XYZ de un producto.
 
@@ -3583,7 +3641,8 @@ async def get_historico_clasificacion(codigo: str, ubicacion_id: Optional[str] =
 
 
 @app.get("/api/productos/{codigo}/historico-inventario", tags=["Productos"])
-async def get_historico_inventario(
+@db_offload
+def get_historico_inventario(
     codigo: str,
     ubicacion_id: Optional[str] = None,
     almacen_codigo: Optional[str] = None,
@@ -3654,15 +3713,22 @@ async def get_historico_inventario(
                 })
 
             # 2. Obtener inventario actual
+            # Carga delta: filas sin cambios conservan su fecha; el último snapshot confirmado está en inventario_cargas
             query_actual = """
                 SELECT
-                    ia.fecha_actualizacion,
+                    GREATEST(ia.fecha_actualizacion, ult.fecha_snapshot),
                     ia.ubicacion_id,
                     u.nombre as ubicacion_nombre,
                     ia.almacen_codigo,
                     ia.cantidad
                 FROM inventario_actual ia
                 JOIN ubicaciones u ON ia.ubicacion_id = u.id
+                LEFT JOIN LATERAL (
+                    SELECT MAX(c.fecha_snapshot) AS fecha_snapshot
+                    FROM inventario_cargas c
+                    WHERE c.ubicacion_id = ia.ubicacion_id
+                      AND c.almacen_codigo = ia.almacen_codigo
+                ) ult ON TRUE
                 WHERE ia.producto_id = %s
             """
             params_actual = [producto_id]
@@ -3711,7 +3777,8 @@ async def get_historico_inventario(
 
 
 @app.get("/api/productos/{codigo}/reconciliacion-inventario", tags=["Productos"])
-async def get_reconciliacion_inventario(
+@db_offload
+def get_reconciliacion_inventario(
     codigo: str,
     ubicacion_id: str,
     almacen_codigo: Optional[str] = None,
@@ -3856,8 +3923,524 @@ async def get_reconciliacion_inventario(
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 
+def _query_stock_base(
+    ubicacion_id: Optional[str],
+    almacen_codigo: Optional[str],
+    categoria: Optional[str],
+    marca: Optional[str],
+    search: Optional[str]
+) -> Tuple[List[str], List[tuple]]:
+    """
+    Query pesada de /api/stock (P75, ABC, stock CEDI, clasificación) para una
+    combinación de filtros base, sin filtros calculados ni paginación.
+
+    Returns: (columnas, filas)
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        # Detectar si la ubicación es un CEDI
+        is_cedi = False
+        cedi_region = None
+        if ubicacion_id:
+            cursor.execute("SELECT tipo, region FROM ubicaciones WHERE id = %s", [ubicacion_id])
+            tipo_row = cursor.fetchone()
+            if tipo_row and tipo_row[0] == 'cedi':
+                is_cedi = True
+                cedi_region = tipo_row[1]
+
+        # Base params para filtros
+        base_params = []
+        base_where = "p.activo = true AND u.activo = true"
+
+        if ubicacion_id:
+            base_where += " AND ia.ubicacion_id = %s"
+            base_params.append(ubicacion_id)
+
+        if almacen_codigo:
+            base_where += " AND ia.almacen_codigo = %s"
+            base_params.append(almacen_codigo)
+
+        if categoria:
+            base_where += " AND p.categoria = %s"
+            base_params.append(categoria)
+
+        if marca:
+            base_where += " AND p.marca = %s"
+            base_params.append(marca)
+
+        if search:
+            # Soporte para múltiples códigos separados por coma (con/sin ceros)
+            search_codes = [c.strip() for c in search.split(',') if c.strip()]
+            if len(search_codes) > 1 or (len(search_codes) == 1 and search_codes[0].replace(' ', '').isdigit()):
+                # Búsqueda por código(s): generar variantes con/sin ceros
+                or_conditions = []
+                for code in search_codes:
+                    code = code.strip()
+                    if not code:
+                        continue
+                    variantes = [code]
+                    if code.isdigit():
+                        padded = code.zfill(6)
+                        if padded != code:
+                            variantes.append(padded)
+                        stripped = code.lstrip('0') or '0'
+                        if stripped != code:
+                            variantes.append(stripped)
+                    placeholders = ','.join(['%s'] * len(variantes))
+                    or_conditions.append(f"p.codigo IN ({placeholders})")
+                    base_params.extend(variantes)
+                if or_conditions:
+                    base_where += f" AND ({' OR '.join(or_conditions)})"
+            else:
+                # Búsqueda libre por código o descripción
+                search_term = f"%{search}%"
+                base_where += " AND (p.codigo ILIKE %s OR p.descripcion ILIKE %s)"
+                base_params.extend([search_term, search_term])
+
+        # =====================================================================
+        # QUERY PRINCIPAL: rama diferente para CEDI vs Tienda
+        # =====================================================================
+        if is_cedi and ubicacion_id:
+            # --- CEDI: P75 regional (suma de tiendas), ABC regional ---
+            main_query = f"""
+            WITH tiendas_region AS (
+                -- Tiendas activas de la misma región que el CEDI
+                SELECT id FROM ubicaciones
+                WHERE region = %s
+                  AND tipo = 'tienda' AND activo = true
+            ),
+            ventas_30d_regional AS (
+                -- Ventas diarias de TODAS las tiendas de la región (30 días)
+                SELECT
+                    producto_id,
+                    ubicacion_id,
+                    DATE(fecha_venta) as fecha,
+                    SUM(cantidad_vendida) as cantidad_dia
+                FROM ventas
+                WHERE ubicacion_id IN (SELECT id FROM tiendas_region)
+                  AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
+                  AND fecha_venta < CURRENT_DATE
+                  AND NOT (ubicacion_id = 'tienda_18' AND DATE(fecha_venta) = '2025-12-06')
+                GROUP BY producto_id, ubicacion_id, DATE(fecha_venta)
+            ),
+            p75_por_tienda AS (
+                -- P75 por producto por tienda
+                SELECT
+                    producto_id,
+                    ubicacion_id,
+                    PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY cantidad_dia) as p75_tienda,
+                    STDDEV(cantidad_dia) as sigma_tienda
+                FROM ventas_30d_regional
+                GROUP BY producto_id, ubicacion_id
+            ),
+            demanda_p75 AS (
+                -- P75 regional = SUMA de P75 de todas las tiendas
+                SELECT
+                    producto_id,
+                    SUM(COALESCE(p75_tienda, 0)) as p75,
+                    SQRT(SUM(COALESCE(sigma_tienda * sigma_tienda, 0))) as sigma_demanda,
+                    COUNT(DISTINCT ubicacion_id) as dias_con_venta
+                FROM p75_por_tienda
+                GROUP BY producto_id
+                HAVING SUM(COALESCE(p75_tienda, 0)) > 0
+            ),
+            abc_ranking AS (
+                -- ABC regional: ranking por cantidad vendida agregada de la región
+                SELECT
+                    producto_id,
+                    SUM(cantidad_dia) as cantidad_total,
+                    ROW_NUMBER() OVER (ORDER BY SUM(cantidad_dia) DESC) as rank_cantidad
+                FROM ventas_30d_regional
+                GROUP BY producto_id
+            ),
+            abc_regional AS (
+                SELECT
+                    producto_id,
+                    rank_cantidad,
+                    CASE
+                        WHEN rank_cantidad <= 50 THEN 'A'
+                        WHEN rank_cantidad <= 200 THEN 'B'
+                        WHEN rank_cantidad <= 800 THEN 'C'
+                        ELSE 'D'
+                    END as clase_abc
+                FROM abc_ranking
+            ),
+            stock_tiendas AS (
+                -- Stock total en tiendas de la región (para la columna "Tiendas")
+                SELECT
+                    ia.producto_id,
+                    SUM(ia.cantidad) as cantidad_tiendas
+                FROM inventario_actual ia
+                WHERE ia.ubicacion_id IN (SELECT id FROM tiendas_region)
+                GROUP BY ia.producto_id
+            ),
+            stock_data AS (
+                SELECT
+                    ia.ubicacion_id,
+                    u.nombre as ubicacion_nombre,
+                    'cedi' as tipo_ubicacion,
+                    ia.producto_id,
+                    COALESCE(p.codigo, '') as codigo_producto,
+                    COALESCE(p.codigo_barras, '') as codigo_barras,
+                    COALESCE(NULLIF(p.descripcion, ''), 'Sin Descripción') as descripcion_producto,
+                    COALESCE(NULLIF(p.categoria, ''), 'Sin Categoría') as categoria,
+                    COALESCE(p.marca, '') as marca,
+                    ia.cantidad as stock_actual,
+                    -- Unidades por bulto
+                    COALESCE(p.unidades_por_bulto, 1) as unidades_por_bulto,
+                    -- Peso y volumen del producto
+                    COALESCE(p.peso_unitario, 0) as peso_unitario_kg,
+                    COALESCE(p.volumen_unitario, 0) as volumen_unitario_m3,
+                    -- Demanda P75 regional
+                    COALESCE(dp.p75, 0) as demanda_p75,
+                    COALESCE(dp.sigma_demanda, 0) as sigma_demanda,
+                    -- Clase ABC regional
+                    COALESCE(abc.clase_abc, 'SIN_VENTAS') as clase_abc,
+                    abc.rank_cantidad as rank_ventas,
+                    -- Lead time para CEDI (default 2.0 días)
+                    2.0 as lead_time,
+                    -- Días de cobertura MAX según clase ABC
+                    CASE COALESCE(abc.clase_abc, 'C')
+                        WHEN 'A' THEN 7
+                        WHEN 'B' THEN 14
+                        WHEN 'C' THEN 21
+                        ELSE 30
+                    END as dias_cobertura_objetivo,
+                    -- Ventas: NULL para CEDIs (no venden)
+                    0 as ventas_30d,
+                    0 as ventas_14d,
+                    0 as ventas_60d,
+                    -- Stock en tiendas de la región (reemplaza stock_cedi)
+                    COALESCE(st.cantidad_tiendas, 0) as stock_cedi,
+                    -- Stock tiendas regional (campo nuevo)
+                    COALESCE(st.cantidad_tiendas, 0) as stock_tiendas_regional,
+                    -- Límites forzados: no aplica a CEDIs
+                    NULL::numeric as limite_min_forzado,
+                    NULL::numeric as limite_max_forzado,
+                    NULL::text as tipo_limite,
+                    -- Metadata (carga delta: filas sin cambios conservan su fecha; el último snapshot confirmado está en inventario_cargas)
+                    TO_CHAR(GREATEST(ia.fecha_actualizacion, ult.fecha_snapshot), 'YYYY-MM-DD HH24:MI:SS') as fecha_extraccion
+                FROM inventario_actual ia
+                INNER JOIN productos p ON ia.producto_id = p.id
+                INNER JOIN ubicaciones u ON ia.ubicacion_id = u.id
+                LEFT JOIN LATERAL (
+                    SELECT MAX(c.fecha_snapshot) AS fecha_snapshot
+                    FROM inventario_cargas c
+                    WHERE c.ubicacion_id = ia.ubicacion_id
+                      AND c.almacen_codigo = ia.almacen_codigo
+                ) ult ON TRUE
+                LEFT JOIN demanda_p75 dp ON dp.producto_id = ia.producto_id
+                LEFT JOIN abc_regional abc ON abc.producto_id = ia.producto_id
+                LEFT JOIN stock_tiendas st ON st.producto_id = ia.producto_id
+                WHERE {base_where}
+            ),
+            calculated AS (
+                SELECT
+                    *,
+                    -- Parámetros de inventario en DÍAS (fórmula simplificada, igual que tiendas)
+                    lead_time as dias_ss,
+                    lead_time + (dias_cobertura_objetivo / 2.0) as dias_rop,
+                    lead_time + dias_cobertura_objetivo as dias_max,
+                    -- Parámetros en UNIDADES
+                    CASE WHEN demanda_p75 > 0 THEN
+                        demanda_p75 * lead_time
+                    ELSE 0 END as stock_seguridad,
+                    CASE WHEN demanda_p75 > 0 THEN
+                        demanda_p75 * (lead_time + dias_cobertura_objetivo / 2.0)
+                    ELSE 0 END as punto_reorden,
+                    CASE WHEN demanda_p75 > 0 THEN
+                        demanda_p75 * (lead_time + dias_cobertura_objetivo)
+                    ELSE 0 END as stock_maximo,
+                    -- Días de cobertura actual = stock / P75 regional
+                    CASE WHEN demanda_p75 > 0 THEN
+                        stock_actual / demanda_p75
+                    ELSE NULL END as dias_cobertura_actual,
+                    -- Clasificación de producto: NULL para CEDIs (no aplica FANTASMA/DORMIDO)
+                    NULL::text as clasificacion_producto,
+                    -- Velocidad de venta: NULL para CEDIs
+                    NULL::text as velocidad_venta
+                FROM stock_data
+            ),
+            final AS (
+                SELECT
+                    *,
+                    -- Estado de criticidad basado en SS, ROP, MAX
+                    CASE
+                        WHEN demanda_p75 = 0 OR demanda_p75 IS NULL THEN 'SIN_DEMANDA'
+                        WHEN dias_cobertura_actual IS NULL THEN 'SIN_DEMANDA'
+                        WHEN stock_actual <= stock_seguridad THEN 'CRITICO'
+                        WHEN stock_actual <= punto_reorden THEN 'URGENTE'
+                        WHEN stock_actual <= stock_maximo THEN 'OPTIMO'
+                        ELSE 'EXCESO'
+                    END as estado_criticidad,
+                    CASE
+                        WHEN stock_actual = 0 THEN 'sin_stock'
+                        WHEN stock_actual < 0 THEN 'stock_negativo'
+                        ELSE 'normal'
+                    END as estado_stock
+                FROM calculated
+            )
+            SELECT * FROM final
+            WHERE 1=1
+            """
+
+            # Params: cedi_region (1 vez para tiendas_region) + base_params
+            query_params = [cedi_region] + base_params
+
+        else:
+            # --- TIENDA: lógica original (P75 de la tienda, ABC de la tienda) ---
+            # Lead time default: 1.5 días
+            # NOTA: Para tienda_18 (PARAÍSO) se excluye 2025-12-06 (inauguración con ventas atípicas)
+            main_query = f"""
+            WITH ventas_20d AS (
+                -- Ventas diarias por producto en la ubicación (últimos 20 días)
+                SELECT
+                    producto_id,
+                    DATE(fecha_venta) as fecha,
+                    SUM(cantidad_vendida) as total_dia
+                FROM ventas
+                WHERE ubicacion_id = %s
+                  AND fecha_venta >= CURRENT_DATE - INTERVAL '20 days'
+                  AND fecha_venta < CURRENT_DATE
+                  AND NOT (ubicacion_id = 'tienda_18' AND DATE(fecha_venta) = '2025-12-06')
+                GROUP BY producto_id, DATE(fecha_venta)
+            ),
+            demanda_p75 AS (
+                -- P75 de ventas diarias (más conservador que promedio)
+                SELECT
+                    producto_id,
+                    PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY total_dia) as p75,
+                    STDDEV(total_dia) as sigma_demanda,
+                    COUNT(DISTINCT fecha) as dias_con_venta
+                FROM ventas_20d
+                GROUP BY producto_id
+            ),
+            ventas_30d AS (
+                -- Total ventas 30 días para clasificación producto
+                SELECT
+                    producto_id,
+                    SUM(cantidad_vendida) as total_30d
+                FROM ventas
+                WHERE ubicacion_id = %s
+                  AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
+                GROUP BY producto_id
+            ),
+            ventas_14d AS (
+                -- Total ventas 14 días para detectar dormidos
+                SELECT
+                    producto_id,
+                    SUM(cantidad_vendida) as total_14d
+                FROM ventas
+                WHERE ubicacion_id = %s
+                  AND fecha_venta >= CURRENT_DATE - INTERVAL '14 days'
+                GROUP BY producto_id
+            ),
+            ventas_60d AS (
+                -- Total ventas 60 días (2 meses)
+                SELECT
+                    producto_id,
+                    SUM(cantidad_vendida) as total_60d
+                FROM ventas
+                WHERE ubicacion_id = %s
+                  AND fecha_venta >= CURRENT_DATE - INTERVAL '60 days'
+                GROUP BY producto_id
+            ),
+            tienda_region AS (
+                -- Obtener la región de la tienda
+                SELECT region FROM ubicaciones WHERE id = %s
+            ),
+            stock_cedi AS (
+                -- Stock disponible en TODOS los CEDIs de la misma región
+                SELECT
+                    ia.producto_id,
+                    SUM(ia.cantidad) as cantidad_cedi
+                FROM inventario_actual ia
+                INNER JOIN ubicaciones cedi ON cedi.id = ia.ubicacion_id
+                WHERE cedi.tipo = 'cedi'
+                  AND cedi.region = (SELECT region FROM tienda_region)
+                GROUP BY ia.producto_id
+            ),
+            abc_tienda AS (
+                -- Clasificación ABC de la tienda
+                SELECT
+                    producto_id,
+                    clase_abc,
+                    rank_cantidad
+                FROM productos_abc_tienda
+                WHERE ubicacion_id = %s
+            ),
+            config_abc AS (
+                -- Configuración de días de cobertura por tienda (de config_parametros_abc_tienda)
+                SELECT
+                    COALESCE(lead_time_override, 1.5) as lead_time,
+                    COALESCE(dias_cobertura_a, 7) as dias_cob_a,
+                    COALESCE(dias_cobertura_b, 14) as dias_cob_b,
+                    COALESCE(dias_cobertura_c, 21) as dias_cob_c,
+                    COALESCE(clase_d_dias_cobertura, 30) as dias_cob_d
+                FROM config_parametros_abc_tienda
+                WHERE tienda_id = %s AND activo = true
+            ),
+            limites_forzados AS (
+                -- Límites forzados por configuración (capacidad máxima y mínimo exhibición)
+                SELECT
+                    producto_codigo,
+                    capacidad_maxima_unidades as limite_max_forzado,
+                    minimo_exhibicion_unidades as limite_min_forzado,
+                    tipo_restriccion as tipo_limite
+                FROM capacidad_almacenamiento_producto
+                WHERE tienda_id = %s AND activo = true
+            ),
+            stock_data AS (
+                SELECT
+                    ia.ubicacion_id,
+                    u.nombre as ubicacion_nombre,
+                    'tienda' as tipo_ubicacion,
+                    ia.producto_id,
+                    COALESCE(p.codigo, '') as codigo_producto,
+                    COALESCE(p.codigo_barras, '') as codigo_barras,
+                    COALESCE(NULLIF(p.descripcion, ''), 'Sin Descripción') as descripcion_producto,
+                    COALESCE(NULLIF(p.categoria, ''), 'Sin Categoría') as categoria,
+                    COALESCE(p.marca, '') as marca,
+                    ia.cantidad as stock_actual,
+                    -- Unidades por bulto
+                    COALESCE(p.unidades_por_bulto, 1) as unidades_por_bulto,
+                    -- Peso y volumen del producto
+                    COALESCE(p.peso_unitario, 0) as peso_unitario_kg,
+                    COALESCE(p.volumen_unitario, 0) as volumen_unitario_m3,
+                    -- Demanda P75
+                    COALESCE(dp.p75, 0) as demanda_p75,
+                    COALESCE(dp.sigma_demanda, 0) as sigma_demanda,
+                    -- Clase ABC y ranking
+                    COALESCE(abc.clase_abc, 'SIN_VENTAS') as clase_abc,
+                    abc.rank_cantidad as rank_ventas,
+                    -- Configuración ABC desde config_parametros_abc_tienda
+                    COALESCE((SELECT lead_time FROM config_abc), 1.5) as lead_time,
+                    -- Días de cobertura MAX según clase ABC (esto es el stock_max_mult en días)
+                    CASE COALESCE(abc.clase_abc, 'C')
+                        WHEN 'A' THEN COALESCE((SELECT dias_cob_a FROM config_abc), 7)
+                        WHEN 'B' THEN COALESCE((SELECT dias_cob_b FROM config_abc), 14)
+                        WHEN 'C' THEN COALESCE((SELECT dias_cob_c FROM config_abc), 21)
+                        ELSE COALESCE((SELECT dias_cob_d FROM config_abc), 30)
+                    END as dias_cobertura_objetivo,
+                    -- Ventas para clasificación producto
+                    COALESCE(v30.total_30d, 0) as ventas_30d,
+                    COALESCE(v14.total_14d, 0) as ventas_14d,
+                    COALESCE(v60.total_60d, 0) as ventas_60d,
+                    -- Stock en CEDI
+                    COALESCE(sc.cantidad_cedi, 0) as stock_cedi,
+                    -- Stock tiendas regional: NULL para tiendas
+                    NULL::numeric as stock_tiendas_regional,
+                    -- Límites forzados por configuración
+                    lf.limite_min_forzado,
+                    lf.limite_max_forzado,
+                    lf.tipo_limite,
+                    -- Metadata (carga delta: filas sin cambios conservan su fecha; el último snapshot confirmado está en inventario_cargas)
+                    TO_CHAR(GREATEST(ia.fecha_actualizacion, ult.fecha_snapshot), 'YYYY-MM-DD HH24:MI:SS') as fecha_extraccion
+                FROM inventario_actual ia
+                INNER JOIN productos p ON ia.producto_id = p.id
+                INNER JOIN ubicaciones u ON ia.ubicacion_id = u.id
+                LEFT JOIN LATERAL (
+                    SELECT MAX(c.fecha_snapshot) AS fecha_snapshot
+                    FROM inventario_cargas c
+                    WHERE c.ubicacion_id = ia.ubicacion_id
+                      AND c.almacen_codigo = ia.almacen_codigo
+                ) ult ON TRUE
+                LEFT JOIN demanda_p75 dp ON dp.producto_id = ia.producto_id
+                LEFT JOIN abc_tienda abc ON abc.producto_id = ia.producto_id
+                LEFT JOIN ventas_60d v60 ON v60.producto_id = ia.producto_id
+                LEFT JOIN ventas_30d v30 ON v30.producto_id = ia.producto_id
+                LEFT JOIN ventas_14d v14 ON v14.producto_id = ia.producto_id
+                LEFT JOIN stock_cedi sc ON sc.producto_id = ia.producto_id
+                LEFT JOIN limites_forzados lf ON lf.producto_codigo = p.codigo
+                WHERE {base_where}
+            ),
+            calculated AS (
+                SELECT
+                    *,
+                    -- Parámetros de inventario en DÍAS (basados en config de tienda)
+                    -- SS = lead_time (stock mínimo para cubrir tiempo de entrega)
+                    lead_time as dias_ss,
+                    -- ROP = lead_time + (dias_cobertura / 2) (punto medio entre SS y MAX)
+                    lead_time + (dias_cobertura_objetivo / 2.0) as dias_rop,
+                    -- MAX = lead_time + dias_cobertura (cobertura total objetivo)
+                    lead_time + dias_cobertura_objetivo as dias_max,
+                    -- Calcular parámetros de inventario en UNIDADES
+                    CASE WHEN demanda_p75 > 0 THEN
+                        demanda_p75 * lead_time
+                    ELSE 0 END as stock_seguridad,
+                    CASE WHEN demanda_p75 > 0 THEN
+                        demanda_p75 * (lead_time + dias_cobertura_objetivo / 2.0)
+                    ELSE 0 END as punto_reorden,
+                    CASE WHEN demanda_p75 > 0 THEN
+                        demanda_p75 * (lead_time + dias_cobertura_objetivo)
+                    ELSE 0 END as stock_maximo,
+                    -- Días de cobertura actual
+                    CASE WHEN demanda_p75 > 0 THEN
+                        stock_actual / demanda_p75
+                    ELSE NULL END as dias_cobertura_actual,
+                    -- Clasificación de producto
+                    CASE
+                        WHEN stock_actual <= 0 AND ventas_30d = 0 THEN 'FANTASMA'
+                        WHEN stock_actual <= 0 AND ventas_30d > 0 THEN 'ANOMALIA'
+                        WHEN stock_actual > 0 AND ventas_14d = 0 THEN 'DORMIDO'
+                        ELSE 'ACTIVO'
+                    END as clasificacion_producto,
+                    -- Velocidad de venta (basado en ventas_30d)
+                    CASE
+                        WHEN ventas_30d = 0 THEN 'SIN_VENTAS'
+                        WHEN ventas_30d BETWEEN 1 AND 5 THEN 'BAJA'
+                        WHEN ventas_30d BETWEEN 6 AND 15 THEN 'MEDIA'
+                        WHEN ventas_30d BETWEEN 16 AND 30 THEN 'ALTA'
+                        ELSE 'MUY_ALTA'
+                    END as velocidad_venta
+                FROM stock_data
+            ),
+            final AS (
+                SELECT
+                    *,
+                    -- Estado de criticidad basado en SS, ROP, MAX
+                    CASE
+                        WHEN demanda_p75 = 0 OR demanda_p75 IS NULL THEN 'SIN_DEMANDA'
+                        WHEN dias_cobertura_actual IS NULL THEN 'SIN_DEMANDA'
+                        WHEN stock_actual <= stock_seguridad THEN 'CRITICO'
+                        WHEN stock_actual <= punto_reorden THEN 'URGENTE'
+                        WHEN stock_actual <= stock_maximo THEN 'OPTIMO'
+                        ELSE 'EXCESO'
+                    END as estado_criticidad,
+                    -- Estado stock legacy
+                    CASE
+                        WHEN stock_actual = 0 THEN 'sin_stock'
+                        WHEN stock_actual < 0 THEN 'stock_negativo'
+                        ELSE 'normal'
+                    END as estado_stock
+                FROM calculated
+            )
+            SELECT * FROM final
+            WHERE 1=1
+            """
+
+            # Params para los CTEs (ubicacion_id se usa 8 veces en CTEs)
+            # Luego base_params puede agregar más (ubicacion_id, almacen, categoria, search)
+            query_params = []
+            if ubicacion_id:
+                # 8 veces para los CTEs: ventas_20d, ventas_30d, ventas_14d, ventas_60d, cedi_region, abc_tienda, config_abc, limites_forzados
+                query_params = [ubicacion_id] * 8 + base_params
+            else:
+                # Sin ubicacion_id, los CTEs de ventas no funcionan bien
+                # Usamos un valor que no matchea nada para evitar errores SQL
+                query_params = ['__none__'] * 8 + base_params
+
+        cursor.execute(main_query, tuple(query_params))
+        rows = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
+        cursor.close()
+    return columns, rows
+
+
 @app.get("/api/stock", response_model=PaginatedStockResponse, tags=["Inventario"])
-async def get_stock(
+@db_offload
+def get_stock(
     ubicacion_id: Optional[str] = None,
     almacen_codigo: Optional[str] = None,
     categoria: Optional[str] = None,
@@ -3873,7 +4456,8 @@ async def get_stock(
     page_size: int = 50,
     search: Optional[str] = None,
     sort_by: Optional[str] = None,
-    sort_order: Optional[str] = 'desc'
+    sort_order: Optional[str] = 'desc',
+    cursor: Optional[str] = None
 ):
     """
     Obtiene el estado del stock actual con paginación server-side y métricas avanzadas.
@@ -3900,589 +4484,71 @@ async def get_stock(
         stock_cedi_filter: CON_STOCK (>0 en CEDI), SIN_STOCK (=0 en CEDI)
         stock_filter: CON_STOCK (stock_actual > 0), SIN_STOCK (stock_actual <= 0)
         page: Número de página
-        page_size: Items por página
+        page_size: Items por página (máx STOCK_SNAPSHOT_MAX_PAGE_SIZE, default 5000)
         search: Buscar por código o descripción
         sort_by: stock, peso, dias_stock, rank_ventas
         sort_order: asc o desc
+        cursor: `pagination.next_cursor` de la respuesta anterior (keyset); si viene, se ignora `page`
+
+    El resultado completo por (ubicación, almacén, categoría, marca, búsqueda)
+    se guarda en un snapshot en memoria (services/stock_snapshot.py): las
+    páginas siguientes, los cambios de orden y los filtros calculados no
+    vuelven a ejecutar la query.
     """
     try:
         if page < 1:
             raise HTTPException(status_code=400, detail="El número de página debe ser >= 1")
-        if page_size < 1 or page_size > 100000:
-            raise HTTPException(status_code=400, detail="page_size debe estar entre 1 y 100000")
-
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-
-            # Detectar si la ubicación es un CEDI
-            is_cedi = False
-            cedi_region = None
-            if ubicacion_id:
-                cursor.execute("SELECT tipo, region FROM ubicaciones WHERE id = %s", [ubicacion_id])
-                tipo_row = cursor.fetchone()
-                if tipo_row and tipo_row[0] == 'cedi':
-                    is_cedi = True
-                    cedi_region = tipo_row[1]
-
-            # Base params para filtros
-            base_params = []
-            base_where = "p.activo = true AND u.activo = true"
-
-            if ubicacion_id:
-                base_where += " AND ia.ubicacion_id = %s"
-                base_params.append(ubicacion_id)
-
-            if almacen_codigo:
-                base_where += " AND ia.almacen_codigo = %s"
-                base_params.append(almacen_codigo)
-
-            if categoria:
-                base_where += " AND p.categoria = %s"
-                base_params.append(categoria)
-
-            if marca:
-                base_where += " AND p.marca = %s"
-                base_params.append(marca)
-
-            if search:
-                # Soporte para múltiples códigos separados por coma (con/sin ceros)
-                search_codes = [c.strip() for c in search.split(',') if c.strip()]
-                if len(search_codes) > 1 or (len(search_codes) == 1 and search_codes[0].replace(' ', '').isdigit()):
-                    # Búsqueda por código(s): generar variantes con/sin ceros
-                    or_conditions = []
-                    for code in search_codes:
-                        code = code.strip()
-                        if not code:
-                            continue
-                        variantes = [code]
-                        if code.isdigit():
-                            padded = code.zfill(6)
-                            if padded != code:
-                                variantes.append(padded)
-                            stripped = code.lstrip('0') or '0'
-                            if stripped != code:
-                                variantes.append(stripped)
-                        placeholders = ','.join(['%s'] * len(variantes))
-                        or_conditions.append(f"p.codigo IN ({placeholders})")
-                        base_params.extend(variantes)
-                    if or_conditions:
-                        base_where += f" AND ({' OR '.join(or_conditions)})"
-                else:
-                    # Búsqueda libre por código o descripción
-                    search_term = f"%{search}%"
-                    base_where += " AND (p.codigo ILIKE %s OR p.descripcion ILIKE %s)"
-                    base_params.extend([search_term, search_term])
-
-            # =====================================================================
-            # QUERY PRINCIPAL: rama diferente para CEDI vs Tienda
-            # =====================================================================
-            if is_cedi and ubicacion_id:
-                # --- CEDI: P75 regional (suma de tiendas), ABC regional ---
-                main_query = f"""
-                WITH tiendas_region AS (
-                    -- Tiendas activas de la misma región que el CEDI
-                    SELECT id FROM ubicaciones
-                    WHERE region = %s
-                      AND tipo = 'tienda' AND activo = true
-                ),
-                ventas_30d_regional AS (
-                    -- Ventas diarias de TODAS las tiendas de la región (30 días)
-                    SELECT
-                        producto_id,
-                        ubicacion_id,
-                        DATE(fecha_venta) as fecha,
-                        SUM(cantidad_vendida) as cantidad_dia
-                    FROM ventas
-                    WHERE ubicacion_id IN (SELECT id FROM tiendas_region)
-                      AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-                      AND fecha_venta < CURRENT_DATE
-                      AND NOT (ubicacion_id = 'tienda_18' AND DATE(fecha_venta) = '2025-12-06')
-                    GROUP BY producto_id, ubicacion_id, DATE(fecha_venta)
-                ),
-                p75_por_tienda AS (
-                    -- P75 por producto por tienda
-                    SELECT
-                        producto_id,
-                        ubicacion_id,
-                        PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY cantidad_dia) as p75_tienda,
-                        STDDEV(cantidad_dia) as sigma_tienda
-                    FROM ventas_30d_regional
-                    GROUP BY producto_id, ubicacion_id
-                ),
-                demanda_p75 AS (
-                    -- P75 regional = SUMA de P75 de todas las tiendas
-                    SELECT
-                        producto_id,
-                        SUM(COALESCE(p75_tienda, 0)) as p75,
-                        SQRT(SUM(COALESCE(sigma_tienda * sigma_tienda, 0))) as sigma_demanda,
-                        COUNT(DISTINCT ubicacion_id) as dias_con_venta
-                    FROM p75_por_tienda
-                    GROUP BY producto_id
-                    HAVING SUM(COALESCE(p75_tienda, 0)) > 0
-                ),
-                abc_ranking AS (
-                    -- ABC regional: ranking por cantidad vendida agregada de la región
-                    SELECT
-                        producto_id,
-                        SUM(cantidad_dia) as cantidad_total,
-                        ROW_NUMBER() OVER (ORDER BY SUM(cantidad_dia) DESC) as rank_cantidad
-                    FROM ventas_30d_regional
-                    GROUP BY producto_id
-                ),
-                abc_regional AS (
-                    SELECT
-                        producto_id,
-                        rank_cantidad,
-                        CASE
-                            WHEN rank_cantidad <= 50 THEN 'A'
-                            WHEN rank_cantidad <= 200 THEN 'B'
-                            WHEN rank_cantidad <= 800 THEN 'C'
-                            ELSE 'D'
-                        END as clase_abc
-                    FROM abc_ranking
-                ),
-                stock_tiendas AS (
-                    -- Stock total en tiendas de la región (para la columna "Tiendas")
-                    SELECT
-                        ia.producto_id,
-                        SUM(ia.cantidad) as cantidad_tiendas
-                    FROM inventario_actual ia
-                    WHERE ia.ubicacion_id IN (SELECT id FROM tiendas_region)
-                    GROUP BY ia.producto_id
-                ),
-                stock_data AS (
-                    SELECT
-                        ia.ubicacion_id,
-                        u.nombre as ubicacion_nombre,
-                        'cedi' as tipo_ubicacion,
-                        ia.producto_id,
-                        COALESCE(p.codigo, '') as codigo_producto,
-                        COALESCE(p.codigo_barras, '') as codigo_barras,
-                        COALESCE(NULLIF(p.descripcion, ''), 'Sin Descripción') as descripcion_producto,
-                        COALESCE(NULLIF(p.categoria, ''), 'Sin Categoría') as categoria,
-                        COALESCE(p.marca, '') as marca,
-                        ia.cantidad as stock_actual,
-                        -- Unidades por bulto
-                        COALESCE(p.unidades_por_bulto, 1) as unidades_por_bulto,
-                        -- Peso y volumen del producto
-                        COALESCE(p.peso_unitario, 0) as peso_unitario_kg,
-                        COALESCE(p.volumen_unitario, 0) as volumen_unitario_m3,
-                        -- Demanda P75 regional
-                        COALESCE(dp.p75, 0) as demanda_p75,
-                        COALESCE(dp.sigma_demanda, 0) as sigma_demanda,
-                        -- Clase ABC regional
-                        COALESCE(abc.clase_abc, 'SIN_VENTAS') as clase_abc,
-                        abc.rank_cantidad as rank_ventas,
-                        -- Lead time para CEDI (default 2.0 días)
-                        2.0 as lead_time,
-                        -- Días de cobertura MAX según clase ABC
-                        CASE COALESCE(abc.clase_abc, 'C')
-                            WHEN 'A' THEN 7
-                            WHEN 'B' THEN 14
-                            WHEN 'C' THEN 21
-                            ELSE 30
-                        END as dias_cobertura_objetivo,
-                        -- Ventas: NULL para CEDIs (no venden)
-                        0 as ventas_30d,
-                        0 as ventas_14d,
-                        0 as ventas_60d,
-                        -- Stock en tiendas de la región (reemplaza stock_cedi)
-                        COALESCE(st.cantidad_tiendas, 0) as stock_cedi,
-                        -- Stock tiendas regional (campo nuevo)
-                        COALESCE(st.cantidad_tiendas, 0) as stock_tiendas_regional,
-                        -- Límites forzados: no aplica a CEDIs
-                        NULL::numeric as limite_min_forzado,
-                        NULL::numeric as limite_max_forzado,
-                        NULL::text as tipo_limite,
-                        -- Metadata
-                        TO_CHAR(ia.fecha_actualizacion, 'YYYY-MM-DD HH24:MI:SS') as fecha_extraccion
-                    FROM inventario_actual ia
-                    INNER JOIN productos p ON ia.producto_id = p.id
-                    INNER JOIN ubicaciones u ON ia.ubicacion_id = u.id
-                    LEFT JOIN demanda_p75 dp ON dp.producto_id = ia.producto_id
-                    LEFT JOIN abc_regional abc ON abc.producto_id = ia.producto_id
-                    LEFT JOIN stock_tiendas st ON st.producto_id = ia.producto_id
-                    WHERE {base_where}
-                ),
-                calculated AS (
-                    SELECT
-                        *,
-                        -- Parámetros de inventario en DÍAS (fórmula simplificada, igual que tiendas)
-                        lead_time as dias_ss,
-                        lead_time + (dias_cobertura_objetivo / 2.0) as dias_rop,
-                        lead_time + dias_cobertura_objetivo as dias_max,
-                        -- Parámetros en UNIDADES
-                        CASE WHEN demanda_p75 > 0 THEN
-                            demanda_p75 * lead_time
-                        ELSE 0 END as stock_seguridad,
-                        CASE WHEN demanda_p75 > 0 THEN
-                            demanda_p75 * (lead_time + dias_cobertura_objetivo / 2.0)
-                        ELSE 0 END as punto_reorden,
-                        CASE WHEN demanda_p75 > 0 THEN
-                            demanda_p75 * (lead_time + dias_cobertura_objetivo)
-                        ELSE 0 END as stock_maximo,
-                        -- Días de cobertura actual = stock / P75 regional
-                        CASE WHEN demanda_p75 > 0 THEN
-                            stock_actual / demanda_p75
-                        ELSE NULL END as dias_cobertura_actual,
-                        -- Clasificación de producto: NULL para CEDIs (no aplica FANTASMA/DORMIDO)
-                        NULL::text as clasificacion_producto,
-                        -- Velocidad de venta: NULL para CEDIs
-                        NULL::text as velocidad_venta
-                    FROM stock_data
-                ),
-                final AS (
-                    SELECT
-                        *,
-                        -- Estado de criticidad basado en SS, ROP, MAX
-                        CASE
-                            WHEN demanda_p75 = 0 OR demanda_p75 IS NULL THEN 'SIN_DEMANDA'
-                            WHEN dias_cobertura_actual IS NULL THEN 'SIN_DEMANDA'
-                            WHEN stock_actual <= stock_seguridad THEN 'CRITICO'
-                            WHEN stock_actual <= punto_reorden THEN 'URGENTE'
-                            WHEN stock_actual <= stock_maximo THEN 'OPTIMO'
-                            ELSE 'EXCESO'
-                        END as estado_criticidad,
-                        CASE
-                            WHEN stock_actual = 0 THEN 'sin_stock'
-                            WHEN stock_actual < 0 THEN 'stock_negativo'
-                            ELSE 'normal'
-                        END as estado_stock
-                    FROM calculated
-                )
-                SELECT * FROM final
-                WHERE 1=1
-                """
-
-                # Params: cedi_region (1 vez para tiendas_region) + base_params
-                query_params = [cedi_region] + base_params
-
-            else:
-                # --- TIENDA: lógica original (P75 de la tienda, ABC de la tienda) ---
-                # Lead time default: 1.5 días
-                # NOTA: Para tienda_18 (PARAÍSO) se excluye 2025-12-06 (inauguración con ventas atípicas)
-                main_query = f"""
-                WITH ventas_20d AS (
-                    -- Ventas diarias por producto en la ubicación (últimos 20 días)
-                    SELECT
-                        producto_id,
-                        DATE(fecha_venta) as fecha,
-                        SUM(cantidad_vendida) as total_dia
-                    FROM ventas
-                    WHERE ubicacion_id = %s
-                      AND fecha_venta >= CURRENT_DATE - INTERVAL '20 days'
-                      AND fecha_venta < CURRENT_DATE
-                      AND NOT (ubicacion_id = 'tienda_18' AND DATE(fecha_venta) = '2025-12-06')
-                    GROUP BY producto_id, DATE(fecha_venta)
-                ),
-                demanda_p75 AS (
-                    -- P75 de ventas diarias (más conservador que promedio)
-                    SELECT
-                        producto_id,
-                        PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY total_dia) as p75,
-                        STDDEV(total_dia) as sigma_demanda,
-                        COUNT(DISTINCT fecha) as dias_con_venta
-                    FROM ventas_20d
-                    GROUP BY producto_id
-                ),
-                ventas_30d AS (
-                    -- Total ventas 30 días para clasificación producto
-                    SELECT
-                        producto_id,
-                        SUM(cantidad_vendida) as total_30d
-                    FROM ventas
-                    WHERE ubicacion_id = %s
-                      AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-                    GROUP BY producto_id
-                ),
-                ventas_14d AS (
-                    -- Total ventas 14 días para detectar dormidos
-                    SELECT
-                        producto_id,
-                        SUM(cantidad_vendida) as total_14d
-                    FROM ventas
-                    WHERE ubicacion_id = %s
-                      AND fecha_venta >= CURRENT_DATE - INTERVAL '14 days'
-                    GROUP BY producto_id
-                ),
-                ventas_60d AS (
-                    -- Total ventas 60 días (2 meses)
-                    SELECT
-                        producto_id,
-                        SUM(cantidad_vendida) as total_60d
-                    FROM ventas
-                    WHERE ubicacion_id = %s
-                      AND fecha_venta >= CURRENT_DATE - INTERVAL '60 days'
-                    GROUP BY producto_id
-                ),
-                tienda_region AS (
-                    -- Obtener la región de la tienda
-                    SELECT region FROM ubicaciones WHERE id = %s
-                ),
-                stock_cedi AS (
-                    -- Stock disponible en TODOS los CEDIs de la misma región
-                    SELECT
-                        ia.producto_id,
-                        SUM(ia.cantidad) as cantidad_cedi
-                    FROM inventario_actual ia
-                    INNER JOIN ubicaciones cedi ON cedi.id = ia.ubicacion_id
-                    WHERE cedi.tipo = 'cedi'
-                      AND cedi.region = (SELECT region FROM tienda_region)
-                    GROUP BY ia.producto_id
-                ),
-                abc_tienda AS (
-                    -- Clasificación ABC de la tienda
-                    SELECT
-                        producto_id,
-                        clase_abc,
-                        rank_cantidad
-                    FROM productos_abc_tienda
-                    WHERE ubicacion_id = %s
-                ),
-                config_abc AS (
-                    -- Configuración de días de cobertura por tienda (de config_parametros_abc_tienda)
-                    SELECT
-                        COALESCE(lead_time_override, 1.5) as lead_time,
-                        COALESCE(dias_cobertura_a, 7) as dias_cob_a,
-                        COALESCE(dias_cobertura_b, 14) as dias_cob_b,
-                        COALESCE(dias_cobertura_c, 21) as dias_cob_c,
-                        COALESCE(clase_d_dias_cobertura, 30) as dias_cob_d
-                    FROM config_parametros_abc_tienda
-                    WHERE tienda_id = %s AND activo = true
-                ),
-                limites_forzados AS (
-                    -- Límites forzados por configuración (capacidad máxima y mínimo exhibición)
-                    SELECT
-                        producto_codigo,
-                        capacidad_maxima_unidades as limite_max_forzado,
-                        minimo_exhibicion_unidades as limite_min_forzado,
-                        tipo_restriccion as tipo_limite
-                    FROM capacidad_almacenamiento_producto
-                    WHERE tienda_id = %s AND activo = true
-                ),
-                stock_data AS (
-                    SELECT
-                        ia.ubicacion_id,
-                        u.nombre as ubicacion_nombre,
-                        'tienda' as tipo_ubicacion,
-                        ia.producto_id,
-                        COALESCE(p.codigo, '') as codigo_producto,
-                        COALESCE(p.codigo_barras, '') as codigo_barras,
-                        COALESCE(NULLIF(p.descripcion, ''), 'Sin Descripción') as descripcion_producto,
-                        COALESCE(NULLIF(p.categoria, ''), 'Sin Categoría') as categoria,
-                        COALESCE(p.marca, '') as marca,
-                        ia.cantidad as stock_actual,
-                        -- Unidades por bulto
-                        COALESCE(p.unidades_por_bulto, 1) as unidades_por_bulto,
-                        -- Peso y volumen del producto
-                        COALESCE(p.peso_unitario, 0) as peso_unitario_kg,
-                        COALESCE(p.volumen_unitario, 0) as volumen_unitario_m3,
-                        -- Demanda P75
-                        COALESCE(dp.p75, 0) as demanda_p75,
-                        COALESCE(dp.sigma_demanda, 0) as sigma_demanda,
-                        -- Clase ABC y ranking
-                        COALESCE(abc.clase_abc, 'SIN_VENTAS') as clase_abc,
-                        abc.rank_cantidad as rank_ventas,
-                        -- Configuración ABC desde config_parametros_abc_tienda
-                        COALESCE((SELECT lead_time FROM config_abc), 1.5) as lead_time,
-                        -- Días de cobertura MAX según clase ABC (esto es el stock_max_mult en días)
-                        CASE COALESCE(abc.clase_abc, 'C')
-                            WHEN 'A' THEN COALESCE((SELECT dias_cob_a FROM config_abc), 7)
-                            WHEN 'B' THEN COALESCE((SELECT dias_cob_b FROM config_abc), 14)
-                            WHEN 'C' THEN COALESCE((SELECT dias_cob_c FROM config_abc), 21)
-                            ELSE COALESCE((SELECT dias_cob_d FROM config_abc), 30)
-                        END as dias_cobertura_objetivo,
-                        -- Ventas para clasificación producto
-                        COALESCE(v30.total_30d, 0) as ventas_30d,
-                        COALESCE(v14.total_14d, 0) as ventas_14d,
-                        COALESCE(v60.total_60d, 0) as ventas_60d,
-                        -- Stock en CEDI
-                        COALESCE(sc.cantidad_cedi, 0) as stock_cedi,
-                        -- Stock tiendas regional: NULL para tiendas
-                        NULL::numeric as stock_tiendas_regional,
-                        -- Límites forzados por configuración
-                        lf.limite_min_forzado,
-                        lf.limite_max_forzado,
-                        lf.tipo_limite,
-                        -- Metadata
-                        TO_CHAR(ia.fecha_actualizacion, 'YYYY-MM-DD HH24:MI:SS') as fecha_extraccion
-                    FROM inventario_actual ia
-                    INNER JOIN productos p ON ia.producto_id = p.id
-                    INNER JOIN ubicaciones u ON ia.ubicacion_id = u.id
-                    LEFT JOIN demanda_p75 dp ON dp.producto_id = ia.producto_id
-                    LEFT JOIN abc_tienda abc ON abc.producto_id = ia.producto_id
-                    LEFT JOIN ventas_60d v60 ON v60.producto_id = ia.producto_id
-                    LEFT JOIN ventas_30d v30 ON v30.producto_id = ia.producto_id
-                    LEFT JOIN ventas_14d v14 ON v14.producto_id = ia.producto_id
-                    LEFT JOIN stock_cedi sc ON sc.producto_id = ia.producto_id
-                    LEFT JOIN limites_forzados lf ON lf.producto_codigo = p.codigo
-                    WHERE {base_where}
-                ),
-                calculated AS (
-                    SELECT
-                        *,
-                        -- Parámetros de inventario en DÍAS (basados en config de tienda)
-                        -- SS = lead_time (stock mínimo para cubrir tiempo de entrega)
-                        lead_time as dias_ss,
-                        -- ROP = lead_time + (dias_cobertura / 2) (punto medio entre SS y MAX)
-                        lead_time + (dias_cobertura_objetivo / 2.0) as dias_rop,
-                        -- MAX = lead_time + dias_cobertura (cobertura total objetivo)
-                        lead_time + dias_cobertura_objetivo as dias_max,
-                        -- Calcular parámetros de inventario en UNIDADES
-                        CASE WHEN demanda_p75 > 0 THEN
-                            demanda_p75 * lead_time
-                        ELSE 0 END as stock_seguridad,
-                        CASE WHEN demanda_p75 > 0 THEN
-                            demanda_p75 * (lead_time + dias_cobertura_objetivo / 2.0)
-                        ELSE 0 END as punto_reorden,
-                        CASE WHEN demanda_p75 > 0 THEN
-                            demanda_p75 * (lead_time + dias_cobertura_objetivo)
-                        ELSE 0 END as stock_maximo,
-                        -- Días de cobertura actual
-                        CASE WHEN demanda_p75 > 0 THEN
-                            stock_actual / demanda_p75
-                        ELSE NULL END as dias_cobertura_actual,
-                        -- Clasificación de producto
-                        CASE
-                            WHEN stock_actual <= 0 AND ventas_30d = 0 THEN 'FANTASMA'
-                            WHEN stock_actual <= 0 AND ventas_30d > 0 THEN 'ANOMALIA'
-                            WHEN stock_actual > 0 AND ventas_14d = 0 THEN 'DORMIDO'
-                            ELSE 'ACTIVO'
-                        END as clasificacion_producto,
-                        -- Velocidad de venta (basado en ventas_30d)
-                        CASE
-                            WHEN ventas_30d = 0 THEN 'SIN_VENTAS'
-                            WHEN ventas_30d BETWEEN 1 AND 5 THEN 'BAJA'
-                            WHEN ventas_30d BETWEEN 6 AND 15 THEN 'MEDIA'
-                            WHEN ventas_30d BETWEEN 16 AND 30 THEN 'ALTA'
-                            ELSE 'MUY_ALTA'
-                        END as velocidad_venta
-                    FROM stock_data
-                ),
-                final AS (
-                    SELECT
-                        *,
-                        -- Estado de criticidad basado en SS, ROP, MAX
-                        CASE
-                            WHEN demanda_p75 = 0 OR demanda_p75 IS NULL THEN 'SIN_DEMANDA'
-                            WHEN dias_cobertura_actual IS NULL THEN 'SIN_DEMANDA'
-                            WHEN stock_actual <= stock_seguridad THEN 'CRITICO'
-                            WHEN stock_actual <= punto_reorden THEN 'URGENTE'
-                            WHEN stock_actual <= stock_maximo THEN 'OPTIMO'
-                            ELSE 'EXCESO'
-                        END as estado_criticidad,
-                        -- Estado stock legacy
-                        CASE
-                            WHEN stock_actual = 0 THEN 'sin_stock'
-                            WHEN stock_actual < 0 THEN 'stock_negativo'
-                            ELSE 'normal'
-                        END as estado_stock
-                    FROM calculated
-                )
-                SELECT * FROM final
-                WHERE 1=1
-                """
-
-                # Params para los CTEs (ubicacion_id se usa 8 veces en CTEs)
-                # Luego base_params puede agregar más (ubicacion_id, almacen, categoria, search)
-                query_params = []
-                if ubicacion_id:
-                    # 8 veces para los CTEs: ventas_20d, ventas_30d, ventas_14d, ventas_60d, cedi_region, abc_tienda, config_abc, limites_forzados
-                    query_params = [ubicacion_id] * 8 + base_params
-                else:
-                    # Sin ubicacion_id, los CTEs de ventas no funcionan bien
-                    # Usamos un valor que no matchea nada para evitar errores SQL
-                    query_params = ['__none__'] * 8 + base_params
-
-            # Filtros adicionales sobre campos calculados
-            filter_params = []
-            if estado_criticidad:
-                main_query += " AND estado_criticidad = %s"
-                filter_params.append(estado_criticidad)
-
-            if clasificacion_producto:
-                main_query += " AND clasificacion_producto = %s"
-                filter_params.append(clasificacion_producto)
-
-            if clase_abc:
-                main_query += " AND clase_abc = %s"
-                filter_params.append(clase_abc)
-
-            if top_ventas:
-                main_query += " AND rank_ventas <= %s"
-                filter_params.append(top_ventas)
-
-            if velocidad_venta:
-                main_query += " AND velocidad_venta = %s"
-                filter_params.append(velocidad_venta)
-
-            if stock_cedi_filter:
-                if stock_cedi_filter == 'CON_STOCK':
-                    main_query += " AND stock_cedi > 0"
-                elif stock_cedi_filter == 'SIN_STOCK':
-                    main_query += " AND stock_cedi <= 0"
-
-            if stock_filter:
-                if stock_filter == 'CON_STOCK':
-                    main_query += " AND stock_actual > 0"
-                elif stock_filter == 'SIN_STOCK':
-                    main_query += " AND stock_actual <= 0"
-
-            # Count query
-            count_query = f"SELECT COUNT(*) FROM ({main_query}) as counted"
-            cursor.execute(count_query, tuple(query_params + filter_params))
-            total_items = cursor.fetchone()[0]
+        if page_size < 1 or page_size > STOCK_SNAPSHOT_MAX_PAGE_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"page_size debe estar entre 1 y {STOCK_SNAPSHOT_MAX_PAGE_SIZE} (para más filas usar cursor)"
+            )
 
-            # Stats query
-            stats_query = f"""
-            SELECT
-                SUM(CASE WHEN stock_actual = 0 THEN 1 ELSE 0 END) as stock_cero,
-                SUM(CASE WHEN stock_actual < 0 THEN 1 ELSE 0 END) as stock_negativo,
-                SUM(CASE WHEN estado_criticidad = 'CRITICO' THEN 1 ELSE 0 END) as criticos,
-                SUM(CASE WHEN estado_criticidad = 'URGENTE' THEN 1 ELSE 0 END) as urgentes,
-                SUM(CASE WHEN clasificacion_producto = 'FANTASMA' THEN 1 ELSE 0 END) as fantasmas,
-                SUM(CASE WHEN clasificacion_producto = 'ANOMALIA' THEN 1 ELSE 0 END) as anomalias,
-                SUM(CASE WHEN clasificacion_producto = 'DORMIDO' THEN 1 ELSE 0 END) as dormidos,
-                SUM(CASE WHEN clasificacion_producto = 'ACTIVO' THEN 1 ELSE 0 END) as activos
-            FROM ({main_query}) as stats
-            """
-            cursor.execute(stats_query, tuple(query_params + filter_params))
-            stats = cursor.fetchone()
+        # Ordenamiento
+        order_direction = 'DESC' if sort_order == 'desc' else 'ASC'
+        order_field = 'stock_actual'
+        if sort_by == 'dias_stock':
+            order_field = 'dias_cobertura_actual'
+        elif sort_by == 'rank_ventas':
+            order_field = 'rank_ventas'
+            order_direction = 'ASC' if sort_order == 'asc' else 'ASC'  # Default ASC for rank
+        elif sort_by == 'peso':
+            order_field = 'peso_unitario_kg'
+        elif sort_by == 'volumen':
+            order_field = 'volumen_unitario_m3'
+        elif sort_by == 'stock':
+            order_field = 'stock_actual'
 
-            # Paginación
-            total_pages = max(1, (total_items + page_size - 1) // page_size)
-            offset = (page - 1) * page_size
+        # Una sola query pesada por combinación de filtros base; filtros
+        # calculados, orden y páginas siguientes se resuelven sobre el snapshot
+        clave = (ubicacion_id, almacen_codigo, categoria, marca, search)
+        snapshot = obtener_snapshot_stock(clave, lambda: _query_stock_base(*clave))
+        filtros = FiltrosStock(
+            estado_criticidad=estado_criticidad,
+            clasificacion_producto=clasificacion_producto,
+            clase_abc=clase_abc,
+            top_ventas=top_ventas,
+            velocidad_venta=velocidad_venta,
+            stock_cedi_filter=stock_cedi_filter,
+            stock_filter=stock_filter,
+        )
+        vista = snapshot.vista(filtros, order_field, order_direction == 'DESC')
 
-            # Ordenamiento
-            order_direction = 'DESC' if sort_order == 'desc' else 'ASC'
-            order_field = 'stock_actual'
-            if sort_by == 'dias_stock':
-                order_field = 'dias_cobertura_actual'
-            elif sort_by == 'rank_ventas':
-                order_field = 'rank_ventas'
-                order_direction = 'ASC' if sort_order == 'asc' else 'ASC'  # Default ASC for rank
-            elif sort_by == 'peso':
-                order_field = 'peso_unitario_kg'
-            elif sort_by == 'volumen':
-                order_field = 'volumen_unitario_m3'
-            elif sort_by == 'stock':
-                order_field = 'stock_actual'
-
-            final_query = f"""
-            {main_query}
-            ORDER BY {order_field} {order_direction} NULLS LAST
-            LIMIT %s OFFSET %s
-            """
+        try:
+            result, offset, next_cursor = vista.pagina(page, page_size, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"cursor inválido: {e}")
 
-            cursor.execute(final_query, tuple(query_params + filter_params + [page_size, offset]))
-            result = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-            cursor.close()
+        # Paginación
+        total_items = len(vista.filas)
+        total_pages = max(1, (total_items + page_size - 1) // page_size)
+        if cursor:
+            page = offset // page_size + 1
+        stats = vista.stats
 
         # Construir respuesta
         stock_data = []
-        for row in result:
-            row_dict = dict(zip(columns, row))
+        for row_dict in result:
             stock_data.append(StockResponse(
                 ubicacion_id=row_dict['ubicacion_id'],
                 ubicacion_nombre=row_dict['ubicacion_nombre'],
@@ -4536,16 +4602,10 @@ async def get_stock(
             total_pages=total_pages,
             current_page=page,
             page_size=page_size,
-            has_next=page < total_pages,
-            has_previous=page > 1,
-            stock_cero=stats[0] or 0,
-            stock_negativo=stats[1] or 0,
-            criticos=stats[2] or 0,
-            urgentes=stats[3] or 0,
-            fantasmas=stats[4] or 0,
-            anomalias=stats[5] or 0,
-            dormidos=stats[6] or 0,
-            activos=stats[7] or 0
+            has_next=offset + len(result) < total_items,
+            has_previous=offset > 0,
+            next_cursor=next_cursor,
+            **stats
         )
 
         return PaginatedStockResponse(
@@ -4603,7 +4663,8 @@ class InventoryHealthResponse(BaseModel):
     by_abc: List[InventoryHealthByABC]
 
 @app.get("/api/stock/health/{ubicacion_id}", response_model=InventoryHealthResponse, tags=["Inventario"])
-async def get_inventory_health(
+@db_offload
+def get_inventory_health(
     ubicacion_id: str,
     stock_cedi_filter: Optional[str] = None  # CON_STOCK, SIN_STOCK, or None for all
 ):
@@ -4864,7 +4925,8 @@ async def get_inventory_health(
 # ============================================================================
 
 @app.get("/api/stock/anomalias/{ubicacion_id}", response_model=AnomaliaStockResponse, tags=["Auditoría Inventario"])
-async def get_anomalias_stock(
+@db_offload
+def get_anomalias_stock(
     ubicacion_id: str,
     almacen_codigo: Optional[str] = None
 ):
@@ -5042,7 +5104,8 @@ async def get_anomalias_stock(
 
 
 @app.post("/api/stock/ajustes", response_model=AjusteAuditoriaResponse, tags=["Auditoría Inventario"])
-async def aplicar_ajustes_auditoria(request: AjusteAuditoriaRequest):
+@db_offload
+def aplicar_ajustes_auditoria(request: AjusteAuditoriaRequest):
     """
     Aplica ajustes de auditoría basados en conteo físico.
 
@@ -5161,6 +5224,9 @@ async def aplicar_ajustes_auditoria(request: AjusteAuditoriaRequest):
             conn.commit()
             cursor.close()
 
+        if total_ajustados:
+            invalidar_snapshot_stock()
+
         return AjusteAuditoriaResponse(
             success=True,
             ubicacion_id=request.ubicacion_id,
@@ -5177,7 +5243,8 @@ async def aplicar_ajustes_auditoria(request: AjusteAuditoriaRequest):
 
 
 @app.get("/api/stock/anomalias/{ubicacion_id}/count", tags=["Auditoría Inventario"])
-async def get_anomalias_count(
+@db_offload
+def get_anomalias_count(
     ubicacion_id: str,
     almacen_codigo: Optional[str] = None
 ):
@@ -5298,7 +5365,8 @@ async def get_anomalias_count(
 # ============================================================================
 
 @app.get("/api/ventas/agotados-visuales/{ubicacion_id}", response_model=AgotadoVisualResponse, tags=["Centro Comando Ventas"])
-async def get_agotados_visuales(
+@db_offload
+def get_agotados_visuales(
     ubicacion_id: str,
     almacen_codigo: Optional[str] = None,
     factor_minimo: float = 2.0,  # Umbral mínimo de alerta (default 2x)
@@ -5420,30 +5488,33 @@ async def get_agotados_visuales(
             query = f"""
                 WITH ventas_periodo AS (
                     -- Ventas de cada producto en últimas 2 semanas EN ESTA TIENDA
+                    -- (rollup horario del ETL: num_lineas = líneas de venta de la hora)
                     SELECT
                         v.producto_id,
-                        COUNT(*) as total_ventas,
-                        MIN(v.fecha_venta) as primera_venta,
-                        MAX(v.fecha_venta) as ultima_venta
-                    FROM ventas v
+                        SUM(v.num_lineas) as total_ventas,
+                        MIN(v.primera_venta) as primera_venta,
+                        MAX(v.ultima_venta) as ultima_venta
+                    FROM ventas_horarias v
                     WHERE v.ubicacion_id = %s
-                      AND v.fecha_venta >= %s
+                      AND v.fecha >= %s::date
+                      AND v.ultima_venta >= %s
                       {almacen_filter_ventas}
                     GROUP BY v.producto_id
-                    HAVING COUNT(*) >= %s  -- Mínimo de ventas para considerar
+                    HAVING SUM(v.num_lineas) >= %s  -- Mínimo de ventas para considerar
                 ),
                 ventas_otras_tiendas AS (
                     -- Performance: Only check OTHER stores for products that sell in THIS store
                     -- This dramatically reduces the scan from millions to thousands of rows
                     SELECT
                         v.producto_id,
-                        COUNT(*) as ventas_otras_tiendas
-                    FROM ventas v
+                        SUM(v.num_lineas) as ventas_otras_tiendas
+                    FROM ventas_horarias v
                     INNER JOIN ubicaciones u ON v.ubicacion_id = u.id
                     INNER JOIN ventas_periodo vp ON v.producto_id = vp.producto_id  -- OPTIMIZATION: Only products from current store
                     WHERE v.ubicacion_id != %s
                       AND COALESCE(u.region, 'VALENCIA') = %s
-                      AND v.fecha_venta >= %s
+                      AND v.fecha >= %s::date
+                      AND v.ultima_venta >= %s
                     GROUP BY v.producto_id
                 ),
                 velocidad_venta AS (
@@ -5532,9 +5603,9 @@ async def get_agotados_visuales(
             # Construir parámetros
             if almacen_codigo:
                 params = [
-                    ubicacion_id, hace_2_semanas, almacen_codigo,  # ventas_periodo
+                    ubicacion_id, hace_2_semanas, hace_2_semanas, almacen_codigo,  # ventas_periodo
                     min_ventas_historicas,  # HAVING
-                    ubicacion_id, region_actual, hace_2_semanas,  # ventas_otras_tiendas
+                    ubicacion_id, region_actual, hace_2_semanas, hace_2_semanas,  # ventas_otras_tiendas
                     ahora, horas_operacion_diarias,  # velocidad_venta: promedio
                     ahora, horas_operacion_diarias,  # velocidad_venta: sin vender
                     ubicacion_id, hace_2_semanas,  # stock_historico (added hace_2_semanas for 30-day limit)
@@ -5542,9 +5613,9 @@ async def get_agotados_visuales(
                 ]
             else:
                 params = [
-                    ubicacion_id, hace_2_semanas,  # ventas_periodo
+                    ubicacion_id, hace_2_semanas, hace_2_semanas,  # ventas_periodo
                     min_ventas_historicas,  # HAVING
-                    ubicacion_id, region_actual, hace_2_semanas,  # ventas_otras_tiendas
+                    ubicacion_id, region_actual, hace_2_semanas, hace_2_semanas,  # ventas_otras_tiendas
                     ahora, horas_operacion_diarias,  # velocidad_venta: promedio
                     ahora, horas_operacion_diarias,  # velocidad_venta: sin vender
                     ubicacion_id, hace_2_semanas,  # stock_historico (added hace_2_semanas for 30-day limit)
@@ -5736,7 +5807,8 @@ async def get_agotados_visuales(
 
 
 @app.get("/api/ventas/agotados-visuales/{ubicacion_id}/count", tags=["Centro Comando Ventas"])
-async def get_agotados_visuales_count(
+@db_offload
+def get_agotados_visuales_count(
     ubicacion_id: str,
     almacen_codigo: Optional[str] = None,
     factor_minimo: float = 2.0,
@@ -5803,15 +5875,16 @@ async def get_agotados_visuales_count(
                 WITH ventas_periodo AS (
                     SELECT
                         v.producto_id,
-                        COUNT(*) as total_ventas,
-                        MIN(v.fecha_venta) as primera_venta,
-                        MAX(v.fecha_venta) as ultima_venta
-                    FROM ventas v
+                        SUM(v.num_lineas) as total_ventas,
+                        MIN(v.primera_venta) as primera_venta,
+                        MAX(v.ultima_venta) as ultima_venta
+                    FROM ventas_horarias v
                     WHERE v.ubicacion_id = %s
-                      AND v.fecha_venta >= %s
+                      AND v.fecha >= %s::date
+                      AND v.ultima_venta >= %s
                       {almacen_filter_ventas}
                     GROUP BY v.producto_id
-                    HAVING COUNT(*) >= %s
+                    HAVING SUM(v.num_lineas) >= %s
                 ),
                 velocidad_venta AS (
                     SELECT
@@ -5838,7 +5911,7 @@ async def get_agotados_visuales_count(
 
             if almacen_codigo:
                 params = [
-                    ubicacion_id, hace_2_semanas, almacen_codigo,
+                    ubicacion_id, hace_2_semanas, hace_2_semanas, almacen_codigo,
                     min_ventas_historicas,
                     ahora, horas_operacion_diarias,
                     ahora, horas_operacion_diarias,
@@ -5846,7 +5919,7 @@ async def get_agotados_visuales_count(
                 ]
             else:
                 params = [
-                    ubicacion_id, hace_2_semanas,
+                    ubicacion_id, hace_2_semanas, hace_2_semanas,
                     min_ventas_historicas,
                     ahora, horas_operacion_diarias,
                     ahora, horas_operacion_diarias,
@@ -5869,7 +5942,8 @@ async def get_agotados_visuales_count(
 
 
 @app.get("/api/ventas/ventas-perdidas/{ubicacion_id}", response_model=VentasPerdidasResponse, tags=["Centro Comando Ventas"])
-async def get_ventas_perdidas(
+@db_offload
+def get_ventas_perdidas(
     ubicacion_id: str,
     almacen_codigo: Optional[str] = None,
     factor_minimo: float = 2.0,
@@ -6163,7 +6237,8 @@ DIAS_SEMANA = {
 
 
 @app.get("/api/ventas/ventas-perdidas-v2/{ubicacion_id}", response_model=VentasPerdidasResponseV2, tags=["Centro Comando Ventas"])
-async def get_ventas_perdidas_v2(
+@db_offload
+def get_ventas_perdidas_v2(
     ubicacion_id: str,
     almacen_codigo: Optional[str] = None,
     semanas_historico: int = 8,
@@ -6461,7 +6536,8 @@ async def get_ventas_perdidas_v2(
 
 
 @app.get("/api/ventas/ventas-perdidas-v3/{ubicacion_id}", response_model=VentasPerdidasResponseV3, tags=["Centro Comando Ventas"])
-async def get_ventas_perdidas_v3(
+@db_offload
+def get_ventas_perdidas_v3(
     ubicacion_id: str,
     fecha_inicio: str,  # YYYY-MM-DD
     fecha_fin: str,     # YYYY-MM-DD
@@ -6533,16 +6609,16 @@ async def get_ventas_perdidas_v3(
                     GROUP BY v.producto_id
                 ),
                 ventas_historico AS (
-                    -- Ventas en el período histórico (para comparación)
+                    -- Ventas en el período histórico (para comparación), desde el agregado diario
                     SELECT
-                        v.producto_id,
-                        SUM(v.cantidad_vendida) as total_vendido,
-                        COUNT(DISTINCT v.fecha_venta::date) as dias_con_ventas
-                    FROM ventas v
-                    WHERE v.ubicacion_id = %s
-                      AND v.fecha_venta::date BETWEEN %s AND %s
-                      AND v.precio_unitario > 0
-                    GROUP BY v.producto_id
+                        vd.producto_id,
+                        SUM(vd.cantidad_vendida) as total_vendido,
+                        COUNT(*) as dias_con_ventas
+                    FROM ventas_diarias vd
+                    WHERE vd.ubicacion_id = %s
+                      AND vd.fecha BETWEEN %s AND %s
+                      AND vd.venta_total > 0
+                    GROUP BY vd.producto_id
                 ),
                 stock_cero_periodo AS (
                     -- Días con stock 0 durante el período analizado
@@ -6742,7 +6818,8 @@ async def get_ventas_perdidas_v3(
 
 
 @app.get("/api/dashboard/metrics", response_model=DashboardMetrics, tags=["Dashboard"])
-async def get_dashboard_metrics():
+@db_offload
+def get_dashboard_metrics():
     """Obtiene métricas principales para el dashboard"""
     try:
         with get_db_connection() as conn:
@@ -6796,7 +6873,8 @@ async def get_dashboard_metrics():
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.get("/api/dashboard/categories", response_model=List[CategoryMetrics], tags=["Dashboard"])
-async def get_category_metrics():
+@db_offload
+def get_category_metrics():
     """Obtiene métricas por categoría"""
     try:
         with get_db_connection() as conn:
@@ -7763,7 +7841,8 @@ async def trigger_etl_sync(request: ETLSyncRequest, background_tasks: Background
     }
 
 @app.get("/api/etl/logs", tags=["ETL"])
-async def get_etl_logs():
+@db_offload
+def get_etl_logs():
     """Obtiene los logs del ETL en ejecución o el último ejecutado
 
     En producción: obtiene logs de CloudWatch usando el task_arn
@@ -8189,62 +8268,60 @@ async def get_ventas_etl_logs():
 # ============================================================================
 
 @app.get("/api/ventas/summary", response_model=List[VentasSummaryResponse], tags=["Ventas"])
-async def get_ventas_summary():
+@db_offload
+def get_ventas_summary():
     """
     Obtiene resumen de ventas por ubicación.
     Usa vista materializada mv_ventas_summary para rendimiento óptimo (<100ms).
     La vista se refresca automáticamente cada 30 minutos con el ETL.
     """
-    # Check cache first
-    cached = get_cached_ventas_summary()
-    if cached is not None:
-        return cached
-
     try:
-        with get_db_connection() as conn:
-            # Usar vista materializada para performance (de 109s a <100ms)
-            query = """
-                SELECT
-                    ubicacion_id,
-                    ubicacion_nombre,
-                    tipo_ubicacion,
-                    total_transacciones,
-                    productos_unicos,
-                    unidades_vendidas,
-                    primera_venta,
-                    ultima_venta
-                FROM mv_ventas_summary
-                ORDER BY ubicacion_nombre
-            """
-            cursor = conn.cursor()
-            cursor.execute(query)
-            result = cursor.fetchall()
-            cursor.close()
-
-            response_data = [
-                VentasSummaryResponse(
-                    ubicacion_id=row[0],
-                    ubicacion_nombre=row[1],
-                    tipo_ubicacion=row[2],
-                    total_transacciones=row[3],
-                    productos_unicos=row[4],
-                    unidades_vendidas=row[5],
-                    primera_venta=row[6],
-                    ultima_venta=row[7]
-                )
-                for row in result
-            ]
-
-            # Store in cache before returning
-            set_ventas_summary_cache(response_data)
-            return response_data
-
+        return obtener_cache_swr(VENTAS_SUMMARY_CACHE)
     except Exception as e:
         logger.error(f"Error obteniendo resumen de ventas: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+def _calcular_ventas_summary() -> List[VentasSummaryResponse]:
+    """Resumen de ventas por ubicación desde mv_ventas_summary"""
+    with get_db_connection() as conn:
+        # Usar vista materializada para performance (de 109s a <100ms)
+        query = """
+            SELECT
+                ubicacion_id,
+                ubicacion_nombre,
+                tipo_ubicacion,
+                total_transacciones,
+                productos_unicos,
+                unidades_vendidas,
+                primera_venta,
+                ultima_venta
+            FROM mv_ventas_summary
+            ORDER BY ubicacion_nombre
+        """
+        cursor = conn.cursor()
+        cursor.execute(query)
+        result = cursor.fetchall()
+        cursor.close()
+
+        return [
+            VentasSummaryResponse(
+                ubicacion_id=row[0],
+                ubicacion_nombre=row[1],
+                tipo_ubicacion=row[2],
+                total_transacciones=row[3],
+                productos_unicos=row[4],
+                unidades_vendidas=row[5],
+                primera_venta=row[6],
+                ultima_venta=row[7]
+            )
+            for row in result
+        ]
+
+registrar_cache_swr(VENTAS_SUMMARY_CACHE, _calcular_ventas_summary, ttl_segundos=VENTAS_SUMMARY_CACHE_TTL)
+
 @app.get("/api/ventas/summary-regional", response_model=List[VentasRegionSummary], tags=["Ventas"])
-async def get_ventas_summary_regional(dias: int = 30):
+@db_offload
+def get_ventas_summary_regional(dias: int = 30):
     """
     Obtiene resumen de ventas agrupado por región (CARACAS / VALENCIA).
     Similar al endpoint de inventarios pero con métricas de ventas.
@@ -8384,7 +8461,8 @@ async def get_ventas_coverage_calendar(days: Optional[int] = 90, mode: str = "da
     )
 
 @app.get("/api/ventas/detail", response_model=PaginatedVentasResponse, tags=["Ventas"])
-async def get_ventas_detail(
+@db_offload
+def get_ventas_detail(
     ubicacion_id: Optional[str] = None,
     categoria: Optional[str] = None,
     fecha_inicio: Optional[str] = None,
@@ -8691,16 +8769,43 @@ async def get_ventas_detail(
         logger.error(f"Error obteniendo detalle de ventas: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+def _pivotar_ventas_diarias(rows, fechas: List[date]):
+    """
+    Filas (producto_id, descripcion, categoria, rank, fecha, cantidad)
+    ordenadas por producto -> una fila por producto con una columna por fecha.
+    """
+    actual = None
+    ventas: Dict[date, float] = {}
+    for producto_id, descripcion, categoria, rank, fecha, cantidad in rows:
+        if actual is not None and producto_id != actual[0]:
+            yield list(actual) + [ventas.get(f, 0) for f in fechas]
+            ventas = {}
+        if actual is None or producto_id != actual[0]:
+            abc = 'A' if rank <= 50 else 'B' if rank <= 200 else 'C'
+            actual = (producto_id, descripcion, categoria, abc, rank)
+        ventas[fecha] = float(cantidad) if cantidad else 0
+    if actual is not None:
+        yield list(actual) + [ventas.get(f, 0) for f in fechas]
+
+
 @app.get("/api/ventas/export-diario", tags=["Ventas"])
-async def get_ventas_export_diario(
+@db_offload
+def get_ventas_export_diario(
     ubicacion_id: str,
     fecha_inicio: str,
     fecha_fin: str,
+    formato: str = "json",
 ):
     """
     Retorna ventas diarias por producto para exportar a Excel.
     Cada fila es un producto, cada columna es un día del rango.
+
+    formato=csv: descarga CSV generada mientras se lee la BD (cursor
+    server-side, memoria constante aunque el rango sea de varios meses).
     """
+    if formato not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'json' o 'csv'")
+
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -8717,6 +8822,53 @@ async def get_ventas_export_diario(
 
             where_clause = " AND ".join(where_clauses)
 
+            if formato == "csv":
+                cursor.execute(
+                    f"SELECT DISTINCT fecha_venta::date FROM ventas WHERE {where_clause} ORDER BY 1 DESC",
+                    params
+                )
+                fechas = [r[0] for r in cursor.fetchall()]
+                cursor.close()
+
+                # Ya ordenado por ranking: el pivot por producto se arma fila a fila
+                query_csv = f"""
+                    WITH producto_totals AS (
+                        SELECT producto_id, SUM(cantidad_vendida) as cantidad_total
+                        FROM ventas
+                        WHERE {where_clause}
+                        GROUP BY producto_id
+                    ),
+                    ranking AS (
+                        SELECT producto_id, ROW_NUMBER() OVER (ORDER BY cantidad_total DESC) as rank_ventas
+                        FROM producto_totals
+                    ),
+                    diario AS (
+                        SELECT producto_id, fecha_venta::date as fecha, SUM(cantidad_vendida) as cantidad
+                        FROM ventas
+                        WHERE {where_clause}
+                        GROUP BY producto_id, fecha_venta::date
+                    )
+                    SELECT
+                        d.producto_id,
+                        COALESCE(p.descripcion, d.producto_id) as descripcion,
+                        COALESCE(p.categoria, 'Sin categoría') as categoria,
+                        r.rank_ventas,
+                        d.fecha,
+                        d.cantidad
+                    FROM diario d
+                    JOIN ranking r ON r.producto_id = d.producto_id
+                    LEFT JOIN productos p ON d.producto_id = p.codigo
+                    ORDER BY r.rank_ventas, d.producto_id, d.fecha
+                """
+                rows = iterar_filas_conexion(get_db_connection, query_csv, params + params)
+                headers = ['Código', 'Descripción', 'Categoría', 'ABC', 'Rank'] + [f.strftime('%Y-%m-%d') for f in fechas]
+                return respuesta_descarga(
+                    generar_csv(headers, _pivotar_ventas_diarias(rows, fechas)),
+                    "csv",
+                    f"ventas_diarias_{ubicacion_id}_{fecha_inicio}_{fecha_fin}",
+                    cerrar=[rows]
+                )
+
             # Query diario
             query = f"""
                 SELECT
@@ -8798,15 +8950,22 @@ async def get_ventas_export_diario(
 
 
 @app.get("/api/ventas/export-resumen", tags=["Ventas"])
-async def get_ventas_export_resumen(
+@db_offload
+def get_ventas_export_resumen(
     ubicacion_id: str,
     fecha_inicio: str,
     fecha_fin: str,
+    formato: str = "json",
 ):
     """
     Retorna todos los productos con métricas completas de ventas (sin paginación) para exportar a Excel.
     Incluye P75, promedios por día de semana/fin de semana y quincena.
+
+    formato=csv: descarga CSV en streaming (cursor server-side).
     """
+    if formato not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'json' o 'csv'")
+
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -8946,13 +9105,8 @@ async def get_ventas_export_resumen(
                     AND ia.ubicacion_id = %s
                 ORDER BY ps.cantidad_total DESC
             """
-            cursor.execute(query, params + [ubicacion_id])
-            result = cursor.fetchall()
-            cursor.close()
-
-            items = []
-            for row in result:
-                items.append({
+            def item(row) -> Dict[str, Any]:
+                return {
                     "codigo_producto": row[0],
                     "descripcion_producto": row[1],
                     "categoria": row[2],
@@ -8973,9 +9127,29 @@ async def get_ventas_export_resumen(
                     "p75_sab": float(row[17]) if row[17] else None,
                     "p75_dom": float(row[18]) if row[18] else None,
                     "q15_boost": float(row[19]) if row[19] else None,
-                })
+                }
+
+            if formato == "csv":
+                cursor.close()
+                rows = iterar_filas_conexion(get_db_connection, query, params + [ubicacion_id])
+                headers = [
+                    "codigo_producto", "descripcion_producto", "categoria", "marca", "cantidad_total",
+                    "promedio_diario", "porcentaje_total", "clase_abc", "rank_ventas", "velocidad_venta",
+                    "stock_actual", "p75_unidades_dia", "p75_lun", "p75_mar", "p75_mie", "p75_jue",
+                    "p75_vie", "p75_sab", "p75_dom", "q15_boost",
+                ]
+                return respuesta_descarga(
+                    generar_csv(headers, (list(item(row).values()) for row in rows)),
+                    "csv",
+                    f"ventas_resumen_{ubicacion_id}_{fecha_inicio}_{fecha_fin}",
+                    cerrar=[rows]
+                )
 
-            return items
+            cursor.execute(query, params + [ubicacion_id])
+            result = cursor.fetchall()
+            cursor.close()
+
+            return [item(row) for row in result]
 
     except Exception as e:
         logger.error(f"Error exportando resumen de ventas: {str(e)}")
@@ -8983,7 +9157,8 @@ async def get_ventas_export_resumen(
 
 
 @app.get("/api/ventas/categorias", tags=["Ventas"])
-async def get_ventas_categorias():
+@db_offload
+def get_ventas_categorias():
     """Obtiene todas las categorías de productos vendidos"""
     try:
         with get_db_connection() as conn:
@@ -9004,7 +9179,8 @@ async def get_ventas_categorias():
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.get("/api/ventas/producto/diario", tags=["Ventas"])
-async def get_ventas_producto_diario(
+@db_offload
+def get_ventas_producto_diario(
     codigo_producto: str,
     fecha_inicio: Optional[str] = None,
     fecha_fin: Optional[str] = None
@@ -9041,22 +9217,21 @@ async def get_ventas_producto_diario(
 
             unidades_por_bulto = float(producto_info[3]) if producto_info[3] else 1.0
 
-            # Obtener ventas diarias por tienda
+            # Obtener ventas diarias por tienda (agregado diario precalculado por el ETL)
             ventas_query = """
                 SELECT
-                    v.fecha_venta::date as fecha,
-                    v.ubicacion_id,
-                    COALESCE(u.nombre, v.ubicacion_id) as ubicacion_nombre,
-                    SUM(v.cantidad_vendida) / %s as total_bultos,
-                    SUM(v.cantidad_vendida) as total_unidades,
-                    SUM(v.venta_total) as venta_total
-                FROM ventas v
-                LEFT JOIN ubicaciones u ON v.ubicacion_id = u.id
-                WHERE v.producto_id = %s
-                    AND v.fecha_venta::date BETWEEN %s AND %s
-                    AND v.cantidad_vendida > 0
-                GROUP BY v.fecha_venta::date, v.ubicacion_id, u.nombre
-                ORDER BY v.fecha_venta::date, v.ubicacion_id
+                    vd.fecha,
+                    vd.ubicacion_id,
+                    COALESCE(u.nombre, vd.ubicacion_id) as ubicacion_nombre,
+                    vd.cantidad_vendida / %s as total_bultos,
+                    vd.cantidad_vendida as total_unidades,
+                    vd.venta_total
+                FROM ventas_diarias vd
+                LEFT JOIN ubicaciones u ON vd.ubicacion_id = u.id
+                WHERE vd.producto_id = %s
+                    AND vd.fecha BETWEEN %s AND %s
+                    AND vd.cantidad_vendida > 0
+                ORDER BY vd.fecha, vd.ubicacion_id
             """
 
             cursor.execute(ventas_query, [unidades_por_bulto, codigo_producto, fecha_inicio, fecha_fin])
@@ -9198,7 +9373,8 @@ async def get_ventas_producto_diario(
 
 
 @app.get("/api/ventas/producto/forecast", tags=["Ventas"])
-async def get_forecast_producto(
+@db_offload
+def get_forecast_producto(
     ubicacion_id: str,
     codigo_producto: str,
     dias_adelante: int = 7
@@ -9240,16 +9416,15 @@ async def get_forecast_producto(
             # Obtener ventas de las últimas 6 semanas (42 días) para tener suficiente data por día de semana
             cursor.execute("""
                 SELECT
-                    fecha_venta::date as fecha,
-                    EXTRACT(DOW FROM fecha_venta::date) as dia_semana,
-                    SUM(cantidad_vendida) as total_unidades
-                FROM ventas
+                    fecha,
+                    EXTRACT(DOW FROM fecha) as dia_semana,
+                    cantidad_vendida as total_unidades
+                FROM ventas_diarias
                 WHERE producto_id = %s
                     AND ubicacion_id = %s
-                    AND fecha_venta >= CURRENT_DATE - INTERVAL '42 days'
-                    AND fecha_venta < CURRENT_DATE
-                GROUP BY fecha_venta::date
-                ORDER BY fecha_venta::date
+                    AND fecha >= CURRENT_DATE - 42
+                    AND fecha < CURRENT_DATE
+                ORDER BY fecha
             """, [codigo_producto, ubicacion_id])
 
             ventas_rows = cursor.fetchall()
@@ -9359,7 +9534,8 @@ async def get_forecast_producto(
 
 
 @app.get("/api/ventas/producto/horario", tags=["Ventas"])
-async def get_ventas_producto_horario(
+@db_offload
+def get_ventas_producto_horario(
     codigo_producto: str,
     fecha: str,
     ubicacion_ids: Optional[str] = None
@@ -9515,7 +9691,8 @@ async def get_ventas_producto_horario(
 
 
 @app.get("/api/ventas/producto/{codigo_producto}/ultimos-20-dias", tags=["Ventas"])
-async def get_ventas_ultimos_20_dias(
+@db_offload
+def get_ventas_ultimos_20_dias(
     codigo_producto: str,
     ubicacion_id: str
 ):
@@ -9584,7 +9761,8 @@ async def get_ventas_ultimos_20_dias(
 
 
 @app.get("/api/ventas/producto/{codigo_producto}/historico-dia", tags=["Ventas"])
-async def get_ventas_historico_dia(
+@db_offload
+def get_ventas_historico_dia(
     codigo_producto: str,
     ubicacion_id: str,
     dia_semana: int  # 0=Domingo, 1=Lunes, 2=Martes, ..., 6=Sábado
@@ -9674,7 +9852,8 @@ async def get_ventas_historico_dia(
 
 
 @app.get("/api/ventas/producto/{codigo_producto}/transacciones", tags=["Ventas"])
-async def get_transacciones_producto(
+@db_offload
+def get_transacciones_producto(
     codigo_producto: str,
     ubicacion_id: str,
     fecha_inicio: str = None,
@@ -10466,7 +10645,8 @@ async def calcular_abc_xyz(
 
 
 @app.post("/api/admin/refresh-analisis-cache", tags=["Admin"])
-async def refresh_analisis_cache(
+@db_offload
+def refresh_analisis_cache(
     background_tasks: BackgroundTasks
 ):
     """
@@ -10503,7 +10683,8 @@ async def refresh_analisis_cache(
 
 
 @app.get("/api/admin/analisis-cache-status", tags=["Admin"])
-async def get_analisis_cache_status():
+@db_offload
+def get_analisis_cache_status():
     """
     Obtiene el estado actual de la tabla cache productos_analisis_cache.
     Incluye: total de registros, última actualización, y conteos por estado.
@@ -10613,7 +10794,8 @@ async def get_historico_abc_xyz_completo(
 @app.get("/api/productos/{codigo_producto}/historial-ventas-inventario",
          response_model=HistorialProductoResponse,
          tags=["Centro Comando Ventas"])
-async def get_historial_ventas_inventario(
+@db_offload
+def get_historial_ventas_inventario(
     codigo_producto: str,
     ubicacion_id: str,
     fecha_inicio: Optional[str] = None,
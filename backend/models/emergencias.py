@@ -232,6 +232,10 @@ class ScanRequest(BaseModel):
         description="Lista de ubicacion_id a escanear. None = todas las habilitadas"
     )
     incluir_anomalias: bool = Field(default=True, description="Detectar también anomalías de inventario")
+    incremental: bool = Field(
+        default=False,
+        description="Releer solo los SKUs con cambios de stock o ventas desde el scan anterior de cada tienda"
+    )
     usuario: Optional[str] = None
 
 
@@ -247,9 +251,12 @@ class ScanResponse(BaseModel):
 
     # Scope
     tiendas_escaneadas: List[str]
+    incremental: bool = False  # Modo efectivo: True solo si todas las tiendas se escanearon incremental
+    tiendas_scan_completo: List[str] = Field(default_factory=list)  # Leídas completas (sin estado previo o vencido)
 
     # Conteos
     total_productos_analizados: int
+    productos_releidos: Optional[int] = None  # SKUs leídos de BD (en incremental, solo los con cambios)
     total_emergencias: int
     total_anomalias: int
 
@@ -233,6 +233,12 @@ class CalcularMultiTiendaResponse(BaseModel):
         description="Resumen consolidado de todos los pedidos"
     )
 
+    # Tiempos por etapa (ms)
+    tiempos_etapas: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Tiempos por etapa del cálculo (contexto, tiendas, consolidación, DPD+U, ensamblaje) y por tienda"
+    )
+
 
 # =====================================================================================
 # MODELOS PARA GUARDAR PEDIDOS EN LOTE
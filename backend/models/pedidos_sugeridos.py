@@ -834,6 +834,30 @@ class VerificarLlegadaResponse(BaseModel):
     mensaje: str = "Verificación completada"
 
 
+MAX_PEDIDOS_VERIFICACION_LOTE = 200
+
+
+class VerificarLlegadaLoteRequest(BaseModel):
+    """Request para verificar la llegada de varios pedidos a la vez"""
+    pedido_ids: List[str]
+
+    @validator('pedido_ids')
+    def validate_pedido_ids(cls, v):
+        if not v:
+            raise ValueError('Debe incluir al menos un pedido')
+        if len(v) > MAX_PEDIDOS_VERIFICACION_LOTE:
+            raise ValueError(f'Máximo {MAX_PEDIDOS_VERIFICACION_LOTE} pedidos por verificación')
+        return v
+
+
+class VerificarLlegadaLoteResponse(BaseModel):
+    """Response de verificación de llegada de varios pedidos"""
+    pedidos: List[VerificarLlegadaResponse]
+    pedidos_no_encontrados: List[str] = []
+    pedidos_sin_productos: List[str] = []
+    fecha_verificacion: datetime
+
+
 class RegistrarLlegadaProducto(BaseModel):
     """Un producto para registrar su llegada"""
     codigo_producto: str
@@ -10,8 +10,9 @@ from typing import Optional, List, Any
 from datetime import datetime, timedelta
 import logging
 
-from db_manager import get_db_connection
+from db_manager import get_db_connection, db_offload
 from auth import require_super_admin, UsuarioConRol
+from services.bi_cache import cache_bi
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +30,9 @@ def get_db():
 # =============================================================================
 
 @router.get("/network/kpis")
-async def get_network_kpis(
+@db_offload
+@cache_bi
+def get_network_kpis(
     fecha_inicio: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     fecha_fin: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     comparar_con: str = Query("anterior", regex="^(anterior|ano_anterior)$"),
@@ -200,7 +203,9 @@ async def get_network_kpis(
 # =============================================================================
 
 @router.get("/{ubicacion_id}/evolution")
-async def get_store_evolution(
+@db_offload
+@cache_bi
+def get_store_evolution(
     ubicacion_id: str,
     fecha_inicio: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     fecha_fin: str = Query(..., description="Fecha fin YYYY-MM-DD"),
@@ -380,7 +385,9 @@ async def get_store_evolution(
 # =============================================================================
 
 @router.get("/{ubicacion_id}/hourly-heatmap")
-async def get_hourly_heatmap(
+@db_offload
+@cache_bi
+def get_hourly_heatmap(
     ubicacion_id: str,
     dias: int = Query(30, description="Días hacia atrás para análisis"),
     current_user: UsuarioConRol = Depends(require_super_admin),
@@ -556,7 +563,9 @@ async def get_hourly_heatmap(
 # =============================================================================
 
 @router.get("/{ubicacion_id}/categories")
-async def get_store_categories(
+@db_offload
+@cache_bi
+def get_store_categories(
     ubicacion_id: str,
     fecha_inicio: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     fecha_fin: str = Query(..., description="Fecha fin YYYY-MM-DD"),
@@ -718,7 +727,9 @@ async def get_store_categories(
 # =============================================================================
 
 @router.get("/{ubicacion_id}/ticket-distribution")
-async def get_ticket_distribution(
+@db_offload
+@cache_bi
+def get_ticket_distribution(
     ubicacion_id: str,
     fecha_inicio: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     fecha_fin: str = Query(..., description="Fecha fin YYYY-MM-DD"),
@@ -904,7 +915,9 @@ async def get_ticket_distribution(
 # =============================================================================
 
 @router.get("/compare-multi")
-async def compare_multi_stores(
+@db_offload
+@cache_bi
+def compare_multi_stores(
     store_ids: str = Query(..., description="IDs de tiendas separados por coma (ej: tienda_01,tienda_08)"),
     fecha_inicio: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     fecha_fin: str = Query(..., description="Fecha fin YYYY-MM-DD"),
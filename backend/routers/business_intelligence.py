@@ -8,8 +8,9 @@ from fastapi import APIRouter, Depends, Query, HTTPException
 from typing import Optional, List, Any
 import logging
 
-from db_manager import get_db_connection
+from db_manager import get_db_connection, db_offload
 from auth import require_super_admin, UsuarioConRol
+from services.bi_cache import cache_bi, establecer_version_datos
 from services.bi_calculations import (
     clasificar_producto_matriz,
     calcular_reduccion_stock,
@@ -33,7 +34,9 @@ def get_db():
 # =============================================================================
 
 @router.get("/impact/summary")
-async def get_impact_summary(
+@db_offload
+@cache_bi
+def get_impact_summary(
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
 ):
@@ -162,7 +165,9 @@ async def get_impact_summary(
 
 
 @router.get("/impact/by-store")
-async def get_impact_by_store(
+@db_offload
+@cache_bi
+def get_impact_by_store(
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
 ):
@@ -229,7 +234,9 @@ async def get_impact_by_store(
 # =============================================================================
 
 @router.get("/store/{ubicacion_id}/kpis")
-async def get_store_kpis(
+@db_offload
+@cache_bi
+def get_store_kpis(
     ubicacion_id: str,
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
@@ -347,7 +354,9 @@ async def get_store_kpis(
 
 
 @router.get("/store/{ubicacion_id}/abc-analysis")
-async def get_store_abc_analysis(
+@db_offload
+@cache_bi
+def get_store_abc_analysis(
     ubicacion_id: str,
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
@@ -425,7 +434,9 @@ async def get_store_abc_analysis(
 
 
 @router.get("/store/{ubicacion_id}/top-bottom-products")
-async def get_store_top_bottom_products(
+@db_offload
+@cache_bi
+def get_store_top_bottom_products(
     ubicacion_id: str,
     metric: str = Query("gmroi", regex="^(gmroi|ventas|rotacion)$"),
     limit: int = Query(10, ge=1, le=50),
@@ -521,7 +532,9 @@ async def get_store_top_bottom_products(
 
 
 @router.get("/stores/ranking")
-async def get_stores_ranking(
+@db_offload
+@cache_bi
+def get_stores_ranking(
     metric: str = Query("gmroi", regex="^(gmroi|ventas|rotacion|stock)$"),
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
@@ -606,7 +619,9 @@ async def get_stores_ranking(
 # =============================================================================
 
 @router.get("/products/abc-consolidated")
-async def get_products_abc_consolidated(
+@db_offload
+@cache_bi
+def get_products_abc_consolidated(
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
 ):
@@ -751,7 +766,9 @@ async def get_products_abc_consolidated(
 
 
 @router.get("/products/matrix")
-async def get_products_matrix(
+@db_offload
+@cache_bi
+def get_products_matrix(
     ubicacion_id: Optional[str] = None,
     categoria: Optional[str] = None,
     limit: int = Query(500, ge=1, le=2000),
@@ -836,7 +853,9 @@ async def get_products_matrix(
 
 
 @router.get("/products/stars")
-async def get_products_stars(
+@db_offload
+@cache_bi
+def get_products_stars(
     ubicacion_id: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
     current_user: UsuarioConRol = Depends(require_super_admin),
@@ -896,7 +915,9 @@ async def get_products_stars(
 
 
 @router.get("/products/eliminate")
-async def get_products_eliminate(
+@db_offload
+@cache_bi
+def get_products_eliminate(
     ubicacion_id: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
     current_user: UsuarioConRol = Depends(require_super_admin),
@@ -960,7 +981,9 @@ async def get_products_eliminate(
 # =============================================================================
 
 @router.get("/profitability/by-category")
-async def get_profitability_by_category(
+@db_offload
+@cache_bi
+def get_profitability_by_category(
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
 ):
@@ -1009,7 +1032,9 @@ async def get_profitability_by_category(
 
 
 @router.get("/profitability/top-products")
-async def get_profitability_top_products(
+@db_offload
+@cache_bi
+def get_profitability_top_products(
     metric: str = Query("utilidad_total", regex="^(utilidad_total|margen_pct|gmroi)$"),
     limit: int = Query(20, ge=1, le=100),
     current_user: UsuarioConRol = Depends(require_super_admin),
@@ -1069,7 +1094,9 @@ async def get_profitability_top_products(
 # =============================================================================
 
 @router.get("/coverage/summary")
-async def get_coverage_summary(
+@db_offload
+@cache_bi
+def get_coverage_summary(
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
 ):
@@ -1124,7 +1151,9 @@ async def get_coverage_summary(
 
 
 @router.get("/coverage/low-coverage-products")
-async def get_low_coverage_products(
+@db_offload
+@cache_bi
+def get_low_coverage_products(
     region: Optional[str] = None,
     limit: int = Query(50, ge=1, le=200),
     current_user: UsuarioConRol = Depends(require_super_admin),
@@ -1184,7 +1213,9 @@ async def get_low_coverage_products(
 
 
 @router.get("/coverage/trapped-in-cedi")
-async def get_trapped_in_cedi(
+@db_offload
+@cache_bi
+def get_trapped_in_cedi(
     region: Optional[str] = None,
     umbral_bajo_stock: int = Query(UMBRAL_STOCK_BAJO, ge=0, le=100),
     limit: int = Query(50, ge=1, le=200),
@@ -1251,7 +1282,9 @@ async def get_trapped_in_cedi(
 
 
 @router.get("/coverage/store-gaps")
-async def get_store_gaps(
+@db_offload
+@cache_bi
+def get_store_gaps(
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
 ):
@@ -1315,7 +1348,9 @@ async def get_store_gaps(
 # =============================================================================
 
 @router.get("/stores/compare")
-async def compare_stores(
+@db_offload
+@cache_bi
+def compare_stores(
     store_ids: str = Query(..., description="IDs de tiendas separados por coma (ej: tienda_17,tienda_18)"),
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
@@ -1512,22 +1547,47 @@ async def compare_stores(
 # =============================================================================
 
 @router.post("/admin/refresh-views")
-async def refresh_bi_views(
+@db_offload
+def refresh_bi_views(
     current_user: UsuarioConRol = Depends(require_super_admin),
     conn: Any = Depends(get_db)
 ):
     """
-    Refresca todas las vistas materializadas de BI.
+    Refresca todas las vistas materializadas de BI e incrementa la versión
+    de datos: el cache de respuestas BI se descarta y se recalcula.
     """
     try:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM refresh_bi_views()")
         results = cursor.fetchall()
+
+        # Nueva versión de datos para el cache BI (migración 043)
+        data_version = None
+        cursor.execute("SAVEPOINT bi_data_version")
+        try:
+            cursor.execute("""
+                UPDATE bi_data_version SET
+                    version = version + 1,
+                    origen = 'refresh_bi_views',
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = 1
+                RETURNING version
+            """)
+            row = cursor.fetchone()
+            data_version = row[0] if row else None
+            cursor.execute("RELEASE SAVEPOINT bi_data_version")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT bi_data_version")
+            logger.warning(f"No se pudo incrementar bi_data_version: {e}")
         cursor.close()
         conn.commit()
 
+        if data_version is not None:
+            establecer_version_datos(str(data_version))
+
         return {
             "status": "OK",
+            "data_version": data_version,
             "vistas_refrescadas": [
                 {"vista": row[0], "tiempo_ms": row[1], "status": row[2]}
                 for row in results
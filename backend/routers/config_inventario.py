@@ -18,7 +18,7 @@ from typing import List, Optional, Any
 from pydantic import BaseModel
 import logging
 
-from db_manager import get_db_connection, get_db_connection_write
+from db_manager import get_db_connection, get_db_connection_write, db_offload
 
 logger = logging.getLogger(__name__)
 
@@ -224,7 +224,8 @@ def get_db_write():
 # =====================================================================================
 
 @router.get("/parametros-abc", response_model=ConfiguracionABCCompleta)
-async def obtener_configuracion_abc(conn: Any = Depends(get_db)):
+@db_offload
+def obtener_configuracion_abc(conn: Any = Depends(get_db)):
     """
     Obtiene la configuración completa del modelo ABC:
     - Parámetros globales (Lead Time, Ventana σD)
@@ -432,7 +433,8 @@ async def obtener_configuracion_abc(conn: Any = Depends(get_db)):
 # =====================================================================================
 
 @router.put("/parametros-abc/globales")
-async def guardar_parametros_globales(
+@db_offload
+def guardar_parametros_globales(
     params: ParametrosGlobales,
     conn: Any = Depends(get_db_write)
 ):
@@ -509,7 +511,8 @@ async def guardar_parametros_globales(
 # =====================================================================================
 
 @router.put("/parametros-abc/niveles")
-async def guardar_niveles_servicio(
+@db_offload
+def guardar_niveles_servicio(
     request: NivelesServicioRequest,
     conn: Any = Depends(get_db_write)
 ):
@@ -559,7 +562,8 @@ async def guardar_niveles_servicio(
 # =====================================================================================
 
 @router.put("/parametros-abc/umbrales")
-async def guardar_umbrales_abc(
+@db_offload
+def guardar_umbrales_abc(
     umbrales: UmbralesABC,
     conn: Any = Depends(get_db_write)
 ):
@@ -630,7 +634,8 @@ async def guardar_umbrales_abc(
 # =====================================================================================
 
 @router.get("/parametros-abc/modelo-activo")
-async def obtener_modelo_activo(conn: Any = Depends(get_db)):
+@db_offload
+def obtener_modelo_activo(conn: Any = Depends(get_db)):
     """
     Obtiene el modelo ABC activo y sus descripciones dinámicas.
     También retorna la lista de todos los modelos disponibles.
@@ -715,7 +720,8 @@ async def obtener_modelo_activo(conn: Any = Depends(get_db)):
 
 
 @router.put("/parametros-abc/modelo-activo")
-async def cambiar_modelo_activo(
+@db_offload
+def cambiar_modelo_activo(
     request: ModeloABCActivo,
     conn: Any = Depends(get_db_write)
 ):
@@ -775,7 +781,8 @@ async def cambiar_modelo_activo(
 # =====================================================================================
 
 @router.put("/parametros-abc/umbrales-pareto")
-async def guardar_umbrales_pareto(
+@db_offload
+def guardar_umbrales_pareto(
     umbrales: UmbralesPareto,
     conn: Any = Depends(get_db_write)
 ):
@@ -844,7 +851,8 @@ async def guardar_umbrales_pareto(
 # =====================================================================================
 
 @router.put("/parametros-abc/tienda/{tienda_id}")
-async def guardar_config_tienda(
+@db_offload
+def guardar_config_tienda(
     tienda_id: str,
     config: ConfigTienda,
     conn: Any = Depends(get_db_write)
@@ -907,7 +915,8 @@ async def guardar_config_tienda(
 # =====================================================================================
 
 @router.delete("/parametros-abc/tienda/{tienda_id}")
-async def eliminar_config_tienda(
+@db_offload
+def eliminar_config_tienda(
     tienda_id: str,
     conn: Any = Depends(get_db_write)
 ):
@@ -974,7 +983,8 @@ class ConfigCoberturaCategoriaCreate(BaseModel):
 
 
 @router.get("/cobertura-categoria", response_model=List[ConfigCoberturaCategoria])
-async def obtener_coberturas_categoria(conn: Any = Depends(get_db)):
+@db_offload
+def obtener_coberturas_categoria(conn: Any = Depends(get_db)):
     """
     Obtiene todas las configuraciones de cobertura por categoría.
     Las categorías perecederas (FRUVER, CARNICERIA, etc.) tienen coberturas más cortas.
@@ -1013,7 +1023,8 @@ async def obtener_coberturas_categoria(conn: Any = Depends(get_db)):
 
 
 @router.get("/categorias-disponibles")
-async def obtener_categorias_disponibles(conn: Any = Depends(get_db)):
+@db_offload
+def obtener_categorias_disponibles(conn: Any = Depends(get_db)):
     """
     Obtiene todas las categorías de productos disponibles para configurar.
     """
@@ -1047,7 +1058,8 @@ async def obtener_categorias_disponibles(conn: Any = Depends(get_db)):
 
 
 @router.post("/cobertura-categoria")
-async def crear_cobertura_categoria(
+@db_offload
+def crear_cobertura_categoria(
     config: ConfigCoberturaCategoriaCreate,
     conn: Any = Depends(get_db_write)
 ):
@@ -1105,7 +1117,8 @@ async def crear_cobertura_categoria(
 
 
 @router.put("/cobertura-categoria/{categoria_id}")
-async def actualizar_cobertura_categoria(
+@db_offload
+def actualizar_cobertura_categoria(
     categoria_id: str,
     config: ConfigCoberturaCategoriaCreate,
     conn: Any = Depends(get_db_write)
@@ -1160,7 +1173,8 @@ async def actualizar_cobertura_categoria(
 
 
 @router.delete("/cobertura-categoria/{categoria_id}")
-async def eliminar_cobertura_categoria(
+@db_offload
+def eliminar_cobertura_categoria(
     categoria_id: str,
     conn: Any = Depends(get_db_write)
 ):
@@ -1252,7 +1266,8 @@ TIPOS_RESTRICCION_VALIDOS = [
 
 
 @router.get("/capacidad-almacenamiento", response_model=List[CapacidadAlmacenamiento])
-async def obtener_capacidades_almacenamiento(
+@db_offload
+def obtener_capacidades_almacenamiento(
     tienda_id: Optional[str] = None,
     conn: Any = Depends(get_db)
 ):
@@ -1332,7 +1347,8 @@ async def obtener_capacidades_por_tienda(
 
 
 @router.get("/capacidad-almacenamiento/producto/{producto_codigo}")
-async def obtener_capacidades_por_producto(
+@db_offload
+def obtener_capacidades_por_producto(
     producto_codigo: str,
     conn: Any = Depends(get_db)
 ):
@@ -1382,7 +1398,8 @@ async def obtener_capacidades_por_producto(
 
 
 @router.post("/capacidad-almacenamiento")
-async def crear_capacidad_almacenamiento(
+@db_offload
+def crear_capacidad_almacenamiento(
     config: CapacidadAlmacenamientoCreate,
     conn: Any = Depends(get_db_write)
 ):
@@ -1477,7 +1494,8 @@ async def crear_capacidad_almacenamiento(
 
 
 @router.put("/capacidad-almacenamiento/{config_id}")
-async def actualizar_capacidad_almacenamiento(
+@db_offload
+def actualizar_capacidad_almacenamiento(
     config_id: str,
     config: CapacidadAlmacenamientoUpdate,
     conn: Any = Depends(get_db_write)
@@ -1561,7 +1579,8 @@ async def actualizar_capacidad_almacenamiento(
 
 
 @router.delete("/capacidad-almacenamiento/{config_id}")
-async def eliminar_capacidad_almacenamiento(
+@db_offload
+def eliminar_capacidad_almacenamiento(
     config_id: str,
     conn: Any = Depends(get_db_write)
 ):
@@ -1605,7 +1624,8 @@ async def eliminar_capacidad_almacenamiento(
 # =====================================================================================
 
 @router.get("/productos/buscar")
-async def buscar_productos(
+@db_offload
+def buscar_productos(
     q: str,
     limite: int = 10,
     conn: Any = Depends(get_db)
@@ -57,7 +57,7 @@ from services.detector_emergencias import (
     calcular_porcentaje_dia_transcurrido,
     obtener_detalle_producto_emergencia,
 )
-from db_manager import get_db_connection
+from db_manager import get_db_connection, db_offload
 
 logger = logging.getLogger(__name__)
 
@@ -73,12 +73,16 @@ _ultimo_scan: Optional[ScanResponse] = None
 # =====================================================================================
 
 @router.post("/scan", response_model=ScanResponse, summary="Ejecutar scan de emergencias")
-async def ejecutar_scan(request: ScanRequest = None):
+@db_offload
+def ejecutar_scan(request: ScanRequest = None):
     """
     Ejecuta un scan de detección de emergencias de inventario.
 
     - **tiendas**: Lista de ubicacion_id a escanear (opcional, default: todas las habilitadas)
     - **incluir_anomalias**: Si detectar anomalías de inventario (default: true)
+    - **incremental**: Releer solo SKUs con cambios de stock/ventas desde el scan anterior (default: false).
+      La respuesta indica el modo efectivo: `incremental` es true solo si todas las
+      tiendas se escanearon así, y `tiendas_scan_completo` lista las que se leyeron completas
     - **usuario**: Usuario que ejecuta el scan (para auditoría)
 
     Retorna emergencias detectadas clasificadas por tipo:
@@ -97,7 +101,8 @@ async def ejecutar_scan(request: ScanRequest = None):
             tiendas=request.tiendas,
             incluir_anomalias=request.incluir_anomalias,
             trigger_tipo=TriggerTipo.MANUAL,
-            trigger_usuario=request.usuario
+            trigger_usuario=request.usuario,
+            incremental=request.incremental
         )
 
         # Guardar último scan para consulta rápida
@@ -115,7 +120,8 @@ async def ejecutar_scan(request: ScanRequest = None):
 # =====================================================================================
 
 @router.get("/", response_model=EmergenciasListResponse, summary="Listar última detección")
-async def listar_emergencias(
+@db_offload
+def listar_emergencias(
     tipo: Optional[TipoEmergencia] = Query(None, description="Filtrar por tipo de emergencia"),
     tienda: Optional[str] = Query(None, description="Filtrar por ubicacion_id"),
     clase_abc: Optional[str] = Query(None, description="Filtrar por clase ABC (A, B, C, D)")
@@ -165,7 +171,8 @@ async def listar_emergencias(
 # =====================================================================================
 
 @router.get("/anomalias", response_model=AnomaliasListResponse, summary="Listar anomalías pendientes")
-async def listar_anomalias(
+@db_offload
+def listar_anomalias(
     tienda: Optional[str] = Query(None, description="Filtrar por ubicacion_id"),
     tipo: Optional[TipoAnomalia] = Query(None, description="Filtrar por tipo de anomalía"),
     limit: int = Query(100, ge=1, le=500, description="Máximo de registros")
@@ -202,7 +209,8 @@ async def listar_anomalias(
 # =====================================================================================
 
 @router.get("/factor-intensidad", response_model=FactorIntensidadResponse, summary="Factor de intensidad del día")
-async def obtener_factor_intensidad(
+@db_offload
+def obtener_factor_intensidad(
     tienda: Optional[str] = Query(None, description="Filtrar por ubicacion_id específico")
 ):
     """
@@ -266,7 +274,8 @@ async def obtener_factor_intensidad(
 # =====================================================================================
 
 @router.get("/config/tiendas", response_model=ConfigTiendasListResponse, summary="Lista configuración de tiendas")
-async def listar_config_tiendas(
+@db_offload
+def listar_config_tiendas(
     solo_habilitadas: bool = Query(False, description="Solo mostrar tiendas habilitadas")
 ):
     """
@@ -295,7 +304,8 @@ async def listar_config_tiendas(
 
 
 @router.get("/config/tiendas/{ubicacion_id}", response_model=ConfigTiendaCompleta, summary="Config de una tienda")
-async def obtener_config_tienda(ubicacion_id: str):
+@db_offload
+def obtener_config_tienda(ubicacion_id: str):
     """
     Obtiene la configuración completa de una tienda específica.
 
@@ -351,7 +361,8 @@ async def obtener_config_tienda(ubicacion_id: str):
     response_model=OperacionExitosaResponse,
     summary="Habilitar tienda"
 )
-async def habilitar_tienda_endpoint(
+@db_offload
+def habilitar_tienda_endpoint(
     ubicacion_id: str,
     request: HabilitarTiendaRequest = None
 ):
@@ -412,7 +423,8 @@ async def habilitar_tienda_endpoint(
     response_model=OperacionExitosaResponse,
     summary="Deshabilitar tienda"
 )
-async def deshabilitar_tienda_endpoint(ubicacion_id: str):
+@db_offload
+def deshabilitar_tienda_endpoint(ubicacion_id: str):
     """
     Deshabilita una tienda para detección de emergencias.
 
@@ -437,7 +449,8 @@ async def deshabilitar_tienda_endpoint(ubicacion_id: str):
     response_model=OperacionExitosaResponse,
     summary="Actualizar configuración"
 )
-async def actualizar_config_tienda(
+@db_offload
+def actualizar_config_tienda(
     ubicacion_id: str,
     request: ActualizarConfigRequest
 ):
@@ -527,7 +540,8 @@ async def actualizar_config_tienda(
     "/detalle/{ubicacion_id}/{producto_id}",
     summary="Detalle de producto con comparativos de venta"
 )
-async def obtener_detalle_producto(ubicacion_id: str, producto_id: str):
+@db_offload
+def obtener_detalle_producto(ubicacion_id: str, producto_id: str):
     """
     Obtiene datos detallados de un producto en emergencia para mostrar gráficos.
 
@@ -10,14 +10,19 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, date, timedelta
 from pydantic import BaseModel, Field
 import logging
+import os
 
-from db_manager import get_db_connection
+from db_manager import get_db_connection, db_offload
 from auth import require_super_admin, UsuarioConRol
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/etl", tags=["ETL History"])
 
+# Intentos por gap antes de 'failed': mismo setting que etl/core/gap_queue.py
+# (configurar el mismo valor en el contenedor del ETL y en el del backend)
+GAP_MAX_INTENTOS = int(os.getenv('ETL_GAP_MAX_INTENTOS', '3'))
+
 
 # =============================================================================
 # MODELOS PYDANTIC
@@ -121,13 +126,77 @@ class ETLStats(BaseModel):
     # Tiendas problemáticas
     tiendas_con_mas_fallos: List[Dict[str, Any]] = []
 
+    # Cola de recuperación de gaps (etl_gap_queue)
+    gap_backlog: int = 0
+    gap_backlog_por_tienda: Dict[str, int] = {}
+    gaps_recuperados: int = 0
+    gaps_fallidos: int = 0
+    gaps_recuperados_ultima_hora: int = 0
+    gap_registros_recuperados: int = 0
+    gap_duracion_promedio_seconds: float = 0
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def _gap_queue_stats(cursor, fecha_desde: datetime, etl_name: Optional[str]) -> Dict[str, Any]:
+    """
+    Backlog y throughput de la cola de gaps (migración 040).
+    Vacío si la tabla todavía no existe.
+    """
+    cursor.execute("SELECT to_regclass('etl_gap_queue')")
+    if cursor.fetchone()[0] is None:
+        return {}
+
+    filtro = ""
+    params: List[Any] = [GAP_MAX_INTENTOS] + [fecha_desde] * 4
+    if etl_name:
+        filtro = " AND etl_name = %s"
+        params.append(etl_name)
+
+    # Backlog = pendientes con intentos disponibles + en curso (igual que GapQueue.backlog)
+    cursor.execute(f"""
+        SELECT
+            COUNT(*) FILTER (WHERE status = 'running' OR (status = 'pending' AND attempts < %s)),
+            COUNT(*) FILTER (WHERE status = 'done' AND finished_at >= %s),
+            COUNT(*) FILTER (WHERE status = 'failed' AND finished_at >= %s),
+            COUNT(*) FILTER (WHERE status = 'done' AND finished_at >= NOW() - INTERVAL '1 hour'),
+            COALESCE(SUM(records_loaded) FILTER (WHERE status = 'done' AND finished_at >= %s), 0),
+            AVG(EXTRACT(EPOCH FROM finished_at - claimed_at))
+                FILTER (WHERE status = 'done' AND finished_at >= %s)
+        FROM etl_gap_queue
+        WHERE 1=1{filtro}
+    """, params)
+    row = cursor.fetchone()
+
+    cursor.execute(f"""
+        SELECT tienda_id, COUNT(*)
+        FROM etl_gap_queue
+        WHERE (status = 'running' OR (status = 'pending' AND attempts < %s)){filtro}
+        GROUP BY tienda_id
+        ORDER BY COUNT(*) DESC
+    """, params[:1] + params[5:])
+    por_tienda = {r[0]: r[1] for r in cursor.fetchall()}
+
+    return {
+        'gap_backlog': row[0] or 0,
+        'gap_backlog_por_tienda': por_tienda,
+        'gaps_recuperados': row[1] or 0,
+        'gaps_fallidos': row[2] or 0,
+        'gaps_recuperados_ultima_hora': row[3] or 0,
+        'gap_registros_recuperados': int(row[4] or 0),
+        'gap_duracion_promedio_seconds': round(float(row[5]), 2) if row[5] else 0,
+    }
+
 
 # =============================================================================
 # ENDPOINTS DE HISTORIAL
 # =============================================================================
 
 @router.get("/history", response_model=List[ETLExecutionSummary])
-async def get_etl_history(
+@db_offload
+def get_etl_history(
     etl_name: Optional[str] = Query(None, description="Filtrar por 'ventas' o 'inventario'"),
     status: Optional[str] = Query(None, description="Filtrar por status: success, partial, failed, running"),
     fecha_desde: Optional[date] = Query(None, description="Fecha inicio del rango"),
@@ -232,7 +301,8 @@ async def get_etl_history(
 
 
 @router.get("/history/{execution_id}", response_model=ETLExecutionDetail)
-async def get_etl_execution_detail(
+@db_offload
+def get_etl_execution_detail(
     execution_id: int,
     current_user: UsuarioConRol = Depends(require_super_admin)
 ):
@@ -333,7 +403,8 @@ async def get_etl_execution_detail(
 
 
 @router.get("/stats", response_model=ETLStats)
-async def get_etl_stats(
+@db_offload
+def get_etl_stats(
     etl_name: Optional[str] = Query(None, description="Filtrar por tipo de ETL"),
     dias: int = Query(default=7, le=90, description="Días hacia atrás para analizar"),
     current_user: UsuarioConRol = Depends(require_super_admin)
@@ -346,6 +417,7 @@ async def get_etl_stats(
     - Duración promedio
     - Errores por fase y categoría
     - Tiendas problemáticas
+    - Cola de gaps: backlog (total y por tienda) y throughput de recuperación
     """
     try:
         with get_db_connection() as conn:
@@ -424,6 +496,8 @@ async def get_etl_stats(
                 for row in cursor.fetchall()
             ]
 
+            gap_stats = _gap_queue_stats(cursor, fecha_desde, etl_name)
+
             cursor.close()
 
             total = general[0] or 1  # Evitar división por cero
@@ -439,7 +513,8 @@ async def get_etl_stats(
                 total_duplicates=general[6] or 0,
                 errors_by_phase=errors_by_phase,
                 errors_by_category=errors_by_category,
-                tiendas_con_mas_fallos=tiendas_problematicas
+                tiendas_con_mas_fallos=tiendas_problematicas,
+                **gap_stats
             )
 
     except Exception as e:
@@ -452,7 +527,8 @@ async def get_etl_stats(
 # =============================================================================
 
 @router.get("/error-categories")
-async def get_error_categories(
+@db_offload
+def get_error_categories(
     current_user: UsuarioConRol = Depends(require_super_admin)
 ):
     """
@@ -13,7 +13,8 @@ from datetime import datetime
 from decimal import Decimal
 import logging
 
-from db_manager import get_db_connection, get_db_connection_write
+from db_manager import get_db_connection, get_db_connection_write, db_offload
+from services.generadores_trafico import recalcular_sugerencias
 
 logger = logging.getLogger(__name__)
 
@@ -81,12 +82,21 @@ class ConfigGeneradorTrafico(BaseModel):
     frecuencia_calculo: str
 
 
+class CambioSugerencia(BaseModel):
+    """Producto que cambió de estado en un recálculo de sugerencias"""
+    producto_id: str
+    gap: Optional[int] = None
+
+
 class CalculoSugerenciasResult(BaseModel):
     """Resultado del cálculo de sugerencias"""
     productos_analizados: int
     nuevas_sugerencias: int
     sugerencias_removidas: int
     tiempo_ejecucion_ms: int
+    # Diff: productos que pasaron a sugeridos / dejaron de serlo
+    productos_sugeridos: List[CambioSugerencia] = []
+    productos_removidos: List[CambioSugerencia] = []
 
 
 class RecalcularABCResult(BaseModel):
@@ -102,6 +112,8 @@ class RecalcularABCResult(BaseModel):
     tiendas_procesadas: int = 0
     productos_por_tienda: int = 0
     tiempo_por_tienda_ms: int = 0
+    # Sugerencias de generadores recalculadas con el nuevo cache (si se pidió)
+    sugerencias: Optional[CalculoSugerenciasResult] = None
 
 
 # ============================================================================
@@ -125,7 +137,8 @@ def get_db_write():
 # ============================================================================
 
 @router.get("/resumen", response_model=ResumenGeneradoresTrafico)
-async def get_resumen(conn: Any = Depends(get_db)):
+@db_offload
+def get_resumen(conn: Any = Depends(get_db)):
     """
     Obtener resumen estadístico de generadores de tráfico
     """
@@ -182,7 +195,8 @@ async def get_resumen(conn: Any = Depends(get_db)):
 
 
 @router.get("/productos")
-async def listar_productos(
+@db_offload
+def listar_productos(
     tab: Optional[str] = None,  # 'activos', 'sugeridos', 'ignorados', 'todos_c'
     filtro: Optional[str] = None,  # alias para compatibilidad
     limit: int = 100,
@@ -311,7 +325,8 @@ async def listar_productos(
 # ============================================================================
 
 @router.post("/marcar")
-async def marcar_generador_trafico(
+@db_offload
+def marcar_generador_trafico(
     request: MarcarGeneradorRequest,
     conn: Any = Depends(get_db_write)
 ):
@@ -403,14 +418,29 @@ async def marcar_generador_trafico(
 # ENDPOINTS: CÁLCULO DE SUGERENCIAS
 # ============================================================================
 
+def _resultado_sugerencias(diff, start_time: float) -> CalculoSugerenciasResult:
+    """CalculoSugerenciasResult a partir del diff del recálculo"""
+    import time
+    return CalculoSugerenciasResult(
+        productos_analizados=diff.productos_analizados,
+        nuevas_sugerencias=len(diff.sugeridos),
+        sugerencias_removidas=len(diff.removidos),
+        tiempo_ejecucion_ms=int((time.time() - start_time) * 1000),
+        productos_sugeridos=[CambioSugerencia(**c) for c in diff.sugeridos],
+        productos_removidos=[CambioSugerencia(**c) for c in diff.removidos]
+    )
+
+
 @router.post("/calcular-sugerencias", response_model=CalculoSugerenciasResult)
-async def calcular_sugerencias(
+@db_offload
+def calcular_sugerencias(
     background_tasks: BackgroundTasks,
     conn: Any = Depends(get_db_write)
 ):
     """
     Calcular y actualizar sugerencias de generadores de tráfico.
-    Usa la tabla cache pre-calculada para rendimiento óptimo.
+    Usa la tabla cache pre-calculada para rendimiento óptimo y devuelve
+    qué productos pasaron a sugeridos o dejaron de serlo.
     """
     import time
     start_time = time.time()
@@ -418,78 +448,14 @@ async def calcular_sugerencias(
     try:
         cursor = conn.cursor()
 
-        # Obtener configuración
-        cursor.execute("""
-            SELECT parametro, valor FROM config_generadores_trafico
-            WHERE parametro IN ('gap_minimo', 'producto_excluido_bolsas')
-        """)
-        config = {row[0]: row[1] for row in cursor.fetchall()}
-        gap_minimo = int(config.get('gap_minimo', 400))
-
-        # Usar tabla cache para obtener candidatos (mucho más rápido)
+        # Una sola sentencia sobre la tabla cache (UPDATE ... FROM candidatos).
         # El GAP es el único criterio - no restringimos por Clase ABC
-        cursor.execute("""
-            SELECT producto_id, gap, clase_abc, venta_30d, tickets_30d
-            FROM productos_abc_cache
-            WHERE gap >= %s
-        """, (gap_minimo,))
-
-        candidatos = cursor.fetchall()
-
-        # Actualizar sugerencias
-        nuevas_sugerencias = 0
-        for producto_id, gap, clase_abc, venta_30d, tickets_30d in candidatos:
-            cursor.execute("""
-                UPDATE productos
-                SET generador_trafico_sugerido = CASE
-                        WHEN COALESCE(es_generador_trafico, FALSE) = FALSE
-                         AND COALESCE(generador_trafico_ignorado, FALSE) = FALSE
-                        THEN TRUE
-                        ELSE generador_trafico_sugerido
-                    END,
-                    generador_trafico_gap = %s,
-                    generador_trafico_fecha_sugerido = NOW()
-                WHERE id = %s
-                  AND COALESCE(es_generador_trafico, FALSE) = FALSE
-                  AND COALESCE(generador_trafico_ignorado, FALSE) = FALSE
-                  AND COALESCE(generador_trafico_sugerido, FALSE) = FALSE
-                RETURNING id
-            """, (gap, producto_id))
-            if cursor.fetchone():
-                nuevas_sugerencias += 1
-                # Registrar en historial
-                cursor.execute("""
-                    INSERT INTO generadores_trafico_historial
-                    (producto_id, accion, gap_score, venta_30d, tickets_30d, clase_abc)
-                    VALUES (%s, 'sugerido', %s, %s, %s, %s)
-                """, (producto_id, gap, float(venta_30d) if venta_30d else 0, tickets_30d, clase_abc))
-
-        # Remover sugerencias de productos que ya no califican (usando cache)
-        # Solo verificamos GAP, no Clase ABC
-        cursor.execute("""
-            UPDATE productos
-            SET generador_trafico_sugerido = FALSE
-            WHERE generador_trafico_sugerido = TRUE
-              AND id NOT IN (
-                  SELECT producto_id
-                  FROM productos_abc_cache
-                  WHERE gap >= %s
-              )
-            RETURNING id
-        """, (gap_minimo,))
-        sugerencias_removidas = cursor.rowcount
+        diff = recalcular_sugerencias(cursor)
 
         conn.commit()
         cursor.close()
 
-        elapsed_ms = int((time.time() - start_time) * 1000)
-
-        return CalculoSugerenciasResult(
-            productos_analizados=len(candidatos),
-            nuevas_sugerencias=nuevas_sugerencias,
-            sugerencias_removidas=sugerencias_removidas,
-            tiempo_ejecucion_ms=elapsed_ms
-        )
+        return _resultado_sugerencias(diff, start_time)
 
     except Exception as e:
         conn.rollback()
@@ -502,7 +468,8 @@ async def calcular_sugerencias(
 # ============================================================================
 
 @router.get("/config", response_model=ConfigGeneradorTrafico)
-async def get_config(conn: Any = Depends(get_db)):
+@db_offload
+def get_config(conn: Any = Depends(get_db)):
     """Obtener configuración actual del módulo"""
     try:
         cursor = conn.cursor()
@@ -523,7 +490,8 @@ async def get_config(conn: Any = Depends(get_db)):
 
 
 @router.put("/config")
-async def update_config(
+@db_offload
+def update_config(
     parametro: str,
     valor: str,
     conn: Any = Depends(get_db_write)
@@ -558,7 +526,8 @@ async def update_config(
 # ============================================================================
 
 @router.get("/historial/{producto_id}")
-async def get_historial_producto(
+@db_offload
+def get_historial_producto(
     producto_id: str,
     limit: int = 20,
     conn: Any = Depends(get_db)
@@ -606,9 +575,11 @@ async def get_historial_producto(
 # ============================================================================
 
 @router.post("/recalcular-abc", response_model=RecalcularABCResult)
-async def recalcular_abc_cache_endpoint(
+@db_offload
+def recalcular_abc_cache_endpoint(
     dias: int = 30,
     incluir_por_tienda: bool = True,
+    incluir_generadores: bool = True,
     conn: Any = Depends(get_db_write)
 ):
     """
@@ -617,10 +588,13 @@ async def recalcular_abc_cache_endpoint(
     Este proceso recalcula:
     1. productos_abc_cache - ABC global (ranking por cantidad vendida)
     2. productos_abc_tienda - ABC por cada tienda (si incluir_por_tienda=True)
+    3. Sugerencias de generadores de tráfico sobre el cache recién calculado
+       (si incluir_generadores=True), en la misma transacción
 
     Parámetros:
     - dias: Período de análisis (default: 30 días)
     - incluir_por_tienda: Si True, también recalcula ABC por tienda (default: True)
+    - incluir_generadores: Si True, recalcula las sugerencias de generadores (default: True)
 
     Tiempo estimado: ~30-60 segundos para global, +30-60 segundos para por tienda
     """
@@ -671,6 +645,13 @@ async def recalcular_abc_cache_endpoint(
             productos_por_tienda = result_tienda[1] if result_tienda else 0
             tiempo_por_tienda_ms = result_tienda[2] if result_tienda else 0
 
+        # 3. Sugerencias de generadores de tráfico con el GAP recién calculado
+        sugerencias = None
+        if incluir_generadores:
+            import time
+            inicio_sugerencias = time.time()
+            sugerencias = _resultado_sugerencias(recalcular_sugerencias(cursor), inicio_sugerencias)
+
         conn.commit()
         cursor.close()
 
@@ -689,7 +670,8 @@ async def recalcular_abc_cache_endpoint(
             fecha_calculo=datetime.now().isoformat(),
             tiendas_procesadas=tiendas_procesadas,
             productos_por_tienda=productos_por_tienda,
-            tiempo_por_tienda_ms=tiempo_por_tienda_ms
+            tiempo_por_tienda_ms=tiempo_por_tienda_ms,
+            sugerencias=sugerencias
         )
 
     except Exception as e:
@@ -699,7 +681,8 @@ async def recalcular_abc_cache_endpoint(
 
 
 @router.get("/abc-cache-status")
-async def get_abc_cache_status(conn: Any = Depends(get_db)):
+@db_offload
+def get_abc_cache_status(conn: Any = Depends(get_db)):
     """
     Obtener estado actual de la cache ABC.
     """
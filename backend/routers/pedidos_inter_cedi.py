@@ -10,14 +10,13 @@ Características:
 - Exportación Excel por CEDI origen
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional, Any, Dict
 import uuid
 from datetime import datetime, date
 from decimal import Decimal
 import math
 import logging
-import io
 
 from models.pedidos_inter_cedi import (
     # Request/Response models
@@ -41,7 +40,16 @@ from models.pedidos_inter_cedi import (
     EstadoPedidoInterCedi,
     CediOrigen,
 )
-from db_manager import get_db_connection, get_db_connection_write
+from db_manager import get_db_connection, get_db_connection_write, db_offload
+from services.demanda_snapshot import obtener_snapshots_demanda, agregar_demanda_regional
+from services.export_stream import (
+    construir_xlsx,
+    generar_csv,
+    iterar_archivo,
+    iterar_filas,
+    iterar_filas_conexion,
+    respuesta_descarga,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -84,7 +92,8 @@ VARIABILIDAD_DEMANDA_DEFAULT = Decimal('0.30')
 # =====================================================================================
 
 @router.get("/", response_model=List[PedidoInterCediResumen])
-async def listar_pedidos_inter_cedi(
+@db_offload
+def listar_pedidos_inter_cedi(
     estado: Optional[str] = None,
     cedi_destino_id: Optional[str] = None,
     limit: int = 50,
@@ -155,7 +164,8 @@ async def listar_pedidos_inter_cedi(
 # =====================================================================================
 
 @router.post("/calcular", response_model=CalcularPedidoInterCediResponse)
-async def calcular_pedido_inter_cedi(
+@db_offload
+def calcular_pedido_inter_cedi(
     request: CalcularPedidoInterCediRequest,
     conn: Any = Depends(get_db)
 ):
@@ -204,58 +214,22 @@ async def calcular_pedido_inter_cedi(
         logger.info(f"📍 Región: {region}, Tiendas: {len(tiendas_region)} ({', '.join([t[1] for t in tiendas_region])})")
 
         # 3. Calcular demanda regional agregada por producto
-        # Obtener productos con ventas en la región
+        # Desde los snapshots de demanda de cada tienda (30 días): solo consultan
+        # `ventas` la primera vez después de cada corrida del ETL de ventas
+        snapshots_region = obtener_snapshots_demanda(conn, tiendas_ids)
+        demanda_regional = agregar_demanda_regional(snapshots_region)
+
+        # Clasificación ABC por ranking de cantidad vendida en la región
+        rank_cantidad_regional = {
+            producto_id: rank
+            for rank, producto_id in enumerate(
+                sorted(demanda_regional, key=lambda pid: demanda_regional[pid]['cantidad_total'], reverse=True),
+                start=1
+            )
+        }
+
         query_demanda = """
-            WITH ventas_30d AS (
-                -- Ventas de los últimos 30 días de las tiendas de la región
-                SELECT
-                    producto_id,
-                    ubicacion_id,
-                    fecha_venta::date as fecha,
-                    SUM(cantidad_vendida) as cantidad_dia
-                FROM ventas
-                WHERE ubicacion_id = ANY(%s)
-                  AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-                  AND fecha_venta < CURRENT_DATE
-                  -- Excluir día de inauguración de Paraíso
-                  AND NOT (ubicacion_id = 'tienda_18' AND fecha_venta::date = '2025-12-06')
-                GROUP BY producto_id, ubicacion_id, fecha_venta::date
-            ),
-            p75_por_tienda AS (
-                -- P75 por producto por tienda
-                SELECT
-                    producto_id,
-                    ubicacion_id,
-                    PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY cantidad_dia) as p75_tienda,
-                    AVG(cantidad_dia) as promedio_tienda,
-                    STDDEV(cantidad_dia) as sigma_tienda,
-                    COUNT(DISTINCT fecha) as dias_con_venta
-                FROM ventas_30d
-                GROUP BY producto_id, ubicacion_id
-            ),
-            demanda_regional AS (
-                -- Suma de P75 de todas las tiendas = demanda regional total
-                SELECT
-                    producto_id,
-                    SUM(COALESCE(p75_tienda, 0)) as p75_regional,
-                    AVG(COALESCE(p75_tienda, 0)) as p75_promedio_tienda,
-                    -- Sigma regional: raíz de suma de varianzas
-                    SQRT(SUM(COALESCE(sigma_tienda * sigma_tienda, 0))) as sigma_regional,
-                    COUNT(DISTINCT ubicacion_id) as num_tiendas
-                FROM p75_por_tienda
-                GROUP BY producto_id
-                -- Removido HAVING para incluir productos sin ventas
-            ),
-            abc_ranking AS (
-                -- Clasificación ABC por ranking de cantidad vendida en la región
-                SELECT
-                    producto_id,
-                    SUM(cantidad_dia) as cantidad_total,
-                    ROW_NUMBER() OVER (ORDER BY SUM(cantidad_dia) DESC) as rank_cantidad
-                FROM ventas_30d
-                GROUP BY producto_id
-            ),
-            stock_cedi_destino AS (
+            WITH stock_cedi_destino AS (
                 -- Stock actual en CEDI destino
                 SELECT
                     producto_id,
@@ -278,25 +252,10 @@ async def calcular_pedido_inter_cedi(
                 COALESCE(p.unidad_pedido, 'Bulto') as unidad_pedido,
                 p.peso_unitario,
                 p.cedi_origen_id,
-                -- Demanda regional
-                COALESCE(dr.p75_regional, 0) as p75_regional,
-                COALESCE(dr.p75_promedio_tienda, 0) as p75_promedio,
-                COALESCE(dr.sigma_regional, dr.p75_regional * 0.3, 0) as sigma_regional,
-                COALESCE(dr.num_tiendas, 0) as num_tiendas,
                 -- Stock CEDI destino
-                COALESCE(scd.stock_actual, 0) as stock_cedi_destino,
-                -- Clasificación ABC
-                CASE
-                    WHEN abc.rank_cantidad <= 50 THEN 'A'
-                    WHEN abc.rank_cantidad <= 200 THEN 'B'
-                    WHEN abc.rank_cantidad <= 800 THEN 'C'
-                    ELSE 'D'
-                END as clase_abc,
-                abc.rank_cantidad
+                COALESCE(scd.stock_actual, 0) as stock_cedi_destino
             FROM productos p
-            LEFT JOIN demanda_regional dr ON p.id = dr.producto_id
             LEFT JOIN stock_cedi_destino scd ON p.id = scd.producto_id
-            LEFT JOIN abc_ranking abc ON p.id = abc.producto_id
             WHERE p.activo = true
               AND p.cedi_origen_id IS NOT NULL
               AND (
@@ -304,15 +263,38 @@ async def calcular_pedido_inter_cedi(
                 (%s = 'cedi_seco'  AND (p.cuadrante IS NULL OR p.cuadrante != 'CUADRANTE VI')) OR
                 (%s = 'cedi_verde' AND p.cuadrante = 'FRUVER')
               )
-            ORDER BY COALESCE(dr.p75_regional, 0) DESC
         """
 
         cursor.execute(query_demanda, [
-            tiendas_ids, request.cedi_destino_id,
+            request.cedi_destino_id,
             request.cedi_origen_id, request.cedi_origen_id, request.cedi_origen_id
         ])
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description] + [
+            'p75_regional', 'p75_promedio', 'sigma_regional', 'num_tiendas', 'clase_abc', 'rank_cantidad'
+        ]
+        rows = []
+        for row in cursor.fetchall():
+            dr = demanda_regional.get(row[0])
+            rank_cantidad = rank_cantidad_regional.get(row[0])
+            if rank_cantidad is None:
+                clase_abc = 'D'
+            elif rank_cantidad <= 50:
+                clase_abc = 'A'
+            elif rank_cantidad <= 200:
+                clase_abc = 'B'
+            elif rank_cantidad <= 800:
+                clase_abc = 'C'
+            else:
+                clase_abc = 'D'
+            rows.append(row + (
+                dr['p75_regional'] if dr else 0,
+                dr['p75_promedio_tienda'] if dr else 0,
+                dr['sigma_regional'] if dr else 0,
+                dr['num_tiendas'] if dr else 0,
+                clase_abc,
+                rank_cantidad,
+            ))
+        rows.sort(key=lambda r: r[-6], reverse=True)  # ORDER BY p75_regional DESC
 
         # Contar cuántos tienen demanda > 0
         productos_con_demanda = sum(1 for row in rows if dict(zip(columns, row))['p75_regional'] > 0)
@@ -332,44 +314,18 @@ async def calcular_pedido_inter_cedi(
             logger.warning(f"⚠️ No se pudieron cargar exclusiones inter-CEDI (tabla puede no existir): {e}")
             codigos_excluidos_intercedi = set()
 
-        # 3.1 Obtener desglose de P75 por tienda para cada producto
-        query_p75_tienda = """
-            WITH ventas_30d AS (
-                SELECT
-                    producto_id,
-                    ubicacion_id,
-                    fecha_venta::date as fecha,
-                    SUM(cantidad_vendida) as cantidad_dia
-                FROM ventas
-                WHERE ubicacion_id = ANY(%s)
-                  AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-                  AND fecha_venta < CURRENT_DATE
-                  AND NOT (ubicacion_id = 'tienda_18' AND fecha_venta::date = '2025-12-06')
-                GROUP BY producto_id, ubicacion_id, fecha_venta::date
-            )
-            SELECT
-                v.producto_id,
-                v.ubicacion_id as tienda_id,
-                u.nombre as tienda_nombre,
-                PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY v.cantidad_dia) as p75_tienda
-            FROM ventas_30d v
-            LEFT JOIN ubicaciones u ON v.ubicacion_id = u.id
-            GROUP BY v.producto_id, v.ubicacion_id, u.nombre
-        """
-        cursor.execute(query_p75_tienda, [tiendas_ids])
-        p75_rows = cursor.fetchall()
-
-        # Crear diccionario de P75 por producto y tienda
+        # 3.1 Obtener desglose de P75 por tienda para cada producto (desde los snapshots)
+        tiendas_nombres = {t[0]: t[1] for t in tiendas_region}
         p75_por_producto: Dict[str, List[Dict]] = {}
-        for p75_row in p75_rows:
-            producto_id, tienda_id, tienda_nombre, p75_valor = p75_row
-            if producto_id not in p75_por_producto:
-                p75_por_producto[producto_id] = []
-            p75_por_producto[producto_id].append({
-                'tienda_id': tienda_id,
-                'tienda_nombre': tienda_nombre or tienda_id,
-                'p75_unidades': Decimal(str(p75_valor)) if p75_valor else Decimal('0')
-            })
+        for tienda_id, snapshot in snapshots_region.items():
+            for producto_id, demanda in snapshot.productos.items():
+                if producto_id not in p75_por_producto:
+                    p75_por_producto[producto_id] = []
+                p75_por_producto[producto_id].append({
+                    'tienda_id': tienda_id,
+                    'tienda_nombre': tiendas_nombres.get(tienda_id) or tienda_id,
+                    'p75_unidades': Decimal(str(demanda.p75_30d)) if demanda.p75_30d else Decimal('0')
+                })
 
         # 3.2 Obtener stock en tiendas de la región
         query_stock_tiendas = """
@@ -697,7 +653,8 @@ async def calcular_pedido_inter_cedi(
 # =====================================================================================
 
 @router.post("/", response_model=PedidoInterCediGuardadoResponse)
-async def guardar_pedido_inter_cedi(
+@db_offload
+def guardar_pedido_inter_cedi(
     request: GuardarPedidoInterCediRequest,
     conn: Any = Depends(get_db_write)
 ):
@@ -831,7 +788,8 @@ async def guardar_pedido_inter_cedi(
 # =====================================================================================
 
 @router.get("/{pedido_id}", response_model=PedidoInterCediCompleto)
-async def obtener_pedido_inter_cedi(
+@db_offload
+def obtener_pedido_inter_cedi(
     pedido_id: str,
     conn: Any = Depends(get_db)
 ):
@@ -900,7 +858,8 @@ async def obtener_pedido_inter_cedi(
 # =====================================================================================
 
 @router.delete("/{pedido_id}")
-async def eliminar_pedido_inter_cedi(
+@db_offload
+def eliminar_pedido_inter_cedi(
     pedido_id: str,
     conn: Any = Depends(get_db_write)
 ):
@@ -1075,7 +1034,8 @@ async def _cambiar_estado(
 # =====================================================================================
 
 @router.get("/{pedido_id}/historial", response_model=List[HistorialEstadoPedido])
-async def obtener_historial_pedido(
+@db_offload
+def obtener_historial_pedido(
     pedido_id: str,
     conn: Any = Depends(get_db)
 ):
@@ -1106,7 +1066,8 @@ async def obtener_historial_pedido(
 # =====================================================================================
 
 @router.get("/config/rutas", response_model=List[ConfiguracionRutaInterCedi])
-async def obtener_rutas_inter_cedi(
+@db_offload
+def obtener_rutas_inter_cedi(
     activo: bool = True,
     conn: Any = Depends(get_db)
 ):
@@ -1140,9 +1101,11 @@ async def obtener_rutas_inter_cedi(
 # =====================================================================================
 
 @router.get("/{pedido_id}/exportar")
-async def exportar_pedido_excel(
+@db_offload
+def exportar_pedido_excel(
     pedido_id: str,
     cedi_origen: Optional[str] = None,
+    formato: str = "xlsx",
     conn: Any = Depends(get_db)
 ):
     """
@@ -1151,11 +1114,12 @@ async def exportar_pedido_excel(
     Query params:
     - cedi_origen: Filtrar por CEDI origen (cedi_seco, cedi_frio, cedi_verde)
                    Si no se especifica, exporta todos
+    - formato: xlsx (default, openpyxl write-only) | csv (streaming)
     """
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    if formato not in ("xlsx", "csv"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'xlsx' o 'csv'")
 
+    try:
         cursor = conn.cursor()
 
         # Obtener pedido
@@ -1170,46 +1134,33 @@ async def exportar_pedido_excel(
 
         numero_pedido, cedi_destino, fecha_pedido, estado = pedido_row
 
-        # Obtener productos
-        query = """
-            SELECT
-                codigo_producto, descripcion_producto, categoria, clasificacion_abc,
-                demanda_regional_p75, num_tiendas_region,
-                stock_actual_cedi, stock_cedi_origen,
-                cantidad_sugerida_bultos, cantidad_pedida_bultos,
-                unidades_por_bulto, total_unidades,
-                cedi_origen_id, cedi_origen_nombre
-            FROM pedidos_inter_cedi_detalle
-            WHERE pedido_id = %s
-        """
+        # Productos (se leen con cursor server-side al generar el archivo)
+        where = "WHERE pedido_id = %s"
         params = [pedido_id]
 
         if cedi_origen:
-            query += " AND cedi_origen_id = %s"
+            where += " AND cedi_origen_id = %s"
             params.append(cedi_origen)
 
-        query += " ORDER BY cedi_origen_id, clasificacion_abc, descripcion_producto"
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM pedidos_inter_cedi_detalle {where})", params)
+        hay_productos = cursor.fetchone()[0]
         cursor.close()
 
-        if not rows:
+        if not hay_productos:
             raise HTTPException(status_code=404, detail="No hay productos para exportar")
 
-        # Crear workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-
-        # Título
-        cedi_filtro = CediOrigen.nombre(cedi_origen) if cedi_origen else "Todos"
-        ws.title = f"Pedido {numero_pedido}"
-        ws.merge_cells('A1:L1')
-        ws['A1'] = f"Pedido Inter-CEDI: {numero_pedido} - {cedi_destino}"
-        ws['A1'].font = Font(bold=True, size=14)
-
-        ws.merge_cells('A2:L2')
-        ws['A2'] = f"Fecha: {fecha_pedido} | Estado: {estado} | CEDI Origen: {cedi_filtro}"
+        query = f"""
+            SELECT
+                codigo_producto, descripcion_producto, categoria, clasificacion_abc,
+                demanda_regional_p75, num_tiendas_region,
+                stock_actual_cedi, stock_cedi_origen,
+                cantidad_sugerida_bultos, cantidad_pedida_bultos,
+                unidades_por_bulto, total_unidades,
+                cedi_origen_id, cedi_origen_nombre
+            FROM pedidos_inter_cedi_detalle
+            {where}
+            ORDER BY cedi_origen_id, clasificacion_abc, descripcion_producto
+        """
 
         # Headers
         headers = [
@@ -1218,15 +1169,6 @@ async def exportar_pedido_excel(
             'Sugerido (Bultos)', 'Pedido (Bultos)', 'Unidades'
         ]
 
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        header_font = Font(bold=True, color='FFFFFF')
-
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=4, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-
         # Data
         cedi_colors = {
             'cedi_seco': 'FFFDE7',   # Amarillo claro
@@ -1234,51 +1176,45 @@ async def exportar_pedido_excel(
             'cedi_verde': 'E8F5E9'   # Verde claro
         }
 
-        for row_idx, row in enumerate(rows, 5):
-            cedi_id = row[12]
-            fill_color = cedi_colors.get(cedi_id, 'FFFFFF')
-            row_fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type='solid')
-
-            data = [
-                row[0],   # Código
-                row[1],   # Descripción
-                row[2],   # Categoría
-                row[3],   # ABC
-                row[13],  # CEDI Origen nombre
-                float(row[4]) if row[4] else 0,   # Demanda P75
-                row[5],   # Tiendas
-                float(row[6]) if row[6] else 0,   # Stock CEDI Destino
-                float(row[7]) if row[7] else 0,   # Stock CEDI Origen
-                float(row[8]) if row[8] else 0,   # Sugerido
-                float(row[9]) if row[9] else 0,   # Pedido
-                float(row[11]) if row[11] else 0  # Unidades
-            ]
-
-            for col, value in enumerate(data, 1):
-                cell = ws.cell(row=row_idx, column=col, value=value)
-                cell.fill = row_fill
-
-        # Ajustar anchos de columna
-        column_widths = [12, 40, 15, 6, 12, 12, 8, 15, 15, 15, 15, 12]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = width
-
-        # Guardar en memoria
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+        def filas(rows):
+            for row in rows:
+                data = [
+                    row[0],   # Código
+                    row[1],   # Descripción
+                    row[2],   # Categoría
+                    row[3],   # ABC
+                    row[13],  # CEDI Origen nombre
+                    float(row[4]) if row[4] else 0,   # Demanda P75
+                    row[5],   # Tiendas
+                    float(row[6]) if row[6] else 0,   # Stock CEDI Destino
+                    float(row[7]) if row[7] else 0,   # Stock CEDI Origen
+                    float(row[8]) if row[8] else 0,   # Sugerido
+                    float(row[9]) if row[9] else 0,   # Pedido
+                    float(row[11]) if row[11] else 0  # Unidades
+                ]
+                yield data, cedi_colors.get(row[12], 'FFFFFF')
 
         # Nombre del archivo
         filename = f"{numero_pedido}"
         if cedi_origen:
             filename += f"_{cedi_origen.upper()}"
-        filename += ".xlsx"
 
-        return Response(
-            content=output.read(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        if formato == "csv":
+            rows = iterar_filas_conexion(get_db_connection, query, params)
+            return respuesta_descarga(
+                generar_csv(headers, (data for data, _ in filas(rows))), "csv", filename, cerrar=[rows]
+            )
+
+        cedi_filtro = CediOrigen.nombre(cedi_origen) if cedi_origen else "Todos"
+        archivo, _ = construir_xlsx(
+            headers,
+            filas(iterar_filas(conn, query, params)),
+            titulo_hoja=f"Pedido {numero_pedido}",
+            titulo=f"Pedido Inter-CEDI: {numero_pedido} - {cedi_destino}",
+            subtitulo=f"Fecha: {fecha_pedido} | Estado: {estado} | CEDI Origen: {cedi_filtro}",
+            anchos=[12, 40, 15, 6, 12, 12, 8, 15, 15, 15, 15, 12],
         )
+        return respuesta_descarga(iterar_archivo(archivo), "xlsx", filename)
 
     except HTTPException:
         raise
@@ -1294,7 +1230,8 @@ async def exportar_pedido_excel(
 # =====================================================================================
 
 @router.get("/historial-ventas/{codigo_producto}")
-async def obtener_historial_ventas_regional(
+@db_offload
+def obtener_historial_ventas_regional(
     codigo_producto: str,
     cedi_destino_id: str = "cedi_caracas",
     dias: int = 30,
@@ -1351,18 +1288,17 @@ async def obtener_historial_ventas_regional(
         # 4. Obtener ventas diarias por tienda
         cursor.execute("""
             SELECT
-                fecha_venta::date as fecha,
-                TO_CHAR(fecha_venta::date, 'Dy') as dia_semana,
+                fecha,
+                TO_CHAR(fecha, 'Dy') as dia_semana,
                 ubicacion_id,
-                SUM(cantidad_vendida) as cantidad
-            FROM ventas
+                cantidad_vendida as cantidad
+            FROM ventas_diarias
             WHERE producto_id = %s
               AND ubicacion_id = ANY(%s)
-              AND fecha_venta::date >= CURRENT_DATE - INTERVAL '%s days'
-              AND fecha_venta::date < CURRENT_DATE
-              AND NOT (ubicacion_id = 'tienda_18' AND fecha_venta::date = '2025-12-06')
-            GROUP BY fecha_venta::date, ubicacion_id
-            ORDER BY fecha_venta::date DESC
+              AND fecha >= CURRENT_DATE - INTERVAL '%s days'
+              AND fecha < CURRENT_DATE
+              AND NOT (ubicacion_id = 'tienda_18' AND fecha = '2025-12-06')
+            ORDER BY fecha DESC
         """, [producto_id, tiendas_ids, dias])
 
         ventas_rows = cursor.fetchall()
@@ -1443,7 +1379,8 @@ async def obtener_historial_ventas_regional(
 # =====================================================================================
 
 @router.get("/historial-inventario/{codigo_producto}")
-async def obtener_historial_inventario_cedi(
+@db_offload
+def obtener_historial_inventario_cedi(
     codigo_producto: str,
     ubicacion_id: str = "cedi_caracas",
     dias: int = 30,
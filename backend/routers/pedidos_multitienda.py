@@ -36,17 +36,37 @@ from models.pedidos_multitienda import (
 from services.algoritmo_dpdu import (
     ConfigDPDU,
     DatosTiendaProducto,
-    calcular_distribucion_dpdu,
     detectar_conflicto,
     to_dict as asignacion_to_dict,
 )
+from services.algoritmo_dpdu_batch import calcular_distribucion_dpdu_batch
+from services.pedidos_persistencia import formatear_numero_pedido, insertar_filas, siguiente_numero_base
 from services.calculo_inventario_abc import (
     calcular_inventario_simple,
     ConfigTiendaABC,
     set_config_tienda,
     LEAD_TIME_DEFAULT
 )
-from db_manager import get_db_connection, get_db_connection_write, get_db_connection_resilient
+from services.pedidos_multitienda_calculo import calcular_productos_tienda
+from services.llegadas_inventario import LlegadaDetectada, obtener_llegadas
+from services.compute_executor import run_in_compute_executor, get_compute_mode
+from services.demanda_snapshot import (
+    obtener_snapshot_demanda,
+    obtener_snapshots_demanda,
+    agregar_demanda_regional,
+)
+from services.export_stream import (
+    construir_xlsx,
+    generar_csv,
+    iterar_archivo,
+    iterar_filas,
+    iterar_filas_conexion,
+    respuesta_descarga,
+)
+from db_manager import (
+    get_db_connection, get_db_connection_write, get_db_connection_resilient,
+    db_offload, run_in_db_executor
+)
 
 logger = logging.getLogger(__name__)
 
@@ -72,7 +92,7 @@ def get_db_write():
 # FUNCIONES AUXILIARES
 # =====================================================================================
 
-async def obtener_config_dpdu(conn) -> ConfigDPDU:
+def obtener_config_dpdu(conn) -> ConfigDPDU:
     """Obtiene la configuración DPD+U desde la base de datos."""
     cursor = conn.cursor()
     cursor.execute("""
@@ -97,7 +117,7 @@ async def obtener_config_dpdu(conn) -> ConfigDPDU:
     return ConfigDPDU()
 
 
-async def cargar_config_tienda(conn, tienda_id: str, set_global: bool = True) -> ConfigTiendaABC:
+def cargar_config_tienda(conn, tienda_id: str, set_global: bool = True) -> ConfigTiendaABC:
     """
     Carga la configuración ABC específica de una tienda desde config_parametros_abc_tienda.
     Si no existe configuración, retorna valores por defecto.
@@ -145,16 +165,17 @@ async def cargar_config_tienda(conn, tienda_id: str, set_global: bool = True) ->
         cursor.close()
 
 
-async def calcular_transito_tienda(conn, cedi_origen: str, tienda_destino: str) -> Dict[str, Dict]:
+def calcular_transito_tienda(conn, cedi_origen: str, tienda_destino: str) -> Dict[str, Dict]:
     """
     Calcula productos en tránsito hacia una tienda.
 
-    Detecta el tránsito real analizando incrementos en inventario_historico
-    (misma lógica que verificar-llegada). NO se basa en el estado del pedido.
+    Detecta el tránsito real con los incrementos de inventario de la tienda
+    (inventario_incrementos, misma lógica que verificar-llegada). NO se basa
+    en el estado del pedido.
 
     Algoritmo:
     1. Buscar pedidos recientes (10 días) del CEDI hacia la tienda
-    2. Para cada producto, detectar incrementos en inventario_historico desde fecha_pedido
+    2. Sumar en una sola consulta los incrementos de cada producto desde su fecha_pedido
     3. transito = cantidad_pedida - llegadas_detectadas (si > 0)
 
     Returns: {codigo_producto: {transito_bultos: float, desglose: [...]}}
@@ -182,37 +203,17 @@ async def calcular_transito_tienda(conn, cedi_origen: str, tienda_destino: str)
     pedidos_productos = cursor.fetchall()
     transito_por_producto: Dict[str, Dict] = {}
 
-    # 2. Para cada producto/pedido, detectar llegadas via inventario_historico
+    # 2. Llegadas de todos los productos/pedidos (inventario_historico usa el código)
+    llegadas = obtener_llegadas(
+        cursor, [(tienda_destino, row[4], row[2]) for row in pedidos_productos]
+    )
+
     for row in pedidos_productos:
         (pedido_id, numero_pedido, fecha_pedido, estado,
          codigo, desc, cantidad_pedida, unidades_por_bulto) = row
 
-        # Query de detección de llegada (igual que verificar-llegada línea 2347)
-        # Suma todos los incrementos positivos entre snapshots consecutivos
-        cursor.execute("""
-            WITH snapshots AS (
-                SELECT
-                    fecha_snapshot,
-                    SUM(cantidad) as cantidad,
-                    LAG(SUM(cantidad)) OVER (ORDER BY fecha_snapshot) as cantidad_anterior
-                FROM inventario_historico
-                WHERE producto_id = %s
-                  AND ubicacion_id = %s
-                  AND fecha_snapshot >= %s
-                GROUP BY fecha_snapshot
-                ORDER BY fecha_snapshot
-            )
-            SELECT COALESCE(SUM(
-                CASE
-                    WHEN cantidad_anterior IS NOT NULL AND cantidad > cantidad_anterior
-                    THEN cantidad - cantidad_anterior
-                    ELSE 0
-                END
-            ), 0) as total_llegadas
-            FROM snapshots
-        """, [codigo, tienda_destino, fecha_pedido])
-
-        llegadas_unidades = float(cursor.fetchone()[0] or 0)
+        llegada = llegadas.get((tienda_destino, codigo, fecha_pedido), LlegadaDetectada())
+        llegadas_unidades = float(llegada.total_llegadas)
         llegadas_bultos = llegadas_unidades / (unidades_por_bulto or 1)
         pendiente = max(0, float(cantidad_pedida) - llegadas_bultos)
 
@@ -238,74 +239,69 @@ async def calcular_transito_tienda(conn, cedi_origen: str, tienda_destino: str)
     return transito_por_producto
 
 
-async def obtener_productos_tienda(
+def cargar_config_cobertura_categoria(conn) -> Dict[str, Dict[str, int]]:
+    """
+    Carga la configuración de cobertura por categoría (perecederos, etc.).
+
+    Returns: {categoria_normalizada: {'A': dias, 'B': dias, 'C': dias, 'D': dias}}
+    """
+    cursor = conn.cursor()
+    config_cobertura_categoria = {}
+    try:
+        cursor.execute("""
+            SELECT categoria_normalizada, dias_cobertura_a, dias_cobertura_b,
+                   dias_cobertura_c, dias_cobertura_d
+            FROM config_cobertura_categoria
+            WHERE activo = true
+        """)
+        for cat_row in cursor.fetchall():
+            cat_norm = (cat_row[0] or '').strip().upper()
+            config_cobertura_categoria[cat_norm] = {
+                'A': cat_row[1] if cat_row[1] is not None else 7,
+                'B': cat_row[2] if cat_row[2] is not None else 14,
+                'C': cat_row[3] if cat_row[3] is not None else 21,
+                'D': cat_row[4] if cat_row[4] is not None else 30
+            }
+        if config_cobertura_categoria:
+            logger.info(f"🥬 Coberturas por categoría cargadas: {list(config_cobertura_categoria.keys())}")
+    except Exception as e:
+        logger.warning(f"No se pudo cargar config cobertura por categoría: {e}")
+    finally:
+        cursor.close()
+
+    return config_cobertura_categoria
+
+
+def cargar_datos_tienda(
     conn,
     cedi_origen: str,
     tienda_destino: str,
-    dias_cobertura: int = 3,
-    filtros: Optional[Dict[str, Any]] = None,
-    config_tienda_abc: Optional[ConfigTiendaABC] = None
-) -> List[Dict]:
+    filtros: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """
-    Obtiene TODOS los productos para una tienda, marcando cuáles necesitan reposición.
+    Carga (I/O) los datos de una tienda necesarios para calcular su pedido.
 
-    LÓGICA:
-    - Retorna todos los productos que tienen ventas, stock en tienda o stock en CEDI
-    - Marca como 'es_sugerido=True' los que están por debajo del ROP (necesitan reposición)
-    - Marca como 'es_sugerido=False' los que están bien abastecidos (para revisión manual)
-
-    Esto permite al usuario:
-    - Ver productos sugeridos automáticamente
-    - Buscar productos no sugeridos y agregarlos manualmente si lo considera necesario
+    Solo ejecuta queries: el cálculo por producto lo hace
+    services.pedidos_multitienda_calculo.calcular_productos_tienda(), que
+    puede correr en otro proceso. Todo lo retornado es picklable.
 
-    Niveles de stock por ABC:
-    - SS (Stock Seguridad): A=1.5d, B=2d, C=3d, D=4d
-    - ROP (Punto Reorden): A=3d, B=4d, C=6d, D=8d
-    - MAX (Stock Máximo): A=5d, B=8d, C=12d, D=15d
+    Returns: {rows, limites_capacidad, transito_data, p75_referencia_batch}
     """
+    # Demanda (P75 20d, sigma/máximo 30d) desde el snapshot en memoria:
+    # solo consulta `ventas` la primera vez después de cada corrida del ETL
+    snapshot = obtener_snapshot_demanda(conn, tienda_destino)
+    productos_con_demanda = [pid for pid, d in snapshot.productos.items() if d.p75_20d > 0]
+
     cursor = conn.cursor()
 
-    # Query principal: obtiene productos con ventas, stock, clasificación ABC y estadísticas
+    # Query principal: obtiene productos con stock y clasificación ABC
     # IMPORTANTE: Aplica los mismos filtros que el wizard de una sola tienda:
     # 1. Solo productos activos (p.activo = true)
     # 2. Excluye productos en productos_excluidos_tienda
     # 3. Solo productos con clasificación ABC válida (A, B, C, D)
-    # 4. Calcula sigma_demanda y demanda_maxima para cálculo estadístico de inventario
+    # 4. Solo productos con demanda (snapshot), stock en tienda o stock en CEDI
     query = """
-        WITH ventas_diarias AS (
-            -- Ventas diarias por producto (base para todos los cálculos)
-            SELECT
-                producto_id,
-                DATE(fecha_venta) as fecha,
-                SUM(cantidad_vendida) as cantidad_vendida
-            FROM ventas
-            WHERE ubicacion_id = %(tienda)s
-              AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-              AND fecha_venta < CURRENT_DATE
-            GROUP BY producto_id, DATE(fecha_venta)
-        ),
-        ventas_20dias AS (
-            SELECT
-                producto_id,
-                AVG(cantidad_vendida) as prom_20d,
-                PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY cantidad_vendida) as p75
-            FROM ventas_diarias
-            WHERE fecha >= CURRENT_DATE - INTERVAL '20 days'
-            GROUP BY producto_id
-        ),
-        estadisticas_30d AS (
-            -- Sigma y demanda máxima para cálculo estadístico (igual que single-store)
-            SELECT
-                producto_id,
-                CASE
-                    WHEN COUNT(*) <= 1 THEN 0
-                    ELSE COALESCE(STDDEV(cantidad_vendida), 0)
-                END as sigma_demanda,
-                COALESCE(MAX(cantidad_vendida), 0) as demanda_maxima
-            FROM ventas_diarias
-            GROUP BY producto_id
-        ),
-        stock_tienda AS (
+        WITH stock_tienda AS (
             SELECT producto_id, SUM(cantidad) as stock
             FROM inventario_actual
             WHERE ubicacion_id = %(tienda)s
@@ -334,19 +330,13 @@ async def obtener_productos_tienda(
             p.categoria,
             p.cuadrante,
             COALESCE(p.unidades_por_bulto, 1) as unidades_por_bulto,
-            COALESCE(v.prom_20d, 0) as prom_20d,
-            COALESCE(v.p75, 0) as p75,
             COALESCE(st.stock, 0) as stock_tienda,
             COALESCE(sc.stock, 0) as stock_cedi,
             COALESCE(abc.clase_abc, 'D') as clase_abc,
             COALESCE(abc.venta_30d, 0) as venta_30d,
-            COALESCE(est.sigma_demanda, 0) as sigma_demanda,
-            COALESCE(est.demanda_maxima, v.p75 * 2, 0) as demanda_maxima,
             COALESCE(p.es_generador_trafico, false) as es_generador_trafico,
             p.peso_unitario
         FROM productos p
-        LEFT JOIN ventas_20dias v ON p.id = v.producto_id
-        LEFT JOIN estadisticas_30d est ON p.id = est.producto_id
         LEFT JOIN stock_tienda st ON p.id = st.producto_id
         LEFT JOIN stock_cedi sc ON p.id = sc.producto_id
         LEFT JOIN abc_tienda abc ON p.id = abc.producto_id
@@ -354,11 +344,11 @@ async def obtener_productos_tienda(
         WHERE p.activo = true
           AND pe.producto_id IS NULL
           AND (abc.clase_abc IN ('A', 'B', 'C', 'D') OR abc.clase_abc IS NULL)
-          AND (COALESCE(v.p75, 0) > 0 OR COALESCE(st.stock, 0) > 0 OR COALESCE(sc.stock, 0) > 0)
+          AND (p.id = ANY(%(con_demanda)s) OR COALESCE(st.stock, 0) > 0 OR COALESCE(sc.stock, 0) > 0)
     """
 
     # Construir parámetros
-    params = {'tienda': tienda_destino, 'cedi': cedi_origen}
+    params = {'tienda': tienda_destino, 'cedi': cedi_origen, 'con_demanda': productos_con_demanda}
 
     # Agregar filtro de cuadrantes si se proporciona
     if filtros and filtros.get('cuadrantes'):
@@ -369,7 +359,24 @@ async def obtener_productos_tienda(
     query += " ORDER BY COALESCE(abc.venta_30d, 0) DESC"
 
     cursor.execute(query, params)
-    rows = cursor.fetchall()
+
+    # Completar cada fila con la demanda del snapshot (mismo orden de columnas
+    # que espera calcular_productos_tienda)
+    rows = []
+    for (producto_id, codigo, descripcion, categoria, cuadrante, unidades_por_bulto,
+         stock_tienda, stock_cedi, clase_abc, venta_30d, es_generador_trafico, peso_unitario) in cursor.fetchall():
+        demanda = snapshot.get(producto_id)
+        if demanda is not None:
+            prom_20d, p75 = demanda.prom_20d, demanda.p75_20d
+            sigma_demanda = demanda.sigma_30d
+            demanda_maxima = demanda.max_30d
+        else:
+            prom_20d = p75 = sigma_demanda = demanda_maxima = 0
+        rows.append((
+            producto_id, codigo, descripcion, categoria, cuadrante, unidades_por_bulto,
+            prom_20d, p75, stock_tienda, stock_cedi, clase_abc, venta_30d,
+            sigma_demanda, demanda_maxima, es_generador_trafico, peso_unitario,
+        ))
 
     # Cargar límites de capacidad para esta tienda (igual que single-store)
     limites_capacidad = {}  # {codigo_producto: {capacidad_maxima, minimo_exhibicion}}
@@ -391,36 +398,14 @@ async def obtener_productos_tienda(
     except Exception as e:
         logger.warning(f"No se pudo cargar límites de capacidad para {tienda_destino}: {e}")
 
-    # Cargar configuración de cobertura por categoría (perecederos, etc.)
-    config_cobertura_categoria = {}
-    try:
-        cursor.execute("""
-            SELECT categoria_normalizada, dias_cobertura_a, dias_cobertura_b,
-                   dias_cobertura_c, dias_cobertura_d
-            FROM config_cobertura_categoria
-            WHERE activo = true
-        """)
-        for cat_row in cursor.fetchall():
-            cat_norm = (cat_row[0] or '').strip().upper()
-            config_cobertura_categoria[cat_norm] = {
-                'A': cat_row[1] if cat_row[1] is not None else 7,
-                'B': cat_row[2] if cat_row[2] is not None else 14,
-                'C': cat_row[3] if cat_row[3] is not None else 21,
-                'D': cat_row[4] if cat_row[4] is not None else 30
-            }
-        if config_cobertura_categoria:
-            logger.info(f"🥬 Coberturas por categoría cargadas: {list(config_cobertura_categoria.keys())}")
-    except Exception as e:
-        logger.warning(f"No se pudo cargar config cobertura por categoría: {e}")
-
     cursor.close()
 
     # Calcular tránsito para esta tienda ANTES del loop de productos
     # para que podamos usar stock efectivo (stock + tránsito) al calcular SUG
-    transito_data = await calcular_transito_tienda(conn, cedi_origen, tienda_destino)
+    transito_data = calcular_transito_tienda(conn, cedi_origen, tienda_destino)
 
     # Pre-calcular P75 de referencia para TODOS los productos candidatos a envío prueba
-    # (p75=0 y stock_cedi>0) en UNA SOLA query batch, en vez de N queries individuales
+    # (p75=0 y stock_cedi>0) desde los snapshots de demanda, en vez de N queries individuales
     candidatos_envio_prueba = [
         row[0]  # producto_id
         for row in rows
@@ -430,256 +415,78 @@ async def obtener_productos_tienda(
     if candidatos_envio_prueba:
         cursor_ep = conn.cursor()
         cursor_ep.execute("""
-            WITH tiendas_mismo_cedi AS (
-                SELECT DISTINCT ps.tienda_destino_id
-                FROM pedidos_sugeridos ps
-                WHERE ps.cedi_origen_id = %s
-                  AND ps.tienda_destino_id != %s
-                LIMIT 10
-            ),
-            ventas_diarias_tiendas AS (
-                SELECT
-                    v.producto_id,
-                    v.ubicacion_id,
-                    DATE(v.fecha_venta) as fecha,
-                    SUM(v.cantidad_vendida) as cantidad_vendida
-                FROM ventas v
-                WHERE v.ubicacion_id IN (SELECT tienda_destino_id FROM tiendas_mismo_cedi)
-                  AND v.producto_id = ANY(%s)
-                  AND v.fecha_venta >= CURRENT_DATE - INTERVAL '20 days'
-                  AND v.fecha_venta < CURRENT_DATE
-                GROUP BY v.producto_id, v.ubicacion_id, DATE(v.fecha_venta)
-            ),
-            p75_por_tienda AS (
-                SELECT
-                    producto_id,
-                    ubicacion_id,
-                    PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY cantidad_vendida) as p75
-                FROM ventas_diarias_tiendas
-                GROUP BY producto_id, ubicacion_id
-            )
-            SELECT producto_id, AVG(p75) as p75_promedio
-            FROM p75_por_tienda
-            WHERE p75 > 0
-            GROUP BY producto_id
-        """, [cedi_origen, tienda_destino, candidatos_envio_prueba])
-        for ep_row in cursor_ep.fetchall():
-            if ep_row[1] and float(ep_row[1]) > 0:
-                p75_referencia_batch[ep_row[0]] = float(ep_row[1])
+            SELECT DISTINCT ps.tienda_destino_id
+            FROM pedidos_sugeridos ps
+            WHERE ps.cedi_origen_id = %s
+              AND ps.tienda_destino_id != %s
+            LIMIT 10
+        """, [cedi_origen, tienda_destino])
+        tiendas_mismo_cedi = [ep_row[0] for ep_row in cursor_ep.fetchall()]
         cursor_ep.close()
+
+        # P75 (20 días) de cada tienda de referencia desde su snapshot de demanda
+        snapshots_ref = obtener_snapshots_demanda(conn, tiendas_mismo_cedi)
+        for producto_id in candidatos_envio_prueba:
+            p75_tiendas = [
+                demanda.p75_20d
+                for demanda in (snap.get(producto_id) for snap in snapshots_ref.values())
+                if demanda is not None and demanda.p75_20d > 0
+            ]
+            if p75_tiendas:
+                p75_referencia_batch[producto_id] = sum(p75_tiendas) / len(p75_tiendas)
         logger.info(f"📦 Envío prueba batch: {len(candidatos_envio_prueba)} candidatos, {len(p75_referencia_batch)} con P75 referencia ({tienda_destino})")
 
-    # Pre-calcular mediana de P75 por categoría (para envío prueba sin referencia)
-    from collections import defaultdict
-    import statistics as stats_module
-    p75_por_cat: dict = defaultdict(list)
-    for row in rows:
-        cat = (row[3] or '').strip().upper()
-        p75_val = float(row[7])
-        if p75_val > 0 and cat:
-            p75_por_cat[cat].append(p75_val)
-    p75_mediana_cat = {
-        cat: stats_module.median(vals) for cat, vals in p75_por_cat.items() if vals
+    return {
+        'rows': rows,
+        'limites_capacidad': limites_capacidad,
+        'transito_data': transito_data,
+        'p75_referencia_batch': p75_referencia_batch,
     }
-    all_p75_vals = [v for vals in p75_por_cat.values() for v in vals]
-    p75_fallback = stats_module.median(all_p75_vals) if all_p75_vals else 1.0
 
-    productos = []
-    for row in rows:
-        producto_id = row[0]
-        codigo = row[1]
-        descripcion = row[2]
-        categoria = row[3]
-        cuadrante = row[4]
-        unidades_por_bulto = int(row[5]) or 1
-        prom_20d = float(row[6])
-        p75 = float(row[7])
-        stock_tienda = float(row[8])
-        stock_cedi = float(row[9])
-        clase_abc = row[10]
-        venta_30d = float(row[11])
-        sigma_demanda = float(row[12])
-        demanda_maxima = float(row[13])
-        es_generador_trafico = bool(row[14]) if row[14] else False
-        peso_unitario = float(row[15]) if row[15] else None
-
-        # Obtener tránsito para este producto
-        transito_info = transito_data.get(codigo, {'transito_bultos': 0, 'desglose': []})
-        transito_bultos = transito_info['transito_bultos']
-        transito_unidades = transito_bultos * unidades_por_bulto
-
-        # Calcular stock efectivo (stock actual + tránsito)
-        stock_efectivo = stock_tienda + transito_unidades
-
-        # Lógica de envío prueba: Si no ha vendido localmente pero hay stock en CEDI
-        # usar P75 de referencia pre-calculado en batch
-        p75_usado = p75
-        clase_abc_usada = clase_abc if clase_abc else 'D'
-        es_envio_prueba = False
-
-        if p75 == 0 and stock_cedi > 0:
-            p75_ref = p75_referencia_batch.get(producto_id)
-            if p75_ref and p75_ref > 0:
-                p75_usado = p75_ref
-                clase_abc_usada = 'D'  # Conservador para productos nuevos
-                es_envio_prueba = True
-            else:
-                # Sin ventas en ninguna tienda pero con stock en CEDI -> envío prueba
-                # Usar mediana de P75 de la categoría como proxy de demanda
-                cat_norm = (categoria or '').strip().upper()
-                p75_usado = p75_mediana_cat.get(cat_norm, p75_fallback)
-                clase_abc_usada = 'D'
-                es_envio_prueba = True
-
-        # Determinar override de días de cobertura por categoría (perecederos)
-        dias_cobertura_override = None
-        if categoria:
-            cat_norm = categoria.strip().upper()
-            if cat_norm in config_cobertura_categoria:
-                # Usar días de cobertura específicos para esta categoría según clase ABC
-                dias_cobertura_override = config_cobertura_categoria[cat_norm].get(clase_abc_usada)
-
-        # Usar el mismo cálculo estadístico que single-store (calcular_inventario_simple)
-        # Esto garantiza que ambos wizards usen la misma lógica de ROP, SS y MAX
-        # IMPORTANTE: Usar stock_efectivo (stock + tránsito) para calcular SUG correctamente
-        # Si es envío prueba, usar p75_usado (de referencia) y clase D
-        sigma_usada = sigma_demanda
-        if es_envio_prueba and sigma_demanda == 0:
-            sigma_usada = p75_usado * 0.3  # Estimar 30% de variabilidad para productos nuevos
 
-        resultado = calcular_inventario_simple(
-            demanda_p75=p75_usado,  # ← Usar P75 de referencia si es envío prueba
-            sigma_demanda=sigma_usada,
-            demanda_maxima=demanda_maxima if demanda_maxima > 0 else p75_usado * 2,
-            unidades_por_bulto=unidades_por_bulto,
-            stock_actual=stock_efectivo,  # ← CAMBIO: usar stock efectivo (stock + tránsito)
-            stock_cedi=stock_cedi,
-            clase_abc=clase_abc_usada,  # ← Usar clase D si es envío prueba
-            es_generador_trafico=es_generador_trafico,
-            dias_cobertura_override=dias_cobertura_override,
-            config_tienda=config_tienda_abc  # Thread-safe: pasar config explícitamente
-        )
-
-        # Extraer valores del resultado estadístico (en unidades)
-        punto_reorden_unid = resultado.punto_reorden_unid
-        stock_maximo_unid = resultado.stock_maximo_unid
-        stock_seguridad_unid = resultado.stock_seguridad_unid
-        cantidad_sugerida_unid = resultado.cantidad_sugerida_unid
-        cantidad_sugerida_bultos = resultado.cantidad_sugerida_bultos
-        tiene_sobrestock = resultado.tiene_sobrestock
-
-        # Calcular días de stock usando stock efectivo (incluye tránsito)
-        # Si es envío prueba, usar p75_usado para el cálculo de días
-        if p75_usado > 0:
-            dias_stock = stock_efectivo / p75_usado  # ← CAMBIO: usar stock efectivo y p75_usado
-            dias_ss = stock_seguridad_unid / p75_usado
-            dias_rop = punto_reorden_unid / p75_usado
-            dias_max = stock_maximo_unid / p75_usado
-        else:
-            dias_stock = 999 if stock_efectivo > 0 else 0
-            dias_ss = 0
-            dias_rop = 0
-            dias_max = 0
-
-        # Determinar si necesita reposición usando el cálculo estadístico
-        # Similar a single-store: sugiere si hay cantidad > 0 y hay stock en CEDI
-        necesita_reposicion = (
-            cantidad_sugerida_bultos > 0 and
-            stock_cedi > 0 and
-            not tiene_sobrestock
-        )
+def obtener_productos_tienda(
+    conn,
+    cedi_origen: str,
+    tienda_destino: str,
+    dias_cobertura: int = 3,
+    filtros: Optional[Dict[str, Any]] = None,
+    config_tienda_abc: Optional[ConfigTiendaABC] = None,
+    config_cobertura_categoria: Optional[Dict[str, Dict[str, int]]] = None
+) -> List[Dict]:
+    """
+    Obtiene TODOS los productos para una tienda, marcando cuáles necesitan reposición.
 
-        # Si no necesita reposición, forzar cantidades a 0
-        # Excepción: envío prueba garantiza mínimo 1 bulto
-        if not necesita_reposicion:
-            if es_envio_prueba and not tiene_sobrestock and stock_cedi > 0:
-                cantidad_sugerida_bultos = 1
-                cantidad_sugerida_unid = float(unidades_por_bulto)
-            else:
-                cantidad_sugerida_unid = 0
-                cantidad_sugerida_bultos = 0
-
-        # Aplicar límites de inventario (igual que single-store)
-        # Orden: 1) Mínimo exhibición, 2) Capacidad máxima
-        limite_info = limites_capacidad.get(codigo)
-        if limite_info and not tiene_sobrestock:
-            # 1. MÍNIMO DE EXHIBICIÓN: elevar cantidad si es necesario para exhibición
-            minimo_exhibicion = limite_info.get('minimo_exhibicion')
-            if minimo_exhibicion and minimo_exhibicion > 0:
-                # Calcular cuántas unidades necesitamos para alcanzar el mínimo de exhibición
-                unidades_necesarias_exhibicion = max(0, minimo_exhibicion - stock_tienda)
-
-                if unidades_necesarias_exhibicion > cantidad_sugerida_unid:
-                    cantidad_antes_minimo = cantidad_sugerida_unid
-                    cantidad_sugerida_unid = unidades_necesarias_exhibicion
-                    cantidad_sugerida_bultos = math.ceil(unidades_necesarias_exhibicion / unidades_por_bulto) if unidades_por_bulto > 0 else 0
-
-                    logger.info(
-                        f"📊 {codigo} ({tienda_destino}): Elevado por mínimo exhibición. "
-                        f"Original: {cantidad_antes_minimo:.0f} → Elevado: {cantidad_sugerida_unid:.0f} unid "
-                        f"(Mín exhibición: {minimo_exhibicion:.0f}, Stock: {stock_tienda:.0f})"
-                    )
+    LÓGICA:
+    - Retorna todos los productos que tienen ventas, stock en tienda o stock en CEDI
+    - Marca como 'es_sugerido=True' los que están por debajo del ROP (necesitan reposición)
+    - Marca como 'es_sugerido=False' los que están bien abastecidos (para revisión manual)
 
-            # 2. CAPACIDAD MÁXIMA: no exceder el espacio disponible
-            capacidad_maxima = limite_info.get('capacidad_maxima')
-            if capacidad_maxima and capacidad_maxima > 0:
-                # Espacio disponible = capacidad máxima - stock actual
-                espacio_disponible = max(0, capacidad_maxima - stock_tienda)
-
-                # Si la cantidad sugerida excede el espacio disponible, ajustar
-                if cantidad_sugerida_unid > espacio_disponible:
-                    cantidad_antes_cap = cantidad_sugerida_unid
-                    cantidad_sugerida_unid = espacio_disponible
-                    cantidad_sugerida_bultos = math.ceil(espacio_disponible / unidades_por_bulto) if unidades_por_bulto > 0 else 0
-
-                    tipo_restriccion = limite_info.get('tipo_restriccion', 'espacio_fisico')
-                    logger.info(
-                        f"⚠️ {codigo} ({tienda_destino}): Ajustado por capacidad de {tipo_restriccion}. "
-                        f"Original: {cantidad_antes_cap:.0f} → Ajustado: {cantidad_sugerida_unid:.0f} unid "
-                        f"(Cap. máx: {capacidad_maxima:.0f}, Stock: {stock_tienda:.0f}, Disponible: {espacio_disponible:.0f})"
-                    )
+    Esto permite al usuario:
+    - Ver productos sugeridos automáticamente
+    - Buscar productos no sugeridos y agregarlos manualmente si lo considera necesario
 
-        # Incluir TODOS los productos (sugeridos y no sugeridos)
-        productos.append({
-            'producto_id': producto_id,
-            'codigo_producto': codigo,
-            'descripcion_producto': descripcion,
-            'categoria': categoria,
-            'cuadrante': cuadrante,
-            'clasificacion_abc': clase_abc,
-            'unidades_por_bulto': unidades_por_bulto,
-            'prom_p75_unid': p75,
-            'prom_20dias_unid': prom_20d,
-            'stock_tienda': stock_tienda,
-            'stock_cedi_origen': stock_cedi,
-            'dias_stock': round(dias_stock, 2),
-            # Niveles en DÍAS (como single-store)
-            'dias_ss': round(dias_ss, 1),
-            'dias_rop': round(dias_rop, 1),
-            'dias_max': round(dias_max, 1),
-            # También incluir en unidades por si se necesita
-            'stock_seguridad_unid': stock_seguridad_unid,
-            'punto_reorden_unid': punto_reorden_unid,
-            'stock_maximo_unid': stock_maximo_unid,
-            'cantidad_necesaria_unid': cantidad_sugerida_unid,
-            'cantidad_sugerida_bultos': int(cantidad_sugerida_bultos),
-            'cantidad_sugerida_unid': cantidad_sugerida_unid,
-            'es_sugerido': necesita_reposicion,
-            # Tránsito (ya calculado antes del loop)
-            'transito_bultos': transito_bultos,
-            'transito_desglose': transito_info['desglose'],
-            # Peso
-            'peso_kg': peso_unitario,
-        })
+    Niveles de stock por ABC:
+    - SS (Stock Seguridad): A=1.5d, B=2d, C=3d, D=4d
+    - ROP (Punto Reorden): A=3d, B=4d, C=6d, D=8d
+    - MAX (Stock Máximo): A=5d, B=8d, C=12d, D=15d
+    """
+    datos_tienda = cargar_datos_tienda(conn, cedi_origen, tienda_destino, filtros)
+    if config_cobertura_categoria is None:
+        config_cobertura_categoria = cargar_config_cobertura_categoria(conn)
 
-    return productos
+    return calcular_productos_tienda(
+        datos_tienda,
+        tienda_destino,
+        config_cobertura_categoria,
+        config_tienda_abc=config_tienda_abc
+    )
 
 
 # =====================================================================================
 # CEDI CARACAS: Cálculo de productos usando demanda regional agregada
 # =====================================================================================
 
-async def obtener_productos_cedi_caracas(
+def obtener_productos_cedi_caracas(
     conn,
     cedi_origen: str,
     dias_cobertura: int = 3,
@@ -715,43 +522,16 @@ async def obtener_productos_cedi_caracas(
 
     logger.info(f"📍 CEDI Caracas multi-tienda: {len(tiendas_region)} tiendas en región CARACAS")
 
-    # 2. Query principal: demanda regional + stock CEDI Caracas + stock CEDI origen
+    # 2. Demanda regional (suma de P75 por tienda) desde los snapshots de demanda
+    demanda_regional = {
+        producto_id: demanda
+        for producto_id, demanda in agregar_demanda_regional(obtener_snapshots_demanda(conn, tiendas_ids)).items()
+        if demanda['p75_regional'] > 0
+    }
+
+    # 3. Query principal: productos con demanda regional + stock CEDI Caracas + stock CEDI origen
     query = """
-        WITH ventas_30d AS (
-            SELECT
-                producto_id,
-                ubicacion_id,
-                fecha_venta::date as fecha,
-                SUM(cantidad_vendida) as cantidad_dia
-            FROM ventas
-            WHERE ubicacion_id = ANY(%(tiendas_ids)s)
-              AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-              AND fecha_venta < CURRENT_DATE
-              AND NOT (ubicacion_id = 'tienda_18' AND fecha_venta::date = '2025-12-06')
-            GROUP BY producto_id, ubicacion_id, fecha_venta::date
-        ),
-        p75_por_tienda AS (
-            SELECT
-                producto_id,
-                ubicacion_id,
-                PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY cantidad_dia) as p75_tienda,
-                STDDEV(cantidad_dia) as sigma_tienda,
-                MAX(cantidad_dia) as max_tienda
-            FROM ventas_30d
-            GROUP BY producto_id, ubicacion_id
-        ),
-        demanda_regional AS (
-            SELECT
-                producto_id,
-                SUM(COALESCE(p75_tienda, 0)) as p75_regional,
-                SQRT(SUM(COALESCE(sigma_tienda * sigma_tienda, 0))) as sigma_regional,
-                SUM(COALESCE(max_tienda, 0)) as demanda_maxima_regional,
-                COUNT(DISTINCT ubicacion_id) as num_tiendas
-            FROM p75_por_tienda
-            GROUP BY producto_id
-            HAVING SUM(COALESCE(p75_tienda, 0)) > 0
-        ),
-        stock_cedi_caracas AS (
+        WITH stock_cedi_caracas AS (
             SELECT producto_id, SUM(cantidad) as stock
             FROM inventario_actual
             WHERE ubicacion_id = 'cedi_caracas'
@@ -823,10 +603,6 @@ async def obtener_productos_cedi_caracas(
             p.categoria,
             p.cuadrante,
             COALESCE(p.unidades_por_bulto, 1) as unidades_por_bulto,
-            COALESCE(dr.p75_regional, 0) as p75_regional,
-            COALESCE(dr.sigma_regional, dr.p75_regional * 0.3) as sigma_regional,
-            COALESCE(dr.demanda_maxima_regional, 0) as demanda_maxima_regional,
-            COALESCE(dr.num_tiendas, 0) as num_tiendas,
             COALESCE(scc.stock, 0) as stock_cedi_caracas,
             COALESCE(sco.stock, 0) as stock_cedi_origen,
             COALESCE(str.stock_total, 0) as stock_tiendas_region,
@@ -835,18 +611,19 @@ async def obtener_productos_cedi_caracas(
             p.peso_unitario,
             COALESCE(abc_cedi.clase_abc_cedi, 'D') as clase_abc
         FROM productos p
-        INNER JOIN demanda_regional dr ON p.id = dr.producto_id
         LEFT JOIN stock_cedi_caracas scc ON p.id = scc.producto_id
         LEFT JOIN stock_cedi_origen sco ON p.id = sco.producto_id
         LEFT JOIN stock_tiendas_region str ON p.id = str.producto_id
         LEFT JOIN abc_cedi_ccs abc_cedi ON p.id = abc_cedi.producto_id
         WHERE p.activo = true
           AND p.cedi_origen_id = %(cedi_origen)s
+          AND p.id = ANY(%(con_demanda)s)
     """
 
     params: Dict[str, Any] = {
         'tiendas_ids': tiendas_ids,
         'cedi_origen': cedi_origen,
+        'con_demanda': list(demanda_regional),
     }
 
     # Filtro de cuadrantes
@@ -854,13 +631,19 @@ async def obtener_productos_cedi_caracas(
         query += " AND p.cuadrante = ANY(%(cuadrantes)s)"
         params['cuadrantes'] = filtros['cuadrantes']
 
-    query += " ORDER BY COALESCE(dr.p75_regional, 0) DESC"
-
     cursor.execute(query, params)
-    rows = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-
-    # 3. Cargar configuración de cobertura por categoría (perecederos)
+    columns = [desc[0] for desc in cursor.description] + [
+        'p75_regional', 'sigma_regional', 'demanda_maxima_regional', 'num_tiendas'
+    ]
+    rows = []
+    for row in cursor.fetchall():
+        dr = demanda_regional[row[0]]
+        rows.append(row + (
+            dr['p75_regional'], dr['sigma_regional'], dr['demanda_maxima_regional'], dr['num_tiendas']
+        ))
+    rows.sort(key=lambda r: r[-4], reverse=True)  # ORDER BY p75_regional DESC
+
+    # 4. Cargar configuración de cobertura por categoría (perecederos)
     config_cobertura_categoria = {}
     try:
         cursor.execute("""
@@ -882,7 +665,7 @@ async def obtener_productos_cedi_caracas(
 
     cursor.close()
 
-    # 4. Calcular productos
+    # 5. Calcular productos
     productos = []
     for row in rows:
         row_dict = dict(zip(columns, row))
@@ -1018,61 +801,89 @@ def _calcular_cedi_caracas_worker(
     """Worker para CEDI Caracas: calcula demanda regional en thread separado."""
     _ts = _time.time()
     with get_db_connection_resilient() as thread_conn:
-        loop = asyncio.new_event_loop()
-        config = loop.run_until_complete(
-            cargar_config_tienda(thread_conn, 'cedi_caracas', set_global=False)
-        )
-        productos = loop.run_until_complete(
-            obtener_productos_cedi_caracas(
-                thread_conn,
-                cedi_origen,
-                dias_cobertura,
-                filtros=filtros,
-                config_tienda_abc=config
-            )
+        config = cargar_config_tienda(thread_conn, 'cedi_caracas', set_global=False)
+        productos = obtener_productos_cedi_caracas(
+            thread_conn,
+            cedi_origen,
+            dias_cobertura,
+            filtros=filtros,
+            config_tienda_abc=config
         )
-        loop.close()
     logger.info(f"⏱️ CEDI Caracas worker ({cedi_origen}): {len(productos)} productos en {_time.time()-_ts:.1f}s")
     return ('cedi_caracas', productos)
 
 
 # =====================================================================================
-# WORKER: Cálculo por tienda en thread separado (para paralelismo)
+# WORKERS: Carga por tienda (threads, I/O) + cálculo (procesos, CPU)
 # =====================================================================================
 
-def _calcular_tienda_worker(
+def _cargar_tienda_worker(
+    cedi_origen: str,
+    tienda_id: str,
+    filtros: Optional[Dict[str, Any]]
+) -> Tuple[Dict[str, Any], ConfigTiendaABC]:
+    """
+    Worker sincrónico (thread) que carga los datos de una tienda.
+    Cada worker obtiene su propia conexión a BD (thread-safe).
+    """
+    with get_db_connection_resilient() as thread_conn:
+        # Cargar config tienda (sin set global - thread-safe)
+        config = cargar_config_tienda(thread_conn, tienda_id, set_global=False)
+        datos_tienda = cargar_datos_tienda(thread_conn, cedi_origen, tienda_id, filtros)
+    return datos_tienda, config
+
+
+async def _calcular_tienda(
+    io_executor: ThreadPoolExecutor,
     cedi_origen: str,
     tienda_id: str,
-    tienda_nombre: str,
-    dias_cobertura: int,
     filtros: Optional[Dict[str, Any]],
+    config_cobertura_categoria: Dict[str, Dict[str, int]],
     idx: int,
     total: int
-) -> Tuple[str, List[Dict]]:
+) -> Tuple[str, List[Dict], Dict[str, Any]]:
     """
-    Worker sincrónico que calcula productos para una tienda.
-    Cada worker obtiene su propia conexión a BD (thread-safe).
+    Pipeline de una tienda: carga en el thread pool de I/O y cálculo en el
+    executor de cómputo (procesos). Mientras una tienda calcula, las
+    siguientes siguen cargando datos de la BD.
     """
+    loop = asyncio.get_running_loop()
     _ts = _time.time()
-    with get_db_connection_resilient() as thread_conn:
-        # Cargar config tienda (sin set global - thread-safe)
-        loop = asyncio.new_event_loop()
-        config = loop.run_until_complete(
-            cargar_config_tienda(thread_conn, tienda_id, set_global=False)
-        )
-        productos = loop.run_until_complete(
-            obtener_productos_tienda(
-                thread_conn,
-                cedi_origen,
-                tienda_id,
-                dias_cobertura,
-                filtros=filtros,
-                config_tienda_abc=config
-            )
-        )
-        loop.close()
-    logger.info(f"⏱️ Tienda {idx}/{total} {tienda_id}: {len(productos)} productos en {_time.time()-_ts:.1f}s")
-    return (tienda_id, productos)
+    datos_tienda, config = await loop.run_in_executor(
+        io_executor, _cargar_tienda_worker, cedi_origen, tienda_id, filtros
+    )
+    _tc = _time.time()
+    productos = await run_in_compute_executor(
+        calcular_productos_tienda, datos_tienda, tienda_id, config_cobertura_categoria, config
+    )
+    _tf = _time.time()
+
+    tiempos = {
+        'carga_datos_ms': round((_tc - _ts) * 1000, 1),
+        'calculo_ms': round((_tf - _tc) * 1000, 1),
+        'productos': len(productos),
+    }
+    logger.info(
+        f"⏱️ Tienda {idx}/{total} {tienda_id}: {len(productos)} productos en {_tf-_ts:.1f}s "
+        f"(carga {_tc-_ts:.1f}s, cálculo {_tf-_tc:.1f}s)"
+    )
+    return tienda_id, productos, tiempos
+
+
+def _cargar_contexto_calculo(conn, cedi_origen: str) -> Tuple[str, ConfigDPDU, Dict[str, Dict[str, int]]]:
+    """
+    Carga (una vez por request) los datos compartidos por todas las tiendas:
+    nombre del CEDI, config DPD+U y config de cobertura por categoría.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT nombre FROM ubicaciones WHERE id = %s", (cedi_origen,))
+    cedi_row = cursor.fetchone()
+    cedi_nombre = cedi_row[0] if cedi_row else cedi_origen
+    cursor.close()
+
+    config_dpdu = obtener_config_dpdu(conn)
+    config_cobertura_categoria = cargar_config_cobertura_categoria(conn)
+    return cedi_nombre, config_dpdu, config_cobertura_categoria
 
 
 # =====================================================================================
@@ -1096,60 +907,56 @@ async def calcular_pedidos_multitienda(
     El paso 2 (resolución de conflictos) en el frontend solo aparece si:
     - Hay más de 1 tienda seleccionada
     - Existen conflictos de stock
+
+    La respuesta incluye 'tiempos_etapas' (ms por etapa y por tienda).
     """
     try:
-        # Obtener nombre del CEDI
-        cursor = conn.cursor()
-        cursor.execute("SELECT nombre FROM ubicaciones WHERE id = %s", (request.cedi_origen,))
-        cedi_row = cursor.fetchone()
-        cedi_nombre = cedi_row[0] if cedi_row else request.cedi_origen
-        cursor.close()
+        _t0 = _time.time()
 
-        # Obtener configuración DPD+U
-        config_dpdu = await obtener_config_dpdu(conn)
+        # Snapshot compartido (read-only) para todas las tiendas:
+        # nombre CEDI, configuración DPD+U y cobertura por categoría
+        cedi_nombre, config_dpdu, config_cobertura_categoria = await run_in_db_executor(
+            _cargar_contexto_calculo, conn, request.cedi_origen
+        )
+        _t_contexto = _time.time()
 
         # Calcular productos para cada tienda EN PARALELO
-        # Cada tienda se procesa en un thread separado con su propia conexión a BD
-        _t0 = _time.time()
+        # - Carga (psycopg2, I/O): threads con su propia conexión a BD
+        # - Cálculo por producto (CPU): executor de procesos, escala con cores
         total_tiendas = len(request.tiendas_destino)
         filtros = {'cuadrantes': cuadrantes} if cuadrantes else None
 
-        # Usar ThreadPoolExecutor para paralelizar (psycopg2 es sync, funciona en threads)
         # max_workers=6 para no saturar las conexiones de BD
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor(max_workers=min(6, total_tiendas)) as executor:
-            futures = [
-                loop.run_in_executor(
-                    executor,
-                    _calcular_tienda_worker,
+        with ThreadPoolExecutor(max_workers=min(6, total_tiendas), thread_name_prefix="multitienda-io") as io_executor:
+            results = await asyncio.gather(*[
+                _calcular_tienda(
+                    io_executor,
                     request.cedi_origen,
                     tienda.tienda_id,
-                    tienda.tienda_nombre,
-                    request.dias_cobertura,
                     filtros,
+                    config_cobertura_categoria,
                     i + 1,
                     total_tiendas
                 )
                 for i, tienda in enumerate(request.tiendas_destino)
-            ]
-            results = await asyncio.gather(*futures)
+            ])
 
-        productos_por_tienda: Dict[str, List[Dict]] = dict(results)
-        logger.info(f"⏱️ Total cálculo tiendas (paralelo): {_time.time()-_t0:.1f}s | {total_tiendas} tiendas")
+        productos_por_tienda: Dict[str, List[Dict]] = {tienda_id: productos for tienda_id, productos, _ in results}
+        tiempos_por_tienda: Dict[str, Dict[str, Any]] = {tienda_id: tiempos for tienda_id, _, tiempos in results}
+        _t_tiendas = _time.time()
+        logger.info(f"⏱️ Total cálculo tiendas (paralelo, cómputo={get_compute_mode()}): {_t_tiendas-_t_contexto:.1f}s | {total_tiendas} tiendas")
 
         # Si se incluye CEDI Caracas, calcular su demanda regional
         incluir_cedi_ccs = request.incluir_cedi_caracas
+        _t_ccs = _time.time()
         if incluir_cedi_ccs:
-            _t_ccs = _time.time()
-            # Ejecutar en thread separado (igual que tiendas) para evitar
-            # conflicto con el event loop de FastAPI
-            cedi_ccs_id, cedi_ccs_productos = await loop.run_in_executor(
-                None,  # default executor
+            cedi_ccs_id, cedi_ccs_productos = await run_in_db_executor(
                 _calcular_cedi_caracas_worker,
                 request.cedi_origen, request.dias_cobertura, filtros
             )
             productos_por_tienda[cedi_ccs_id] = cedi_ccs_productos
             logger.info(f"⏱️ CEDI Caracas incluido: {len(cedi_ccs_productos)} productos en {_time.time()-_t_ccs:.1f}s")
+        _t_ccs_fin = _time.time()
 
         # Consolidar todos los productos únicos
         _tc = _time.time()
@@ -1187,10 +994,11 @@ async def calcular_pedidos_multitienda(
 
         logger.info(f"⏱️ Consolidación: {len(todos_productos)} productos únicos en {_time.time()-_tc:.1f}s")
 
-        # Detectar conflictos y aplicar DPD+U
+        # Detectar conflictos y aplicar DPD+U (todos los productos en un solo batch)
         _td = _time.time()
         conflictos = []
         productos_sin_conflicto = 0
+        candidatos = []  # (codigo, prod_data, datos_tiendas, necesidad_total)
 
         for codigo, prod_data in todos_productos.items():
             stock_cedi = prod_data['stock_cedi']
@@ -1230,54 +1038,61 @@ async def calcular_pedidos_multitienda(
                     productos_sin_conflicto += 1
                     continue
 
-                # Aplicar DPD+U
-                asignaciones = calcular_distribucion_dpdu(
-                    stock_cedi=stock_cedi,
-                    unidades_por_bulto=prod_data['unidades_por_bulto'],
-                    datos_tiendas=datos_tiendas,
-                    config=config_dpdu
-                )
-
-                # Crear distribución DPD+U con datos de tránsito
-                distribucion_con_transito = []
-                for a in asignaciones:
-                    tienda_data = tiendas_data.get(a.tienda_id, {})
-                    distribucion_con_transito.append(AsignacionTiendaResponse(
-                        tienda_id=a.tienda_id,
-                        tienda_nombre=a.tienda_nombre,
-                        abc=tienda_data.get('clasificacion_abc', 'D'),  # ABC específico de esta tienda
-                        demanda_p75=a.demanda_p75,
-                        stock_actual=a.stock_actual,
-                        dias_stock=a.dias_stock,
-                        cantidad_necesaria=a.cantidad_necesaria,
-                        transito_bultos=tienda_data.get('transito_bultos', 0),
-                        transito_desglose=tienda_data.get('transito_desglose'),
-                        urgencia=a.urgencia,
-                        pct_demanda=a.pct_demanda,
-                        pct_urgencia=a.pct_urgencia,
-                        peso_final=a.peso_final,
-                        cantidad_asignada_unid=a.cantidad_asignada_unid,
-                        cantidad_asignada_bultos=a.cantidad_asignada_bultos,
-                        deficit_vs_necesidad=a.deficit_vs_necesidad,
-                        cobertura_dias_resultante=a.cobertura_dias_resultante
-                    ))
-
-                conflictos.append(ConflictoProductoResponse(
-                    codigo_producto=codigo,
-                    descripcion_producto=prod_data['descripcion_producto'],
-                    categoria=prod_data['categoria'],
-                    clasificacion_abc=prod_data['clasificacion_abc'],
-                    unidades_por_bulto=prod_data['unidades_por_bulto'],
-                    stock_cedi_disponible=stock_cedi,
-                    stock_cedi_bultos=math.floor(stock_cedi / prod_data['unidades_por_bulto']),
-                    demanda_total_tiendas=sum(d.demanda_p75 for d in datos_tiendas),
-                    necesidad_total_tiendas=necesidad_total,
-                    es_conflicto=True,
-                    distribucion_dpdu=distribucion_con_transito
-                ))
+                candidatos.append((codigo, prod_data, datos_tiendas, necesidad_total))
             else:
                 productos_sin_conflicto += 1
 
+        # Aplicar DPD+U a todos los conflictos (matriz productos x tiendas)
+        distribucion = calcular_distribucion_dpdu_batch(
+            stocks_cedi=[c[1]['stock_cedi'] for c in candidatos],
+            unidades_por_bulto=[c[1]['unidades_por_bulto'] for c in candidatos],
+            datos_tiendas=[c[2] for c in candidatos],
+            config=config_dpdu
+        )
+
+        for i, (codigo, prod_data, datos_tiendas, necesidad_total) in enumerate(candidatos):
+            stock_cedi = prod_data['stock_cedi']
+            tiendas_data = prod_data['tiendas']
+            asignaciones = distribucion.asignaciones(i)
+
+            # Crear distribución DPD+U con datos de tránsito
+            distribucion_con_transito = []
+            for a in asignaciones:
+                tienda_data = tiendas_data.get(a.tienda_id, {})
+                distribucion_con_transito.append(AsignacionTiendaResponse(
+                    tienda_id=a.tienda_id,
+                    tienda_nombre=a.tienda_nombre,
+                    abc=tienda_data.get('clasificacion_abc', 'D'),  # ABC específico de esta tienda
+                    demanda_p75=a.demanda_p75,
+                    stock_actual=a.stock_actual,
+                    dias_stock=a.dias_stock,
+                    cantidad_necesaria=a.cantidad_necesaria,
+                    transito_bultos=tienda_data.get('transito_bultos', 0),
+                    transito_desglose=tienda_data.get('transito_desglose'),
+                    urgencia=a.urgencia,
+                    pct_demanda=a.pct_demanda,
+                    pct_urgencia=a.pct_urgencia,
+                    peso_final=a.peso_final,
+                    cantidad_asignada_unid=a.cantidad_asignada_unid,
+                    cantidad_asignada_bultos=a.cantidad_asignada_bultos,
+                    deficit_vs_necesidad=a.deficit_vs_necesidad,
+                    cobertura_dias_resultante=a.cobertura_dias_resultante
+                ))
+
+            conflictos.append(ConflictoProductoResponse(
+                codigo_producto=codigo,
+                descripcion_producto=prod_data['descripcion_producto'],
+                categoria=prod_data['categoria'],
+                clasificacion_abc=prod_data['clasificacion_abc'],
+                unidades_por_bulto=prod_data['unidades_por_bulto'],
+                stock_cedi_disponible=stock_cedi,
+                stock_cedi_bultos=math.floor(stock_cedi / prod_data['unidades_por_bulto']),
+                demanda_total_tiendas=sum(d.demanda_p75 for d in datos_tiendas),
+                necesidad_total_tiendas=necesidad_total,
+                es_conflicto=True,
+                distribucion_dpdu=distribucion_con_transito
+            ))
+
         logger.info(f"⏱️ Detección conflictos: {len(conflictos)} conflictos en {_time.time()-_td:.1f}s")
 
         # Construir pedidos por tienda con cantidades ajustadas
@@ -1428,8 +1243,9 @@ async def calcular_pedidos_multitienda(
         conflictos.sort(key=lambda c: c.stock_cedi_disponible)
 
         total_prods_response = sum(len(p['productos']) for p in pedidos_por_tienda)
-        logger.info(f"⏱️ Ensamblaje pedidos: {total_prods_response} productos en {_time.time()-_te:.1f}s")
-        logger.info(f"⏱️ TOTAL calcular: {_time.time()-_t0:.1f}s | {len(request.tiendas_destino)} tiendas, {len(todos_productos)} productos únicos, {len(conflictos)} conflictos, {total_prods_response} items en respuesta")
+        _t_fin = _time.time()
+        logger.info(f"⏱️ Ensamblaje pedidos: {total_prods_response} productos en {_t_fin-_te:.1f}s")
+        logger.info(f"⏱️ TOTAL calcular: {_t_fin-_t0:.1f}s | {len(request.tiendas_destino)} tiendas, {len(todos_productos)} productos únicos, {len(conflictos)} conflictos, {total_prods_response} items en respuesta")
 
         # Serialize conflictos (Pydantic models) to dicts once
         _ts = _time.time()
@@ -1456,6 +1272,17 @@ async def calcular_pedidos_multitienda(
                 'total_bultos': sum(p['total_bultos'] for p in pedidos_por_tienda),
                 'incluye_cedi_caracas': incluir_cedi_ccs,
             },
+            'tiempos_etapas': {
+                'modo_calculo': get_compute_mode(),
+                'contexto_ms': round((_t_contexto - _t0) * 1000, 1),
+                'tiendas_ms': round((_t_tiendas - _t_contexto) * 1000, 1),
+                'cedi_caracas_ms': round((_t_ccs_fin - _t_ccs) * 1000, 1),
+                'consolidacion_ms': round((_td - _tc) * 1000, 1),
+                'conflictos_dpdu_ms': round((_te - _td) * 1000, 1),
+                'ensamblaje_ms': round((_t_fin - _te) * 1000, 1),
+                'total_ms': round((_t_fin - _t0) * 1000, 1),
+                'por_tienda': tiempos_por_tienda,
+            },
         }
         logger.info(f"⏱️ Serialización: {_time.time()-_ts:.1f}s")
 
@@ -1473,7 +1300,8 @@ async def calcular_pedidos_multitienda(
 # =====================================================================================
 
 @router.post("/guardar-lote", response_model=GuardarMultiTiendaResponse)
-async def guardar_pedidos_lote(
+@db_offload
+def guardar_pedidos_lote(
     request: GuardarMultiTiendaRequest,
     conn: Any = Depends(get_db_write)
 ):
@@ -1482,6 +1310,7 @@ async def guardar_pedidos_lote(
 
     - Genera un grupo_pedido_id para agrupar los pedidos
     - Números de pedido correlacionados: PS-XXXXX-1, PS-XXXXX-2, etc.
+    - Pedidos, detalle e historial se insertan con INSERT multi-fila
     - Rollback automático si falla alguno
     """
     try:
@@ -1490,25 +1319,18 @@ async def guardar_pedidos_lote(
         # Generar ID de grupo
         grupo_id = f"GRUPO-{uuid.uuid4().hex[:8].upper()}"
 
-        # Obtener siguiente número base de pedido
-        cursor.execute("SELECT MAX(numero_pedido) FROM pedidos_sugeridos WHERE numero_pedido LIKE 'PS-%'")
-        ultimo = cursor.fetchone()[0]
-        if ultimo:
-            try:
-                # Extraer número base (puede ser PS-00001 o PS-00001-1)
-                partes = ultimo.replace('PS-', '').split('-')
-                num_base = int(partes[0]) + 1
-            except:
-                num_base = 1
-        else:
-            num_base = 1
+        # Número base del lote (un solo nextval para todos los pedidos)
+        num_base = siguiente_numero_base(cursor)
 
         fecha_pedido = request.fecha_pedido or datetime.now(VENEZUELA_TZ).strftime('%Y-%m-%d')
         pedidos_creados = []
+        filas_pedidos = []
+        filas_detalle = []
+        filas_historial = []
 
         for idx, pedido in enumerate(request.pedidos, 1):
             pedido_id = f"ped_{uuid.uuid4().hex[:12]}"
-            numero_pedido = f"PS-{num_base:05d}-{idx}"
+            numero_pedido = formatear_numero_pedido(num_base, idx)
 
             # Filtrar solo productos incluidos
             productos_incluidos = [p for p in pedido.productos if p.incluido]
@@ -1520,30 +1342,7 @@ async def guardar_pedidos_lote(
             total_bultos = sum(p.cantidad_pedida_bultos for p in productos_incluidos)
             total_unidades = sum(p.cantidad_pedida_unidades for p in productos_incluidos)
 
-            # Insertar pedido
-            cursor.execute("""
-                INSERT INTO pedidos_sugeridos (
-                    id, numero_pedido, version,
-                    cedi_origen_id, cedi_origen_nombre,
-                    tienda_destino_id, tienda_destino_nombre,
-                    fecha_pedido, fecha_creacion,
-                    estado, tipo_pedido, prioridad,
-                    dias_cobertura,
-                    total_productos, total_lineas, total_bultos, total_unidades,
-                    grupo_pedido_id, orden_en_grupo,
-                    usuario_creador
-                ) VALUES (
-                    %s, %s, 1,
-                    %s, %s,
-                    %s, %s,
-                    %s, (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
-                    'borrador', %s, %s,
-                    %s,
-                    %s, %s, %s, %s,
-                    %s, %s,
-                    %s
-                )
-            """, (
+            filas_pedidos.append((
                 pedido_id, numero_pedido,
                 request.cedi_origen_id, request.cedi_origen_nombre,
                 pedido.tienda_destino_id, pedido.tienda_destino_nombre,
@@ -1555,31 +1354,8 @@ async def guardar_pedidos_lote(
                 request.usuario_creador
             ))
 
-            # Insertar detalle de productos
-            for linea_num, prod in enumerate(productos_incluidos, start=1):
-                cursor.execute("""
-                    INSERT INTO pedidos_sugeridos_detalle (
-                        pedido_id, linea_numero, codigo_producto, descripcion_producto,
-                        categoria, clasificacion_abc, cuadrante_producto,
-                        cantidad_bultos, cantidad_sugerida_bultos,
-                        cantidad_pedida_bultos, cantidad_pedida_unidades, total_unidades,
-                        stock_tienda, stock_cedi_origen,
-                        prom_ventas_5dias_unid, prom_ventas_20dias_unid,
-                        prom_p75_unid,
-                        stock_minimo, stock_maximo, punto_reorden,
-                        razon_pedido
-                    ) VALUES (
-                        %s, %s, %s, %s,
-                        %s, %s, %s,
-                        %s, %s,
-                        %s, %s, %s,
-                        %s, %s,
-                        %s, %s,
-                        %s,
-                        %s, %s, %s,
-                        %s
-                    )
-                """, (
+            filas_detalle.extend(
+                (
                     pedido_id, linea_num, prod.codigo_producto, prod.descripcion_producto,
                     prod.categoria, prod.clasificacion_abc, prod.cuadrante,
                     prod.unidades_por_bulto, prod.cantidad_pedida_bultos,
@@ -1589,14 +1365,11 @@ async def guardar_pedidos_lote(
                     prod.prom_p75_unid,
                     prod.stock_minimo, prod.stock_maximo, prod.punto_reorden,
                     prod.razon_ajuste_dpdu if prod.ajustado_por_dpdu else None
-                ))
+                )
+                for linea_num, prod in enumerate(productos_incluidos, start=1)
+            )
 
-            # Insertar en historial
-            cursor.execute("""
-                INSERT INTO pedidos_sugeridos_historial (
-                    pedido_id, estado_anterior, estado_nuevo, motivo_cambio
-                ) VALUES (%s, NULL, 'borrador', 'Pedido creado (multi-tienda)')
-            """, (pedido_id,))
+            filas_historial.append((pedido_id, None, 'borrador', 'Pedido creado (multi-tienda)'))
 
             pedidos_creados.append(PedidoGuardadoInfo(
                 pedido_id=pedido_id,
@@ -1608,6 +1381,37 @@ async def guardar_pedidos_lote(
                 estado='borrador'
             ))
 
+        # Insertar pedidos, detalle e historial del lote (INSERT multi-fila)
+        insertar_filas(cursor, 'pedidos_sugeridos', [
+            'id', 'numero_pedido',
+            'cedi_origen_id', 'cedi_origen_nombre',
+            'tienda_destino_id', 'tienda_destino_nombre',
+            'fecha_pedido',
+            'tipo_pedido', 'prioridad',
+            'dias_cobertura',
+            'total_productos', 'total_lineas', 'total_bultos', 'total_unidades',
+            'grupo_pedido_id', 'orden_en_grupo',
+            'usuario_creador',
+        ], filas_pedidos, valores_fijos={
+            'version': '1',
+            'fecha_creacion': "(CURRENT_TIMESTAMP AT TIME ZONE 'UTC')",
+            'estado': "'borrador'",
+        })
+        insertar_filas(cursor, 'pedidos_sugeridos_detalle', [
+            'pedido_id', 'linea_numero', 'codigo_producto', 'descripcion_producto',
+            'categoria', 'clasificacion_abc', 'cuadrante_producto',
+            'cantidad_bultos', 'cantidad_sugerida_bultos',
+            'cantidad_pedida_bultos', 'cantidad_pedida_unidades', 'total_unidades',
+            'stock_tienda', 'stock_cedi_origen',
+            'prom_ventas_5dias_unid', 'prom_ventas_20dias_unid',
+            'prom_p75_unid',
+            'stock_minimo', 'stock_maximo', 'punto_reorden',
+            'razon_pedido',
+        ], filas_detalle)
+        insertar_filas(cursor, 'pedidos_sugeridos_historial', [
+            'pedido_id', 'estado_anterior', 'estado_nuevo', 'motivo_cambio',
+        ], filas_historial)
+
         conn.commit()
         cursor.close()
 
@@ -1632,10 +1436,11 @@ async def guardar_pedidos_lote(
 # =====================================================================================
 
 @router.get("/config-dpdu", response_model=ConfigDPDUResponse)
-async def get_config_dpdu(conn: Any = Depends(get_db)):
+@db_offload
+def get_config_dpdu(conn: Any = Depends(get_db)):
     """Obtiene la configuración actual del algoritmo DPD+U."""
     try:
-        config = await obtener_config_dpdu(conn)
+        config = obtener_config_dpdu(conn)
         return ConfigDPDUResponse(
             peso_demanda=config.peso_demanda,
             peso_urgencia=config.peso_urgencia,
@@ -1647,20 +1452,22 @@ async def get_config_dpdu(conn: Any = Depends(get_db)):
 
 
 @router.get("/{pedido_id}/exportar-excel")
-async def exportar_pedido_excel_multitienda(
+@db_offload
+def exportar_pedido_excel_multitienda(
     pedido_id: str,
+    formato: str = Query("xlsx", description="xlsx (default) | csv"),
     conn: Any = Depends(get_db)
 ):
     """
     Exporta pedido multi-tienda a Excel con columna Cuadrante.
     Similar a single-tienda con indicador de ajustes DPD+U.
+
+    Streaming: cursor server-side + openpyxl write-only (xlsx) o CSV por chunks.
     """
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, Alignment, PatternFill
-        import io
-        from fastapi.responses import Response
+    if formato not in ("xlsx", "csv"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'xlsx' o 'csv'")
 
+    try:
         cursor = conn.cursor()
 
         # Query similar a single-tienda, agregar grupo_pedido_id y razon_pedido
@@ -1678,6 +1485,18 @@ async def exportar_pedido_excel_multitienda(
         numero_pedido, tienda_nombre, cedi_nombre, fecha_pedido, estado, dias_cobertura, grupo_id = pedido_row
 
         cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM pedidos_sugeridos_detalle
+                WHERE pedido_id = %s AND incluido = true
+            )
+        """, [pedido_id])
+        hay_productos = cursor.fetchone()[0]
+        cursor.close()
+
+        if not hay_productos:
+            raise HTTPException(status_code=404, detail="No hay productos")
+
+        query_detalle = """
             SELECT
                 codigo_producto, descripcion_producto, categoria,
                 clasificacion_abc, cuadrante_producto, cantidad_bultos,
@@ -1686,31 +1505,7 @@ async def exportar_pedido_excel_multitienda(
             FROM pedidos_sugeridos_detalle
             WHERE pedido_id = %s AND incluido = true
             ORDER BY clasificacion_abc, descripcion_producto
-        """, [pedido_id])
-
-        rows = cursor.fetchall()
-        cursor.close()
-
-        if not rows:
-            raise HTTPException(status_code=404, detail="No hay productos")
-
-        # Crear Excel (código similar a single-tienda)
-        wb = openpyxl.Workbook()
-        ws = wb.active
-
-        # Título con indicador de grupo
-        ws.merge_cells('A1:K1')
-        titulo = f"Pedido Multi-Tienda: {numero_pedido}"
-        if grupo_id:
-            titulo += f" (Grupo: {grupo_id})"
-        ws['A1'] = titulo
-        ws['A1'].font = Font(bold=True, size=14)
-        ws['A1'].alignment = Alignment(horizontal='center')
-
-        # Info
-        ws.merge_cells('A2:K2')
-        ws['A2'] = f"Tienda: {tienda_nombre} | CEDI: {cedi_nombre} | Fecha: {fecha_pedido}"
-        ws['A2'].alignment = Alignment(horizontal='center')
+        """
 
         # Headers (agregar columna Observación)
         headers = [
@@ -1718,59 +1513,49 @@ async def exportar_pedido_excel_multitienda(
             'Unid/Bulto', 'Stock', 'Sugerido', 'Pedido', 'Total', 'Observación'
         ]
 
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        header_font = Font(bold=True, color='FFFFFF')
-
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=4, column=col_idx, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-
         # Colores ABC
         abc_colors = {'A': 'E8F5E9', 'B': 'FFF9C4', 'C': 'FFE0B2', 'D': 'F5F5F5'}
 
-        # Datos
-        for row_idx, row_data in enumerate(rows, 5):
-            abc = row_data[3] or 'D'
-            razon = row_data[10] or ''
-            observacion = 'Ajustado DPD+U' if 'dpdu' in razon.lower() or 'conflicto' in razon.lower() else ''
-
-            data = [
-                row_data[0], row_data[1], row_data[2], abc,
-                row_data[4] or 'NO ESPECIFICADO',
-                int(row_data[5]) if row_data[5] else 1,
-                float(row_data[6]) if row_data[6] else 0,
-                float(row_data[7]) if row_data[7] else 0,
-                float(row_data[8]) if row_data[8] else 0,
-                float(row_data[9]) if row_data[9] else 0,
-                observacion
-            ]
+        def filas(rows):
+            for row_data in rows:
+                abc = row_data[3] or 'D'
+                razon = row_data[10] or ''
+                observacion = 'Ajustado DPD+U' if 'dpdu' in razon.lower() or 'conflicto' in razon.lower() else ''
+
+                data = [
+                    row_data[0], row_data[1], row_data[2], abc,
+                    row_data[4] or 'NO ESPECIFICADO',
+                    int(row_data[5]) if row_data[5] else 1,
+                    float(row_data[6]) if row_data[6] else 0,
+                    float(row_data[7]) if row_data[7] else 0,
+                    float(row_data[8]) if row_data[8] else 0,
+                    float(row_data[9]) if row_data[9] else 0,
+                    observacion
+                ]
+                yield data, abc_colors.get(abc, 'FFFFFF')
+
+        nombre_archivo = f"{numero_pedido.replace('/', '-')}_multitienda"
+
+        if formato == "csv":
+            rows = iterar_filas_conexion(get_db_connection_resilient, query_detalle, [pedido_id])
+            return respuesta_descarga(
+                generar_csv(headers, (data for data, _ in filas(rows))), "csv", nombre_archivo, cerrar=[rows]
+            )
+
+        # Título con indicador de grupo
+        titulo = f"Pedido Multi-Tienda: {numero_pedido}"
+        if grupo_id:
+            titulo += f" (Grupo: {grupo_id})"
 
-            for col_idx, value in enumerate(data, 1):
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.fill = PatternFill(start_color=abc_colors.get(abc, 'FFFFFF'),
-                                       end_color=abc_colors.get(abc, 'FFFFFF'),
-                                       fill_type='solid')
-                if 6 <= col_idx <= 10:
-                    cell.alignment = Alignment(horizontal='right')
-
-        # Anchos
-        column_widths = [12, 35, 18, 6, 15, 10, 10, 12, 12, 12, 20]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = width
-
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        filename = f"{numero_pedido.replace('/', '-')}_multitienda.xlsx"
-
-        return Response(
-            content=output.read(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        archivo, _ = construir_xlsx(
+            headers,
+            filas(iterar_filas(conn, query_detalle, [pedido_id])),
+            titulo=titulo,
+            subtitulo=f"Tienda: {tienda_nombre} | CEDI: {cedi_nombre} | Fecha: {fecha_pedido}",
+            anchos=[12, 35, 18, 6, 15, 10, 10, 12, 12, 12, 20],
+            columnas_derecha=range(6, 11),
         )
+        return respuesta_descarga(iterar_archivo(archivo), "xlsx", nombre_archivo)
 
     except HTTPException:
         raise
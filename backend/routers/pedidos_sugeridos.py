@@ -40,10 +40,23 @@ from models.pedidos_sugeridos import (
     EstadoLlegada,
     ProductoLlegadaVerificacion,
     VerificarLlegadaResponse,
+    VerificarLlegadaLoteRequest,
+    VerificarLlegadaLoteResponse,
     RegistrarLlegadaRequest,
     RegistrarLlegadaResponse,
 )
-from db_manager import get_db_connection, get_db_connection_write, get_db_connection_resilient
+from db_manager import get_db_connection, get_db_connection_write, get_db_connection_resilient, db_offload
+from services.pedidos_persistencia import formatear_numero_pedido, insertar_filas, siguiente_numero_base
+from services.demanda_snapshot import obtener_snapshot_demanda, obtener_snapshots_demanda
+from services.llegadas_inventario import LlegadaDetectada, obtener_llegadas
+from services.export_stream import (
+    construir_xlsx,
+    generar_csv,
+    iterar_archivo,
+    iterar_filas,
+    iterar_filas_conexion,
+    respuesta_descarga,
+)
 from services.calculo_inventario_abc import (
     calcular_inventario_simple,
     set_config_tienda,
@@ -115,7 +128,8 @@ def to_venezuela_aware(dt: datetime) -> datetime:
 # =====================================================================================
 
 @router.get("/", response_model=List[PedidoSugeridoResumen])
-async def listar_pedidos(
+@db_offload
+def listar_pedidos(
     estado: Optional[str] = None,
     tienda_id: Optional[str] = None,
     conn: Any = Depends(get_db)
@@ -302,7 +316,8 @@ async def crear_pedido(
 
 
 @router.post("/guardar", response_model=PedidoGuardadoResponse)
-async def guardar_pedido(
+@db_offload
+def guardar_pedido(
     request: GuardarPedidoRequest,
     conn: Any = Depends(get_db_write)
 ):
@@ -317,13 +332,7 @@ async def guardar_pedido(
         pedido_id = str(uuid.uuid4())
 
         # Generar número de pedido
-        cursor.execute("SELECT MAX(numero_pedido) FROM pedidos_sugeridos WHERE numero_pedido LIKE 'PS-%%'")
-        result = cursor.fetchone()
-        if result and result[0]:
-            ultimo = int(result[0].split('-')[1])
-            numero_pedido = f"PS-{ultimo + 1:05d}"
-        else:
-            numero_pedido = "PS-00001"
+        numero_pedido = formatear_numero_pedido(siguiente_numero_base(cursor))
 
         # Filtrar productos incluidos
         productos_incluidos = [p for p in request.productos if p.incluido]
@@ -369,26 +378,22 @@ async def guardar_pedido(
             "sistema"
         ])
 
-        # Insertar detalle de productos a RECIBIR
-        for idx, producto in enumerate(productos_incluidos):
-            detalle_id = str(uuid.uuid4())
-            cursor.execute("""
-                INSERT INTO pedidos_sugeridos_detalle (
-                    id, pedido_id, linea_numero,
-                    codigo_producto, codigo_barras, descripcion_producto,
-                    categoria, grupo, subgrupo, marca, modelo, presentacion,
-                    cuadrante_producto, cantidad_bultos,
-                    cantidad_sugerida_unidades, cantidad_sugerida_bultos,
-                    cantidad_pedida_unidades, cantidad_pedida_bultos,
-                    total_unidades,
-                    prom_ventas_5dias_unid, prom_ventas_8sem_unid,
-                    stock_tienda, stock_cedi_origen,
-                    stock_minimo, stock_maximo, punto_reorden,
-                    razon_pedido, incluido, observaciones,
-                    fecha_creacion
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-            """, [
-                detalle_id, pedido_id, idx + 1,
+        # Insertar detalle de productos a RECIBIR (INSERT multi-fila)
+        insertar_filas(cursor, 'pedidos_sugeridos_detalle', [
+            'id', 'pedido_id', 'linea_numero',
+            'codigo_producto', 'codigo_barras', 'descripcion_producto',
+            'categoria', 'grupo', 'subgrupo', 'marca', 'modelo', 'presentacion',
+            'cuadrante_producto', 'cantidad_bultos',
+            'cantidad_sugerida_unidades', 'cantidad_sugerida_bultos',
+            'cantidad_pedida_unidades', 'cantidad_pedida_bultos',
+            'total_unidades',
+            'prom_ventas_5dias_unid', 'prom_ventas_8sem_unid',
+            'stock_tienda', 'stock_cedi_origen',
+            'stock_minimo', 'stock_maximo', 'punto_reorden',
+            'razon_pedido', 'incluido', 'observaciones',
+        ], [
+            (
+                str(uuid.uuid4()), pedido_id, idx + 1,
                 producto.codigo_producto, producto.codigo_barras, producto.descripcion_producto,
                 producto.categoria, producto.grupo, producto.subgrupo,
                 producto.marca, producto.modelo, producto.presentacion,
@@ -400,29 +405,27 @@ async def guardar_pedido(
                 float(producto.stock_tienda), float(producto.stock_cedi_origen),
                 float(producto.stock_minimo), float(producto.stock_maximo), float(producto.punto_reorden),
                 producto.razon_pedido, producto.incluido, producto.observaciones
-            ])
-
-        # Insertar devoluciones
-        for idx, devolucion in enumerate(devoluciones_incluidas):
-            devolucion_id = str(uuid.uuid4())
-            cursor.execute("""
-                INSERT INTO pedidos_sugeridos_devoluciones (
-                    id, pedido_id, linea_numero,
-                    codigo_producto, codigo_barras, descripcion_producto,
-                    categoria, grupo, subgrupo, marca, presentacion,
-                    cuadrante_producto, cantidad_bultos,
-                    stock_actual_tienda, stock_maximo, stock_optimo,
-                    exceso_unidades, exceso_bultos,
-                    devolucion_sugerida_unidades, devolucion_sugerida_bultos,
-                    devolucion_confirmada_unidades, devolucion_confirmada_bultos,
-                    total_unidades_devolver,
-                    razon_devolucion, prioridad_devolucion,
-                    dias_sin_venta, prom_ventas_30dias, dias_cobertura_actual,
-                    incluido, observaciones,
-                    fecha_creacion
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-            """, [
-                devolucion_id, pedido_id, idx + 1,
+            )
+            for idx, producto in enumerate(productos_incluidos)
+        ], valores_fijos={'fecha_creacion': 'CURRENT_TIMESTAMP'})
+
+        # Insertar devoluciones (INSERT multi-fila)
+        insertar_filas(cursor, 'pedidos_sugeridos_devoluciones', [
+            'id', 'pedido_id', 'linea_numero',
+            'codigo_producto', 'codigo_barras', 'descripcion_producto',
+            'categoria', 'grupo', 'subgrupo', 'marca', 'presentacion',
+            'cuadrante_producto', 'cantidad_bultos',
+            'stock_actual_tienda', 'stock_maximo', 'stock_optimo',
+            'exceso_unidades', 'exceso_bultos',
+            'devolucion_sugerida_unidades', 'devolucion_sugerida_bultos',
+            'devolucion_confirmada_unidades', 'devolucion_confirmada_bultos',
+            'total_unidades_devolver',
+            'razon_devolucion', 'prioridad_devolucion',
+            'dias_sin_venta', 'prom_ventas_30dias', 'dias_cobertura_actual',
+            'incluido', 'observaciones',
+        ], [
+            (
+                str(uuid.uuid4()), pedido_id, idx + 1,
                 devolucion.codigo_producto, devolucion.codigo_barras, devolucion.descripcion_producto,
                 devolucion.categoria, devolucion.grupo, devolucion.subgrupo,
                 devolucion.marca, devolucion.presentacion,
@@ -438,7 +441,9 @@ async def guardar_pedido(
                 float(devolucion.prom_ventas_30dias) if devolucion.prom_ventas_30dias else None,
                 float(devolucion.dias_cobertura_actual) if devolucion.dias_cobertura_actual else None,
                 devolucion.incluido, devolucion.observaciones
-            ])
+            )
+            for idx, devolucion in enumerate(devoluciones_incluidas)
+        ], valores_fijos={'fecha_creacion': 'CURRENT_TIMESTAMP'})
 
         # Registrar en historial
         historial_id = str(uuid.uuid4())
@@ -481,7 +486,8 @@ async def guardar_pedido(
 # =====================================================================================
 
 @router.get("/{pedido_id}", response_model=PedidoSugeridoCompleto)
-async def obtener_pedido(
+@db_offload
+def obtener_pedido(
     pedido_id: str,
     conn: Any = Depends(get_db)
 ):
@@ -626,7 +632,8 @@ async def obtener_pedido(
 # =====================================================================================
 
 @router.delete("/{pedido_id}")
-async def eliminar_pedido(
+@db_offload
+def eliminar_pedido(
     pedido_id: str,
     conn: Any = Depends(get_db_write)
 ):
@@ -693,7 +700,8 @@ async def eliminar_pedido(
 # =====================================================================================
 
 @router.post("/{pedido_id}/enviar-aprobacion")
-async def enviar_para_aprobacion(
+@db_offload
+def enviar_para_aprobacion(
     pedido_id: str,
     conn: Any = Depends(get_db_write)
 ):
@@ -771,7 +779,8 @@ async def enviar_para_aprobacion(
 # =====================================================================================
 
 @router.post("/{pedido_id}/aprobar")
-async def aprobar_pedido(
+@db_offload
+def aprobar_pedido(
     pedido_id: str,
     comentario_general: Optional[str] = None,
     conn: Any = Depends(get_db_write)
@@ -852,7 +861,8 @@ async def aprobar_pedido(
 # =====================================================================================
 
 @router.post("/{pedido_id}/rechazar")
-async def rechazar_pedido(
+@db_offload
+def rechazar_pedido(
     pedido_id: str,
     motivo: str,
     conn: Any = Depends(get_db_write)
@@ -933,7 +943,8 @@ async def rechazar_pedido(
 # =====================================================================================
 
 @router.get("/debug/schema")
-async def get_table_schema(conn: Any = Depends(get_db)):
+@db_offload
+def get_table_schema(conn: Any = Depends(get_db)):
     """
     Endpoint temporal para inspeccionar el esquema de la tabla pedidos_sugeridos
     """
@@ -1087,7 +1098,8 @@ class ProductoCalculado(BaseModel):
 
 
 @router.post("/calcular", response_model=List[ProductoCalculado])
-async def calcular_productos_sugeridos(
+@db_offload
+def calcular_productos_sugeridos(
     request: CalcularProductosRequest,
     cuadrantes: Optional[List[str]] = Query(None, description="Filtrar por cuadrantes"),
     conn: Any = Depends(get_db)
@@ -1244,97 +1256,33 @@ async def calcular_productos_sugeridos(
 
         logger.info(f"📍 Región: {tienda_region}, Tiendas referencia: {[t[1] for t in tiendas_referencia]}")
 
-        # 3. Query principal para calcular productos sugeridos desde PostgreSQL
-        # NOTA: Esta consulta está diseñada para funcionar con tiendas nuevas que tienen
-        # pocos días de historial. Si hay menos de 20 días, usa los datos disponibles.
-        # NUEVO: Incluye P75 de tiendas de referencia para productos sin ventas locales.
+        # 3. Demanda desde los snapshots en memoria (tienda destino + tiendas de referencia)
+        # Solo consultan `ventas` la primera vez después de cada corrida del ETL de ventas.
+        # NOTA: Para tienda_18 (PARAISO) el snapshot excluye 2025-12-06 (inauguración con ventas atípicas)
+        snapshot_tienda = obtener_snapshot_demanda(conn, request.tienda_destino)
+        snapshots_referencia = obtener_snapshots_demanda(conn, tiendas_ref_ids)
+        productos_con_venta = [pid for pid, d in snapshot_tienda.productos.items() if d.total_20d > 0]
+
+        # P75 de tiendas de referencia (misma región, 30 días) para productos SIN ventas locales
+        # Esto permite sugerir "envíos de prueba" basados en demanda de tiendas similares
+        p75_referencia: dict = {}  # {producto_id: (p75_ref, tiendas_con_venta)}
+        for tienda_ref_id in sorted(snapshots_referencia):
+            for producto_id, demanda_ref in snapshots_referencia[tienda_ref_id].productos.items():
+                p75_referencia.setdefault(producto_id, []).append((tienda_ref_id, demanda_ref.p75_30d))
+        p75_referencia = {
+            producto_id: (sum(p for _, p in valores) / len(valores), ','.join(t for t, _ in valores))
+            for producto_id, valores in p75_referencia.items()
+        }
+
+        # 3.1 Query principal: maestro de productos + inventario + ABC (la demanda viene del snapshot)
         query = """
-            WITH ventas_diarias_disponibles AS (
-                -- Ventas últimos 30 días (optimizado para tiendas con millones de registros como Bosque)
-                -- IMPORTANTE: Excluir día actual (incompleto) para no sesgar promedios
-                -- NOTA: Para tienda_18 (PARAISO) se excluye 2025-12-06 (inauguración con ventas atípicas)
-                SELECT
-                    producto_id,
-                    fecha_venta::date as fecha,
-                    SUM(cantidad_vendida) as total_dia
-                FROM ventas
-                WHERE ubicacion_id = %s
-                  AND fecha_venta::date >= CURRENT_DATE - INTERVAL '30 days'  -- Solo últimos 30 días (performance: reduce 8.7M → 260K filas para Bosque)
-                  AND fecha_venta::date < CURRENT_DATE  -- Excluir hoy (día incompleto)
-                  AND NOT (ubicacion_id = 'tienda_18' AND fecha_venta::date = '2025-12-06')  -- Excluir inauguración Paraíso
-                GROUP BY producto_id, fecha_venta::date
-            ),
-            ventas_20dias AS (
-                -- Estadisticas de los ultimos 20 dias (o los dias disponibles si hay menos)
-                SELECT
-                    producto_id,
-                    COUNT(DISTINCT fecha) as dias_con_venta,
-                    SUM(total_dia) as total_vendido,
-                    AVG(total_dia) as prom_diario
-                FROM ventas_diarias_disponibles
-                WHERE fecha >= CURRENT_DATE - INTERVAL '20 days'
-                GROUP BY producto_id
-            ),
-            ventas_5dias AS (
-                SELECT
-                    producto_id,
-                    AVG(total_dia) as prom_diario_5d
-                FROM ventas_diarias_disponibles
-                WHERE fecha >= CURRENT_DATE - INTERVAL '5 days'
-                GROUP BY producto_id
-            ),
-            -- TOP3: promedio de los 3 días con más ventas (o menos si no hay 3 dias)
-            ranked_days AS (
-                SELECT
-                    producto_id,
-                    total_dia,
-                    ROW_NUMBER() OVER (PARTITION BY producto_id ORDER BY total_dia DESC) as rn
-                FROM ventas_diarias_disponibles
-                WHERE fecha >= CURRENT_DATE - INTERVAL '20 days'
-            ),
-            top3_ventas AS (
-                SELECT
-                    producto_id,
-                    AVG(total_dia) as prom_top3
-                FROM ranked_days
-                WHERE rn <= 3
-                GROUP BY producto_id
-            ),
-            -- P75: Percentil 75 (si solo hay 1 dia, usa ese valor como P75)
-            percentil_75 AS (
-                SELECT
-                    producto_id,
-                    CASE
-                        WHEN COUNT(*) = 1 THEN MAX(total_dia)  -- Solo 1 dia: usar ese valor
-                        ELSE PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY total_dia)
-                    END as p75
-                FROM ventas_diarias_disponibles
-                WHERE fecha >= CURRENT_DATE - INTERVAL '20 days'
-                GROUP BY producto_id
-            ),
-            -- Estadisticas para calculo ABC (sigma_demanda y demanda_maxima)
-            estadisticas_30d AS (
-                SELECT
-                    producto_id,
-                    CASE
-                        WHEN COUNT(*) <= 1 THEN 0  -- Con 1 dia no hay desviacion
-                        ELSE COALESCE(STDDEV(total_dia), 0)
-                    END as sigma_demanda,
-                    COALESCE(MAX(total_dia), 0) as demanda_maxima
-                FROM ventas_diarias_disponibles
-                WHERE fecha >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY producto_id
-            ),
-            -- ABC desde tabla cache (productos_abc_tienda)
-            -- Pre-calculado diariamente a las 4:00 AM por recalcular_abc_cache.py
-            -- Usa ranking por CANTIDAD vendida en los últimos 30 días POR TIENDA
-            abc_tienda_cache AS (
+            WITH abc_tienda_cache AS (
+                -- ABC desde tabla cache (productos_abc_tienda)
+                -- Pre-calculado diariamente a las 4:00 AM por recalcular_abc_cache.py
+                -- Usa ranking por CANTIDAD vendida en los últimos 30 días POR TIENDA
                 SELECT
                     producto_id,
-                    clase_abc as clase_abc_valor,
-                    rank_cantidad,
-                    cantidad_30d as cantidad_total,
-                    venta_30d as venta_total
+                    clase_abc as clase_abc_valor
                 FROM productos_abc_tienda
                 WHERE ubicacion_id = %s
             ),
@@ -1353,36 +1301,6 @@ async def calcular_productos_sugeridos(
                 FROM inventario_actual
                 WHERE ubicacion_id = %s
                 GROUP BY producto_id
-            ),
-            -- P75 de tiendas de referencia (misma región) para productos SIN ventas locales
-            -- Esto permite sugerir "envíos de prueba" basados en demanda de tiendas similares
-            ventas_referencia AS (
-                SELECT
-                    producto_id,
-                    fecha_venta::date as fecha,
-                    ubicacion_id,
-                    SUM(cantidad_vendida) as total_dia
-                FROM ventas
-                WHERE ubicacion_id = ANY(%s)  -- Tiendas de referencia (misma región)
-                  AND fecha_venta::date < CURRENT_DATE
-                  AND fecha_venta >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY producto_id, fecha_venta::date, ubicacion_id
-            ),
-            p75_referencia AS (
-                -- P75 promedio de las tiendas de referencia
-                SELECT
-                    producto_id,
-                    AVG(p75_tienda) as p75_ref,
-                    STRING_AGG(DISTINCT ubicacion_id, ',' ORDER BY ubicacion_id) as tiendas_con_venta
-                FROM (
-                    SELECT
-                        producto_id,
-                        ubicacion_id,
-                        PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY total_dia) as p75_tienda
-                    FROM ventas_referencia
-                    GROUP BY producto_id, ubicacion_id
-                ) sub
-                GROUP BY producto_id
             )
             SELECT
                 p.codigo as codigo_producto,
@@ -1397,48 +1315,27 @@ async def calcular_productos_sugeridos(
                 COALESCE(p.unidades_por_bulto, 1) as cantidad_bultos,
                 COALESCE(p.unidad_pedido, 'Bulto') as unidad_pedido,
                 COALESCE(p.peso_unitario * 1000, 1000.0) as peso_unidad,  -- Convertir kg a gramos
-                -- Ventas
-                COALESCE(v5.prom_diario_5d, 0) as prom_ventas_5dias_unid,
-                COALESCE(v20.prom_diario, 0) as prom_ventas_20dias_unid,
-                COALESCE(v20.dias_con_venta, 0) as dias_con_venta,
-                COALESCE(v20.total_vendido, 0) as total_vendido_20d,
                 -- Inventario
                 COALESCE(it.stock_tienda, 0) as stock_tienda,
                 COALESCE(ic.stock_cedi, 0) as stock_cedi_origen,
-                -- TOP3 y P75
-                COALESCE(t3.prom_top3, 0) as prom_top3,
-                COALESCE(p75.p75, 0) as prom_p75,
                 -- ABC por valor (Pareto)
                 abc.clase_abc_valor,
-                -- Estadisticas 30 dias para calculo inventario ABC
-                COALESCE(est30.sigma_demanda, 0) as sigma_demanda,
-                COALESCE(est30.demanda_maxima, 0) as demanda_maxima,
                 -- Generador de trafico (GAP > 400)
-                COALESCE(p.es_generador_trafico, false) as es_generador_trafico,
-                -- NUEVO: P75 de referencia (tiendas misma región)
-                COALESCE(p75ref.p75_ref, 0) as p75_referencia,
-                p75ref.tiendas_con_venta as tiendas_referencia
+                COALESCE(p.es_generador_trafico, false) as es_generador_trafico
             FROM productos p
-            LEFT JOIN ventas_20dias v20 ON p.codigo = v20.producto_id
-            LEFT JOIN ventas_5dias v5 ON p.codigo = v5.producto_id
-            LEFT JOIN top3_ventas t3 ON p.codigo = t3.producto_id
-            LEFT JOIN percentil_75 p75 ON p.codigo = p75.producto_id
             LEFT JOIN abc_tienda_cache abc ON p.codigo = abc.producto_id
-            LEFT JOIN estadisticas_30d est30 ON p.codigo = est30.producto_id
             LEFT JOIN inv_tienda it ON p.codigo = it.producto_id
             LEFT JOIN inv_cedi ic ON p.codigo = ic.producto_id
-            LEFT JOIN p75_referencia p75ref ON p.codigo = p75ref.producto_id
             WHERE p.activo = true
-                AND (v20.total_vendido > 0 OR it.stock_tienda > 0 OR ic.stock_cedi > 0)
+                AND (p.codigo = ANY(%s) OR it.stock_tienda > 0 OR ic.stock_cedi > 0)
         """
 
         # Construir parámetros base
         params = [
-            request.tienda_destino,  # ventas_diarias_disponibles
             request.tienda_destino,  # abc_tienda_cache (tabla cache ABC por tienda)
             request.tienda_destino,  # inv_tienda
             request.cedi_origen,     # inv_cedi
-            tiendas_ref_ids if tiendas_ref_ids else ['__NONE__']  # tiendas referencia (evitar error si vacío)
+            productos_con_venta      # productos con ventas en los últimos 20 días (snapshot)
         ]
 
         # Agregar filtro de cuadrantes si se proporciona
@@ -1446,90 +1343,38 @@ async def calcular_productos_sugeridos(
             query += " AND p.cuadrante = ANY(%s)"
             params.append(cuadrantes)
 
-        # Agregar ORDER BY al final
-        query += " ORDER BY COALESCE(v20.total_vendido, 0) DESC"
-
         # Ejecutar query con parámetros
         cursor.execute(query, params)
 
-        rows = cursor.fetchall()
-
-        logger.info(f"📊 Encontrados {len(rows)} productos con datos")
-
-        # ====================================================================
-        # QUERY V3: Obtener promedios por día de semana para cada producto
-        # ====================================================================
-        # Esto permite calcular cobertura real día a día
-        # DOW: 0=Domingo, 1=Lunes, ..., 6=Sábado
-        cursor_dow = conn.cursor()
-        cursor_dow.execute("""
-            WITH ventas_por_dow AS (
-                SELECT
-                    producto_id,
-                    EXTRACT(DOW FROM fecha_venta::date) as dow,
-                    fecha_venta::date as fecha,
-                    SUM(cantidad_vendida) as total_dia
-                FROM ventas
-                WHERE ubicacion_id = %s
-                  AND fecha_venta::date >= CURRENT_DATE - INTERVAL '30 days'
-                  AND fecha_venta::date < CURRENT_DATE
-                GROUP BY producto_id, fecha_venta::date
-            )
-            SELECT
-                producto_id,
-                dow,
-                AVG(total_dia) as prom_dow
-            FROM ventas_por_dow
-            GROUP BY producto_id, dow
-            ORDER BY producto_id, dow
-        """, [request.tienda_destino])
-
-        # Construir diccionario de promedios por DOW para cada producto
-        # Formato: {producto_id: [prom_dom, prom_lun, prom_mar, prom_mie, prom_jue, prom_vie, prom_sab]}
-        promedios_dow_dict: dict = {}
-        for row_dow in cursor_dow.fetchall():
-            prod_id = row_dow[0]
-            dow = int(row_dow[1])
-            prom = float(row_dow[2]) if row_dow[2] else 0.0
-            if prod_id not in promedios_dow_dict:
-                promedios_dow_dict[prod_id] = [0.0] * 7  # 7 días
-            promedios_dow_dict[prod_id][dow] = prom
-        cursor_dow.close()
+        # Completar cada fila con la demanda del snapshot, en el orden de columnas
+        # que usa el cálculo: ventas 5d/20d, TOP3, P75, sigma/máximo 30d y P75 referencia
+        rows = []
+        for (codigo_producto, codigo_barras, descripcion_producto, categoria, grupo, subgrupo, marca,
+             presentacion, cuadrante, cantidad_bultos, unidad_pedido, peso_unidad,
+             stock_tienda, stock_cedi_origen, clase_abc_valor, es_generador_trafico) in cursor.fetchall():
+            demanda = snapshot_tienda.get(codigo_producto)
+            p75_ref, tiendas_con_venta = p75_referencia.get(codigo_producto, (0, None))
+            rows.append((
+                codigo_producto, codigo_barras, descripcion_producto, categoria, grupo, subgrupo, marca,
+                presentacion, cuadrante, cantidad_bultos, unidad_pedido, peso_unidad,
+                demanda.prom_5d if demanda else 0,
+                demanda.prom_20d if demanda else 0,
+                demanda.dias_con_venta_20d if demanda else 0,
+                demanda.total_20d if demanda else 0,
+                stock_tienda, stock_cedi_origen,
+                demanda.top3_20d if demanda else 0,
+                demanda.p75_20d if demanda else 0,
+                clase_abc_valor,
+                demanda.sigma_30d if demanda else 0,
+                demanda.max_30d if demanda else 0,
+                es_generador_trafico,
+                p75_ref, tiendas_con_venta,
+            ))
 
-        # ====================================================================
-        # QUERY V3b: Obtener detalle histórico por DOW (para modal explicativo)
-        # ====================================================================
-        cursor_dow_detail = conn.cursor()
-        cursor_dow_detail.execute("""
-            SELECT
-                producto_id,
-                EXTRACT(DOW FROM fecha_venta::date) as dow,
-                TO_CHAR(fecha_venta::date, 'DD Mon') as fecha_str,
-                fecha_venta::date as fecha,
-                SUM(cantidad_vendida) as total_dia
-            FROM ventas
-            WHERE ubicacion_id = %s
-              AND fecha_venta::date >= CURRENT_DATE - INTERVAL '30 days'
-              AND fecha_venta::date < CURRENT_DATE
-            GROUP BY producto_id, fecha_venta::date
-            ORDER BY producto_id, fecha_venta::date
-        """, [request.tienda_destino])
+        # ORDER BY total vendido 20 días DESC
+        rows.sort(key=lambda r: r[15], reverse=True)
 
-        # Construir diccionario de detalle histórico por DOW
-        # Formato: {producto_id: {dow: [{fecha: "18 Dic", venta: 25}, ...]}}
-        historico_dow_dict: dict = {}
-        for row_detail in cursor_dow_detail.fetchall():
-            prod_id = row_detail[0]
-            dow = int(row_detail[1])
-            fecha_str = row_detail[2]
-            venta = float(row_detail[4]) if row_detail[4] else 0.0
-            if prod_id not in historico_dow_dict:
-                historico_dow_dict[prod_id] = {i: [] for i in range(7)}
-            historico_dow_dict[prod_id][dow].append({
-                "fecha": fecha_str,
-                "venta": venta
-            })
-        cursor_dow_detail.close()
+        logger.info(f"📊 Encontrados {len(rows)} productos con datos")
 
         # Obtener el día actual para calcular cobertura real
         from datetime import datetime, timedelta
@@ -1541,7 +1386,7 @@ async def calcular_productos_sugeridos(
         # Mapeo de DOW a nombre del día
         NOMBRES_DIA = ['Dom', 'Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb']
 
-        logger.info(f"📅 Día actual: {NOMBRES_DIA[dow_actual]} (DOW={dow_actual}), productos con DOW data: {len(promedios_dow_dict)}")
+        logger.info(f"📅 Día actual: {NOMBRES_DIA[dow_actual]} (DOW={dow_actual}), productos con DOW data: {len(snapshot_tienda)}")
 
         # ====================================================================
         # PRE-CÁLCULO: Mediana de P75 por categoría (para envío prueba)
@@ -1726,7 +1571,9 @@ async def calcular_productos_sugeridos(
                 # - Necesita cubrir: Vie + Sáb + Dom
                 # - Si Sábado vende 2x que Viernes, V2 lo considera
                 #
-                v2_prom_dow = promedios_dow_dict.get(codigo, [0.0] * 7)
+                # Promedios por día de semana (0=Domingo ... 6=Sábado) desde el snapshot
+                demanda_local = snapshot_tienda.get(codigo)
+                v2_prom_dow = list(demanda_local.prom_dow) if demanda_local else [0.0] * 7
                 v2_cobertura_dias = []
                 v2_dias_cobertura_real = 0.0
                 v2_primer_dia_riesgo = None
@@ -1800,7 +1647,7 @@ async def calcular_productos_sugeridos(
 
                 # Construir histórico detallado por DOW para este producto
                 v2_historico_dow = []
-                historico_producto = historico_dow_dict.get(codigo, {})
+                historico_producto = demanda_local.historico_dow() if demanda_local else {}
                 for dow in range(7):
                     datos_dow = historico_producto.get(dow, [])
                     promedio = v2_prom_dow[dow] if v2_prom_dow else 0.0
@@ -2152,7 +1999,8 @@ async def calcular_productos_sugeridos(
 
 
 @router.post("/crear-v2", response_model=PedidoGuardadoResponse)
-async def crear_pedido_v2(
+@db_offload
+def crear_pedido_v2(
     request: CrearPedidoV2Request,
     conn: Any = Depends(get_db_write)
 ):
@@ -2167,13 +2015,7 @@ async def crear_pedido_v2(
         pedido_id = str(uuid.uuid4())
 
         # Generar número de pedido
-        cursor.execute("SELECT MAX(numero_pedido) FROM pedidos_sugeridos WHERE numero_pedido LIKE 'PS-%%'")
-        result = cursor.fetchone()
-        if result and result[0]:
-            ultimo = int(result[0].split('-')[1])
-            numero_pedido = f"PS-{ultimo + 1:05d}"
-        else:
-            numero_pedido = "PS-00001"
+        numero_pedido = formatear_numero_pedido(siguiente_numero_base(cursor))
 
         # Obtener nombres de ubicaciones
         cursor.execute("SELECT nombre FROM ubicaciones WHERE id = %s", [request.cedi_origen_id])
@@ -2214,21 +2056,22 @@ async def crear_pedido_v2(
             request.metodo_calculo
         ])
 
-        # Insertar detalles de productos
+        # Información de los productos en una sola consulta
+        cursor.execute("""
+            SELECT
+                codigo,
+                COALESCE(nombre, descripcion) as descripcion,
+                categoria,
+                marca
+            FROM productos
+            WHERE codigo = ANY(%s)
+        """, [list({p.producto_id for p in request.productos})])
+        productos_info = {row[0]: row for row in cursor.fetchall()}
+
+        # Insertar detalles de productos (INSERT multi-fila)
+        filas_detalle = []
         for idx, producto in enumerate(request.productos):
-            detalle_id = str(uuid.uuid4())
-
-            # Obtener información adicional del producto
-            cursor.execute("""
-                SELECT
-                    codigo,
-                    COALESCE(nombre, descripcion) as descripcion,
-                    categoria,
-                    marca
-                FROM productos
-                WHERE codigo = %s
-            """, [producto.producto_id])
-            prod_info = cursor.fetchone()
+            prod_info = productos_info.get(producto.producto_id)
 
             if not prod_info:
                 logger.warning(f"Producto {producto.producto_id} no encontrado, saltando...")
@@ -2236,22 +2079,8 @@ async def crear_pedido_v2(
 
             codigo, descripcion, categoria, marca = prod_info
 
-            cursor.execute("""
-                INSERT INTO pedidos_sugeridos_detalle (
-                    id, pedido_id, linea_numero,
-                    codigo_producto, descripcion_producto,
-                    categoria, marca,
-                    cuadrante_producto,
-                    cantidad_sugerida_unidades,
-                    cantidad_pedida_unidades,
-                    total_unidades,
-                    stock_tienda,
-                    stock_minimo,
-                    incluido,
-                    fecha_creacion
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-            """, [
-                detalle_id, pedido_id, idx + 1,
+            filas_detalle.append((
+                str(uuid.uuid4()), pedido_id, idx + 1,
                 codigo, descripcion,
                 categoria, marca,
                 producto.matriz_abc_xyz,
@@ -2261,7 +2090,20 @@ async def crear_pedido_v2(
                 float(producto.stock_actual),
                 float(producto.nivel_objetivo),
                 True
-            ])
+            ))
+
+        insertar_filas(cursor, 'pedidos_sugeridos_detalle', [
+            'id', 'pedido_id', 'linea_numero',
+            'codigo_producto', 'descripcion_producto',
+            'categoria', 'marca',
+            'cuadrante_producto',
+            'cantidad_sugerida_unidades',
+            'cantidad_pedida_unidades',
+            'total_unidades',
+            'stock_tienda',
+            'stock_minimo',
+            'incluido',
+        ], filas_detalle, valores_fijos={'fecha_creacion': 'CURRENT_TIMESTAMP'})
 
         conn.commit()
         cursor.close()
@@ -2290,44 +2132,39 @@ async def crear_pedido_v2(
 # VERIFICAR LLEGADA - Detectar incrementos de inventario
 # =====================================================================================
 
-@router.get("/{pedido_id}/verificar-llegada", response_model=VerificarLlegadaResponse)
-async def verificar_llegada(
-    pedido_id: str,
-    conn: Any = Depends(get_db)
-):
+def _verificar_llegadas(cursor, pedido_ids: List[str]):
     """
-    Verifica si los productos de un pedido llegaron a la tienda.
+    Verifica la llegada de los productos de varios pedidos con tres consultas
+    en total (cabeceras, productos, llegadas), sin importar cuántos pedidos
+    o productos sean.
 
-    Detecta incrementos de inventario desde la fecha del pedido hasta ahora,
-    sumando todos los incrementos positivos (llegadas) e ignorando decrementos (ventas).
+    Las llegadas salen de inventario_incrementos (incrementos positivos entre
+    snapshots consecutivos, mantenidos por el ETL de inventario) sumados
+    desde la fecha de cada pedido.
 
-    Funciona en cualquier estado del pedido (borrador, aprobado, etc.)
+    Returns:
+        (verificaciones {pedido_id: VerificarLlegadaResponse}, no_encontrados, sin_productos)
     """
-    try:
-        cursor = conn.cursor()
-
-        # 1. Obtener información del pedido
-        cursor.execute("""
-            SELECT
-                p.id, p.numero_pedido, p.fecha_pedido,
-                p.tienda_destino_id, p.tienda_destino_nombre
-            FROM pedidos_sugeridos p
-            WHERE p.id = %s
-        """, [pedido_id])
-
-        pedido_row = cursor.fetchone()
-        if not pedido_row:
-            raise HTTPException(status_code=404, detail=f"Pedido {pedido_id} no encontrado")
-
-        _, numero_pedido, fecha_pedido, tienda_destino_id, tienda_destino_nombre = pedido_row
-
-        # 2. Obtener productos del pedido con sus cantidades, factor de conversión, clasificación ABC y stocks
-        # La clasificación ABC viene de productos_abc_tienda (específica por tienda)
-        # El factor de conversión (unidades_por_bulto) viene de la tabla productos
-        # Los stocks vienen de inventario_actual para tienda, cedi_caracas y cedi_verde
-        # IMPORTANTE: inventario_historico.producto_id almacena el CÓDIGO del producto, no productos.id
+    # 1. Cabeceras de los pedidos
+    cursor.execute("""
+        SELECT
+            p.id, p.numero_pedido, p.fecha_pedido,
+            p.tienda_destino_id, p.tienda_destino_nombre
+        FROM pedidos_sugeridos p
+        WHERE p.id = ANY(%s)
+    """, [pedido_ids])
+    pedidos = {row[0]: row for row in cursor.fetchall()}
+
+    # 2. Productos de los pedidos con sus cantidades, factor de conversión, clasificación ABC y stocks
+    # La clasificación ABC viene de productos_abc_tienda (específica por tienda)
+    # El factor de conversión (unidades_por_bulto) viene de la tabla productos
+    # Los stocks vienen de inventario_actual para tienda, cedi_caracas y cedi_verde
+    # IMPORTANTE: inventario_historico.producto_id almacena el CÓDIGO del producto, no productos.id
+    productos_por_pedido = {pedido_id: [] for pedido_id in pedidos}
+    if pedidos:
         cursor.execute("""
             SELECT
+                d.pedido_id,
                 d.codigo_producto,
                 d.descripcion_producto,
                 COALESCE(d.cantidad_pedida_bultos, 0) as cantidad_pedida_bultos,
@@ -2341,30 +2178,45 @@ async def verificar_llegada(
                 COALESCE(inv_caracas.cantidad, 0) as stock_cedi_caracas,
                 COALESCE(inv_verde.cantidad, 0) as stock_cedi_verde
             FROM pedidos_sugeridos_detalle d
+            JOIN pedidos_sugeridos ps ON ps.id = d.pedido_id
             LEFT JOIN productos p ON d.codigo_producto = p.codigo
-            LEFT JOIN productos_abc_tienda abc ON abc.producto_id = p.id AND abc.ubicacion_id = %s
-            LEFT JOIN inventario_actual inv_tienda ON inv_tienda.producto_id = d.codigo_producto AND inv_tienda.ubicacion_id = %s
+            LEFT JOIN productos_abc_tienda abc ON abc.producto_id = p.id AND abc.ubicacion_id = ps.tienda_destino_id
+            LEFT JOIN inventario_actual inv_tienda ON inv_tienda.producto_id = d.codigo_producto AND inv_tienda.ubicacion_id = ps.tienda_destino_id
             LEFT JOIN inventario_actual inv_caracas ON inv_caracas.producto_id = d.codigo_producto AND inv_caracas.ubicacion_id = 'cedi_caracas'
             LEFT JOIN inventario_actual inv_verde ON inv_verde.producto_id = d.codigo_producto AND inv_verde.ubicacion_id = 'cedi_verde'
-            WHERE d.pedido_id = %s AND d.incluido = true
-            ORDER BY d.linea_numero
-        """, [tienda_destino_id, tienda_destino_id, pedido_id])
-
-        productos_pedido = cursor.fetchall()
-
+            WHERE d.pedido_id = ANY(%s) AND d.incluido = true
+            ORDER BY d.pedido_id, d.linea_numero
+        """, [list(pedidos)])
+        for row in cursor.fetchall():
+            productos_por_pedido[row[0]].append(row[1:])
+
+    # 3. Llegadas de todos los productos de todos los pedidos en una sola consulta
+    llegadas = obtener_llegadas(cursor, [
+        (pedidos[pedido_id][3], prod_row[5], pedidos[pedido_id][2])
+        for pedido_id, productos_pedido in productos_por_pedido.items()
+        for prod_row in productos_pedido
+    ], con_snapshots=True)
+
+    # Tolerancia del 3% para considerar llegada "completa"
+    TOLERANCIA_COMPLETO = Decimal('97')
+
+    verificaciones = {}
+    no_encontrados = [pedido_id for pedido_id in pedido_ids if pedido_id not in pedidos]
+    sin_productos = []
+
+    for pedido_id, (_, numero_pedido, fecha_pedido, tienda_destino_id, tienda_destino_nombre) in pedidos.items():
+        productos_pedido = productos_por_pedido[pedido_id]
         if not productos_pedido:
-            raise HTTPException(status_code=404, detail="El pedido no tiene productos")
+            sin_productos.append(pedido_id)
+            continue
 
-        # 3. Procesar cada producto
+        # 4. Procesar cada producto
         productos_verificados = []
         productos_completos = 0
         productos_parciales = 0
         productos_no_llegaron = 0
         hay_nuevos_incrementos = False
 
-        # Tolerancia del 3% para considerar llegada "completa"
-        TOLERANCIA_COMPLETO = Decimal('97')
-
         for prod_row in productos_pedido:
             (codigo_producto, descripcion, cant_pedida_bultos, cant_pedida_unidades,
              cant_ya_guardada, producto_id_historico, unidades_x_bulto, unidad, clasificacion_abc,
@@ -2376,47 +2228,11 @@ async def verificar_llegada(
             stock_cedi_caracas = Decimal(str(stock_cedi_caracas or 0))
             stock_cedi_verde = Decimal(str(stock_cedi_verde or 0))
 
-            # Query para detectar incrementos desde fecha_pedido
-            # IMPORTANTE: inventario_historico.producto_id usa el CÓDIGO del producto
-            # Suma todos los incrementos positivos entre snapshots consecutivos
-            cursor.execute("""
-                WITH snapshots AS (
-                    SELECT
-                        fecha_snapshot,
-                        SUM(cantidad) as cantidad,
-                        LAG(SUM(cantidad)) OVER (ORDER BY fecha_snapshot) as cantidad_anterior
-                    FROM inventario_historico
-                    WHERE producto_id = %s
-                      AND ubicacion_id = %s
-                      AND fecha_snapshot >= %s
-                    GROUP BY fecha_snapshot
-                    ORDER BY fecha_snapshot
-                ),
-                incrementos AS (
-                    SELECT
-                        fecha_snapshot,
-                        cantidad,
-                        cantidad_anterior,
-                        CASE
-                            WHEN cantidad_anterior IS NOT NULL AND cantidad > cantidad_anterior
-                            THEN cantidad - cantidad_anterior
-                            ELSE 0
-                        END as incremento
-                    FROM snapshots
-                )
-                SELECT
-                    COALESCE(SUM(incremento), 0) as total_llegadas,
-                    MIN(CASE WHEN incremento > 0 THEN fecha_snapshot END) as fecha_primer_incremento,
-                    (SELECT cantidad FROM snapshots ORDER BY fecha_snapshot ASC LIMIT 1) as snapshot_inicial,
-                    (SELECT cantidad FROM snapshots ORDER BY fecha_snapshot DESC LIMIT 1) as snapshot_final,
-                    COUNT(*) as num_snapshots
-                FROM incrementos
-            """, [producto_id_historico, tienda_destino_id, fecha_pedido])
-
-            result = cursor.fetchone()
-            total_llegadas_unidades, fecha_primer_incremento, snapshot_inicial, snapshot_final, num_snapshots = result
-
-            total_llegadas_unidades = Decimal(str(total_llegadas_unidades or 0))
+            llegada = llegadas.get(
+                (tienda_destino_id, producto_id_historico, fecha_pedido), LlegadaDetectada()
+            )
+
+            total_llegadas_unidades = llegada.total_llegadas
             cant_ya_guardada = Decimal(str(cant_ya_guardada or 0))
             cant_pedida_bultos = Decimal(str(cant_pedida_bultos or 0))
             cant_pedida_unidades = Decimal(str(cant_pedida_unidades or 0))
@@ -2436,7 +2252,7 @@ async def verificar_llegada(
             # Determinar estado (con tolerancia del 3%)
             # Si no hay datos de inventario, asumimos inventario cero
             # Por lo tanto, si no hay incrementos detectados = no llegó
-            tiene_datos = num_snapshots > 1 if num_snapshots else False
+            tiene_datos = llegada.tiene_datos
 
             if porcentaje >= TOLERANCIA_COMPLETO:
                 estado = EstadoLlegada.COMPLETO
@@ -2477,22 +2293,17 @@ async def verificar_llegada(
                 stock_tienda=stock_tienda,
                 stock_cedi_caracas=stock_cedi_caracas,
                 stock_cedi_verde=stock_cedi_verde,
-                snapshot_inicial=Decimal(str(snapshot_inicial)) if snapshot_inicial else None,
-                snapshot_final=Decimal(str(snapshot_final)) if snapshot_final else None,
-                fecha_primer_incremento=fecha_primer_incremento
+                snapshot_inicial=llegada.snapshot_inicial,
+                snapshot_final=llegada.snapshot_final,
+                fecha_primer_incremento=llegada.fecha_primer_incremento
             ))
 
-        cursor.close()
-
         # Calcular porcentaje global = productos completos / total productos
         # Ya no excluimos "sin_datos" porque ahora se tratan como "no_llego"
         total_productos = len(productos_verificados)
-        if total_productos > 0:
-            porcentaje_global = Decimal(productos_completos) / Decimal(total_productos) * 100
-        else:
-            porcentaje_global = Decimal(0)
+        porcentaje_global = Decimal(productos_completos) / Decimal(total_productos) * 100
 
-        return VerificarLlegadaResponse(
+        verificaciones[pedido_id] = VerificarLlegadaResponse(
             pedido_id=pedido_id,
             numero_pedido=numero_pedido,
             tienda_destino_id=tienda_destino_id,
@@ -2511,6 +2322,35 @@ async def verificar_llegada(
             mensaje="Verificación completada"
         )
 
+    return verificaciones, no_encontrados, sin_productos
+
+
+@router.get("/{pedido_id}/verificar-llegada", response_model=VerificarLlegadaResponse)
+@db_offload
+def verificar_llegada(
+    pedido_id: str,
+    conn: Any = Depends(get_db)
+):
+    """
+    Verifica si los productos de un pedido llegaron a la tienda.
+
+    Detecta incrementos de inventario desde la fecha del pedido hasta ahora,
+    sumando todos los incrementos positivos (llegadas) e ignorando decrementos (ventas).
+
+    Funciona en cualquier estado del pedido (borrador, aprobado, etc.)
+    """
+    try:
+        cursor = conn.cursor()
+        verificaciones, no_encontrados, _ = _verificar_llegadas(cursor, [pedido_id])
+        cursor.close()
+
+        if no_encontrados:
+            raise HTTPException(status_code=404, detail=f"Pedido {pedido_id} no encontrado")
+        if pedido_id not in verificaciones:
+            raise HTTPException(status_code=404, detail="El pedido no tiene productos")
+
+        return verificaciones[pedido_id]
+
     except HTTPException:
         raise
     except Exception as e:
@@ -2518,12 +2358,53 @@ async def verificar_llegada(
         raise HTTPException(status_code=500, detail=f"Error verificando llegada: {str(e)}")
 
 
+@router.post("/verificar-llegada", response_model=VerificarLlegadaLoteResponse)
+@db_offload
+def verificar_llegada_lote(
+    request: VerificarLlegadaLoteRequest,
+    conn: Any = Depends(get_db)
+):
+    """
+    Verifica la llegada de varios pedidos a la vez (p.ej. la lista de pedidos
+    pendientes de un supervisor), con el mismo resultado por pedido que
+    GET /{pedido_id}/verificar-llegada.
+
+    Los pedidos que no existen o no tienen productos incluidos se devuelven
+    en pedidos_no_encontrados / pedidos_sin_productos.
+    """
+    try:
+        pedido_ids = list(dict.fromkeys(request.pedido_ids))
+
+        cursor = conn.cursor()
+        verificaciones, no_encontrados, sin_productos = _verificar_llegadas(cursor, pedido_ids)
+        cursor.close()
+
+        logger.info(
+            f"📦 Llegadas verificadas para {len(verificaciones)} pedidos "
+            f"({len(no_encontrados)} no encontrados, {len(sin_productos)} sin productos)"
+        )
+
+        return VerificarLlegadaLoteResponse(
+            pedidos=[verificaciones[pid] for pid in pedido_ids if pid in verificaciones],
+            pedidos_no_encontrados=no_encontrados,
+            pedidos_sin_productos=sin_productos,
+            fecha_verificacion=datetime.now()
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error verificando llegada de pedidos: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error verificando llegada: {str(e)}")
+
+
 # =====================================================================================
 # REGISTRAR LLEGADA - Guardar las llegadas detectadas
 # =====================================================================================
 
 @router.post("/{pedido_id}/registrar-llegada", response_model=RegistrarLlegadaResponse)
-async def registrar_llegada(
+@db_offload
+def registrar_llegada(
     pedido_id: str,
     request: RegistrarLlegadaRequest,
     conn: Any = Depends(get_db_write)
@@ -2591,8 +2472,10 @@ async def registrar_llegada(
 
 
 @router.get("/{pedido_id}/exportar-excel")
-async def exportar_pedido_excel(
+@db_offload
+def exportar_pedido_excel(
     pedido_id: str,
+    formato: str = Query("xlsx", description="xlsx (default) | csv"),
     conn: Any = Depends(get_db)
 ):
     """
@@ -2600,13 +2483,15 @@ async def exportar_pedido_excel(
 
     Formato:
     - Código | Descripción | Categoría | ABC | Cuadrante | Stock | Sugerido | Pedido
+
+    Las líneas se leen con un cursor server-side: el .xlsx se arma en modo
+    write-only sobre un archivo temporal y el .csv se genera mientras se
+    descarga (memoria constante en ambos casos).
     """
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, Alignment, PatternFill
-        import io
-        from fastapi.responses import Response
+    if formato not in ("xlsx", "csv"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'xlsx' o 'csv'")
 
+    try:
         cursor = conn.cursor()
 
         # Obtener encabezado del pedido
@@ -2623,8 +2508,20 @@ async def exportar_pedido_excel(
 
         numero_pedido, tienda_nombre, cedi_nombre, fecha_pedido, estado, dias_cobertura = pedido_row
 
-        # Obtener productos del pedido
         cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM pedidos_sugeridos_detalle
+                WHERE pedido_id = %s AND incluido = true
+            )
+        """, [pedido_id])
+        hay_productos = cursor.fetchone()[0]
+        cursor.close()
+
+        if not hay_productos:
+            raise HTTPException(status_code=404, detail="No hay productos en el pedido")
+
+        # Productos del pedido
+        query_detalle = """
             SELECT
                 codigo_producto,
                 descripcion_producto,
@@ -2639,46 +2536,13 @@ async def exportar_pedido_excel(
             FROM pedidos_sugeridos_detalle
             WHERE pedido_id = %s AND incluido = true
             ORDER BY clasificacion_abc, descripcion_producto
-        """, [pedido_id])
-
-        rows = cursor.fetchall()
-        cursor.close()
-
-        if not rows:
-            raise HTTPException(status_code=404, detail="No hay productos en el pedido")
-
-        # Crear workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = f"Pedido {numero_pedido[:20]}"
-
-        # Título
-        ws.merge_cells('A1:J1')
-        ws['A1'] = f"Pedido: {numero_pedido}"
-        ws['A1'].font = Font(bold=True, size=14)
-        ws['A1'].alignment = Alignment(horizontal='center')
-
-        # Información del pedido
-        ws.merge_cells('A2:J2')
-        ws['A2'] = f"Tienda: {tienda_nombre} | CEDI: {cedi_nombre} | Fecha: {fecha_pedido} | Cobertura: {dias_cobertura}d"
-        ws['A2'].font = Font(size=10)
-        ws['A2'].alignment = Alignment(horizontal='center')
+        """
 
-        # Headers
         headers = [
             'Código', 'Descripción', 'Categoría', 'ABC', 'Cuadrante',
             'Unid/Bulto', 'Stock', 'Sugerido', 'Pedido', 'Total Unid'
         ]
 
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        header_font = Font(bold=True, color='FFFFFF')
-
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=4, column=col_idx, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
         # Colores por clasificación ABC
         abc_colors = {
             'A': 'E8F5E9',  # Verde claro
@@ -2687,48 +2551,41 @@ async def exportar_pedido_excel(
             'D': 'F5F5F5'   # Gris claro
         }
 
-        # Datos
-        for row_idx, row_data in enumerate(rows, 5):
-            abc = row_data[3] or 'D'
-            fill_color = abc_colors.get(abc, 'FFFFFF')
-            row_fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type='solid')
-
-            data = [
-                row_data[0],   # Código
-                row_data[1],   # Descripción
-                row_data[2],   # Categoría
-                abc,           # ABC
-                row_data[4] or 'NO ESPECIFICADO',  # Cuadrante
-                int(row_data[5]) if row_data[5] else 1,
-                float(row_data[6]) if row_data[6] else 0,
-                float(row_data[7]) if row_data[7] else 0,
-                float(row_data[8]) if row_data[8] else 0,
-                float(row_data[9]) if row_data[9] else 0
-            ]
-
-            for col_idx, value in enumerate(data, 1):
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.fill = row_fill
-                if col_idx >= 6:  # Números: alinear derecha
-                    cell.alignment = Alignment(horizontal='right')
-
-        # Ajustar anchos
-        column_widths = [12, 40, 20, 6, 15, 10, 12, 15, 15, 15]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = width
-
-        # Guardar en memoria
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        filename = f"{numero_pedido.replace('/', '-')}.xlsx"
-
-        return Response(
-            content=output.read(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        def filas(rows):
+            for row_data in rows:
+                abc = row_data[3] or 'D'
+                data = [
+                    row_data[0],   # Código
+                    row_data[1],   # Descripción
+                    row_data[2],   # Categoría
+                    abc,           # ABC
+                    row_data[4] or 'NO ESPECIFICADO',  # Cuadrante
+                    int(row_data[5]) if row_data[5] else 1,
+                    float(row_data[6]) if row_data[6] else 0,
+                    float(row_data[7]) if row_data[7] else 0,
+                    float(row_data[8]) if row_data[8] else 0,
+                    float(row_data[9]) if row_data[9] else 0
+                ]
+                yield data, abc_colors.get(abc, 'FFFFFF')
+
+        nombre_archivo = numero_pedido.replace('/', '-')
+
+        if formato == "csv":
+            rows = iterar_filas_conexion(get_db_connection_resilient, query_detalle, [pedido_id])
+            return respuesta_descarga(
+                generar_csv(headers, (data for data, _ in filas(rows))), "csv", nombre_archivo, cerrar=[rows]
+            )
+
+        archivo, _ = construir_xlsx(
+            headers,
+            filas(iterar_filas(conn, query_detalle, [pedido_id])),
+            titulo_hoja=f"Pedido {numero_pedido[:20]}",
+            titulo=f"Pedido: {numero_pedido}",
+            subtitulo=f"Tienda: {tienda_nombre} | CEDI: {cedi_nombre} | Fecha: {fecha_pedido} | Cobertura: {dias_cobertura}d",
+            anchos=[12, 40, 20, 6, 15, 10, 12, 15, 15, 15],
+            columnas_derecha=range(6, 11),
         )
+        return respuesta_descarga(iterar_archivo(archivo), "xlsx", nombre_archivo)
 
     except HTTPException:
         raise
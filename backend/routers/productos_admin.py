@@ -17,7 +17,7 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 import logging
 
-from db_manager import get_db_connection, get_db_connection_write
+from db_manager import get_db_connection, get_db_connection_write, db_offload
 
 logger = logging.getLogger(__name__)
 
@@ -77,7 +77,8 @@ class OpcionResponse(BaseModel):
 # =====================================================================================
 
 @router.get("/opciones/cuadrantes", response_model=List[OpcionResponse])
-async def obtener_cuadrantes():
+@db_offload
+def obtener_cuadrantes():
     """Obtiene lista de cuadrantes únicos para selector"""
     try:
         with get_db_connection() as conn:
@@ -101,7 +102,8 @@ async def obtener_cuadrantes():
 
 
 @router.get("/opciones/marcas", response_model=List[OpcionResponse])
-async def obtener_marcas():
+@db_offload
+def obtener_marcas():
     """Obtiene lista de marcas únicas para selector"""
     try:
         with get_db_connection() as conn:
@@ -126,7 +128,8 @@ async def obtener_marcas():
 
 
 @router.get("/opciones/categorias", response_model=List[OpcionResponse])
-async def obtener_categorias():
+@db_offload
+def obtener_categorias():
     """Obtiene lista de categorías únicas para selector"""
     try:
         with get_db_connection() as conn:
@@ -154,7 +157,8 @@ async def obtener_categorias():
 # =====================================================================================
 
 @router.get("", response_model=ProductoListResponse)
-async def listar_productos(
+@db_offload
+def listar_productos(
     search: Optional[str] = Query(None, min_length=2, description="Buscar por código o descripción"),
     categoria: Optional[str] = Query(None, description="Filtrar por categoría"),
     cuadrante: Optional[str] = Query(None, description="Filtrar por cuadrante"),
@@ -255,7 +259,8 @@ async def listar_productos(
 
 
 @router.get("/{codigo}", response_model=ProductoAdminResponse)
-async def obtener_producto(codigo: str):
+@db_offload
+def obtener_producto(codigo: str):
     """Obtiene detalle de un producto por código"""
     try:
         with get_db_connection() as conn:
@@ -299,7 +304,8 @@ async def obtener_producto(codigo: str):
 
 
 @router.put("/{codigo}")
-async def actualizar_producto(codigo: str, data: ProductoUpdateRequest):
+@db_offload
+def actualizar_producto(codigo: str, data: ProductoUpdateRequest):
     """Actualiza características editables de un producto"""
     try:
         # Construir SET dinámico solo con campos proporcionados
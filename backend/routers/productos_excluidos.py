@@ -15,7 +15,7 @@ from pydantic import BaseModel
 from datetime import datetime
 import logging
 
-from db_manager import get_db_connection, get_db_connection_write
+from db_manager import get_db_connection, get_db_connection_write, db_offload
 
 logger = logging.getLogger(__name__)
 
@@ -59,7 +59,8 @@ class ProductoBusqueda(BaseModel):
 # =====================================================================================
 
 @router.get("/{tienda_id}", response_model=List[ProductoExcluido])
-async def listar_productos_excluidos(
+@db_offload
+def listar_productos_excluidos(
     tienda_id: str,
     search: Optional[str] = Query(None, description="Buscar por código o descripción"),
     limit: int = Query(100, ge=1, le=500),
@@ -115,7 +116,8 @@ async def listar_productos_excluidos(
 
 
 @router.post("", response_model=ProductoExcluido)
-async def crear_exclusion(request: CrearExclusionRequest):
+@db_offload
+def crear_exclusion(request: CrearExclusionRequest):
     """
     Agrega un producto a la lista de excluidos para una tienda.
     Busca automáticamente la información del producto en la tabla productos.
@@ -205,7 +207,8 @@ async def crear_exclusion(request: CrearExclusionRequest):
 
 
 @router.delete("/{tienda_id}/{codigo_producto}")
-async def eliminar_exclusion(tienda_id: str, codigo_producto: str):
+@db_offload
+def eliminar_exclusion(tienda_id: str, codigo_producto: str):
     """
     Elimina un producto de la lista de excluidos (soft delete).
     """
@@ -243,7 +246,8 @@ async def eliminar_exclusion(tienda_id: str, codigo_producto: str):
 
 
 @router.get("/buscar-productos/", response_model=List[ProductoBusqueda])
-async def buscar_productos_para_excluir(
+@db_offload
+def buscar_productos_para_excluir(
     tienda_id: str = Query(..., description="ID de la tienda"),
     search: str = Query(..., min_length=2, description="Término de búsqueda (mín 2 caracteres)")
 ):
@@ -282,7 +286,8 @@ async def buscar_productos_para_excluir(
 
 
 @router.get("/codigos-excluidos/{tienda_id}")
-async def obtener_codigos_excluidos(tienda_id: str):
+@db_offload
+def obtener_codigos_excluidos(tienda_id: str):
     """
     Retorna solo los códigos de productos excluidos para una tienda.
     Útil para el filtrado rápido en el cálculo de pedidos sugeridos.
@@ -17,7 +17,7 @@ from pydantic import BaseModel
 from datetime import datetime
 import logging
 
-from db_manager import get_db_connection, get_db_connection_write
+from db_manager import get_db_connection, get_db_connection_write, db_offload
 
 logger = logging.getLogger(__name__)
 
@@ -85,7 +85,8 @@ class ProductoBusqueda(BaseModel):
 # =====================================================================================
 
 @router.get("/{cedi_destino_id}", response_model=List[ProductoExcluidoInterCedi])
-async def listar_productos_excluidos_inter_cedi(
+@db_offload
+def listar_productos_excluidos_inter_cedi(
     cedi_destino_id: str,
     search: Optional[str] = Query(None, description="Buscar por código o descripción"),
     motivo: Optional[str] = Query(None, description="Filtrar por motivo"),
@@ -145,7 +146,8 @@ async def listar_productos_excluidos_inter_cedi(
 
 
 @router.get("/codigos/{cedi_destino_id}")
-async def obtener_codigos_excluidos_inter_cedi(cedi_destino_id: str):
+@db_offload
+def obtener_codigos_excluidos_inter_cedi(cedi_destino_id: str):
     """
     Retorna solo los códigos de productos excluidos para un CEDI destino.
     Útil para el filtrado rápido en el cálculo de pedidos inter-CEDI.
@@ -174,7 +176,8 @@ async def obtener_codigos_excluidos_inter_cedi(cedi_destino_id: str):
 
 
 @router.post("", response_model=ProductoExcluidoInterCedi)
-async def crear_exclusion_inter_cedi(request: CrearExclusionInterCediRequest):
+@db_offload
+def crear_exclusion_inter_cedi(request: CrearExclusionInterCediRequest):
     """
     Agrega un producto a la lista de excluidos para un CEDI destino.
     Soporta códigos con o sin ceros iniciales (ej: "3216" o "003216").
@@ -298,7 +301,8 @@ def normalizar_codigo_producto(codigo: str) -> list:
 
 
 @router.post("/bulk", response_model=CargaMasivaResponse)
-async def carga_masiva_exclusiones(request: CargaMasivaRequest):
+@db_offload
+def carga_masiva_exclusiones(request: CargaMasivaRequest):
     """
     Carga masiva de productos excluidos.
     Acepta una lista de códigos de productos y los agrega todos.
@@ -406,7 +410,8 @@ async def carga_masiva_exclusiones(request: CargaMasivaRequest):
 
 
 @router.delete("/{exclusion_id}")
-async def eliminar_exclusion_inter_cedi(exclusion_id: int):
+@db_offload
+def eliminar_exclusion_inter_cedi(exclusion_id: int):
     """
     Elimina una exclusión por su ID (soft delete).
     """
@@ -444,7 +449,8 @@ async def eliminar_exclusion_inter_cedi(exclusion_id: int):
 
 
 @router.get("/buscar-productos/")
-async def buscar_productos_para_excluir_inter_cedi(
+@db_offload
+def buscar_productos_para_excluir_inter_cedi(
     cedi_destino_id: str = Query(..., description="ID del CEDI destino"),
     search: str = Query(..., min_length=2, description="Término de búsqueda (mín 2 caracteres)")
 ) -> List[ProductoBusqueda]:
@@ -488,7 +494,8 @@ async def buscar_productos_para_excluir_inter_cedi(
 
 
 @router.get("/estadisticas/{cedi_destino_id}")
-async def obtener_estadisticas_exclusiones(cedi_destino_id: str):
+@db_offload
+def obtener_estadisticas_exclusiones(cedi_destino_id: str):
     """
     Retorna estadísticas de exclusiones para un CEDI destino.
     """
@@ -3,13 +3,13 @@ Router para endpoints de Ubicaciones
 """
 
 from fastapi import APIRouter, HTTPException
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict
 import logging
 import sys
 from pathlib import Path
-from datetime import datetime, timedelta
 
-from db_manager import get_db_connection, execute_query_dict
+from db_manager import get_db_connection, execute_query_dict, db_offload
+from services.cache_swr import obtener_cache_swr, registrar_cache_swr
 from schemas.ubicaciones import (
     UbicacionResponse,
     UbicacionSummaryResponse,
@@ -24,18 +24,19 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api", tags=["Ubicaciones"])
 
 # ============================================================================
-# SIMPLE IN-MEMORY CACHE
+# CACHE
 # ============================================================================
-# Cache for expensive summary-regional query (10 minutes TTL)
-# This reduces load time from 25s to <100ms for subsequent requests
+# summary-regional tarda ~25s: se sirve desde el cache SWR compartido
+# (services/cache_swr.py) y se recalcula en segundo plano cada 10 minutos
+# o cuando un ETL incrementa bi_data_version.
 
-_summary_regional_cache: Optional[Dict[str, Any]] = None
-_summary_regional_cache_time: Optional[datetime] = None
 CACHE_TTL_MINUTES = 10
+SUMMARY_REGIONAL_CACHE = 'ubicaciones.summary_regional'
 
 
 @router.get("/ubicaciones", response_model=List[UbicacionResponse])
-async def get_ubicaciones(
+@db_offload
+def get_ubicaciones(
     tipo: Optional[str] = None,
     visible_pedidos: Optional[bool] = None
 ):
@@ -79,7 +80,8 @@ async def get_ubicaciones(
 
 
 @router.get("/ubicaciones/summary", response_model=List[UbicacionSummaryResponse])
-async def get_ubicaciones_summary():
+@db_offload
+def get_ubicaciones_summary():
     """
     Obtiene un resumen de inventario por ubicación (Stellar + KLK)
     """
@@ -120,7 +122,12 @@ async def get_ubicaciones_summary():
                     COUNT(DISTINCT ia.producto_id) as total_productos,
                     SUM(CASE WHEN ia.cantidad = 0 THEN 1 ELSE 0 END) as stock_cero,
                     SUM(CASE WHEN ia.cantidad < 0 THEN 1 ELSE 0 END) as stock_negativo,
-                    TO_CHAR(MAX(ia.fecha_actualizacion), 'YYYY-MM-DD HH24:MI:SS') as ultima_actualizacion,
+                    -- Carga delta: filas sin cambios conservan su fecha; el último snapshot confirmado está en inventario_cargas
+                    TO_CHAR(GREATEST(
+                        MAX(ia.fecha_actualizacion),
+                        (SELECT MAX(c.fecha_snapshot) FROM inventario_cargas c
+                         WHERE c.ubicacion_id = ia.ubicacion_id AND c.almacen_codigo = ia.almacen_codigo)
+                    ), 'YYYY-MM-DD HH24:MI:SS') as ultima_actualizacion,
                     ia.almacen_codigo
                 FROM inventario_actual ia
                 LEFT JOIN ubicaciones u ON ia.ubicacion_id = u.id
@@ -164,23 +171,24 @@ async def get_ubicaciones_summary():
 
 
 @router.get("/ubicaciones/summary-regional", response_model=List[RegionSummary])
-async def get_ubicaciones_summary_regional():
+@db_offload
+def get_ubicaciones_summary_regional():
     """
     Obtiene resumen de inventario agrupado por región (CARACAS / VALENCIA).
 
-    PERFORMANCE: Cached for 10 minutes to reduce load from 25s to <100ms
+    PERFORMANCE: Servido desde el cache SWR compartido (<100ms); el cálculo
+    (~25s) corre en segundo plano cada 10 minutos o tras un ETL.
     """
-    global _summary_regional_cache, _summary_regional_cache_time
+    try:
+        return obtener_cache_swr(SUMMARY_REGIONAL_CACHE)
+    except Exception as e:
+        logger.error(f"Error obteniendo resumen regional: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
-    # Check cache validity
-    now = datetime.now()
-    if (_summary_regional_cache is not None and
-        _summary_regional_cache_time is not None and
-        now - _summary_regional_cache_time < timedelta(minutes=CACHE_TTL_MINUTES)):
-        logger.info(f"⚡ CACHE HIT: summary-regional (age: {(now - _summary_regional_cache_time).seconds}s)")
-        return _summary_regional_cache
 
-    logger.info("🔄 CACHE MISS: Calculating summary-regional (will take ~25s)")
+def _calcular_summary_regional() -> List[RegionSummary]:
+    """Resumen regional de inventario (la consulta de ~25s)"""
+    logger.info("🔄 Calculando summary-regional (~25s)")
 
     try:
         with get_db_connection() as conn:
@@ -212,7 +220,12 @@ async def get_ubicaciones_summary_regional():
                         SUM(CASE WHEN ia.cantidad > 0 THEN 1 ELSE 0 END) as skus_con_stock,
                         SUM(CASE WHEN ia.cantidad = 0 THEN 1 ELSE 0 END) as stock_cero,
                         SUM(CASE WHEN ia.cantidad < 0 THEN 1 ELSE 0 END) as stock_negativo,
-                        TO_CHAR(MAX(ia.fecha_actualizacion), 'YYYY-MM-DD HH24:MI:SS') as ultima_actualizacion
+                        -- Carga delta: filas sin cambios conservan su fecha; el último snapshot confirmado está en inventario_cargas
+                        TO_CHAR(GREATEST(
+                            MAX(ia.fecha_actualizacion),
+                            (SELECT MAX(c.fecha_snapshot) FROM inventario_cargas c
+                             WHERE c.ubicacion_id = ia.ubicacion_id AND c.almacen_codigo = ia.almacen_codigo)
+                        ), 'YYYY-MM-DD HH24:MI:SS') as ultima_actualizacion
                     FROM inventario_actual ia
                     JOIN ubicaciones u ON ia.ubicacion_id = u.id
                     GROUP BY u.id, u.nombre, u.tipo, u.region, ia.almacen_codigo
@@ -365,22 +378,21 @@ async def get_ubicaciones_summary_regional():
 
             result.sort(key=lambda r: (0 if r.region == 'VALENCIA' else 1, r.region))
 
-            # Save to cache before returning
-            _summary_regional_cache = result
-            _summary_regional_cache_time = datetime.now()
-            logger.info(f"✅ CACHE SAVED: summary-regional (valid for {CACHE_TTL_MINUTES} min)")
-
             return result
 
     except Exception as e:
-        logger.error(f"Error obteniendo resumen regional: {str(e)}")
+        logger.error(f"Error calculando resumen regional: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+        raise
+
+
+registrar_cache_swr(SUMMARY_REGIONAL_CACHE, _calcular_summary_regional, ttl_segundos=CACHE_TTL_MINUTES * 60)
 
 
 @router.get("/ubicaciones/{ubicacion_id}/stock-params")
-async def get_stock_params(ubicacion_id: str):
+@db_offload
+def get_stock_params(ubicacion_id: str):
     """
     Obtiene los parámetros de stock para una tienda en DÍAS.
     Usa la configuración real de config_parametros_abc_tienda si existe,
@@ -530,7 +542,8 @@ async def get_all_almacenes_klk():
 
 
 @router.get("/ubicaciones/tiendas-por-cedi/{cedi_id}")
-async def get_tiendas_por_cedi(cedi_id: str):
+@db_offload
+def get_tiendas_por_cedi(cedi_id: str):
     """
     Obtiene las tiendas que son servidas por un CEDI específico.
     Las tiendas se asignan según la región del CEDI.
@@ -596,7 +609,8 @@ async def get_tiendas_por_cedi(cedi_id: str):
 
 
 @router.get("/ubicaciones/cedis")
-async def get_cedis():
+@db_offload
+def get_cedis():
     """
     Obtiene todos los CEDIs disponibles.
     """
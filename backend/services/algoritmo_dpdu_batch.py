@@ -0,0 +1,275 @@
+"""
+Algoritmo DPD+U vectorizado (NumPy) para muchos productos a la vez.
+
+Version batch de algoritmo_dpdu.calcular_distribucion_dpdu: arma una matriz
+productos x tiendas (las filas con menos tiendas se rellenan y enmascaran) y
+calcula urgencias, pesos normalizados, asignacion en bultos y reparto de
+bultos sobrantes de todos los productos en conflicto en una sola pasada.
+
+Replica exactamente la version escalar:
+- Las sumas por producto (demanda, urgencia, peso) se acumulan tienda por
+  tienda en el mismo orden que sum() (np.sum usa suma por pares y puede
+  diferir en el ultimo bit).
+- Los bultos sobrantes se reparten con el mismo orden que sorted(): mayor
+  urgencia, luego mayor pct_demanda redondeado a 2 decimales, luego orden
+  original. El redondeo usa round() de Python (np.round no siempre coincide
+  y cambiaria desempates).
+
+Los tests en tests/test_algoritmo_dpdu_batch.py comparan ambas versiones.
+"""
+from dataclasses import dataclass, field
+from typing import List, Sequence
+
+import numpy as np
+
+from services.algoritmo_dpdu import (
+    AsignacionTienda,
+    ConfigDPDU,
+    DatosTiendaProducto,
+)
+
+
+@dataclass
+class ResultadoDPDUBatch:
+    """Resultado del DPD+U batch: matrices (productos x tiendas) + mascara."""
+    mascara: np.ndarray            # True donde la celda es una tienda real
+    sin_stock: np.ndarray          # Por producto: stock_cedi <= 0
+
+    urgencia: np.ndarray
+    pct_demanda: np.ndarray        # Fraccion 0-1 (sin redondear)
+    pct_urgencia: np.ndarray
+    peso_final: np.ndarray         # Normalizado para sumar 1 por producto
+
+    bultos_base: np.ndarray        # Bultos antes de repartir sobrantes
+    bultos_extra: np.ndarray       # 1 si la tienda recibio un bulto sobrante
+    cantidad_asignada_bultos: np.ndarray
+
+    # Entradas (para reconstruir AsignacionTienda por producto)
+    unidades_por_bulto: list = field(repr=False, default_factory=list)
+    datos_tiendas: list = field(repr=False, default_factory=list)
+    pct_demanda_redondeado: np.ndarray = field(repr=False, default=None)
+
+    def __len__(self) -> int:
+        return len(self.datos_tiendas)
+
+    def asignaciones(self, i: int) -> List[AsignacionTienda]:
+        """
+        Reconstruye las AsignacionTienda del producto i, identicas a las de
+        calcular_distribucion_dpdu (incluye los redondeos de presentacion).
+        """
+        tiendas = self.datos_tiendas[i]
+        upb = self.unidades_por_bulto[i]
+        urgencia = self.urgencia[i].tolist()
+
+        if self.sin_stock[i]:
+            return [
+                AsignacionTienda(
+                    tienda_id=t.tienda_id,
+                    tienda_nombre=t.tienda_nombre,
+                    demanda_p75=t.demanda_p75,
+                    stock_actual=t.stock_actual,
+                    dias_stock=t.dias_stock,
+                    cantidad_necesaria=t.cantidad_necesaria,
+                    urgencia=urgencia[j],
+                    pct_demanda=0,
+                    pct_urgencia=0,
+                    peso_final=0,
+                    cantidad_asignada_unid=0,
+                    cantidad_asignada_bultos=0,
+                    deficit_vs_necesidad=-t.cantidad_necesaria,
+                    cobertura_dias_resultante=t.dias_stock
+                )
+                for j, t in enumerate(tiendas)
+            ]
+
+        pct_demanda = self.pct_demanda_redondeado[i].tolist()
+        pct_urgencia = self.pct_urgencia[i].tolist()
+        peso_final = self.peso_final[i].tolist()
+        bultos_base = self.bultos_base[i].tolist()
+        bultos_extra = self.bultos_extra[i].tolist()
+
+        resultados = []
+        for j, t in enumerate(tiendas):
+            bultos = bultos_base[j]
+            unid = bultos * upb
+            deficit = unid - t.cantidad_necesaria
+            if bultos_extra[j]:
+                bultos += 1
+                unid += upb
+                deficit += upb
+
+            stock_despues = t.stock_actual + unid
+            cobertura = stock_despues / t.demanda_p75 if t.demanda_p75 > 0 else 999
+
+            resultados.append(AsignacionTienda(
+                tienda_id=t.tienda_id,
+                tienda_nombre=t.tienda_nombre,
+                demanda_p75=t.demanda_p75,
+                stock_actual=t.stock_actual,
+                dias_stock=t.dias_stock,
+                cantidad_necesaria=t.cantidad_necesaria,
+                urgencia=urgencia[j],
+                pct_demanda=pct_demanda[j],
+                pct_urgencia=round(pct_urgencia[j] * 100, 2),
+                peso_final=round(peso_final[j] * 100, 2),
+                cantidad_asignada_unid=unid,
+                cantidad_asignada_bultos=bultos,
+                deficit_vs_necesidad=deficit,
+                cobertura_dias_resultante=round(cobertura, 1)
+            ))
+        return resultados
+
+
+def _suma_secuencial(matriz: np.ndarray) -> np.ndarray:
+    """Suma por fila acumulando columna a columna (mismo orden que sum())."""
+    total = np.zeros(matriz.shape[0])
+    for j in range(matriz.shape[1]):
+        total += matriz[:, j]
+    return total
+
+
+def _redondear_pct(fracciones: np.ndarray, mascara: np.ndarray) -> np.ndarray:
+    """round(x * 100, 2) de Python sobre las celdas validas."""
+    redondeado = np.zeros_like(fracciones)
+    redondeado[mascara] = [round(v, 2) for v in (fracciones[mascara] * 100).tolist()]
+    return redondeado
+
+
+def resolver_dpdu_matriz(
+    stock_cedi: np.ndarray,
+    unidades_por_bulto: np.ndarray,
+    demanda_p75: np.ndarray,
+    dias_stock: np.ndarray,
+    mascara: np.ndarray,
+    config: ConfigDPDU
+) -> ResultadoDPDUBatch:
+    """
+    Nucleo vectorizado del DPD+U.
+
+    Args:
+        stock_cedi, unidades_por_bulto: arrays de largo P (uno por producto)
+        demanda_p75, dias_stock: matrices P x S
+        mascara: matriz P x S, True en las celdas con tienda real. Las
+            tiendas de cada producto van en las primeras columnas, en el
+            orden de entrada.
+        config: pesos DPD+U
+
+    Returns:
+        ResultadoDPDUBatch sin los datos de entrada por tienda
+    """
+    P, S = mascara.shape
+    n_tiendas = mascara.sum(axis=1)
+    D = np.where(mascara, demanda_p75, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Urgencia: 100 si dias_stock <= max(0, dias_minimo), sino 1 / dias_stock
+        urgencia = np.where(
+            (dias_stock <= 0) | (dias_stock <= config.dias_minimo_urgencia),
+            100.0,
+            1.0 / dias_stock
+        )
+        urgencia = np.where(mascara, urgencia, 0.0)
+
+        total_demanda = _suma_secuencial(D)[:, None]
+        total_urgencia = _suma_secuencial(urgencia)[:, None]
+        uniforme = (1 / np.maximum(n_tiendas, 1))[:, None]
+
+        pct_demanda = np.where(total_demanda > 0, D / total_demanda, uniforme)
+        pct_urgencia = np.where(total_urgencia > 0, urgencia / total_urgencia, uniforme)
+        peso = (pct_demanda * config.peso_demanda) + (pct_urgencia * config.peso_urgencia)
+        peso = np.where(mascara, peso, 0.0)
+
+        total_peso = _suma_secuencial(peso)[:, None]
+        peso = np.where(total_peso > 0, peso / total_peso, peso)
+
+        upb = unidades_por_bulto[:, None]
+        cantidad_unid = stock_cedi[:, None] * peso
+        bultos_base = np.where(
+            mascara & (upb > 0),
+            np.floor(np.divide(cantidad_unid, upb, out=np.zeros_like(cantidad_unid), where=upb > 0)),
+            0.0
+        ).astype(np.int64)
+
+        # Bultos sobrantes por el redondeo hacia abajo
+        asignado = (bultos_base * upb).sum(axis=1)
+        sobrantes = np.where(
+            unidades_por_bulto > 0,
+            np.floor(np.divide(stock_cedi - asignado, unidades_por_bulto,
+                               out=np.zeros(P), where=unidades_por_bulto > 0)),
+            0.0
+        )
+
+    sin_stock = stock_cedi <= 0
+    pct_demanda_redondeado = _redondear_pct(pct_demanda, mascara)
+
+    # Orden de reparto por producto: -urgencia, -pct_demanda (redondeado),
+    # posicion original. Las celdas de relleno van al final.
+    columnas = np.broadcast_to(np.arange(S), (P, S))
+    orden = np.lexsort((
+        columnas,
+        -pct_demanda_redondeado,
+        np.where(mascara, -urgencia, np.inf),
+    ), axis=-1)
+    posicion = np.empty((P, S), dtype=np.int64)
+    np.put_along_axis(posicion, orden, columnas, axis=-1)
+    bultos_extra = mascara & (posicion < sobrantes[:, None]) & ~sin_stock[:, None]
+
+    bultos_base = np.where(sin_stock[:, None], 0, bultos_base)
+    return ResultadoDPDUBatch(
+        mascara=mascara,
+        sin_stock=sin_stock,
+        urgencia=urgencia,
+        pct_demanda=pct_demanda,
+        pct_urgencia=pct_urgencia,
+        peso_final=peso,
+        bultos_base=bultos_base,
+        bultos_extra=bultos_extra,
+        cantidad_asignada_bultos=bultos_base + bultos_extra,
+        pct_demanda_redondeado=pct_demanda_redondeado,
+    )
+
+
+def calcular_distribucion_dpdu_batch(
+    stocks_cedi: Sequence[float],
+    unidades_por_bulto: Sequence[int],
+    datos_tiendas: Sequence[List[DatosTiendaProducto]],
+    config: ConfigDPDU
+) -> ResultadoDPDUBatch:
+    """
+    Version vectorizada de calcular_distribucion_dpdu para P productos.
+
+    Args:
+        stocks_cedi: stock disponible en CEDI por producto (unidades)
+        unidades_por_bulto: unidades por bulto por producto
+        datos_tiendas: por producto, la lista de tiendas a repartir (mismo
+            orden que se pasaria a calcular_distribucion_dpdu)
+        config: configuracion de pesos DPD+U
+
+    Returns:
+        ResultadoDPDUBatch; resultado.asignaciones(i) devuelve la misma
+        lista que calcular_distribucion_dpdu para el producto i
+        (lista vacia si el producto no tiene tiendas).
+    """
+    P = len(datos_tiendas)
+    S = max((len(t) for t in datos_tiendas), default=0)
+
+    demanda = np.zeros((P, S))
+    dias_stock = np.zeros((P, S))
+    mascara = np.zeros((P, S), dtype=bool)
+    for i, tiendas in enumerate(datos_tiendas):
+        n = len(tiendas)
+        demanda[i, :n] = [t.demanda_p75 for t in tiendas]
+        dias_stock[i, :n] = [t.dias_stock for t in tiendas]
+        mascara[i, :n] = True
+
+    resultado = resolver_dpdu_matriz(
+        stock_cedi=np.asarray(stocks_cedi, dtype=float).reshape(P),
+        unidades_por_bulto=np.asarray(unidades_por_bulto, dtype=float).reshape(P),
+        demanda_p75=demanda,
+        dias_stock=dias_stock,
+        mascara=mascara,
+        config=config,
+    )
+    resultado.unidades_por_bulto = list(unidades_por_bulto)
+    resultado.datos_tiendas = [list(t) for t in datos_tiendas]
+    return resultado
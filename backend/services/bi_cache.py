@@ -0,0 +1,323 @@
+"""
+Cache de respuestas de los routers de BI.
+
+Los endpoints de /bi y /bi/stores corren agregaciones pesadas sobre ventas e
+inventario cuyo resultado solo cambia cuando termina un ETL o se refrescan
+las vistas materializadas. Este módulo guarda la respuesta serializada por
+(endpoint, parámetros normalizados, versión de datos):
+
+- La versión de datos es bi_data_version.version (migración 043), que el
+  ETL incrementa al cargar registros y POST /bi/admin/refresh-views después
+  de refrescar las vistas, más la fecha del día (los endpoints con ventanas
+  relativas a CURRENT_DATE cambian aunque no haya carga). Se relee de la BD
+  como máximo cada BI_DATA_VERSION_CHECK_SECONDS.
+- Al cambiar la versión se descartan las respuestas viejas y se recalculan
+  en segundo plano las BI_CACHE_WARM_MAX más usadas.
+- El cache es LRU acotado por cantidad de entradas y por bytes.
+- Cada respuesta lleva un ETag (hash del cuerpo, igual en todos los
+  workers) y Cache-Control: no-cache; si el navegador envía If-None-Match
+  con el mismo ETag se responde 304 sin cuerpo.
+
+Si bi_data_version no existe (migración sin aplicar) los endpoints responden
+sin cache.
+
+Configuración (env):
+    BI_CACHE_MAX_ENTRIES: respuestas en memoria por proceso (default 256; 0 = sin cache)
+    BI_CACHE_MAX_MB: tamaño máximo de las respuestas cacheadas (default 64)
+    BI_DATA_VERSION_CHECK_SECONDS: cada cuánto se relee la versión (default 30)
+    BI_CACHE_WARM_MAX: respuestas a recalcular tras un cambio de versión (default 20)
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+BI_CACHE_MAX_ENTRIES = int(os.getenv('BI_CACHE_MAX_ENTRIES', '256'))
+BI_CACHE_MAX_BYTES = int(float(os.getenv('BI_CACHE_MAX_MB', '64')) * 1024 * 1024)
+BI_DATA_VERSION_CHECK_SECONDS = float(os.getenv('BI_DATA_VERSION_CHECK_SECONDS', '30'))
+BI_CACHE_WARM_MAX = int(os.getenv('BI_CACHE_WARM_MAX', '20'))
+
+# Parámetros de los endpoints que no forman parte de la clave
+_PARAMS_EXCLUIDOS = {'current_user', 'conn'}
+
+ClaveCache = Tuple[str, tuple, str]
+
+
+@dataclass
+class EntradaCache:
+    """Respuesta serializada de un endpoint para una versión de datos."""
+    etag: str
+    cuerpo: bytes
+    kwargs: Dict[str, Any] = field(repr=False, default_factory=dict)  # para recalcular
+
+
+_cache: "OrderedDict[ClaveCache, EntradaCache]" = OrderedDict()
+_bytes_en_cache = 0
+_endpoints: Dict[str, Callable] = {}
+_version: Optional[str] = None
+_version_leida_en = 0.0
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0, 'cambios_version': 0, 'calentadas': 0}
+
+
+# =============================================================================
+# VERSIÓN DE DATOS
+# =============================================================================
+
+def leer_version_datos(conn) -> Optional[str]:
+    """
+    Versión de datos de BI desde la BD, o None si la tabla no existe. Si la
+    lectura falla hace rollback para no dejar abortada la transacción del
+    endpoint.
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM bi_data_version WHERE id = 1")
+        row = cursor.fetchone()
+        cursor.close()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer bi_data_version (BI sin cache): {e}")
+        conn.rollback()
+        return None
+    return str(row[0]) if row else '0'
+
+
+def version_datos(conn) -> Optional[str]:
+    """Versión vigente (releída de la BD cada BI_DATA_VERSION_CHECK_SECONDS)."""
+    global _version_leida_en
+    with _lock:
+        if _version is not None and time.monotonic() - _version_leida_en < BI_DATA_VERSION_CHECK_SECONDS:
+            return _token(_version)
+
+    version = leer_version_datos(conn)
+    if version is None:
+        return None
+    with _lock:
+        _version_leida_en = time.monotonic()
+    establecer_version_datos(version)
+    return _token(version)
+
+
+def establecer_version_datos(version: str) -> None:
+    """
+    Registra la versión de datos vigente. Si cambió, descarta las respuestas
+    cacheadas y recalcula en segundo plano las más usadas.
+    """
+    global _version, _version_leida_en
+    with _lock:
+        anterior = _version
+        _version = str(version)
+        _version_leida_en = time.monotonic()
+        if anterior is None or anterior == _version:
+            return
+        token = _token(_version)
+        _stats['cambios_version'] += 1
+        # Las más usadas (más recientes en el LRU) de la versión anterior
+        a_calentar = [(clave[0], entrada.kwargs) for clave, entrada in reversed(_cache.items())
+                      if clave[2] != token][:BI_CACHE_WARM_MAX]
+        for clave in [c for c in _cache if c[2] != token]:
+            _descartar(clave)
+
+    logger.info(f"🔄 BI data version {anterior} -> {version}: recalculando {len(a_calentar)} respuestas")
+    if a_calentar:
+        threading.Thread(
+            target=_calentar, args=(a_calentar, token), name="bi-cache-warm", daemon=True
+        ).start()
+
+
+def _token(version: str) -> str:
+    return f"{version}:{date.today().isoformat()}"
+
+
+# =============================================================================
+# CACHE
+# =============================================================================
+
+def normalizar_params(kwargs: Dict[str, Any]) -> tuple:
+    """Parámetros del endpoint como tupla ordenada y hasheable."""
+    normalizados = []
+    for nombre in sorted(kwargs):
+        if nombre in _PARAMS_EXCLUIDOS:
+            continue
+        valor = kwargs[nombre]
+        if isinstance(valor, str):
+            valor = valor.strip()
+        elif isinstance(valor, (list, tuple, set)):
+            valor = tuple(valor)
+        normalizados.append((nombre, valor))
+    return tuple(normalizados)
+
+
+def serializar(contenido: Any) -> EntradaCache:
+    """JSON igual al de JSONResponse de FastAPI + ETag del cuerpo."""
+    cuerpo = json.dumps(
+        jsonable_encoder(contenido), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+    return EntradaCache(etag=f'"{hashlib.sha1(cuerpo).hexdigest()}"', cuerpo=cuerpo)
+
+
+def _descartar(clave: ClaveCache) -> None:
+    global _bytes_en_cache
+    entrada = _cache.pop(clave)
+    _bytes_en_cache -= len(entrada.cuerpo)
+
+
+def _obtener(clave: ClaveCache) -> Optional[EntradaCache]:
+    with _lock:
+        entrada = _cache.get(clave)
+        if entrada is None:
+            _stats['misses'] += 1
+            return None
+        _cache.move_to_end(clave)
+        _stats['hits'] += 1
+        return entrada
+
+
+def _guardar(clave: ClaveCache, entrada: EntradaCache) -> None:
+    global _bytes_en_cache
+    if len(entrada.cuerpo) > BI_CACHE_MAX_BYTES:
+        return
+    with _lock:
+        if clave[2] != _token(_version):
+            return  # la versión cambió mientras se calculaba
+        if clave in _cache:
+            _descartar(clave)
+        _cache[clave] = entrada
+        _bytes_en_cache += len(entrada.cuerpo)
+        while len(_cache) > BI_CACHE_MAX_ENTRIES or _bytes_en_cache > BI_CACHE_MAX_BYTES:
+            _descartar(next(iter(_cache)))
+            _stats['evictions'] += 1
+
+
+def _etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    etags = [e.strip() for e in if_none_match.split(',')]
+    return '*' in etags or etag in etags or f"W/{etag}" in etags
+
+
+def responder(entrada: EntradaCache, if_none_match: Optional[str] = None) -> Response:
+    """Respuesta JSON con ETag, o 304 si el cliente ya tiene ese cuerpo."""
+    headers = {'ETag': entrada.etag, 'Cache-Control': 'private, no-cache'}
+    if _etag_coincide(if_none_match, entrada.etag):
+        with _lock:
+            _stats['not_modified'] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=entrada.cuerpo, media_type='application/json', headers=headers)
+
+
+def _calentar(pendientes: List[Tuple[str, Dict[str, Any]]], token: str) -> None:
+    """Recalcula respuestas de la versión anterior para la versión `token`."""
+    from db_manager import get_db_connection
+
+    calentadas = 0
+    try:
+        with get_db_connection() as conn:
+            for nombre, kwargs in pendientes:
+                if token != _token(_version):
+                    break  # llegó otra versión: sus propias respuestas se recalculan aparte
+                func = _endpoints.get(nombre)
+                if func is None:
+                    continue
+                try:
+                    resultado = func(**kwargs, current_user=None, conn=conn)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo recalcular {nombre} para el cache BI: {e}")
+                    conn.rollback()
+                    continue
+                if isinstance(resultado, Response):
+                    continue
+                entrada = serializar(resultado)
+                entrada.kwargs = kwargs
+                _guardar((nombre, normalizar_params(kwargs), token), entrada)
+                calentadas += 1
+    except Exception as e:
+        logger.warning(f"⚠️ Error recalculando el cache BI: {e}")
+
+    with _lock:
+        _stats['calentadas'] += calentadas
+    logger.info(f"🔥 Cache BI: {calentadas}/{len(pendientes)} respuestas recalculadas")
+
+
+def cache_bi(func: Callable) -> Callable:
+    """
+    Decorator para endpoints síncronos de BI (va debajo de @db_offload).
+    Agrega el header If-None-Match a la firma del endpoint y responde desde
+    el cache mientras no cambie la versión de datos.
+
+    Usage:
+        @router.get("/network/kpis")
+        @db_offload
+        @cache_bi
+        def get_network_kpis(..., conn: Any = Depends(get_db)):
+            ...
+    """
+    nombre = f"{func.__module__}.{func.__name__}"
+    _endpoints[nombre] = func
+    firma = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, if_none_match: Optional[str] = None, **kwargs):
+        conn = kwargs.get('conn')
+        version = version_datos(conn) if conn is not None and BI_CACHE_MAX_ENTRIES > 0 else None
+        if version is None:
+            return func(*args, **kwargs)
+
+        clave = (nombre, normalizar_params(kwargs), version)
+        entrada = _obtener(clave)
+        if entrada is None:
+            resultado = func(*args, **kwargs)
+            if isinstance(resultado, Response):
+                return resultado
+            entrada = serializar(resultado)
+            entrada.kwargs = {k: v for k, v in kwargs.items() if k not in _PARAMS_EXCLUIDOS}
+            _guardar(clave, entrada)
+        return responder(entrada, if_none_match)
+
+    wrapper.__signature__ = firma.replace(parameters=[
+        *firma.parameters.values(),
+        inspect.Parameter('if_none_match', inspect.Parameter.KEYWORD_ONLY,
+                          default=Header(None), annotation=Optional[str]),
+    ])
+    return wrapper
+
+
+def invalidar_cache_bi() -> int:
+    """Descarta todas las respuestas cacheadas. Retorna cuántas había."""
+    with _lock:
+        cantidad = len(_cache)
+        for clave in list(_cache):
+            _descartar(clave)
+        return cantidad
+
+
+def get_bi_cache_stats() -> Dict:
+    """Métricas del cache BI del worker actual."""
+    with _lock:
+        return {
+            'max_entries': BI_CACHE_MAX_ENTRIES,
+            'max_mb': round(BI_CACHE_MAX_BYTES / 1024 / 1024, 1),
+            'entries': len(_cache),
+            'mb': round(_bytes_en_cache / 1024 / 1024, 2),
+            'data_version': _version,
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'not_modified': _stats['not_modified'],
+            'evictions': _stats['evictions'],
+            'cambios_version': _stats['cambios_version'],
+            'calentadas': _stats['calentadas'],
+        }
@@ -0,0 +1,348 @@
+"""
+Cache stale-while-revalidate compartido entre workers.
+
+Para endpoints caros sin parámetros (summary-regional de inventario tarda
+~25 s, resumen de ventas) que antes tenían un cache en memoria con TTL por
+worker: el primer usuario después del vencimiento pagaba el cálculo y cada
+worker/task de Fargate tenía su propia copia.
+
+- La copia vigente vive en cache_respuestas (migración 046), compartida por
+  todos los workers. Cada worker la relee como máximo cada
+  SWR_CACHE_CHECK_SECONDS y la sirve desde memoria.
+- Una respuesta vencida (TTL, o bi_data_version distinta de la que se usó
+  al calcularla: el ETL la incrementa al terminar) se sigue sirviendo
+  mientras se recalcula en segundo plano. El lease
+  cache_respuestas.refrescando_desde hace que la recalcule un solo worker.
+- Un hilo por worker revisa los caches registrados y los refresca sin
+  esperar a que llegue un request (SWR_CACHE_REFRESCO_AUTOMATICO).
+- Solo un request que encuentra el cache vacío en todos los workers espera
+  el cálculo (o a que termine el worker que tiene el lease).
+
+Si cache_respuestas no existe (migración sin aplicar) o la BD falla, cada
+worker mantiene su copia local con el mismo comportamiento y reintenta el
+store compartido al minuto.
+
+Configuración (env):
+    SWR_CACHE_CHECK_SECONDS: cada cuánto se relee la copia compartida (default 15)
+    SWR_CACHE_LEASE_SECONDS: duración máxima de un recálculo antes de que otro worker lo retome (default 300)
+    SWR_CACHE_REFRESCO_AUTOMATICO: refrescar en segundo plano sin requests (default true)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from db_manager import get_db_connection, get_db_connection_write
+
+logger = logging.getLogger(__name__)
+
+SWR_CACHE_CHECK_SECONDS = float(os.getenv('SWR_CACHE_CHECK_SECONDS', '15'))
+SWR_CACHE_LEASE_SECONDS = int(os.getenv('SWR_CACHE_LEASE_SECONDS', '300'))
+SWR_CACHE_REFRESCO_AUTOMATICO = os.getenv('SWR_CACHE_REFRESCO_AUTOMATICO', 'true').lower() == 'true'
+
+# Tras un error del store compartido, segundos hasta reintentarlo
+_REINTENTO_COMPARTIDO_SEGUNDOS = 60
+# Máximo que un request con el cache vacío espera al worker que tiene el lease
+_ESPERA_MAXIMA_SEGUNDOS = 60
+
+
+@dataclass
+class EntradaSWR:
+    """Respuesta calculada (JSON) y cuándo (time.monotonic de este worker)."""
+    contenido: Any
+    calculado_en: float
+    version_datos: Optional[str] = None
+
+
+@dataclass
+class CacheSWR:
+    """Un endpoint cacheado: cómo calcularlo y su copia en este worker."""
+    nombre: str
+    calcular: Callable[[], Any]
+    ttl_segundos: float
+    entrada: Optional[EntradaSWR] = None
+    version_vigente: Optional[str] = None  # bi_data_version en la última lectura
+    leida_en: float = float('-inf')
+    refrescando: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def vencida(self) -> bool:
+        if self.entrada is None:
+            return True
+        if time.monotonic() - self.entrada.calculado_en >= self.ttl_segundos:
+            return True
+        return self.version_vigente is not None and self.entrada.version_datos != self.version_vigente
+
+
+_caches: Dict[str, CacheSWR] = {}
+_lock = threading.Lock()
+_compartido_deshabilitado_hasta = 0.0
+_hilo_refresco: Optional[threading.Thread] = None
+_stats = {'hits': 0, 'stale': 0, 'misses': 0, 'recalculos': 0, 'recalculos_otro_worker': 0, 'errores': 0}
+
+
+def registrar_cache_swr(nombre: str, calcular: Callable[[], Any], ttl_segundos: float) -> CacheSWR:
+    """
+    Registra un endpoint cacheado. `calcular` no recibe parámetros, abre su
+    propia conexión y retorna algo serializable con jsonable_encoder.
+    """
+    cache = CacheSWR(nombre=nombre, calcular=calcular, ttl_segundos=ttl_segundos)
+    _caches[nombre] = cache
+    return cache
+
+
+# =============================================================================
+# STORE COMPARTIDO (cache_respuestas)
+# =============================================================================
+
+def _compartido_activo() -> bool:
+    return time.monotonic() >= _compartido_deshabilitado_hasta
+
+
+def _deshabilitar_compartido(error: Exception) -> None:
+    global _compartido_deshabilitado_hasta
+    _compartido_deshabilitado_hasta = time.monotonic() + _REINTENTO_COMPARTIDO_SEGUNDOS
+    logger.warning(f"⚠️ cache_respuestas no disponible, usando cache local ({error})")
+
+
+def _leer_compartido(nombre: str) -> tuple:
+    """(contenido | None, edad en segundos, version_datos, versión vigente de bi_data_version)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.contenido,
+                   EXTRACT(EPOCH FROM (NOW() - c.calculado_en)),
+                   c.version_datos,
+                   v.version
+            FROM (SELECT %s::varchar AS clave) k
+            LEFT JOIN cache_respuestas c ON c.clave = k.clave AND c.contenido IS NOT NULL
+            LEFT JOIN bi_data_version v ON v.id = 1
+        """, (nombre,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row
+
+
+def _tomar_lease(nombre: str) -> bool:
+    """True si este worker queda a cargo del recálculo."""
+    with get_db_connection_write() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO cache_respuestas (clave, refrescando_desde)
+            VALUES (%s, NOW())
+            ON CONFLICT (clave) DO UPDATE SET refrescando_desde = NOW()
+            WHERE cache_respuestas.refrescando_desde IS NULL
+               OR cache_respuestas.refrescando_desde < NOW() - make_interval(secs => %s)
+            RETURNING clave
+        """, (nombre, SWR_CACHE_LEASE_SECONDS))
+        tomado = cursor.fetchone() is not None
+        conn.commit()
+        cursor.close()
+    return tomado
+
+
+def _guardar_compartido(nombre: str, contenido: Any, version: Optional[str], duracion_ms: int) -> None:
+    """Publica la respuesta y libera el lease."""
+    with get_db_connection_write() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO cache_respuestas (clave, contenido, version_datos, calculado_en, duracion_ms, refrescando_desde)
+            VALUES (%s, %s::jsonb, %s, NOW(), %s, NULL)
+            ON CONFLICT (clave) DO UPDATE SET
+                contenido = EXCLUDED.contenido,
+                version_datos = EXCLUDED.version_datos,
+                calculado_en = EXCLUDED.calculado_en,
+                duracion_ms = EXCLUDED.duracion_ms,
+                refrescando_desde = NULL
+        """, (nombre, json.dumps(contenido), version, duracion_ms))
+        conn.commit()
+        cursor.close()
+
+
+def _liberar_lease(nombre: str) -> None:
+    with get_db_connection_write() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE cache_respuestas SET refrescando_desde = NULL WHERE clave = %s", (nombre,))
+        conn.commit()
+        cursor.close()
+
+
+def _sincronizar(cache: CacheSWR, forzar: bool = False) -> None:
+    """Relee la copia compartida (y la versión de datos) si pasó el intervalo."""
+    if not _compartido_activo():
+        return
+    if not forzar and time.monotonic() - cache.leida_en < SWR_CACHE_CHECK_SECONDS:
+        return
+    try:
+        contenido, edad, version_datos, version_vigente = _leer_compartido(cache.nombre)
+    except Exception as e:
+        _deshabilitar_compartido(e)
+        return
+
+    ahora = time.monotonic()
+    cache.leida_en = ahora
+    cache.version_vigente = str(version_vigente) if version_vigente is not None else None
+    if contenido is None:
+        return
+    calculado_en = ahora - float(edad)
+    # Solo si es más nueva que la local (la local puede no haberse podido publicar)
+    if cache.entrada is None or calculado_en > cache.entrada.calculado_en + 1:
+        cache.entrada = EntradaSWR(contenido, calculado_en, version_datos)
+
+
+# =============================================================================
+# RECÁLCULO
+# =============================================================================
+
+def _recalcular(cache: CacheSWR, esperar_otro_worker: bool) -> bool:
+    """
+    Recalcula la respuesta y la publica. Si otro worker tiene el lease:
+    con esperar_otro_worker=False no hace nada; con True espera su
+    resultado (hasta _ESPERA_MAXIMA_SEGUNDOS) y, si no llega, calcula.
+
+    Returns:
+        True si este worker recalculó
+    """
+    compartido = _compartido_activo()
+    if compartido:
+        try:
+            tomado = _tomar_lease(cache.nombre)
+        except Exception as e:
+            _deshabilitar_compartido(e)
+            compartido = tomado = False
+        if compartido and not tomado:
+            if not esperar_otro_worker:
+                return False
+            limite = time.monotonic() + _ESPERA_MAXIMA_SEGUNDOS
+            while time.monotonic() < limite:
+                time.sleep(1)
+                _sincronizar(cache, forzar=True)
+                if cache.entrada is not None:
+                    with _lock:
+                        _stats['recalculos_otro_worker'] += 1
+                    return False
+
+    version = cache.version_vigente
+    inicio = time.monotonic()
+    try:
+        contenido = jsonable_encoder(cache.calcular())
+    except Exception:
+        with _lock:
+            _stats['errores'] += 1
+        if compartido:
+            try:
+                _liberar_lease(cache.nombre)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo liberar el lease de {cache.nombre}: {e}")
+        raise
+    duracion_ms = int((time.monotonic() - inicio) * 1000)
+
+    cache.entrada = EntradaSWR(contenido, time.monotonic(), version)
+    with _lock:
+        _stats['recalculos'] += 1
+    logger.info(f"✅ Cache {cache.nombre} recalculado en {duracion_ms} ms (data version {version})")
+
+    if compartido:
+        try:
+            _guardar_compartido(cache.nombre, contenido, version, duracion_ms)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo publicar {cache.nombre} en cache_respuestas: {e}")
+    return True
+
+
+def _refrescar_hilo(cache: CacheSWR) -> None:
+    try:
+        _recalcular(cache, esperar_otro_worker=False)
+    except Exception as e:
+        logger.error(f"❌ Error recalculando {cache.nombre} en segundo plano: {e}")
+    finally:
+        cache.refrescando = False
+
+
+def refrescar_en_segundo_plano(nombre: str) -> bool:
+    """Lanza el recálculo en un hilo si no hay uno en curso en este worker."""
+    cache = _caches[nombre]
+    with _lock:
+        if cache.refrescando:
+            return False
+        cache.refrescando = True
+    threading.Thread(target=_refrescar_hilo, args=(cache,), name=f"swr-{nombre}", daemon=True).start()
+    return True
+
+
+def obtener_cache_swr(nombre: str) -> Any:
+    """
+    Respuesta cacheada de `nombre` (JSON). Si está vencida la sirve igual y
+    dispara el recálculo en segundo plano; solo bloquea si no existe ninguna.
+    """
+    cache = _caches[nombre]
+    _sincronizar(cache)
+
+    if cache.entrada is None:
+        with cache.lock:
+            _sincronizar(cache, forzar=True)
+            if cache.entrada is None:
+                with _lock:
+                    _stats['misses'] += 1
+                logger.info(f"🔄 CACHE MISS: {nombre} (sin copia en ningún worker)")
+                _recalcular(cache, esperar_otro_worker=True)
+        return cache.entrada.contenido
+
+    entrada = cache.entrada
+    if cache.vencida():
+        with _lock:
+            _stats['stale'] += 1
+        refrescar_en_segundo_plano(nombre)
+    else:
+        with _lock:
+            _stats['hits'] += 1
+    return entrada.contenido
+
+
+def _bucle_refresco() -> None:
+    while True:
+        for cache in list(_caches.values()):
+            try:
+                _sincronizar(cache)
+                if cache.vencida():
+                    refrescar_en_segundo_plano(cache.nombre)
+            except Exception as e:
+                logger.warning(f"⚠️ Error revisando el cache {cache.nombre}: {e}")
+        time.sleep(SWR_CACHE_CHECK_SECONDS)
+
+
+def iniciar_refresco_automatico() -> None:
+    """Arranca (una vez por worker) el hilo que refresca los caches vencidos."""
+    global _hilo_refresco
+    if not SWR_CACHE_REFRESCO_AUTOMATICO or _hilo_refresco is not None:
+        return
+    _hilo_refresco = threading.Thread(target=_bucle_refresco, name="swr-refresco", daemon=True)
+    _hilo_refresco.start()
+    logger.info(f"🔁 Refresco automático de caches SWR: {', '.join(_caches) or 'ninguno'}")
+
+
+def get_swr_cache_stats() -> Dict:
+    """Métricas de los caches SWR del worker actual."""
+    ahora = time.monotonic()
+    with _lock:
+        return {
+            'compartido': _compartido_activo(),
+            'check_seconds': SWR_CACHE_CHECK_SECONDS,
+            'caches': {
+                nombre: {
+                    'ttl_segundos': cache.ttl_segundos,
+                    'edad_segundos': round(ahora - cache.entrada.calculado_en, 1) if cache.entrada else None,
+                    'version_datos': cache.entrada.version_datos if cache.entrada else None,
+                    'version_vigente': cache.version_vigente,
+                    'vencida': cache.vencida(),
+                    'refrescando': cache.refrescando,
+                }
+                for nombre, cache in _caches.items()
+            },
+            **_stats,
+        }
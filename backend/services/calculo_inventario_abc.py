@@ -12,7 +12,8 @@ Caracteristicas:
 """
 import math
 from dataclasses import dataclass, field
-from typing import List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
 
@@ -109,6 +110,32 @@ class ConfigTiendaABC:
     dias_cobertura_d: int = 30
 
 
+@lru_cache(maxsize=64)
+def _params_abc_cacheados(dias_cobertura: Tuple[int, int, int, int]) -> Dict[str, ParametrosABC]:
+    dias_a, dias_b, dias_c, dias_d = dias_cobertura
+    return {
+        'A': ParametrosABC(nivel_servicio_z=2.33, dias_cobertura=dias_a, metodo=MetodoCalculo.ESTADISTICO),
+        'B': ParametrosABC(nivel_servicio_z=1.88, dias_cobertura=dias_b, metodo=MetodoCalculo.ESTADISTICO),
+        'C': ParametrosABC(nivel_servicio_z=1.28, dias_cobertura=dias_c, metodo=MetodoCalculo.ESTADISTICO),
+        'D': ParametrosABC(nivel_servicio_z=0.0, dias_cobertura=dias_d, metodo=MetodoCalculo.PADRE_PRUDENTE),
+    }
+
+
+def params_abc_para_config(config: ConfigTiendaABC) -> Dict[str, ParametrosABC]:
+    """
+    Parametros ABC para una config de tienda, sin mutar los globals.
+
+    Cacheado por dias de cobertura: calcular_inventario() se invoca miles
+    de veces por tienda con la misma config. No mutar el dict retornado.
+    """
+    return _params_abc_cacheados((
+        config.dias_cobertura_a,
+        config.dias_cobertura_b,
+        config.dias_cobertura_c,
+        config.dias_cobertura_d,
+    ))
+
+
 def set_config_tienda(config: Optional[ConfigTiendaABC] = None):
     """
     Configura los parámetros ABC para una tienda específica.
@@ -423,12 +450,7 @@ def calcular_inventario(input_data: InputCalculo, dias_cobertura_override: Optio
 
     # Usar params de config_tienda si se proporcionó (thread-safe), sino usar globals
     if config_tienda is not None:
-        params_abc_local = {
-            'A': ParametrosABC(nivel_servicio_z=2.33, dias_cobertura=config_tienda.dias_cobertura_a, metodo=MetodoCalculo.ESTADISTICO),
-            'B': ParametrosABC(nivel_servicio_z=1.88, dias_cobertura=config_tienda.dias_cobertura_b, metodo=MetodoCalculo.ESTADISTICO),
-            'C': ParametrosABC(nivel_servicio_z=1.28, dias_cobertura=config_tienda.dias_cobertura_c, metodo=MetodoCalculo.ESTADISTICO),
-            'D': ParametrosABC(nivel_servicio_z=0.0, dias_cobertura=config_tienda.dias_cobertura_d, metodo=MetodoCalculo.PADRE_PRUDENTE),
-        }
+        params_abc_local = params_abc_para_config(config_tienda)
         params = params_abc_local.get(clase_efectiva, params_abc_local['B'])
         lead_time = config_tienda.lead_time
     else:
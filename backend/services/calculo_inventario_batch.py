@@ -0,0 +1,255 @@
+"""
+Calculo vectorizado (NumPy) de parametros de inventario por clasificacion ABC.
+
+Version batch de calculo_inventario_abc.calcular_inventario: recibe columnas
+(un elemento por SKU) y calcula stock minimo / seguridad / maximo / cantidad
+sugerida de todo el surtido de una tienda en una sola pasada.
+
+Replica exactamente la logica escalar (mismas formulas, mismo orden de
+operaciones de punto flotante, mismo redondeo a bultos). Los tests en
+tests/test_calculo_inventario_batch.py comparan ambas implementaciones.
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+import numpy as np
+
+from services import calculo_inventario_abc as abc
+from services.calculo_inventario_abc import (
+    ConfigTiendaABC,
+    InputCalculo,
+    MetodoCalculo,
+    ResultadoCalculo,
+)
+
+
+@dataclass
+class ResultadoCalculoBatch:
+    """Resultado del calculo batch: un array por campo de ResultadoCalculo."""
+    # Valores en UNIDADES
+    stock_minimo_unid: np.ndarray
+    stock_seguridad_unid: np.ndarray
+    stock_maximo_unid: np.ndarray
+    punto_reorden_unid: np.ndarray
+    cantidad_sugerida_unid: np.ndarray
+
+    # Valores en BULTOS
+    stock_minimo_bultos: np.ndarray
+    stock_seguridad_bultos: np.ndarray
+    stock_maximo_bultos: np.ndarray
+    punto_reorden_bultos: np.ndarray
+    cantidad_sugerida_bultos: np.ndarray
+
+    # Metadata
+    metodo_usado: np.ndarray
+    clase_efectiva: np.ndarray
+    demanda_ciclo: np.ndarray
+    dias_cobertura_actual: np.ndarray
+
+    # Sobrestock
+    tiene_sobrestock: np.ndarray
+    exceso_unidades: np.ndarray
+    exceso_bultos: np.ndarray
+    dias_exceso: np.ndarray
+
+    # Columnas de entrada (para reconstruir InputCalculo / warnings por fila)
+    entradas: dict = field(repr=False, default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.stock_maximo_unid)
+
+    def fila(self, i: int) -> ResultadoCalculo:
+        """
+        Reconstruye el ResultadoCalculo escalar de la fila i, incluyendo
+        los warnings de sanity checks (que solo se calculan bajo demanda).
+        """
+        resultado = ResultadoCalculo(
+            stock_minimo_unid=float(self.stock_minimo_unid[i]),
+            stock_seguridad_unid=float(self.stock_seguridad_unid[i]),
+            stock_maximo_unid=float(self.stock_maximo_unid[i]),
+            punto_reorden_unid=float(self.punto_reorden_unid[i]),
+            cantidad_sugerida_unid=float(self.cantidad_sugerida_unid[i]),
+            stock_minimo_bultos=int(self.stock_minimo_bultos[i]),
+            stock_seguridad_bultos=int(self.stock_seguridad_bultos[i]),
+            stock_maximo_bultos=int(self.stock_maximo_bultos[i]),
+            punto_reorden_bultos=int(self.punto_reorden_bultos[i]),
+            cantidad_sugerida_bultos=int(self.cantidad_sugerida_bultos[i]),
+            metodo_usado=str(self.metodo_usado[i]),
+            clase_efectiva=self.clase_efectiva[i],
+            demanda_ciclo=float(self.demanda_ciclo[i]),
+            dias_cobertura_actual=float(self.dias_cobertura_actual[i]),
+            tiene_sobrestock=bool(self.tiene_sobrestock[i]),
+            exceso_unidades=float(self.exceso_unidades[i]),
+            exceso_bultos=int(self.exceso_bultos[i]),
+            dias_exceso=float(self.dias_exceso[i]),
+            warnings=[],
+        )
+        input_data = InputCalculo(**{
+            campo: valores[i].item() if isinstance(valores[i], np.generic) else valores[i]
+            for campo, valores in self.entradas.items()
+        })
+        resultado.warnings = abc._ejecutar_sanity_checks(resultado, input_data, input_data.demanda_p75)
+        return resultado
+
+
+def _columna_float(valores, n: int, nombre: str) -> np.ndarray:
+    arr = np.asarray(valores, dtype=float)
+    if arr.ndim == 0:
+        arr = np.full(n, float(arr))
+    if arr.shape != (n,):
+        raise ValueError(f"{nombre}: se esperaban {n} elementos, recibidos {arr.shape}")
+    return arr
+
+
+def _dias_override(valores, n: int) -> Optional[np.ndarray]:
+    """Override de dias por SKU; None / NaN = usar los dias de la clase."""
+    if valores is None:
+        return None
+    if np.isscalar(valores):
+        return np.full(n, float(valores))
+    return _columna_float([np.nan if v is None else v for v in valores], n, "dias_cobertura_override")
+
+
+def _ceil_bultos(cantidad: np.ndarray, unidades_bulto: np.ndarray, solo_positivas: bool = True) -> np.ndarray:
+    """
+    ceil(cantidad / unidades_bulto), con la misma guarda que la version escalar:
+    - solo_positivas (stock minimo, seguridad, maximo, ROP): 0 si unidades_bulto <= 0
+    - sin ella (cantidad sugerida, exceso): se divide tambien por negativos;
+      el 0 lo rechaza el llamador antes (ZeroDivisionError en la escalar)
+    """
+    validas = unidades_bulto > 0 if solo_positivas else unidades_bulto != 0
+    division = np.divide(cantidad, unidades_bulto, out=np.zeros_like(cantidad), where=validas)
+    return np.ceil(division).astype(np.int64)
+
+
+def calcular_inventario_batch(
+    demanda_p75: Sequence[float],
+    sigma_demanda: Sequence[float],
+    demanda_maxima: Sequence[float],
+    unidades_por_bulto: Sequence[int],
+    stock_actual: Sequence[float],
+    stock_cedi: Sequence[float],
+    clase_abc: Sequence[str],
+    es_generador_trafico: Sequence[bool],
+    dias_cobertura_override=None,
+    config_tienda: Optional[ConfigTiendaABC] = None
+) -> ResultadoCalculoBatch:
+    """
+    Version vectorizada de calcular_inventario para N SKUs.
+
+    Args:
+        demanda_p75 ... es_generador_trafico: columnas de largo N (mismos
+            campos que InputCalculo).
+        dias_cobertura_override: escalar, o secuencia de largo N donde
+            None/NaN significa "usar dias de la clase ABC".
+        config_tienda: config explicita (thread-safe). Si es None se usan
+            los globals PARAMS_ABC / LEAD_TIME, igual que la version escalar.
+
+    Raises:
+        ZeroDivisionError: si algun SKU con cantidad sugerida o exceso > 0
+            tiene unidades_por_bulto = 0 (la version escalar falla igual).
+    """
+    clases = np.asarray(clase_abc, dtype=object)
+    n = len(clases)
+
+    D = _columna_float(demanda_p75, n, "demanda_p75")
+    sigma_D = _columna_float(sigma_demanda, n, "sigma_demanda")
+    D_max = _columna_float(demanda_maxima, n, "demanda_maxima")
+    unidades_bulto = _columna_float(unidades_por_bulto, n, "unidades_por_bulto")
+    stock = _columna_float(stock_actual, n, "stock_actual")
+    stock_cedi_arr = _columna_float(stock_cedi, n, "stock_cedi")
+    generador = np.asarray(es_generador_trafico, dtype=bool)
+    if generador.ndim == 0:
+        generador = np.full(n, bool(generador))
+
+    # Clase efectiva: generadores de trafico -> A
+    clase_efectiva = np.where(generador, 'A', clases).astype(object)
+
+    if config_tienda is not None:
+        params_abc = abc.params_abc_para_config(config_tienda)
+        L = config_tienda.lead_time
+    else:
+        params_abc = abc.PARAMS_ABC
+        L = abc.LEAD_TIME
+
+    # Parametros por SKU (clases desconocidas usan B, igual que .get(clase, PARAMS['B']))
+    default = params_abc['B']
+    Z = np.full(n, default.nivel_servicio_z)
+    dias = np.full(n, float(default.dias_cobertura))
+    padre_prudente = np.full(n, default.metodo == MetodoCalculo.PADRE_PRUDENTE)
+    for clase, params in params_abc.items():
+        mask = clase_efectiva == clase
+        Z[mask] = params.nivel_servicio_z
+        dias[mask] = params.dias_cobertura
+        padre_prudente[mask] = params.metodo == MetodoCalculo.PADRE_PRUDENTE
+
+    override = _dias_override(dias_cobertura_override, n)
+    if override is not None:
+        dias = np.where(np.isnan(override), dias, override)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        demanda_ciclo = D * L
+
+        # Estadistico (A, B, C): SS = Z * sigmaD * sqrt(L); minimo 30% de D*L si sigma = 0
+        ss_estadistico = np.where(sigma_D > 0, Z * sigma_D * math.sqrt(L), 0.30 * D * L)
+
+        # Padre Prudente (D): SS = D_max*L - D*L; minimo 20% de D*L si es 0
+        ss_pp_calculado = np.maximum(0, (D_max * L) - demanda_ciclo)
+        ss_padre_prudente = np.where(ss_pp_calculado > 0, ss_pp_calculado, 0.20 * demanda_ciclo)
+
+        stock_seguridad = np.where(padre_prudente, ss_padre_prudente, ss_estadistico)
+        punto_reorden = demanda_ciclo + stock_seguridad
+        stock_maximo = punto_reorden + (D * dias)
+
+        # Pedir hasta MAX solo si stock <= ROP
+        cantidad_sugerida = np.where(stock <= punto_reorden, np.maximum(0, stock_maximo - stock), 0.0)
+
+        exceso = stock - stock_maximo
+        tiene_sobrestock = exceso > 0
+
+        sin_bulto = unidades_bulto == 0
+        if np.any(sin_bulto & ((cantidad_sugerida > 0) | tiene_sobrestock)):
+            raise ZeroDivisionError("unidades_por_bulto = 0 con cantidad sugerida o exceso > 0")
+
+        cantidad_bultos = np.where(cantidad_sugerida <= 0, 0, _ceil_bultos(cantidad_sugerida, unidades_bulto, solo_positivas=False))
+        cantidad_unid_final = cantidad_bultos * unidades_bulto
+
+        dias_cobertura = np.where(D > 0, (stock + cantidad_unid_final) / D, 999.0)
+
+        exceso_unidades = np.where(tiene_sobrestock, exceso, 0.0)
+        exceso_bultos = np.where(tiene_sobrestock, _ceil_bultos(exceso, unidades_bulto, solo_positivas=False), 0)
+        dias_exceso = np.where(tiene_sobrestock, np.where(D > 0, exceso / D, 999.0), 0.0)
+
+    metodo = np.where(padre_prudente, MetodoCalculo.PADRE_PRUDENTE.value, MetodoCalculo.ESTADISTICO.value)
+
+    return ResultadoCalculoBatch(
+        stock_minimo_unid=punto_reorden,
+        stock_seguridad_unid=stock_seguridad,
+        stock_maximo_unid=stock_maximo,
+        punto_reorden_unid=punto_reorden,
+        cantidad_sugerida_unid=cantidad_unid_final,
+        stock_minimo_bultos=_ceil_bultos(punto_reorden, unidades_bulto),
+        stock_seguridad_bultos=_ceil_bultos(stock_seguridad, unidades_bulto),
+        stock_maximo_bultos=_ceil_bultos(stock_maximo, unidades_bulto),
+        punto_reorden_bultos=_ceil_bultos(punto_reorden, unidades_bulto),
+        cantidad_sugerida_bultos=cantidad_bultos.astype(np.int64),
+        metodo_usado=metodo,
+        clase_efectiva=clase_efectiva,
+        demanda_ciclo=demanda_ciclo,
+        dias_cobertura_actual=dias_cobertura,
+        tiene_sobrestock=tiene_sobrestock,
+        exceso_unidades=exceso_unidades,
+        exceso_bultos=exceso_bultos.astype(np.int64),
+        dias_exceso=dias_exceso,
+        entradas={
+            'demanda_p75': D,
+            'sigma_demanda': sigma_D,
+            'demanda_maxima': D_max,
+            'unidades_por_bulto': unidades_bulto,
+            'stock_actual': stock,
+            'stock_cedi': stock_cedi_arr,
+            'clase_abc': clases,
+            'es_generador_trafico': generador,
+        },
+    )
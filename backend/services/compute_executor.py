@@ -0,0 +1,113 @@
+"""
+Executor de cómputo (CPU) para cálculos pesados en Python puro.
+
+El post-procesamiento de pedidos multi-tienda (un loop por producto por
+tienda) queda serializado por el GIL si corre en threads. Este módulo
+expone un ProcessPoolExecutor compartido (uno por worker de uvicorn) para
+repartir ese trabajo entre cores.
+
+- Contexto "spawn": los procesos hijos no heredan conexiones psycopg2 ni
+  threads del padre (fork + threads = deadlocks).
+- Las funciones enviadas deben vivir en módulos livianos (sin FastAPI ni
+  db_manager) y recibir/retornar datos picklables.
+- Si el pool se rompe (OOM killer, crash de un hijo) se recrea y la tarea
+  se ejecuta en un thread como fallback.
+
+Configuración (env):
+    COMPUTE_EXECUTOR_MODE: "process" (default) | "thread" | "inline"
+    COMPUTE_EXECUTOR_WORKERS: procesos del pool (default: min(cpu_count, 8))
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+COMPUTE_EXECUTOR_MODE = os.getenv('COMPUTE_EXECUTOR_MODE', 'process').lower()
+COMPUTE_EXECUTOR_WORKERS = int(os.getenv('COMPUTE_EXECUTOR_WORKERS', str(min(os.cpu_count() or 1, 8))))
+
+_compute_executor: Optional[Executor] = None
+_compute_executor_pid: Optional[int] = None
+_compute_executor_lock = threading.Lock()
+
+
+def get_compute_mode() -> str:
+    """Modo efectivo del executor de cómputo (process | thread | inline)."""
+    if COMPUTE_EXECUTOR_MODE in ('process', 'thread', 'inline'):
+        return COMPUTE_EXECUTOR_MODE
+    return 'process'
+
+
+def _get_compute_executor() -> Optional[Executor]:
+    """Executor de cómputo compartido (uno por proceso, fork-safe)."""
+    global _compute_executor, _compute_executor_pid
+    mode = get_compute_mode()
+    if mode == 'inline':
+        return None
+
+    pid = os.getpid()
+    if _compute_executor is None or _compute_executor_pid != pid:
+        with _compute_executor_lock:
+            if _compute_executor is None or _compute_executor_pid != pid:
+                if mode == 'process':
+                    _compute_executor = ProcessPoolExecutor(
+                        max_workers=COMPUTE_EXECUTOR_WORKERS,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+                else:
+                    _compute_executor = ThreadPoolExecutor(
+                        max_workers=COMPUTE_EXECUTOR_WORKERS,
+                        thread_name_prefix="compute-worker",
+                    )
+                _compute_executor_pid = pid
+                logger.info(f"🧮 Compute executor iniciado: mode={mode}, workers={COMPUTE_EXECUTOR_WORKERS}")
+    return _compute_executor
+
+
+def _reset_compute_executor(executor: Executor) -> None:
+    """Descarta un executor roto para que la próxima llamada cree uno nuevo."""
+    global _compute_executor
+    with _compute_executor_lock:
+        if _compute_executor is executor:
+            _compute_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_in_compute_executor(func, *args):
+    """
+    Ejecuta `func(*args)` en el executor de cómputo sin bloquear el event loop.
+
+    En modo "process", func y args deben ser picklables (función a nivel de
+    módulo, datos planos). En modo "inline" se ejecuta en el thread pool por
+    defecto del loop.
+
+    Usage:
+        productos = await run_in_compute_executor(calcular_productos_tienda, datos, tienda_id, ...)
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_compute_executor()
+    if executor is None:
+        return await loop.run_in_executor(None, func, *args)
+
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool as e:
+        logger.error(f"❌ Compute executor roto ({e}); recreando y ejecutando en thread")
+        _reset_compute_executor(executor)
+        return await loop.run_in_executor(None, func, *args)
+
+
+def close_compute_executor() -> None:
+    """Apaga el executor de cómputo (shutdown de la app)."""
+    global _compute_executor, _compute_executor_pid
+    with _compute_executor_lock:
+        executor = _compute_executor
+        _compute_executor = None
+        _compute_executor_pid = None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
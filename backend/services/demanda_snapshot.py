@@ -0,0 +1,373 @@
+"""
+Snapshot de demanda (ventas diarias agregadas) por ubicación.
+
+Los endpoints de pedidos (sugeridos, multi-tienda, CEDI Caracas, inter-CEDI)
+calculan las mismas estadísticas de los últimos 20/30 días desde la tabla
+`ventas` en cada click. Este módulo las calcula UNA vez por
+(ubicacion_id, fecha_corte) y las deja en memoria del proceso:
+
+- P75 / promedio / top3 / días con venta (20 días)
+- Promedio 5 días
+- P75 / sigma / máximo / total (30 días)
+- Promedio por día de semana y detalle diario (30 días)
+
+Invalidación: el snapshot se descarta cuando cambia la fecha de corte
+(CURRENT_DATE de la BD) o cuando termina una nueva ejecución del ETL de
+ventas que toca fechas anteriores al corte (tabla etl_executions). La
+verificación es una query liviana que se hace como máximo cada
+DEMANDA_SNAPSHOT_CHECK_SECONDS segundos.
+
+Configuración (env):
+    DEMANDA_SNAPSHOT_ENABLED: "true" (default) | "false"
+    DEMANDA_SNAPSHOT_CHECK_SECONDS: frecuencia de verificación de versión (default 60)
+    DEMANDA_SNAPSHOT_MAX_AGE_SECONDS: edad máxima de un snapshot (default 21600)
+"""
+import logging
+import math
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEMANDA_SNAPSHOT_ENABLED = os.getenv('DEMANDA_SNAPSHOT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DEMANDA_SNAPSHOT_CHECK_SECONDS = float(os.getenv('DEMANDA_SNAPSHOT_CHECK_SECONDS', '60'))
+DEMANDA_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv('DEMANDA_SNAPSHOT_MAX_AGE_SECONDS', '21600'))
+
+DIAS_HISTORIA = 30
+DIAS_VENTANA_CORTA = 20
+DIAS_VENTANA_RECIENTE = 5
+
+# Mismo formato que TO_CHAR(fecha, 'Mon') de PostgreSQL
+_MESES_ABREV = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+@dataclass(frozen=True)
+class DemandaProducto:
+    """Estadísticas de demanda de un producto en una ubicación (solo lectura)."""
+    # Ventana 20 días
+    dias_con_venta_20d: int
+    total_20d: float
+    prom_20d: float
+    p75_20d: float
+    top3_20d: float
+    # Ventana 5 días
+    prom_5d: float
+    # Ventana 30 días
+    dias_con_venta_30d: int
+    total_30d: float
+    prom_30d: float
+    p75_30d: float
+    sigma_30d: float  # STDDEV muestral; 0 con 1 solo día
+    max_30d: float
+    # Promedio por día de semana (índice = DOW PostgreSQL: 0=Domingo ... 6=Sábado)
+    prom_dow: Tuple[float, ...]
+    # Detalle diario (fecha, cantidad) ordenado por fecha
+    ventas_diarias: Tuple[Tuple[date, float], ...]
+
+    def historico_dow(self) -> Dict[int, List[Dict]]:
+        """Detalle por DOW: {dow: [{fecha: "18 Dec", venta: 25.0}, ...]}"""
+        historico: Dict[int, List[Dict]] = {i: [] for i in range(7)}
+        for fecha, cantidad in self.ventas_diarias:
+            historico[dow_postgres(fecha)].append({
+                "fecha": f"{fecha.day:02d} {_MESES_ABREV[fecha.month - 1]}",
+                "venta": cantidad,
+            })
+        return historico
+
+
+@dataclass
+class SnapshotDemanda:
+    """Demanda de todos los productos de una ubicación a una fecha de corte."""
+    ubicacion_id: str
+    fecha_corte: date
+    version_etl: Optional[int]
+    creado_en: float
+    productos: Dict[str, DemandaProducto]
+
+    def get(self, producto_id: str) -> Optional[DemandaProducto]:
+        return self.productos.get(producto_id)
+
+    def __contains__(self, producto_id: str) -> bool:
+        return producto_id in self.productos
+
+    def __len__(self) -> int:
+        return len(self.productos)
+
+
+# =============================================================================
+# CÁLCULO DE ESTADÍSTICAS (misma semántica que las queries SQL originales)
+# =============================================================================
+
+def dow_postgres(fecha: date) -> int:
+    """EXTRACT(DOW FROM fecha): 0=Domingo ... 6=Sábado."""
+    return (fecha.weekday() + 1) % 7
+
+
+def percentil_75(valores: List[float]) -> float:
+    """PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY valor): interpolación lineal."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = 0.75 * (len(ordenados) - 1)
+    inferior = math.floor(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+def calcular_demanda_producto(ventas_diarias: Iterable[Tuple[date, float]], fecha_corte: date) -> DemandaProducto:
+    """
+    Calcula las estadísticas de un producto a partir de sus ventas diarias
+    (solo días con registros en `ventas`, como el GROUP BY de SQL).
+    """
+    diarias = tuple(sorted(ventas_diarias))
+    inicio_20d = fecha_corte - timedelta(days=DIAS_VENTANA_CORTA)
+    inicio_5d = fecha_corte - timedelta(days=DIAS_VENTANA_RECIENTE)
+
+    valores_30d = [cantidad for _, cantidad in diarias]
+    valores_20d = [cantidad for fecha, cantidad in diarias if fecha >= inicio_20d]
+    valores_5d = [cantidad for fecha, cantidad in diarias if fecha >= inicio_5d]
+
+    por_dow: Dict[int, List[float]] = defaultdict(list)
+    for fecha, cantidad in diarias:
+        por_dow[dow_postgres(fecha)].append(cantidad)
+
+    total_20d = sum(valores_20d)
+    total_30d = sum(valores_30d)
+    top3 = sorted(valores_20d, reverse=True)[:3]
+
+    return DemandaProducto(
+        dias_con_venta_20d=len(valores_20d),
+        total_20d=total_20d,
+        prom_20d=total_20d / len(valores_20d) if valores_20d else 0.0,
+        p75_20d=percentil_75(valores_20d),
+        top3_20d=sum(top3) / len(top3) if top3 else 0.0,
+        prom_5d=sum(valores_5d) / len(valores_5d) if valores_5d else 0.0,
+        dias_con_venta_30d=len(valores_30d),
+        total_30d=total_30d,
+        prom_30d=total_30d / len(valores_30d) if valores_30d else 0.0,
+        p75_30d=percentil_75(valores_30d),
+        sigma_30d=statistics.stdev(valores_30d) if len(valores_30d) > 1 else 0.0,
+        max_30d=max(valores_30d) if valores_30d else 0.0,
+        prom_dow=tuple(
+            sum(por_dow[d]) / len(por_dow[d]) if por_dow.get(d) else 0.0
+            for d in range(7)
+        ),
+        ventas_diarias=diarias,
+    )
+
+
+# =============================================================================
+# CACHE EN MEMORIA
+# =============================================================================
+
+_snapshots: Dict[Tuple[str, date], SnapshotDemanda] = {}
+_build_locks: Dict[Tuple[str, date], threading.Lock] = {}
+_lock = threading.Lock()
+_estado = {'fecha_corte': None, 'version_etl': None, 'verificado_en': 0.0}
+_stats = {'hits': 0, 'misses': 0, 'builds': 0, 'invalidaciones': 0, 'build_ms_total': 0.0}
+
+
+def _verificar_estado(conn) -> Tuple[date, Optional[int]]:
+    """
+    Fecha de corte (CURRENT_DATE de la BD) y versión del ETL de ventas.
+
+    La versión es el id de la última ejecución terminada del ETL de ventas
+    que cargó fechas anteriores al corte. Cachea el resultado por
+    DEMANDA_SNAPSHOT_CHECK_SECONDS para no consultar en cada request.
+    """
+    ahora = time.monotonic()
+    if _estado['fecha_corte'] is not None and ahora - _estado['verificado_en'] < DEMANDA_SNAPSHOT_CHECK_SECONDS:
+        return _estado['fecha_corte'], _estado['version_etl']
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT CURRENT_DATE")
+        fecha_corte = cursor.fetchone()[0]
+
+        version_etl = None
+        cursor.execute("SAVEPOINT demanda_snapshot_version")
+        try:
+            cursor.execute("""
+                SELECT COALESCE(MAX(id), 0)
+                FROM etl_executions
+                WHERE etl_name = 'ventas'
+                  AND status IN ('success', 'partial')
+                  AND finished_at IS NOT NULL
+                  AND (fecha_desde IS NULL OR fecha_desde < CURRENT_DATE)
+            """)
+            version_etl = int(cursor.fetchone()[0])
+            cursor.execute("RELEASE SAVEPOINT demanda_snapshot_version")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT demanda_snapshot_version")
+            logger.warning(f"No se pudo leer versión del ETL de ventas (snapshot expira por edad): {e}")
+    finally:
+        cursor.close()
+
+    with _lock:
+        cambio = (
+            _estado['fecha_corte'] is not None
+            and (fecha_corte != _estado['fecha_corte'] or version_etl != _estado['version_etl'])
+        )
+        _estado.update(fecha_corte=fecha_corte, version_etl=version_etl, verificado_en=ahora)
+        if cambio and _snapshots:
+            logger.info(f"🔄 Snapshot demanda invalidado: corte={fecha_corte}, versión ETL ventas={version_etl}")
+            _stats['invalidaciones'] += len(_snapshots)
+            _snapshots.clear()
+            _build_locks.clear()
+    return fecha_corte, version_etl
+
+
+def _construir_snapshot(conn, ubicacion_id: str, fecha_corte: date, version_etl: Optional[int]) -> SnapshotDemanda:
+    """Una query sobre el agregado diario `ventas_diarias` para toda la ubicación."""
+    inicio = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        # NOTA: Para tienda_18 (PARAISO) se excluye 2025-12-06 (inauguración con ventas atípicas)
+        cursor.execute("""
+            SELECT
+                producto_id,
+                fecha,
+                cantidad_vendida as total_dia
+            FROM ventas_diarias
+            WHERE ubicacion_id = %s
+              AND fecha >= %s
+              AND fecha < %s
+              AND NOT (ubicacion_id = 'tienda_18' AND fecha = '2025-12-06')
+        """, [ubicacion_id, fecha_corte - timedelta(days=DIAS_HISTORIA), fecha_corte])
+        ventas_por_producto: Dict[str, List[Tuple[date, float]]] = defaultdict(list)
+        for producto_id, fecha, total_dia in cursor.fetchall():
+            ventas_por_producto[producto_id].append((fecha, float(total_dia or 0)))
+    finally:
+        cursor.close()
+
+    snapshot = SnapshotDemanda(
+        ubicacion_id=ubicacion_id,
+        fecha_corte=fecha_corte,
+        version_etl=version_etl,
+        creado_en=time.monotonic(),
+        productos={
+            producto_id: calcular_demanda_producto(diarias, fecha_corte)
+            for producto_id, diarias in ventas_por_producto.items()
+        },
+    )
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    with _lock:
+        _stats['builds'] += 1
+        _stats['build_ms_total'] += duracion_ms
+    logger.info(f"📸 Snapshot demanda {ubicacion_id} ({fecha_corte}): {len(snapshot)} productos en {duracion_ms:.0f}ms")
+    return snapshot
+
+
+def obtener_snapshot_demanda(conn, ubicacion_id: str) -> SnapshotDemanda:
+    """
+    Snapshot de demanda de una ubicación (se construye en el primer uso
+    después de cada corrida del ETL de ventas y luego se sirve de memoria).
+
+    Usage:
+        snapshot = obtener_snapshot_demanda(conn, 'tienda_01')
+        demanda = snapshot.get(producto_id)
+        p75 = demanda.p75_20d if demanda else 0
+    """
+    fecha_corte, version_etl = _verificar_estado(conn)
+    if not DEMANDA_SNAPSHOT_ENABLED:
+        return _construir_snapshot(conn, ubicacion_id, fecha_corte, version_etl)
+
+    clave = (ubicacion_id, fecha_corte)
+    with _lock:
+        snapshot = _snapshots.get(clave)
+        if snapshot is not None and time.monotonic() - snapshot.creado_en < DEMANDA_SNAPSHOT_MAX_AGE_SECONDS:
+            _stats['hits'] += 1
+            return snapshot
+        build_lock = _build_locks.setdefault(clave, threading.Lock())
+
+    # Un solo build por clave aunque varios threads lo pidan a la vez
+    with build_lock:
+        with _lock:
+            snapshot = _snapshots.get(clave)
+            if snapshot is not None and time.monotonic() - snapshot.creado_en < DEMANDA_SNAPSHOT_MAX_AGE_SECONDS:
+                _stats['hits'] += 1
+                return snapshot
+            _stats['misses'] += 1
+        snapshot = _construir_snapshot(conn, ubicacion_id, fecha_corte, version_etl)
+        with _lock:
+            if _estado['fecha_corte'] == fecha_corte and _estado['version_etl'] == version_etl:
+                _snapshots[clave] = snapshot
+    return snapshot
+
+
+def obtener_snapshots_demanda(conn, ubicacion_ids: Iterable[str]) -> Dict[str, SnapshotDemanda]:
+    """Snapshots de varias ubicaciones: {ubicacion_id: SnapshotDemanda}."""
+    return {ubicacion_id: obtener_snapshot_demanda(conn, ubicacion_id) for ubicacion_id in ubicacion_ids}
+
+
+def agregar_demanda_regional(snapshots: Dict[str, SnapshotDemanda]) -> Dict[str, Dict[str, float]]:
+    """
+    Demanda regional por producto a partir de los snapshots de cada tienda
+    (ventana 30 días):
+
+    - p75_regional: suma de P75 de cada tienda
+    - p75_promedio_tienda: promedio de P75 entre tiendas con venta
+    - sigma_regional: raíz de la suma de varianzas
+    - demanda_maxima_regional: suma de máximos diarios
+    - cantidad_total: unidades vendidas en la región
+    - num_tiendas: tiendas con venta del producto
+    """
+    regional: Dict[str, Dict[str, float]] = {}
+    for snapshot in snapshots.values():
+        for producto_id, demanda in snapshot.productos.items():
+            acumulado = regional.get(producto_id)
+            if acumulado is None:
+                acumulado = regional[producto_id] = {
+                    'p75_regional': 0.0, 'varianza': 0.0, 'demanda_maxima_regional': 0.0,
+                    'cantidad_total': 0.0, 'num_tiendas': 0,
+                }
+            acumulado['p75_regional'] += demanda.p75_30d
+            acumulado['varianza'] += demanda.sigma_30d * demanda.sigma_30d
+            acumulado['demanda_maxima_regional'] += demanda.max_30d
+            acumulado['cantidad_total'] += demanda.total_30d
+            acumulado['num_tiendas'] += 1
+
+    for acumulado in regional.values():
+        acumulado['sigma_regional'] = math.sqrt(acumulado.pop('varianza'))
+        acumulado['p75_promedio_tienda'] = acumulado['p75_regional'] / acumulado['num_tiendas']
+    return regional
+
+
+def invalidar_snapshot_demanda(ubicacion_id: Optional[str] = None) -> int:
+    """
+    Descarta snapshots en memoria (todos, o solo los de una ubicación) y
+    fuerza a re-verificar la versión del ETL en el próximo uso.
+
+    Returns: cantidad de snapshots descartados
+    """
+    with _lock:
+        claves = [c for c in _snapshots if ubicacion_id is None or c[0] == ubicacion_id]
+        for clave in claves:
+            del _snapshots[clave]
+            _build_locks.pop(clave, None)
+        _estado['verificado_en'] = 0.0
+        _stats['invalidaciones'] += len(claves)
+    return len(claves)
+
+
+def get_snapshot_stats() -> Dict:
+    """Métricas del cache de snapshots de demanda (por proceso)."""
+    with _lock:
+        return {
+            'enabled': DEMANDA_SNAPSHOT_ENABLED,
+            'fecha_corte': str(_estado['fecha_corte']) if _estado['fecha_corte'] else None,
+            'version_etl': _estado['version_etl'],
+            'snapshots': sorted(c[0] for c in _snapshots),
+            'productos_total': sum(len(s) for s in _snapshots.values()),
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'builds': _stats['builds'],
+            'invalidaciones': _stats['invalidaciones'],
+            'build_avg_ms': round(_stats['build_ms_total'] / _stats['builds'], 1) if _stats['builds'] else 0.0,
+        }
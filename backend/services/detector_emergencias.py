@@ -9,10 +9,14 @@ Detecta situaciones críticas de inventario basándose en:
 """
 
 import logging
+import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, date, timedelta
 from decimal import Decimal
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, FrozenSet
 import psycopg2.extras
 
 from db_manager import get_db_connection, get_db_connection_write
@@ -60,6 +64,15 @@ UMBRAL_CRITICO_DEFAULT = Decimal("0.25")
 UMBRAL_INMINENTE_DEFAULT = Decimal("0.50")
 UMBRAL_ALERTA_DEFAULT = Decimal("0.75")
 
+# Scan concurrente: tiendas en paralelo (cada una usa sus propias conexiones del pool)
+EMERGENCIAS_SCAN_WORKERS = int(os.getenv('EMERGENCIAS_SCAN_WORKERS', '4'))
+# Scan incremental: cada cuánto forzar un scan completo de la tienda
+EMERGENCIAS_FULL_SCAN_MINUTES = float(os.getenv('EMERGENCIAS_FULL_SCAN_MINUTES', '60'))
+
+# Semanas de historia del mismo día de semana para baselines
+# (igual que BASELINE_VENTANA_DIAS en etl/core/ventas_horarias.py)
+SEMANAS_BASELINE = 4
+
 
 # =============================================================================
 # FUNCIONES DE CONFIGURACIÓN
@@ -291,6 +304,47 @@ def calcular_porcentaje_dia_transcurrido(hora_actual: int) -> Decimal:
     return min(total, Decimal("1.0"))
 
 
+def dia_semana_pg(fecha: date) -> int:
+    """Día de semana con la convención de PostgreSQL DOW (0=domingo ... 6=sábado)."""
+    return (fecha.weekday() + 1) % 7
+
+
+def fechas_mismo_dia_semana(fecha: date, semanas: int = SEMANAS_BASELINE) -> List[date]:
+    """Las `semanas` fechas anteriores a `fecha` que caen en su mismo día de semana."""
+    return [fecha - timedelta(days=7 * i) for i in range(1, semanas + 1)]
+
+
+def _promedio_venta_mismo_dia_semana(cursor, ubicacion_id: str, fecha: date) -> Decimal:
+    """
+    Venta diaria promedio de la tienda en el mismo día de semana (días con
+    ventas de las últimas 4 semanas). Usa el baseline que precalcula el ETL
+    (ventas_baseline_tienda_dow) si tiene corte `fecha`; si no, lo calcula
+    sobre ventas_diarias para las 4 fechas exactas.
+    """
+    cursor.execute("""
+        SELECT promedio_venta_dia
+        FROM ventas_baseline_tienda_dow
+        WHERE ubicacion_id = %s
+          AND dia_semana = %s
+          AND fecha_corte = %s
+    """, (ubicacion_id, dia_semana_pg(fecha), fecha))
+    row = cursor.fetchone()
+    if row:
+        return Decimal(str(row[0] or 0))
+
+    cursor.execute("""
+        SELECT COALESCE(AVG(total_dia), 0) AS promedio_dia
+        FROM (
+            SELECT fecha, SUM(venta_total) AS total_dia
+            FROM ventas_diarias
+            WHERE ubicacion_id = %s
+              AND fecha = ANY(%s)
+            GROUP BY fecha
+        ) sub
+    """, (ubicacion_id, fechas_mismo_dia_semana(fecha)))
+    return Decimal(str(cursor.fetchone()[0] or 0))
+
+
 def calcular_factor_intensidad(
     ubicacion_id: str,
     fecha: date = None
@@ -316,47 +370,19 @@ def calcular_factor_intensidad(
     hora_actual = datetime.now().hour
     pct_dia = calcular_porcentaje_dia_transcurrido(hora_actual)
 
-    # Obtener ventas del mismo día de la semana en últimas 4 semanas
-    dia_semana = fecha.weekday()  # 0=Lunes, 6=Domingo
-
-    query_historico = """
-        SELECT COALESCE(AVG(total_dia), 0) AS promedio_dia
-        FROM (
-            SELECT
-                fecha_venta::date AS dia,
-                SUM(venta_total) AS total_dia
-            FROM ventas
-            WHERE ubicacion_id = %s
-              AND EXTRACT(DOW FROM fecha_venta) = %s
-              AND fecha_venta >= %s
-              AND fecha_venta < %s
-            GROUP BY fecha_venta::date
-        ) sub
-    """
-
-    query_hoy = """
-        SELECT COALESCE(SUM(venta_total), 0) AS total_hoy
-        FROM ventas
-        WHERE ubicacion_id = %s
-          AND fecha_venta::date = %s
-    """
-
-    fecha_inicio = fecha - timedelta(days=28)  # 4 semanas atrás
-
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        # Promedio histórico del mismo día de semana
-        cursor.execute(query_historico, (
-            ubicacion_id,
-            dia_semana,
-            fecha_inicio,
-            fecha
-        ))
-        promedio_dia = Decimal(str(cursor.fetchone()[0] or 0))
+        # Promedio histórico del mismo día de semana (últimas 4 semanas)
+        promedio_dia = _promedio_venta_mismo_dia_semana(cursor, ubicacion_id, fecha)
 
         # Ventas de hoy
-        cursor.execute(query_hoy, (ubicacion_id, fecha))
+        cursor.execute("""
+            SELECT COALESCE(SUM(venta_total), 0) AS total_hoy
+            FROM ventas_diarias
+            WHERE ubicacion_id = %s
+              AND fecha = %s
+        """, (ubicacion_id, fecha))
         ventas_hoy = Decimal(str(cursor.fetchone()[0] or 0))
 
         cursor.close()
@@ -501,30 +527,31 @@ def guardar_anomalias(anomalias: List[AnomaliaDetectada], scan_id: str):
             estado,
             fecha_deteccion,
             scan_id
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
+        ) VALUES %s
     """
 
+    ahora = datetime.now()
+    filas = [
+        (
+            a.ubicacion_id,
+            a.producto_id,
+            a.almacen_codigo,
+            a.tipo_anomalia.value,
+            a.valor_detectado,
+            a.valor_esperado,
+            a.desviacion_porcentual,
+            a.descripcion,
+            a.severidad.value,
+            EstadoAnomalia.PENDIENTE.value,
+            ahora,
+            scan_id
+        )
+        for a in anomalias
+    ]
+
     with get_db_connection_write() as conn:
         cursor = conn.cursor()
-
-        for a in anomalias:
-            cursor.execute(query, (
-                a.ubicacion_id,
-                a.producto_id,
-                a.almacen_codigo,
-                a.tipo_anomalia.value,
-                a.valor_detectado,
-                a.valor_esperado,
-                a.desviacion_porcentual,
-                a.descripcion,
-                a.severidad.value,
-                EstadoAnomalia.PENDIENTE.value,
-                datetime.now(),
-                scan_id
-            ))
-
+        psycopg2.extras.execute_values(cursor, query, filas, page_size=1000)
         conn.commit()
         cursor.close()
 
@@ -535,20 +562,403 @@ def guardar_anomalias(anomalias: List[AnomaliaDetectada], scan_id: str):
 # DETECCIÓN PRINCIPAL DE EMERGENCIAS
 # =============================================================================
 
+_QUERY_PRODUCTOS_TIENDA = """
+    WITH stock_tienda AS (
+        SELECT
+            producto_id,
+            SUM(cantidad) AS stock_actual,
+            MAX(almacen_codigo) AS almacen_codigo
+        FROM inventario_actual
+        WHERE ubicacion_id = %(ubicacion_id)s
+          {filtro_stock}
+        GROUP BY producto_id
+    ),
+    ventas_hoy AS (
+        SELECT
+            producto_id,
+            cantidad_vendida
+        FROM ventas_diarias
+        WHERE ubicacion_id = %(ubicacion_id)s
+          AND fecha = %(fecha_hoy)s
+          {filtro_ventas}
+    ),
+    demanda_promedio AS (
+        SELECT
+            producto_id,
+            AVG(cantidad_vendida) AS demanda_diaria_promedio
+        FROM ventas_diarias
+        WHERE ubicacion_id = %(ubicacion_id)s
+          AND fecha >= %(fecha_inicio_historico)s
+          {filtro_ventas}
+        GROUP BY producto_id
+    ),
+    abc_productos AS (
+        SELECT
+            puc.producto_id,
+            puc.clase_abc
+        FROM productos_abc_tienda puc
+        WHERE puc.ubicacion_id = %(ubicacion_id)s
+    )
+    SELECT
+        p.id AS producto_id,
+        p.nombre AS nombre_producto,
+        p.categoria,
+        COALESCE(abc.clase_abc, 'D') AS clase_abc,
+        COALESCE(s.stock_actual, 0) AS stock_actual,
+        s.almacen_codigo,
+        COALESCE(v.cantidad_vendida, 0) AS ventas_hoy,
+        COALESCE(d.demanda_diaria_promedio, 0) AS demanda_diaria_promedio
+    FROM productos p
+    LEFT JOIN stock_tienda s ON p.id = s.producto_id
+    LEFT JOIN ventas_hoy v ON p.id = v.producto_id
+    LEFT JOIN demanda_promedio d ON p.id = d.producto_id
+    LEFT JOIN abc_productos abc ON p.id = abc.producto_id
+    WHERE (s.stock_actual IS NOT NULL OR v.cantidad_vendida IS NOT NULL)
+      AND p.activo = TRUE
+      {filtro_productos}
+    ORDER BY COALESCE(abc.clase_abc, 'D'), p.nombre
+"""
+
+
+@dataclass
+class FirmasTienda:
+    """
+    Stock y ventas de hoy por SKU tal como estaban en la base, para detectar
+    cambios comparando valores: las marcas de tiempo de inventario_actual y
+    ventas son de extracción, no de commit, y un DELETE no deja ninguna.
+    """
+    cargas: FrozenSet[int]                      # ids de inventario_cargas ya reflejadas en `stock`
+    stock: Dict[str, Tuple[Any, Optional[str]]]  # producto_id -> (SUM(cantidad), MAX(almacen_codigo))
+    ventas: Dict[str, Any]                      # producto_id -> cantidad_vendida de hoy
+
+
+@dataclass
+class EstadoScanTienda:
+    """Insumos por SKU del último scan de una tienda (base del scan incremental)"""
+    scan_id: str
+    fecha: date
+    ultimo_completo: datetime
+    firmas: FirmasTienda     # leídas antes que `productos`
+    productos: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+@dataclass
+class ResultadoScanTienda:
+    emergencias: List[EmergenciaDetectada]
+    anomalias: List[AnomaliaDetectada]
+    resumen: EmergenciasResumen
+    productos_analizados: int
+    productos_releidos: int
+    incremental: bool
+
+
+# ubicacion_id -> EstadoScanTienda (en memoria, por proceso)
+_estado_scan: Dict[str, EstadoScanTienda] = {}
+_estado_scan_lock = threading.Lock()
+
+
+def invalidar_estado_scan(ubicacion_id: str = None):
+    """Descarta el estado incremental (de una tienda o de todas)"""
+    with _estado_scan_lock:
+        if ubicacion_id:
+            _estado_scan.pop(ubicacion_id, None)
+        else:
+            _estado_scan.clear()
+
+
+def _leer_productos_tienda(
+    ubicacion_id: str,
+    fecha_hoy: date,
+    productos_ids: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Stock, ventas de hoy, demanda promedio (30 días) y clase ABC por SKU.
+    Con `productos_ids` lee solo esos SKUs.
+    """
+    params = {
+        'ubicacion_id': ubicacion_id,
+        'fecha_hoy': fecha_hoy,
+        'fecha_inicio_historico': fecha_hoy - timedelta(days=30),
+    }
+    filtros = {'filtro_stock': '', 'filtro_ventas': '', 'filtro_productos': ''}
+    if productos_ids is not None:
+        params['productos_ids'] = list(productos_ids)
+        filtros = {
+            'filtro_stock': 'AND producto_id = ANY(%(productos_ids)s)',
+            'filtro_ventas': 'AND producto_id = ANY(%(productos_ids)s)',
+            'filtro_productos': 'AND p.id = ANY(%(productos_ids)s)',
+        }
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(_QUERY_PRODUCTOS_TIENDA.format(**filtros), params)
+        productos = cursor.fetchall()
+        cursor.close()
+    return productos
+
+
+def _leer_firmas_tienda(
+    ubicacion_id: str,
+    fecha_hoy: date,
+    previas: Optional[FirmasTienda] = None
+) -> FirmasTienda:
+    """
+    Firmas de stock y ventas de hoy de la tienda.
+
+    Cada carga delta de inventario inserta su fila en inventario_cargas en la
+    misma transacción, así que una id que `previas` no tiene es una carga
+    confirmada después, aunque haya tardado en hacer commit. Sin cargas nuevas
+    el stock de `previas` sigue vigente y no se relee inventario_actual.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id
+            FROM inventario_cargas
+            WHERE ubicacion_id = %s
+              AND created_at >= %s
+        """, (ubicacion_id, fecha_hoy - timedelta(days=1)))
+        cargas = frozenset(row[0] for row in cursor.fetchall())
+
+        if previas is not None and cargas <= previas.cargas:
+            stock = previas.stock
+        else:
+            cursor.execute("""
+                SELECT producto_id, SUM(cantidad), MAX(almacen_codigo)
+                FROM inventario_actual
+                WHERE ubicacion_id = %s
+                GROUP BY producto_id
+            """, (ubicacion_id,))
+            stock = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT producto_id, cantidad_vendida
+            FROM ventas_diarias
+            WHERE ubicacion_id = %s
+              AND fecha = %s
+        """, (ubicacion_id, fecha_hoy))
+        ventas = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.close()
+    return FirmasTienda(cargas, stock, ventas)
+
+
+def _productos_con_cambios(previas: FirmasTienda, actuales: FirmasTienda) -> List[str]:
+    """SKUs cuyo stock o ventas de hoy difieren, incluidos los que aparecieron o desaparecieron"""
+    cambiados = set()
+    for antes, ahora in ((previas.stock, actuales.stock), (previas.ventas, actuales.ventas)):
+        if antes is ahora:
+            continue
+        cambiados.update(
+            producto_id for producto_id in antes.keys() | ahora.keys()
+            if antes.get(producto_id) != ahora.get(producto_id)
+        )
+    return sorted(cambiados)
+
+
+def _cargar_insumos_tienda(
+    ubicacion_id: str,
+    scan_id: str,
+    incremental: bool
+) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """
+    Insumos por SKU para evaluar la tienda.
+
+    En modo incremental, si hay estado de un scan previo del mismo día y
+    no venció EMERGENCIAS_FULL_SCAN_MINUTES, relee solo los SKUs cuyas
+    firmas de stock o ventas cambiaron desde ese scan y reutiliza el resto;
+    los que ya no tienen stock ni ventas salen del estado. Si no, lee la
+    tienda completa. En ambos casos guarda el estado para el próximo.
+
+    Las firmas se leen antes que los productos: un cambio que se confirma
+    entre ambas lecturas aparece como diferencia en el scan siguiente.
+
+    Returns:
+        (productos, productos_releidos, fue_incremental)
+    """
+    ahora = datetime.now()
+    fecha_hoy = ahora.date()
+
+    with _estado_scan_lock:
+        previo = _estado_scan.get(ubicacion_id)
+
+    usar_previo = (
+        incremental
+        and previo is not None
+        and previo.fecha == fecha_hoy
+        and (ahora - previo.ultimo_completo).total_seconds() < EMERGENCIAS_FULL_SCAN_MINUTES * 60
+    )
+
+    if usar_previo:
+        firmas = _leer_firmas_tienda(ubicacion_id, fecha_hoy, previo.firmas)
+        cambiados = _productos_con_cambios(previo.firmas, firmas)
+        productos = dict(previo.productos)
+        for producto_id in cambiados:
+            productos.pop(producto_id, None)
+        if cambiados:
+            for prod in _leer_productos_tienda(ubicacion_id, fecha_hoy, cambiados):
+                productos[prod['producto_id']] = prod
+        estado = EstadoScanTienda(scan_id, fecha_hoy, previo.ultimo_completo, firmas, productos)
+        releidos = len(cambiados)
+        logger.info(f"Scan incremental {ubicacion_id}: {releidos} SKUs con cambios desde scan {previo.scan_id}")
+    else:
+        firmas = _leer_firmas_tienda(ubicacion_id, fecha_hoy)
+        filas = _leer_productos_tienda(ubicacion_id, fecha_hoy)
+        estado = EstadoScanTienda(scan_id, fecha_hoy, ahora, firmas, {prod['producto_id']: prod for prod in filas})
+        releidos = len(filas)
+
+    with _estado_scan_lock:
+        _estado_scan[ubicacion_id] = estado
+
+    # Mismo orden que la query completa: clase ABC, nombre
+    lista = sorted(
+        estado.productos.values(),
+        key=lambda prod: (prod['clase_abc'] or 'D', prod['nombre_producto'] or '')
+    )
+    return lista, releidos, usar_previo
+
+
+def evaluar_emergencias_tienda(
+    config_tienda: ConfigTiendaResumen,
+    productos: List[Dict[str, Any]],
+    factor_intensidad: Decimal,
+    pct_dia_restante: Decimal
+) -> List[EmergenciaDetectada]:
+    """
+    Clasifica las emergencias de una tienda a partir de los insumos por SKU
+    (stock_actual, ventas_hoy, demanda_diaria_promedio). No toca la BD.
+    """
+    ubicacion_id = config_tienda.ubicacion_id
+    emergencias_tienda: List[EmergenciaDetectada] = []
+
+    for prod in productos:
+        stock_actual = Decimal(str(prod['stock_actual']))
+        ventas_hoy_prod = Decimal(str(prod['ventas_hoy']))
+        demanda_diaria = Decimal(str(prod['demanda_diaria_promedio']))
+
+        # FILTRO: Solo alertar productos con demanda real (ventas en últimos 30 días)
+        if demanda_diaria <= 0:
+            continue  # Sin demanda histórica = no es emergencia
+
+        # Calcular demanda restante del día
+        # demanda_restante = (demanda_diaria * factor_intensidad * pct_dia_restante)
+        demanda_restante = demanda_diaria * factor_intensidad * pct_dia_restante
+
+        # FILTRO: Si no hay demanda restante esperada, no es emergencia
+        # (ya sea porque es tarde en el día o porque el factor de intensidad es bajo)
+        if demanda_restante <= Decimal("0.1"):
+            continue  # Sin demanda restante significativa = no es emergencia hoy
+
+        # Calcular cobertura
+        cobertura = stock_actual / demanda_restante
+
+        # Clasificar emergencia
+        tipo_emergencia = clasificar_emergencia(
+            cobertura,
+            config_tienda.umbral_critico,
+            config_tienda.umbral_inminente,
+            config_tienda.umbral_alerta
+        )
+
+        if tipo_emergencia:
+            # Calcular horas restantes
+            if demanda_diaria > 0:
+                horas_restantes = (stock_actual / (demanda_diaria / Decimal("10")))  # Aprox 10 horas de operación
+            else:
+                horas_restantes = None
+
+            emergencia = EmergenciaDetectada(
+                ubicacion_id=ubicacion_id,
+                nombre_tienda=config_tienda.nombre_tienda,
+                producto_id=prod['producto_id'],
+                nombre_producto=prod['nombre_producto'],
+                categoria=prod['categoria'],
+                clase_abc=prod['clase_abc'],
+                tipo_emergencia=tipo_emergencia,
+                stock_actual=stock_actual,
+                ventas_hoy=ventas_hoy_prod,
+                demanda_restante=round(demanda_restante, 2),
+                cobertura=round(cobertura, 4),
+                factor_intensidad=round(factor_intensidad, 4),
+                horas_restantes=round(horas_restantes, 1) if horas_restantes else None,
+                almacen_codigo=prod['almacen_codigo']
+            )
+            emergencias_tienda.append(emergencia)
+
+    return emergencias_tienda
+
+
+def _contar_por_tipo(emergencias: List[EmergenciaDetectada]) -> Dict[str, int]:
+    return {
+        'stockouts': sum(1 for e in emergencias if e.tipo_emergencia == TipoEmergencia.STOCKOUT),
+        'criticos': sum(1 for e in emergencias if e.tipo_emergencia == TipoEmergencia.CRITICO),
+        'inminentes': sum(1 for e in emergencias if e.tipo_emergencia == TipoEmergencia.INMINENTE),
+        'alertas': sum(1 for e in emergencias if e.tipo_emergencia == TipoEmergencia.ALERTA),
+    }
+
+
+def escanear_tienda(
+    config_tienda: ConfigTiendaResumen,
+    scan_id: str,
+    incluir_anomalias: bool = True,
+    incremental: bool = False
+) -> ResultadoScanTienda:
+    """Escanea una tienda: factor de intensidad, emergencias por SKU y anomalías."""
+    ubicacion_id = config_tienda.ubicacion_id
+    logger.info(f"Escaneando tienda {ubicacion_id} ({config_tienda.nombre_tienda})")
+
+    # Calcular factor de intensidad del día
+    factor_intensidad, _, _ = calcular_factor_intensidad(ubicacion_id)
+
+    # Obtener productos con stock y ventas de hoy (ventas_diarias, agregado del ETL)
+    productos, releidos, fue_incremental = _cargar_insumos_tienda(ubicacion_id, scan_id, incremental)
+
+    hora_actual = datetime.now().hour
+    pct_dia_restante = Decimal("1.0") - calcular_porcentaje_dia_transcurrido(hora_actual)
+
+    emergencias_tienda = evaluar_emergencias_tienda(config_tienda, productos, factor_intensidad, pct_dia_restante)
+
+    # Detectar anomalías si está habilitado
+    anomalias_tienda = detectar_anomalias_tienda(ubicacion_id, scan_id) if incluir_anomalias else []
+
+    resumen = EmergenciasResumen(
+        ubicacion_id=ubicacion_id,
+        nombre_tienda=config_tienda.nombre_tienda,
+        total_emergencias=len(emergencias_tienda),
+        factor_intensidad_promedio=round(factor_intensidad, 4),
+        **_contar_por_tipo(emergencias_tienda)
+    )
+    return ResultadoScanTienda(
+        emergencias=emergencias_tienda,
+        anomalias=anomalias_tienda,
+        resumen=resumen,
+        productos_analizados=len(productos),
+        productos_releidos=releidos,
+        incremental=fue_incremental
+    )
+
+
 def detectar_emergencias(
     tiendas: List[str] = None,
     incluir_anomalias: bool = True,
     trigger_tipo: TriggerTipo = TriggerTipo.MANUAL,
-    trigger_usuario: str = None
+    trigger_usuario: str = None,
+    incremental: bool = False,
+    max_workers: Optional[int] = None
 ) -> ScanResponse:
     """
     Ejecuta detección de emergencias de inventario.
 
+    Las tiendas se escanean en paralelo (hasta `max_workers`, default
+    EMERGENCIAS_SCAN_WORKERS) y las anomalías se insertan en bloque al final.
+
     Args:
         tiendas: Lista de ubicacion_id a escanear. None = todas las habilitadas.
         incluir_anomalias: Si detectar también anomalías
         trigger_tipo: Tipo de trigger (MANUAL, SCHEDULER, API)
         trigger_usuario: Usuario que inició el scan
+        incremental: Releer solo los SKUs con cambios de stock o ventas desde
+            el scan anterior de cada tienda (ver _cargar_insumos_tienda)
+        max_workers: Tiendas escaneadas en paralelo
 
     Returns:
         ScanResponse con resultados del scan
@@ -556,7 +966,7 @@ def detectar_emergencias(
     scan_id = str(uuid.uuid4())[:8]
     fecha_inicio = datetime.now()
 
-    logger.info(f"Iniciando scan de emergencias {scan_id}")
+    logger.info(f"Iniciando scan de emergencias {scan_id}{' (incremental)' if incremental else ''}")
 
     # Obtener tiendas a escanear
     if tiendas:
@@ -587,179 +997,23 @@ def detectar_emergencias(
             resumen_por_tienda=[]
         )
 
-    todas_emergencias: List[EmergenciaDetectada] = []
-    todas_anomalias: List[AnomaliaDetectada] = []
-    resumenes: List[EmergenciasResumen] = []
-    total_productos = 0
-
-    # Procesar cada tienda
-    for config_tienda in tiendas_a_escanear:
-        ubicacion_id = config_tienda.ubicacion_id
-        nombre_tienda = config_tienda.nombre_tienda
-
-        logger.info(f"Escaneando tienda {ubicacion_id} ({nombre_tienda})")
-
-        # Calcular factor de intensidad del día
-        factor_intensidad, ventas_hoy, ventas_esperadas = calcular_factor_intensidad(ubicacion_id)
-
-        # Obtener productos con stock y ventas de hoy
-        query_productos = """
-            WITH stock_tienda AS (
-                SELECT
-                    producto_id,
-                    SUM(cantidad) AS stock_actual,
-                    MAX(almacen_codigo) AS almacen_codigo
-                FROM inventario_actual
-                WHERE ubicacion_id = %s
-                GROUP BY producto_id
-            ),
-            ventas_hoy AS (
-                SELECT
-                    producto_id,
-                    SUM(cantidad_vendida) AS cantidad_vendida
-                FROM ventas
-                WHERE ubicacion_id = %s
-                  AND fecha_venta::date = %s
-                GROUP BY producto_id
-            ),
-            demanda_promedio AS (
-                SELECT
-                    producto_id,
-                    AVG(cantidad_dia) AS demanda_diaria_promedio
-                FROM (
-                    SELECT
-                        producto_id,
-                        fecha_venta::date AS dia,
-                        SUM(cantidad_vendida) AS cantidad_dia
-                    FROM ventas
-                    WHERE ubicacion_id = %s
-                      AND fecha_venta >= %s
-                    GROUP BY producto_id, fecha_venta::date
-                ) sub
-                GROUP BY producto_id
-            ),
-            abc_productos AS (
-                SELECT
-                    puc.producto_id,
-                    puc.clase_abc
-                FROM productos_abc_tienda puc
-                WHERE puc.ubicacion_id = %s
-            )
-            SELECT
-                p.id AS producto_id,
-                p.nombre AS nombre_producto,
-                p.categoria,
-                COALESCE(abc.clase_abc, 'D') AS clase_abc,
-                COALESCE(s.stock_actual, 0) AS stock_actual,
-                s.almacen_codigo,
-                COALESCE(v.cantidad_vendida, 0) AS ventas_hoy,
-                COALESCE(d.demanda_diaria_promedio, 0) AS demanda_diaria_promedio
-            FROM productos p
-            LEFT JOIN stock_tienda s ON p.id = s.producto_id
-            LEFT JOIN ventas_hoy v ON p.id = v.producto_id
-            LEFT JOIN demanda_promedio d ON p.id = d.producto_id
-            LEFT JOIN abc_productos abc ON p.id = abc.producto_id
-            WHERE (s.stock_actual IS NOT NULL OR v.cantidad_vendida IS NOT NULL)
-              AND p.activo = TRUE
-            ORDER BY COALESCE(abc.clase_abc, 'D'), p.nombre
-        """
-
-        fecha_hoy = date.today()
-        fecha_inicio_historico = fecha_hoy - timedelta(days=30)
-        hora_actual = datetime.now().hour
-        pct_dia_restante = Decimal("1.0") - calcular_porcentaje_dia_transcurrido(hora_actual)
-
-        emergencias_tienda: List[EmergenciaDetectada] = []
-
-        with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            cursor.execute(query_productos, (
-                ubicacion_id,
-                ubicacion_id,
-                fecha_hoy,
-                ubicacion_id,
-                fecha_inicio_historico,
-                ubicacion_id
-            ))
-            productos = cursor.fetchall()
-            cursor.close()
-
-        total_productos += len(productos)
-
-        for prod in productos:
-            stock_actual = Decimal(str(prod['stock_actual']))
-            ventas_hoy_prod = Decimal(str(prod['ventas_hoy']))
-            demanda_diaria = Decimal(str(prod['demanda_diaria_promedio']))
-
-            # FILTRO: Solo alertar productos con demanda real (ventas en últimos 30 días)
-            if demanda_diaria <= 0:
-                continue  # Sin demanda histórica = no es emergencia
-
-            # Calcular demanda restante del día
-            # demanda_restante = (demanda_diaria * factor_intensidad * pct_dia_restante)
-            demanda_restante = demanda_diaria * factor_intensidad * pct_dia_restante
-
-            # FILTRO: Si no hay demanda restante esperada, no es emergencia
-            # (ya sea porque es tarde en el día o porque el factor de intensidad es bajo)
-            if demanda_restante <= Decimal("0.1"):
-                continue  # Sin demanda restante significativa = no es emergencia hoy
-
-            # Calcular cobertura
-            cobertura = stock_actual / demanda_restante
-
-            # Clasificar emergencia
-            tipo_emergencia = clasificar_emergencia(
-                cobertura,
-                config_tienda.umbral_critico,
-                config_tienda.umbral_inminente,
-                config_tienda.umbral_alerta
-            )
+    # Procesar tiendas en paralelo (map conserva el orden de tiendas_a_escanear)
+    workers = max(1, min(max_workers or EMERGENCIAS_SCAN_WORKERS, len(tiendas_a_escanear)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="emergencias-scan") as executor:
+        resultados = list(executor.map(
+            lambda config_tienda: escanear_tienda(config_tienda, scan_id, incluir_anomalias, incremental),
+            tiendas_a_escanear
+        ))
 
-            if tipo_emergencia:
-                # Calcular horas restantes
-                if demanda_diaria > 0:
-                    horas_restantes = (stock_actual / (demanda_diaria / Decimal("10")))  # Aprox 10 horas de operación
-                else:
-                    horas_restantes = None
-
-                emergencia = EmergenciaDetectada(
-                    ubicacion_id=ubicacion_id,
-                    nombre_tienda=nombre_tienda,
-                    producto_id=prod['producto_id'],
-                    nombre_producto=prod['nombre_producto'],
-                    categoria=prod['categoria'],
-                    clase_abc=prod['clase_abc'],
-                    tipo_emergencia=tipo_emergencia,
-                    stock_actual=stock_actual,
-                    ventas_hoy=ventas_hoy_prod,
-                    demanda_restante=round(demanda_restante, 2),
-                    cobertura=round(cobertura, 4),
-                    factor_intensidad=round(factor_intensidad, 4),
-                    horas_restantes=round(horas_restantes, 1) if horas_restantes else None,
-                    almacen_codigo=prod['almacen_codigo']
-                )
-                emergencias_tienda.append(emergencia)
-
-        # Agregar emergencias de esta tienda
-        todas_emergencias.extend(emergencias_tienda)
-
-        # Detectar anomalías si está habilitado
-        if incluir_anomalias:
-            anomalias_tienda = detectar_anomalias_tienda(ubicacion_id, scan_id)
-            todas_anomalias.extend(anomalias_tienda)
-
-        # Crear resumen de tienda
-        resumen = EmergenciasResumen(
-            ubicacion_id=ubicacion_id,
-            nombre_tienda=nombre_tienda,
-            total_emergencias=len(emergencias_tienda),
-            stockouts=sum(1 for e in emergencias_tienda if e.tipo_emergencia == TipoEmergencia.STOCKOUT),
-            criticos=sum(1 for e in emergencias_tienda if e.tipo_emergencia == TipoEmergencia.CRITICO),
-            inminentes=sum(1 for e in emergencias_tienda if e.tipo_emergencia == TipoEmergencia.INMINENTE),
-            alertas=sum(1 for e in emergencias_tienda if e.tipo_emergencia == TipoEmergencia.ALERTA),
-            factor_intensidad_promedio=round(factor_intensidad, 4)
-        )
-        resumenes.append(resumen)
+    todas_emergencias: List[EmergenciaDetectada] = [e for r in resultados for e in r.emergencias]
+    todas_anomalias: List[AnomaliaDetectada] = [a for r in resultados for a in r.anomalias]
+    resumenes: List[EmergenciasResumen] = [r.resumen for r in resultados]
+    total_productos = sum(r.productos_analizados for r in resultados)
+    productos_releidos = sum(r.productos_releidos for r in resultados)
+    # Modo efectivo: una tienda sin estado previo vuelve al scan completo
+    tiendas_scan_completo = [
+        t.ubicacion_id for t, r in zip(tiendas_a_escanear, resultados) if not r.incremental
+    ]
 
     # Guardar anomalías en BD
     if todas_anomalias:
@@ -767,6 +1021,7 @@ def detectar_emergencias(
 
     fecha_fin = datetime.now()
     duracion_ms = int((fecha_fin - fecha_inicio).total_seconds() * 1000)
+    conteos = _contar_por_tipo(todas_emergencias)
 
     # Guardar registro del scan
     guardar_scan(
@@ -778,17 +1033,15 @@ def detectar_emergencias(
         total_productos=total_productos,
         emergencias=len(todas_emergencias),
         anomalias=len(todas_anomalias),
-        stockouts=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.STOCKOUT),
-        criticos=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.CRITICO),
-        inminentes=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.INMINENTE),
-        alertas=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.ALERTA),
         trigger_tipo=trigger_tipo,
-        trigger_usuario=trigger_usuario
+        trigger_usuario=trigger_usuario,
+        **conteos
     )
 
     logger.info(
-        f"Scan {scan_id} completado en {duracion_ms}ms: "
-        f"{len(todas_emergencias)} emergencias, {len(todas_anomalias)} anomalías"
+        f"Scan {scan_id} completado en {duracion_ms}ms ({workers} workers): "
+        f"{len(todas_emergencias)} emergencias, {len(todas_anomalias)} anomalías, "
+        f"{productos_releidos}/{total_productos} SKUs leídos de BD"
     )
 
     return ScanResponse(
@@ -802,13 +1055,13 @@ def detectar_emergencias(
         total_productos_analizados=total_productos,
         total_emergencias=len(todas_emergencias),
         total_anomalias=len(todas_anomalias),
-        stockouts=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.STOCKOUT),
-        criticos=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.CRITICO),
-        inminentes=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.INMINENTE),
-        alertas=sum(1 for e in todas_emergencias if e.tipo_emergencia == TipoEmergencia.ALERTA),
         emergencias=todas_emergencias,
         anomalias=todas_anomalias,
-        resumen_por_tienda=resumenes
+        resumen_por_tienda=resumenes,
+        incremental=not tiendas_scan_completo,
+        tiendas_scan_completo=tiendas_scan_completo,
+        productos_releidos=productos_releidos,
+        **conteos
     )
 
 
@@ -1052,95 +1305,76 @@ def obtener_detalle_producto_emergencia(
         stock_row = cursor.fetchone()
         stock_actual = Decimal(str(stock_row['stock'] or 0))
 
-        # 4. Ventas de hoy por hora
+        # 4-6. Ventas por hora de hoy, ayer y el mismo día de la semana pasada (rollup horario)
         cursor.execute("""
             SELECT
-                EXTRACT(HOUR FROM fecha_venta)::int AS hora,
-                COALESCE(SUM(cantidad), 0) AS cantidad
-            FROM ventas
+                fecha,
+                hora,
+                COALESCE(SUM(cantidad_vendida), 0) AS cantidad
+            FROM ventas_horarias
             WHERE ubicacion_id = %s
+              AND fecha = ANY(%s)
               AND producto_id = %s
-              AND DATE(fecha_venta) = %s
-            GROUP BY EXTRACT(HOUR FROM fecha_venta)
-            ORDER BY hora
-        """, (ubicacion_id, producto_id, fecha_hoy))
-        ventas_hoy_rows = cursor.fetchall()
-
-        # 5. Ventas de ayer por hora
-        cursor.execute("""
-            SELECT
-                EXTRACT(HOUR FROM fecha_venta)::int AS hora,
-                COALESCE(SUM(cantidad), 0) AS cantidad
-            FROM ventas
-            WHERE ubicacion_id = %s
-              AND producto_id = %s
-              AND DATE(fecha_venta) = %s
-            GROUP BY EXTRACT(HOUR FROM fecha_venta)
-            ORDER BY hora
-        """, (ubicacion_id, producto_id, fecha_ayer))
-        ventas_ayer_rows = cursor.fetchall()
-
-        # 6. Ventas del mismo día de la semana pasada por hora
+            GROUP BY fecha, hora
+            ORDER BY fecha, hora
+        """, (ubicacion_id, [fecha_hoy, fecha_ayer, fecha_semana_pasada], producto_id))
+        ventas_horarias_rows = cursor.fetchall()
+        ventas_hoy_rows = [r for r in ventas_horarias_rows if r['fecha'] == fecha_hoy]
+        ventas_ayer_rows = [r for r in ventas_horarias_rows if r['fecha'] == fecha_ayer]
+        ventas_semana_rows = [r for r in ventas_horarias_rows if r['fecha'] == fecha_semana_pasada]
+
+        # 7. Promedio histórico por hora (últimas 4 semanas, mismo día de la semana):
+        # baseline precalculado por el ETL o, si no tiene corte de hoy, desde el rollup
         cursor.execute("""
-            SELECT
-                EXTRACT(HOUR FROM fecha_venta)::int AS hora,
-                COALESCE(SUM(cantidad), 0) AS cantidad
-            FROM ventas
+            SELECT hora, promedio_cantidad AS cantidad
+            FROM ventas_baseline_producto_hora
             WHERE ubicacion_id = %s
               AND producto_id = %s
-              AND DATE(fecha_venta) = %s
-            GROUP BY EXTRACT(HOUR FROM fecha_venta)
-            ORDER BY hora
-        """, (ubicacion_id, producto_id, fecha_semana_pasada))
-        ventas_semana_rows = cursor.fetchall()
-
-        # 7. Promedio histórico por hora (últimos 30 días, mismo día de la semana)
-        cursor.execute("""
-            SELECT
-                EXTRACT(HOUR FROM fecha_venta)::int AS hora,
-                COALESCE(AVG(cantidad_diaria), 0) AS cantidad
-            FROM (
-                SELECT
-                    DATE(fecha_venta) AS fecha,
-                    EXTRACT(HOUR FROM fecha_venta)::int AS hora,
-                    SUM(cantidad) AS cantidad_diaria
-                FROM ventas
-                WHERE ubicacion_id = %s
-                  AND producto_id = %s
-                  AND fecha_venta >= %s - INTERVAL '30 days'
-                  AND fecha_venta < %s
-                  AND EXTRACT(DOW FROM fecha_venta) = EXTRACT(DOW FROM %s::date)
-                GROUP BY DATE(fecha_venta), EXTRACT(HOUR FROM fecha_venta)
-            ) subq
-            GROUP BY hora
+              AND dia_semana = %s
+              AND fecha_corte = %s
             ORDER BY hora
-        """, (ubicacion_id, producto_id, fecha_hoy, fecha_hoy, fecha_hoy))
+        """, (ubicacion_id, producto_id, dia_semana_pg(fecha_hoy), fecha_hoy))
         promedio_rows = cursor.fetchall()
+        if not promedio_rows:
+            cursor.execute("""
+                SELECT
+                    hora,
+                    COALESCE(AVG(cantidad_hora), 0) AS cantidad
+                FROM (
+                    SELECT fecha, hora, SUM(cantidad_vendida) AS cantidad_hora
+                    FROM ventas_horarias
+                    WHERE ubicacion_id = %s
+                      AND fecha = ANY(%s)
+                      AND producto_id = %s
+                    GROUP BY fecha, hora
+                ) subq
+                GROUP BY hora
+                ORDER BY hora
+            """, (ubicacion_id, fechas_mismo_dia_semana(fecha_hoy), producto_id))
+            promedio_rows = cursor.fetchall()
 
         # 8. Totales de ventas para comparar
         cursor.execute("""
             SELECT
-                COALESCE(SUM(CASE WHEN DATE(fecha_venta) = %s THEN cantidad ELSE 0 END), 0) AS ventas_hoy,
-                COALESCE(SUM(CASE WHEN DATE(fecha_venta) = %s THEN cantidad ELSE 0 END), 0) AS ventas_ayer,
-                COALESCE(SUM(CASE WHEN DATE(fecha_venta) = %s THEN cantidad ELSE 0 END), 0) AS ventas_semana
-            FROM ventas
+                COALESCE(SUM(CASE WHEN fecha = %s THEN cantidad_vendida ELSE 0 END), 0) AS ventas_hoy,
+                COALESCE(SUM(CASE WHEN fecha = %s THEN cantidad_vendida ELSE 0 END), 0) AS ventas_ayer,
+                COALESCE(SUM(CASE WHEN fecha = %s THEN cantidad_vendida ELSE 0 END), 0) AS ventas_semana
+            FROM ventas_diarias
             WHERE ubicacion_id = %s AND producto_id = %s
-        """, (fecha_hoy, fecha_ayer, fecha_semana_pasada, ubicacion_id, producto_id))
+              AND fecha = ANY(%s)
+        """, (fecha_hoy, fecha_ayer, fecha_semana_pasada, ubicacion_id, producto_id,
+              [fecha_hoy, fecha_ayer, fecha_semana_pasada]))
         totales = cursor.fetchone()
 
         # 9. Promedio 30 días
         cursor.execute("""
-            SELECT COALESCE(AVG(cantidad_diaria), 0) AS promedio
-            FROM (
-                SELECT DATE(fecha_venta), SUM(cantidad) AS cantidad_diaria
-                FROM ventas
-                WHERE ubicacion_id = %s
-                  AND producto_id = %s
-                  AND fecha_venta >= %s - INTERVAL '30 days'
-                  AND fecha_venta < %s
-                GROUP BY DATE(fecha_venta)
-            ) subq
-        """, (ubicacion_id, producto_id, fecha_hoy, fecha_hoy))
+            SELECT COALESCE(AVG(cantidad_vendida), 0) AS promedio
+            FROM ventas_diarias
+            WHERE ubicacion_id = %s
+              AND producto_id = %s
+              AND fecha >= %s
+              AND fecha < %s
+        """, (ubicacion_id, producto_id, fecha_hoy - timedelta(days=30), fecha_hoy))
         prom_row = cursor.fetchone()
 
         cursor.close()
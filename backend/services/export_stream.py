@@ -0,0 +1,247 @@
+"""
+Exportaciones Excel/CSV en memoria constante.
+
+Los exports de pedidos y ventas armaban el archivo completo en memoria
+(fetchall + openpyxl.Workbook + BytesIO). Este módulo reemplaza esas piezas:
+
+- iterar_filas(): lee con un cursor server-side (DECLARE CURSOR de psycopg2)
+  en bloques de EXPORT_ITERSIZE filas.
+- generar_csv(): CSV por chunks para StreamingResponse; la descarga empieza
+  con las primeras filas.
+- construir_xlsx(): openpyxl en modo write-only sobre un archivo temporal
+  (las filas no quedan en memoria); el archivo se entrega por chunks.
+- respuesta_descarga(): StreamingResponse que cierra sus iteradores al
+  terminar, también si el cliente corta la descarga, para que la conexión
+  de iterar_filas_conexion() vuelva al pool.
+
+Configuración (env):
+    EXPORT_ITERSIZE: filas por fetch del cursor server-side (default 2000)
+    EXPORT_CHUNK_BYTES: tamaño de cada chunk enviado (default 65536)
+"""
+import csv
+import io
+import logging
+import os
+import tempfile
+import uuid
+from typing import IO, Callable, Iterable, Iterator, Optional, Sequence, Tuple
+
+import anyio
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', '2000'))
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+
+MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Fila de export: (valores, color de relleno hex o None)
+FilaExcel = Tuple[Sequence, Optional[str]]
+
+
+def iterar_filas(conn, query: str, params: Sequence = (), itersize: int = EXPORT_ITERSIZE) -> Iterator[tuple]:
+    """
+    Ejecuta `query` con un cursor server-side y entrega las filas de a una,
+    trayendo `itersize` filas por round-trip.
+
+    Usage:
+        for row in iterar_filas(conn, "SELECT ... FROM ventas WHERE ...", params):
+            ...
+    """
+    cursor = conn.cursor(name=f"export_{uuid.uuid4().hex[:12]}")
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+    finally:
+        cursor.close()
+
+
+def iterar_filas_conexion(abrir_conexion: Callable, query: str, params: Sequence = ()) -> Iterator[tuple]:
+    """
+    Igual que iterar_filas() pero abre su propia conexión con
+    `abrir_conexion` (context manager de db_manager). Para generadores de
+    StreamingResponse, que se consumen después de que el endpoint retorna:
+    la conexión se libera al agotar las filas o al cerrar el generador
+    (GeneratorExit), así que pasarlo en `cerrar` de respuesta_descarga().
+    """
+    with abrir_conexion() as conn:
+        yield from iterar_filas(conn, query, params)
+
+
+def generar_csv(encabezados: Sequence[str], filas: Iterable[Sequence]) -> Iterator[bytes]:
+    """CSV (UTF-8 con BOM, compatible con Excel) en chunks de ~EXPORT_CHUNK_BYTES."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(encabezados)
+    try:
+        for fila in filas:
+            writer.writerow(fila)
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate(0)
+    except Exception as e:
+        # Los headers HTTP ya se enviaron: solo queda cortar la descarga
+        logger.error(f"❌ Error generando CSV (descarga incompleta): {e}")
+        raise
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def construir_xlsx(
+    encabezados: Sequence[str],
+    filas: Iterable[FilaExcel],
+    titulo_hoja: str = "Hoja1",
+    titulo: Optional[str] = None,
+    subtitulo: Optional[str] = None,
+    anchos: Sequence[int] = (),
+    columnas_derecha: Sequence[int] = (),
+) -> Tuple[IO[bytes], int]:
+    """
+    Arma un .xlsx con openpyxl en modo write-only y lo deja en un archivo
+    temporal. Mismo layout que los exports anteriores: título (fila 1),
+    subtítulo (fila 2), encabezados en la fila 4 y datos desde la fila 5,
+    con relleno por fila.
+
+    Args:
+        filas: (valores, color_hex) por fila; color None = sin relleno
+        columnas_derecha: índices (1-based) de columnas alineadas a la derecha
+
+    Returns: (archivo temporal posicionado al inicio, cantidad de filas de datos)
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=titulo_hoja[:31])
+    for i, ancho in enumerate(anchos, 1):
+        ws.column_dimensions[get_column_letter(i)].width = ancho
+
+    ultima_columna = get_column_letter(len(encabezados))
+    centrado = Alignment(horizontal='center')
+    derecha = Alignment(horizontal='right')
+
+    def celda(valor, **estilo):
+        cell = WriteOnlyCell(ws, value=valor)
+        for atributo, valor_estilo in estilo.items():
+            setattr(cell, atributo, valor_estilo)
+        return cell
+
+    if titulo is not None:
+        ws.append([celda(titulo, font=Font(bold=True, size=14), alignment=centrado)])
+        ws.merged_cells.add(f"A1:{ultima_columna}1")
+    else:
+        ws.append([])
+    if subtitulo is not None:
+        ws.append([celda(subtitulo, font=Font(size=10), alignment=centrado)])
+        ws.merged_cells.add(f"A2:{ultima_columna}2")
+    else:
+        ws.append([])
+    ws.append([])
+
+    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+    header_font = Font(bold=True, color='FFFFFF')
+    ws.append([
+        celda(h, fill=header_fill, font=header_font, alignment=Alignment(horizontal='center', vertical='center'))
+        for h in encabezados
+    ])
+
+    # Un PatternFill por color (openpyxl deduplica estilos, pero evita crear objetos por celda)
+    rellenos = {}
+    derecha_set = set(columnas_derecha)
+    total = 0
+    for valores, color in filas:
+        relleno = None
+        if color:
+            relleno = rellenos.get(color)
+            if relleno is None:
+                relleno = rellenos[color] = PatternFill(start_color=color, end_color=color, fill_type='solid')
+        fila = []
+        for col_idx, valor in enumerate(valores, 1):
+            cell = WriteOnlyCell(ws, value=valor)
+            if relleno is not None:
+                cell.fill = relleno
+            if col_idx in derecha_set:
+                cell.alignment = derecha
+            fila.append(cell)
+        ws.append(fila)
+        total += 1
+
+    archivo = tempfile.TemporaryFile()
+    wb.save(archivo)
+    archivo.seek(0)
+    return archivo, total
+
+
+def iterar_archivo(archivo: IO[bytes], chunk_size: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """Lee un archivo en chunks y lo cierra al terminar (o si se corta la descarga)."""
+    try:
+        while True:
+            chunk = archivo.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        archivo.close()
+
+
+def cerrar_iteradores(iteradores: Iterable) -> None:
+    """Cierra los generadores (close()) en orden; un error no impide cerrar los demás."""
+    for iterador in iteradores:
+        cerrar = getattr(iterador, 'close', None)
+        if cerrar is None:
+            continue
+        try:
+            cerrar()
+        except Exception as e:
+            logger.warning(f"⚠️ Error cerrando iterador de descarga: {e}")
+
+
+class _DescargaStreaming(StreamingResponse):
+    """
+    StreamingResponse que al terminar cierra el contenido y los iteradores de
+    `cerrar`. Si el cliente corta la descarga Starlette deja de iterar pero no
+    cierra el generador, y la conexión de iterar_filas_conexion() no volvería
+    al pool hasta que el GC lo finalice.
+    """
+
+    def __init__(self, contenido: Iterator[bytes], cerrar: Sequence = (), **kwargs):
+        super().__init__(contenido, **kwargs)
+        self._iteradores = [contenido, *cerrar]
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # El cierre devuelve conexiones al pool: fuera del event loop y
+            # aunque la tarea esté cancelada
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(cerrar_iteradores, self._iteradores)
+
+
+def respuesta_descarga(
+    contenido: Iterator[bytes], formato: str, nombre_archivo: str, cerrar: Sequence = ()
+) -> StreamingResponse:
+    """
+    StreamingResponse con media type y Content-Disposition del formato.
+
+    Args:
+        cerrar: iteradores a cerrar al terminar la respuesta además de
+                `contenido` (las filas de iterar_filas_conexion())
+    """
+    return _DescargaStreaming(
+        contenido,
+        cerrar,
+        media_type=MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f"attachment; filename={nombre_archivo}.{formato}"},
+    )
@@ -0,0 +1,119 @@
+"""
+Recálculo set-based de sugerencias de generadores de tráfico.
+
+Antes calcular-sugerencias traía todos los candidatos de productos_abc_cache
+(gap >= gap_minimo) y hacía un UPDATE productos + un INSERT de historial por
+candidato. Ahora todo es una sola sentencia con CTEs que modifican datos:
+
+- candidatos: productos_abc_cache con gap >= gap_minimo
+- sugeridos: UPDATE productos ... FROM candidatos (solo los que no son
+  generador, no fueron ignorados y no estaban sugeridos) + historial
+- removidos: sugeridos que ya no son candidatos
+
+y devuelve el diff (qué productos pasaron a sugeridos y cuáles se
+removieron). Corre dentro de la transacción del llamador, así que puede ir
+justo después de recalcular_abc_cache() en la misma pasada.
+
+etl/core/generadores_trafico.py tiene la misma sentencia para el recálculo
+nocturno del ETL.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+GAP_MINIMO_DEFAULT = 400
+
+RECALCULAR_SUGERENCIAS_SQL = """
+    WITH candidatos AS (
+        SELECT producto_id, gap, clase_abc, venta_30d, tickets_30d
+        FROM productos_abc_cache
+        WHERE gap >= %(gap_minimo)s
+    ),
+    sugeridos AS (
+        UPDATE productos p
+        SET generador_trafico_sugerido = TRUE,
+            generador_trafico_gap = c.gap,
+            generador_trafico_fecha_sugerido = NOW()
+        FROM candidatos c
+        WHERE p.id = c.producto_id
+          AND COALESCE(p.es_generador_trafico, FALSE) = FALSE
+          AND COALESCE(p.generador_trafico_ignorado, FALSE) = FALSE
+          AND COALESCE(p.generador_trafico_sugerido, FALSE) = FALSE
+        RETURNING p.id, c.gap, c.clase_abc, c.venta_30d, c.tickets_30d
+    ),
+    historial AS (
+        INSERT INTO generadores_trafico_historial
+            (producto_id, accion, gap_score, venta_30d, tickets_30d, clase_abc)
+        SELECT id, 'sugerido', gap, COALESCE(venta_30d, 0), tickets_30d, clase_abc
+        FROM sugeridos
+    ),
+    removidos AS (
+        UPDATE productos p
+        SET generador_trafico_sugerido = FALSE
+        WHERE p.generador_trafico_sugerido = TRUE
+          AND NOT EXISTS (SELECT 1 FROM candidatos c WHERE c.producto_id = p.id)
+        RETURNING p.id, p.generador_trafico_gap
+    )
+    SELECT 'sugerido' AS cambio, id, gap FROM sugeridos
+    UNION ALL
+    SELECT 'removido', id, generador_trafico_gap FROM removidos
+    UNION ALL
+    SELECT 'analizados', NULL, COUNT(*) FROM candidatos
+"""
+
+
+@dataclass
+class DiffSugerencias:
+    """Productos que cambiaron de estado en un recálculo de sugerencias."""
+    gap_minimo: int
+    productos_analizados: int = 0
+    sugeridos: List[dict] = field(default_factory=list)   # {'producto_id', 'gap'}
+    removidos: List[dict] = field(default_factory=list)
+
+
+def leer_gap_minimo(cursor) -> int:
+    """gap_minimo de config_generadores_trafico (default 400)."""
+    cursor.execute("""
+        SELECT valor FROM config_generadores_trafico
+        WHERE parametro = 'gap_minimo'
+    """)
+    row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else GAP_MINIMO_DEFAULT
+
+
+def recalcular_sugerencias(cursor, gap_minimo: Optional[int] = None) -> DiffSugerencias:
+    """
+    Marca como sugeridos los candidatos nuevos de productos_abc_cache,
+    registra el historial y quita las sugerencias que ya no califican, en
+    una sola sentencia. No hace commit.
+
+    Args:
+        cursor: cursor de tuplas (no RealDictCursor)
+        gap_minimo: GAP mínimo; si es None se lee de la configuración
+
+    Returns:
+        DiffSugerencias con los productos sugeridos y removidos
+    """
+    if gap_minimo is None:
+        gap_minimo = leer_gap_minimo(cursor)
+
+    cursor.execute(RECALCULAR_SUGERENCIAS_SQL, {'gap_minimo': gap_minimo})
+
+    diff = DiffSugerencias(gap_minimo=gap_minimo)
+    for cambio, producto_id, gap in cursor.fetchall():
+        if cambio == 'analizados':
+            diff.productos_analizados = int(gap)
+        elif cambio == 'sugerido':
+            diff.sugeridos.append({'producto_id': producto_id, 'gap': gap})
+        else:
+            diff.removidos.append({'producto_id': producto_id, 'gap': gap})
+
+    diff.sugeridos.sort(key=lambda c: c['producto_id'])
+    diff.removidos.sort(key=lambda c: c['producto_id'])
+    logger.info(
+        f"🚦 Generadores de tráfico (gap >= {gap_minimo}): {diff.productos_analizados} candidatos, "
+        f"+{len(diff.sugeridos)} sugeridos, -{len(diff.removidos)} removidos"
+    )
+    return diff
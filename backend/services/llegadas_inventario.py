@@ -0,0 +1,140 @@
+"""
+Detección de llegadas de pedidos a partir de inventario_incrementos.
+
+Antes verificar-llegada y el tránsito multi-tienda reconstruían, por cada
+producto del pedido, los deltas entre snapshots de inventario_historico
+(GROUP BY fecha_snapshot + LAG) desde la fecha del pedido hasta hoy. Ahora
+el ETL de inventario guarda los incrementos positivos al cargar cada
+snapshot (migración 047), y las llegadas de cualquier cantidad de
+(ubicación, producto, fecha desde) salen de una sola consulta: una suma por
+rango de índice por combinación.
+
+Un incremento cuenta si su snapshot anterior es >= la fecha desde, igual
+que el LAG calculado dentro de la ventana (el primer snapshot de la ventana
+es la base y no suma).
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LLEGADAS_SQL = """
+    SELECT
+        c.ubicacion_id, c.producto_id, c.desde,
+        inc.total_llegadas, inc.fecha_primer_incremento
+    FROM unnest(%s::varchar[], %s::varchar[], %s::date[]) AS c(ubicacion_id, producto_id, desde)
+    CROSS JOIN LATERAL (
+        SELECT
+            COALESCE(SUM(i.incremento), 0) AS total_llegadas,
+            MIN(i.fecha_snapshot) AS fecha_primer_incremento
+        FROM inventario_incrementos i
+        WHERE i.ubicacion_id = c.ubicacion_id
+          AND i.producto_id = c.producto_id
+          AND i.fecha_snapshot_anterior >= c.desde
+    ) inc
+"""
+
+# Primer y último snapshot de la ventana (solo para el detalle de
+# verificar-llegada): sondeos MIN/MAX sobre el índice
+# (producto_id, ubicacion_id, fecha_snapshot) de inventario_historico
+LLEGADAS_CON_SNAPSHOTS_SQL = """
+    SELECT
+        c.ubicacion_id, c.producto_id, c.desde,
+        inc.total_llegadas, inc.fecha_primer_incremento,
+        ini.cantidad, fin.cantidad,
+        COALESCE(f.inicial < f.final, FALSE) AS tiene_datos
+    FROM unnest(%s::varchar[], %s::varchar[], %s::date[]) AS c(ubicacion_id, producto_id, desde)
+    CROSS JOIN LATERAL (
+        SELECT
+            COALESCE(SUM(i.incremento), 0) AS total_llegadas,
+            MIN(i.fecha_snapshot) AS fecha_primer_incremento
+        FROM inventario_incrementos i
+        WHERE i.ubicacion_id = c.ubicacion_id
+          AND i.producto_id = c.producto_id
+          AND i.fecha_snapshot_anterior >= c.desde
+    ) inc
+    CROSS JOIN LATERAL (
+        SELECT MIN(h.fecha_snapshot) AS inicial, MAX(h.fecha_snapshot) AS final
+        FROM inventario_historico h
+        WHERE h.producto_id = c.producto_id
+          AND h.ubicacion_id = c.ubicacion_id
+          AND h.fecha_snapshot >= c.desde
+    ) f
+    CROSS JOIN LATERAL (
+        SELECT SUM(h.cantidad) AS cantidad
+        FROM inventario_historico h
+        WHERE h.producto_id = c.producto_id
+          AND h.ubicacion_id = c.ubicacion_id
+          AND h.fecha_snapshot = f.inicial
+    ) ini
+    CROSS JOIN LATERAL (
+        SELECT SUM(h.cantidad) AS cantidad
+        FROM inventario_historico h
+        WHERE h.producto_id = c.producto_id
+          AND h.ubicacion_id = c.ubicacion_id
+          AND h.fecha_snapshot = f.final
+    ) fin
+"""
+
+ClaveLlegada = Tuple[str, str, date]   # (ubicacion_id, producto_id, desde)
+
+
+@dataclass
+class LlegadaDetectada:
+    """Llegadas (unidades) de un producto a una ubicación desde una fecha."""
+    total_llegadas: Decimal = Decimal(0)
+    fecha_primer_incremento: Optional[datetime] = None
+    snapshot_inicial: Optional[Decimal] = None
+    snapshot_final: Optional[Decimal] = None
+    tiene_datos: bool = False   # más de un snapshot en la ventana
+
+
+def obtener_llegadas(
+    cursor,
+    consultas: Iterable[ClaveLlegada],
+    con_snapshots: bool = False
+) -> Dict[ClaveLlegada, LlegadaDetectada]:
+    """
+    Suma los incrementos de inventario de cada (ubicación, producto, desde)
+    en una sola consulta.
+
+    Args:
+        cursor: cursor de tuplas (no RealDictCursor)
+        consultas: claves (ubicacion_id, producto_id, fecha desde); el
+                   producto_id es el de inventario_historico (código) y la
+                   fecha un date (pedidos_sugeridos.fecha_pedido)
+        con_snapshots: incluir snapshot inicial/final y tiene_datos
+                       (detalle de verificar-llegada)
+
+    Returns:
+        {clave: LlegadaDetectada}
+    """
+    claves = list(dict.fromkeys(consultas))
+    if not claves:
+        return {}
+
+    ubicaciones, productos, fechas = (list(col) for col in zip(*claves))
+    cursor.execute(
+        LLEGADAS_CON_SNAPSHOTS_SQL if con_snapshots else LLEGADAS_SQL,
+        [ubicaciones, productos, fechas]
+    )
+
+    llegadas: Dict[ClaveLlegada, LlegadaDetectada] = {}
+    for row in cursor.fetchall():
+        ubicacion_id, producto_id, desde, total, fecha_primer = row[:5]
+        llegada = LlegadaDetectada(
+            total_llegadas=Decimal(str(total or 0)),
+            fecha_primer_incremento=fecha_primer,
+        )
+        if con_snapshots:
+            inicial, final, tiene_datos = row[5:8]
+            llegada.snapshot_inicial = Decimal(str(inicial)) if inicial else None
+            llegada.snapshot_final = Decimal(str(final)) if final else None
+            llegada.tiene_datos = bool(tiene_datos)
+        llegadas[(ubicacion_id, producto_id, desde)] = llegada
+
+    logger.debug(f"📦 Llegadas consultadas: {len(claves)} combinaciones ubicación/producto/fecha")
+    return llegadas
@@ -0,0 +1,287 @@
+"""
+Cálculo (CPU) de productos sugeridos por tienda para pedidos multi-tienda.
+
+Separado de routers/pedidos_multitienda.py para poder ejecutarse en un
+proceso worker (services/compute_executor.py): no importa FastAPI ni
+db_manager, y solo recibe datos ya cargados de la BD (tuplas / dicts
+picklables).
+"""
+import logging
+import math
+import statistics as stats_module
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from services.calculo_inventario_abc import ConfigTiendaABC
+from services.calculo_inventario_batch import calcular_inventario_batch
+
+logger = logging.getLogger(__name__)
+
+
+def calcular_productos_tienda(
+    datos_tienda: Dict[str, Any],
+    tienda_destino: str,
+    config_cobertura_categoria: Dict[str, Dict[str, int]],
+    config_tienda_abc: Optional[ConfigTiendaABC] = None
+) -> List[Dict]:
+    """
+    Calcula TODOS los productos de una tienda, marcando cuáles necesitan reposición.
+
+    Args:
+        datos_tienda: Resultado de cargar_datos_tienda() (router): filas de la query
+            principal, límites de capacidad, tránsito y P75 de referencia.
+        config_cobertura_categoria: Snapshot de config_cobertura_categoria
+            (compartido por todas las tiendas del cálculo).
+        config_tienda_abc: Config ABC de la tienda (explícita, sin globals).
+
+    Returns:
+        Lista de productos (mismo formato que obtener_productos_tienda).
+    """
+    rows = datos_tienda['rows']
+    limites_capacidad = datos_tienda['limites_capacidad']
+    transito_data = datos_tienda['transito_data']
+    p75_referencia_batch = datos_tienda['p75_referencia_batch']
+
+    # Pre-calcular mediana de P75 por categoría (para envío prueba sin referencia)
+    p75_por_cat: dict = defaultdict(list)
+    for row in rows:
+        cat = (row[3] or '').strip().upper()
+        p75_val = float(row[7])
+        if p75_val > 0 and cat:
+            p75_por_cat[cat].append(p75_val)
+    p75_mediana_cat = {
+        cat: stats_module.median(vals) for cat, vals in p75_por_cat.items() if vals
+    }
+    all_p75_vals = [v for vals in p75_por_cat.values() for v in vals]
+    p75_fallback = stats_module.median(all_p75_vals) if all_p75_vals else 1.0
+
+    preparados = []
+    for row in rows:
+        producto_id = row[0]
+        codigo = row[1]
+        descripcion = row[2]
+        categoria = row[3]
+        cuadrante = row[4]
+        unidades_por_bulto = int(row[5]) or 1
+        prom_20d = float(row[6])
+        p75 = float(row[7])
+        stock_tienda = float(row[8])
+        stock_cedi = float(row[9])
+        clase_abc = row[10]
+        venta_30d = float(row[11])
+        sigma_demanda = float(row[12])
+        demanda_maxima = float(row[13])
+        es_generador_trafico = bool(row[14]) if row[14] else False
+        peso_unitario = float(row[15]) if row[15] else None
+
+        # Obtener tránsito para este producto
+        transito_info = transito_data.get(codigo, {'transito_bultos': 0, 'desglose': []})
+        transito_bultos = transito_info['transito_bultos']
+        transito_unidades = transito_bultos * unidades_por_bulto
+
+        # Calcular stock efectivo (stock actual + tránsito)
+        stock_efectivo = stock_tienda + transito_unidades
+
+        # Lógica de envío prueba: Si no ha vendido localmente pero hay stock en CEDI
+        # usar P75 de referencia pre-calculado en batch
+        p75_usado = p75
+        clase_abc_usada = clase_abc if clase_abc else 'D'
+        es_envio_prueba = False
+
+        if p75 == 0 and stock_cedi > 0:
+            p75_ref = p75_referencia_batch.get(producto_id)
+            if p75_ref and p75_ref > 0:
+                p75_usado = p75_ref
+                clase_abc_usada = 'D'  # Conservador para productos nuevos
+                es_envio_prueba = True
+            else:
+                # Sin ventas en ninguna tienda pero con stock en CEDI -> envío prueba
+                # Usar mediana de P75 de la categoría como proxy de demanda
+                cat_norm = (categoria or '').strip().upper()
+                p75_usado = p75_mediana_cat.get(cat_norm, p75_fallback)
+                clase_abc_usada = 'D'
+                es_envio_prueba = True
+
+        # Determinar override de días de cobertura por categoría (perecederos)
+        dias_cobertura_override = None
+        if categoria:
+            cat_norm = categoria.strip().upper()
+            if cat_norm in config_cobertura_categoria:
+                # Usar días de cobertura específicos para esta categoría según clase ABC
+                dias_cobertura_override = config_cobertura_categoria[cat_norm].get(clase_abc_usada)
+
+        # Usar el mismo cálculo estadístico que single-store (calcular_inventario_simple)
+        # Esto garantiza que ambos wizards usen la misma lógica de ROP, SS y MAX
+        # IMPORTANTE: Usar stock_efectivo (stock + tránsito) para calcular SUG correctamente
+        # Si es envío prueba, usar p75_usado (de referencia) y clase D
+        sigma_usada = sigma_demanda
+        if es_envio_prueba and sigma_demanda == 0:
+            sigma_usada = p75_usado * 0.3  # Estimar 30% de variabilidad para productos nuevos
+
+        preparados.append({
+            'producto_id': producto_id,
+            'codigo': codigo,
+            'descripcion': descripcion,
+            'categoria': categoria,
+            'cuadrante': cuadrante,
+            'clase_abc': clase_abc,
+            'unidades_por_bulto': unidades_por_bulto,
+            'prom_20d': prom_20d,
+            'p75': p75,
+            'p75_usado': p75_usado,
+            'stock_tienda': stock_tienda,
+            'stock_cedi': stock_cedi,
+            'stock_efectivo': stock_efectivo,
+            'es_envio_prueba': es_envio_prueba,
+            'transito_bultos': transito_bultos,
+            'transito_info': transito_info,
+            'peso_unitario': peso_unitario,
+            # Entradas del cálculo ABC (columnas para calcular_inventario_batch)
+            'sigma_usada': sigma_usada,
+            'demanda_maxima': demanda_maxima if demanda_maxima > 0 else p75_usado * 2,
+            'clase_abc_usada': clase_abc_usada,
+            'es_generador_trafico': es_generador_trafico,
+            'dias_cobertura_override': dias_cobertura_override,
+        })
+
+    # Cálculo estadístico de todo el surtido en una pasada (mismo resultado que
+    # calcular_inventario_simple por producto). Usa stock efectivo (stock + tránsito)
+    # y P75/clase D de referencia para envíos prueba.
+    resultados = calcular_inventario_batch(
+        demanda_p75=[p['p75_usado'] for p in preparados],
+        sigma_demanda=[p['sigma_usada'] for p in preparados],
+        demanda_maxima=[p['demanda_maxima'] for p in preparados],
+        unidades_por_bulto=[p['unidades_por_bulto'] for p in preparados],
+        stock_actual=[p['stock_efectivo'] for p in preparados],
+        stock_cedi=[p['stock_cedi'] for p in preparados],
+        clase_abc=[p['clase_abc_usada'] for p in preparados],
+        es_generador_trafico=[p['es_generador_trafico'] for p in preparados],
+        dias_cobertura_override=[p['dias_cobertura_override'] for p in preparados],
+        config_tienda=config_tienda_abc  # Thread-safe: pasar config explícitamente
+    )
+
+    productos = []
+    for i, p in enumerate(preparados):
+        producto_id = p['producto_id']
+        codigo = p['codigo']
+        unidades_por_bulto = p['unidades_por_bulto']
+        p75_usado = p['p75_usado']
+        stock_tienda = p['stock_tienda']
+        stock_cedi = p['stock_cedi']
+        stock_efectivo = p['stock_efectivo']
+        es_envio_prueba = p['es_envio_prueba']
+        transito_info = p['transito_info']
+
+        # Extraer valores del resultado estadístico (en unidades)
+        punto_reorden_unid = float(resultados.punto_reorden_unid[i])
+        stock_maximo_unid = float(resultados.stock_maximo_unid[i])
+        stock_seguridad_unid = float(resultados.stock_seguridad_unid[i])
+        cantidad_sugerida_unid = float(resultados.cantidad_sugerida_unid[i])
+        cantidad_sugerida_bultos = int(resultados.cantidad_sugerida_bultos[i])
+        tiene_sobrestock = bool(resultados.tiene_sobrestock[i])
+
+        # Calcular días de stock usando stock efectivo (incluye tránsito)
+        # Si es envío prueba, usar p75_usado para el cálculo de días
+        if p75_usado > 0:
+            dias_stock = stock_efectivo / p75_usado  # ← CAMBIO: usar stock efectivo y p75_usado
+            dias_ss = stock_seguridad_unid / p75_usado
+            dias_rop = punto_reorden_unid / p75_usado
+            dias_max = stock_maximo_unid / p75_usado
+        else:
+            dias_stock = 999 if stock_efectivo > 0 else 0
+            dias_ss = 0
+            dias_rop = 0
+            dias_max = 0
+
+        # Determinar si necesita reposición usando el cálculo estadístico
+        # Similar a single-store: sugiere si hay cantidad > 0 y hay stock en CEDI
+        necesita_reposicion = (
+            cantidad_sugerida_bultos > 0 and
+            stock_cedi > 0 and
+            not tiene_sobrestock
+        )
+
+        # Si no necesita reposición, forzar cantidades a 0
+        # Excepción: envío prueba garantiza mínimo 1 bulto
+        if not necesita_reposicion:
+            if es_envio_prueba and not tiene_sobrestock and stock_cedi > 0:
+                cantidad_sugerida_bultos = 1
+                cantidad_sugerida_unid = float(unidades_por_bulto)
+            else:
+                cantidad_sugerida_unid = 0
+                cantidad_sugerida_bultos = 0
+
+        # Aplicar límites de inventario (igual que single-store)
+        # Orden: 1) Mínimo exhibición, 2) Capacidad máxima
+        limite_info = limites_capacidad.get(codigo)
+        if limite_info and not tiene_sobrestock:
+            # 1. MÍNIMO DE EXHIBICIÓN: elevar cantidad si es necesario para exhibición
+            minimo_exhibicion = limite_info.get('minimo_exhibicion')
+            if minimo_exhibicion and minimo_exhibicion > 0:
+                # Calcular cuántas unidades necesitamos para alcanzar el mínimo de exhibición
+                unidades_necesarias_exhibicion = max(0, minimo_exhibicion - stock_tienda)
+
+                if unidades_necesarias_exhibicion > cantidad_sugerida_unid:
+                    cantidad_antes_minimo = cantidad_sugerida_unid
+                    cantidad_sugerida_unid = unidades_necesarias_exhibicion
+                    cantidad_sugerida_bultos = math.ceil(unidades_necesarias_exhibicion / unidades_por_bulto) if unidades_por_bulto > 0 else 0
+
+                    logger.info(
+                        f"📊 {codigo} ({tienda_destino}): Elevado por mínimo exhibición. "
+                        f"Original: {cantidad_antes_minimo:.0f} → Elevado: {cantidad_sugerida_unid:.0f} unid "
+                        f"(Mín exhibición: {minimo_exhibicion:.0f}, Stock: {stock_tienda:.0f})"
+                    )
+
+            # 2. CAPACIDAD MÁXIMA: no exceder el espacio disponible
+            capacidad_maxima = limite_info.get('capacidad_maxima')
+            if capacidad_maxima and capacidad_maxima > 0:
+                # Espacio disponible = capacidad máxima - stock actual
+                espacio_disponible = max(0, capacidad_maxima - stock_tienda)
+
+                # Si la cantidad sugerida excede el espacio disponible, ajustar
+                if cantidad_sugerida_unid > espacio_disponible:
+                    cantidad_antes_cap = cantidad_sugerida_unid
+                    cantidad_sugerida_unid = espacio_disponible
+                    cantidad_sugerida_bultos = math.ceil(espacio_disponible / unidades_por_bulto) if unidades_por_bulto > 0 else 0
+
+                    tipo_restriccion = limite_info.get('tipo_restriccion', 'espacio_fisico')
+                    logger.info(
+                        f"⚠️ {codigo} ({tienda_destino}): Ajustado por capacidad de {tipo_restriccion}. "
+                        f"Original: {cantidad_antes_cap:.0f} → Ajustado: {cantidad_sugerida_unid:.0f} unid "
+                        f"(Cap. máx: {capacidad_maxima:.0f}, Stock: {stock_tienda:.0f}, Disponible: {espacio_disponible:.0f})"
+                    )
+
+        # Incluir TODOS los productos (sugeridos y no sugeridos)
+        productos.append({
+            'producto_id': producto_id,
+            'codigo_producto': codigo,
+            'descripcion_producto': p['descripcion'],
+            'categoria': p['categoria'],
+            'cuadrante': p['cuadrante'],
+            'clasificacion_abc': p['clase_abc'],
+            'unidades_por_bulto': unidades_por_bulto,
+            'prom_p75_unid': p['p75'],
+            'prom_20dias_unid': p['prom_20d'],
+            'stock_tienda': stock_tienda,
+            'stock_cedi_origen': stock_cedi,
+            'dias_stock': round(dias_stock, 2),
+            # Niveles en DÍAS (como single-store)
+            'dias_ss': round(dias_ss, 1),
+            'dias_rop': round(dias_rop, 1),
+            'dias_max': round(dias_max, 1),
+            # También incluir en unidades por si se necesita
+            'stock_seguridad_unid': stock_seguridad_unid,
+            'punto_reorden_unid': punto_reorden_unid,
+            'stock_maximo_unid': stock_maximo_unid,
+            'cantidad_necesaria_unid': cantidad_sugerida_unid,
+            'cantidad_sugerida_bultos': int(cantidad_sugerida_bultos),
+            'cantidad_sugerida_unid': cantidad_sugerida_unid,
+            'es_sugerido': necesita_reposicion,
+            # Tránsito (ya calculado antes del loop)
+            'transito_bultos': p['transito_bultos'],
+            'transito_desglose': transito_info['desglose'],
+            # Peso
+            'peso_kg': p['peso_unitario'],
+        })
+
+    return productos
@@ -0,0 +1,91 @@
+"""
+Persistencia en bloque de pedidos sugeridos.
+
+Los guardados de pedidos (individual, v2 y lote multi-tienda) insertaban
+una fila por línea de producto con un cursor.execute por fila: un lote de
+19 tiendas x ~1500 líneas eran decenas de miles de round trips dentro de la
+misma transacción. Este módulo arma las filas en Python y las inserta con
+psycopg2.extras.execute_values (un INSERT multi-fila por página).
+
+El número de pedido sale de pedidos_sugeridos_numero_seq (migración 044):
+un nextval por guardado, compartido por todos los pedidos de un lote
+(PS-<n>-1, PS-<n>-2, ...). Si la secuencia no existe se usa el MAX() de
+siempre.
+"""
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import psycopg2.extras
+
+logger = logging.getLogger(__name__)
+
+# Filas por INSERT multi-fila
+PAGE_SIZE = 1000
+
+
+def siguiente_numero_base(cursor) -> int:
+    """
+    Reserva el próximo número base de pedido (PS-<n>). No hace commit.
+    """
+    cursor.execute("SAVEPOINT numero_pedido")
+    try:
+        cursor.execute("SELECT nextval('pedidos_sugeridos_numero_seq')")
+        numero = cursor.fetchone()[0]
+        cursor.execute("RELEASE SAVEPOINT numero_pedido")
+        return int(numero)
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT numero_pedido")
+        logger.warning(f"⚠️ Sin pedidos_sugeridos_numero_seq ({e}), usando MAX(numero_pedido)")
+
+    cursor.execute("SELECT MAX(numero_pedido) FROM pedidos_sugeridos WHERE numero_pedido LIKE 'PS-%%'")
+    row = cursor.fetchone()
+    if not row or not row[0]:
+        return 1
+    try:
+        # PS-00001 o PS-00001-1
+        return int(row[0].split('-')[1]) + 1
+    except (IndexError, ValueError):
+        return 1
+
+
+def formatear_numero_pedido(numero_base: int, orden: Optional[int] = None) -> str:
+    """PS-00042 o, dentro de un lote, PS-00042-3."""
+    numero = f"PS-{numero_base:05d}"
+    return f"{numero}-{orden}" if orden is not None else numero
+
+
+def insertar_filas(
+    cursor,
+    tabla: str,
+    columnas: Sequence[str],
+    filas: List[Sequence],
+    valores_fijos: Optional[Dict[str, str]] = None
+) -> int:
+    """
+    INSERT multi-fila de `filas` en `tabla`.
+
+    Args:
+        tabla: tabla destino (nombre interno, no viene del request)
+        columnas: columnas que vienen en cada fila, en orden
+        filas: tuplas/listas con un valor por columna
+        valores_fijos: columna -> expresión SQL igual para todas las filas
+            (p.ej. {'fecha_creacion': 'CURRENT_TIMESTAMP'})
+
+    Returns:
+        Filas insertadas
+    """
+    if not filas:
+        return 0
+
+    valores_fijos = valores_fijos or {}
+    todas = list(columnas) + list(valores_fijos)
+    template = "(" + ", ".join(["%s"] * len(columnas) + list(valores_fijos.values())) + ")"
+
+    psycopg2.extras.execute_values(
+        cursor,
+        f"INSERT INTO {tabla} ({', '.join(todas)}) VALUES %s",
+        filas,
+        template=template,
+        page_size=PAGE_SIZE,
+    )
+    return len(filas)
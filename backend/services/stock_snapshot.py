@@ -0,0 +1,362 @@
+"""
+Snapshot en memoria del resultado de /api/stock.
+
+La query de stock (ventas 20/30/60 días, P75, ABC, stock CEDI) es la parte
+cara del endpoint; paginar con LIMIT/OFFSET la recalculaba completa en cada
+página y en cada cambio de orden. Este módulo guarda el resultado completo
+por combinación de filtros base (ubicación, almacén, categoría, marca,
+búsqueda) y resuelve en memoria:
+
+- Filtros sobre campos calculados (criticidad, clasificación, ABC, top
+  ventas, velocidad, stock CEDI, stock)
+- Estadísticas de la paginación (stock cero, críticos, fantasmas, ...)
+- Ordenamiento y paginación por página o por cursor (keyset)
+
+El cursor codifica el valor del campo de orden y la clave (ubicacion_id,
+producto_id) de la última fila entregada, así que la página siguiente es
+estable aunque el snapshot se reconstruya entre requests.
+
+Configuración (env):
+    STOCK_SNAPSHOT_TTL_SECONDS: vida de un snapshot (default 120; 0 = sin cache)
+    STOCK_SNAPSHOT_MAX_ENTRIES: snapshots en memoria por proceso (default 32)
+    STOCK_SNAPSHOT_MAX_ROWS: filas en memoria sumando todos los snapshots
+        (default 200000); un snapshot más grande se sirve sin cachear
+    STOCK_SNAPSHOT_MAX_PAGE_SIZE: page_size máximo de /api/stock (default 5000);
+        para más filas se pagina con el cursor
+"""
+import base64
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+STOCK_SNAPSHOT_TTL_SECONDS = float(os.getenv('STOCK_SNAPSHOT_TTL_SECONDS', '120'))
+STOCK_SNAPSHOT_MAX_ENTRIES = int(os.getenv('STOCK_SNAPSHOT_MAX_ENTRIES', '32'))
+STOCK_SNAPSHOT_MAX_ROWS = int(os.getenv('STOCK_SNAPSHOT_MAX_ROWS', '200000'))
+STOCK_SNAPSHOT_MAX_PAGE_SIZE = int(os.getenv('STOCK_SNAPSHOT_MAX_PAGE_SIZE', '5000'))
+
+# Vistas (filtro + orden) precalculadas por snapshot
+MAX_VISTAS_POR_SNAPSHOT = 16
+
+ClaveStock = Tuple[Optional[str], ...]
+
+
+@dataclass(frozen=True)
+class FiltrosStock:
+    """Filtros sobre campos calculados (misma semántica que el WHERE de SQL)."""
+    estado_criticidad: Optional[str] = None
+    clasificacion_producto: Optional[str] = None
+    clase_abc: Optional[str] = None
+    top_ventas: Optional[int] = None
+    velocidad_venta: Optional[str] = None
+    stock_cedi_filter: Optional[str] = None
+    stock_filter: Optional[str] = None
+
+    def aplica(self, fila: Dict[str, Any]) -> bool:
+        if self.estado_criticidad and fila['estado_criticidad'] != self.estado_criticidad:
+            return False
+        if self.clasificacion_producto and fila['clasificacion_producto'] != self.clasificacion_producto:
+            return False
+        if self.clase_abc and fila['clase_abc'] != self.clase_abc:
+            return False
+        if self.top_ventas and (fila['rank_ventas'] is None or fila['rank_ventas'] > self.top_ventas):
+            return False
+        if self.velocidad_venta and fila['velocidad_venta'] != self.velocidad_venta:
+            return False
+        if self.stock_cedi_filter == 'CON_STOCK' and not (fila['stock_cedi'] is not None and fila['stock_cedi'] > 0):
+            return False
+        if self.stock_cedi_filter == 'SIN_STOCK' and not (fila['stock_cedi'] is not None and fila['stock_cedi'] <= 0):
+            return False
+        if self.stock_filter == 'CON_STOCK' and not (fila['stock_actual'] is not None and fila['stock_actual'] > 0):
+            return False
+        if self.stock_filter == 'SIN_STOCK' and not (fila['stock_actual'] is not None and fila['stock_actual'] <= 0):
+            return False
+        return True
+
+
+def _clave_orden(fila: Dict[str, Any], campo: str, descendente: bool) -> tuple:
+    """ORDER BY campo [ASC|DESC] NULLS LAST, ubicacion_id, producto_id."""
+    valor = fila[campo]
+    if valor is None:
+        return (1, 0, fila['ubicacion_id'], fila['producto_id'])
+    return (0, -valor if descendente else valor, fila['ubicacion_id'], fila['producto_id'])
+
+
+def calcular_stats(filas: Sequence[Dict[str, Any]]) -> Dict[str, int]:
+    """Conteos de la barra de estadísticas de /api/stock."""
+    stats = {
+        'stock_cero': 0, 'stock_negativo': 0, 'criticos': 0, 'urgentes': 0,
+        'fantasmas': 0, 'anomalias': 0, 'dormidos': 0, 'activos': 0,
+    }
+    por_clasificacion = {'FANTASMA': 'fantasmas', 'ANOMALIA': 'anomalias', 'DORMIDO': 'dormidos', 'ACTIVO': 'activos'}
+    for fila in filas:
+        stock = fila['stock_actual']
+        if stock == 0:
+            stats['stock_cero'] += 1
+        elif stock is not None and stock < 0:
+            stats['stock_negativo'] += 1
+        if fila['estado_criticidad'] == 'CRITICO':
+            stats['criticos'] += 1
+        elif fila['estado_criticidad'] == 'URGENTE':
+            stats['urgentes'] += 1
+        clave = por_clasificacion.get(fila['clasificacion_producto'])
+        if clave:
+            stats[clave] += 1
+    return stats
+
+
+# =============================================================================
+# CURSOR (KEYSET)
+# =============================================================================
+
+def codificar_cursor(fila: Dict[str, Any], campo: str, descendente: bool) -> str:
+    """Cursor opaco con la posición de `fila` en el orden (campo, dirección)."""
+    valor = fila[campo]
+    if valor is None:
+        tipo, texto = 'n', None
+    elif isinstance(valor, Decimal):
+        tipo, texto = 'd', str(valor)
+    elif isinstance(valor, int):
+        tipo, texto = 'i', str(valor)
+    else:
+        tipo, texto = 'f', repr(float(valor))
+    payload = [campo, descendente, tipo, texto, fila['ubicacion_id'], fila['producto_id']]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decodificar_cursor(cursor: str, campo: str, descendente: bool) -> tuple:
+    """
+    Clave de orden codificada en el cursor.
+
+    Raises:
+        ValueError: cursor mal formado o generado para otro orden
+    """
+    try:
+        cursor_campo, cursor_desc, tipo, texto, ubicacion_id, producto_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+        if tipo == 'n':
+            valor = None
+        elif tipo == 'd':
+            valor = Decimal(texto)
+        elif tipo == 'i':
+            valor = int(texto)
+        elif tipo == 'f':
+            valor = float(texto)
+        else:
+            raise ValueError(f"tipo desconocido: {tipo}")
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise ValueError(f"cursor mal formado: {e}") from e
+
+    if cursor_campo != campo or bool(cursor_desc) != descendente:
+        raise ValueError("el cursor corresponde a otro ordenamiento")
+    fila = {campo: valor, 'ubicacion_id': ubicacion_id, 'producto_id': producto_id}
+    return _clave_orden(fila, campo, descendente)
+
+
+# =============================================================================
+# SNAPSHOT Y VISTAS
+# =============================================================================
+
+@dataclass
+class VistaStock:
+    """Filas de un snapshot filtradas y ordenadas, con sus estadísticas."""
+    campo: str
+    descendente: bool
+    filas: List[Dict[str, Any]]
+    claves: List[tuple]
+    stats: Dict[str, int]
+
+    def pagina(self, page: int, page_size: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int, Optional[str]]:
+        """
+        Página de la vista por número de página o, si viene, por cursor.
+
+        Returns: (filas, offset, next_cursor)
+        """
+        if cursor:
+            offset = bisect.bisect_right(self.claves, decodificar_cursor(cursor, self.campo, self.descendente))
+        else:
+            offset = (page - 1) * page_size
+        filas = self.filas[offset:offset + page_size]
+        next_cursor = None
+        if filas and offset + len(filas) < len(self.filas):
+            next_cursor = codificar_cursor(filas[-1], self.campo, self.descendente)
+        return filas, offset, next_cursor
+
+
+@dataclass
+class SnapshotStock:
+    """Resultado completo de la query de stock para una combinación de filtros base."""
+    clave: ClaveStock
+    filas: List[Dict[str, Any]]
+    creado_en: float
+    _vistas: "OrderedDict[tuple, VistaStock]" = field(default_factory=OrderedDict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def __len__(self) -> int:
+        return len(self.filas)
+
+    def vista(self, filtros: FiltrosStock, campo: str, descendente: bool) -> VistaStock:
+        """Vista filtrada y ordenada (se calcula una vez por filtro + orden)."""
+        clave = (filtros, campo, descendente)
+        with self._lock:
+            vista = self._vistas.get(clave)
+            if vista is not None:
+                self._vistas.move_to_end(clave)
+                return vista
+
+        filtradas = [fila for fila in self.filas if filtros.aplica(fila)]
+        claves_filas = sorted((_clave_orden(fila, campo, descendente), i) for i, fila in enumerate(filtradas))
+        vista = VistaStock(
+            campo=campo,
+            descendente=descendente,
+            filas=[filtradas[i] for _, i in claves_filas],
+            claves=[c for c, _ in claves_filas],
+            stats=calcular_stats(filtradas),
+        )
+        with self._lock:
+            self._vistas[clave] = vista
+            while len(self._vistas) > MAX_VISTAS_POR_SNAPSHOT:
+                self._vistas.popitem(last=False)
+        return vista
+
+
+_snapshots: "OrderedDict[ClaveStock, SnapshotStock]" = OrderedDict()
+_build_locks: Dict[ClaveStock, threading.Lock] = {}
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'builds': 0, 'invalidaciones': 0, 'desalojos': 0, 'sin_cache': 0, 'build_ms_total': 0.0}
+_filas_total = 0
+
+
+def _vigente(snapshot: Optional[SnapshotStock]) -> bool:
+    return snapshot is not None and time.monotonic() - snapshot.creado_en < STOCK_SNAPSHOT_TTL_SECONDS
+
+
+def _descartar(clave: ClaveStock) -> None:
+    """Saca un snapshot del cache (con _lock tomado)."""
+    global _filas_total
+    snapshot = _snapshots.pop(clave, None)
+    if snapshot is not None:
+        _filas_total -= len(snapshot)
+    _build_locks.pop(clave, None)
+
+
+def _guardar(clave: ClaveStock, snapshot: SnapshotStock) -> None:
+    """
+    Guarda el snapshot y desaloja los menos usados hasta volver a los límites
+    de entradas y filas (con _lock tomado). Un snapshot que solo excede
+    STOCK_SNAPSHOT_MAX_ROWS no se guarda.
+    """
+    global _filas_total
+    _descartar(clave)
+    if len(snapshot) > STOCK_SNAPSHOT_MAX_ROWS:
+        _stats['sin_cache'] += 1
+        logger.warning(
+            f"⚠️ Snapshot stock {clave[0] or 'todas'} de {len(snapshot)} filas excede "
+            f"STOCK_SNAPSHOT_MAX_ROWS={STOCK_SNAPSHOT_MAX_ROWS}: no se cachea"
+        )
+        return
+    _snapshots[clave] = snapshot
+    _filas_total += len(snapshot)
+    while len(_snapshots) > STOCK_SNAPSHOT_MAX_ENTRIES or _filas_total > STOCK_SNAPSHOT_MAX_ROWS:
+        _descartar(next(iter(_snapshots)))
+        _stats['desalojos'] += 1
+
+
+def _construir(clave: ClaveStock, consultar: Callable[[], Tuple[List[str], List[tuple]]]) -> SnapshotStock:
+    inicio = time.perf_counter()
+    columnas, rows = consultar()
+    snapshot = SnapshotStock(
+        clave=clave,
+        filas=[dict(zip(columnas, row)) for row in rows],
+        creado_en=time.monotonic(),
+    )
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    with _lock:
+        _stats['builds'] += 1
+        _stats['build_ms_total'] += duracion_ms
+    logger.info(f"📸 Snapshot stock {clave[0] or 'todas'}: {len(snapshot)} filas en {duracion_ms:.0f}ms")
+    return snapshot
+
+
+def obtener_snapshot_stock(
+    clave: ClaveStock,
+    consultar: Callable[[], Tuple[List[str], List[tuple]]],
+) -> SnapshotStock:
+    """
+    Snapshot de stock para `clave` (filtros base). Si no hay uno vigente,
+    llama a `consultar()` -> (columnas, filas) una sola vez aunque varios
+    requests lo pidan a la vez.
+
+    Usage:
+        snapshot = obtener_snapshot_stock(
+            (ubicacion_id, almacen_codigo, categoria, marca, search),
+            lambda: _query_stock_base(ubicacion_id, almacen_codigo, categoria, marca, search),
+        )
+        vista = snapshot.vista(FiltrosStock(clase_abc='A'), 'stock_actual', True)
+        filas, offset, next_cursor = vista.pagina(page, page_size, cursor)
+    """
+    if STOCK_SNAPSHOT_TTL_SECONDS <= 0:
+        return _construir(clave, consultar)
+
+    with _lock:
+        snapshot = _snapshots.get(clave)
+        if _vigente(snapshot):
+            _snapshots.move_to_end(clave)
+            _stats['hits'] += 1
+            return snapshot
+        build_lock = _build_locks.setdefault(clave, threading.Lock())
+
+    with build_lock:
+        with _lock:
+            snapshot = _snapshots.get(clave)
+            if _vigente(snapshot):
+                _snapshots.move_to_end(clave)
+                _stats['hits'] += 1
+                return snapshot
+            _stats['misses'] += 1
+        snapshot = _construir(clave, consultar)
+        with _lock:
+            _guardar(clave, snapshot)
+    return snapshot
+
+
+def invalidar_snapshot_stock(ubicacion_id: Optional[str] = None) -> int:
+    """
+    Descarta snapshots (todos, o los de una ubicación).
+
+    Returns: cantidad de snapshots descartados
+    """
+    with _lock:
+        claves = [c for c in _snapshots if ubicacion_id is None or c[0] == ubicacion_id]
+        for clave in claves:
+            _descartar(clave)
+        _stats['invalidaciones'] += len(claves)
+    return len(claves)
+
+
+def get_stock_snapshot_stats() -> Dict:
+    """Métricas del cache de snapshots de stock (por proceso)."""
+    with _lock:
+        return {
+            'ttl_seconds': STOCK_SNAPSHOT_TTL_SECONDS,
+            'max_entries': STOCK_SNAPSHOT_MAX_ENTRIES,
+            'max_rows': STOCK_SNAPSHOT_MAX_ROWS,
+            'snapshots': len(_snapshots),
+            'filas_total': _filas_total,
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'builds': _stats['builds'],
+            'invalidaciones': _stats['invalidaciones'],
+            'desalojos': _stats['desalojos'],
+            'sin_cache': _stats['sin_cache'],
+            'build_avg_ms': round(_stats['build_ms_total'] / _stats['builds'], 1) if _stats['builds'] else 0.0,
+        }
@@ -15,6 +15,8 @@ Usage:
 
 import os
 
+import psycopg2
+import psycopg2.extensions
 import pytest
 
 # ---------------------------------------------------------------------------
@@ -41,6 +43,139 @@ def pytest_collection_modifyitems(items):
             item.add_marker(_requires_db)
 
 
+# ---------------------------------------------------------------------------
+# Fake connection for unit tests (no database)
+# ---------------------------------------------------------------------------
+
+class FakeCursor:
+    """
+    Cursor falso de FakeConnection. Cada execute busca la primera regla
+    (etiqueta, fragmento, respuesta) cuyo fragmento aparece en el SQL y
+    registra (etiqueta, params) en `queries`; `respuesta` es una lista de
+    filas o un callable (sql, params) -> filas, que puede lanzar para simular
+    un error de la base. Sin regla el resultado es vacío (o AssertionError si
+    la conexión es estricta). Todas las sentencias quedan en `sentencias`.
+    Con la conexión marcada `rota` todo execute lanza OperationalError.
+    """
+
+    def __init__(self, connection, name=None):
+        self.connection = connection
+        self.name = name
+        self.itersize = None
+        self.queries = []
+        self.sentencias = []
+        self.resultado = []
+        self.cerrado = False
+
+    def execute(self, sql, params=None):
+        if self.connection.rota:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        sql = sql.decode() if isinstance(sql, bytes) else sql
+        self.sentencias.append(sql)
+        for etiqueta, fragmento, respuesta in self.connection.reglas:
+            if fragmento in sql:
+                self.queries.append((etiqueta, params))
+                filas = respuesta(sql, params) if callable(respuesta) else respuesta
+                self.resultado = list(filas or [])
+                return
+        if self.connection.estricto:
+            raise AssertionError(f"Consulta inesperada: {sql}")
+        self.resultado = []
+
+    def mogrify(self, template, args):
+        return (template.decode() if isinstance(template, bytes) else template).encode() % tuple(
+            repr(a).encode() for a in args
+        )
+
+    def fetchone(self):
+        return self.resultado[0] if self.resultado else None
+
+    def fetchall(self):
+        return list(self.resultado)
+
+    def __iter__(self):
+        return iter(self.resultado)
+
+    def close(self):
+        self.cerrado = True
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    """
+    Conexión falsa configurable por reglas (ver FakeCursor). `reglas` puede
+    ser la lista o un callable (conexión) -> lista, para reglas que leen el
+    estado de la propia conexión. Cada cursor() devuelve un cursor nuevo;
+    `queries` y `sentencias` acumulan las de todos.
+    """
+
+    encoding = 'UTF8'
+
+    def __init__(self, reglas=(), estricto=False, dsn=None):
+        self.reglas = list(reglas(self) if callable(reglas) else reglas)
+        self.estricto = estricto
+        self.dsn = dsn
+        self.cursores = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = 0
+        self.autocommit = False
+        self.rota = False
+        self.info = FakeInfo()
+
+    def cursor(self, name=None):
+        cursor = FakeCursor(self, name)
+        self.cursores.append(cursor)
+        return cursor
+
+    @property
+    def queries(self):
+        return [q for c in self.cursores for q in c.queries]
+
+    @property
+    def sentencias(self):
+        return [s for c in self.cursores for s in c.sentencias]
+
+    def etiquetas(self):
+        """Etiquetas de las reglas que respondieron, en orden"""
+        return [etiqueta for etiqueta, _ in self.queries]
+
+    def params(self, etiqueta):
+        """Parámetros de cada consulta que respondió la regla `etiqueta`"""
+        return [params for e, params in self.queries if e == etiqueta]
+
+    def commit(self):
+        self.commits += 1
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def fake_conn():
+    """
+    Fábrica de FakeConnection: fake_conn(reglas, estricto=False, **estado).
+    El estado queda como atributos de la conexión, donde lo leen las reglas
+    y lo modifican los tests.
+    """
+    def crear(reglas=(), estricto=False, **estado):
+        conn = FakeConnection(reglas, estricto=estricto)
+        for nombre, valor in estado.items():
+            setattr(conn, nombre, valor)
+        return conn
+
+    return crear
+
+
 # ---------------------------------------------------------------------------
 # Database fixtures (only used when TEST_DATABASE_URL is set)
 # ---------------------------------------------------------------------------
@@ -81,6 +216,19 @@ def client():
         yield c
 
 
+MIGRACIONES_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "database", "migrations")
+
+
+def ejecutar_migracion(cursor, archivo):
+    """
+    Ejecuta una migración de database/migrations dentro de la transacción
+    del cursor (sin su BEGIN;/COMMIT;), para que el rollback del test la
+    descarte.
+    """
+    with open(os.path.join(MIGRACIONES_DIR, archivo)) as f:
+        cursor.execute(''.join(l for l in f if l.strip() not in ("BEGIN;", "COMMIT;")))
+
+
 # ---------------------------------------------------------------------------
 # Sample data fixtures
 # ---------------------------------------------------------------------------
@@ -0,0 +1,255 @@
+"""
+Tests del recálculo ABC incremental (etl/core/abc_incremental.py).
+
+Cada escenario parte de una corrida completa, cambia ventas y corre el
+modo incremental; el estado resultante (agregados, productos_abc_tienda y
+productos_abc_cache) debe ser igual al de una reconstrucción completa con
+los mismos parámetros.
+
+Requieren PostgreSQL (TEST_DATABASE_URL): trabajan en un schema temporal
+que se descarta con el rollback de db_conn.
+"""
+
+import importlib.util
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+from tests.conftest import ejecutar_migracion
+
+_RUTA = os.path.join(os.path.dirname(__file__), '..', '..', 'etl', 'core', 'abc_incremental.py')
+_spec = importlib.util.spec_from_file_location('abc_incremental', _RUTA)
+abc_incremental = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(abc_incremental)
+
+HOY = date(2026, 10, 17)
+DIAS = 7
+EXCLUIDO = '003760'
+TIENDAS = ['tienda_01', 'tienda_02']
+PRODUCTOS = ['P0', 'P1', 'P2', 'P3']
+PRECIOS = [Decimal('9'), Decimal('2.5'), Decimal('0.6'), Decimal('0.05')]
+PARAMETROS = dict(
+    producto_excluido=EXCLUIDO, umbral_a=1, umbral_b=2, umbral_c=3,
+    pareto_a_pct=80, pareto_b_pct=95, modelo_activo='ranking_volumen',
+)
+
+TABLAS_BASE = """
+    CREATE TABLE ventas (
+        ubicacion_id VARCHAR(50),
+        producto_id VARCHAR(50),
+        fecha_venta TIMESTAMP,
+        cantidad_vendida NUMERIC(18,4),
+        venta_total NUMERIC(18,4),
+        numero_factura VARCHAR(100)
+    );
+    CREATE TABLE ventas_diarias (
+        ubicacion_id VARCHAR(50),
+        fecha DATE,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (ubicacion_id, fecha)
+    );
+    CREATE TABLE productos_abc_tienda (
+        producto_id VARCHAR(50), ubicacion_id VARCHAR(50),
+        cantidad_30d NUMERIC(18,4), venta_30d DECIMAL(18,2), tickets_30d INTEGER,
+        venta_acumulada DECIMAL(18,2), venta_total_tienda DECIMAL(18,2),
+        porcentaje_venta DECIMAL(8,4), porcentaje_acumulado DECIMAL(8,4),
+        rank_cantidad INTEGER, rank_valor INTEGER,
+        clase_ranking_vol CHAR(1), clase_ranking_val CHAR(1),
+        clase_pareto_vol CHAR(1), clase_pareto_val CHAR(1),
+        clase_abc CHAR(1),
+        fecha_calculo TIMESTAMP, periodo_inicio DATE, periodo_fin DATE
+    );
+    CREATE TABLE productos_abc_cache (
+        producto_id VARCHAR(50),
+        cantidad_30d NUMERIC(18,4), venta_30d DECIMAL(18,2), tickets_30d INTEGER,
+        total_tickets_periodo INTEGER, penetracion_pct DECIMAL(8,4),
+        venta_acumulada DECIMAL(18,2), venta_total_periodo DECIMAL(18,2),
+        porcentaje_venta DECIMAL(8,4), porcentaje_acumulado DECIMAL(8,4),
+        rank_cantidad INTEGER, rank_valor INTEGER, rank_penetracion INTEGER, gap INTEGER,
+        clase_ranking_vol CHAR(1), clase_ranking_val CHAR(1),
+        clase_pareto_vol CHAR(1), clase_pareto_val CHAR(1),
+        clase_abc CHAR(1),
+        fecha_calculo TIMESTAMP, periodo_inicio DATE, periodo_fin DATE, dias_periodo INTEGER
+    );
+    CREATE TABLE abc_cache_control (
+        nombre_proceso VARCHAR(100), fecha_inicio TIMESTAMP, fecha_fin TIMESTAMP,
+        estado VARCHAR(20), productos_procesados INTEGER, parametros JSONB
+    );
+"""
+
+# Estado comparable: todo lo que escribe el recálculo menos fecha_calculo
+CONSULTAS_ESTADO = {
+    'abc_ventas_dia': "SELECT * FROM abc_ventas_dia ORDER BY 1, 2, 3",
+    'abc_tickets_dia': "SELECT * FROM abc_tickets_dia ORDER BY 1, 2",
+    'abc_acumulado_tienda': "SELECT * FROM abc_acumulado_tienda ORDER BY 1, 2",
+    'productos_abc_tienda': """
+        SELECT producto_id, ubicacion_id, cantidad_30d, venta_30d, tickets_30d,
+               venta_acumulada, venta_total_tienda, porcentaje_venta, porcentaje_acumulado,
+               rank_cantidad, rank_valor, clase_ranking_vol, clase_ranking_val,
+               clase_pareto_vol, clase_pareto_val, clase_abc, periodo_inicio, periodo_fin
+        FROM productos_abc_tienda ORDER BY 2, 1
+    """,
+    'productos_abc_cache': """
+        SELECT producto_id, cantidad_30d, venta_30d, tickets_30d, total_tickets_periodo,
+               penetracion_pct, venta_acumulada, venta_total_periodo, porcentaje_venta,
+               porcentaje_acumulado, rank_cantidad, rank_valor, rank_penetracion, gap,
+               clase_ranking_vol, clase_ranking_val, clase_pareto_vol, clase_pareto_val,
+               clase_abc, periodo_inicio, periodo_fin, dias_periodo
+        FROM productos_abc_cache ORDER BY 1
+    """,
+}
+
+
+def _filas_dia(tienda, fecha, factor=1):
+    """
+    Ventas de un día: el producto i se vende en i+1 tickets (sin empates
+    entre productos en ningún ranking). Los tickets del primer producto
+    llevan dos líneas (formato KLK "{factura}_L{linea}") y hay una venta
+    del producto excluido.
+    """
+    filas = []
+    for i, (producto, precio) in enumerate(zip(PRODUCTOS, PRECIOS)):
+        cantidad = Decimal(10 ** i * (1 + fecha.day % 3) * factor)
+        for t in range(i + 1):
+            factura = f"{tienda}-{fecha:%m%d}-{producto}-{t}"
+            lineas = 2 if i == 0 else 1
+            for linea in range(1, lineas + 1):
+                parte = cantidad / (i + 1) / lineas
+                filas.append((tienda, producto, fecha, parte, parte * precio, f"{factura}_L{linea}"))
+    filas.append((tienda, EXCLUIDO, fecha, Decimal(1000), Decimal(1000), f"{tienda}-{fecha:%m%d}-X_L1"))
+    return filas
+
+
+def _cargar_dia(cursor, tienda, fecha, filas, recargado=True):
+    """Reemplaza las ventas de un día y su fila de ventas_diarias, como los loaders."""
+    cursor.execute(
+        "DELETE FROM ventas WHERE ubicacion_id = %s AND fecha_venta::date = %s", (tienda, fecha)
+    )
+    cursor.execute("DELETE FROM ventas_diarias WHERE ubicacion_id = %s AND fecha = %s", (tienda, fecha))
+    if not filas:
+        return
+    cursor.executemany(
+        "INSERT INTO ventas VALUES (%s, %s, %s::date + TIME '10:00', %s, %s, %s)", filas
+    )
+    cursor.execute(
+        "INSERT INTO ventas_diarias VALUES (%s, %s, NOW() - %s::interval)",
+        (tienda, fecha, '0 seconds' if recargado else '1 day')
+    )
+
+
+def _recalcular(cursor, hoy=HOY, dias=DIAS, reconstruir=False, **cambios):
+    return abc_incremental.recalcular_abc_incremental(
+        cursor, dias, reconstruir=reconstruir, hoy=hoy, **dict(PARAMETROS, **cambios)
+    )
+
+
+def _estado(cursor):
+    estado = {}
+    for tabla, sql in CONSULTAS_ESTADO.items():
+        cursor.execute(sql)
+        estado[tabla] = cursor.fetchall()
+    return estado
+
+
+def _estado_completo(cursor, **kwargs):
+    """Estado de una reconstrucción completa, sin dejar rastro (savepoint)."""
+    cursor.execute("SAVEPOINT completo")
+    _recalcular(cursor, reconstruir=True, **kwargs)
+    estado = _estado(cursor)
+    cursor.execute("ROLLBACK TO SAVEPOINT completo")
+    return estado
+
+
+@pytest.fixture
+def cursor(db_conn):
+    cur = db_conn.cursor()
+    cur.execute("CREATE SCHEMA abc_incremental_test")
+    cur.execute("SET LOCAL search_path TO abc_incremental_test")
+    cur.execute(TABLAS_BASE)
+    # Tablas abc_* de la migración 045, dentro de la transacción del test
+    ejecutar_migracion(cur, '045_abc_acumulado_UP.sql')
+    # Un día fuera de la ventana inicial y la ventana sin el día de hoy
+    for tienda in TIENDAS:
+        for n in range(1, DIAS + 2):
+            fecha = HOY - timedelta(days=n)
+            _cargar_dia(cursor=cur, tienda=tienda, fecha=fecha,
+                        filas=_filas_dia(tienda, fecha), recargado=False)
+
+    resultado = _recalcular(cur)
+    assert resultado['modo'] == 'completo'
+    yield cur
+    cur.close()
+
+
+@pytest.mark.integration
+class TestRecalculoIncremental:
+
+    def test_dia_recargado(self, cursor):
+        fecha = HOY - timedelta(days=3)
+        _cargar_dia(cursor, 'tienda_01', fecha, _filas_dia('tienda_01', fecha, factor=3))
+
+        resultado = _recalcular(cursor)
+
+        assert (resultado['modo'], resultado['dias_recalculados'], resultado['dias_vencidos']) == ('incremental', 1, 0)
+        assert resultado['tiendas_procesadas'] == 1
+        assert _estado(cursor) == _estado_completo(cursor)
+
+    def test_dia_recargado_sin_ventas(self, cursor):
+        # El día pierde su fila de ventas_diarias: se detecta por abc_tickets_dia
+        fecha = HOY - timedelta(days=2)
+        _cargar_dia(cursor, 'tienda_02', fecha, [])
+
+        resultado = _recalcular(cursor)
+
+        assert (resultado['modo'], resultado['dias_recalculados']) == ('incremental', 1)
+        assert _estado(cursor) == _estado_completo(cursor)
+
+    def test_dia_vencido(self, cursor):
+        manana = HOY + timedelta(days=1)
+
+        resultado = _recalcular(cursor, hoy=manana)
+
+        assert (resultado['modo'], resultado['dias_recalculados'], resultado['dias_vencidos']) == ('incremental', 0, 2)
+        assert _estado(cursor) == _estado_completo(cursor, hoy=manana)
+
+    def test_dia_nuevo(self, cursor):
+        # Cargado "antes" de la marca: se toma por ser posterior al fin de ventana anterior
+        for tienda in TIENDAS:
+            _cargar_dia(cursor, tienda, HOY, _filas_dia(tienda, HOY, factor=2), recargado=False)
+        manana = HOY + timedelta(days=1)
+
+        resultado = _recalcular(cursor, hoy=manana)
+
+        assert (resultado['modo'], resultado['dias_recalculados'], resultado['dias_vencidos']) == ('incremental', 2, 2)
+        assert _estado(cursor) == _estado_completo(cursor, hoy=manana)
+
+    def test_cambio_de_parametros(self, cursor):
+        cambios = dict(umbral_a=2, pareto_a_pct=50, modelo_activo='pareto_valor')
+
+        resultado = _recalcular(cursor, **cambios)
+
+        assert (resultado['modo'], resultado['dias_recalculados']) == ('incremental', 0)
+        assert resultado['tiendas_procesadas'] == len(TIENDAS)
+        assert _estado(cursor) == _estado_completo(cursor, **cambios)
+
+    def test_reconstruccion_completa(self, cursor):
+        # Cambiar la ventana reconstruye; también se reconstruye a pedido
+        resultado = _recalcular(cursor, dias=DIAS + 1)
+        assert resultado['modo'] == 'completo'
+        assert _estado(cursor) == _estado_completo(cursor, dias=DIAS + 1)
+
+        cursor.execute("UPDATE abc_acumulado_tienda SET cantidad = 0")
+        assert _recalcular(cursor, reconstruir=True)['modo'] == 'completo'
+        assert _estado(cursor) == _estado_completo(cursor)
+        cursor.execute("SELECT COUNT(*) FROM abc_acumulado_tienda WHERE producto_id = %s", (EXCLUIDO,))
+        assert cursor.fetchone()[0] == 0
+
+    def test_sin_cambios_no_rerankea(self, cursor):
+        antes = _estado(cursor)
+
+        resultado = _recalcular(cursor)
+
+        assert (resultado['modo'], resultado['dias_recalculados'], resultado['tiendas_procesadas']) == ('incremental', 0, 0)
+        assert _estado(cursor) == antes
@@ -0,0 +1,88 @@
+"""
+Tests para el DPD+U batch (NumPy).
+
+Valida que calcular_distribucion_dpdu_batch produce exactamente las mismas
+asignaciones que calcular_distribucion_dpdu (escalar) producto por producto,
+incluyendo el reparto de bultos sobrantes.
+"""
+
+import random
+from dataclasses import asdict
+
+import pytest
+
+from services.algoritmo_dpdu import ConfigDPDU, DatosTiendaProducto, calcular_distribucion_dpdu
+from services.algoritmo_dpdu_batch import calcular_distribucion_dpdu_batch
+
+
+def generar_productos(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    productos = []
+    for p in range(n):
+        tiendas = []
+        for t in range(rng.randint(2, 19)):
+            demanda = rng.choice([0.0, rng.uniform(0.1, 5), rng.uniform(5, 300), 12.5])
+            stock = rng.choice([0.0, rng.uniform(0, 50), rng.uniform(0, 3000)])
+            tiendas.append(DatosTiendaProducto(
+                tienda_id=f'tienda_{t:02d}',
+                tienda_nombre=f'TIENDA {t}',
+                demanda_p75=demanda,
+                stock_actual=stock,
+                dias_stock=stock / demanda if demanda > 0 else 999,
+                cantidad_necesaria=rng.choice([rng.uniform(1, 500), float(rng.randint(1, 40) * 6)]),
+            ))
+        productos.append((
+            rng.choice([0.0, -5.0, rng.uniform(0, 100), rng.uniform(100, 20000)]),
+            rng.choice([1, 6, 12, 24, 48, 0]),
+            tiendas,
+        ))
+    return productos
+
+
+def comparar(productos, config):
+    batch = calcular_distribucion_dpdu_batch(
+        [p[0] for p in productos], [p[1] for p in productos], [p[2] for p in productos], config
+    )
+    assert len(batch) == len(productos)
+    for i, (stock, upb, tiendas) in enumerate(productos):
+        esperado = calcular_distribucion_dpdu(stock, upb, tiendas, config)
+        obtenido = batch.asignaciones(i)
+        assert [asdict(a) for a in obtenido] == [asdict(a) for a in esperado], f"Producto {i}"
+    return batch
+
+
+@pytest.mark.critical
+class TestAlgoritmoDPDUBatch:
+
+    @pytest.mark.parametrize("config", [
+        ConfigDPDU(),
+        ConfigDPDU(peso_demanda=0.3, peso_urgencia=0.7, dias_minimo_urgencia=2.0),
+        ConfigDPDU(peso_demanda=1.0, peso_urgencia=0.0, dias_minimo_urgencia=0.0),
+    ])
+    def test_identico_a_version_escalar(self, config):
+        comparar(generar_productos(1500), config)
+
+    def test_bultos_sobrantes_desempatan_por_demanda_y_orden(self):
+        # Todas sin stock (urgencia 100): los sobrantes van por pct_demanda y luego posición
+        tiendas = [
+            DatosTiendaProducto(f't{i}', f'T{i}', demanda_p75=d, stock_actual=0, dias_stock=0, cantidad_necesaria=50)
+            for i, d in enumerate([10, 30, 10, 30])
+        ]
+        batch = comparar([(7 * 12, 12, tiendas)], ConfigDPDU())
+
+        asignaciones = batch.asignaciones(0)
+        assert sum(a.cantidad_asignada_bultos for a in asignaciones) == 7
+        assert [a.cantidad_asignada_bultos for a in asignaciones] == [1, 3, 1, 2]
+
+    def test_sobrantes_mayores_que_tiendas_no_se_reparten_dos_veces(self):
+        tiendas = [
+            DatosTiendaProducto(f't{i}', f'T{i}', demanda_p75=0, stock_actual=0, dias_stock=0.1, cantidad_necesaria=10)
+            for i in range(3)
+        ]
+        comparar([(100, 1, tiendas), (0.9, 1, tiendas)], ConfigDPDU(peso_demanda=0, peso_urgencia=0))
+
+    def test_productos_sin_tiendas_y_lote_vacio(self):
+        batch = calcular_distribucion_dpdu_batch([], [], [], ConfigDPDU())
+        assert len(batch) == 0
+
+        comparar([(100, 6, []), (100, 6, generar_productos(1)[0][2])], ConfigDPDU())
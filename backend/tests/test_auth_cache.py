@@ -0,0 +1,93 @@
+"""
+Tests para el cache de usuarios de auth.verify_token.
+
+Reemplazan la conexión de auth por la falsa de conftest, que cuenta queries:
+no requieren base de datos.
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+
+
+def reglas(conn):
+    """Usuarios {username: fila} y tiendas {user_id: [ubicacion_id]} del estado de la conexión"""
+    return [
+        ('usuario', "FROM usuarios u",
+         lambda sql, params: [conn.usuarios[params[0]]] if params[0] in conn.usuarios else []),
+        ('tiendas', "FROM usuarios_tiendas",
+         lambda sql, params: [(t,) for t in conn.tiendas.get(params[0], [])]),
+    ]
+
+
+@pytest.fixture
+def db(monkeypatch, fake_conn):
+    fake = fake_conn(
+        reglas,
+        usuarios={
+            "ana": ("u-1", "ana", "Ana", "ana@fluxion.ai", True, "gerente_tienda", "Gerente Tienda", 2),
+            "beto": ("u-2", "beto", "Beto", None, True, "visualizador", "Visualizador", 1),
+        },
+        tiendas={"u-1": ["tienda_01"]},
+    )
+
+    @contextmanager
+    def connection(read_only=False):
+        yield fake
+
+    monkeypatch.setattr(auth, "get_db_connection", connection)
+    monkeypatch.setattr(auth, "USER_CACHE_TTL_SECONDS", 60)
+    auth.invalidate_user_cache()
+    yield fake
+    auth.invalidate_user_cache()
+
+
+def credenciales(username):
+    token = auth.create_access_token({"sub": username})
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.mark.basic
+class TestVerifyTokenCache:
+
+    def test_segunda_llamada_no_consulta_bd(self, db):
+        primero = auth.verify_token(credenciales("ana"))
+        queries = len(db.sentencias)
+        segundo = auth.verify_token(credenciales("ana"))
+
+        assert primero.tiendas_asignadas == ["tienda_01"]
+        assert segundo == primero
+        assert len(db.sentencias) == queries
+
+    def test_invalidacion_por_user_id(self, db):
+        auth.verify_token(credenciales("ana"))
+        db.usuarios["ana"] = db.usuarios["ana"][:5] + ("super_admin", "Super Admin", 5)
+
+        assert auth.invalidate_user_cache(user_id="u-1") == 1
+        assert auth.verify_token(credenciales("ana")).rol_id == "super_admin"
+
+    def test_usuario_desactivado_deja_de_autenticar(self, db):
+        auth.verify_token(credenciales("beto"))
+        del db.usuarios["beto"]
+        auth.invalidate_user_cache(username="beto")
+
+        with pytest.raises(HTTPException) as exc:
+            auth.verify_token(credenciales("beto"))
+        assert exc.value.status_code == 401
+
+    def test_ttl_cero_deshabilita_cache(self, db, monkeypatch):
+        monkeypatch.setattr(auth, "USER_CACHE_TTL_SECONDS", 0)
+        auth.verify_token(credenciales("beto"))
+        queries = len(db.sentencias)
+        auth.verify_token(credenciales("beto"))
+        assert len(db.sentencias) > queries
+
+    def test_cache_acotado(self, db, monkeypatch):
+        monkeypatch.setattr(auth, "USER_CACHE_MAX_SIZE", 1)
+        auth.verify_token(credenciales("ana"))
+        auth.verify_token(credenciales("beto"))
+        assert auth.get_user_cache_stats()["size"] == 1
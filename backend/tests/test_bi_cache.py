@@ -0,0 +1,133 @@
+"""
+Tests para el cache de respuestas BI (services/bi_cache.py).
+
+Montan un router mínimo con el mismo stack de decorators que los routers de
+BI (@db_offload + @cache_bi) y la conexión falsa de conftest: no requieren base de datos.
+"""
+
+from contextlib import contextmanager
+from typing import Any, List, Optional
+
+import pytest
+from fastapi import APIRouter, Depends, FastAPI, Query
+from fastapi.testclient import TestClient
+
+import db_manager
+from db_manager import db_offload
+from services import bi_cache
+from services.bi_cache import cache_bi, establecer_version_datos, invalidar_cache_bi
+
+
+# Conexión falsa del test en curso (fixture conn): responde la versión de bi_data_version
+CONN = None
+LLAMADAS = []
+
+router = APIRouter()
+
+
+def get_db():
+    yield CONN
+
+
+@router.get("/kpis")
+@db_offload
+@cache_bi
+def get_kpis(
+    fecha_inicio: str = Query(...),
+    region: Optional[str] = None,
+    tiendas: List[str] = Query([]),
+    current_user: Any = None,
+    conn: Any = Depends(get_db)
+):
+    LLAMADAS.append((fecha_inicio, region, tuple(tiendas)))
+    return {"fecha": fecha_inicio, "region": region, "tiendas": tiendas, "version": conn.version}
+
+
+@pytest.fixture
+def conn(fake_conn, monkeypatch):
+    conexion = fake_conn([('version', "bi_data_version", lambda sql, params: [(conexion.version,)])], version=1)
+    monkeypatch.setitem(globals(), 'CONN', conexion)
+    return conexion
+
+
+@pytest.fixture
+def api(monkeypatch, conn):
+    monkeypatch.setattr(bi_cache, 'BI_DATA_VERSION_CHECK_SECONDS', 0)
+    monkeypatch.setattr(bi_cache, '_version', None)
+    invalidar_cache_bi()
+    LLAMADAS.clear()
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+@pytest.mark.basic
+class TestCacheBI:
+
+    def test_misma_clave_no_recalcula(self, api):
+        r1 = api.get("/kpis", params={"fecha_inicio": "2026-10-01", "region": "VALENCIA"})
+        r2 = api.get("/kpis", params={"region": "VALENCIA", "fecha_inicio": "2026-10-01 "})
+
+        assert r1.status_code == r2.status_code == 200
+        assert r1.json() == r2.json() == {"fecha": "2026-10-01", "region": "VALENCIA", "tiendas": [], "version": 1}
+        assert len(LLAMADAS) == 1
+        assert r1.headers["etag"] == r2.headers["etag"]
+
+        api.get("/kpis", params={"fecha_inicio": "2026-10-01", "region": "CARACAS"})
+        api.get("/kpis", params={"fecha_inicio": "2026-10-01", "tiendas": ["t1", "t2"]})
+        assert len(LLAMADAS) == 3
+
+    def test_if_none_match_responde_304(self, api):
+        r1 = api.get("/kpis", params={"fecha_inicio": "2026-10-01"})
+        r2 = api.get("/kpis", params={"fecha_inicio": "2026-10-01"}, headers={"If-None-Match": r1.headers["etag"]})
+
+        assert r2.status_code == 304
+        assert r2.content == b""
+        assert r2.headers["etag"] == r1.headers["etag"]
+
+    def test_cambio_de_version_invalida_y_calienta(self, api, conn, monkeypatch):
+        calentadas = []
+        monkeypatch.setattr(bi_cache, '_calentar', lambda pendientes, token: calentadas.extend(pendientes))
+
+        r1 = api.get("/kpis", params={"fecha_inicio": "2026-10-01"})
+        conn.version = 2
+        r2 = api.get("/kpis", params={"fecha_inicio": "2026-10-01"}, headers={"If-None-Match": r1.headers["etag"]})
+
+        assert r2.status_code == 200
+        assert r2.json()["version"] == 2
+        assert r2.headers["etag"] != r1.headers["etag"]
+        assert len(LLAMADAS) == 2
+        assert [nombre for nombre, _ in calentadas] == [f"{__name__}.get_kpis"]
+        assert calentadas[0][1]["fecha_inicio"] == "2026-10-01"
+
+    def test_calentar_recalcula_para_la_version_nueva(self, api, monkeypatch):
+        api.get("/kpis", params={"fecha_inicio": "2026-10-01"})
+        kwargs = {"fecha_inicio": "2026-10-01", "region": None, "tiendas": []}
+        establecer_version_datos("7")
+        token = bi_cache._token("7")
+
+        monkeypatch.setattr(db_manager, 'get_db_connection', contextmanager(get_db))
+        bi_cache._calentar([(f"{__name__}.get_kpis", kwargs)], token)
+
+        clave = (f"{__name__}.get_kpis", bi_cache.normalizar_params(kwargs), token)
+        assert clave in bi_cache._cache
+
+    def test_lru_acotado_por_entradas_y_bytes(self, api, monkeypatch):
+        monkeypatch.setattr(bi_cache, 'BI_CACHE_MAX_ENTRIES', 2)
+        for dia in ("01", "02", "03"):
+            api.get("/kpis", params={"fecha_inicio": f"2026-10-{dia}"})
+        assert len(bi_cache._cache) == 2
+        assert bi_cache.get_bi_cache_stats()["evictions"] == 1
+
+        monkeypatch.setattr(bi_cache, 'BI_CACHE_MAX_BYTES', 10)
+        api.get("/kpis", params={"fecha_inicio": "2026-10-04"})
+        assert all("2026-10-04" not in str(clave) for clave in bi_cache._cache)
+
+    def test_sin_tabla_de_version_responde_sin_cache(self, api, monkeypatch):
+        monkeypatch.setattr(bi_cache, 'leer_version_datos', lambda conn: None)
+        api.get("/kpis", params={"fecha_inicio": "2026-10-01"})
+        r = api.get("/kpis", params={"fecha_inicio": "2026-10-01"})
+
+        assert r.status_code == 200
+        assert "etag" not in r.headers
+        assert len(LLAMADAS) == 2
@@ -0,0 +1,149 @@
+"""
+Tests del cache stale-while-revalidate compartido (services/cache_swr.py).
+
+Reemplazan el store compartido (cache_respuestas) por un diccionario: no
+requieren base de datos.
+"""
+
+import threading
+import time
+
+import pytest
+
+from services import cache_swr
+
+
+class FakeStore:
+    """cache_respuestas + bi_data_version en memoria."""
+
+    def __init__(self):
+        self.filas = {}
+        self.version = 1
+        self.lease_ajeno = False
+        self.disponible = True
+
+    def leer(self, nombre):
+        if not self.disponible:
+            raise RuntimeError('relation "cache_respuestas" does not exist')
+        fila = self.filas.get(nombre)
+        if fila is None:
+            return None, None, None, self.version
+        return fila['contenido'], time.time() - fila['calculado_en'], fila['version_datos'], self.version
+
+    def tomar_lease(self, nombre):
+        if not self.disponible:
+            raise RuntimeError('relation "cache_respuestas" does not exist')
+        return not self.lease_ajeno
+
+    def guardar(self, nombre, contenido, version, duracion_ms):
+        self.filas[nombre] = {'contenido': contenido, 'calculado_en': time.time(), 'version_datos': version}
+
+    def liberar(self, nombre):
+        pass
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(cache_swr, '_leer_compartido', store.leer)
+    monkeypatch.setattr(cache_swr, '_tomar_lease', store.tomar_lease)
+    monkeypatch.setattr(cache_swr, '_guardar_compartido', store.guardar)
+    monkeypatch.setattr(cache_swr, '_liberar_lease', store.liberar)
+    monkeypatch.setattr(cache_swr, 'SWR_CACHE_CHECK_SECONDS', 0)
+    monkeypatch.setattr(cache_swr, '_compartido_deshabilitado_hasta', 0.0)
+    monkeypatch.setattr(cache_swr, '_caches', {})
+    return store
+
+
+def contador(valores):
+    """Función de cálculo que devuelve valores sucesivos y cuenta llamadas."""
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+        return valores[min(len(llamadas), len(valores)) - 1]
+
+    return calcular, llamadas
+
+
+def esperar_refresco(nombre, timeout=2.0):
+    limite = time.monotonic() + timeout
+    while cache_swr._caches[nombre].refrescando and time.monotonic() < limite:
+        time.sleep(0.01)
+
+
+@pytest.mark.basic
+class TestCacheSWR:
+
+    def test_miss_calcula_una_vez_y_publica(self, store):
+        calcular, llamadas = contador([[{'region': 'VALENCIA'}]])
+        cache_swr.registrar_cache_swr('t.miss', calcular, ttl_segundos=60)
+
+        assert cache_swr.obtener_cache_swr('t.miss') == [{'region': 'VALENCIA'}]
+        assert cache_swr.obtener_cache_swr('t.miss') == [{'region': 'VALENCIA'}]
+
+        assert len(llamadas) == 1
+        assert store.filas['t.miss']['version_datos'] == '1'
+
+    def test_usa_la_copia_de_otro_worker(self, store):
+        store.guardar('t.otro', ['de otro worker'], '1', 10)
+        calcular, llamadas = contador([['local']])
+        cache_swr.registrar_cache_swr('t.otro', calcular, ttl_segundos=60)
+
+        assert cache_swr.obtener_cache_swr('t.otro') == ['de otro worker']
+        assert llamadas == []
+
+    def test_vencida_se_sirve_mientras_se_recalcula(self, store):
+        liberar = threading.Event()
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            liberar.wait(2)
+            return ['nuevo']
+
+        store.guardar('t.stale', ['viejo'], '1', 10)
+        store.filas['t.stale']['calculado_en'] -= 120
+        cache_swr.registrar_cache_swr('t.stale', calcular, ttl_segundos=60)
+
+        inicio = time.monotonic()
+        assert cache_swr.obtener_cache_swr('t.stale') == ['viejo']
+        assert time.monotonic() - inicio < 0.5
+
+        liberar.set()
+        esperar_refresco('t.stale')
+        assert llamadas == [1]
+        assert cache_swr.obtener_cache_swr('t.stale') == ['nuevo']
+
+    def test_nueva_version_de_datos_vence_la_copia(self, store):
+        calcular, llamadas = contador([['v1'], ['v2']])
+        cache_swr.registrar_cache_swr('t.version', calcular, ttl_segundos=3600)
+        assert cache_swr.obtener_cache_swr('t.version') == ['v1']
+
+        store.version = 2  # terminó un ETL
+        assert cache_swr.obtener_cache_swr('t.version') == ['v1']
+        esperar_refresco('t.version')
+
+        assert cache_swr.obtener_cache_swr('t.version') == ['v2']
+        assert store.filas['t.version']['version_datos'] == '2'
+
+    def test_lease_de_otro_worker_no_recalcula(self, store):
+        store.guardar('t.lease', ['viejo'], '1', 10)
+        store.filas['t.lease']['calculado_en'] -= 120
+        store.lease_ajeno = True
+        calcular, llamadas = contador([['nuevo']])
+        cache_swr.registrar_cache_swr('t.lease', calcular, ttl_segundos=60)
+
+        assert cache_swr.obtener_cache_swr('t.lease') == ['viejo']
+        esperar_refresco('t.lease')
+        assert llamadas == []
+
+    def test_sin_store_compartido_usa_cache_local(self, store):
+        store.disponible = False
+        calcular, llamadas = contador([['local']])
+        cache_swr.registrar_cache_swr('t.local', calcular, ttl_segundos=60)
+
+        assert cache_swr.obtener_cache_swr('t.local') == ['local']
+        assert cache_swr.obtener_cache_swr('t.local') == ['local']
+        assert len(llamadas) == 1
+        assert not cache_swr.get_swr_cache_stats()['compartido']
@@ -0,0 +1,94 @@
+"""
+Tests para el cálculo batch (NumPy) de parámetros de inventario.
+
+Valida que calcular_inventario_batch produce exactamente el mismo
+resultado que calcular_inventario (escalar) SKU por SKU.
+"""
+
+import random
+from dataclasses import asdict
+
+import pytest
+
+from services.calculo_inventario_abc import (
+    ConfigTiendaABC,
+    calcular_inventario_simple,
+    set_config_tienda,
+)
+from services.calculo_inventario_batch import calcular_inventario_batch
+
+
+def generar_surtido(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    filas = []
+    for _ in range(n):
+        p75 = rng.choice([0.0, 0.25, rng.uniform(0.1, 5), rng.uniform(5, 200)])
+        filas.append({
+            'demanda_p75': p75,
+            'sigma_demanda': rng.choice([0.0, rng.uniform(0, p75 * 3 + 1)]),
+            'demanda_maxima': rng.choice([p75, p75 * rng.uniform(1, 4)]),
+            'unidades_por_bulto': rng.choice([1, 6, 12, 24, 48, -1, -12]),  # negativos: dato sucio del maestro
+            'stock_actual': rng.choice([0.0, rng.uniform(0, 50), rng.uniform(0, 5000)]),
+            'stock_cedi': rng.uniform(0, 10000),
+            'clase_abc': rng.choice(['A', 'B', 'C', 'D', '-', None]),
+            'es_generador_trafico': rng.random() < 0.1,
+            'dias_cobertura_override': rng.choice([None, None, None, 1, 3]),
+        })
+    return filas
+
+
+def calcular_batch(filas, config_tienda=None):
+    columnas = {campo: [f[campo] for f in filas] for campo in filas[0]}
+    return calcular_inventario_batch(**columnas, config_tienda=config_tienda)
+
+
+@pytest.mark.critical
+class TestCalculoInventarioBatch:
+
+    @pytest.mark.parametrize("config", [
+        None,
+        ConfigTiendaABC(lead_time=2.0, dias_cobertura_a=3, dias_cobertura_b=5,
+                        dias_cobertura_c=10, dias_cobertura_d=15),
+    ])
+    def test_identico_a_version_escalar(self, config):
+        filas = generar_surtido(2000)
+        batch = calcular_batch(filas, config_tienda=config)
+
+        assert len(batch) == len(filas)
+        for i, fila in enumerate(filas):
+            esperado = calcular_inventario_simple(**fila, config_tienda=config)
+            assert asdict(batch.fila(i)) == asdict(esperado), f"Fila {i}: {fila}"
+
+    def test_usa_globals_de_set_config_tienda(self):
+        filas = generar_surtido(300, seed=7)
+        set_config_tienda(ConfigTiendaABC(lead_time=1.0, dias_cobertura_a=2))
+        try:
+            batch = calcular_batch(filas)
+            for i, fila in enumerate(filas):
+                esperado = calcular_inventario_simple(**fila)
+                assert batch.stock_maximo_unid[i] == esperado.stock_maximo_unid
+                assert batch.cantidad_sugerida_bultos[i] == esperado.cantidad_sugerida_bultos
+        finally:
+            set_config_tienda(None)
+
+    def test_generador_trafico_se_calcula_como_clase_a(self):
+        batch = calcular_inventario_batch(
+            demanda_p75=[10.0, 10.0],
+            sigma_demanda=[2.0, 2.0],
+            demanda_maxima=[20.0, 20.0],
+            unidades_por_bulto=[6, 6],
+            stock_actual=[0.0, 0.0],
+            stock_cedi=[100.0, 100.0],
+            clase_abc=['D', 'A'],
+            es_generador_trafico=[True, False],
+        )
+        assert list(batch.clase_efectiva) == ['A', 'A']
+        assert batch.stock_maximo_unid[0] == batch.stock_maximo_unid[1]
+
+    def test_bulto_cero_con_cantidad_sugerida_falla_igual_que_escalar(self):
+        with pytest.raises(ZeroDivisionError):
+            calcular_inventario_batch(
+                demanda_p75=[5.0], sigma_demanda=[1.0], demanda_maxima=[10.0],
+                unidades_por_bulto=[0], stock_actual=[0.0], stock_cedi=[10.0],
+                clase_abc=['A'], es_generador_trafico=[False],
+            )
@@ -0,0 +1,86 @@
+"""
+Tests para el executor de cómputo de pedidos multi-tienda
+(services.compute_executor + services.pedidos_multitienda_calculo).
+
+No requieren base de datos: usan filas sintéticas con el mismo formato
+que la query principal de cargar_datos_tienda().
+"""
+
+import os
+import random
+from decimal import Decimal
+
+import pytest
+
+from services import compute_executor
+from services.calculo_inventario_abc import ConfigTiendaABC
+from services.pedidos_multitienda_calculo import calcular_productos_tienda
+
+
+def generar_datos_tienda(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    categorias = ['VIVERES', 'FRUVER', 'PANADERIA', 'LIMPIEZA', None]
+    rows = []
+    for i in range(n):
+        p75 = rng.choice([0, rng.uniform(0.1, 50)])
+        rows.append((
+            f"prod-{i}", f"{i:06d}", f"Producto {i}", rng.choice(categorias), rng.choice(['I', 'II', None]),
+            rng.choice([1, 6, 12, 24]),
+            Decimal(str(round(p75 * 0.9, 4))), Decimal(str(round(p75, 4))),
+            Decimal(str(round(rng.uniform(0, 300), 2))), Decimal(str(round(rng.uniform(0, 5000), 2))),
+            rng.choice(['A', 'B', 'C', 'D']), Decimal(str(round(p75 * 30, 2))),
+            Decimal(str(round(rng.uniform(0, p75 + 1), 4))), Decimal(str(round(p75 * 2, 4))),
+            rng.random() < 0.05, rng.choice([None, Decimal('1.5')]),
+        ))
+    return {
+        'rows': rows,
+        'limites_capacidad': {'000003': {'capacidad_maxima': 10.0, 'minimo_exhibicion': None,
+                                         'tipo_restriccion': 'espacio_fisico'}},
+        'transito_data': {'000005': {'transito_bultos': 2, 'desglose': []}},
+        'p75_referencia_batch': {'prod-7': 3.5},
+    }
+
+
+def _pid():
+    return os.getpid()
+
+
+@pytest.fixture
+def modo_process(monkeypatch):
+    compute_executor.close_compute_executor()
+    monkeypatch.setattr(compute_executor, "COMPUTE_EXECUTOR_MODE", "process")
+    monkeypatch.setattr(compute_executor, "COMPUTE_EXECUTOR_WORKERS", 2)
+    yield
+    compute_executor.close_compute_executor()
+
+
+@pytest.mark.basic
+class TestComputeExecutor:
+
+    async def test_calculo_en_proceso_identico_a_inline(self, modo_process):
+        datos = generar_datos_tienda(500)
+        config = ConfigTiendaABC(lead_time=2.0, dias_cobertura_a=5)
+        cobertura = {'LIMPIEZA': {'A': 10, 'B': 12, 'C': 15, 'D': 20}}
+
+        esperado = calcular_productos_tienda(datos, 'tienda_01', cobertura, config)
+        resultado = await compute_executor.run_in_compute_executor(
+            calcular_productos_tienda, datos, 'tienda_01', cobertura, config
+        )
+
+        assert resultado == esperado
+
+    async def test_corre_en_otro_proceso(self, modo_process):
+        assert await compute_executor.run_in_compute_executor(_pid) != os.getpid()
+
+    async def test_pool_roto_se_recrea_y_ejecuta_en_thread(self, modo_process):
+        await compute_executor.run_in_compute_executor(_pid)
+        executor = compute_executor._compute_executor
+        for proceso in list(executor._processes.values()):
+            proceso.kill()
+            proceso.join()
+
+        # Pool roto: fallback en thread del proceso actual
+        assert await compute_executor.run_in_compute_executor(_pid) == os.getpid()
+        # Siguiente llamada usa un pool nuevo
+        assert await compute_executor.run_in_compute_executor(_pid) != os.getpid()
+        assert compute_executor._compute_executor is not executor
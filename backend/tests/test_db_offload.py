@@ -0,0 +1,47 @@
+"""
+Tests para el acceso no bloqueante a DB (db_manager.db_offload / run_in_db_executor).
+
+No requieren base de datos: verifican que el trabajo bloqueante corre
+fuera del event loop.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from db_manager import db_offload, run_in_db_executor
+
+
+@pytest.mark.basic
+class TestDbOffload:
+
+    async def test_endpoint_bloqueante_no_congela_event_loop(self):
+        @db_offload
+        def query_pesada():
+            time.sleep(0.3)
+            return "ok"
+
+        tarea = asyncio.create_task(query_pesada())
+        await asyncio.sleep(0)
+
+        inicio = time.monotonic()
+        await asyncio.sleep(0.01)
+        latencia = time.monotonic() - inicio
+
+        assert latencia < 0.1
+        assert await tarea == "ok"
+
+    async def test_corre_en_thread_del_executor(self):
+        nombre = await run_in_db_executor(lambda: threading.current_thread().name)
+        assert nombre.startswith("db-worker")
+
+    async def test_propaga_argumentos_y_excepciones(self):
+        @db_offload
+        def dividir(a, b=1):
+            return a / b
+
+        assert await dividir(6, b=3) == 2
+        with pytest.raises(ZeroDivisionError):
+            await dividir(1, b=0)
@@ -0,0 +1,102 @@
+"""
+Tests para el pool de conexiones PostgreSQL (db_pool.py).
+
+Usan la conexión falsa de conftest: no requieren base de datos.
+"""
+
+import threading
+import time
+
+import psycopg2.extensions
+import pytest
+
+from db_pool import PostgresConnectionPool, PoolTimeoutError
+
+
+@pytest.fixture
+def make_pool(fake_conn):
+    def crear(**kwargs):
+        created = []
+
+        def connect(dsn):
+            conn = fake_conn(dsn=dsn)
+            created.append(conn)
+            return conn
+
+        params = dict(min_size=0, max_size=2, acquire_timeout=0.2)
+        params.update(kwargs)
+        return PostgresConnectionPool("postgresql://test", connect=connect, **params), created
+
+    return crear
+
+
+@pytest.mark.basic
+class TestPostgresConnectionPool:
+
+    def test_reutiliza_conexion_devuelta(self, make_pool):
+        pool, created = make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+        assert len(created) == 1
+        assert pool.stats()["checkouts"] == 2
+
+    def test_rollback_de_transaccion_abierta_al_devolver(self, make_pool):
+        pool, _ = make_pool()
+        conn = pool.getconn()
+        conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        pool.putconn(conn)
+        assert conn.rollbacks == 1
+        assert pool.stats()["idle"] == 1
+
+    def test_timeout_cuando_pool_agotado(self, make_pool):
+        pool, _ = make_pool(max_size=1, acquire_timeout=0.05)
+        pool.getconn()
+        with pytest.raises(PoolTimeoutError):
+            pool.getconn()
+        assert pool.stats()["timeouts"] == 1
+
+    def test_espera_hasta_que_se_libera_conexion(self, make_pool):
+        pool, _ = make_pool(max_size=1, acquire_timeout=2)
+        conn = pool.getconn()
+
+        def release():
+            time.sleep(0.05)
+            pool.putconn(conn)
+
+        threading.Thread(target=release).start()
+        assert pool.getconn() is conn
+        stats = pool.stats()
+        assert stats["waits"] == 1
+        assert stats["wait_time_max_ms"] > 0
+
+    def test_descarta_conexion_que_falla_health_check(self, make_pool):
+        pool, created = make_pool(health_check_after=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.rota = True
+        nueva = pool.getconn()
+        assert nueva is not conn
+        assert conn.closed
+        stats = pool.stats()
+        assert stats["health_check_failures"] == 1
+        assert stats["size"] == 1
+
+    def test_descarta_conexion_marcada_como_rota(self, make_pool):
+        pool, _ = make_pool()
+        conn = pool.getconn()
+        pool.putconn(conn, discard=True)
+        stats = pool.stats()
+        assert conn.closed
+        assert stats["size"] == 0
+        assert stats["discarded"] == 1
+
+    def test_reaping_respeta_min_size(self, make_pool):
+        pool, _ = make_pool(min_size=1, max_idle_seconds=0)
+        a = pool.getconn()
+        b = pool.getconn()
+        pool.putconn(a)
+        pool.putconn(b)
+        stats = pool.stats()
+        assert stats["size"] == 1
+        assert stats["reaped"] == 1
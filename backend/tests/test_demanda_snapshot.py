@@ -0,0 +1,146 @@
+"""
+Tests para el snapshot de demanda por ubicación (services/demanda_snapshot.py).
+
+Usan la conexión falsa de conftest simulando `ventas` y `etl_executions`:
+no requieren base de datos.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from services import demanda_snapshot
+from services.demanda_snapshot import (
+    agregar_demanda_regional,
+    calcular_demanda_producto,
+    invalidar_snapshot_demanda,
+    obtener_snapshot_demanda,
+    obtener_snapshots_demanda,
+)
+
+FECHA_CORTE = date(2026, 3, 16)  # Lunes
+
+
+def reglas(conn):
+    """`ventas`, fecha de corte y versión ETL leídos del estado de la conexión"""
+    def leer_ventas(sql, params):
+        ubicacion_id, desde, hasta = params
+        return [
+            (producto_id, fecha, cantidad)
+            for (ubicacion, producto_id, fecha), cantidad in conn.ventas.items()
+            if ubicacion == ubicacion_id and desde <= fecha < hasta
+        ]
+
+    return [
+        ('version', "etl_executions", lambda sql, params: [(conn.version_etl,)]),
+        ('fecha_corte', "CURRENT_DATE", lambda sql, params: [(conn.fecha_corte,)]),
+        ('ventas', "FROM ventas", leer_ventas),
+    ]
+
+
+def ventas_leidas(conn):
+    return [params[0] for params in conn.params('ventas')]
+
+
+def ventas_diarias(valores, fecha_corte=FECHA_CORTE):
+    """[(fecha, cantidad)] para los últimos len(valores) días antes del corte."""
+    return [(fecha_corte - timedelta(days=len(valores) - i), v) for i, v in enumerate(valores)]
+
+
+@pytest.fixture(autouse=True)
+def cache_limpio(monkeypatch):
+    monkeypatch.setattr(demanda_snapshot, "DEMANDA_SNAPSHOT_CHECK_SECONDS", 0)
+    invalidar_snapshot_demanda()
+    demanda_snapshot._estado.update(fecha_corte=None, version_etl=None, verificado_en=0.0)
+    yield
+    invalidar_snapshot_demanda()
+
+
+@pytest.mark.basic
+class TestCalculoDemanda:
+
+    def test_estadisticas_iguales_a_sql(self):
+        valores = [float(v) for v in [4, 0, 7, 3, 12, 5, 9, 1, 6, 8, 2, 10, 3, 4, 7,
+                                     5, 6, 11, 2, 9, 4, 8, 3, 6, 7, 5, 9, 2, 1, 6]]
+        demanda = calcular_demanda_producto(ventas_diarias(valores), FECHA_CORTE)
+        ultimos_20 = valores[-20:]
+
+        assert demanda.p75_30d == pytest.approx(np.percentile(valores, 75))
+        assert demanda.p75_20d == pytest.approx(np.percentile(ultimos_20, 75))
+        assert demanda.sigma_30d == pytest.approx(np.std(valores, ddof=1))
+        assert demanda.max_30d == 12.0
+        assert demanda.prom_20d == pytest.approx(np.mean(ultimos_20))
+        assert demanda.prom_5d == pytest.approx(np.mean(valores[-5:]))
+        assert demanda.top3_20d == pytest.approx(np.mean(sorted(ultimos_20)[-3:]))
+        assert demanda.dias_con_venta_20d == 20
+        assert demanda.total_30d == sum(valores)
+
+    def test_un_solo_dia(self):
+        demanda = calcular_demanda_producto(ventas_diarias([5.0]), FECHA_CORTE)
+        assert demanda.p75_20d == 5.0
+        assert demanda.sigma_30d == 0.0
+
+    def test_promedio_y_detalle_por_dow(self):
+        # Domingo 15 y 8 de marzo (DOW 0), lunes 9 (DOW 1)
+        demanda = calcular_demanda_producto(
+            [(date(2026, 3, 15), 10.0), (date(2026, 3, 8), 20.0), (date(2026, 3, 9), 3.0)],
+            FECHA_CORTE,
+        )
+        assert demanda.prom_dow[0] == 15.0
+        assert demanda.prom_dow[1] == 3.0
+        assert demanda.prom_dow[2] == 0.0
+        assert demanda.historico_dow()[0] == [
+            {"fecha": "08 Mar", "venta": 20.0},
+            {"fecha": "15 Mar", "venta": 10.0},
+        ]
+
+
+@pytest.fixture
+def conn(fake_conn):
+    ventas = {}
+    for tienda, producto, valores in [
+        ("tienda_01", "P1", [3.0, 5.0, 4.0]),
+        ("tienda_01", "P2", [1.0]),
+        ("tienda_02", "P1", [6.0, 2.0]),
+    ]:
+        for fecha, cantidad in ventas_diarias(valores):
+            ventas[(tienda, producto, fecha)] = cantidad
+    return fake_conn(reglas, ventas=ventas, fecha_corte=FECHA_CORTE, version_etl=1)
+
+
+@pytest.mark.basic
+class TestCacheSnapshot:
+
+    def test_segunda_lectura_no_consulta_ventas(self, conn):
+        primero = obtener_snapshot_demanda(conn, "tienda_01")
+        segundo = obtener_snapshot_demanda(conn, "tienda_01")
+
+        assert segundo is primero
+        assert ventas_leidas(conn) == ["tienda_01"]
+        assert primero.get("P1").p75_20d == 4.5
+        assert primero.get("P9") is None
+
+    def test_nueva_corrida_etl_invalida(self, conn):
+        primero = obtener_snapshot_demanda(conn, "tienda_01")
+
+        conn.version_etl = 2
+        segundo = obtener_snapshot_demanda(conn, "tienda_01")
+
+        assert segundo is not primero
+        assert segundo.version_etl == 2
+        assert ventas_leidas(conn) == ["tienda_01", "tienda_01"]
+
+    def test_cambio_de_fecha_corte_invalida(self, conn):
+        obtener_snapshot_demanda(conn, "tienda_01")
+        conn.fecha_corte = FECHA_CORTE + timedelta(days=1)
+        assert obtener_snapshot_demanda(conn, "tienda_01").fecha_corte == conn.fecha_corte
+        assert len(ventas_leidas(conn)) == 2
+
+    def test_demanda_regional(self, conn):
+        regional = agregar_demanda_regional(obtener_snapshots_demanda(conn, ["tienda_01", "tienda_02"]))
+
+        assert regional["P1"]["num_tiendas"] == 2
+        assert regional["P1"]["p75_regional"] == pytest.approx(4.5 + 5.0)
+        assert regional["P1"]["cantidad_total"] == 20.0
+        assert regional["P2"]["sigma_regional"] == 0.0
@@ -0,0 +1,277 @@
+"""
+Tests para el detector de emergencias (services/detector_emergencias.py):
+baselines del mismo día de semana, evaluación por SKU, scan incremental y
+scan concurrente por tiendas.
+
+Usan la conexión falsa de conftest y monkeypatch de las lecturas: no requieren base de datos.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from models.emergencias import ConfigTiendaResumen, TipoEmergencia
+from services import detector_emergencias
+from services.detector_emergencias import (
+    EstadoScanTienda,
+    FirmasTienda,
+    _cargar_insumos_tienda,
+    _promedio_venta_mismo_dia_semana,
+    detectar_emergencias,
+    dia_semana_pg,
+    evaluar_emergencias_tienda,
+    fechas_mismo_dia_semana,
+    invalidar_estado_scan,
+)
+
+SABADO = date(2026, 10, 17)
+
+
+def reglas(conn):
+    """Baselines precalculados {(ubicacion, dow, fecha_corte): valor} y ventas_diarias {(ubicacion, fecha): total}"""
+    def baseline(sql, params):
+        valor = conn.baselines.get(params)
+        return [(valor,)] if valor is not None else []
+
+    def promedio_diarias(sql, params):
+        ubicacion_id, fechas = params
+        totales = [v for (u, f), v in conn.diarias.items() if u == ubicacion_id and f in fechas]
+        return [(sum(totales) / len(totales) if totales else 0,)]
+
+    return [
+        ('baseline', "ventas_baseline_tienda_dow", baseline),
+        ('diarias', "FROM ventas_diarias", promedio_diarias),
+    ]
+
+
+@pytest.mark.basic
+class TestBaselineMismoDiaSemana:
+
+    def test_dia_semana_con_convencion_dow(self):
+        assert dia_semana_pg(date(2026, 10, 18)) == 0  # domingo
+        assert dia_semana_pg(date(2026, 10, 19)) == 1  # lunes
+        assert dia_semana_pg(SABADO) == 6
+
+    def test_fechas_mismo_dia_semana(self):
+        fechas = fechas_mismo_dia_semana(SABADO)
+        assert fechas == [date(2026, 10, 10), date(2026, 10, 3), date(2026, 9, 26), date(2026, 9, 19)]
+        assert all(dia_semana_pg(f) == 6 for f in fechas)
+
+    def test_usa_baseline_precalculado_del_dia(self, fake_conn):
+        conn = fake_conn(reglas, baselines={('tienda_01', 6, SABADO): Decimal('1500.50')}, diarias={})
+
+        assert _promedio_venta_mismo_dia_semana(conn.cursor(), 'tienda_01', SABADO) == Decimal('1500.50')
+        assert conn.etiquetas() == ['baseline']
+
+    def test_sin_baseline_calcula_sobre_las_cuatro_fechas(self, fake_conn):
+        diarias = {
+            ('tienda_01', date(2026, 10, 10)): 1000,
+            ('tienda_01', date(2026, 10, 3)): 2000,
+            ('tienda_01', date(2026, 10, 16)): 99999,  # viernes: no cuenta
+            ('tienda_02', date(2026, 10, 10)): 50000,
+        }
+        conn = fake_conn(reglas, baselines={('tienda_01', 6, date(2026, 10, 16)): 1}, diarias=diarias)
+
+        assert _promedio_venta_mismo_dia_semana(conn.cursor(), 'tienda_01', SABADO) == Decimal('1500.0')
+        assert conn.etiquetas() == ['baseline', 'diarias']
+
+
+def config_tienda(ubicacion_id='tienda_01'):
+    return ConfigTiendaResumen(
+        ubicacion_id=ubicacion_id,
+        nombre_tienda=ubicacion_id.upper(),
+        habilitado=True,
+        umbral_critico=Decimal('0.25'),
+        umbral_inminente=Decimal('0.50'),
+        umbral_alerta=Decimal('0.75'),
+    )
+
+
+def producto(producto_id, stock, demanda, ventas_hoy=0, clase='A'):
+    return {
+        'producto_id': producto_id,
+        'nombre_producto': f'Producto {producto_id}',
+        'categoria': 'VIVERES',
+        'clase_abc': clase,
+        'stock_actual': stock,
+        'almacen_codigo': 'PRINCIPAL',
+        'ventas_hoy': ventas_hoy,
+        'demanda_diaria_promedio': demanda,
+    }
+
+
+@pytest.mark.basic
+class TestEvaluarEmergencias:
+
+    def test_clasifica_por_cobertura(self):
+        productos = [
+            producto('P1', stock=0, demanda=10),    # stockout
+            producto('P2', stock=2, demanda=10),    # cobertura 0.2 -> crítico
+            producto('P3', stock=100, demanda=10),  # cubierto
+            producto('P4', stock=0, demanda=0),     # sin demanda histórica
+        ]
+        emergencias = evaluar_emergencias_tienda(config_tienda(), productos, Decimal('1'), Decimal('1'))
+
+        tipos = {e.producto_id: e.tipo_emergencia for e in emergencias}
+        assert tipos == {'P1': TipoEmergencia.STOCKOUT, 'P2': TipoEmergencia.CRITICO}
+
+    def test_sin_demanda_restante_no_alerta(self):
+        emergencias = evaluar_emergencias_tienda(
+            config_tienda(), [producto('P1', stock=0, demanda=10)], Decimal('1'), Decimal('0')
+        )
+        assert emergencias == []
+
+
+def reglas_tienda(conn):
+    """ids de inventario_cargas, stock por SKU (inventario_actual) y ventas de hoy (ventas_diarias) de la tienda"""
+    return [
+        ('cargas', "FROM inventario_cargas", lambda sql, params: [(i,) for i in sorted(conn.cargas)]),
+        ('stock', "FROM inventario_actual",
+         lambda sql, params: [(pid, cantidad, 'PRINCIPAL') for pid, cantidad in conn.stock.items()]),
+        ('ventas', "FROM ventas_diarias", lambda sql, params: list(conn.ventas.items())),
+    ]
+
+
+@pytest.mark.basic
+class TestScanIncremental:
+
+    @pytest.fixture(autouse=True)
+    def limpiar_estado(self):
+        invalidar_estado_scan()
+        yield
+        invalidar_estado_scan()
+
+    @pytest.fixture
+    def tienda(self, fake_conn, monkeypatch):
+        """Tienda falsa: las firmas salen de la conexión y la lectura de productos de su mismo estado"""
+        conn = fake_conn(reglas_tienda, cargas={1}, stock={'P1': 5, 'P2': 50, 'P3': 8}, ventas={'P1': 2}, lecturas=[])
+
+        @contextmanager
+        def conexion():
+            yield conn
+
+        def leer(ubicacion_id, fecha_hoy, productos_ids=None):
+            conn.lecturas.append(productos_ids)
+            ids = sorted(conn.stock.keys() | conn.ventas.keys())
+            return [
+                producto(pid, conn.stock.get(pid, 0), 10, ventas_hoy=conn.ventas.get(pid, 0))
+                for pid in ids if productos_ids is None or pid in productos_ids
+            ]
+
+        monkeypatch.setattr(detector_emergencias, 'get_db_connection', conexion)
+        monkeypatch.setattr(detector_emergencias, '_leer_productos_tienda', leer)
+        return conn
+
+    def test_primer_scan_lee_tienda_completa(self, tienda):
+        productos, releidos, fue_incremental = _cargar_insumos_tienda('tienda_01', 's1', incremental=True)
+
+        assert tienda.lecturas == [None]
+        assert tienda.etiquetas() == ['cargas', 'stock', 'ventas']
+        assert (releidos, fue_incremental) == (3, False)
+        assert [p['producto_id'] for p in productos] == ['P1', 'P2', 'P3']
+
+    def test_relee_solo_skus_con_cambios(self, tienda):
+        _cargar_insumos_tienda('tienda_01', 's1', incremental=True)
+        # Carga delta confirmada después del scan: P2 cambia y P3 se borra; P4 vende por primera vez
+        tienda.cargas.add(2)
+        tienda.stock = {'P1': 5, 'P2': 0}
+        tienda.ventas['P4'] = 1
+
+        productos, releidos, fue_incremental = _cargar_insumos_tienda('tienda_01', 's2', incremental=True)
+
+        assert tienda.lecturas[-1] == ['P2', 'P3', 'P4']
+        assert (releidos, fue_incremental) == (3, True)
+        assert {p['producto_id']: p['stock_actual'] for p in productos} == {'P1': 5, 'P2': 0, 'P4': 0}
+        assert detector_emergencias._estado_scan['tienda_01'].scan_id == 's2'
+
+    def test_sin_cargas_nuevas_no_relee_el_inventario(self, tienda):
+        _cargar_insumos_tienda('tienda_01', 's1', incremental=True)
+        tienda.ventas['P1'] = 3
+        etiquetas_previas = len(tienda.queries)
+
+        productos, releidos, _ = _cargar_insumos_tienda('tienda_01', 's2', incremental=True)
+
+        assert tienda.etiquetas()[etiquetas_previas:] == ['cargas', 'ventas']
+        assert tienda.lecturas[-1] == ['P1']
+        assert releidos == 1
+        assert {p['producto_id']: p['ventas_hoy'] for p in productos}['P1'] == 3
+
+    def test_sin_cambios_no_relee_productos(self, tienda):
+        _cargar_insumos_tienda('tienda_01', 's1', incremental=True)
+        tienda.cargas.add(2)  # carga que no cambió ningún SKU
+
+        productos, releidos, fue_incremental = _cargar_insumos_tienda('tienda_01', 's2', incremental=True)
+
+        assert tienda.lecturas == [None]
+        assert (releidos, fue_incremental) == (0, True)
+        assert len(productos) == 3
+
+    def test_scan_completo_si_el_estado_es_de_otro_dia(self, tienda):
+        ayer = datetime.now() - timedelta(days=1)
+        detector_emergencias._estado_scan['tienda_01'] = EstadoScanTienda(
+            scan_id='s1', fecha=ayer.date(), ultimo_completo=ayer,
+            firmas=FirmasTienda(frozenset({1}), {}, {}), productos={},
+        )
+
+        _, releidos, fue_incremental = _cargar_insumos_tienda('tienda_01', 's2', incremental=True)
+
+        assert tienda.lecturas == [None]
+        assert (releidos, fue_incremental) == (3, False)
+
+
+@pytest.mark.basic
+class TestScanConcurrente:
+
+    def test_escanea_tiendas_en_paralelo_y_conserva_orden(self, monkeypatch):
+        tiendas = [config_tienda(f'tienda_{i:02d}') for i in range(1, 7)]
+        en_curso = {'actual': 0, 'maximo': 0}
+        lock = threading.Lock()
+        guardadas = {}
+
+        def factor(ubicacion_id, fecha=None):
+            with lock:
+                en_curso['actual'] += 1
+                en_curso['maximo'] = max(en_curso['maximo'], en_curso['actual'])
+            time.sleep(0.05)
+            with lock:
+                en_curso['actual'] -= 1
+            return Decimal('1'), Decimal('0'), Decimal('0')
+
+        monkeypatch.setattr(detector_emergencias, 'get_tiendas_habilitadas', lambda: tiendas)
+        monkeypatch.setattr(detector_emergencias, 'calcular_factor_intensidad', factor)
+        monkeypatch.setattr(detector_emergencias, '_cargar_insumos_tienda',
+                            lambda ubicacion_id, scan_id, incremental: ([producto('P1', 0, 10)], 1, incremental))
+        monkeypatch.setattr(detector_emergencias, 'detectar_anomalias_tienda', lambda *a: [])
+        monkeypatch.setattr(detector_emergencias, 'guardar_scan', lambda **kw: guardadas.update(kw))
+
+        respuesta = detectar_emergencias(max_workers=3, incremental=True)
+
+        assert en_curso['maximo'] == 3
+        assert respuesta.tiendas_escaneadas == [t.ubicacion_id for t in tiendas]
+        assert [r.ubicacion_id for r in respuesta.resumen_por_tienda] == respuesta.tiendas_escaneadas
+        assert respuesta.total_emergencias == 6 and respuesta.stockouts == 6
+        assert respuesta.incremental and respuesta.productos_releidos == 6
+        assert respuesta.tiendas_scan_completo == []
+        assert guardadas['stockouts'] == 6 and guardadas['total_productos'] == 6
+
+    def test_reporta_el_modo_efectivo(self, monkeypatch):
+        tiendas = [config_tienda('tienda_01'), config_tienda('tienda_02')]
+        monkeypatch.setattr(detector_emergencias, 'get_tiendas_habilitadas', lambda: tiendas)
+        monkeypatch.setattr(detector_emergencias, 'calcular_factor_intensidad',
+                            lambda ubicacion_id, fecha=None: (Decimal('1'), Decimal('0'), Decimal('0')))
+        # tienda_02 no tiene estado previo: cae a scan completo
+        monkeypatch.setattr(detector_emergencias, '_cargar_insumos_tienda',
+                            lambda ubicacion_id, scan_id, incremental: (
+                                [producto('P1', 5, 1)], 1, incremental and ubicacion_id == 'tienda_01'))
+        monkeypatch.setattr(detector_emergencias, 'detectar_anomalias_tienda', lambda *a: [])
+        monkeypatch.setattr(detector_emergencias, 'guardar_scan', lambda **kw: None)
+
+        mixto = detectar_emergencias(incremental=True)
+        assert (mixto.incremental, mixto.tiendas_scan_completo) == (False, ['tienda_02'])
+
+        completo = detectar_emergencias(incremental=False)
+        assert (completo.incremental, completo.tiendas_scan_completo) == (False, ['tienda_01', 'tienda_02'])
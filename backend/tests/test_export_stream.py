@@ -0,0 +1,162 @@
+"""
+Tests para las exportaciones en streaming (services/export_stream.py).
+
+No requieren base de datos: el cursor server-side es el de la conexión falsa de conftest.
+"""
+
+import asyncio
+import csv
+import io
+from contextlib import contextmanager
+
+import openpyxl
+import pytest
+
+from services import export_stream
+from services.export_stream import (
+    construir_xlsx,
+    generar_csv,
+    iterar_archivo,
+    iterar_filas,
+    iterar_filas_conexion,
+    respuesta_descarga,
+)
+
+
+@pytest.mark.basic
+class TestExportStream:
+
+    def test_iterar_filas_usa_cursor_server_side(self, fake_conn):
+        conn = fake_conn([('export', "SELECT 1", [(1, 'a'), (2, 'b')])])
+        filas = list(iterar_filas(conn, "SELECT 1", [10], itersize=500))
+
+        cursor = conn.cursores[0]
+        assert filas == [(1, 'a'), (2, 'b')]
+        assert cursor.name and cursor.itersize == 500
+        assert cursor.queries == [('export', [10])]
+        assert cursor.cerrado
+
+    def test_csv_por_chunks(self, monkeypatch):
+        monkeypatch.setattr(export_stream, "EXPORT_CHUNK_BYTES", 256)
+        filas = ([f"P{i:05d}", f"Producto, {i}", i * 1.5] for i in range(200))
+
+        chunks = list(generar_csv(['Código', 'Descripción', 'Cantidad'], filas))
+        contenido = b''.join(chunks).decode('utf-8')
+        leido = list(csv.reader(io.StringIO(contenido.lstrip('\ufeff'))))
+
+        assert len(chunks) > 10
+        assert contenido.startswith('\ufeff')
+        assert leido[0] == ['Código', 'Descripción', 'Cantidad']
+        assert leido[2] == ['P00001', 'Producto, 1', '1.5']
+        assert len(leido) == 201
+
+    def test_csv_no_consume_todo_el_iterador_de_golpe(self, monkeypatch):
+        monkeypatch.setattr(export_stream, "EXPORT_CHUNK_BYTES", 64)
+        consumidas = []
+
+        def filas():
+            for i in range(1000):
+                consumidas.append(i)
+                yield [i, 'x' * 20]
+
+        primer_chunk = next(generar_csv(['a', 'b'], filas()))
+        assert primer_chunk
+        assert len(consumidas) < 10
+
+    def test_xlsx_write_only_mantiene_layout(self):
+        filas = [([f"P{i}", i, i * 2.0], 'E8F5E9' if i % 2 else None) for i in range(50)]
+        archivo, total = construir_xlsx(
+            ['Código', 'Stock', 'Pedido'], iter(filas),
+            titulo_hoja="Pedido PED-1", titulo="Pedido: PED-1", subtitulo="Tienda: T1",
+            anchos=[12, 10, 10], columnas_derecha=[2, 3],
+        )
+        ws = openpyxl.load_workbook(archivo).active
+
+        assert total == 50
+        assert ws.title == "Pedido PED-1"
+        assert ws['A1'].value == "Pedido: PED-1"
+        assert ws['A2'].value == "Tienda: T1"
+        assert [c.value for c in ws[4]] == ['Código', 'Stock', 'Pedido']
+        assert [c.value for c in ws[6]] == ['P1', 1, 2.0]
+        assert ws['A6'].fill.start_color.rgb.endswith('E8F5E9')
+        assert ws['B6'].alignment.horizontal == 'right'
+        assert ws.max_row == 54
+        assert 'A1:C1' in {str(r) for r in ws.merged_cells.ranges}
+
+    def test_iterar_archivo_cierra(self, tmp_path):
+        archivo = open(tmp_path / "x.bin", "w+b")
+        archivo.write(b"0123456789")
+        archivo.seek(0)
+
+        assert list(iterar_archivo(archivo, chunk_size=4)) == [b"0123", b"4567", b"89"]
+        assert archivo.closed
+
+
+class ConexionesPrestadas:
+    """abrir_conexion falso: presta `conn` y registra cuántas veces se entregó y devolvió."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.abiertas = 0
+        self.devueltas = 0
+
+    @contextmanager
+    def __call__(self):
+        self.abiertas += 1
+        try:
+            yield self.conn
+        finally:
+            self.devueltas += 1
+
+
+async def _descargar(respuesta, spec_version, cortar_despues=2):
+    """Sirve la respuesta por ASGI; el cliente se va tras `cortar_despues` chunks."""
+    chunks = []
+    desconectado = asyncio.Event()
+
+    async def receive():
+        await desconectado.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(mensaje):
+        if mensaje["type"] != "http.response.body":
+            return
+        chunks.append(mensaje["body"])
+        if len(chunks) >= cortar_despues:
+            desconectado.set()
+            if spec_version == "2.4":
+                raise OSError("connection reset by peer")
+        await asyncio.sleep(0)
+
+    scope = {"type": "http", "asgi": {"spec_version": spec_version}}
+    try:
+        await respuesta(scope, receive, send)
+    except Exception:
+        pass
+    return chunks
+
+
+@pytest.mark.basic
+class TestDescargaCortada:
+
+    @pytest.mark.parametrize("spec_version", ["2.0", "2.4"])
+    async def test_cliente_desconectado_devuelve_la_conexion(self, monkeypatch, fake_conn, spec_version):
+        monkeypatch.setattr(export_stream, "EXPORT_CHUNK_BYTES", 64)
+        conexiones = ConexionesPrestadas(fake_conn([('export', "SELECT", [(i, 'x' * 20) for i in range(10000)])]))
+        rows = iterar_filas_conexion(conexiones, "SELECT 1")
+
+        respuesta = respuesta_descarga(generar_csv(['a', 'b'], rows), "csv", "export", cerrar=[rows])
+        chunks = await _descargar(respuesta, spec_version)
+
+        assert 2 <= len(chunks) < 100
+        assert (conexiones.abiertas, conexiones.devueltas) == (1, 1)
+
+    async def test_descarga_completa(self, fake_conn):
+        conexiones = ConexionesPrestadas(fake_conn([('export', "SELECT", [(1, 'a'), (2, 'b')])]))
+        rows = iterar_filas_conexion(conexiones, "SELECT 1")
+
+        respuesta = respuesta_descarga(generar_csv(['a', 'b'], rows), "csv", "export", cerrar=[rows])
+        chunks = await _descargar(respuesta, "2.4", cortar_despues=10)
+
+        assert b''.join(chunks).decode('utf-8-sig') == 'a,b\r\n1,a\r\n2,b\r\n'
+        assert (conexiones.abiertas, conexiones.devueltas) == (1, 1)
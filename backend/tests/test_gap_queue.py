@@ -0,0 +1,195 @@
+"""
+Tests de la cola de gaps de ventas (etl/core/gap_queue.py): encolado
+idempotente, claims con SKIP LOCKED y límite por tienda, cierre con
+reintentos/backoff y claims huérfanos.
+
+Requieren PostgreSQL (TEST_DATABASE_URL). GapQueue confirma cada operación
+con su propia conexión, así que trabajan en un schema propio que se borra
+al terminar.
+"""
+
+import importlib.util
+import os
+from datetime import datetime
+
+import psycopg2
+import pytest
+
+from routers.etl_history import _gap_queue_stats
+from tests.conftest import ejecutar_migracion
+
+_RUTA = os.path.join(os.path.dirname(__file__), '..', '..', 'etl', 'core', 'gap_queue.py')
+_spec = importlib.util.spec_from_file_location('gap_queue', _RUTA)
+gap_queue = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(gap_queue)
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+SCHEMA = 'gap_queue_test'
+
+GAP_T1_08 = {'hora_inicio': datetime(2026, 10, 17, 8), 'hora_fin': datetime(2026, 10, 17, 9)}
+GAP_T1_10 = {'hora_inicio': datetime(2026, 10, 17, 10), 'hora_fin': datetime(2026, 10, 17, 11)}
+GAP_T2_09 = {'hora_inicio': datetime(2026, 10, 17, 9), 'hora_fin': datetime(2026, 10, 17, 10)}
+
+
+def _conectar():
+    # lock_timeout: si SKIP LOCKED no saltara la fila, el test falla en vez de colgarse
+    return psycopg2.connect(TEST_DATABASE_URL, options=f'-c search_path={SCHEMA} -c lock_timeout=2000')
+
+
+@pytest.fixture
+def cola(db_conn):
+    cursor = db_conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path TO {SCHEMA}")
+    cursor.execute("CREATE TABLE etl_executions (id SERIAL PRIMARY KEY)")
+    ejecutar_migracion(cursor, '040_etl_gap_queue_UP.sql')
+    cursor.execute("SET search_path TO DEFAULT")
+    db_conn.commit()
+
+    yield gap_queue.GapQueue(_conectar)
+
+    db_conn.rollback()
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    db_conn.commit()
+
+
+def _fila(gap_id):
+    conn = _conectar()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT status, attempts, records_loaded, available_at > NOW() FROM etl_gap_queue WHERE id = %s",
+                       (gap_id,))
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+def _backlog_stats():
+    """gap_backlog del endpoint de stats de ETL sobre el schema del test"""
+    conn = _conectar()
+    try:
+        return _gap_queue_stats(conn.cursor(), datetime(2026, 1, 1), 'ventas')['gap_backlog']
+    finally:
+        conn.close()
+
+
+def _liberar_backoff():
+    conn = _conectar()
+    try:
+        conn.cursor().execute("UPDATE etl_gap_queue SET available_at = NOW() - INTERVAL '1 second'")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.mark.integration
+class TestGapQueue:
+
+    def test_encolar_es_idempotente(self, cola):
+        assert cola.encolar('t1', [GAP_T1_08, GAP_T1_10]) == 2
+        assert cola.encolar('t1', [GAP_T1_08]) == 0
+        assert cola.backlog(['t1']) == 2
+
+        # Un gap 'done' sin registros que se vuelve a detectar se re-encola
+        gap = cola.reclamar(['t1'], 'w1')
+        assert cola.completar(gap, 'w1', success=True, registros=0)
+        assert cola.encolar('t1', [GAP_T1_08]) == 1
+        assert _fila(gap['id'])[0] == 'pending'
+
+    def test_reclamar_mas_antiguo_con_limite_por_tienda(self, cola):
+        cola.encolar('t1', [GAP_T1_10, GAP_T1_08])
+        cola.encolar('t2', [GAP_T2_09])
+
+        primero = cola.reclamar(['t1', 't2'], 'w1', max_por_tienda=1)
+        segundo = cola.reclamar(['t1', 't2'], 'w2', max_por_tienda=1)
+
+        assert (primero['tienda_id'], primero['hora_inicio'], primero['attempts']) == ('t1', GAP_T1_08['hora_inicio'], 1)
+        # t1 ya tiene un gap en curso: el siguiente es de t2
+        assert (segundo['tienda_id'], segundo['hora_inicio']) == ('t2', GAP_T2_09['hora_inicio'])
+        assert cola.reclamar(['t1', 't2'], 'w3', max_por_tienda=1) is None
+        assert cola.reclamar(['t1'], 'w3', max_por_tienda=2)['hora_inicio'] == GAP_T1_10['hora_inicio']
+
+    def test_reclamar_salta_filas_bloqueadas(self, cola):
+        cola.encolar('t1', [GAP_T1_08, GAP_T1_10])
+
+        otra = _conectar()
+        try:
+            # Otra transacción tiene tomada la fila del gap más antiguo
+            otra.cursor().execute(
+                "SELECT id FROM etl_gap_queue WHERE hora_inicio = %s FOR UPDATE", (GAP_T1_08['hora_inicio'],)
+            )
+            gap = cola.reclamar(['t1'], 'w1', max_por_tienda=2)
+        finally:
+            otra.rollback()
+            otra.close()
+
+        assert gap['hora_inicio'] == GAP_T1_10['hora_inicio']
+
+    def test_completar_exitoso(self, cola):
+        cola.encolar('t1', [GAP_T1_08])
+        gap = cola.reclamar(['t1'], 'w1')
+
+        assert cola.completar(gap, 'w1', success=True, registros=42)
+        assert _fila(gap['id'])[:3] == ('done', 1, 42)
+        assert cola.backlog(['t1']) == 0
+
+    def test_reintentos_con_backoff_hasta_failed(self, cola):
+        cola.encolar('t1', [GAP_T1_08])
+
+        for intento in range(1, gap_queue.GAP_MAX_INTENTOS + 1):
+            gap = cola.reclamar(['t1'], 'w1')
+            assert gap['attempts'] == intento
+            assert cola.completar(gap, 'w1', success=False, error='timeout KLK')
+            if intento < gap_queue.GAP_MAX_INTENTOS:
+                status, _, _, en_backoff = _fila(gap['id'])
+                assert (status, en_backoff) == ('pending', True)
+                # En backoff no se puede reclamar
+                assert cola.reclamar(['t1'], 'w1') is None
+                _liberar_backoff()
+
+        assert _fila(gap['id'])[0] == 'failed'
+        assert cola.backlog(['t1']) == 0
+        assert cola.reclamar(['t1'], 'w1') is None
+
+    def test_claim_huerfano_se_retoma(self, cola, monkeypatch):
+        cola.encolar('t1', [GAP_T1_08])
+        gap = cola.reclamar(['t1'], 'muerto')
+        assert cola.reclamar(['t1'], 'w2') is None
+
+        # Con timeout 0 el claim 'running' ya cuenta como huérfano
+        monkeypatch.setattr(gap_queue, 'GAP_CLAIM_TIMEOUT_MINUTES', 0)
+        retomado = cola.reclamar(['t1'], 'w2')
+
+        assert (retomado['id'], retomado['attempts']) == (gap['id'], 2)
+        # El dueño original ya no puede cerrarlo
+        assert not cola.completar(gap, 'muerto', success=True, registros=10)
+        assert cola.completar(retomado, 'w2', success=True, registros=10)
+
+    def test_claim_huerfano_del_ultimo_intento_queda_failed(self, cola, monkeypatch):
+        cola.encolar('t1', [GAP_T1_08])
+        for _ in range(gap_queue.GAP_MAX_INTENTOS - 1):
+            gap = cola.reclamar(['t1'], 'w1')
+            cola.completar(gap, 'w1', success=False, error='timeout KLK')
+            _liberar_backoff()
+
+        # El worker del último intento muere sin cerrar el claim
+        gap = cola.reclamar(['t1'], 'muerto')
+        assert gap['attempts'] == gap_queue.GAP_MAX_INTENTOS
+        assert cola.backlog(['t1']) == _backlog_stats() == 1
+
+        monkeypatch.setattr(gap_queue, 'GAP_CLAIM_TIMEOUT_MINUTES', 0)
+        assert cola.reclamar(['t1'], 'w2') is None
+
+        conn = _conectar()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, last_error, finished_at IS NOT NULL FROM etl_gap_queue WHERE id = %s",
+                           (gap['id'],))
+            status, last_error, cerrado = cursor.fetchone()
+        finally:
+            conn.close()
+        assert (status, cerrado) == ('failed', True)
+        assert 'muerto' in last_error
+        assert cola.backlog(['t1']) == _backlog_stats() == 0
+        assert not cola.completar(gap, 'muerto', success=True, registros=10)
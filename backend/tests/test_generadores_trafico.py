@@ -0,0 +1,247 @@
+"""
+Tests del recálculo set-based de sugerencias de generadores de tráfico
+(services/generadores_trafico.py) y de los endpoints que lo usan.
+
+Los unitarios usan la conexión falsa de conftest. Los de integración
+(TEST_DATABASE_URL) corren RECALCULAR_SUGERENCIAS_SQL y el loop por fila
+que reemplaza sobre las mismas tablas y comparan el resultado.
+"""
+
+import importlib.util
+import os
+from decimal import Decimal
+
+import pytest
+
+from routers import generadores_trafico_router
+from services import generadores_trafico
+from services.generadores_trafico import recalcular_sugerencias
+
+_RUTA = os.path.join(os.path.dirname(__file__), '..', '..', 'etl', 'core', 'generadores_trafico.py')
+_spec = importlib.util.spec_from_file_location('generadores_trafico_etl', _RUTA)
+generadores_trafico_etl = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(generadores_trafico_etl)
+
+
+def reglas(conn):
+    """Config de gap (None = sin fila) y filas del diff que devuelve el recálculo"""
+    return [
+        ('config', "config_generadores_trafico",
+         lambda sql, params: [(conn.gap_config,)] if conn.gap_config is not None else []),
+        ('recalculo', "WITH candidatos", lambda sql, params: conn.filas_diff),
+    ]
+
+
+FILAS_DIFF = [
+    ('sugerido', 'P3', 620),
+    ('sugerido', 'P1', 410),
+    ('removido', 'P9', 380),
+    ('analizados', None, 7),
+]
+
+
+@pytest.mark.basic
+class TestRecalcularSugerencias:
+
+    def test_una_sola_sentencia_con_gap_de_config(self, fake_conn):
+        cursor = fake_conn(reglas, filas_diff=FILAS_DIFF, gap_config='500').cursor()
+
+        diff = recalcular_sugerencias(cursor)
+
+        assert cursor.queries == [('config', None), ('recalculo', {'gap_minimo': 500})]
+        assert diff.gap_minimo == 500
+        assert diff.productos_analizados == 7
+        assert diff.sugeridos == [{'producto_id': 'P1', 'gap': 410}, {'producto_id': 'P3', 'gap': 620}]
+        assert diff.removidos == [{'producto_id': 'P9', 'gap': 380}]
+
+    def test_gap_explicito_no_lee_config(self, fake_conn):
+        cursor = fake_conn(reglas, filas_diff=[('analizados', None, 0)], gap_config='500').cursor()
+
+        diff = recalcular_sugerencias(cursor, gap_minimo=300)
+
+        assert cursor.queries == [('recalculo', {'gap_minimo': 300})]
+        assert (diff.productos_analizados, diff.sugeridos, diff.removidos) == (0, [], [])
+
+    def test_sin_config_usa_default(self, fake_conn):
+        cursor = fake_conn(reglas, filas_diff=[('analizados', None, 0)], gap_config=None).cursor()
+
+        assert recalcular_sugerencias(cursor).gap_minimo == 400
+
+
+@pytest.mark.basic
+class TestEndpoints:
+
+    def test_calcular_sugerencias_devuelve_diff(self, fake_conn):
+        conn = fake_conn(reglas, filas_diff=FILAS_DIFF, gap_config='500')
+
+        resultado = generadores_trafico_router.calcular_sugerencias.__wrapped__(None, conn=conn)
+
+        assert conn.commits == 1
+        assert (resultado.productos_analizados, resultado.nuevas_sugerencias, resultado.sugerencias_removidas) == (7, 2, 1)
+        assert [c.producto_id for c in resultado.productos_sugeridos] == ['P1', 'P3']
+        assert [c.producto_id for c in resultado.productos_removidos] == ['P9']
+
+
+@pytest.mark.basic
+def test_etl_usa_la_misma_sentencia_que_el_backend():
+    assert generadores_trafico_etl.RECALCULAR_SUGERENCIAS_SQL == generadores_trafico.RECALCULAR_SUGERENCIAS_SQL
+
+
+GAP_MINIMO = 400
+
+TABLAS_BASE = """
+    CREATE TABLE productos (
+        id VARCHAR(50) PRIMARY KEY,
+        es_generador_trafico BOOLEAN,
+        generador_trafico_ignorado BOOLEAN,
+        generador_trafico_sugerido BOOLEAN,
+        generador_trafico_gap INTEGER,
+        generador_trafico_fecha_sugerido TIMESTAMP
+    );
+    CREATE TABLE productos_abc_cache (
+        producto_id VARCHAR(50) NOT NULL UNIQUE,
+        venta_30d DECIMAL(18,2) DEFAULT 0,
+        tickets_30d INTEGER DEFAULT 0,
+        gap INTEGER DEFAULT 0,
+        clase_abc CHAR(1)
+    );
+    CREATE TABLE generadores_trafico_historial (
+        id SERIAL PRIMARY KEY,
+        producto_id VARCHAR(50) NOT NULL,
+        accion VARCHAR(20) NOT NULL,
+        gap_score INTEGER,
+        venta_30d DECIMAL(18,2),
+        tickets_30d INTEGER,
+        clase_abc CHAR(1),
+        comentario TEXT,
+        fecha TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+# id, es_generador, ignorado, sugerido, gap guardado
+PRODUCTOS = [
+    ('P1', False, False, False, None),   # candidato nuevo
+    ('P2', True, False, False, None),    # ya es generador
+    ('P3', False, True, False, None),    # ignorado
+    ('P4', False, False, True, 450),     # ya sugerido y sigue calificando
+    ('P5', False, False, True, 380),     # sugerido que ya no califica
+    ('P6', False, False, False, None),   # no califica
+    ('P7', None, None, None, None),      # banderas NULL, venta NULL
+    ('P9', False, False, True, 500),     # sugerido que salió del cache
+]
+
+# producto_id, venta_30d, tickets_30d, gap, clase_abc
+ABC_CACHE = [
+    ('P1', Decimal('1500.50'), 320, 620, 'A'),
+    ('P2', Decimal('900'), 210, 410, 'B'),
+    ('P3', Decimal('700'), 150, 500, 'B'),
+    ('P4', Decimal('650'), 140, 455, 'C'),
+    ('P5', Decimal('300'), 40, 120, 'C'),
+    ('P6', Decimal('250'), 35, 399, 'C'),
+    ('P7', None, 90, 400, 'B'),
+    ('P8', Decimal('100'), 20, 800, 'C'),   # candidato sin fila en productos
+]
+
+
+def _recalcular_por_fila(cursor, gap_minimo):
+    """Loop que tenía calcular-sugerencias: un UPDATE (y un INSERT de historial) por candidato"""
+    cursor.execute("""
+        SELECT producto_id, gap, clase_abc, venta_30d, tickets_30d
+        FROM productos_abc_cache
+        WHERE gap >= %s
+    """, (gap_minimo,))
+    candidatos = cursor.fetchall()
+
+    nuevas = []
+    for producto_id, gap, clase_abc, venta_30d, tickets_30d in candidatos:
+        cursor.execute("""
+            UPDATE productos
+            SET generador_trafico_sugerido = CASE
+                    WHEN COALESCE(es_generador_trafico, FALSE) = FALSE
+                     AND COALESCE(generador_trafico_ignorado, FALSE) = FALSE
+                    THEN TRUE
+                    ELSE generador_trafico_sugerido
+                END,
+                generador_trafico_gap = %s,
+                generador_trafico_fecha_sugerido = NOW()
+            WHERE id = %s
+              AND COALESCE(es_generador_trafico, FALSE) = FALSE
+              AND COALESCE(generador_trafico_ignorado, FALSE) = FALSE
+              AND COALESCE(generador_trafico_sugerido, FALSE) = FALSE
+            RETURNING id
+        """, (gap, producto_id))
+        if cursor.fetchone():
+            nuevas.append(producto_id)
+            cursor.execute("""
+                INSERT INTO generadores_trafico_historial
+                (producto_id, accion, gap_score, venta_30d, tickets_30d, clase_abc)
+                VALUES (%s, 'sugerido', %s, %s, %s, %s)
+            """, (producto_id, gap, float(venta_30d) if venta_30d else 0, tickets_30d, clase_abc))
+
+    cursor.execute("""
+        UPDATE productos
+        SET generador_trafico_sugerido = FALSE
+        WHERE generador_trafico_sugerido = TRUE
+          AND id NOT IN (
+              SELECT producto_id
+              FROM productos_abc_cache
+              WHERE gap >= %s
+          )
+        RETURNING id
+    """, (gap_minimo,))
+    removidas = [r[0] for r in cursor.fetchall()]
+    return len(candidatos), sorted(nuevas), sorted(removidas)
+
+
+def _estado(cursor):
+    cursor.execute("""
+        SELECT id, generador_trafico_sugerido, generador_trafico_gap,
+               generador_trafico_fecha_sugerido IS NOT NULL
+        FROM productos ORDER BY id
+    """)
+    productos = cursor.fetchall()
+    cursor.execute("""
+        SELECT producto_id, accion, gap_score, venta_30d, tickets_30d, clase_abc
+        FROM generadores_trafico_historial ORDER BY producto_id
+    """)
+    return productos, cursor.fetchall()
+
+
+@pytest.fixture
+def cursor(db_conn):
+    cur = db_conn.cursor()
+    cur.execute("CREATE SCHEMA generadores_trafico_test")
+    cur.execute("SET LOCAL search_path TO generadores_trafico_test")
+    cur.execute(TABLAS_BASE)
+    cur.executemany("INSERT INTO productos VALUES (%s, %s, %s, %s, %s)", PRODUCTOS)
+    cur.executemany("INSERT INTO productos_abc_cache VALUES (%s, %s, %s, %s, %s)", ABC_CACHE)
+    yield cur
+    cur.close()
+
+
+@pytest.mark.integration
+class TestRecalculoContraLoopPorFila:
+
+    def test_mismo_resultado_que_el_loop(self, cursor):
+        cursor.execute("SAVEPOINT antes")
+        analizados, nuevas, removidas = _recalcular_por_fila(cursor, GAP_MINIMO)
+        esperado = _estado(cursor)
+        cursor.execute("ROLLBACK TO SAVEPOINT antes")
+
+        diff = recalcular_sugerencias(cursor, gap_minimo=GAP_MINIMO)
+
+        assert _estado(cursor) == esperado
+        assert diff.productos_analizados == analizados == 6
+        assert [c['producto_id'] for c in diff.sugeridos] == nuevas == ['P1', 'P7']
+        assert [c['producto_id'] for c in diff.removidos] == removidas == ['P5', 'P9']
+        # El diff informa el gap guardado de los removidos (antes de la sentencia)
+        assert [c['gap'] for c in diff.removidos] == [380, 500]
+
+    def test_segunda_pasada_no_cambia_nada(self, cursor):
+        recalcular_sugerencias(cursor, gap_minimo=GAP_MINIMO)
+        estado = _estado(cursor)
+
+        diff = recalcular_sugerencias(cursor, gap_minimo=GAP_MINIMO)
+
+        assert (diff.sugeridos, diff.removidos) == ([], [])
+        assert _estado(cursor) == estado
@@ -0,0 +1,152 @@
+"""
+Tests del mantenimiento de inventario_incrementos en la carga delta de
+inventario (PostgreSQLInventarioLoader._cargar_delta_inventario).
+
+Cargan varios snapshots de dos almacenes de una ubicación, uno por corrida
+como el ETL, y comparan inventario_incrementos con los incrementos que
+reconstruye el LAG sobre inventario_historico (la consulta que reemplaza).
+
+Requieren PostgreSQL (TEST_DATABASE_URL): trabajan en un schema temporal
+que se descarta con el rollback de db_conn.
+"""
+
+import importlib.util
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from tests.conftest import ejecutar_migracion
+
+_RUTA = os.path.join(os.path.dirname(__file__), '..', '..', 'etl', 'core', 'loader_inventario_postgres.py')
+_spec = importlib.util.spec_from_file_location('loader_inventario_postgres', _RUTA)
+loader_inventario = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(loader_inventario)
+
+UBICACION = 'tienda_01'
+ALMACENES = ['A1', 'A2']
+
+# fecha del snapshot -> almacén -> producto -> cantidad
+SNAPSHOTS = [
+    (datetime(2026, 10, 13, 6), {'A1': {'P1': 10, 'P2': 5}, 'A2': {'P1': 4, 'P3': 7}}),
+    (datetime(2026, 10, 14, 6), {'A1': {'P1': 30, 'P2': 5}, 'A2': {'P1': 4, 'P3': 2}}),
+    (datetime(2026, 10, 15, 6), {'A1': {'P1': 30, 'P2': 1}, 'A2': {'P1': 12, 'P2': 9, 'P3': 2}}),
+    (datetime(2026, 10, 16, 6), {'A1': {'P1': 30}, 'A2': {'P1': 12, 'P3': 15}}),
+    # Repite el anterior: solo lleva el snapshot del 16 al histórico
+    (datetime(2026, 10, 17, 6), {'A1': {'P1': 30}, 'A2': {'P1': 12, 'P3': 15}}),
+]
+
+TABLAS_BASE = """
+    CREATE TABLE inventario_actual (
+        ubicacion_id VARCHAR(50) NOT NULL,
+        producto_id VARCHAR(50) NOT NULL,
+        almacen_codigo VARCHAR(50) NOT NULL,
+        cantidad NUMERIC(12,4) NOT NULL,
+        fecha_actualizacion TIMESTAMP,
+        PRIMARY KEY (ubicacion_id, producto_id, almacen_codigo)
+    );
+    CREATE TABLE inventario_historico (
+        id SERIAL PRIMARY KEY,
+        ubicacion_id VARCHAR(50) NOT NULL,
+        producto_id VARCHAR(50) NOT NULL,
+        almacen_codigo VARCHAR(50),
+        cantidad DECIMAL(15,3) NOT NULL,
+        fecha_snapshot TIMESTAMP NOT NULL
+    );
+"""
+
+# Incrementos entre snapshots consecutivos como los calculaba verificar-llegada
+INCREMENTOS_LAG = """
+    SELECT ubicacion_id, producto_id, fecha_snapshot, fecha_anterior,
+           cantidad_anterior, cantidad, cantidad - cantidad_anterior
+    FROM (
+        SELECT
+            ubicacion_id,
+            producto_id,
+            fecha_snapshot,
+            SUM(cantidad) AS cantidad,
+            LAG(fecha_snapshot) OVER w AS fecha_anterior,
+            LAG(SUM(cantidad)) OVER w AS cantidad_anterior
+        FROM inventario_historico
+        GROUP BY ubicacion_id, producto_id, fecha_snapshot
+        WINDOW w AS (PARTITION BY ubicacion_id, producto_id ORDER BY fecha_snapshot)
+    ) s
+    WHERE cantidad_anterior IS NOT NULL
+      AND cantidad > cantidad_anterior
+    ORDER BY 1, 2, 3
+"""
+
+
+@pytest.fixture
+def cursor(db_conn):
+    cur = db_conn.cursor()
+    cur.execute("CREATE SCHEMA inventario_incrementos_test")
+    cur.execute("SET LOCAL search_path TO inventario_incrementos_test")
+    cur.execute(TABLAS_BASE)
+    ejecutar_migracion(cur, '038_inventario_cargas_delta_UP.sql')
+    ejecutar_migracion(cur, '047_inventario_incrementos_UP.sql')
+    yield cur
+    cur.close()
+
+
+def _cargar(cursor, fecha, almacenes):
+    """Una corrida del loader; sus tablas temporales se borrarían al confirmar."""
+    filas = pd.DataFrame(
+        [(almacen, producto, cantidad, fecha)
+         for almacen, productos in almacenes.items()
+         for producto, cantidad in productos.items()],
+        columns=['almacen_codigo', 'producto', 'cantidad', 'fecha_actualizacion'],
+    )
+    loader = loader_inventario.PostgreSQLInventarioLoader.__new__(loader_inventario.PostgreSQLInventarioLoader)
+    loader.logger = loader_inventario.logger
+    resultado = loader._cargar_delta_inventario(
+        cursor, UBICACION, list(almacenes), filas, fecha, resolver_codigo=False
+    )
+    cursor.execute("DROP TABLE inventario_staging, inventario_nuevo")
+    return resultado
+
+
+def _incrementos(cursor):
+    cursor.execute("""
+        SELECT ubicacion_id, producto_id, fecha_snapshot, fecha_snapshot_anterior,
+               cantidad_anterior, cantidad, incremento
+        FROM inventario_incrementos
+        ORDER BY 1, 2, 3
+    """)
+    return cursor.fetchall()
+
+
+@pytest.mark.integration
+class TestInventarioIncrementos:
+
+    @pytest.mark.parametrize("por_almacen", [True, False], ids=['una_corrida_por_almacen', 'almacenes_juntos'])
+    def test_igual_al_lag_sobre_historico(self, cursor, por_almacen):
+        for fecha, almacenes in SNAPSHOTS:
+            if por_almacen:
+                for almacen in ALMACENES:
+                    _cargar(cursor, fecha, {almacen: almacenes[almacen]})
+            else:
+                _cargar(cursor, fecha, almacenes)
+
+        incrementos = _incrementos(cursor)
+        cursor.execute(INCREMENTOS_LAG)
+
+        assert incrementos == cursor.fetchall()
+        assert [(producto, fecha.day, int(incremento))
+                for _, producto, fecha, _, _, _, incremento in incrementos] == [
+            ('P1', 14, 20), ('P1', 15, 8), ('P2', 15, 5), ('P3', 16, 13)
+        ]
+
+    def test_filas_sin_cambios_toman_la_fecha_del_snapshot(self, cursor):
+        # P1 de A1 no cambia desde el 14: su fecha_actualizacion queda vieja,
+        # pero en el histórico cuenta en cada snapshot del almacén
+        for fecha, almacenes in SNAPSHOTS:
+            _cargar(cursor, fecha, almacenes)
+
+        cursor.execute("""
+            SELECT fecha_snapshot::date, cantidad FROM inventario_historico
+            WHERE producto_id = 'P1' AND almacen_codigo = 'A1'
+            ORDER BY fecha_snapshot
+        """)
+        assert [(f.day, int(c)) for f, c in cursor.fetchall()] == [(13, 10), (14, 30), (15, 30), (16, 30)]
@@ -0,0 +1,146 @@
+"""
+Tests de la detección de llegadas desde inventario_incrementos
+(services/llegadas_inventario.py), de verificar-llegada (individual y por
+lote) y del tránsito multi-tienda.
+
+Usan la conexión falsa de conftest: no requieren base de datos.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from models.pedidos_sugeridos import VerificarLlegadaLoteRequest
+from routers import pedidos_multitienda, pedidos_sugeridos
+from services.llegadas_inventario import obtener_llegadas
+
+FECHA_PEDIDO = date(2026, 10, 10)
+
+PEDIDOS = {
+    'ped-1': ('ped-1', 'PED-0001', FECHA_PEDIDO, 'tienda_01', 'Tienda 01'),
+    'ped-2': ('ped-2', 'PED-0002', date(2026, 10, 12), 'tienda_02', 'Tienda 02'),
+    'ped-vacio': ('ped-vacio', 'PED-0003', FECHA_PEDIDO, 'tienda_01', 'Tienda 01'),
+}
+
+# pedido_id, codigo, descripcion, bultos pedidos, unidades pedidas, recibidos,
+# codigo historico, unidades x bulto, unidad, abc, stocks tienda/caracas/verde
+DETALLE = [
+    ('ped-1', 'P1', 'Harina', 10, 120, 0, 'P1', 12, 'bultos', 'A', 50, 100, 0),
+    ('ped-1', 'P2', 'Arroz', 5, 60, 2, 'P2', 12, 'bultos', 'B', 5, 0, 0),
+    ('ped-2', 'P1', 'Harina', 4, 48, 0, 'P1', 12, 'bultos', 'A', 0, 100, 0),
+]
+
+# (ubicacion, producto, desde) -> total, primer incremento, inicial, final, tiene_datos
+LLEGADAS = {
+    ('tienda_01', 'P1', FECHA_PEDIDO): (Decimal('120'), datetime(2026, 10, 11, 8), Decimal('3'), Decimal('90'), True),
+    ('tienda_01', 'P2', FECHA_PEDIDO): (Decimal('36'), datetime(2026, 10, 12, 8), Decimal('1'), Decimal('20'), True),
+}
+
+
+def _llegadas(sql, params):
+    con_snapshots = "inventario_historico" in sql
+    filas = []
+    for clave in zip(*params):
+        if clave in LLEGADAS:
+            total, primer, inicial, final, tiene_datos = LLEGADAS[clave]
+            fila = clave + (total, primer)
+            filas.append(fila + (inicial, final, tiene_datos) if con_snapshots else fila)
+        elif con_snapshots:
+            filas.append(clave + (0, None, None, None, False))
+        else:
+            filas.append(clave + (0, None))
+    return filas
+
+
+REGLAS = [
+    ('transito', "FROM pedidos_sugeridos ps", [
+        ('ped-1', 'PED-0001', FECHA_PEDIDO, 'aprobado', 'P1', 'Harina', Decimal('10'), 12),
+        ('ped-1', 'PED-0001', FECHA_PEDIDO, 'aprobado', 'P2', 'Arroz', Decimal('5'), 12),
+    ]),
+    ('pedidos', "FROM pedidos_sugeridos p", lambda sql, params: [PEDIDOS[pid] for pid in params[0] if pid in PEDIDOS]),
+    ('detalle', "FROM pedidos_sugeridos_detalle d", lambda sql, params: [row for row in DETALLE if row[0] in params[0]]),
+    ('llegadas_con_snapshots', "inventario_historico", _llegadas),
+    ('llegadas', "inventario_incrementos", _llegadas),
+]
+
+
+@pytest.fixture
+def conn(fake_conn):
+    return fake_conn(REGLAS, estricto=True)
+
+
+@pytest.mark.basic
+class TestObtenerLlegadas:
+
+    def test_una_consulta_para_todas_las_claves(self, conn):
+        clave = ('tienda_01', 'P1', FECHA_PEDIDO)
+
+        llegadas = obtener_llegadas(conn.cursor(), [clave, clave, ('tienda_01', 'P9', FECHA_PEDIDO)])
+
+        assert conn.queries == [('llegadas', [
+            ['tienda_01', 'tienda_01'], ['P1', 'P9'], [FECHA_PEDIDO, FECHA_PEDIDO]
+        ])]
+        assert llegadas[clave].total_llegadas == Decimal('120')
+        assert llegadas[('tienda_01', 'P9', FECHA_PEDIDO)].total_llegadas == Decimal(0)
+        assert llegadas[clave].snapshot_final is None
+
+    def test_sin_claves_no_consulta(self, conn):
+        assert obtener_llegadas(conn.cursor(), []) == {}
+        assert conn.queries == []
+
+
+@pytest.mark.basic
+class TestVerificarLlegada:
+
+    def test_pedido_individual(self, conn):
+        resultado = pedidos_sugeridos.verificar_llegada.__wrapped__('ped-1', conn=conn)
+
+        assert conn.etiquetas() == ['pedidos', 'detalle', 'llegadas_con_snapshots']
+        p1, p2 = resultado.productos
+        assert (p1.estado_llegada, p1.total_llegadas_detectadas, p1.snapshot_final) == ('completo', Decimal('10.00'), Decimal('90'))
+        assert (p2.estado_llegada, p2.total_llegadas_detectadas, p2.nuevo_incremento) == ('parcial', Decimal('3.00'), Decimal('1.00'))
+        assert resultado.productos_completos == 1
+        assert resultado.porcentaje_cumplimiento_global == Decimal('50.0')
+        assert resultado.hay_nuevos_incrementos
+
+    def test_pedido_inexistente_o_sin_productos(self, conn):
+        with pytest.raises(HTTPException) as exc:
+            pedidos_sugeridos.verificar_llegada.__wrapped__('no-existe', conn=conn)
+        assert exc.value.status_code == 404
+
+        with pytest.raises(HTTPException) as exc:
+            pedidos_sugeridos.verificar_llegada.__wrapped__('ped-vacio', conn=conn)
+        assert exc.value.detail == "El pedido no tiene productos"
+
+    def test_lote_con_tres_consultas(self, conn):
+        request = VerificarLlegadaLoteRequest(pedido_ids=['ped-2', 'ped-1', 'no-existe', 'ped-vacio', 'ped-1'])
+
+        resultado = pedidos_sugeridos.verificar_llegada_lote.__wrapped__(request, conn=conn)
+
+        assert conn.etiquetas() == ['pedidos', 'detalle', 'llegadas_con_snapshots']
+        assert [p.pedido_id for p in resultado.pedidos] == ['ped-2', 'ped-1']
+        assert resultado.pedidos_no_encontrados == ['no-existe']
+        assert resultado.pedidos_sin_productos == ['ped-vacio']
+
+        ped2 = resultado.pedidos[0]
+        assert ped2.productos[0].estado_llegada == 'no_llego'
+        assert ped2.productos[0].mensaje == "Sin histórico de inventario (asumido como no llegó)"
+
+    def test_lote_vacio_es_invalido(self):
+        with pytest.raises(ValueError):
+            VerificarLlegadaLoteRequest(pedido_ids=[])
+
+
+@pytest.mark.basic
+class TestTransitoTienda:
+
+    def test_transito_desde_incrementos(self, conn):
+        transito = pedidos_multitienda.calcular_transito_tienda(conn, 'cedi_seco', 'tienda_01')
+
+        assert conn.etiquetas() == ['transito', 'llegadas']
+        # P1 llegó completo (120 u = 10 bultos); de P2 llegaron 3 de 5 bultos
+        assert list(transito) == ['P2']
+        assert transito['P2']['transito_bultos'] == pytest.approx(2.0)
+        assert transito['P2']['desglose'][0]['llegadas_bultos'] == 3.0
@@ -0,0 +1,117 @@
+"""
+Tests para la persistencia en bloque de pedidos (services/pedidos_persistencia.py)
+y su uso en POST /pedidos-multitienda/guardar-lote.
+
+Usan la conexión falsa de conftest (con mogrify): no requieren base de datos.
+"""
+
+import pytest
+
+from models.pedidos_multitienda import (
+    GuardarMultiTiendaRequest,
+    PedidoTiendaParaGuardar,
+    ProductoPedidoAjustado,
+)
+from routers.pedidos_multitienda import guardar_pedidos_lote
+from services.pedidos_persistencia import (
+    formatear_numero_pedido,
+    insertar_filas,
+    siguiente_numero_base,
+)
+
+
+def reglas(conn):
+    """nextval de la secuencia (falla si la conexión no la tiene) y MAX(numero_pedido)"""
+    def nextval(sql, params):
+        if not conn.con_secuencia:
+            raise Exception('relation "pedidos_sugeridos_numero_seq" does not exist')
+        return [(conn.siguiente,)]
+
+    return [
+        ('secuencia', 'nextval', nextval),
+        ('maximo', 'MAX(numero_pedido)', lambda sql, params: [(conn.maximo,)]),
+    ]
+
+
+@pytest.fixture
+def conn(fake_conn):
+    return fake_conn(reglas, con_secuencia=True, siguiente=42, maximo=None)
+
+
+def inserts(conn, tabla):
+    return [s for s in conn.sentencias if s.startswith(f"INSERT INTO {tabla} ")]
+
+
+@pytest.mark.basic
+class TestNumeroPedido:
+
+    def test_usa_la_secuencia(self, conn):
+        assert siguiente_numero_base(conn.cursor()) == 42
+        assert not any('MAX(' in s for s in conn.sentencias)
+
+    @pytest.mark.parametrize("maximo, esperado", [(None, 1), ('PS-00041', 42), ('PS-00041-7', 42)])
+    def test_sin_secuencia_usa_max(self, conn, maximo, esperado):
+        conn.con_secuencia, conn.maximo = False, maximo
+        assert siguiente_numero_base(conn.cursor()) == esperado
+        assert 'ROLLBACK TO SAVEPOINT numero_pedido' in conn.sentencias
+
+    def test_formato(self):
+        assert formatear_numero_pedido(42) == 'PS-00042'
+        assert formatear_numero_pedido(42, 3) == 'PS-00042-3'
+
+
+@pytest.mark.basic
+class TestInsertarFilas:
+
+    def test_insert_multifila_paginado_con_valores_fijos(self, conn):
+        filas = [(i, f"P{i}") for i in range(2500)]
+
+        assert insertar_filas(conn.cursor(), 'pedidos_sugeridos_detalle', ['linea_numero', 'codigo_producto'], filas,
+                              valores_fijos={'fecha_creacion': 'CURRENT_TIMESTAMP'}) == 2500
+
+        detalle = inserts(conn, 'pedidos_sugeridos_detalle')
+        assert len(detalle) == 3
+        assert detalle[0].startswith(
+            "INSERT INTO pedidos_sugeridos_detalle (linea_numero, codigo_producto, fecha_creacion) VALUES (0, 'P0', CURRENT_TIMESTAMP),"
+        )
+        assert detalle[2].count('CURRENT_TIMESTAMP') == 500
+
+    def test_sin_filas_no_ejecuta(self, conn):
+        assert insertar_filas(conn.cursor(), 'pedidos_sugeridos_historial', ['pedido_id'], []) == 0
+        assert conn.sentencias == []
+
+
+@pytest.mark.basic
+class TestGuardarPedidosLote:
+
+    def test_lote_multitienda_en_pocos_inserts(self, conn):
+        tiendas = 19
+        lineas = 1500
+        request = GuardarMultiTiendaRequest(
+            cedi_origen_id='cedi_seco',
+            cedi_origen_nombre='CEDI SECO',
+            pedidos=[
+                PedidoTiendaParaGuardar(
+                    tienda_destino_id=f'tienda_{t:02d}',
+                    tienda_destino_nombre=f'TIENDA {t}',
+                    productos=[
+                        ProductoPedidoAjustado(
+                            codigo_producto=f'{p:06d}', descripcion_producto=f'Producto {p}',
+                            cantidad_pedida_bultos=2, cantidad_pedida_unidades=24,
+                            incluido=t != 0,  # la tienda 0 no incluye nada: no genera pedido
+                        )
+                        for p in range(lineas)
+                    ],
+                )
+                for t in range(tiendas)
+            ],
+        )
+        respuesta = guardar_pedidos_lote.__wrapped__(request, conn)
+
+        assert respuesta.total_pedidos == tiendas - 1
+        assert [p.numero_pedido for p in respuesta.pedidos_creados][:2] == ['PS-00042-2', 'PS-00042-3']
+        assert len(inserts(conn, 'pedidos_sugeridos')) == 1
+        assert len(inserts(conn, 'pedidos_sugeridos_detalle')) == 27  # 27.000 líneas / 1000
+        assert len(inserts(conn, 'pedidos_sugeridos_historial')) == 1
+        assert len(conn.sentencias) < 40
+        assert conn.commits == 1
@@ -0,0 +1,166 @@
+"""
+Tests para el snapshot de /api/stock (services/stock_snapshot.py).
+
+Usan filas sintéticas con las columnas de la query de stock:
+no requieren base de datos.
+"""
+
+import random
+from decimal import Decimal
+
+import pytest
+
+from services import stock_snapshot
+from services.stock_snapshot import FiltrosStock, invalidar_snapshot_stock, obtener_snapshot_stock
+
+COLUMNAS = [
+    'ubicacion_id', 'producto_id', 'stock_actual', 'stock_cedi', 'dias_cobertura_actual',
+    'rank_ventas', 'clase_abc', 'estado_criticidad', 'clasificacion_producto', 'velocidad_venta',
+]
+
+
+def generar_filas(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    filas = []
+    for i in range(n):
+        stock = Decimal(rng.choice([0, -2, rng.randint(1, 40), rng.randint(1, 40)]))
+        filas.append((
+            'tienda_01', f"prod-{i:04d}", stock, Decimal(rng.choice([0, 10])),
+            rng.choice([None, Decimal(str(round(rng.uniform(0, 30), 2))), Decimal('3.5')]),
+            rng.choice([None, rng.randint(1, 300)]),
+            rng.choice(['A', 'B', 'C', 'SIN_VENTAS']),
+            rng.choice(['CRITICO', 'URGENTE', 'OPTIMO', 'EXCESO', 'SIN_DEMANDA']),
+            rng.choice(['FANTASMA', 'ANOMALIA', 'DORMIDO', 'ACTIVO']),
+            rng.choice(['SIN_VENTAS', 'BAJA', 'ALTA']),
+        ))
+    return filas
+
+
+class Consulta:
+    """Reemplazo de la query pesada: cuenta cuántas veces se ejecuta."""
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.llamadas = 0
+
+    def __call__(self):
+        self.llamadas += 1
+        return COLUMNAS, self.filas
+
+
+@pytest.fixture(autouse=True)
+def cache_limpio(monkeypatch):
+    monkeypatch.setattr(stock_snapshot, "STOCK_SNAPSHOT_TTL_SECONDS", 120)
+    invalidar_snapshot_stock()
+    yield
+    invalidar_snapshot_stock()
+
+
+def orden_sql(filas, campo, descendente):
+    """ORDER BY campo dir NULLS LAST, ubicacion_id, producto_id."""
+    dicts = [dict(zip(COLUMNAS, f)) for f in filas]
+    con_valor = sorted((d for d in dicts if d[campo] is not None),
+                       key=lambda d: (d['ubicacion_id'], d['producto_id']))
+    con_valor.sort(key=lambda d: d[campo], reverse=descendente)
+    nulos = sorted((d for d in dicts if d[campo] is None), key=lambda d: (d['ubicacion_id'], d['producto_id']))
+    return [d['producto_id'] for d in con_valor + nulos]
+
+
+@pytest.mark.basic
+class TestStockSnapshot:
+
+    def test_paginar_no_repite_query(self):
+        consulta = Consulta(generar_filas(300))
+        clave = ('tienda_01', None, None, None, None)
+
+        for page in (1, 2, 40):
+            vista = obtener_snapshot_stock(clave, consulta).vista(FiltrosStock(), 'stock_actual', True)
+            vista.pagina(page, 50)
+        obtener_snapshot_stock(clave, consulta).vista(FiltrosStock(), 'rank_ventas', False)
+
+        assert consulta.llamadas == 1
+        assert stock_snapshot.get_stock_snapshot_stats()['hits'] == 3
+
+    @pytest.mark.parametrize("campo,descendente", [
+        ('stock_actual', True), ('dias_cobertura_actual', False), ('rank_ventas', False),
+    ])
+    def test_recorrido_por_cursor_igual_a_order_by(self, campo, descendente):
+        filas = generar_filas(257)
+        vista = obtener_snapshot_stock(('t',), Consulta(filas)).vista(FiltrosStock(), campo, descendente)
+
+        vistos, cursor = [], None
+        while True:
+            pagina, _, cursor = vista.pagina(1, 20, cursor)
+            vistos.extend(f['producto_id'] for f in pagina)
+            if cursor is None:
+                break
+
+        assert vistos == orden_sql(filas, campo, descendente)
+
+    def test_cursor_estable_tras_reconstruir_snapshot(self):
+        filas = generar_filas(100)
+        clave = ('tienda_01', None, None, None, None)
+        vista = obtener_snapshot_stock(clave, Consulta(filas)).vista(FiltrosStock(), 'stock_actual', True)
+        primera, _, cursor = vista.pagina(1, 30)
+
+        # El ETL elimina un producto de la primera página: la segunda página no se corre
+        invalidar_snapshot_stock('tienda_01')
+        nuevas = [f for f in filas if f[1] != primera[0]['producto_id']]
+        vista = obtener_snapshot_stock(clave, Consulta(nuevas)).vista(FiltrosStock(), 'stock_actual', True)
+        segunda, offset, _ = vista.pagina(1, 30, cursor)
+
+        esperado = orden_sql(filas, 'stock_actual', True)[30:60]
+        assert [f['producto_id'] for f in segunda] == esperado
+        assert offset == 29
+
+    def test_filtros_y_stats_como_sql(self):
+        filas = generar_filas(400)
+        filtros = FiltrosStock(clase_abc='A', top_ventas=150, stock_filter='CON_STOCK')
+        vista = obtener_snapshot_stock(('t',), Consulta(filas)).vista(filtros, 'stock_actual', True)
+
+        dicts = [dict(zip(COLUMNAS, f)) for f in filas]
+        esperadas = [
+            d for d in dicts
+            if d['clase_abc'] == 'A' and d['rank_ventas'] is not None
+            and d['rank_ventas'] <= 150 and d['stock_actual'] > 0
+        ]
+        assert len(vista.filas) == len(esperadas)
+        assert vista.stats['criticos'] == sum(d['estado_criticidad'] == 'CRITICO' for d in esperadas)
+        assert vista.stats['stock_cero'] == 0
+
+    def test_cursor_de_otro_orden_es_invalido(self):
+        snapshot = obtener_snapshot_stock(('t',), Consulta(generar_filas(50)))
+        _, _, cursor = snapshot.vista(FiltrosStock(), 'stock_actual', True).pagina(1, 10)
+
+        with pytest.raises(ValueError):
+            snapshot.vista(FiltrosStock(), 'rank_ventas', False).pagina(1, 10, cursor)
+        with pytest.raises(ValueError):
+            snapshot.vista(FiltrosStock(), 'stock_actual', True).pagina(1, 10, "no-es-un-cursor")
+
+    def test_cache_acotado_por_filas(self, monkeypatch):
+        monkeypatch.setattr(stock_snapshot, "STOCK_SNAPSHOT_MAX_ROWS", 250)
+        consultas = {t: Consulta(generar_filas(100)) for t in ('t1', 't2', 't3')}
+
+        for tienda in ('t1', 't2', 't1', 't3'):
+            obtener_snapshot_stock((tienda,), consultas[tienda])
+
+        # t3 no entra junto a t1 y t2: se desaloja t2, el menos usado
+        stats = stock_snapshot.get_stock_snapshot_stats()
+        assert (stats['snapshots'], stats['filas_total'], stats['desalojos']) == (2, 200, 1)
+        obtener_snapshot_stock(('t1',), consultas['t1'])
+        obtener_snapshot_stock(('t2',), consultas['t2'])
+        assert [c.llamadas for c in consultas.values()] == [1, 2, 1]
+
+    def test_snapshot_mayor_al_limite_no_se_cachea(self, monkeypatch):
+        monkeypatch.setattr(stock_snapshot, "STOCK_SNAPSHOT_MAX_ROWS", 250)
+        obtener_snapshot_stock(('t1',), Consulta(generar_filas(100)))
+        grande = Consulta(generar_filas(300))
+
+        assert len(obtener_snapshot_stock(('todas',), grande)) == 300
+        obtener_snapshot_stock(('todas',), grande)
+
+        stats = stock_snapshot.get_stock_snapshot_stats()
+        assert grande.llamadas == 2
+        assert (stats['snapshots'], stats['filas_total'], stats['sin_cache']) == (1, 100, 2)
+        assert invalidar_snapshot_stock() == 1
+        assert stock_snapshot.get_stock_snapshot_stats()['filas_total'] == 0
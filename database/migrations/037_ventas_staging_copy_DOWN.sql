@@ -0,0 +1,11 @@
+-- Migration: 037_ventas_staging_copy_DOWN.sql
+-- Rollback de staging UNLOGGED para carga de ventas con COPY
+
+BEGIN;
+
+ALTER TABLE etl_executions
+DROP COLUMN IF EXISTS load_rows_per_second;
+
+DROP TABLE IF EXISTS ventas_staging;
+
+COMMIT;
@@ -0,0 +1,47 @@
+-- =========================================================================
+-- Migration 037 UP: Staging UNLOGGED para carga de ventas con COPY
+-- Description: Tabla de staging sin WAL para el modo de carga 'copy' de
+--              PostgreSQLVentasLoader (COPY del lote + un solo upsert
+--              set-based hacia ventas). Cada lote se identifica con lote_id
+--              y se borra en la misma transacción del merge. Tipos sin
+--              precisión: el redondeo ocurre al insertar en ventas.
+--              Agrega load_rows_per_second a etl_executions.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS ventas_staging (
+    lote_id VARCHAR(36) NOT NULL,
+    ordinal INTEGER NOT NULL,
+    numero_factura TEXT,
+    fecha_venta TIMESTAMP,
+    ubicacion_id TEXT,
+    almacen_codigo TEXT,
+    almacen_nombre TEXT,
+    producto_id TEXT,
+    cuadrante_producto TEXT,
+    cantidad_vendida NUMERIC,
+    peso_unitario NUMERIC,
+    peso_calculado NUMERIC,
+    total_cantidad_por_unidad_medida NUMERIC,
+    unidad_medida_venta TEXT,
+    factor_unidad_medida NUMERIC,
+    precio_unitario NUMERIC,
+    costo_unitario NUMERIC,
+    venta_total NUMERIC,
+    costo_total NUMERIC,
+    utilidad_bruta NUMERIC,
+    margen_bruto_pct NUMERIC,
+    fecha_creacion TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ventas_staging_lote ON ventas_staging (lote_id);
+
+ALTER TABLE etl_executions
+ADD COLUMN IF NOT EXISTS load_rows_per_second DECIMAL(12,1);
+
+COMMENT ON COLUMN etl_executions.load_rows_per_second IS 'Throughput de la fase de carga (registros cargados / segundos de carga)';
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Migration: 038_inventario_cargas_delta_DOWN.sql
+-- Rollback del registro de cargas de inventario
+
+BEGIN;
+
+DROP TABLE IF EXISTS inventario_cargas;
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- =========================================================================
+-- Migration 038 UP: Registro de cargas de inventario (carga delta)
+-- Description: El ETL de inventario ya no borra y re-inserta
+--              inventario_actual por almacén: compara el snapshot entrante
+--              contra el estado actual y solo inserta, actualiza o borra
+--              las filas que cambiaron. inventario_actual.fecha_actualizacion
+--              pasa a ser la fecha del último cambio de la fila; la fecha
+--              del último snapshot confirmado por almacén (y los conteos de
+--              cambios de cada corrida) quedan en inventario_cargas.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS inventario_cargas (
+    id BIGSERIAL PRIMARY KEY,
+    ubicacion_id VARCHAR(50) NOT NULL,
+    almacen_codigo VARCHAR(50) NOT NULL,
+    fecha_snapshot TIMESTAMP NOT NULL,
+    filas_snapshot INTEGER NOT NULL DEFAULT 0,
+    insertados INTEGER NOT NULL DEFAULT 0,
+    actualizados INTEGER NOT NULL DEFAULT 0,
+    eliminados INTEGER NOT NULL DEFAULT 0,
+    sin_cambios INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventario_cargas_almacen_fecha
+    ON inventario_cargas (ubicacion_id, almacen_codigo, fecha_snapshot DESC);
+
+COMMENT ON TABLE inventario_cargas IS 'Una fila por corrida del ETL de inventario y almacén: fecha del snapshot y conteo de cambios aplicados a inventario_actual';
+
+COMMIT;
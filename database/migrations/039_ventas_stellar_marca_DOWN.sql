@@ -0,0 +1,8 @@
+-- Migration: 039_ventas_stellar_marca_DOWN.sql
+-- Rollback de la marca de extracción de ventas Stellar
+
+BEGIN;
+
+DROP TABLE IF EXISTS ventas_stellar_marca;
+
+COMMIT;
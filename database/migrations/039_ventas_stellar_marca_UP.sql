@@ -0,0 +1,26 @@
+-- =========================================================================
+-- Migration 039 UP: Marca de extracción (high-water mark) de ventas Stellar
+-- Description: La extracción de ventas desde SQL Server (Stellar) pagina
+--              por keyset sobre (fecha, numero_factura, linea) en lugar de
+--              OFFSET/FETCH. Tras cargar cada chunk se guarda aquí la clave
+--              de la última fila por tienda, para que una extracción larga
+--              interrumpida pueda reanudarse (--reanudar) sin re-extraer
+--              lo ya cargado.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ventas_stellar_marca (
+    ubicacion_id VARCHAR(50) PRIMARY KEY,
+    fecha TIMESTAMP NOT NULL,
+    numero_factura VARCHAR(50) NOT NULL,
+    linea VARCHAR(20) NOT NULL,
+    filas_extraidas BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE ventas_stellar_marca IS 'Última clave (fecha, numero_factura, linea) de ventas Stellar cargada por tienda';
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Migration: 040_etl_gap_queue_DOWN.sql
+-- Rollback de la cola de recuperación de gaps
+
+BEGIN;
+
+DROP TABLE IF EXISTS etl_gap_queue;
+
+COMMIT;
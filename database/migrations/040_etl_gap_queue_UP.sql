@@ -0,0 +1,42 @@
+-- =========================================================================
+-- Migration 040 UP: Cola persistente de recuperación de gaps de ventas
+-- Description: El ETL de ventas encola los gaps detectados (horas sin
+--              ventas en horario comercial) en etl_gap_queue y los drena
+--              con un pool de workers con límite de concurrencia por
+--              tienda. Cada gap se reclama con FOR UPDATE SKIP LOCKED y
+--              queda ligado a la ejecución (etl_executions) que lo detectó
+--              y a la que lo procesó. Backlog y throughput se exponen en
+--              /api/etl/stats.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS etl_gap_queue (
+    id BIGSERIAL PRIMARY KEY,
+    etl_name VARCHAR(100) NOT NULL DEFAULT 'ventas',
+    tienda_id VARCHAR(50) NOT NULL,
+    hora_inicio TIMESTAMP NOT NULL,
+    hora_fin TIMESTAMP NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',   -- pending, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,  -- backoff entre reintentos
+    detected_execution_id INTEGER REFERENCES etl_executions(id) ON DELETE SET NULL,
+    claimed_execution_id INTEGER REFERENCES etl_executions(id) ON DELETE SET NULL,
+    claimed_by VARCHAR(200),
+    claimed_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    records_loaded INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_etl_gap_queue_gap UNIQUE (etl_name, tienda_id, hora_inicio)
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_gap_queue_pendientes
+    ON etl_gap_queue (etl_name, available_at)
+    WHERE status IN ('pending', 'running');
+
+COMMENT ON TABLE etl_gap_queue IS 'Gaps de ventas por tienda y hora pendientes/recuperados por el ETL (claims con SKIP LOCKED)';
+
+COMMIT;
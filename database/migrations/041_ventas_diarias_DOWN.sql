@@ -0,0 +1,8 @@
+-- Migration: 041_ventas_diarias_DOWN.sql
+-- Rollback de la tabla de hechos diaria de ventas
+
+BEGIN;
+
+DROP TABLE IF EXISTS ventas_diarias;
+
+COMMIT;
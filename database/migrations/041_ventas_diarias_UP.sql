@@ -0,0 +1,57 @@
+-- =========================================================================
+-- Migration 041 UP: Tabla de hechos diaria de ventas (ventas_diarias)
+-- Description: Agregado por (ubicacion_id, producto_id, fecha) con
+--              unidades, venta, costo y número de transacciones. Lo
+--              mantienen los loaders de ventas del ETL recalculando solo
+--              los días (ubicación, fecha) tocados por cada carga, y lo
+--              leen los endpoints analíticos (forecast, factor de
+--              intensidad, ventas diarias, ventas perdidas, P75) en lugar
+--              de agrupar la tabla ventas línea a línea.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ventas_diarias (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    producto_id VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    cantidad_vendida NUMERIC(18,4) NOT NULL DEFAULT 0,
+    venta_total NUMERIC(18,4) NOT NULL DEFAULT 0,
+    costo_total NUMERIC(18,4) NOT NULL DEFAULT 0,
+    num_transacciones INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ubicacion_id, producto_id, fecha)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ventas_diarias_producto_fecha
+    ON ventas_diarias (producto_id, fecha);
+CREATE INDEX IF NOT EXISTS idx_ventas_diarias_fecha
+    ON ventas_diarias (fecha);
+
+COMMENT ON TABLE ventas_diarias IS
+    'Agregado diario de ventas por ubicación/producto. Lo recalcula el ETL por día tocado (etl/core/ventas_diarias.py)';
+COMMENT ON COLUMN ventas_diarias.num_transacciones IS
+    'Tickets del día: facturas distintas sin el sufijo de línea _L<n> de KLK';
+
+-- Backfill inicial desde ventas
+INSERT INTO ventas_diarias (
+    ubicacion_id, producto_id, fecha,
+    cantidad_vendida, venta_total, costo_total, num_transacciones
+)
+SELECT
+    ubicacion_id,
+    producto_id,
+    fecha_venta::date,
+    COALESCE(SUM(cantidad_vendida), 0),
+    COALESCE(SUM(venta_total), 0),
+    COALESCE(SUM(costo_total), 0),
+    COUNT(DISTINCT regexp_replace(numero_factura, '_L[0-9]+$', ''))
+FROM ventas
+GROUP BY ubicacion_id, producto_id, fecha_venta::date
+ON CONFLICT (ubicacion_id, producto_id, fecha) DO NOTHING;
+
+ANALYZE ventas_diarias;
+
+COMMIT;
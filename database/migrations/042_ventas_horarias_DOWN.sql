@@ -0,0 +1,11 @@
+-- Migration: 042_ventas_horarias_DOWN.sql
+-- Rollback del rollup horario de ventas y sus baselines
+
+BEGIN;
+
+DROP TABLE IF EXISTS ventas_baseline_producto_hora;
+DROP TABLE IF EXISTS ventas_baseline_tienda_dow;
+DROP TABLE IF EXISTS ventas_horarias;
+DROP INDEX IF EXISTS idx_ventas_diarias_ubicacion_fecha;
+
+COMMIT;
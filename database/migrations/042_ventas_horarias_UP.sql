@@ -0,0 +1,114 @@
+-- =========================================================================
+-- Migration 042 UP: Rollup horario de ventas y baselines por día de semana
+-- Description: ventas_horarias agrega ventas por (ubicación, fecha, hora,
+--              producto, almacén) con unidades, venta, líneas y primera/
+--              última venta de la hora, y guarda dia_semana (DOW de
+--              PostgreSQL, 0=domingo) como columna. Lo mantiene el ETL de
+--              ventas recalculando los días tocados por cada carga.
+--              ventas_baseline_tienda_dow y ventas_baseline_producto_hora
+--              guardan los promedios del mismo día de semana (últimas 4
+--              semanas) que usan el detector de emergencias y el modal de
+--              detalle; el ETL los recalcula una vez al día por tienda.
+--              Agrega además (ubicacion_id, fecha) a ventas_diarias para
+--              las lecturas por tienda y rango de fechas.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+-- -------------------------------------------------------------------------
+-- 1. Rollup horario
+-- -------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS ventas_horarias (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    hora SMALLINT NOT NULL,
+    producto_id VARCHAR(50) NOT NULL,
+    almacen_codigo VARCHAR(50) NOT NULL DEFAULT '',
+    dia_semana SMALLINT NOT NULL,
+    cantidad_vendida NUMERIC(18,4) NOT NULL DEFAULT 0,
+    venta_total NUMERIC(18,4) NOT NULL DEFAULT 0,
+    num_lineas INTEGER NOT NULL DEFAULT 0,
+    primera_venta TIMESTAMP NOT NULL,
+    ultima_venta TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ubicacion_id, fecha, hora, producto_id, almacen_codigo)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ventas_horarias_producto_fecha
+    ON ventas_horarias (producto_id, fecha);
+
+COMMENT ON TABLE ventas_horarias IS
+    'Rollup horario de ventas por ubicación/producto/almacén. Lo recalcula el ETL por día tocado (etl/core/ventas_horarias.py)';
+COMMENT ON COLUMN ventas_horarias.dia_semana IS
+    'EXTRACT(DOW FROM fecha): 0=domingo ... 6=sábado';
+COMMENT ON COLUMN ventas_horarias.num_lineas IS
+    'Líneas de venta de la hora (COUNT(*) sobre ventas)';
+
+-- -------------------------------------------------------------------------
+-- 2. Baselines del mismo día de semana (últimas 4 semanas antes de fecha_corte)
+-- -------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS ventas_baseline_tienda_dow (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    dia_semana SMALLINT NOT NULL,
+    fecha_corte DATE NOT NULL,
+    promedio_venta_dia NUMERIC(18,4) NOT NULL DEFAULT 0,
+    dias_muestra INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ubicacion_id, dia_semana)
+);
+
+CREATE TABLE IF NOT EXISTS ventas_baseline_producto_hora (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    producto_id VARCHAR(50) NOT NULL,
+    dia_semana SMALLINT NOT NULL,
+    hora SMALLINT NOT NULL,
+    fecha_corte DATE NOT NULL,
+    promedio_cantidad NUMERIC(18,4) NOT NULL DEFAULT 0,
+    dias_muestra INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ubicacion_id, producto_id, dia_semana, hora)
+);
+
+COMMENT ON TABLE ventas_baseline_tienda_dow IS
+    'Promedio de venta diaria de la tienda por día de semana (días con ventas en [fecha_corte - 28, fecha_corte))';
+COMMENT ON TABLE ventas_baseline_producto_hora IS
+    'Promedio de unidades por hora de cada producto por día de semana (días con ventas en la hora, [fecha_corte - 28, fecha_corte))';
+
+-- -------------------------------------------------------------------------
+-- 3. ventas_diarias: lecturas por tienda y rango de fechas
+-- -------------------------------------------------------------------------
+
+CREATE INDEX IF NOT EXISTS idx_ventas_diarias_ubicacion_fecha
+    ON ventas_diarias (ubicacion_id, fecha);
+
+-- -------------------------------------------------------------------------
+-- 4. Backfill de los últimos 60 días (los lectores usan hasta 30)
+-- -------------------------------------------------------------------------
+
+INSERT INTO ventas_horarias (
+    ubicacion_id, fecha, hora, producto_id, almacen_codigo, dia_semana,
+    cantidad_vendida, venta_total, num_lineas, primera_venta, ultima_venta
+)
+SELECT
+    ubicacion_id,
+    fecha_venta::date,
+    EXTRACT(HOUR FROM fecha_venta)::smallint,
+    producto_id,
+    COALESCE(almacen_codigo, ''),
+    EXTRACT(DOW FROM fecha_venta)::smallint,
+    COALESCE(SUM(cantidad_vendida), 0),
+    COALESCE(SUM(venta_total), 0),
+    COUNT(*),
+    MIN(fecha_venta),
+    MAX(fecha_venta)
+FROM ventas
+WHERE fecha_venta >= CURRENT_DATE - 60
+GROUP BY 1, 2, 3, 4, 5, 6
+ON CONFLICT DO NOTHING;
+
+ANALYZE ventas_horarias;
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Migration: 043_bi_data_version_DOWN.sql
+-- Rollback de la versión de datos del cache BI
+
+BEGIN;
+
+DROP TABLE IF EXISTS bi_data_version;
+
+COMMIT;
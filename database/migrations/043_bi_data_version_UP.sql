@@ -0,0 +1,28 @@
+-- =========================================================================
+-- Migration 043 UP: Versión de datos para el cache de respuestas BI
+-- Description: bi_data_version guarda un contador (una sola fila) que el
+--              ETL incrementa al terminar una ejecución que cargó registros
+--              y que POST /bi/admin/refresh-views incrementa después de
+--              refrescar las vistas materializadas. El backend lo usa como
+--              parte de la clave del cache de los routers de BI: cuando la
+--              versión cambia, las respuestas cacheadas dejan de servirse.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS bi_data_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    origen VARCHAR(100),
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO bi_data_version (id, version, origen)
+VALUES (1, 1, 'migracion_043')
+ON CONFLICT (id) DO NOTHING;
+
+COMMENT ON TABLE bi_data_version IS 'Versión de datos de BI (la incrementan el ETL y refresh_bi_views); clave del cache de respuestas BI';
+
+COMMIT;
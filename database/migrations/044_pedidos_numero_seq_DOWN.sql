@@ -0,0 +1,8 @@
+-- Migration: 044_pedidos_numero_seq_DOWN.sql
+-- Rollback de la secuencia de numero_pedido
+
+BEGIN;
+
+DROP SEQUENCE IF EXISTS pedidos_sugeridos_numero_seq;
+
+COMMIT;
@@ -0,0 +1,26 @@
+-- =========================================================================
+-- Migration 044 UP: Secuencia para numero_pedido de pedidos sugeridos
+-- Description: pedidos_sugeridos_numero_seq reemplaza el
+--              SELECT MAX(numero_pedido) que hacía cada guardado. Un
+--              pedido individual toma PS-<n> y un lote multi-tienda toma un
+--              solo n para PS-<n>-1, PS-<n>-2, ... La secuencia arranca
+--              después del mayor número existente (con o sin sufijo).
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE SEQUENCE IF NOT EXISTS pedidos_sugeridos_numero_seq;
+
+SELECT setval(
+    'pedidos_sugeridos_numero_seq',
+    COALESCE(MAX(substring(numero_pedido FROM '^PS-([0-9]+)')::bigint), 0) + 1,
+    false
+)
+FROM pedidos_sugeridos
+WHERE numero_pedido ~ '^PS-[0-9]+';
+
+COMMENT ON SEQUENCE pedidos_sugeridos_numero_seq IS 'Número base de pedidos sugeridos (PS-<n> y PS-<n>-<orden> en lotes)';
+
+COMMIT;
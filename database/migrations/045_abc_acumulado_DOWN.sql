@@ -0,0 +1,11 @@
+-- Migration: 045_abc_acumulado_DOWN.sql
+-- Rollback de los agregados rodantes del ABC incremental
+
+BEGIN;
+
+DROP TABLE IF EXISTS abc_acumulado_control;
+DROP TABLE IF EXISTS abc_acumulado_tienda;
+DROP TABLE IF EXISTS abc_tickets_dia;
+DROP TABLE IF EXISTS abc_ventas_dia;
+
+COMMIT;
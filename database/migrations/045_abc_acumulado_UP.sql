@@ -0,0 +1,67 @@
+-- =========================================================================
+-- Migration 045 UP: Agregados rodantes para el recálculo ABC incremental
+-- Description: abc_ventas_dia y abc_tickets_dia guardan por tienda y día
+--              las métricas ABC (cantidad, venta, tickets sin el sufijo
+--              _L<n>) de la ventana de análisis; abc_acumulado_tienda
+--              mantiene la suma de la ventana por tienda/producto sumando
+--              los días nuevos o recargados y restando los que vencen.
+--              recalcular_abc_cache.py --incremental re-rankea solo las
+--              tiendas afectadas y el ABC global desde estos acumulados.
+--              abc_acumulado_control registra la ventana vigente; la
+--              primera corrida incremental (o un cambio de días/producto
+--              excluido) reconstruye todo desde ventas.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS abc_ventas_dia (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    producto_id VARCHAR(50) NOT NULL,
+    cantidad NUMERIC(18,4) NOT NULL DEFAULT 0,
+    venta NUMERIC(18,4) NOT NULL DEFAULT 0,
+    tickets INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ubicacion_id, fecha, producto_id)
+);
+
+CREATE TABLE IF NOT EXISTS abc_tickets_dia (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    fecha DATE NOT NULL,
+    tickets INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ubicacion_id, fecha)
+);
+
+CREATE TABLE IF NOT EXISTS abc_acumulado_tienda (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    producto_id VARCHAR(50) NOT NULL,
+    cantidad NUMERIC(18,4) NOT NULL DEFAULT 0,
+    venta NUMERIC(18,4) NOT NULL DEFAULT 0,
+    tickets INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ubicacion_id, producto_id)
+);
+
+CREATE TABLE IF NOT EXISTS abc_acumulado_control (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    dias INTEGER NOT NULL,
+    producto_excluido VARCHAR(50) NOT NULL,
+    ventana_inicio DATE NOT NULL,
+    ventana_fin DATE NOT NULL,
+    marca TIMESTAMP NOT NULL,
+    parametros JSONB,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE abc_ventas_dia IS
+    'Métricas ABC por tienda/día/producto de la ventana vigente (etl/core/abc_incremental.py)';
+COMMENT ON TABLE abc_tickets_dia IS
+    'Tickets distintos por tienda/día (sin el producto excluido) para total_tickets_periodo';
+COMMENT ON TABLE abc_acumulado_tienda IS
+    'Suma de abc_ventas_dia en la ventana por tienda/producto, mantenida por deltas';
+COMMENT ON COLUMN abc_acumulado_control.marca IS
+    'Inicio de la última corrida: los días de ventas_diarias con updated_at posterior se recalculan';
+COMMENT ON COLUMN abc_acumulado_control.parametros IS
+    'Umbrales y modelo activo de la última clasificación: si cambian se re-rankean todas las tiendas';
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Migration: 046_cache_respuestas_DOWN.sql
+-- Rollback del cache compartido de respuestas
+
+BEGIN;
+
+DROP TABLE IF EXISTS cache_respuestas;
+
+COMMIT;
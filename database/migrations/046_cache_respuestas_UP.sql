@@ -0,0 +1,32 @@
+-- =========================================================================
+-- Migration 046 UP: Cache compartido de respuestas (stale-while-revalidate)
+-- Description: cache_respuestas guarda el JSON de endpoints caros
+--              (summary-regional de inventario y resumen de ventas) para
+--              que todos los workers/tasks del backend sirvan la misma
+--              copia. Una respuesta vencida (TTL o bi_data_version nueva
+--              tras un ETL) se sigue sirviendo mientras un solo worker la
+--              recalcula en segundo plano; refrescando_desde es el lease
+--              que evita que varios la recalculen a la vez.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cache_respuestas (
+    clave VARCHAR(100) PRIMARY KEY,
+    contenido JSONB,
+    version_datos VARCHAR(50),
+    calculado_en TIMESTAMP,
+    duracion_ms INTEGER,
+    refrescando_desde TIMESTAMP
+);
+
+COMMENT ON TABLE cache_respuestas IS
+    'Respuestas cacheadas compartidas entre workers (backend/services/cache_swr.py)';
+COMMENT ON COLUMN cache_respuestas.version_datos IS
+    'bi_data_version.version con la que se calculó: si el ETL la incrementa la respuesta queda vencida';
+COMMENT ON COLUMN cache_respuestas.refrescando_desde IS
+    'Lease del worker que está recalculando (NULL = nadie)';
+
+COMMIT;
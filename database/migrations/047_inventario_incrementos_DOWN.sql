@@ -0,0 +1,8 @@
+-- Migration: 047_inventario_incrementos_DOWN.sql
+-- Rollback de los incrementos de inventario precalculados
+
+BEGIN;
+
+DROP TABLE IF EXISTS inventario_incrementos;
+
+COMMIT;
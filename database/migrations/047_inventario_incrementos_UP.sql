@@ -0,0 +1,65 @@
+-- =========================================================================
+-- Migration 047 UP: Incrementos de inventario precalculados
+-- Description: inventario_incrementos guarda, por ubicación/producto, cada
+--              snapshot de inventario_historico cuya cantidad total (suma
+--              de almacenes) subió respecto al snapshot anterior. La
+--              mantiene el loader de inventario del ETL al guardar el
+--              snapshot histórico, así que detectar la llegada de un pedido
+--              (verificar-llegada y tránsito multi-tienda) pasa de
+--              reconstruir los deltas con LAG sobre inventario_historico a
+--              una suma por rango de índice.
+-- Date: 2026-10-17
+-- Author: System
+-- =========================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS inventario_incrementos (
+    ubicacion_id VARCHAR(50) NOT NULL,
+    producto_id VARCHAR(50) NOT NULL,
+    fecha_snapshot TIMESTAMP NOT NULL,
+    fecha_snapshot_anterior TIMESTAMP NOT NULL,
+    cantidad_anterior NUMERIC(15,3) NOT NULL,
+    cantidad NUMERIC(15,3) NOT NULL,
+    incremento NUMERIC(15,3) NOT NULL,
+    PRIMARY KEY (ubicacion_id, producto_id, fecha_snapshot)
+);
+
+-- Llegadas desde una fecha: el incremento cuenta si el snapshot anterior ya
+-- era posterior a esa fecha (mismo criterio que el LAG dentro de la ventana)
+CREATE INDEX IF NOT EXISTS idx_inventario_incrementos_desde
+    ON inventario_incrementos (ubicacion_id, producto_id, fecha_snapshot_anterior)
+    INCLUDE (incremento, fecha_snapshot);
+
+COMMENT ON TABLE inventario_incrementos IS
+    'Incrementos positivos entre snapshots consecutivos de inventario_historico (por ubicación/producto), mantenidos por el ETL de inventario';
+COMMENT ON COLUMN inventario_incrementos.fecha_snapshot_anterior IS
+    'Snapshot contra el que se midió el incremento';
+
+-- Backfill de los últimos 60 días (los pedidos que se verifican o están en
+-- tránsito son recientes); el primer snapshot de la ventana no tiene
+-- anterior y no genera incremento
+INSERT INTO inventario_incrementos (
+    ubicacion_id, producto_id, fecha_snapshot, fecha_snapshot_anterior,
+    cantidad_anterior, cantidad, incremento
+)
+SELECT ubicacion_id, producto_id, fecha_snapshot, fecha_anterior,
+       cantidad_anterior, cantidad, cantidad - cantidad_anterior
+FROM (
+    SELECT
+        ubicacion_id,
+        producto_id,
+        fecha_snapshot,
+        SUM(cantidad) AS cantidad,
+        LAG(fecha_snapshot) OVER w AS fecha_anterior,
+        LAG(SUM(cantidad)) OVER w AS cantidad_anterior
+    FROM inventario_historico
+    WHERE fecha_snapshot >= CURRENT_DATE - INTERVAL '60 days'
+    GROUP BY ubicacion_id, producto_id, fecha_snapshot
+    WINDOW w AS (PARTITION BY ubicacion_id, producto_id ORDER BY fecha_snapshot)
+) s
+WHERE cantidad_anterior IS NOT NULL
+  AND cantidad > cantidad_anterior
+ON CONFLICT (ubicacion_id, producto_id, fecha_snapshot) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Recálculo ABC incremental (agregados rodantes por tienda)
+
+Las funciones SQL recalcular_abc_cache() y recalcular_abc_por_tienda()
+agrupan toda la tabla ventas de la ventana (30 días) en cada corrida. Este
+módulo mantiene en cambio:
+
+- abc_ventas_dia / abc_tickets_dia: métricas ABC por (tienda, día,
+  producto) y tickets por (tienda, día), sin el producto excluido
+- abc_acumulado_tienda: suma de la ventana por (tienda, producto)
+
+En cada corrida se recalculan desde ventas solo los días (tienda, fecha)
+que cambiaron desde la corrida anterior (ventas_diarias.updated_at, que los
+loaders actualizan por día tocado, o días guardados que ya no tienen fila
+en ventas_diarias) y los días nuevos; su valor anterior se
+resta del acumulado y el nuevo se suma. Los días que salen de la ventana se
+restan y se borran. Después se re-rankean solo las tiendas afectadas y el
+ABC global (desde el acumulado agrupado por producto, unas decenas de miles
+de filas), con la misma clasificación de 4 modelos que la migración 036.
+
+Diferencia con el cálculo completo: tickets_30d global es la suma de los
+tickets por tienda (igual mientras los números de factura no se repitan
+entre tiendas).
+
+Configuración (env):
+    ABC_INCREMENTAL_MARGEN_MINUTOS: margen hacia atrás sobre la marca de la
+        corrida anterior al buscar días recargados (default 15)
+"""
+
+import json
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+ABC_INCREMENTAL_MARGEN_MINUTOS = int(os.getenv('ABC_INCREMENTAL_MARGEN_MINUTOS', '15'))
+
+# Ticket = numero_factura sin el sufijo de línea (igual que la migración 036)
+_TICKET = "regexp_replace(v.numero_factura, '_L[0-9]+$', '')"
+
+# Clase de cada modelo + clase activa (misma lógica que la migración 036)
+_CLASES = """
+    CASE
+        WHEN r.rank_cantidad <= %(umbral_a)s THEN 'A'
+        WHEN r.rank_cantidad <= %(umbral_b)s THEN 'B'
+        WHEN r.rank_cantidad <= %(umbral_c)s THEN 'C'
+        ELSE 'D'
+    END as clase_ranking_vol,
+    CASE
+        WHEN r.rank_valor <= %(umbral_a)s THEN 'A'
+        WHEN r.rank_valor <= %(umbral_b)s THEN 'B'
+        WHEN r.rank_valor <= %(umbral_c)s THEN 'C'
+        ELSE 'D'
+    END as clase_ranking_val,
+    CASE
+        WHEN r.cantidad_acum <= r.cantidad_total * (%(pareto_a_pct)s / 100.0) THEN 'A'
+        WHEN r.cantidad_acum <= r.cantidad_total * (%(pareto_b_pct)s / 100.0) THEN 'B'
+        WHEN r.cantidad_30d > 0 THEN 'C'
+        ELSE 'D'
+    END as clase_pareto_vol,
+    CASE
+        WHEN r.venta_acum <= r.venta_total * (%(pareto_a_pct)s / 100.0) THEN 'A'
+        WHEN r.venta_acum <= r.venta_total * (%(pareto_b_pct)s / 100.0) THEN 'B'
+        WHEN r.venta_30d > 0 THEN 'C'
+        ELSE 'D'
+    END as clase_pareto_val
+"""
+
+_CLASE_ACTIVA = """
+    CASE %(modelo_activo)s
+        WHEN 'ranking_volumen' THEN c.clase_ranking_vol
+        WHEN 'ranking_valor'   THEN c.clase_ranking_val
+        WHEN 'pareto_volumen'  THEN c.clase_pareto_vol
+        WHEN 'pareto_valor'    THEN c.clase_pareto_val
+        ELSE c.clase_ranking_vol
+    END
+"""
+
+RERANK_TIENDAS_SQL = f"""
+    WITH rankings AS (
+        SELECT
+            a.producto_id,
+            a.ubicacion_id,
+            a.cantidad as cantidad_30d,
+            a.venta as venta_30d,
+            a.tickets as tickets_30d,
+            ROW_NUMBER() OVER (PARTITION BY a.ubicacion_id ORDER BY a.cantidad DESC) as rank_cantidad,
+            ROW_NUMBER() OVER (PARTITION BY a.ubicacion_id ORDER BY a.venta DESC) as rank_valor,
+            SUM(a.venta) OVER (PARTITION BY a.ubicacion_id ORDER BY a.venta DESC) as venta_acum,
+            SUM(a.venta) OVER (PARTITION BY a.ubicacion_id) as venta_total,
+            SUM(a.cantidad) OVER (PARTITION BY a.ubicacion_id ORDER BY a.cantidad DESC) as cantidad_acum,
+            SUM(a.cantidad) OVER (PARTITION BY a.ubicacion_id) as cantidad_total
+        FROM abc_acumulado_tienda a
+        WHERE %(todas)s OR a.ubicacion_id = ANY(%(ubicaciones)s)
+    ),
+    clasificado AS (
+        SELECT
+            r.*,
+            ROUND(r.venta_30d / NULLIF(r.venta_total, 0) * 100, 4) as porcentaje_venta,
+            ROUND(r.venta_acum / NULLIF(r.venta_total, 0) * 100, 4) as porcentaje_acumulado,
+            {_CLASES}
+        FROM rankings r
+    )
+    INSERT INTO productos_abc_tienda (
+        producto_id, ubicacion_id,
+        cantidad_30d, venta_30d, tickets_30d,
+        venta_acumulada, venta_total_tienda,
+        porcentaje_venta, porcentaje_acumulado,
+        rank_cantidad, rank_valor,
+        clase_ranking_vol, clase_ranking_val,
+        clase_pareto_vol, clase_pareto_val,
+        clase_abc,
+        fecha_calculo, periodo_inicio, periodo_fin
+    )
+    SELECT
+        c.producto_id, c.ubicacion_id,
+        c.cantidad_30d, c.venta_30d, c.tickets_30d,
+        c.venta_acum, c.venta_total,
+        c.porcentaje_venta, c.porcentaje_acumulado,
+        c.rank_cantidad, c.rank_valor,
+        c.clase_ranking_vol, c.clase_ranking_val,
+        c.clase_pareto_vol, c.clase_pareto_val,
+        {_CLASE_ACTIVA},
+        CURRENT_TIMESTAMP,
+        %(inicio)s,
+        %(fin)s
+    FROM clasificado c
+"""
+
+RERANK_GLOBAL_SQL = f"""
+    WITH metricas AS (
+        SELECT
+            producto_id,
+            SUM(cantidad) as cantidad_30d,
+            SUM(venta) as venta_30d,
+            SUM(tickets) as tickets_30d
+        FROM abc_acumulado_tienda
+        GROUP BY producto_id
+    ),
+    total_tickets AS (
+        SELECT COALESCE(SUM(tickets), 0) as total
+        FROM abc_tickets_dia
+        WHERE fecha >= %(inicio)s AND fecha <= %(fin)s
+    ),
+    rankings AS (
+        SELECT
+            m.*,
+            t.total as total_tickets,
+            ROW_NUMBER() OVER (ORDER BY m.cantidad_30d DESC) as rank_cantidad,
+            ROW_NUMBER() OVER (ORDER BY m.venta_30d DESC) as rank_valor,
+            ROW_NUMBER() OVER (ORDER BY m.tickets_30d DESC) as rank_penetracion,
+            SUM(m.cantidad_30d) OVER (ORDER BY m.cantidad_30d DESC) as cantidad_acum,
+            SUM(m.cantidad_30d) OVER () as cantidad_total,
+            SUM(m.venta_30d) OVER (ORDER BY m.venta_30d DESC) as venta_acum,
+            SUM(m.venta_30d) OVER () as venta_total
+        FROM metricas m
+        CROSS JOIN total_tickets t
+    ),
+    clasificado AS (
+        SELECT
+            r.*,
+            ROUND(r.tickets_30d::numeric / NULLIF(r.total_tickets, 0) * 100, 4) as penetracion_pct,
+            ROUND(r.venta_30d / NULLIF(r.venta_total, 0) * 100, 4) as porcentaje_venta,
+            ROUND(r.venta_acum / NULLIF(r.venta_total, 0) * 100, 4) as porcentaje_acumulado,
+            r.rank_cantidad - r.rank_penetracion as gap,
+            {_CLASES}
+        FROM rankings r
+    )
+    INSERT INTO productos_abc_cache (
+        producto_id, cantidad_30d, venta_30d, tickets_30d,
+        total_tickets_periodo, penetracion_pct,
+        venta_acumulada, venta_total_periodo,
+        porcentaje_venta, porcentaje_acumulado,
+        rank_cantidad, rank_valor, rank_penetracion, gap,
+        clase_ranking_vol, clase_ranking_val,
+        clase_pareto_vol, clase_pareto_val,
+        clase_abc,
+        fecha_calculo, periodo_inicio, periodo_fin, dias_periodo
+    )
+    SELECT
+        c.producto_id, c.cantidad_30d, c.venta_30d, c.tickets_30d,
+        c.total_tickets, c.penetracion_pct,
+        c.venta_acum, c.venta_total,
+        c.porcentaje_venta, c.porcentaje_acumulado,
+        c.rank_cantidad, c.rank_valor, c.rank_penetracion, c.gap,
+        c.clase_ranking_vol, c.clase_ranking_val,
+        c.clase_pareto_vol, c.clase_pareto_val,
+        {_CLASE_ACTIVA},
+        CURRENT_TIMESTAMP,
+        %(inicio)s,
+        %(fin)s,
+        %(dias)s
+    FROM clasificado c
+"""
+
+
+def _unnest_dias(dias: List[Tuple[str, date]]) -> Tuple[List[str], List[date]]:
+    return [d[0] for d in dias], [d[1] for d in dias]
+
+
+def _leer_control(cursor) -> Optional[Dict]:
+    cursor.execute("""
+        SELECT dias, producto_excluido, ventana_inicio, ventana_fin, marca, parametros
+        FROM abc_acumulado_control
+        WHERE id = 1
+    """)
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return dict(zip(('dias', 'producto_excluido', 'ventana_inicio', 'ventana_fin', 'marca', 'parametros'), row))
+
+
+def reconstruir_acumulado(cursor, inicio: date, fin: date, producto_excluido: str) -> None:
+    """
+    Reconstruye los agregados de la ventana [inicio, fin] desde ventas (un
+    recorrido completo, como el cálculo no incremental). No hace commit.
+    """
+    cursor.execute("TRUNCATE TABLE abc_ventas_dia, abc_tickets_dia, abc_acumulado_tienda")
+    params = {'inicio': inicio, 'hasta': fin + timedelta(days=1), 'excluido': producto_excluido}
+    cursor.execute(f"""
+        INSERT INTO abc_ventas_dia (ubicacion_id, fecha, producto_id, cantidad, venta, tickets)
+        SELECT
+            v.ubicacion_id,
+            v.fecha_venta::date,
+            v.producto_id,
+            COALESCE(SUM(v.cantidad_vendida), 0),
+            COALESCE(SUM(v.venta_total), 0),
+            COUNT(DISTINCT {_TICKET})
+        FROM ventas v
+        WHERE v.fecha_venta >= %(inicio)s
+          AND v.fecha_venta < %(hasta)s
+          AND v.producto_id != %(excluido)s
+        GROUP BY v.ubicacion_id, v.fecha_venta::date, v.producto_id
+    """, params)
+    cursor.execute(f"""
+        INSERT INTO abc_tickets_dia (ubicacion_id, fecha, tickets)
+        SELECT v.ubicacion_id, v.fecha_venta::date, COUNT(DISTINCT {_TICKET})
+        FROM ventas v
+        WHERE v.fecha_venta >= %(inicio)s
+          AND v.fecha_venta < %(hasta)s
+          AND v.producto_id != %(excluido)s
+        GROUP BY v.ubicacion_id, v.fecha_venta::date
+    """, params)
+    cursor.execute("""
+        INSERT INTO abc_acumulado_tienda (ubicacion_id, producto_id, cantidad, venta, tickets)
+        SELECT ubicacion_id, producto_id, SUM(cantidad), SUM(venta), SUM(tickets)
+        FROM abc_ventas_dia
+        GROUP BY ubicacion_id, producto_id
+    """)
+
+
+def dias_a_recalcular(cursor, control: Dict, inicio: date, fin: date) -> List[Tuple[str, date]]:
+    """
+    Días (tienda, fecha) de la ventana que cambiaron desde la corrida
+    anterior (ventas_diarias recalculada después de la marca, con margen),
+    que son nuevos (desde el último fin de ventana) o que quedaron sin
+    ventas (guardados en abc_tickets_dia pero ya sin filas en
+    ventas_diarias: un día recargado a cero no deja fila con updated_at).
+    """
+    desde = control['marca'] - timedelta(minutes=ABC_INCREMENTAL_MARGEN_MINUTOS)
+    cursor.execute("""
+        SELECT ubicacion_id, fecha
+        FROM ventas_diarias
+        WHERE fecha >= %(inicio)s
+          AND fecha <= %(fin)s
+          AND (updated_at >= %(desde)s OR fecha >= %(ventana_fin)s)
+        UNION
+        SELECT t.ubicacion_id, t.fecha
+        FROM abc_tickets_dia t
+        WHERE t.fecha >= %(inicio)s
+          AND t.fecha <= %(fin)s
+          AND NOT EXISTS (
+              SELECT 1 FROM ventas_diarias vd
+              WHERE vd.ubicacion_id = t.ubicacion_id AND vd.fecha = t.fecha
+          )
+        ORDER BY 1, 2
+    """, {'inicio': inicio, 'fin': fin, 'desde': desde, 'ventana_fin': control['ventana_fin']})
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def dias_vencidos(cursor, inicio: date) -> List[Tuple[str, date]]:
+    """Días (tienda, fecha) guardados que ya salieron de la ventana."""
+    cursor.execute("""
+        SELECT ubicacion_id, fecha FROM abc_tickets_dia WHERE fecha < %s
+        UNION
+        SELECT DISTINCT ubicacion_id, fecha FROM abc_ventas_dia WHERE fecha < %s
+        ORDER BY 1, 2
+    """, (inicio, inicio))
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def restar_dias(cursor, dias: List[Tuple[str, date]]) -> None:
+    """Resta del acumulado lo guardado para `dias` y borra esos días. No hace commit."""
+    if not dias:
+        return
+    ubicaciones, fechas = _unnest_dias(dias)
+    cursor.execute("""
+        UPDATE abc_acumulado_tienda a
+        SET cantidad = a.cantidad - d.cantidad,
+            venta = a.venta - d.venta,
+            tickets = a.tickets - d.tickets
+        FROM (
+            SELECT v.ubicacion_id, v.producto_id,
+                   SUM(v.cantidad) AS cantidad, SUM(v.venta) AS venta, SUM(v.tickets) AS tickets
+            FROM abc_ventas_dia v
+            JOIN unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+              ON v.ubicacion_id = d.ubicacion_id AND v.fecha = d.fecha
+            GROUP BY v.ubicacion_id, v.producto_id
+        ) d
+        WHERE a.ubicacion_id = d.ubicacion_id
+          AND a.producto_id = d.producto_id
+    """, (ubicaciones, fechas))
+    cursor.execute("""
+        DELETE FROM abc_ventas_dia v
+        USING unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        WHERE v.ubicacion_id = d.ubicacion_id AND v.fecha = d.fecha
+    """, (ubicaciones, fechas))
+    cursor.execute("""
+        DELETE FROM abc_tickets_dia t
+        USING unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        WHERE t.ubicacion_id = d.ubicacion_id AND t.fecha = d.fecha
+    """, (ubicaciones, fechas))
+
+
+def sumar_dias(cursor, dias: List[Tuple[str, date]], producto_excluido: str) -> None:
+    """
+    Calcula desde ventas las métricas de `dias` (ya restados) y las suma
+    al acumulado. No hace commit.
+    """
+    if not dias:
+        return
+    ubicaciones, fechas = _unnest_dias(dias)
+    cursor.execute(f"""
+        INSERT INTO abc_ventas_dia (ubicacion_id, fecha, producto_id, cantidad, venta, tickets)
+        SELECT
+            v.ubicacion_id,
+            d.fecha,
+            v.producto_id,
+            COALESCE(SUM(v.cantidad_vendida), 0),
+            COALESCE(SUM(v.venta_total), 0),
+            COUNT(DISTINCT {_TICKET})
+        FROM unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        JOIN ventas v
+          ON v.ubicacion_id = d.ubicacion_id
+         AND v.fecha_venta >= d.fecha
+         AND v.fecha_venta < d.fecha + 1
+        WHERE v.producto_id != %s
+        GROUP BY v.ubicacion_id, d.fecha, v.producto_id
+    """, (ubicaciones, fechas, producto_excluido))
+    cursor.execute(f"""
+        INSERT INTO abc_tickets_dia (ubicacion_id, fecha, tickets)
+        SELECT v.ubicacion_id, d.fecha, COUNT(DISTINCT {_TICKET})
+        FROM unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        JOIN ventas v
+          ON v.ubicacion_id = d.ubicacion_id
+         AND v.fecha_venta >= d.fecha
+         AND v.fecha_venta < d.fecha + 1
+        WHERE v.producto_id != %s
+        GROUP BY v.ubicacion_id, d.fecha
+    """, (ubicaciones, fechas, producto_excluido))
+    cursor.execute("""
+        INSERT INTO abc_acumulado_tienda (ubicacion_id, producto_id, cantidad, venta, tickets)
+        SELECT v.ubicacion_id, v.producto_id, SUM(v.cantidad), SUM(v.venta), SUM(v.tickets)
+        FROM abc_ventas_dia v
+        JOIN unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+          ON v.ubicacion_id = d.ubicacion_id AND v.fecha = d.fecha
+        GROUP BY v.ubicacion_id, v.producto_id
+        ON CONFLICT (ubicacion_id, producto_id) DO UPDATE SET
+            cantidad = abc_acumulado_tienda.cantidad + EXCLUDED.cantidad,
+            venta = abc_acumulado_tienda.venta + EXCLUDED.venta,
+            tickets = abc_acumulado_tienda.tickets + EXCLUDED.tickets
+    """, (ubicaciones, fechas))
+
+
+def rerankear(cursor, ubicaciones: Optional[List[str]], params: Dict) -> Dict[str, int]:
+    """
+    Reescribe productos_abc_tienda de `ubicaciones` (None = todas) y
+    productos_abc_cache completo desde el acumulado. Usa DELETE (no TRUNCATE) para que las
+    lecturas concurrentes sigan viendo la clasificación anterior hasta el
+    commit. No hace commit.
+
+    Returns:
+        Productos por tienda reescritos, productos globales y conteo por clase
+    """
+    todas = ubicaciones is None
+    params = dict(params, todas=todas, ubicaciones=ubicaciones or [])
+
+    if todas:
+        cursor.execute("DELETE FROM productos_abc_tienda")
+    else:
+        cursor.execute("DELETE FROM productos_abc_tienda WHERE ubicacion_id = ANY(%s)", (ubicaciones,))
+    cursor.execute(RERANK_TIENDAS_SQL, params)
+    productos_por_tienda = cursor.rowcount
+
+    cursor.execute("DELETE FROM productos_abc_cache")
+    cursor.execute(RERANK_GLOBAL_SQL, params)
+    productos_globales = cursor.rowcount
+
+    cursor.execute("SELECT clase_abc, COUNT(*) FROM productos_abc_cache GROUP BY clase_abc")
+    por_clase = {row[0]: row[1] for row in cursor.fetchall()}
+
+    return {
+        'productos_por_tienda': productos_por_tienda,
+        'productos_procesados': productos_globales,
+        'productos_a': por_clase.get('A', 0),
+        'productos_b': por_clase.get('B', 0),
+        'productos_c': por_clase.get('C', 0),
+        'productos_d': por_clase.get('D', 0),
+    }
+
+
+def recalcular_abc_incremental(
+    cursor,
+    dias: int,
+    producto_excluido: str,
+    umbral_a: int,
+    umbral_b: int,
+    umbral_c: int,
+    pareto_a_pct: float,
+    pareto_b_pct: float,
+    modelo_activo: str,
+    reconstruir: bool = False,
+    hoy: date = None
+) -> Dict:
+    """
+    Actualiza los agregados rodantes y re-rankea lo afectado. No hace commit.
+
+    La ventana es [hoy - dias, hoy], igual que recalcular_abc_cache().
+    Reconstruye desde ventas si no hay corrida previa, si cambiaron `dias`
+    o el producto excluido, o si se pide con `reconstruir`. Si solo
+    cambiaron los umbrales o el modelo activo, re-rankea todas las tiendas
+    sin reconstruir.
+
+    Args:
+        cursor: cursor de tuplas (no RealDictCursor)
+
+    Returns:
+        Dict con modo ('incremental' | 'completo'), días recalculados y
+        vencidos, tiendas re-rankeadas y los conteos del ABC global
+    """
+    hoy = hoy or date.today()
+    inicio = hoy - timedelta(days=dias)
+    clasificacion = {
+        'umbral_a': umbral_a, 'umbral_b': umbral_b, 'umbral_c': umbral_c,
+        'pareto_a_pct': float(pareto_a_pct), 'pareto_b_pct': float(pareto_b_pct),
+        'modelo_activo': modelo_activo,
+    }
+
+    # Una corrida a la vez (hasta el commit del llamador): cargas KLK y
+    # Stellar solapadas restarían dos veces los mismos días o chocarían en
+    # las PK de los agregados
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('abc_incremental'))")
+    control = _leer_control(cursor)
+    completo = (
+        reconstruir
+        or control is None
+        or control['dias'] != dias
+        or control['producto_excluido'] != producto_excluido
+        or control['ventana_fin'] < inicio
+    )
+
+    if completo:
+        reconstruir_acumulado(cursor, inicio, hoy, producto_excluido)
+        recalculados, vencidos = [], []
+    else:
+        recalculados = dias_a_recalcular(cursor, control, inicio, hoy)
+        vencidos = dias_vencidos(cursor, inicio)
+        restar_dias(cursor, vencidos + recalculados)
+        sumar_dias(cursor, recalculados, producto_excluido)
+        tiendas = sorted({d[0] for d in recalculados + vencidos})
+        if tiendas:
+            # Productos que se quedaron sin ventas en la ventana
+            cursor.execute("""
+                DELETE FROM abc_acumulado_tienda
+                WHERE ubicacion_id = ANY(%s) AND tickets <= 0
+            """, (tiendas,))
+
+    # Umbrales o modelo distintos: la clasificación de todas las tiendas cambia
+    rerank_todas = completo or control['parametros'] != clasificacion
+    if rerank_todas:
+        cursor.execute("SELECT COUNT(DISTINCT ubicacion_id) FROM abc_acumulado_tienda")
+        tiendas_procesadas = cursor.fetchone()[0]
+    else:
+        tiendas_procesadas = len(tiendas)
+
+    resultado = {
+        'modo': 'completo' if completo else 'incremental',
+        'dias_recalculados': len(recalculados),
+        'dias_vencidos': len(vencidos),
+        'tiendas_procesadas': tiendas_procesadas,
+        'productos_por_tienda': 0,
+        'productos_procesados': 0,
+        'productos_a': 0, 'productos_b': 0, 'productos_c': 0, 'productos_d': 0,
+    }
+    if rerank_todas or tiendas or control['ventana_inicio'] != inicio:
+        resultado.update(rerankear(
+            cursor, None if rerank_todas else tiendas,
+            dict(clasificacion, dias=dias, inicio=inicio, fin=hoy)
+        ))
+
+    cursor.execute("""
+        INSERT INTO abc_acumulado_control
+            (id, dias, producto_excluido, ventana_inicio, ventana_fin, marca, parametros, updated_at)
+        VALUES (1, %s, %s, %s, %s, NOW(), %s::jsonb, CURRENT_TIMESTAMP)
+        ON CONFLICT (id) DO UPDATE SET
+            dias = EXCLUDED.dias,
+            producto_excluido = EXCLUDED.producto_excluido,
+            ventana_inicio = EXCLUDED.ventana_inicio,
+            ventana_fin = EXCLUDED.ventana_fin,
+            marca = EXCLUDED.marca,
+            parametros = EXCLUDED.parametros,
+            updated_at = EXCLUDED.updated_at
+    """, (dias, producto_excluido, inicio, hoy, json.dumps(clasificacion)))
+
+    cursor.execute("""
+        INSERT INTO abc_cache_control
+            (nombre_proceso, fecha_inicio, fecha_fin, estado, productos_procesados, parametros)
+        VALUES ('recalcular_abc_incremental', NOW(), clock_timestamp(), 'completado', %s, %s::jsonb)
+    """, (resultado['productos_procesados'], json.dumps({
+        'dias': dias, 'producto_excluido': producto_excluido, 'modelo_activo': modelo_activo,
+        'modo': resultado['modo'], 'dias_recalculados': resultado['dias_recalculados'],
+        'dias_vencidos': resultado['dias_vencidos'],
+        'tiendas': 'todas' if rerank_todas else tiendas,
+    })))
+
+    return resultado
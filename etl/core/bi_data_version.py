@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Versión de datos de BI (bi_data_version)
+
+El backend cachea las respuestas de los routers de BI usando esta versión
+como parte de la clave. El ETL la incrementa al terminar una ejecución que
+cargó registros, dentro de la misma transacción que cierra la ejecución en
+etl_executions; el backend la relee cada BI_DATA_VERSION_CHECK_SECONDS.
+"""
+
+
+def incrementar_version_bi(cursor, origen: str) -> int:
+    """
+    Incrementa la versión de datos de BI (crea la fila si no existe).
+    No hace commit.
+
+    Returns:
+        Versión nueva
+    """
+    cursor.execute("""
+        INSERT INTO bi_data_version (id, version, origen, updated_at)
+        VALUES (1, 1, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (id) DO UPDATE SET
+            version = bi_data_version.version + 1,
+            origen = EXCLUDED.origen,
+            updated_at = EXCLUDED.updated_at
+        RETURNING version
+    """, (origen[:100],))
+    return cursor.fetchone()[0]
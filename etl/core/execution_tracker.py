@@ -22,6 +22,7 @@ Uso básico:
 """
 
 import socket
+import threading
 import time
 from datetime import datetime
 from typing import Optional, Dict, List, Any
@@ -33,10 +34,12 @@ import traceback
 
 try:
     from core.config import DatabaseConfig
+    from core.bi_data_version import incrementar_version_bi
     import psycopg2
     from psycopg2.extras import Json
 except ImportError:
     from config import DatabaseConfig
+    from bi_data_version import incrementar_version_bi
     import psycopg2
     from psycopg2.extras import Json
 
@@ -130,6 +133,14 @@ class TiendaResult:
     records_loaded: int = 0
     duplicates_skipped: int = 0
 
+    # Tiempos por etapa (ETLs con extracción y carga en etapas separadas)
+    extract_seconds: float = 0
+
+    # Throughput de la escritura en BD (lo reporta el loader)
+    load_mode: Optional[str] = None
+    load_seconds: float = 0
+    load_rows_per_second: Optional[float] = None
+
     error_phase: Optional[ETLPhase] = None
     error_category: Optional[ErrorCategory] = None
     error_message: Optional[str] = None
@@ -164,6 +175,10 @@ class ETLExecution:
     duplicates_skipped: int = 0
     gaps_recovered: int = 0
 
+    # Throughput agregado de carga (filas escritas / segundos de escritura)
+    load_rows_timed: int = 0
+    load_seconds_timed: float = 0
+
     # Métricas por fase
     extract_metrics: Optional[PhaseMetrics] = None
     transform_metrics: Optional[PhaseMetrics] = None
@@ -237,6 +252,7 @@ class ExecutionTracker:
         self.logger = logging.getLogger('execution_tracker')
         self._current_execution: Optional[ETLExecution] = None
         self._current_tienda: Optional[TiendaResult] = None
+        self._lock = threading.Lock()
 
     def _get_connection(self):
         """Obtiene conexión a PostgreSQL"""
@@ -393,6 +409,57 @@ class ExecutionTracker:
 
         self._current_tienda = None
 
+    def record_tienda_result(self, result: TiendaResult):
+        """
+        Agrega a la ejecución actual un TiendaResult ya finalizado.
+
+        Para ETLs que procesan tiendas en paralelo: cada hilo arma su propio
+        TiendaResult en lugar de usar start_tienda/finish_tienda_* (que
+        comparten _current_tienda). Thread-safe.
+        """
+        if not self._current_execution:
+            return
+
+        with self._lock:
+            ex = self._current_execution
+            ex.tiendas_results.append(result)
+            ex.records_extracted += result.records_extracted
+            ex.records_loaded += result.records_loaded
+            ex.duplicates_skipped += result.duplicates_skipped
+            if result.load_seconds > 0:
+                ex.load_rows_timed += result.records_loaded
+                ex.load_seconds_timed += result.load_seconds
+
+    def record_load_throughput(self, records: int, seconds: float, mode: Optional[str] = None):
+        """
+        Registra el throughput de la escritura en BD de la tienda actual.
+
+        Args:
+            records: Registros escritos
+            seconds: Segundos de escritura (sin extracción ni transformación)
+            mode: Modo de carga del loader ('upsert', 'copy')
+        """
+        if not self._current_tienda:
+            self.logger.warning("record_load_throughput called without active tienda")
+            return
+
+        t = self._current_tienda
+        t.load_mode = mode
+        t.load_seconds = seconds
+        t.load_rows_per_second = round(records / seconds, 1) if seconds > 0 else None
+
+        if self._current_execution:
+            self._current_execution.load_rows_timed += records
+            self._current_execution.load_seconds_timed += seconds
+
+    @property
+    def load_rows_per_second(self) -> Optional[float]:
+        """Throughput de carga agregado de la ejecución actual"""
+        ex = self._current_execution
+        if not ex or ex.load_seconds_timed <= 0:
+            return None
+        return round(ex.load_rows_timed / ex.load_seconds_timed, 1)
+
     def finish_tienda_error(
         self,
         phase: ETLPhase,
@@ -604,6 +671,32 @@ class ExecutionTracker:
                     t.server_ip, t.server_port, t.connection_latency_ms
                 ))
 
+            # Throughput de carga (columna de la migración 037; si no existe
+            # todavía, no se pierde el resto del registro)
+            load_rows_per_second = self.load_rows_per_second
+            if load_rows_per_second is not None:
+                cursor.execute("SAVEPOINT load_throughput")
+                try:
+                    cursor.execute(
+                        "UPDATE etl_executions SET load_rows_per_second = %s WHERE id = %s",
+                        (load_rows_per_second, ex.id)
+                    )
+                    cursor.execute("RELEASE SAVEPOINT load_throughput")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT load_throughput")
+                    self.logger.warning(f"Could not persist load_rows_per_second: {e}")
+
+            # Nueva versión de datos para el cache de BI (migración 043)
+            if ex.records_loaded:
+                cursor.execute("SAVEPOINT bi_data_version")
+                try:
+                    version = incrementar_version_bi(cursor, f"etl_{ex.etl_name}:{ex.id}")
+                    cursor.execute("RELEASE SAVEPOINT bi_data_version")
+                    self.logger.info(f"BI data version -> {version}")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT bi_data_version")
+                    self.logger.warning(f"Could not bump bi_data_version: {e}")
+
             conn.commit()
             cursor.close()
             conn.close()
@@ -613,6 +706,7 @@ class ExecutionTracker:
                 f"duration={ex.duration_seconds:.1f}s, "
                 f"records={ex.records_loaded:,}, "
                 f"tiendas={len(ex.tiendas_results)}"
+                + (f", load={load_rows_per_second:,.0f} rows/s" if load_rows_per_second else "")
             )
 
         except Exception as e:
@@ -634,6 +728,9 @@ class ExecutionTracker:
             'records_extracted': t.records_extracted,
             'records_loaded': t.records_loaded,
             'duplicates_skipped': t.duplicates_skipped,
+            'extract_seconds': t.extract_seconds,
+            'load_mode': t.load_mode,
+            'load_rows_per_second': t.load_rows_per_second,
             'error_phase': t.error_phase.value if t.error_phase else None,
             'error_category': t.error_category.value if t.error_category else None,
             'error_message': t.error_message
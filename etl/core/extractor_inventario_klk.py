@@ -16,6 +16,7 @@ from datetime import datetime
 from dataclasses import dataclass
 import logging
 from pathlib import Path
+import threading
 import time
 
 # Import relativo dentro de core/
@@ -34,6 +35,44 @@ class KLKAPIConfig:
     retry_delay_seconds: int = 5
     # Mapeo de ubicacion_id a CodigoAlmacen de KLK
     codigo_almacen_map: Dict[str, str] = None
+    # Requests por segundo al API, compartido por todos los extractores del proceso (0 = sin límite)
+    max_requests_per_second: float = 0
+
+
+class RateLimiter:
+    """
+    Espacia el inicio de requests a como máximo `rps` por segundo.
+    Thread-safe: lo comparten los workers que extraen tiendas en paralelo.
+    """
+
+    def __init__(self, rps: float):
+        self.intervalo = 1.0 / rps if rps > 0 else 0.0
+        self._lock = threading.Lock()
+        self._proximo = 0.0
+
+    def acquire(self):
+        """Bloquea hasta que se pueda iniciar el siguiente request."""
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            espera = self._proximo - ahora
+            self._proximo = max(ahora, self._proximo) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: str, rps: float) -> RateLimiter:
+    """RateLimiter único por URL base del API (todas las instancias lo comparten)."""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(base_url)
+        if limiter is None:
+            limiter = _rate_limiters[base_url] = RateLimiter(rps)
+        return limiter
 
 
 # Mapeo de tiendas a códigos de almacén de KLK
@@ -62,10 +101,12 @@ class InventarioKLKExtractor:
                 timeout_seconds=int(os.getenv("KLK_API_TIMEOUT", "60")),
                 max_retries=int(os.getenv("KLK_API_MAX_RETRIES", "3")),
                 retry_delay_seconds=int(os.getenv("KLK_API_RETRY_DELAY", "5")),
-                codigo_almacen_map=codigo_almacen_map
+                codigo_almacen_map=codigo_almacen_map,
+                max_requests_per_second=float(os.getenv("KLK_API_MAX_RPS", "0"))
             )
 
         self.api_config = api_config
+        self.rate_limiter = get_rate_limiter(api_config.base_url, api_config.max_requests_per_second)
         self.session = requests.Session()
 
         # Headers comunes para todas las requests
@@ -154,6 +195,7 @@ class InventarioKLKExtractor:
                 start_time = time.time()
 
                 # Realizar POST request
+                self.rate_limiter.acquire()
                 response = self.session.post(
                     endpoint,
                     json=payload,
@@ -289,6 +331,7 @@ class InventarioKLKExtractor:
                 self.logger.info(f"   🔄 Intento {intento}/{self.api_config.max_retries}")
                 start_time = time.time()
 
+                self.rate_limiter.acquire()
                 response = self.session.post(
                     endpoint, json=payload, timeout=self.api_config.timeout_seconds
                 )
@@ -7,7 +7,7 @@ Extrae transacciones de ventas desde SQL Server
 import os
 import pyodbc
 import pandas as pd
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, Tuple
 from datetime import datetime, date
 import logging
 from pathlib import Path
@@ -16,6 +16,47 @@ import re
 
 from config import ETLConfig
 
+# Filas por chunk en la extracción keyset (iterar_ventas_chunks)
+STELLAR_VENTAS_CHUNK_SIZE = int(os.getenv('STELLAR_VENTAS_CHUNK_SIZE', '50000'))
+
+# Clave de paginación: orden total de las líneas de venta en el query
+CLAVE_KEYSET = ('fecha', 'numero_factura', 'linea')
+
+
+def _valor_sql(valor):
+    """Escalar numpy/pandas -> tipo Python (pyodbc no acepta numpy.int64 ni Timestamp)"""
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    if hasattr(valor, 'item'):
+        return valor.item()
+    return valor
+
+
+def query_keyset(query_base: str, chunk_size: int, con_clave: bool) -> str:
+    """
+    Envuelve el query de ventas como tabla derivada y pagina por keyset:
+    TOP chunk_size filas con clave mayor a la última leída, ordenadas por
+    (fecha, numero_factura, linea). A diferencia de OFFSET/FETCH, cada
+    chunk arranca en la clave (sin re-escanear las filas ya leídas).
+    """
+    base = re.sub(r'SELECT\s+TOP\s+\d+', 'SELECT', query_base, flags=re.IGNORECASE)
+    base = base.rstrip().rstrip(';')
+    # ORDER BY final no es válido dentro de una tabla derivada
+    base = re.sub(r'\s+ORDER\s+BY\s+[^()]*$', '', base, flags=re.IGNORECASE)
+
+    fecha, factura, linea = (f"q.{c}" for c in CLAVE_KEYSET)
+    where = ""
+    if con_clave:
+        where = (
+            f"WHERE {fecha} > ? OR ({fecha} = ? AND "
+            f"({factura} > ? OR ({factura} = ? AND {linea} > ?)))\n"
+        )
+    return (
+        f"SELECT TOP {int(chunk_size)} q.*\nFROM (\n{base}\n) AS q\n"
+        f"{where}ORDER BY {fecha}, {factura}, {linea}"
+    )
+
+
 class VentasExtractor:
     """Extractor especializado para datos de ventas"""
 
@@ -35,11 +76,18 @@ class VentasExtractor:
 
         return logger
 
-    def _create_connection_string(self, config) -> str:
-        """Crea la cadena de conexión para SQL Server (pyodbc)"""
+    def _create_connection_string(self, config, keepalive: bool = False) -> str:
+        """
+        Crea la cadena de conexión para SQL Server (pyodbc)
+
+        Args:
+            keepalive: Agrega TCP keepalive del driver ODBC (conexiones que
+                se reutilizan entre chunks, con pausas mientras se carga)
+        """
         # SIMPLIFICADO: Usar EXACTAMENTE la misma configuración que inventario (que funciona)
         odbc_driver = os.environ.get('SQL_ODBC_DRIVER', 'ODBC Driver 18 for SQL Server')
 
+        keepalive_params = "KeepAlive=30;KeepAliveInterval=10;" if keepalive else ""
         return (
             f"DRIVER={{{odbc_driver}}};"
             f"SERVER={config.server_ip},{config.port};"
@@ -48,6 +96,7 @@ class VentasExtractor:
             f"PWD={config.password};"
             f"TrustServerCertificate=yes;"
             f"Connection Timeout={config.timeout_seconds};"
+            f"{keepalive_params}"
         )
 
     def _create_sqlalchemy_engine(self, config):
@@ -116,79 +165,113 @@ class VentasExtractor:
 
         return engine
 
-    def _extract_chunk_with_offset(self,
-                                   config,
-                                   query_base: str,
-                                   offset: int,
-                                   fetch_size: int,
-                                   max_retries: int = 2) -> Optional[pd.DataFrame]:
-        """
-        Extrae un chunk de datos usando OFFSET/FETCH, con reconexión en cada chunk
-        para evitar timeouts de conexión TCP
+    def _conectar_keyset(self, config):
+        """Conexión para la extracción por chunks: keepalive y timeout de query por chunk"""
+        connection_string = self._create_connection_string(config, keepalive=True)
+        conn = pyodbc.connect(connection_string, timeout=config.timeout_seconds)
+        conn.autocommit = True
+        conn.timeout = 300
+        return conn
+
+    def iterar_ventas_chunks(self,
+                             config,
+                             fecha_inicio,
+                             fecha_fin,
+                             hora_inicio: str = None,
+                             hora_fin: str = None,
+                             desde_clave: Optional[Tuple] = None,
+                             chunk_size: Optional[int] = None,
+                             max_reintentos: int = 3,
+                             query_file: str = "query_ventas_generic.sql") -> Iterator[Tuple[pd.DataFrame, Tuple]]:
         """
-        conn = None  # Inicializar conn antes del try
+        Extrae ventas en chunks con paginación keyset sobre
+        (fecha, numero_factura, linea), para transformar y cargar cada chunk
+        mientras se extrae el siguiente rango. El costo por chunk no crece
+        con el avance (OFFSET re-escaneaba las filas saltadas).
 
-        for retry in range(max_retries):
-            try:
-                # Nueva conexión para cada chunk (evita timeout de VPN/TCP)
-                connection_string = self._create_connection_string(config)
-                conn = pyodbc.connect(connection_string)
-                conn.timeout = 300
+        Usa una sola conexión (con TCP keepalive) para todo el rango; si se
+        cae, reconecta y sigue desde la última clave leída.
 
-                # Agregar OFFSET/FETCH al final del query
-                # Primero remover TOP si existe (incompatible con OFFSET/FETCH)
-                query_with_pagination = re.sub(r'SELECT\s+TOP\s+\d+', 'SELECT', query_base, flags=re.IGNORECASE)
-
-                # Agregar paginación al final
-                query_with_pagination = query_with_pagination.rstrip().rstrip(';')
-                query_with_pagination += f"\nOFFSET {offset} ROWS FETCH NEXT {fetch_size} ROWS ONLY"
-
-                # Ejecutar query rápido (solo fetch_size registros)
-                df = pd.read_sql_query(query_with_pagination, conn)
-                conn.close()
-
-                return df
+        Args:
+            desde_clave: Clave (fecha, numero_factura, linea) a partir de la
+                cual extraer (exclusiva), p.ej. la marca guardada por el loader
+            chunk_size: Filas por chunk (default: STELLAR_VENTAS_CHUNK_SIZE)
 
-            except Exception as e:
-                if conn:
-                    try:
-                        conn.close()
-                    except:
-                        pass
-
-                if retry < max_retries - 1:
-                    self.logger.warning(f"⚠️ Error en chunk offset={offset}, reintentando... ({str(e)})")
-                    time.sleep(2)
-                else:
-                    raise
+        Yields:
+            (DataFrame del chunk con metadatos de ubicación, clave de su última fila)
+        """
+        query_base = self._preparar_query(query_file, fecha_inicio, fecha_fin, hora_inicio, hora_fin, None)
+        if query_base is None:
+            raise FileNotFoundError(f"Query de ventas no encontrado: {query_file}")
+
+        chunk_size = chunk_size or STELLAR_VENTAS_CHUNK_SIZE
+        clave = tuple(desde_clave) if desde_clave else None
+        conn = None
+        fallos = 0
+        chunk_num = 0
+
+        if clave:
+            self.logger.info(f"   ⏩ {config.ubicacion_nombre}: reanudando después de {clave}")
+
+        try:
+            while True:
+                try:
+                    if conn is None:
+                        conn = self._conectar_keyset(config)
+                    params = None if clave is None else [clave[0], clave[0], clave[1], clave[1], clave[2]]
+                    df = pd.read_sql_query(query_keyset(query_base, chunk_size, clave is not None), conn, params=params)
+                except pyodbc.Error as e:
+                    if conn is not None:
+                        try:
+                            conn.close()
+                        except Exception:
+                            pass
+                        conn = None
+                    fallos += 1
+                    if fallos >= max_reintentos:
+                        raise
+                    self.logger.warning(
+                        f"⚠️ Error en chunk {chunk_num + 1} de {config.ubicacion_nombre}, "
+                        f"reconectando desde {clave} ({e})"
+                    )
+                    time.sleep(5)
+                    continue
 
-        return None
+                fallos = 0
+                if df.empty:
+                    return
 
-    def extract_ventas_data(self,
-                          config,
-                          fecha_inicio,
-                          fecha_fin,
-                          hora_inicio: str = None,
-                          hora_fin: str = None,
-                          limite_registros: int = None,
-                          query_file: str = "query_ventas_generic.sql") -> Optional[pd.DataFrame]:
-        """
-        Extrae datos de ventas para un rango de fechas/horas específico
-        Usa múltiples conexiones cortas (una por chunk) para evitar timeouts TCP
+                faltantes = [c for c in CLAVE_KEYSET if c not in df.columns]
+                if faltantes:
+                    raise ValueError(f"El query de ventas no tiene las columnas de la clave keyset: {faltantes}")
 
-        Args:
-            config: Configuración de la base de datos
-            fecha_inicio: Fecha inicial del rango (date o datetime)
-            fecha_fin: Fecha final del rango (date o datetime)
-            hora_inicio: Hora inicial HH:MM (opcional, default 00:00)
-            hora_fin: Hora final HH:MM (opcional, default 23:59)
-            limite_registros: Límite máximo de registros (None = sin límite, extrae todo)
-            query_file: Archivo con el query SQL
+                nueva_clave = tuple(_valor_sql(df[c].iloc[-1]) for c in CLAVE_KEYSET)
+                if nueva_clave == clave:
+                    # La última fila es la misma clave: el driver no compara la clave exacta
+                    raise RuntimeError(f"La paginación keyset no avanza en {nueva_clave}")
+                clave = nueva_clave
+                chunk_num += 1
 
-        Returns:
-            DataFrame con los datos de ventas o None si falla
-        """
+                df['ubicacion_id'] = config.ubicacion_id
+                df['ubicacion_nombre'] = config.ubicacion_nombre
+                df['fecha_extraccion'] = datetime.now()
 
+                self.logger.info(f"   📦 Chunk {chunk_num}: {len(df):,} registros (hasta {clave[0]})")
+                yield df, clave
+
+                if len(df) < chunk_size:
+                    return
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def _preparar_query(self, query_file: str, fecha_inicio, fecha_fin,
+                        hora_inicio: Optional[str], hora_fin: Optional[str],
+                        limite_registros: Optional[int]) -> Optional[str]:
+        """Carga el template de query y reemplaza rango de fechas/horas y límite (None si no existe)"""
         self.logger.info(f"📄 Cargando query desde: {Path(__file__).parent / query_file}")
 
         # Cargar el query desde archivo
@@ -233,6 +316,39 @@ class VentasExtractor:
 
         self.logger.info(f"📄 Query preparado: {len(query_base)} caracteres")
         self.logger.info(f"📅 Rango: {fecha_inicio_str} {hora_inicio} a {fecha_fin_str} {hora_fin}")
+        return query_base
+
+    def extract_ventas_data(self,
+                          config,
+                          fecha_inicio,
+                          fecha_fin,
+                          hora_inicio: str = None,
+                          hora_fin: str = None,
+                          limite_registros: int = None,
+                          query_file: str = "query_ventas_generic.sql") -> Optional[pd.DataFrame]:
+        """
+        Extrae datos de ventas para un rango de fechas/horas específico
+        en un solo query (para rangos grandes, iterar_ventas_chunks())
+
+        Args:
+            config: Configuración de la base de datos
+            fecha_inicio: Fecha inicial del rango (date o datetime)
+            fecha_fin: Fecha final del rango (date o datetime)
+            hora_inicio: Hora inicial HH:MM (opcional, default 00:00)
+            hora_fin: Hora final HH:MM (opcional, default 23:59)
+            limite_registros: Límite máximo de registros (None = sin límite, extrae todo)
+            query_file: Archivo con el query SQL
+
+        Returns:
+            DataFrame con los datos de ventas o None si falla
+        """
+
+        query_base = self._preparar_query(
+            query_file, fecha_inicio, fecha_fin, hora_inicio, hora_fin, limite_registros
+        )
+        if query_base is None:
+            return None
+
         if limite_registros:
             self.logger.info(f"🔢 Límite total: {limite_registros:,} registros")
         else:
@@ -9,14 +9,21 @@ Fecha: 2025-11-24
 
 import requests
 import pandas as pd
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Tuple
 from datetime import datetime, date, timedelta
 from dataclasses import dataclass
+from itertools import islice
 import logging
 import time
 
 from config import ETLConfig
 
+# Parser JSON incremental (opcional): sin ijson se usa response.json()
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 
 @dataclass
 class KLKVentasAPIConfig:
@@ -25,6 +32,8 @@ class KLKVentasAPIConfig:
     timeout_seconds: int = 600  # 10 minutos (aumentado de 120s para consultas de múltiples días)
     max_retries: int = 3
     retry_delay_seconds: int = 5
+    stream_json: bool = True  # Parsear el body incrementalmente con ijson (si está instalado)
+    stream_chunk_size: int = 5000  # Ventas por bloque al aplanar en modo streaming
 
 
 # Mapeo de tienda_id a código de sucursal KLK
@@ -52,6 +61,69 @@ TIENDA_TO_SUCURSAL = {
 }
 
 
+# Columnas del DataFrame de ventas: (columna, array anidado o None, clave en origen).
+# El orden es el orden de columnas del DataFrame.
+VENTAS_COLUMNAS = [
+    # Identificadores de la transacción
+    ('numero_factura', None, 'numero_factura'),
+    ('linea', None, 'linea'),
+
+    # Fecha y hora
+    ('fecha', None, 'fecha'),
+    ('hora', None, 'hora'),
+    ('fecha_hora_completa', None, 'fecha_hora_completa'),
+
+    # Producto
+    ('codigo_producto', 'producto', 'codigo_producto'),
+    ('descripcion_producto', 'producto', 'descripcion_producto'),
+    ('marca_producto', 'producto', 'marca_producto'),
+    ('modelo_producto', 'producto', 'modelo_producto'),
+    ('categoria_producto', 'producto', 'categoria_producto'),
+    ('grupo_producto', 'producto', 'grupo_articulo'),
+    ('subgrupo_producto', 'producto', 'subgrupo_producto'),
+    ('codigo_barras', 'producto', 'codigo_barras'),
+
+    # Cantidad y almacén
+    ('codigo_almacen', 'cantidad', 'codigo_almacen'),
+    ('nombre_almacen', 'cantidad', 'nombre_almacen'),
+    ('cantidad_vendida', 'cantidad', 'cantidad_vendida'),
+    ('peso_unitario', 'cantidad', 'peso_unitario'),
+    ('unidad_medida_venta', 'cantidad', 'unidad_medida_venta'),
+    ('factor_unidad_medida', 'cantidad', 'factor_unidad_medida'),
+
+    # Financiero en Bs
+    ('costo_unitario_bs', 'financiero', 'costo_unitario_bs'),
+    ('precio_unitario_bs', 'financiero', 'precio_unitario_bs'),
+    ('venta_total_bs', 'financiero', 'venta_total_bs'),
+    ('costo_total_bs', 'financiero', 'costo_total_bs'),
+    ('utilidad_bruta_bs', 'financiero', 'utilidad_bruta_bs'),
+
+    # Financiero en USD
+    ('costo_unitario_usd', 'financiero', 'costo_unitario_usd'),
+    ('precio_unitario_usd', 'financiero', 'precio_unitario_usd'),
+    ('venta_total_usd', 'financiero', 'venta_total_usd'),
+    ('costo_total_usd', 'financiero', 'costo_total_usd'),
+    ('utilidad_bruta_usd', 'financiero', 'utilidad_bruta_usd'),
+
+    # Impuestos y descuentos
+    ('impuesto_porcentaje', 'financiero', 'impuesto_porcentaje'),
+    ('impuesto_monto', 'financiero', 'impuesto_monto'),
+    ('porcentaje_descuento', 'financiero', 'porcentaje_descuento'),
+    ('monto_descuento', 'financiero', 'monto_descuento'),
+
+    # Totales de factura
+    ('total_factura', None, 'total_factura'),
+    ('tasa_usd', None, 'tasa_usd'),
+
+    # Otros
+    ('es_no_fiscal', None, 'es_no_fiscal'),
+    ('tiene_promocion', None, 'tiene_promocion'),
+    ('codigo_promocion', None, 'codigo_promocion'),
+]
+
+_ARRAYS_ANIDADOS = ('producto', 'cantidad', 'financiero')
+
+
 class VentasKLKExtractor:
     """Extractor de ventas desde API KLK"""
 
@@ -152,11 +224,13 @@ class VentasKLKExtractor:
                 self.logger.info(f"   🔑 Headers: {dict(self.session.headers)}")
 
                 start_time = time.time()
+                streaming = self.api_config.stream_json and ijson is not None
 
                 response = self.session.post(
                     endpoint,
                     json=payload,
-                    timeout=self.api_config.timeout_seconds
+                    timeout=self.api_config.timeout_seconds,
+                    stream=streaming
                 )
                 request_time = time.time() - start_time
 
@@ -164,7 +238,6 @@ class VentasKLKExtractor:
                 self.logger.info(f"   📨 Status Code: {response.status_code}")
                 self.logger.info(f"   ⏱️  Request Time: {request_time:.2f}s")
                 self.logger.info(f"   📄 Response Headers: {dict(response.headers)}")
-                self.logger.info(f"   📝 Response Body (primeros 500 chars): {response.text[:500]}")
 
                 if response.status_code != 200:
                     self.logger.error(f"❌ Error HTTP {response.status_code}: {response.text[:200]}")
@@ -173,6 +246,39 @@ class VentasKLKExtractor:
                         continue
                     return None
 
+                if streaming:
+                    # El body se parsea y aplana por bloques sin cargarlo completo
+                    try:
+                        df, info = self._flatten_ventas_stream(response)
+                    finally:
+                        response.close()
+                    request_time = time.time() - start_time
+
+                    if 'error' in info:
+                        self.logger.error(f"❌ Error de API: {info['error']}")
+                        return None
+                    if 'unexpected' in info:
+                        self.logger.error(f"❌ Response inesperado: {info['unexpected']}")
+                        return None
+                    if 'meta' in info:
+                        self.logger.info(f"   📊 Meta: {info['meta'].get('total_registros', 'N/A')} registros")
+
+                    if df.empty:
+                        self.logger.warning(f"⚠️  API retornó 0 ventas para {ubicacion_nombre}")
+                        return pd.DataFrame()
+
+                    self.logger.info(f"✅ Extraídas: {len(df):,} líneas de venta en {request_time:.2f}s (streaming)")
+
+                    # Agregar metadatos
+                    df['ubicacion_id'] = ubicacion_id
+                    df['ubicacion_nombre'] = ubicacion_nombre
+                    df['fecha_extraccion'] = datetime.now()
+                    df['fuente_sistema'] = 'KLK'
+
+                    return df
+
+                self.logger.info(f"   📝 Response Body (primeros 500 chars): {response.text[:500]}")
+
                 data = response.json()
 
                 # Parsear respuesta
@@ -229,77 +335,98 @@ class VentasKLKExtractor:
         """
         Aplana la estructura anidada de ventas KLK a un DataFrame plano
 
-        La estructura de KLK tiene arrays anidados para producto, cantidad y financiero
+        La estructura de KLK tiene arrays anidados para producto, cantidad y financiero.
+        Se arma columna por columna (sin un dict por línea de venta).
         """
-        rows = []
-
-        for venta in ventas:
-            # Extraer datos del producto (primer elemento del array)
-            producto = venta.get('producto', [{}])[0] if venta.get('producto') else {}
-            cantidad = venta.get('cantidad', [{}])[0] if venta.get('cantidad') else {}
-            financiero = venta.get('financiero', [{}])[0] if venta.get('financiero') else {}
-
-            row = {
-                # Identificadores de la transacción
-                'numero_factura': venta.get('numero_factura'),
-                'linea': venta.get('linea'),
-
-                # Fecha y hora
-                'fecha': venta.get('fecha'),
-                'hora': venta.get('hora'),
-                'fecha_hora_completa': venta.get('fecha_hora_completa'),
-
-                # Producto
-                'codigo_producto': producto.get('codigo_producto'),
-                'descripcion_producto': producto.get('descripcion_producto'),
-                'marca_producto': producto.get('marca_producto'),
-                'modelo_producto': producto.get('modelo_producto'),
-                'categoria_producto': producto.get('categoria_producto'),
-                'grupo_producto': producto.get('grupo_articulo'),
-                'subgrupo_producto': producto.get('subgrupo_producto'),
-                'codigo_barras': producto.get('codigo_barras'),
-
-                # Cantidad y almacén
-                'codigo_almacen': cantidad.get('codigo_almacen'),
-                'nombre_almacen': cantidad.get('nombre_almacen'),
-                'cantidad_vendida': cantidad.get('cantidad_vendida'),
-                'peso_unitario': cantidad.get('peso_unitario'),
-                'unidad_medida_venta': cantidad.get('unidad_medida_venta'),
-                'factor_unidad_medida': cantidad.get('factor_unidad_medida'),
-
-                # Financiero en Bs
-                'costo_unitario_bs': financiero.get('costo_unitario_bs'),
-                'precio_unitario_bs': financiero.get('precio_unitario_bs'),
-                'venta_total_bs': financiero.get('venta_total_bs'),
-                'costo_total_bs': financiero.get('costo_total_bs'),
-                'utilidad_bruta_bs': financiero.get('utilidad_bruta_bs'),
-
-                # Financiero en USD
-                'costo_unitario_usd': financiero.get('costo_unitario_usd'),
-                'precio_unitario_usd': financiero.get('precio_unitario_usd'),
-                'venta_total_usd': financiero.get('venta_total_usd'),
-                'costo_total_usd': financiero.get('costo_total_usd'),
-                'utilidad_bruta_usd': financiero.get('utilidad_bruta_usd'),
-
-                # Impuestos y descuentos
-                'impuesto_porcentaje': financiero.get('impuesto_porcentaje'),
-                'impuesto_monto': financiero.get('impuesto_monto'),
-                'porcentaje_descuento': financiero.get('porcentaje_descuento'),
-                'monto_descuento': financiero.get('monto_descuento'),
-
-                # Totales de factura
-                'total_factura': venta.get('total_factura'),
-                'tasa_usd': venta.get('tasa_usd'),
-
-                # Otros
-                'es_no_fiscal': venta.get('es_no_fiscal'),
-                'tiene_promocion': venta.get('tiene_promocion'),
-                'codigo_promocion': venta.get('codigo_promocion'),
-            }
-
-            rows.append(row)
-
-        return pd.DataFrame(rows)
+        if not ventas:
+            return pd.DataFrame()
+        return self._dataframe_ventas(self._columnas_ventas(ventas))
+
+    def _flatten_ventas_stream(self, response) -> Tuple[pd.DataFrame, Dict]:
+        """
+        Parsea el body de la respuesta con ijson y aplana las ventas por
+        bloques de stream_chunk_size: en memoria solo queda un bloque de
+        dicts crudos más las columnas ya aplanadas.
+
+        Returns:
+            (DataFrame igual al de _flatten_ventas, info con 'meta', 'error'
+            o 'unexpected' según lo que traiga el response)
+        """
+        info = {}
+        response.raw.decode_content = True  # gzip/deflate transparente
+        ventas = self._iterar_ventas_json(response.raw, info)
+
+        columnas = None
+        while True:
+            bloque = list(islice(ventas, self.api_config.stream_chunk_size))
+            if not bloque:
+                break
+            parcial = self._columnas_ventas(bloque)
+            if columnas is None:
+                columnas = parcial
+            else:
+                for nombre, valores in parcial.items():
+                    columnas[nombre].extend(valores)
+
+        if columnas is None:
+            return pd.DataFrame(), info
+        return self._dataframe_ventas(columnas), info
+
+    @staticmethod
+    def _iterar_ventas_json(stream, info: Dict) -> Iterator[Dict]:
+        """
+        Genera cada venta del body JSON ({'ventas': [...], 'meta': {...}} o
+        lista directa) a medida que se lee. 'meta' y 'error' se dejan en `info`.
+        """
+        builder = None
+        destino = None
+        prefijo_inicio = None
+
+        # use_float: mismos tipos que json.loads (int / float, no Decimal)
+        for prefix, event, value in ijson.parse(stream, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == prefijo_inicio and event in ('end_map', 'end_array'):
+                    if destino == 'venta':
+                        yield builder.value
+                    else:
+                        info[destino] = builder.value
+                    builder = None
+                continue
+
+            if prefix in ('item', 'ventas.item') and event == 'start_map':
+                destino = 'venta'
+            elif prefix in ('meta', 'error'):
+                destino = prefix
+                if event not in ('start_map', 'start_array'):
+                    info[destino] = value
+                    continue
+            elif prefix == '' and event not in ('start_map', 'start_array', 'end_map', 'end_array', 'map_key'):
+                info['unexpected'] = type(value).__name__
+                return
+            else:
+                continue
+
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            prefijo_inicio = prefix
+
+    @staticmethod
+    def _columnas_ventas(ventas: List[Dict]) -> Dict[str, list]:
+        """Arma {columna: valores} para un bloque de ventas."""
+        anidados = {
+            clave: [(venta.get(clave) or [{}])[0] for venta in ventas]
+            for clave in _ARRAYS_ANIDADOS
+        }
+        return {
+            columna: [fila.get(clave) for fila in (anidados[origen] if origen else ventas)]
+            for columna, origen, clave in VENTAS_COLUMNAS
+        }
+
+    @staticmethod
+    def _dataframe_ventas(columnas: Dict[str, list]) -> pd.DataFrame:
+        """DataFrame con la misma inferencia de tipos que pd.DataFrame(lista de dicts)."""
+        return pd.DataFrame(columnas, columns=[c for c, _, _ in VENTAS_COLUMNAS])
 
     def extract_ventas_rango(
         self,
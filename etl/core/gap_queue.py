@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Cola persistente de gaps de ventas (etl_gap_queue)
+
+Los gaps detectados (horas sin ventas en horario comercial) se encolan en
+PostgreSQL y los drena un pool de workers. Cada gap se reclama con
+UPDATE ... FOR UPDATE SKIP LOCKED, así dos workers (o dos corridas) nunca
+procesan el mismo gap, y un gap reclamado por una corrida que murió vuelve
+a estar disponible pasado GAP_CLAIM_TIMEOUT_MINUTES.
+
+Estados: pending -> running -> done | pending (reintento con backoff) | failed
+(también failed si vence el claim del último intento)
+
+Configuración (env):
+    ETL_GAP_MAX_INTENTOS: intentos por gap antes de marcarlo failed (default 3)
+    ETL_GAP_CLAIM_TIMEOUT_MIN: minutos tras los cuales un claim 'running' se
+        considera huérfano (default 30)
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger('etl_gap_queue')
+
+GAP_MAX_INTENTOS = int(os.getenv('ETL_GAP_MAX_INTENTOS', '3'))
+GAP_CLAIM_TIMEOUT_MINUTES = int(os.getenv('ETL_GAP_CLAIM_TIMEOUT_MIN', '30'))
+
+class GapQueue:
+    """
+    Acceso a etl_gap_queue. Cada operación usa una conexión corta de
+    `get_connection` (compartible entre threads).
+    """
+
+    def __init__(self, get_connection: Callable, etl_name: str = 'ventas'):
+        self._get_connection = get_connection
+        self.etl_name = etl_name
+
+    def _ejecutar(self, query: str, params=None, fetch: str = None):
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            if fetch == 'one':
+                resultado = cursor.fetchone()
+            elif fetch == 'all':
+                resultado = cursor.fetchall()
+            else:
+                resultado = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            return resultado
+        finally:
+            conn.close()
+
+    def disponible(self) -> bool:
+        """True si la tabla existe (migración 040 aplicada)"""
+        row = self._ejecutar("SELECT to_regclass('etl_gap_queue') IS NOT NULL", fetch='one')
+        return bool(row and row[0])
+
+    def encolar(self, tienda_id: str, gaps: List[Dict], execution_id: Optional[int] = None) -> int:
+        """
+        Encola gaps (hora_inicio, hora_fin). Idempotente: un gap ya encolado
+        no se duplica; uno ya 'done' que se vuelve a detectar sin haber
+        cargado registros se re-encola mientras le queden intentos.
+
+        Returns:
+            Cantidad de gaps nuevos o re-encolados
+        """
+        if not gaps:
+            return 0
+
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            encolados = 0
+            for gap in gaps:
+                cursor.execute("""
+                    INSERT INTO etl_gap_queue (etl_name, tienda_id, hora_inicio, hora_fin, detected_execution_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (etl_name, tienda_id, hora_inicio) DO UPDATE SET
+                        status = 'pending',
+                        available_at = CURRENT_TIMESTAMP,
+                        detected_execution_id = EXCLUDED.detected_execution_id
+                    WHERE etl_gap_queue.status = 'done'
+                      AND etl_gap_queue.records_loaded = 0
+                      AND etl_gap_queue.attempts < %s
+                """, (self.etl_name, tienda_id, gap['hora_inicio'], gap['hora_fin'],
+                      execution_id, GAP_MAX_INTENTOS))
+                encolados += cursor.rowcount
+            conn.commit()
+            cursor.close()
+            return encolados
+        finally:
+            conn.close()
+
+    def reclamar(self, tiendas: List[str], worker_id: str, execution_id: Optional[int] = None,
+                 max_por_tienda: int = 1) -> Optional[Dict]:
+        """
+        Reclama el gap disponible más antiguo de `tiendas` cuya tienda tenga
+        menos de `max_por_tienda` gaps en curso.
+
+        En la misma sentencia marca 'failed' los claims huérfanos de `tiendas`
+        que ya usaron su último intento: nadie los va a retomar ni cerrar.
+
+        Returns:
+            Dict con id, tienda_id, hora_inicio, hora_fin, attempts o None si no hay
+        """
+        row = self._ejecutar("""
+            WITH agotados AS (
+                UPDATE etl_gap_queue SET
+                    status = 'failed',
+                    finished_at = CURRENT_TIMESTAMP,
+                    last_error = 'Claim de ' || COALESCE(claimed_by, '?')
+                        || ' vencido en el último intento (' || attempts || ')'
+                WHERE etl_name = %(etl_name)s
+                  AND tienda_id = ANY(%(tiendas)s)
+                  AND status = 'running'
+                  AND attempts >= %(max_intentos)s
+                  AND claimed_at < CURRENT_TIMESTAMP - make_interval(mins => %(timeout)s)
+            )
+            UPDATE etl_gap_queue q SET
+                status = 'running',
+                attempts = q.attempts + 1,
+                claimed_by = %(worker_id)s,
+                claimed_at = CURRENT_TIMESTAMP,
+                claimed_execution_id = %(execution_id)s
+            WHERE q.id = (
+                SELECT c.id
+                FROM etl_gap_queue c
+                WHERE c.etl_name = %(etl_name)s
+                  AND c.tienda_id = ANY(%(tiendas)s)
+                  AND c.attempts < %(max_intentos)s
+                  AND (
+                      (c.status = 'pending' AND c.available_at <= CURRENT_TIMESTAMP)
+                      OR (c.status = 'running'
+                          AND c.claimed_at < CURRENT_TIMESTAMP - make_interval(mins => %(timeout)s))
+                  )
+                  AND (
+                      SELECT COUNT(*) FROM etl_gap_queue r
+                      WHERE r.etl_name = c.etl_name
+                        AND r.tienda_id = c.tienda_id
+                        AND r.status = 'running'
+                        AND r.claimed_at >= CURRENT_TIMESTAMP - make_interval(mins => %(timeout)s)
+                  ) < %(max_por_tienda)s
+                ORDER BY c.hora_inicio
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING q.id, q.tienda_id, q.hora_inicio, q.hora_fin, q.attempts
+        """, {
+            'worker_id': worker_id,
+            'execution_id': execution_id,
+            'etl_name': self.etl_name,
+            'tiendas': list(tiendas),
+            'max_intentos': GAP_MAX_INTENTOS,
+            'timeout': GAP_CLAIM_TIMEOUT_MINUTES,
+            'max_por_tienda': max_por_tienda,
+        }, fetch='one')
+
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'tienda_id': row[1],
+            'hora_inicio': row[2],
+            'hora_fin': row[3],
+            'attempts': row[4],
+        }
+
+    def completar(self, gap: Dict, worker_id: str, success: bool,
+                  registros: int = 0, error: Optional[str] = None) -> bool:
+        """
+        Cierra un gap reclamado por `worker_id`. Si falló y le quedan intentos
+        vuelve a 'pending' con backoff (10 min por intento). Solo el dueño
+        del claim puede cerrarlo (un claim huérfano re-tomado no se pisa).
+
+        Returns:
+            True si el claim seguía siendo de este worker
+        """
+        if success:
+            actualizados = self._ejecutar("""
+                UPDATE etl_gap_queue SET
+                    status = 'done',
+                    finished_at = %s,
+                    records_loaded = %s,
+                    last_error = NULL
+                WHERE id = %s AND claimed_by = %s AND status = 'running'
+            """, (datetime.now(), registros, gap['id'], worker_id))
+        else:
+            actualizados = self._ejecutar("""
+                UPDATE etl_gap_queue SET
+                    status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                    available_at = CURRENT_TIMESTAMP + make_interval(mins => 10 * attempts),
+                    finished_at = %s,
+                    last_error = %s
+                WHERE id = %s AND claimed_by = %s AND status = 'running'
+            """, (GAP_MAX_INTENTOS, datetime.now(), (error or '')[:1000], gap['id'], worker_id))
+
+        if not actualizados:
+            logger.warning(f"Gap {gap['id']} ya no pertenece a {worker_id} (claim re-tomado)")
+        return bool(actualizados)
+
+    def backlog(self, tiendas: List[str]) -> int:
+        """
+        Gaps pendientes con intentos disponibles o en curso de `tiendas`. Un
+        claim en curso cuenta aunque sea el último intento: sigue sin cerrar
+        hasta que termina o vence.
+        """
+        row = self._ejecutar("""
+            SELECT COUNT(*) FROM etl_gap_queue
+            WHERE etl_name = %s AND tienda_id = ANY(%s)
+              AND (status = 'running' OR (status = 'pending' AND attempts < %s))
+        """, (self.etl_name, list(tiendas), GAP_MAX_INTENTOS), fetch='one')
+        return row[0] if row else 0
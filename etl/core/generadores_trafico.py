@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Sugerencias de generadores de tráfico tras el recálculo ABC
+
+recalcular_abc_cache.py recalcula el GAP de productos_abc_cache; con este
+paso las sugerencias de generadores de tráfico se actualizan en la misma
+transacción (una sola sentencia UPDATE ... FROM candidatos) en vez de
+esperar a que alguien pulse "calcular sugerencias" en el admin.
+"""
+
+# Misma sentencia que backend/services/generadores_trafico.py
+RECALCULAR_SUGERENCIAS_SQL = """
+    WITH candidatos AS (
+        SELECT producto_id, gap, clase_abc, venta_30d, tickets_30d
+        FROM productos_abc_cache
+        WHERE gap >= %(gap_minimo)s
+    ),
+    sugeridos AS (
+        UPDATE productos p
+        SET generador_trafico_sugerido = TRUE,
+            generador_trafico_gap = c.gap,
+            generador_trafico_fecha_sugerido = NOW()
+        FROM candidatos c
+        WHERE p.id = c.producto_id
+          AND COALESCE(p.es_generador_trafico, FALSE) = FALSE
+          AND COALESCE(p.generador_trafico_ignorado, FALSE) = FALSE
+          AND COALESCE(p.generador_trafico_sugerido, FALSE) = FALSE
+        RETURNING p.id, c.gap, c.clase_abc, c.venta_30d, c.tickets_30d
+    ),
+    historial AS (
+        INSERT INTO generadores_trafico_historial
+            (producto_id, accion, gap_score, venta_30d, tickets_30d, clase_abc)
+        SELECT id, 'sugerido', gap, COALESCE(venta_30d, 0), tickets_30d, clase_abc
+        FROM sugeridos
+    ),
+    removidos AS (
+        UPDATE productos p
+        SET generador_trafico_sugerido = FALSE
+        WHERE p.generador_trafico_sugerido = TRUE
+          AND NOT EXISTS (SELECT 1 FROM candidatos c WHERE c.producto_id = p.id)
+        RETURNING p.id, p.generador_trafico_gap
+    )
+    SELECT 'sugerido' AS cambio, id, gap FROM sugeridos
+    UNION ALL
+    SELECT 'removido', id, generador_trafico_gap FROM removidos
+    UNION ALL
+    SELECT 'analizados', NULL, COUNT(*) FROM candidatos
+"""
+
+
+def recalcular_sugerencias_generadores(cursor, gap_minimo: int = None) -> dict:
+    """
+    Marca los candidatos nuevos como sugeridos (con historial) y quita las
+    sugerencias que ya no califican. No hace commit. `cursor` puede ser
+    RealDictCursor.
+
+    Returns:
+        {'gap_minimo', 'productos_analizados', 'sugeridos': [ids], 'removidos': [ids]}
+    """
+    if gap_minimo is None:
+        cursor.execute("""
+            SELECT valor FROM config_generadores_trafico
+            WHERE parametro = 'gap_minimo'
+        """)
+        row = cursor.fetchone()
+        valor = (row['valor'] if isinstance(row, dict) else row[0]) if row else None
+        gap_minimo = int(valor) if valor is not None else 400
+
+    cursor.execute(RECALCULAR_SUGERENCIAS_SQL, {'gap_minimo': gap_minimo})
+
+    resultado = {'gap_minimo': gap_minimo, 'productos_analizados': 0, 'sugeridos': [], 'removidos': []}
+    for row in cursor.fetchall():
+        cambio, producto_id, gap = (row['cambio'], row['id'], row['gap']) if isinstance(row, dict) else row
+        if cambio == 'analizados':
+            resultado['productos_analizados'] = int(gap)
+        elif cambio == 'sugerido':
+            resultado['sugeridos'].append(producto_id)
+        else:
+            resultado['removidos'].append(producto_id)
+
+    resultado['sugeridos'].sort()
+    resultado['removidos'].sort()
+    return resultado
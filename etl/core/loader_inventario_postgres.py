@@ -4,9 +4,11 @@ PostgreSQL Loader - Escritura directa a PostgreSQL
 Sin DuckDB - PostgreSQL only
 """
 
+import os
 import psycopg2
 import pandas as pd
-from typing import Optional, Dict, Any
+import io
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 import logging
 from pathlib import Path
@@ -18,6 +20,113 @@ from db_config import POSTGRES_DSN
 
 logger = logging.getLogger('etl_loader_postgres')
 
+# Días de registros de carga (inventario_cargas) a conservar por almacén
+INVENTARIO_CARGAS_RETENCION_DIAS = int(os.getenv('INVENTARIO_CARGAS_RETENCION_DIAS', '30'))
+
+def _columna(df: pd.DataFrame, nombre: str, default=None) -> pd.Series:
+    """
+    Columna como dtype object con NaN/NaT convertidos a None (NULL en
+    PostgreSQL). Si la columna no existe, una serie con `default`.
+    """
+    if nombre not in df.columns:
+        return pd.Series([default] * len(df), index=df.index, dtype=object)
+    columna = df[nombre].astype(object)
+    return columna.where(columna.notna(), None)
+
+
+def _vacio(serie: pd.Series) -> pd.Series:
+    """Máscara de valores nulos o string vacío (los falsy de `row.get(...) or ...`)"""
+    return serie.isna() | (serie == '')
+
+
+def _registros(frame: pd.DataFrame) -> List[tuple]:
+    """Tuplas para execute_values (valores Python, sin escalares numpy)"""
+    return list(frame.astype(object).itertuples(index=False, name=None))
+
+
+def preparar_productos(df: pd.DataFrame) -> List[tuple]:
+    """
+    Tuplas para el UPSERT de productos desde el DataFrame del ETL KLK,
+    de-duplicadas por codigo (última ocurrencia gana).
+
+    Orden: id, codigo, codigo_barras, nombre, descripcion, marca, modelo,
+    categoria, grupo_articulo, subgrupo, activo, fecha_actualizacion
+    """
+    codigo = _columna(df, 'codigo')
+    descripcion = _columna(df, 'descripcion')
+    nombre = _columna(df, 'nombre')
+    nombre = nombre.mask(_vacio(nombre), _columna(df, 'descripcion', ''))
+    activo = _columna(df, 'activo', True)
+    updated_at = _columna(df, 'updated_at', datetime.now())
+
+    frame = pd.DataFrame({
+        'id': codigo,
+        'codigo': codigo,
+        'codigo_barras': _columna(df, 'codigo_barras'),
+        'nombre': nombre,
+        'descripcion': descripcion,
+        'marca': _columna(df, 'marca'),
+        'modelo': _columna(df, 'modelo'),
+        'categoria': _columna(df, 'categoria'),
+        'grupo_articulo': _columna(df, 'grupo'),
+        'subgrupo': _columna(df, 'subgrupo'),
+        'activo': activo.where(activo.notna(), True),
+        'fecha_actualizacion': updated_at.where(updated_at.notna(), datetime.now()),
+    })
+    return _registros(frame.drop_duplicates('codigo', keep='last'))
+
+
+def preparar_stock_klk(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Filas de stock KLK para _cargar_delta_inventario:
+    almacen_codigo, producto (productos.codigo), cantidad, fecha_actualizacion.
+    """
+    return pd.DataFrame({
+        'almacen_codigo': _columna(df, 'almacen_codigo'),
+        'producto': _columna(df, 'codigo_producto'),
+        'cantidad': pd.to_numeric(df['cantidad_actual'], errors='coerce'),
+        'fecha_actualizacion': _columna(df, 'fecha_extraccion', datetime.now()),
+    })
+
+
+def preparar_inventario_stellar(df: pd.DataFrame, almacen_codigo: str) -> Tuple[List[tuple], pd.DataFrame]:
+    """
+    Productos y stock desde el DataFrame del transformer Stellar. Descarta
+    filas sin codigo_producto; productos de-duplicados por codigo y stock por
+    producto (última ocurrencia gana).
+
+    Returns:
+        (tuplas id, codigo, nombre, descripcion, categoria, marca,
+         DataFrame almacen_codigo, producto, cantidad, fecha_actualizacion)
+    """
+    codigo = _columna(df, 'codigo_producto')
+    validas = ~_vacio(codigo)
+    df = df[validas]
+    codigo = codigo[validas]
+
+    descripcion = _columna(df, 'descripcion_producto')
+    nombre = descripcion.mask(_vacio(descripcion), 'Producto ' + codigo.astype(str))
+    productos = pd.DataFrame({
+        'id': codigo,
+        'codigo': codigo,
+        'nombre': nombre,
+        'descripcion': nombre,
+        'categoria': _columna(df, 'categoria'),
+        'marca': _columna(df, 'marca'),
+    })
+
+    cantidad = _columna(df, 'cantidad_actual', 0)
+    stock = pd.DataFrame({
+        'almacen_codigo': almacen_codigo,
+        'producto': codigo,
+        'cantidad': cantidad.mask(_vacio(cantidad), 0),
+        'fecha_actualizacion': _columna(df, 'fecha_extraccion', datetime.now()),
+    })
+    return (
+        _registros(productos.drop_duplicates('codigo', keep='last')),
+        stock.drop_duplicates('producto', keep='last'),
+    )
+
 
 class PostgreSQLInventarioLoader:
     """Cargador directo a PostgreSQL - Sin DuckDB"""
@@ -119,31 +228,8 @@ class PostgreSQLInventarioLoader:
             conn = self._get_connection()
             cursor = conn.cursor()
 
-            # Preparar datos para batch insert
-            batch_data = []
-            for _, row in df.iterrows():
-                nombre = row.get('nombre') or row.get('descripcion', '')
-                codigo = row.get('codigo')
-                batch_data.append((
-                    codigo,  # id
-                    codigo,  # codigo
-                    row.get('codigo_barras'),
-                    nombre,
-                    row.get('descripcion'),
-                    row.get('marca'),
-                    row.get('modelo'),
-                    row.get('categoria'),
-                    row.get('grupo'),  # Mapeado a grupo_articulo
-                    row.get('subgrupo'),
-                    row.get('activo', True),
-                    row.get('updated_at', datetime.now())
-                ))
-
-            # De-duplicar por codigo (índice 1)
-            seen = {}
-            for record in batch_data:
-                seen[record[1]] = record
-            batch_data = list(seen.values())
+            # Preparar datos para batch insert (columnar, de-duplicado por codigo)
+            batch_data = preparar_productos(df)
 
             # Batch insert con execute_values
             from psycopg2.extras import execute_values
@@ -272,55 +358,13 @@ class PostgreSQLInventarioLoader:
             if len(almacenes_unicos) > 0:
                 self.logger.info(f"   ✅ Almacenes sincronizados: {list(almacenes_unicos)}")
 
-            # PASO 1: Guardar snapshot histórico ANTES de eliminar
-            # Para TODOS los almacenes de esta ubicación que vamos a actualizar
-            self.logger.info(f"📸 Guardando snapshot histórico para ubicacion_id={ubicacion_id}, almacenes={list(almacenes_unicos)}")
-
-            historico_insert = """
-                INSERT INTO inventario_historico (
-                    ubicacion_id, producto_id, almacen_codigo, cantidad, fecha_snapshot
-                )
-                SELECT
-                    ia.ubicacion_id,
-                    ia.producto_id,
-                    ia.almacen_codigo,
-                    ia.cantidad,
-                    ia.fecha_actualizacion
-                FROM inventario_actual ia
-                WHERE ia.ubicacion_id = %s
-                  AND ia.almacen_codigo = ANY(%s)
-            """
-            cursor.execute(historico_insert, (ubicacion_id, list(almacenes_unicos) if len(almacenes_unicos) > 0 else [None]))
-            historico_saved = cursor.rowcount
-            self.logger.info(f"✅ {historico_saved} registros guardados en histórico")
-
-            # PASO 2: Eliminar stock anterior de esta ubicación para los almacenes que vamos a actualizar
-            cursor.execute("""
-                DELETE FROM inventario_actual
-                WHERE ubicacion_id = %s
-                  AND almacen_codigo = ANY(%s)
-            """, (ubicacion_id, list(almacenes_unicos) if len(almacenes_unicos) > 0 else [None]))
-
-            # PASO 3: INSERT stock nuevo
-            insert_query = """
-                INSERT INTO inventario_actual (
-                    ubicacion_id, producto_id, almacen_codigo, cantidad, fecha_actualizacion
-                )
-                SELECT %s, p.id, %s, %s, %s
-                FROM productos p
-                WHERE p.codigo = %s
-            """
-
-            records_loaded = 0
-            for _, row in df.iterrows():
-                cursor.execute(insert_query, (
-                    row['ubicacion_id'],
-                    row.get('almacen_codigo'),
-                    row['cantidad_actual'],
-                    row.get('fecha_extraccion', datetime.now()),
-                    row['codigo_producto']
-                ))
-                records_loaded += 1
+            # PASO 1: Snapshot histórico + carga delta de inventario_actual
+            # (el producto se resuelve por productos.codigo; sin producto no se carga)
+            delta = self._cargar_delta_inventario(
+                cursor, ubicacion_id, list(almacenes_unicos), preparar_stock_klk(df),
+                fecha_snapshot, resolver_codigo=True
+            )
+            records_loaded = delta['filas_snapshot']
 
             conn.commit()
             cursor.close()
@@ -373,6 +417,9 @@ class PostgreSQLInventarioLoader:
 
             self.logger.info(f"📦 Cargando inventario Stellar: {ubicacion_nombre} ({ubicacion_id})")
             self.logger.info(f"   Almacén: {almacen_codigo}, Registros: {len(df)}")
+            fecha_extraccion_snapshot = (
+                df['fecha_extraccion'].iloc[0] if 'fecha_extraccion' in df.columns else datetime.now()
+            )
 
             # Determinar tipo de ubicación
             ubicacion_tipo = 'cedi' if 'cedi' in ubicacion_id.lower() else 'tienda'
@@ -397,76 +444,10 @@ class PostgreSQLInventarioLoader:
             """, (almacen_codigo, f'Almacén {ubicacion_nombre}', ubicacion_id))
             self.logger.info(f"   ✅ Almacén sincronizado: {almacen_codigo}")
 
-            # PASO 3: Guardar snapshot histórico ANTES de eliminar
-            self.logger.info(f"   📸 Guardando snapshot histórico...")
-            cursor.execute("""
-                INSERT INTO inventario_historico (
-                    ubicacion_id, producto_id, almacen_codigo, cantidad, fecha_snapshot
-                )
-                SELECT
-                    ia.ubicacion_id,
-                    ia.producto_id,
-                    ia.almacen_codigo,
-                    ia.cantidad,
-                    ia.fecha_actualizacion
-                FROM inventario_actual ia
-                WHERE ia.ubicacion_id = %s AND ia.almacen_codigo = %s
-            """, (ubicacion_id, almacen_codigo))
-            historico_saved = cursor.rowcount
-            self.logger.info(f"   ✅ {historico_saved} registros guardados en histórico")
+            # PASO 3: Preparar datos para batch insert (columnar, de-duplicado por codigo)
+            productos_data, stock = preparar_inventario_stellar(df, almacen_codigo)
 
-            # PASO 4: Eliminar stock anterior de esta ubicación/almacén
-            cursor.execute("""
-                DELETE FROM inventario_actual
-                WHERE ubicacion_id = %s AND almacen_codigo = %s
-            """, (ubicacion_id, almacen_codigo))
-            deleted = cursor.rowcount
-            self.logger.info(f"   🗑️ {deleted} registros anteriores eliminados")
-
-            # PASO 5: Preparar datos para batch insert
-            productos_data = []
-            stock_data = []
-
-            for _, row in df.iterrows():
-                codigo_producto = row.get('codigo_producto')
-                if not codigo_producto:
-                    continue
-
-                # Datos para productos
-                nombre_producto = row.get('descripcion_producto') or f'Producto {codigo_producto}'
-                productos_data.append((
-                    codigo_producto,  # id = codigo
-                    codigo_producto,
-                    nombre_producto,
-                    nombre_producto,
-                    row.get('categoria'),
-                    row.get('marca')
-                ))
-
-                # Datos para stock
-                cantidad = row.get('cantidad_actual', 0) or 0
-                fecha_extraccion = row.get('fecha_extraccion', datetime.now())
-                stock_data.append((
-                    ubicacion_id,
-                    codigo_producto,
-                    almacen_codigo,
-                    cantidad,
-                    fecha_extraccion
-                ))
-
-            # De-duplicar por codigo (productos) y por key compuesta (stock)
-            seen_productos = {}
-            for p in productos_data:
-                seen_productos[p[0]] = p  # key = codigo
-            productos_data = list(seen_productos.values())
-
-            seen_stock = {}
-            for s in stock_data:
-                key = (s[0], s[1], s[2])  # ubicacion_id, producto_id, almacen_codigo
-                seen_stock[key] = s
-            stock_data = list(seen_stock.values())
-
-            # PASO 5a: Batch insert productos
+            # PASO 3a: Batch insert productos
             from psycopg2.extras import execute_values
             try:
                 productos_query = """
@@ -504,45 +485,20 @@ class PostgreSQLInventarioLoader:
                     except Exception:
                         pass
 
-            # PASO 5b: Batch insert stock
-            try:
-                stock_query = """
-                    INSERT INTO inventario_actual (
-                        ubicacion_id, producto_id, almacen_codigo, cantidad, fecha_actualizacion
-                    )
-                    VALUES %s
-                    ON CONFLICT (ubicacion_id, producto_id, almacen_codigo) DO UPDATE SET
-                        cantidad = EXCLUDED.cantidad,
-                        fecha_actualizacion = EXCLUDED.fecha_actualizacion
-                """
-                execute_values(cursor, stock_query, stock_data, page_size=1000)
-                stock_insertado = len(stock_data)
-            except Exception as e:
-                self.logger.error(f"Error en batch insert stock: {e}")
-                conn.rollback()
-                # Fallback individual
-                stock_insertado = 0
-                for s in stock_data:
-                    try:
-                        cursor.execute("""
-                            INSERT INTO inventario_actual (
-                                ubicacion_id, producto_id, almacen_codigo, cantidad, fecha_actualizacion
-                            )
-                            VALUES (%s, %s, %s, %s, %s)
-                            ON CONFLICT (ubicacion_id, producto_id, almacen_codigo) DO UPDATE SET
-                                cantidad = EXCLUDED.cantidad,
-                                fecha_actualizacion = EXCLUDED.fecha_actualizacion
-                        """, s)
-                        stock_insertado += 1
-                    except Exception:
-                        pass
+            # PASO 3b: Snapshot histórico + carga delta del stock
+            delta = self._cargar_delta_inventario(
+                cursor, ubicacion_id, [almacen_codigo], stock,
+                fecha_extraccion_snapshot, resolver_codigo=False
+            )
+            historico_saved = delta['historico']
+            stock_insertado = delta['filas_snapshot']
 
             conn.commit()
             cursor.close()
             conn.close()
 
             self.logger.info(f"   ✅ Productos upserted: {productos_insertados}")
-            self.logger.info(f"   ✅ Stock insertado: {stock_insertado}")
+            self.logger.info(f"   ✅ Stock cargado: {stock_insertado}")
 
             return {
                 "success": True,
@@ -550,7 +506,8 @@ class PostgreSQLInventarioLoader:
                 "stats": {
                     "insertados": stock_insertado,
                     "productos": productos_insertados,
-                    "historico": historico_saved
+                    "historico": historico_saved,
+                    "cambios": {k: delta[k] for k in ('insertados', 'actualizados', 'eliminados', 'sin_cambios')}
                 }
             }
 
@@ -564,6 +521,237 @@ class PostgreSQLInventarioLoader:
                 "stats": {"insertados": 0}
             }
 
+    def _cargar_delta_inventario(
+        self,
+        cursor,
+        ubicacion_id: str,
+        almacenes: List[str],
+        filas: pd.DataFrame,
+        fecha_snapshot,
+        resolver_codigo: bool
+    ) -> Dict[str, int]:
+        """
+        Aplica a inventario_actual solo las diferencias con el snapshot entrante
+        (en lugar de DELETE + INSERT de todo el almacén):
+
+        1. COPY del snapshot a una tabla temporal (sin WAL) y de-duplicado por
+           (producto, almacén), última ocurrencia gana.
+        2. Snapshot histórico del estado actual (igual que antes), fechado con
+           el último snapshot confirmado del almacén, y en inventario_incrementos
+           los productos cuyo total en la ubicación subió respecto a su snapshot
+           anterior (llegadas, para verificar-llegada y tránsito).
+        3. En un solo statement: DELETE de lo que ya no viene, UPDATE de las
+           cantidades que cambiaron, INSERT de lo nuevo, y una fila por
+           almacén en inventario_cargas con los conteos.
+
+        Las filas sin cambios no se tocan, así que su fecha_actualizacion es
+        la del último cambio; la fecha del último snapshot por almacén queda
+        en inventario_cargas.
+
+        Args:
+            filas: DataFrame almacen_codigo, producto, cantidad, fecha_actualizacion;
+                   producto es productos.codigo si resolver_codigo, si no el producto_id
+            fecha_snapshot: Fecha de extracción del snapshot
+
+        Returns:
+            Dict con historico, incrementos, filas_snapshot, insertados, actualizados,
+            eliminados, sin_cambios
+        """
+        almacenes = [a for a in almacenes if a is not None] or [None]
+
+        cursor.execute("""
+            CREATE TEMP TABLE inventario_staging (
+                ordinal INTEGER,
+                almacen_codigo VARCHAR(50),
+                producto VARCHAR(50),
+                cantidad NUMERIC(12,4),
+                fecha_actualizacion TIMESTAMP
+            ) ON COMMIT DROP
+        """)
+        staging = filas[['almacen_codigo', 'producto', 'cantidad', 'fecha_actualizacion']].copy()
+        staging.insert(0, 'ordinal', range(len(staging)))
+        buffer = io.StringIO()
+        staging.to_csv(buffer, header=False, index=False, na_rep='\\N')
+        buffer.seek(0)
+        cursor.copy_expert(
+            "COPY inventario_staging FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+
+        producto_id = "p.id" if resolver_codigo else "s.producto"
+        join_productos = "JOIN productos p ON p.codigo = s.producto" if resolver_codigo else ""
+        cursor.execute(f"""
+            CREATE TEMP TABLE inventario_nuevo ON COMMIT DROP AS
+            SELECT DISTINCT ON ({producto_id}, s.almacen_codigo)
+                {producto_id} AS producto_id,
+                s.almacen_codigo,
+                s.cantidad,
+                s.fecha_actualizacion
+            FROM inventario_staging s
+            {join_productos}
+            WHERE s.almacen_codigo = ANY(%s)
+            ORDER BY {producto_id}, s.almacen_codigo, s.ordinal DESC
+        """, (almacenes,))
+        cursor.execute("ALTER TABLE inventario_nuevo ADD PRIMARY KEY (producto_id, almacen_codigo)")
+        cursor.execute("ANALYZE inventario_nuevo")
+
+        # Snapshot histórico ANTES de aplicar cambios (estado vigente completo),
+        # y en el mismo statement los incrementos respecto al snapshot anterior
+        # de cada producto (total de la ubicación, todos los almacenes)
+        cursor.execute("""
+            WITH historico AS (
+                INSERT INTO inventario_historico (
+                    ubicacion_id, producto_id, almacen_codigo, cantidad, fecha_snapshot
+                )
+                SELECT
+                    ia.ubicacion_id,
+                    ia.producto_id,
+                    ia.almacen_codigo,
+                    ia.cantidad,
+                    GREATEST(ia.fecha_actualizacion, ult.fecha_snapshot)
+                FROM inventario_actual ia
+                LEFT JOIN LATERAL (
+                    SELECT MAX(c.fecha_snapshot) AS fecha_snapshot
+                    FROM inventario_cargas c
+                    WHERE c.ubicacion_id = ia.ubicacion_id
+                      AND c.almacen_codigo = ia.almacen_codigo
+                ) ult ON TRUE
+                WHERE ia.ubicacion_id = %(ubicacion_id)s
+                  AND ia.almacen_codigo = ANY(%(almacenes)s)
+                RETURNING producto_id, cantidad, fecha_snapshot
+            ),
+            por_producto AS (
+                SELECT producto_id, fecha_snapshot, SUM(cantidad) AS cantidad
+                FROM historico
+                GROUP BY producto_id, fecha_snapshot
+            ),
+            incrementos AS (
+                INSERT INTO inventario_incrementos (
+                    ubicacion_id, producto_id, fecha_snapshot, fecha_snapshot_anterior,
+                    cantidad_anterior, cantidad, incremento
+                )
+                SELECT
+                    %(ubicacion_id)s, s.producto_id, s.fecha_snapshot, ant.fecha_snapshot,
+                    ant.cantidad, s.cantidad + mismo.cantidad,
+                    s.cantidad + mismo.cantidad - ant.cantidad
+                FROM por_producto s
+                -- Otros almacenes de la ubicación ya guardados con la misma fecha
+                CROSS JOIN LATERAL (
+                    SELECT COALESCE(SUM(h.cantidad), 0) AS cantidad
+                    FROM inventario_historico h
+                    WHERE h.producto_id = s.producto_id
+                      AND h.ubicacion_id = %(ubicacion_id)s
+                      AND h.fecha_snapshot = s.fecha_snapshot
+                ) mismo
+                CROSS JOIN LATERAL (
+                    SELECT MAX(h.fecha_snapshot) AS fecha_snapshot
+                    FROM inventario_historico h
+                    WHERE h.producto_id = s.producto_id
+                      AND h.ubicacion_id = %(ubicacion_id)s
+                      AND h.fecha_snapshot < s.fecha_snapshot
+                ) previo
+                CROSS JOIN LATERAL (
+                    SELECT previo.fecha_snapshot, SUM(h.cantidad) AS cantidad
+                    FROM inventario_historico h
+                    WHERE h.producto_id = s.producto_id
+                      AND h.ubicacion_id = %(ubicacion_id)s
+                      AND h.fecha_snapshot = previo.fecha_snapshot
+                ) ant
+                WHERE ant.cantidad IS NOT NULL
+                  AND s.cantidad + mismo.cantidad > ant.cantidad
+                ON CONFLICT (ubicacion_id, producto_id, fecha_snapshot) DO UPDATE SET
+                    cantidad = EXCLUDED.cantidad,
+                    incremento = EXCLUDED.incremento
+                RETURNING 1
+            )
+            SELECT
+                (SELECT COUNT(*) FROM historico),
+                (SELECT COUNT(*) FROM incrementos)
+        """, {'ubicacion_id': ubicacion_id, 'almacenes': almacenes})
+        historico, incrementos = cursor.fetchone()
+
+        cursor.execute("""
+            WITH eliminados AS (
+                DELETE FROM inventario_actual ia
+                WHERE ia.ubicacion_id = %(ubicacion_id)s
+                  AND ia.almacen_codigo = ANY(%(almacenes)s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM inventario_nuevo n
+                      WHERE n.producto_id = ia.producto_id
+                        AND n.almacen_codigo = ia.almacen_codigo
+                  )
+                RETURNING ia.almacen_codigo
+            ),
+            actualizados AS (
+                UPDATE inventario_actual ia SET
+                    cantidad = n.cantidad,
+                    fecha_actualizacion = n.fecha_actualizacion
+                FROM inventario_nuevo n
+                WHERE ia.ubicacion_id = %(ubicacion_id)s
+                  AND ia.producto_id = n.producto_id
+                  AND ia.almacen_codigo = n.almacen_codigo
+                  AND ia.cantidad IS DISTINCT FROM n.cantidad
+                RETURNING ia.almacen_codigo
+            ),
+            insertados AS (
+                INSERT INTO inventario_actual (
+                    ubicacion_id, producto_id, almacen_codigo, cantidad, fecha_actualizacion
+                )
+                SELECT %(ubicacion_id)s, n.producto_id, n.almacen_codigo, n.cantidad, n.fecha_actualizacion
+                FROM inventario_nuevo n
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM inventario_actual ia
+                    WHERE ia.ubicacion_id = %(ubicacion_id)s
+                      AND ia.producto_id = n.producto_id
+                      AND ia.almacen_codigo = n.almacen_codigo
+                )
+                RETURNING almacen_codigo
+            ),
+            conteos AS (
+                SELECT
+                    a.almacen_codigo,
+                    (SELECT COUNT(*) FROM inventario_nuevo n WHERE n.almacen_codigo = a.almacen_codigo) AS filas,
+                    (SELECT COUNT(*) FROM insertados i WHERE i.almacen_codigo = a.almacen_codigo) AS insertados,
+                    (SELECT COUNT(*) FROM actualizados u WHERE u.almacen_codigo = a.almacen_codigo) AS actualizados,
+                    (SELECT COUNT(*) FROM eliminados e WHERE e.almacen_codigo = a.almacen_codigo) AS eliminados
+                FROM unnest(%(almacenes)s::varchar[]) AS a(almacen_codigo)
+                WHERE a.almacen_codigo IS NOT NULL
+            )
+            INSERT INTO inventario_cargas (
+                ubicacion_id, almacen_codigo, fecha_snapshot, filas_snapshot,
+                insertados, actualizados, eliminados, sin_cambios
+            )
+            SELECT
+                %(ubicacion_id)s, almacen_codigo, %(fecha_snapshot)s, filas,
+                insertados, actualizados, eliminados, filas - insertados - actualizados
+            FROM conteos
+            RETURNING filas_snapshot, insertados, actualizados, eliminados, sin_cambios
+        """, {
+            'ubicacion_id': ubicacion_id,
+            'almacenes': almacenes,
+            'fecha_snapshot': fecha_snapshot,
+        })
+        por_almacen = cursor.fetchall()
+
+        # Retención de inventario_cargas (una fila por almacén en cada corrida);
+        # la fila recién insertada, que es el último snapshot confirmado, queda
+        cursor.execute("""
+            DELETE FROM inventario_cargas
+            WHERE ubicacion_id = %s
+              AND almacen_codigo = ANY(%s)
+              AND created_at < NOW() - make_interval(days => %s)
+        """, (ubicacion_id, almacenes, INVENTARIO_CARGAS_RETENCION_DIAS))
+
+        resultado = {'historico': historico, 'incrementos': incrementos}
+        for i, clave in enumerate(('filas_snapshot', 'insertados', 'actualizados', 'eliminados', 'sin_cambios')):
+            resultado[clave] = sum(fila[i] for fila in por_almacen)
+
+        self.logger.info(
+            f"   🔁 Delta {ubicacion_id}: {resultado['insertados']} nuevos, "
+            f"{resultado['actualizados']} actualizados, {resultado['eliminados']} eliminados, "
+            f"{resultado['sin_cambios']} sin cambios ({historico} en histórico, {incrementos} incrementos)"
+        )
+        return resultado
+
     def update_stock_actual_table(self, df: pd.DataFrame) -> Dict[str, Any]:
         """
         Actualiza la tabla inventario_actual en PostgreSQL
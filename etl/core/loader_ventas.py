@@ -5,12 +5,16 @@ PostgreSQL only - DuckDB removed (Dec 2025)
 """
 
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 import logging
 from pathlib import Path
 
 from config import ETLConfig
+from ventas_diarias import dias_tocados, refrescar_ventas_diarias
+from ventas_horarias import (
+    refrescar_baselines_dow, refrescar_ventas_horarias, tiendas_con_baseline_vencido
+)
 
 
 class VentasLoader:
@@ -33,12 +37,15 @@ class VentasLoader:
 
         return logger
 
-    def load_ventas_postgresql(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def load_ventas_postgresql(self, df: pd.DataFrame, refrescar_vistas: bool = True) -> Dict[str, Any]:
         """
         Carga datos de ventas en PostgreSQL
 
         Args:
             df: DataFrame con datos de ventas transformados
+            refrescar_vistas: Si False, no refresca las vistas materializadas
+                (al cargar por chunks se refrescan una vez al final con
+                refresh_materialized_views())
 
         Returns:
             Dict con resultados de la carga
@@ -207,8 +214,11 @@ class VentasLoader:
                 pg_conn.commit()
                 self.logger.info(f"✅ Carga completada: {records_loaded:,} registros, {errors} errores")
 
-                # Refresh materialized views for performance
                 if records_loaded > 0:
+                    self._refrescar_agregados(pg_conn, df_prep)
+
+                # Refresh materialized views for performance
+                if records_loaded > 0 and refrescar_vistas:
                     self._refresh_materialized_views(pg_conn)
 
         except Exception as e:
@@ -240,6 +250,97 @@ class VentasLoader:
             "errors": errors
         }
 
+    def refresh_materialized_views(self) -> None:
+        """Refresca las vistas materializadas con una conexión propia"""
+        from db_manager import get_postgres_connection
+
+        try:
+            with get_postgres_connection() as pg_conn:
+                self._refresh_materialized_views(pg_conn)
+        except Exception as e:
+            # Las ventas ya quedaron cargadas: no fallar el ETL por el refresh
+            self.logger.error(f"❌ Error refrescando vistas materializadas: {e}")
+
+    def get_marca_extraccion(self, ubicacion_id: str) -> Optional[Tuple]:
+        """
+        Última clave (fecha, numero_factura, linea) de ventas Stellar cargada
+        para la tienda, o None si no hay marca.
+        """
+        from db_manager import get_postgres_connection
+
+        try:
+            with get_postgres_connection() as pg_conn:
+                cursor = pg_conn.cursor()
+                cursor.execute(
+                    "SELECT fecha, numero_factura, linea FROM ventas_stellar_marca WHERE ubicacion_id = %s",
+                    (ubicacion_id,)
+                )
+                row = cursor.fetchone()
+                pg_conn.commit()
+                return tuple(row) if row else None
+        except Exception as e:
+            self.logger.warning(f"⚠️ No se pudo leer la marca de extracción de {ubicacion_id}: {e}")
+            return None
+
+    def guardar_marca_extraccion(self, ubicacion_id: str, clave: Tuple, filas: int) -> None:
+        """
+        Guarda la clave de la última fila cargada (después de cargar el chunk:
+        si la carga falla, la marca no avanza).
+        """
+        from db_manager import get_postgres_connection
+
+        fecha, numero_factura, linea = clave
+        try:
+            with get_postgres_connection() as pg_conn:
+                cursor = pg_conn.cursor()
+                cursor.execute("""
+                    INSERT INTO ventas_stellar_marca (ubicacion_id, fecha, numero_factura, linea, filas_extraidas)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (ubicacion_id) DO UPDATE SET
+                        fecha = EXCLUDED.fecha,
+                        numero_factura = EXCLUDED.numero_factura,
+                        linea = EXCLUDED.linea,
+                        filas_extraidas = ventas_stellar_marca.filas_extraidas + EXCLUDED.filas_extraidas,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (ubicacion_id, fecha, str(numero_factura), str(linea), filas))
+                pg_conn.commit()
+        except Exception as e:
+            self.logger.warning(f"⚠️ No se pudo guardar la marca de extracción de {ubicacion_id}: {e}")
+
+    def _refrescar_agregados(self, conn, df_prep: pd.DataFrame) -> None:
+        """
+        Recalcula ventas_diarias, ventas_horarias y (si vencieron) los
+        baselines por día de semana para los días (ubicacion_id, fecha) del
+        DataFrame cargado. Si alguno falla, las ventas ya quedaron cargadas:
+        el día se corrige en la próxima carga que lo toque.
+        """
+        fechas = pd.to_datetime(df_prep['fecha_venta'], errors='coerce')
+        dias = dias_tocados(zip(df_prep['ubicacion_id'], fechas))
+        if not dias:
+            return
+
+        try:
+            cursor = conn.cursor()
+            refrescar_ventas_diarias(cursor, dias)
+            conn.commit()
+            cursor.close()
+            self.logger.info(f"📅 ventas_diarias recalculada para {len(dias)} día(s) tienda")
+        except Exception as e:
+            conn.rollback()
+            self.logger.error(f"❌ Error recalculando ventas_diarias: {e}")
+
+        try:
+            cursor = conn.cursor()
+            refrescar_ventas_horarias(cursor, dias)
+            vencidas = tiendas_con_baseline_vencido(cursor, dias)
+            refrescar_baselines_dow(cursor, vencidas)
+            conn.commit()
+            cursor.close()
+            self.logger.info(f"🕐 ventas_horarias recalculada para {len(dias)} día(s) tienda")
+        except Exception as e:
+            conn.rollback()
+            self.logger.error(f"❌ Error recalculando ventas_horarias: {e}")
+
     def _refresh_materialized_views(self, conn) -> None:
         """
         Refresh materialized views after ventas load.
@@ -29,8 +29,13 @@ Schema PostgreSQL existente (tabla ventas):
 import psycopg2
 import psycopg2.extras
 import pandas as pd
+import csv
+import io
 import json
-from typing import Optional, Dict, Any, List
+import os
+import time
+import uuid
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 import logging
 from pathlib import Path
@@ -40,15 +45,44 @@ import sys
 sys.path.append(str(Path(__file__).parent.parent.parent / 'backend'))
 from db_config import POSTGRES_DSN
 
+try:
+    from core.ventas_diarias import dias_tocados, refrescar_ventas_diarias
+    from core.ventas_horarias import (
+        refrescar_baselines_dow, refrescar_ventas_horarias, tiendas_con_baseline_vencido
+    )
+except ImportError:
+    from ventas_diarias import dias_tocados, refrescar_ventas_diarias
+    from ventas_horarias import (
+        refrescar_baselines_dow, refrescar_ventas_horarias, tiendas_con_baseline_vencido
+    )
+
 logger = logging.getLogger('etl_ventas_postgres')
 
+# Modo de carga: 'upsert' (execute_values + ON CONFLICT) o 'copy'
+# (COPY a staging UNLOGGED + un solo upsert set-based; recomendado para backfills)
+VENTAS_LOAD_MODE = os.getenv('VENTAS_LOAD_MODE', 'upsert').lower()
+
+# Columnas de ventas en el orden de los registros armados por load_ventas_raw
+VENTAS_COLUMNS = [
+    'numero_factura', 'fecha_venta', 'ubicacion_id', 'almacen_codigo', 'almacen_nombre',
+    'producto_id', 'cuadrante_producto', 'cantidad_vendida', 'peso_unitario', 'peso_calculado',
+    'total_cantidad_por_unidad_medida', 'unidad_medida_venta', 'factor_unidad_medida',
+    'precio_unitario', 'costo_unitario', 'venta_total', 'costo_total',
+    'utilidad_bruta', 'margen_bruto_pct', 'fecha_creacion',
+]
+
 
 class PostgreSQLVentasLoader:
     """Cargador de ventas a PostgreSQL"""
 
-    def __init__(self):
+    def __init__(self, load_mode: Optional[str] = None):
+        """
+        Args:
+            load_mode: 'upsert' o 'copy' (default: env VENTAS_LOAD_MODE)
+        """
         self.dsn = POSTGRES_DSN
         self.logger = logger
+        self.load_mode = (load_mode or VENTAS_LOAD_MODE).lower()
         self._setup_logger()
 
     def _setup_logger(self):
@@ -76,7 +110,8 @@ class PostgreSQLVentasLoader:
             tienda_codigo: Codigo de tienda (ej: SUC001)
 
         Returns:
-            Dict con success, records_loaded, duplicates_skipped
+            Dict con success, records_loaded, duplicates_skipped, load_mode,
+            load_seconds y rows_per_second (throughput de la escritura en BD)
         """
         if not ventas_data:
             self.logger.warning("Lista de ventas vacia")
@@ -220,84 +255,46 @@ class PostgreSQLVentasLoader:
                     datetime.now()
                 ))
 
-            # De-duplicar batch_data por numero_factura_unico (índice 0)
-            # El API KLK a veces retorna líneas duplicadas en el mismo response
-            # execute_values falla con "ON CONFLICT cannot affect row a second time"
-            original_count = len(batch_data)
-            seen = {}
-            for record in batch_data:
-                seen[record[0]] = record  # Mantener última ocurrencia
-            batch_data = list(seen.values())
-            duplicates_in_batch = original_count - len(batch_data)
-            if duplicates_in_batch > 0:
-                self.logger.info(f"   ⚠️ {duplicates_in_batch} duplicados en batch removidos antes de insertar")
-
-            # Ejecutar batch upsert usando execute_values para mejor rendimiento
-            # y menor probabilidad de deadlocks (un solo INSERT en lugar de N)
-            try:
-                from psycopg2.extras import execute_values
-
-                # execute_values requiere la query con %s como placeholder para VALUES
-                batch_upsert_query = """
-                    INSERT INTO ventas (
-                        numero_factura, fecha_venta, ubicacion_id, almacen_codigo, almacen_nombre,
-                        producto_id, cuadrante_producto, cantidad_vendida, peso_unitario, peso_calculado,
-                        total_cantidad_por_unidad_medida, unidad_medida_venta, factor_unidad_medida,
-                        precio_unitario, costo_unitario, venta_total, costo_total,
-                        utilidad_bruta, margen_bruto_pct, fecha_creacion
-                    )
-                    VALUES %s
-                    ON CONFLICT (numero_factura) DO UPDATE SET
-                        fecha_venta = EXCLUDED.fecha_venta,
-                        ubicacion_id = EXCLUDED.ubicacion_id,
-                        almacen_codigo = EXCLUDED.almacen_codigo,
-                        almacen_nombre = EXCLUDED.almacen_nombre,
-                        producto_id = EXCLUDED.producto_id,
-                        cuadrante_producto = EXCLUDED.cuadrante_producto,
-                        cantidad_vendida = EXCLUDED.cantidad_vendida,
-                        peso_unitario = EXCLUDED.peso_unitario,
-                        peso_calculado = EXCLUDED.peso_calculado,
-                        total_cantidad_por_unidad_medida = EXCLUDED.total_cantidad_por_unidad_medida,
-                        unidad_medida_venta = EXCLUDED.unidad_medida_venta,
-                        factor_unidad_medida = EXCLUDED.factor_unidad_medida,
-                        precio_unitario = EXCLUDED.precio_unitario,
-                        costo_unitario = EXCLUDED.costo_unitario,
-                        venta_total = EXCLUDED.venta_total,
-                        costo_total = EXCLUDED.costo_total,
-                        utilidad_bruta = EXCLUDED.utilidad_bruta,
-                        margen_bruto_pct = EXCLUDED.margen_bruto_pct,
-                        fecha_creacion = EXCLUDED.fecha_creacion
-                """
-
-                # Ejecutar en batches de 1000 registros para evitar queries muy grandes
-                execute_values(cursor, batch_upsert_query, batch_data, page_size=1000)
-                records_loaded = len(batch_data)
-
-            except Exception as e:
-                self.logger.error(f"Error en batch insert: {e}")
-                conn.rollback()
-                # Fallback: insertar uno por uno si batch falla
-                self.logger.warning("Intentando fallback con inserciones individuales...")
-                for record in batch_data:
-                    try:
-                        cursor.execute(upsert_query, record)
-                        records_loaded += 1
-                    except Exception as e2:
-                        self.logger.warning(f"Error insertando registro: {e2}")
-                        conn.rollback()
-                        duplicates_skipped += 1
+            inicio_carga = time.perf_counter()
+            load_mode = self.load_mode
+
+            if load_mode == 'copy':
+                try:
+                    records_loaded, duplicates_in_batch = self._load_copy(cursor, batch_data)
+                    if duplicates_in_batch > 0:
+                        self.logger.info(f"   ⚠️ {duplicates_in_batch} duplicados en batch resueltos en el merge")
+                except Exception as e:
+                    self.logger.warning(f"⚠️ Carga COPY falló ({e}); usando upsert con execute_values")
+                    conn.rollback()
+                    load_mode = 'upsert'
+
+            if load_mode != 'copy':
+                records_loaded, duplicates_skipped = self._load_upsert(conn, cursor, batch_data, upsert_query)
+
+            dias_refrescados = self._refrescar_agregados(cursor, batch_data)
 
             conn.commit()
             cursor.close()
             conn.close()
 
-            self.logger.info(f"✅ Ventas cargadas: {records_loaded} nuevas, {duplicates_skipped} duplicados/errores omitidos")
+            load_seconds = time.perf_counter() - inicio_carga
+            rows_per_second = records_loaded / load_seconds if load_seconds > 0 else 0.0
+
+            self.logger.info(
+                f"✅ Ventas cargadas: {records_loaded} nuevas, {duplicates_skipped} duplicados/errores omitidos "
+                f"({load_mode}, {load_seconds:.2f}s, {rows_per_second:,.0f} filas/s)"
+            )
+            if dias_refrescados:
+                self.logger.info(f"   📅 Agregados diarios/horarios recalculados para {dias_refrescados} día(s) tienda")
 
             return {
                 "success": True,
                 "message": f"{records_loaded} ventas cargadas",
                 "records_loaded": records_loaded,
-                "duplicates_skipped": duplicates_skipped
+                "duplicates_skipped": duplicates_skipped,
+                "load_mode": load_mode,
+                "load_seconds": round(load_seconds, 3),
+                "rows_per_second": round(rows_per_second, 1)
             }
 
         except Exception as e:
@@ -311,6 +308,171 @@ class PostgreSQLVentasLoader:
                 "duplicates_skipped": 0
             }
 
+    def _load_upsert(self, conn, cursor, batch_data: List[tuple], upsert_query: str) -> Tuple[int, int]:
+        """
+        Carga con execute_values + ON CONFLICT DO UPDATE (modo 'upsert').
+        Si el batch falla, reintenta registro por registro.
+
+        Returns: (records_loaded, duplicates_skipped)
+        """
+        records_loaded = 0
+        duplicates_skipped = 0
+
+        # De-duplicar batch_data por numero_factura_unico (índice 0)
+        # El API KLK a veces retorna líneas duplicadas en el mismo response
+        # execute_values falla con "ON CONFLICT cannot affect row a second time"
+        original_count = len(batch_data)
+        seen = {}
+        for record in batch_data:
+            seen[record[0]] = record  # Mantener última ocurrencia
+        batch_data = list(seen.values())
+        duplicates_in_batch = original_count - len(batch_data)
+        if duplicates_in_batch > 0:
+            self.logger.info(f"   ⚠️ {duplicates_in_batch} duplicados en batch removidos antes de insertar")
+
+        # Ejecutar batch upsert usando execute_values para mejor rendimiento
+        # y menor probabilidad de deadlocks (un solo INSERT en lugar de N)
+        try:
+            from psycopg2.extras import execute_values
+
+            # execute_values requiere la query con %s como placeholder para VALUES
+            batch_upsert_query = """
+                INSERT INTO ventas (
+                    numero_factura, fecha_venta, ubicacion_id, almacen_codigo, almacen_nombre,
+                    producto_id, cuadrante_producto, cantidad_vendida, peso_unitario, peso_calculado,
+                    total_cantidad_por_unidad_medida, unidad_medida_venta, factor_unidad_medida,
+                    precio_unitario, costo_unitario, venta_total, costo_total,
+                    utilidad_bruta, margen_bruto_pct, fecha_creacion
+                )
+                VALUES %s
+                ON CONFLICT (numero_factura) DO UPDATE SET
+                    fecha_venta = EXCLUDED.fecha_venta,
+                    ubicacion_id = EXCLUDED.ubicacion_id,
+                    almacen_codigo = EXCLUDED.almacen_codigo,
+                    almacen_nombre = EXCLUDED.almacen_nombre,
+                    producto_id = EXCLUDED.producto_id,
+                    cuadrante_producto = EXCLUDED.cuadrante_producto,
+                    cantidad_vendida = EXCLUDED.cantidad_vendida,
+                    peso_unitario = EXCLUDED.peso_unitario,
+                    peso_calculado = EXCLUDED.peso_calculado,
+                    total_cantidad_por_unidad_medida = EXCLUDED.total_cantidad_por_unidad_medida,
+                    unidad_medida_venta = EXCLUDED.unidad_medida_venta,
+                    factor_unidad_medida = EXCLUDED.factor_unidad_medida,
+                    precio_unitario = EXCLUDED.precio_unitario,
+                    costo_unitario = EXCLUDED.costo_unitario,
+                    venta_total = EXCLUDED.venta_total,
+                    costo_total = EXCLUDED.costo_total,
+                    utilidad_bruta = EXCLUDED.utilidad_bruta,
+                    margen_bruto_pct = EXCLUDED.margen_bruto_pct,
+                    fecha_creacion = EXCLUDED.fecha_creacion
+            """
+
+            # Ejecutar en batches de 1000 registros para evitar queries muy grandes
+            execute_values(cursor, batch_upsert_query, batch_data, page_size=1000)
+            records_loaded = len(batch_data)
+
+        except Exception as e:
+            self.logger.error(f"Error en batch insert: {e}")
+            conn.rollback()
+            # Fallback: insertar uno por uno si batch falla
+            self.logger.warning("Intentando fallback con inserciones individuales...")
+            for record in batch_data:
+                try:
+                    cursor.execute(upsert_query, record)
+                    records_loaded += 1
+                except Exception as e2:
+                    self.logger.warning(f"Error insertando registro: {e2}")
+                    conn.rollback()
+                    duplicates_skipped += 1
+
+        return records_loaded, duplicates_skipped
+
+    def _refrescar_agregados(self, cursor, batch_data: List[tuple]) -> int:
+        """
+        Recalcula ventas_diarias, ventas_horarias y (si vencieron) los baselines
+        por día de semana para los días (ubicacion_id, fecha) del lote, en la
+        transacción de la carga. Cada agregado corre bajo su SAVEPOINT: si uno
+        falla, las ventas se cargan igual y el día se corrige en la próxima
+        carga que lo toque.
+
+        Returns: días (ubicación, fecha) recalculados en ventas_diarias
+        """
+        # Índices en el registro: 1 = fecha_venta, 2 = ubicacion_id
+        dias = dias_tocados((record[2], record[1]) for record in batch_data)
+        if not dias:
+            return 0
+
+        def diarias():
+            refrescar_ventas_diarias(cursor, dias)
+
+        def horarias():
+            refrescar_ventas_horarias(cursor, dias)
+            vencidas = tiendas_con_baseline_vencido(cursor, dias)
+            if vencidas:
+                refrescar_baselines_dow(cursor, vencidas)
+                self.logger.info(f"   📐 Baselines por día de semana recalculados: {', '.join(vencidas)}")
+
+        ok_diarias = self._en_savepoint(cursor, 'ventas_diarias', diarias)
+        self._en_savepoint(cursor, 'ventas_horarias', horarias)
+        return len(dias) if ok_diarias else 0
+
+    def _en_savepoint(self, cursor, nombre: str, funcion) -> bool:
+        """Ejecuta `funcion` bajo un SAVEPOINT; si falla, revierte solo ese paso"""
+        cursor.execute(f"SAVEPOINT {nombre}")
+        try:
+            funcion()
+            cursor.execute(f"RELEASE SAVEPOINT {nombre}")
+            return True
+        except Exception as e:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {nombre}")
+            self.logger.warning(f"⚠️ No se pudo recalcular {nombre}: {e}")
+            return False
+
+    def _load_copy(self, cursor, batch_data: List[tuple]) -> Tuple[int, int]:
+        """
+        Carga por COPY (modo 'copy'):
+
+        1. COPY del lote completo a ventas_staging (UNLOGGED, sin WAL) desde
+           un buffer CSV en memoria, con lote_id y ordinal por fila.
+        2. Un solo INSERT ... SELECT DISTINCT ON (numero_factura) hacia ventas
+           con ON CONFLICT DO UPDATE. La última ocurrencia de cada factura en
+           el lote gana (misma regla que el de-duplicado en Python).
+        3. DELETE del lote en staging, en la misma transacción.
+
+        Returns: (records_loaded, duplicates_in_batch)
+        """
+        lote_id = str(uuid.uuid4())
+
+        # None se escribe como \N (marcador NULL del COPY); '' queda como string vacío
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for ordinal, record in enumerate(batch_data):
+            writer.writerow([lote_id, ordinal] + ['\\N' if v is None else v for v in record])
+        buffer.seek(0)
+
+        columnas = ', '.join(VENTAS_COLUMNS)
+        cursor.copy_expert(
+            f"COPY ventas_staging (lote_id, ordinal, {columnas}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+
+        update_set = ',\n                '.join(
+            f"{c} = EXCLUDED.{c}" for c in VENTAS_COLUMNS if c != 'numero_factura'
+        )
+        cursor.execute(f"""
+            INSERT INTO ventas ({columnas})
+            SELECT DISTINCT ON (numero_factura) {columnas}
+            FROM ventas_staging
+            WHERE lote_id = %s
+            ORDER BY numero_factura, ordinal DESC
+            ON CONFLICT (numero_factura) DO UPDATE SET
+                {update_set}
+        """, [lote_id])
+        records_loaded = cursor.rowcount
+
+        cursor.execute("DELETE FROM ventas_staging WHERE lote_id = %s", [lote_id])
+        return records_loaded, len(batch_data) - records_loaded
+
     def get_ultima_venta_tienda(self, ubicacion_id: str) -> Optional[datetime]:
         """
         Obtiene la fecha/hora de la ultima venta registrada para una tienda.
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento incremental de ventas_diarias
+
+ventas_diarias guarda por (ubicacion_id, producto_id, fecha) las unidades,
+venta, costo y número de transacciones del día. Los loaders de ventas la
+actualizan después de cada carga recalculando desde ventas solo los días
+(ubicación, fecha) que tocó el lote, dentro de la misma transacción: el
+agregado nunca queda adelantado ni atrasado respecto a las líneas.
+
+El recálculo es por día completo (no suma deltas), así que es idempotente
+ante re-extracciones, upserts que corrigen líneas y recuperación de gaps.
+"""
+
+from datetime import date, datetime
+from typing import Iterable, List, Tuple
+
+def dias_tocados(pares: Iterable[Tuple[str, object]]) -> List[Tuple[str, date]]:
+    """
+    (ubicacion_id, fecha_venta) -> lista ordenada de (ubicacion_id, fecha)
+    únicos. Acepta datetime, pd.Timestamp o date; ignora fechas nulas.
+    """
+    dias = set()
+    for ubicacion_id, fecha_venta in pares:
+        if ubicacion_id is None or fecha_venta is None or fecha_venta != fecha_venta:
+            continue
+        if isinstance(fecha_venta, datetime):
+            fecha_venta = fecha_venta.date()
+        dias.add((ubicacion_id, fecha_venta))
+    return sorted(dias)
+
+
+def refrescar_ventas_diarias(cursor, dias: List[Tuple[str, date]]) -> int:
+    """
+    Recalcula ventas_diarias para los días (ubicacion_id, fecha) dados.
+
+    Borra el agregado de esos días (un producto que dejó de tener ventas
+    en el día no queda colgado) y lo vuelve a insertar agrupando ventas por
+    rango de fecha_venta (usa idx_ventas_ubicacion_fecha). No hace commit:
+    corre en la transacción de la carga.
+
+    Returns:
+        Filas (ubicación, producto, día) escritas
+    """
+    if not dias:
+        return 0
+
+    ubicaciones = [d[0] for d in dias]
+    fechas = [d[1] for d in dias]
+
+    cursor.execute("""
+        DELETE FROM ventas_diarias vd
+        USING unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        WHERE vd.ubicacion_id = d.ubicacion_id
+          AND vd.fecha = d.fecha
+    """, (ubicaciones, fechas))
+
+    # ON CONFLICT: otra carga concurrente pudo recalcular el mismo día
+    cursor.execute("""
+        INSERT INTO ventas_diarias (
+            ubicacion_id, producto_id, fecha,
+            cantidad_vendida, venta_total, costo_total, num_transacciones, updated_at
+        )
+        SELECT
+            v.ubicacion_id,
+            v.producto_id,
+            d.fecha,
+            COALESCE(SUM(v.cantidad_vendida), 0),
+            COALESCE(SUM(v.venta_total), 0),
+            COALESCE(SUM(v.costo_total), 0),
+            -- Ticket = numero_factura sin el sufijo de línea de KLK (igual que la migración 036)
+            COUNT(DISTINCT regexp_replace(v.numero_factura, '_L[0-9]+$', '')),
+            CURRENT_TIMESTAMP
+        FROM unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        JOIN ventas v
+          ON v.ubicacion_id = d.ubicacion_id
+         AND v.fecha_venta >= d.fecha
+         AND v.fecha_venta < d.fecha + 1
+        GROUP BY v.ubicacion_id, v.producto_id, d.fecha
+        ON CONFLICT (ubicacion_id, producto_id, fecha) DO UPDATE SET
+            cantidad_vendida = EXCLUDED.cantidad_vendida,
+            venta_total = EXCLUDED.venta_total,
+            costo_total = EXCLUDED.costo_total,
+            num_transacciones = EXCLUDED.num_transacciones,
+            updated_at = EXCLUDED.updated_at
+    """, (ubicaciones, fechas))
+    return cursor.rowcount
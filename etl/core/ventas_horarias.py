@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento incremental de ventas_horarias y baselines por día de semana
+
+ventas_horarias agrega ventas por (ubicación, fecha, hora, producto, almacén)
+y guarda dia_semana como columna, para que el detector de emergencias y el
+scan de agotados visuales lean horas ya agregadas en vez de líneas de ventas.
+Igual que ventas_diarias, se recalcula por día completo para los días
+(ubicación, fecha) tocados por cada carga.
+
+Los baselines del mismo día de semana (promedio de las últimas 4 semanas) se
+recalculan por tienda una vez al día, o antes si una carga toca un día de la
+ventana (recuperación de gaps, re-extracciones). En ese mismo paso se purgan
+las horas más viejas que VENTAS_HORARIAS_RETENCION_DIAS.
+
+Configuración (env):
+    VENTAS_HORARIAS_RETENCION_DIAS: días de rollup horario a conservar (default 60)
+"""
+
+import os
+from datetime import date, timedelta
+from typing import List, Tuple
+
+VENTAS_HORARIAS_RETENCION_DIAS = int(os.getenv('VENTAS_HORARIAS_RETENCION_DIAS', '60'))
+
+# Días previos a fecha_corte que cubren los baselines (4 semanas)
+BASELINE_VENTANA_DIAS = 28
+
+def refrescar_ventas_horarias(cursor, dias: List[Tuple[str, date]]) -> int:
+    """
+    Recalcula ventas_horarias para los días (ubicacion_id, fecha) dados
+    (borra y re-inserta el día completo). No hace commit.
+
+    Returns:
+        Filas (ubicación, fecha, hora, producto, almacén) escritas
+    """
+    if not dias:
+        return 0
+
+    ubicaciones = [d[0] for d in dias]
+    fechas = [d[1] for d in dias]
+
+    cursor.execute("""
+        DELETE FROM ventas_horarias vh
+        USING unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        WHERE vh.ubicacion_id = d.ubicacion_id
+          AND vh.fecha = d.fecha
+    """, (ubicaciones, fechas))
+
+    cursor.execute("""
+        INSERT INTO ventas_horarias (
+            ubicacion_id, fecha, hora, producto_id, almacen_codigo, dia_semana,
+            cantidad_vendida, venta_total, num_lineas, primera_venta, ultima_venta, updated_at
+        )
+        SELECT
+            v.ubicacion_id,
+            d.fecha,
+            EXTRACT(HOUR FROM v.fecha_venta)::smallint,
+            v.producto_id,
+            COALESCE(v.almacen_codigo, ''),
+            EXTRACT(DOW FROM d.fecha)::smallint,
+            COALESCE(SUM(v.cantidad_vendida), 0),
+            COALESCE(SUM(v.venta_total), 0),
+            COUNT(*),
+            MIN(v.fecha_venta),
+            MAX(v.fecha_venta),
+            CURRENT_TIMESTAMP
+        FROM unnest(%s::varchar[], %s::date[]) AS d(ubicacion_id, fecha)
+        JOIN ventas v
+          ON v.ubicacion_id = d.ubicacion_id
+         AND v.fecha_venta >= d.fecha
+         AND v.fecha_venta < d.fecha + 1
+        GROUP BY v.ubicacion_id, d.fecha, EXTRACT(HOUR FROM v.fecha_venta),
+                 v.producto_id, COALESCE(v.almacen_codigo, '')
+        ON CONFLICT (ubicacion_id, fecha, hora, producto_id, almacen_codigo) DO UPDATE SET
+            dia_semana = EXCLUDED.dia_semana,
+            cantidad_vendida = EXCLUDED.cantidad_vendida,
+            venta_total = EXCLUDED.venta_total,
+            num_lineas = EXCLUDED.num_lineas,
+            primera_venta = EXCLUDED.primera_venta,
+            ultima_venta = EXCLUDED.ultima_venta,
+            updated_at = EXCLUDED.updated_at
+    """, (ubicaciones, fechas))
+    return cursor.rowcount
+
+
+def tiendas_con_baseline_vencido(cursor, dias: List[Tuple[str, date]], hoy: date = None) -> List[str]:
+    """
+    Tiendas de `dias` cuyo baseline hay que recalcular: no tiene corte de hoy
+    o la carga tocó un día de la ventana de 4 semanas.
+    """
+    hoy = hoy or date.today()
+    ubicaciones = sorted({d[0] for d in dias})
+    if not ubicaciones:
+        return []
+
+    inicio_ventana = hoy - timedelta(days=BASELINE_VENTANA_DIAS)
+    vencidas = {u for u, fecha in dias if inicio_ventana <= fecha < hoy}
+
+    cursor.execute("""
+        SELECT u.ubicacion_id
+        FROM unnest(%s::varchar[]) AS u(ubicacion_id)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM ventas_baseline_tienda_dow b
+            WHERE b.ubicacion_id = u.ubicacion_id
+              AND b.fecha_corte = %s
+        )
+    """, (ubicaciones, hoy))
+    vencidas.update(row[0] for row in cursor.fetchall())
+    return sorted(vencidas)
+
+
+def refrescar_baselines_dow(cursor, ubicaciones: List[str], hoy: date = None) -> None:
+    """
+    Recalcula los baselines del mismo día de semana de `ubicaciones` con
+    corte `hoy` (días con ventas en [hoy - 28, hoy)) y purga el rollup
+    horario fuera de la retención. No hace commit.
+    """
+    if not ubicaciones:
+        return
+    hoy = hoy or date.today()
+    inicio_ventana = hoy - timedelta(days=BASELINE_VENTANA_DIAS)
+
+    cursor.execute("DELETE FROM ventas_baseline_tienda_dow WHERE ubicacion_id = ANY(%s)", (ubicaciones,))
+    cursor.execute("""
+        INSERT INTO ventas_baseline_tienda_dow (
+            ubicacion_id, dia_semana, fecha_corte, promedio_venta_dia, dias_muestra
+        )
+        SELECT ubicacion_id, dia_semana, %s, AVG(total_dia), COUNT(*)
+        FROM (
+            SELECT ubicacion_id, fecha, dia_semana, SUM(venta_total) AS total_dia
+            FROM ventas_horarias
+            WHERE ubicacion_id = ANY(%s)
+              AND fecha >= %s
+              AND fecha < %s
+            GROUP BY ubicacion_id, fecha, dia_semana
+        ) por_dia
+        GROUP BY ubicacion_id, dia_semana
+    """, (hoy, ubicaciones, inicio_ventana, hoy))
+
+    cursor.execute("DELETE FROM ventas_baseline_producto_hora WHERE ubicacion_id = ANY(%s)", (ubicaciones,))
+    cursor.execute("""
+        INSERT INTO ventas_baseline_producto_hora (
+            ubicacion_id, producto_id, dia_semana, hora, fecha_corte, promedio_cantidad, dias_muestra
+        )
+        SELECT ubicacion_id, producto_id, dia_semana, hora, %s, AVG(cantidad), COUNT(*)
+        FROM (
+            SELECT ubicacion_id, producto_id, fecha, dia_semana, hora, SUM(cantidad_vendida) AS cantidad
+            FROM ventas_horarias
+            WHERE ubicacion_id = ANY(%s)
+              AND fecha >= %s
+              AND fecha < %s
+            GROUP BY ubicacion_id, producto_id, fecha, dia_semana, hora
+        ) por_hora
+        GROUP BY ubicacion_id, producto_id, dia_semana, hora
+    """, (hoy, ubicaciones, inicio_ventana, hoy))
+
+    cursor.execute("""
+        DELETE FROM ventas_horarias
+        WHERE ubicacion_id = ANY(%s)
+          AND fecha < %s
+    """, (ubicaciones, hoy - timedelta(days=VENTAS_HORARIAS_RETENCION_DIAS)))
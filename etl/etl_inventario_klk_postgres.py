@@ -18,8 +18,14 @@ sys.path.insert(0, str(CORE_DIR))
 
 import os
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+import pandas as pd
 
 # Set DB_MODE to postgresql BEFORE any other imports
 os.environ['DB_MODE'] = 'postgresql'
@@ -43,6 +49,17 @@ try:
 except ImportError:
     SENTRY_AVAILABLE = False
 
+try:
+    from core.execution_tracker import ExecutionTracker, ETLPhase, TiendaResult
+    EXECUTION_TRACKER_AVAILABLE = True
+except ImportError:
+    EXECUTION_TRACKER_AVAILABLE = False
+
+# Tiendas extrayendo en paralelo (1 = secuencial). El rate limit del API KLK
+# se configura en el extractor (KLK_API_MAX_RPS, default 0 = sin límite) y lo
+# comparten todos los workers: conviene fijarlo al subir los workers.
+ETL_INVENTARIO_WORKERS = int(os.getenv('ETL_INVENTARIO_WORKERS', '1'))
+
 
 class InventarioKLKETLPostgres:
     """
@@ -50,12 +67,14 @@ class InventarioKLKETLPostgres:
     Extrae desde KLK API → Transforma → Carga a PostgreSQL
     """
 
-    def __init__(self, dry_run: bool = False):
+    def __init__(self, dry_run: bool = False, workers: Optional[int] = None):
         """
         Args:
             dry_run: Si True, no carga datos (solo extrae y transforma)
+            workers: Tiendas extrayendo en paralelo (default: env ETL_INVENTARIO_WORKERS)
         """
         self.dry_run = dry_run
+        self.workers = max(1, workers or ETL_INVENTARIO_WORKERS)
         self.logger = self._setup_logger()
 
         # Componentes ETL
@@ -63,8 +82,15 @@ class InventarioKLKETLPostgres:
         self.transformer = InventarioKLKTransformer()
         self.loader = PostgreSQLInventarioLoader()
 
+        # Un extractor (requests.Session) por hilo de extracción
+        self._local = threading.local()
+        self._local.extractor = self.extractor
+        self._extractores = [self.extractor]
+        self._extractores_lock = threading.Lock()
+
         # Tracking (opcional)
         self.tracker = ETLTracker() if TRACKER_AVAILABLE else None
+        self.execution_tracker = ExecutionTracker() if EXECUTION_TRACKER_AVAILABLE else None
 
         # Estadísticas
         self.stats = {
@@ -96,6 +122,15 @@ class InventarioKLKETLPostgres:
 
         return logger
 
+    def _get_extractor(self) -> InventarioKLKExtractor:
+        """Extractor del hilo actual (requests.Session no es thread-safe)"""
+        extractor = getattr(self._local, 'extractor', None)
+        if extractor is None:
+            extractor = self._local.extractor = InventarioKLKExtractor()
+            with self._extractores_lock:
+                self._extractores.append(extractor)
+        return extractor
+
     def procesar_tienda(self, config: TiendaConfig) -> bool:
         """
         Procesa una tienda individual: extrae TODOS los almacenes activos, transforma y carga a PostgreSQL
@@ -103,6 +138,18 @@ class InventarioKLKETLPostgres:
         Returns:
             True si exitoso, False si falló
         """
+        contexto = self._iniciar_tienda(config)
+        self._abrir_monitor_sentry(config, contexto)
+        extraccion = self._extraer_tienda(config, contexto)
+        return self._cargar_tienda(config, contexto, extraccion)
+
+    def _iniciar_tienda(self, config: TiendaConfig) -> Dict[str, Any]:
+        """
+        Inicia tracking (ETLTracker) y timing de una tienda.
+
+        Returns:
+            Contexto de la tienda para _extraer_tienda / _cargar_tienda
+        """
         tienda_id = config.ubicacion_id
         tienda_nombre = config.ubicacion_nombre
 
@@ -110,11 +157,21 @@ class InventarioKLKETLPostgres:
         self.logger.info(f"🏪 PROCESANDO: {tienda_nombre} ({tienda_id})")
         self.logger.info(f"{'='*80}")
 
+        contexto = {
+            'ejecucion_id': None,
+            'sentry_monitor': None,
+            'registros_extraidos': 0,
+            'error': None,
+            'resultado': TiendaResult(
+                tienda_id=tienda_id,
+                tienda_nombre=tienda_nombre,
+                source_system='klk',
+                started_at=datetime.now()
+            ) if EXECUTION_TRACKER_AVAILABLE else None
+        }
+
         # Tracking: Iniciar ejecución
-        ejecucion_id = None
         fecha_hoy = datetime.now().date()
-        registros_extraidos = 0
-
         if self.tracker:
             ejecucion = ETLEjecucion(
                 etl_tipo='inventario_postgres',
@@ -124,46 +181,64 @@ class InventarioKLKETLPostgres:
                 fecha_hasta=fecha_hoy,
                 modo='postgresql'
             )
-            ejecucion_id = self.tracker.iniciar_ejecucion(ejecucion)
+            contexto['ejecucion_id'] = self.tracker.iniciar_ejecucion(ejecucion)
 
-        # Sentry: Iniciar monitoreo
-        sentry_monitor = None
-        if SENTRY_AVAILABLE:
-            sentry_monitor = SentryETLMonitor(
-                etl_name="inventario_klk_postgres",
-                tienda_id=tienda_id,
-                fecha_inicio=str(fecha_hoy),
-                fecha_fin=str(fecha_hoy),
-                extra_context={"modo": "postgresql", "db": "AWS RDS"}
-            )
-            sentry_monitor.__enter__()
+        return contexto
+
+    def _abrir_monitor_sentry(self, config: TiendaConfig, contexto: Dict[str, Any]):
+        """
+        Sentry: Iniciar monitoreo. La transacción vive en el scope del hilo,
+        así que se abre en el mismo hilo que la cierra (_cargar_tienda).
+        """
+        if not SENTRY_AVAILABLE:
+            return
+        fecha_hoy = str(datetime.now().date())
+        sentry_monitor = SentryETLMonitor(
+            etl_name="inventario_klk_postgres",
+            tienda_id=config.ubicacion_id,
+            fecha_inicio=fecha_hoy,
+            fecha_fin=fecha_hoy,
+            extra_context={"modo": "postgresql", "db": "AWS RDS"}
+        )
+        sentry_monitor.__enter__()
+        contexto['sentry_monitor'] = sentry_monitor
+
+    def _extraer_tienda(self, config: TiendaConfig, contexto: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        PASOS 1 y 2: extrae todos los almacenes activos y transforma.
+        No lanza excepciones: un error queda en contexto['error'].
+
+        Returns:
+            {'df_productos', 'df_stock'} o None si no hay datos válidos
+        """
+        tienda_nombre = config.ubicacion_nombre
+        inicio = time.perf_counter()
 
         try:
             # PASO 1: EXTRACCIÓN DE TODOS LOS ALMACENES ACTIVOS
-            self.logger.info(f"\n📡 PASO 1/3: Extrayendo inventario desde KLK API...")
+            self.logger.info(f"\n📡 PASO 1/3: Extrayendo inventario de {tienda_nombre} desde KLK API...")
 
             # Usar el método que extrae todos los almacenes activos
-            dfs_raw = self.extractor.extract_all_almacenes_tienda(config)
+            dfs_raw = self._get_extractor().extract_all_almacenes_tienda(config)
 
             if not dfs_raw:
                 self.logger.error(f"❌ No se pudo extraer inventario de {tienda_nombre}")
-                return False
+                return None
 
             # Combinar todos los DataFrames de almacenes
-            import pandas as pd
             df_raw = pd.concat(dfs_raw, ignore_index=True)
 
             registros_extraidos = len(df_raw)
-            self.logger.info(f"✅ Extraídos {registros_extraidos:,} productos de {len(dfs_raw)} almacén(es)")
-            self.stats['total_productos_extraidos'] += registros_extraidos
+            contexto['registros_extraidos'] = registros_extraidos
+            self.logger.info(f"✅ {tienda_nombre}: extraídos {registros_extraidos:,} productos de {len(dfs_raw)} almacén(es)")
 
             # PASO 2: TRANSFORMACIÓN
-            self.logger.info(f"\n🔄 PASO 2/3: Transformando datos al esquema PostgreSQL...")
+            self.logger.info(f"\n🔄 PASO 2/3: Transformando {tienda_nombre} al esquema PostgreSQL...")
             df_productos, df_stock = self.transformer.transform(df_raw)
 
             if df_productos.empty or df_stock.empty:
                 self.logger.error(f"❌ Error en transformación de {tienda_nombre}")
-                return False
+                return None
 
             # Validar datos transformados
             validacion = self.transformer.validate_transformed_data(df_productos, df_stock)
@@ -171,15 +246,60 @@ class InventarioKLKETLPostgres:
             if not validacion['valido']:
                 self.logger.error(f"❌ Validación falló para {tienda_nombre}")
                 self.logger.error(f"Errores: {validacion['errores']}")
-                return False
+                return None
 
-            self.logger.info(f"✅ Transformación exitosa:")
+            self.logger.info(f"✅ Transformación exitosa ({tienda_nombre}):")
             self.logger.info(f"   - Productos: {len(df_productos):,}")
             self.logger.info(f"   - Stock: {len(df_stock):,}")
 
+            return {'df_productos': df_productos, 'df_stock': df_stock}
+
+        except Exception as e:
+            self.logger.error(f"❌ Error extrayendo {tienda_nombre}: {e}")
+            contexto['error'] = e
+            contexto['error_phase'] = ETLPhase.EXTRACT if EXECUTION_TRACKER_AVAILABLE else None
+            return None
+
+        finally:
+            if contexto['resultado']:
+                contexto['resultado'].extract_seconds = round(time.perf_counter() - inicio, 3)
+
+    def _cargar_tienda(
+        self,
+        config: TiendaConfig,
+        contexto: Dict[str, Any],
+        extraccion: Optional[Dict[str, Any]]
+    ) -> bool:
+        """
+        PASO 3: carga a PostgreSQL y cierra el tracking de la tienda.
+
+        Returns:
+            True si exitoso, False si falló
+        """
+        tienda_nombre = config.ubicacion_nombre
+        registros_extraidos = contexto['registros_extraidos']
+        ejecucion_id = contexto['ejecucion_id']
+        sentry_monitor = contexto['sentry_monitor']
+        self.stats['total_productos_extraidos'] += registros_extraidos
+
+        if contexto['error'] is not None:
+            # _extraer_tienda ya lo logueó: solo registrar el fallo
+            self._finalizar_fallida(contexto, contexto['error'], contexto.get('error_phase'))
+            return False
+
+        if extraccion is None:
+            self._registrar_tienda(contexto, 'failed', mensaje='Sin datos válidos de inventario')
+            if sentry_monitor:
+                sentry_monitor.__exit__(None, None, None)
+            return False
+
+        try:
+            df_productos = extraccion['df_productos']
+            df_stock = extraccion['df_stock']
+
             # PASO 3: CARGA A POSTGRESQL
             if self.dry_run:
-                self.logger.info(f"\n⚠️  DRY RUN: Saltando carga a PostgreSQL")
+                self.logger.info(f"\n⚠️  DRY RUN: Saltando carga a PostgreSQL ({tienda_nombre})")
                 self.logger.info(f"   Productos a cargar: {len(df_productos):,}")
                 self.logger.info(f"   Stock a cargar: {len(df_stock):,}")
                 # Mostrar almacenes extraídos
@@ -187,7 +307,8 @@ class InventarioKLKETLPostgres:
                     almacenes = df_stock['almacen_codigo'].unique()
                     self.logger.info(f"   Almacenes: {list(almacenes)}")
             else:
-                self.logger.info(f"\n💾 PASO 3/3: Cargando datos a PostgreSQL (AWS RDS)...")
+                self.logger.info(f"\n💾 PASO 3/3: Cargando {tienda_nombre} a PostgreSQL (AWS RDS)...")
+                inicio_carga = time.perf_counter()
 
                 # PASO 3A: Cargar productos primero (necesario por FK de inventario_actual)
                 productos_cargados = self.loader.load_productos(df_productos)
@@ -199,7 +320,11 @@ class InventarioKLKETLPostgres:
                 self.logger.info(f"   ✅ Stock cargado: {stock_cargado:,}")
                 self.stats['total_stock_cargado'] += stock_cargado
 
+                if contexto['resultado']:
+                    contexto['resultado'].load_seconds = round(time.perf_counter() - inicio_carga, 3)
+
             self.logger.info(f"\n✅ {tienda_nombre} procesada exitosamente")
+            self._registrar_tienda(contexto, 'success')
 
             # Tracking: Finalizar exitosamente (no-crítico, no debe fallar el ETL)
             if self.tracker and ejecucion_id:
@@ -223,32 +348,124 @@ class InventarioKLKETLPostgres:
 
         except Exception as e:
             self.logger.error(f"❌ Error procesando {tienda_nombre}: {e}", exc_info=True)
+            self._finalizar_fallida(contexto, e, ETLPhase.LOAD if EXECUTION_TRACKER_AVAILABLE else None)
+            return False
 
-            # Tracking: Finalizar con error (no-crítico, no debe fallar el ETL)
-            if self.tracker and ejecucion_id:
-                try:
-                    error_tipo = 'api_error'
-                    if 'timeout' in str(e).lower():
-                        error_tipo = 'timeout'
-                    elif 'connection' in str(e).lower():
-                        error_tipo = 'conexion'
-                    elif 'postgres' in str(e).lower():
-                        error_tipo = 'db_error'
-
-                    self.tracker.finalizar_ejecucion_fallida(
-                        ejecucion_id,
-                        error_mensaje=str(e),
-                        error_tipo=error_tipo,
-                        registros_extraidos=registros_extraidos
-                    )
-                except Exception as tracker_err:
-                    self.logger.warning(f"⚠️ Error en tracker (no-crítico): {tracker_err}")
+    def _finalizar_fallida(self, contexto: Dict[str, Any], e: Exception, fase):
+        """Registra el fallo de una tienda en ExecutionTracker, ETLTracker y Sentry"""
+        self._registrar_tienda(contexto, 'failed', mensaje=str(e), error=e, fase=fase)
+
+        # Tracking: Finalizar con error (no-crítico, no debe fallar el ETL)
+        ejecucion_id = contexto['ejecucion_id']
+        if self.tracker and ejecucion_id:
+            try:
+                error_tipo = 'api_error'
+                if 'timeout' in str(e).lower():
+                    error_tipo = 'timeout'
+                elif 'connection' in str(e).lower():
+                    error_tipo = 'conexion'
+                elif 'postgres' in str(e).lower():
+                    error_tipo = 'db_error'
+
+                self.tracker.finalizar_ejecucion_fallida(
+                    ejecucion_id,
+                    error_mensaje=str(e),
+                    error_tipo=error_tipo,
+                    registros_extraidos=contexto['registros_extraidos']
+                )
+            except Exception as tracker_err:
+                self.logger.warning(f"⚠️ Error en tracker (no-crítico): {tracker_err}")
+
+        # Sentry: Reportar error
+        sentry_monitor = contexto['sentry_monitor']
+        if sentry_monitor:
+            sentry_monitor.__exit__(type(e), e, e.__traceback__)
+
+    def _registrar_tienda(
+        self,
+        contexto: Dict[str, Any],
+        status: str,
+        mensaje: str = None,
+        error: Exception = None,
+        fase=None
+    ):
+        """Finaliza el TiendaResult de la tienda y lo agrega al ExecutionTracker"""
+        t = contexto['resultado']
+        if not t or not self.execution_tracker:
+            return
+
+        t.status = status
+        t.finished_at = datetime.now()
+        t.duration_seconds = (t.finished_at - t.started_at).total_seconds()
+        t.records_extracted = contexto['registros_extraidos']
+        if status == 'success':
+            t.records_loaded = t.records_extracted
+        else:
+            t.error_phase = fase
+            if error is not None and fase is not None:
+                t.error_category = ExecutionTracker.classify_error(error, fase)
+            t.error_message = mensaje[:500] if mensaje else None
+
+        self.execution_tracker.record_tienda_result(t)
+
+    def _procesar_secuencial(self, tiendas: List[TiendaConfig]):
+        """Procesa las tiendas una por una"""
+        for config in tiendas:
+            self._contar_resultado(self.procesar_tienda(config))
+
+    def _procesar_concurrente(self, tiendas: List[TiendaConfig]):
+        """
+        Pipeline en dos etapas conectadas por una cola acotada:
 
-            # Sentry: Reportar error
-            if sentry_monitor:
-                sentry_monitor.__exit__(type(e), e, e.__traceback__)
+        - Extracción + transformación: `self.workers` hilos. Es I/O contra el
+          API KLK (rate limit compartido en el extractor).
+        - Carga: este hilo, una tienda a la vez en orden de llegada. Así las
+          cargas no compiten por los mismos productos en PostgreSQL.
 
-            return False
+        La cola (maxsize=workers) limita cuántas tiendas extraídas esperan
+        carga en memoria: si la carga se atrasa, los workers esperan.
+        """
+        cola = queue.Queue(maxsize=self.workers)
+
+        def extraer(config: TiendaConfig):
+            contexto = extraccion = None
+            try:
+                contexto = self._iniciar_tienda(config)
+                extraccion = self._extraer_tienda(config, contexto)
+            finally:
+                cola.put((config, contexto, extraccion))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='KLK') as executor:
+            for config in tiendas:
+                executor.submit(extraer, config)
+
+            carga_iniciada = False
+            extraidos = 0
+            for pendientes in range(len(tiendas), 0, -1):
+                config, contexto, extraccion = cola.get()
+                extraidos += contexto['registros_extraidos'] if contexto else 0
+                if pendientes == 1 and self.execution_tracker:
+                    self.execution_tracker.finish_phase(ETLPhase.EXTRACT, records=extraidos)
+                if contexto is None:
+                    # El worker falló antes de iniciar la tienda
+                    self._contar_resultado(False)
+                    continue
+                if not carga_iniciada and self.execution_tracker:
+                    self.execution_tracker.start_phase(ETLPhase.LOAD)
+                    carga_iniciada = True
+                # En este hilo, el mismo que lo cierra: el monitor cubre la carga
+                self._abrir_monitor_sentry(config, contexto)
+                self._contar_resultado(self._cargar_tienda(config, contexto, extraccion))
+
+        if carga_iniciada and self.execution_tracker:
+            self.execution_tracker.finish_phase(ETLPhase.LOAD, records=self.stats['total_stock_cargado'])
+
+    def _contar_resultado(self, exitoso: bool):
+        self.stats['tiendas_procesadas'] += 1
+        if exitoso:
+            self.stats['tiendas_exitosas'] += 1
+        else:
+            self.stats['tiendas_fallidas'] += 1
 
     def ejecutar(self, tienda_ids: List[str] = None) -> bool:
         """
@@ -265,6 +482,7 @@ class InventarioKLKETLPostgres:
         self.logger.info(f"# Fecha: {self.stats['inicio'].strftime('%Y-%m-%d %H:%M:%S')}")
         self.logger.info(f"# Modo: {'DRY RUN' if self.dry_run else 'PRODUCCIÓN - PostgreSQL AWS RDS'}")
         self.logger.info(f"# DB_MODE: {os.getenv('DB_MODE', 'postgresql')}")
+        self.logger.info(f"# Workers: {self.workers} {'(secuencial)' if self.workers == 1 else '(extracción paralela)'}")
         self.logger.info(f"{'#'*80}\n")
 
         # Obtener configuraciones de tiendas KLK
@@ -286,16 +504,34 @@ class InventarioKLKETLPostgres:
         for tienda_id, config in tiendas_klk.items():
             self.logger.info(f"   - {config.ubicacion_nombre} ({tienda_id}) - Almacén: {config.codigo_almacen_klk}")
 
-        # Procesar cada tienda
-        for tienda_id, config in tiendas_klk.items():
-            self.stats['tiendas_procesadas'] += 1
-
-            exitoso = self.procesar_tienda(config)
-
-            if exitoso:
-                self.stats['tiendas_exitosas'] += 1
-            else:
-                self.stats['tiendas_fallidas'] += 1
+        if self.execution_tracker:
+            self.execution_tracker.start_execution(
+                etl_name='inventario',
+                etl_type='manual' if tienda_ids else 'scheduled',
+                fecha_desde=self.stats['inicio'],
+                fecha_hasta=self.stats['inicio'],
+                tiendas=list(tiendas_klk.keys())
+            )
+            self.execution_tracker.start_phase(ETLPhase.EXTRACT)
+
+        # Procesar tiendas
+        tiendas = list(tiendas_klk.values())
+        if self.workers > 1 and len(tiendas) > 1:
+            self._procesar_concurrente(tiendas)
+        else:
+            if self.execution_tracker:
+                self.execution_tracker.start_phase(ETLPhase.LOAD)
+            self._procesar_secuencial(tiendas)
+            if self.execution_tracker:
+                self.execution_tracker.finish_phase(ETLPhase.EXTRACT, records=self.stats['total_productos_extraidos'])
+                self.execution_tracker.finish_phase(ETLPhase.LOAD, records=self.stats['total_stock_cargado'])
+
+        if self.execution_tracker:
+            self.execution_tracker.finish_execution()
+
+        for extractor in self._extractores:
+            if extractor is not self.extractor:
+                extractor.close()
 
         # Resumen final
         self.stats['fin'] = datetime.now()
@@ -325,11 +561,13 @@ def main():
                        help='Ejecuta sin cargar datos (solo extrae y transforma)')
     parser.add_argument('--tiendas', nargs='+',
                        help='IDs de tiendas a procesar (ej: tienda_01 tienda_08). Si no se especifica, procesa todas')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Tiendas extrayendo en paralelo (default: env ETL_INVENTARIO_WORKERS o 1)')
 
     args = parser.parse_args()
 
     # Crear y ejecutar ETL
-    etl = InventarioKLKETLPostgres(dry_run=args.dry_run)
+    etl = InventarioKLKETLPostgres(dry_run=args.dry_run, workers=args.workers)
     exitoso = etl.ejecutar(tienda_ids=args.tiendas)
 
     # Exit code
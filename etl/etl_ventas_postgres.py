@@ -18,8 +18,16 @@ Modo Recuperacion (para llenar gaps de datos):
   python etl_ventas_postgres.py --recovery-mode                    # Procesa dia anterior completo
   python etl_ventas_postgres.py --recovery-mode --recovery-days 2  # Procesa hace 2 dias
 
+Las tiendas Stellar se extraen por chunks (paginacion keyset) que se cargan a medida
+que llegan; un backfill (--fecha-desde/--fecha-hasta) lanzado con --reanudar guarda la ultima clave
+cargada y, si se interrumpe, al relanzarlo igual retoma desde ella.
+
 Este modo se ejecuta automaticamente cada noche a las 3am Venezuela para recuperar
 cualquier dato que se haya perdido durante las ejecuciones de 30 minutos del dia.
+
+Las corridas incrementales encolan los gaps recientes (horas sin ventas) en
+etl_gap_queue y la drenan con ETL_GAP_WORKERS workers (ETL_GAP_MAX_POR_TIENDA
+gaps simultaneos por tienda); lo que no se recupera queda en cola para la proxima.
 """
 
 import sys
@@ -30,7 +38,9 @@ CORE_DIR = Path(__file__).parent / "core"
 sys.path.insert(0, str(CORE_DIR))
 
 import os
+import socket
 import logging
+import threading
 import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
@@ -50,6 +60,11 @@ from core.loader_ventas import VentasLoader
 
 from core.tiendas_config import TIENDAS_CONFIG, get_tiendas_activas
 from core.config import ETLConfig, DatabaseConfig
+from core.gap_queue import GapQueue
+
+# Recuperación de gaps: workers del pool y gaps simultáneos por tienda
+ETL_GAP_WORKERS = int(os.getenv('ETL_GAP_WORKERS', '4'))
+ETL_GAP_MAX_POR_TIENDA = int(os.getenv('ETL_GAP_MAX_POR_TIENDA', '1'))
 
 # Sentry monitoring (optional)
 try:
@@ -87,16 +102,25 @@ class VentasETLPostgres:
     Detecta automaticamente KLK vs Stellar y usa el extractor apropiado
     """
 
-    def __init__(self, dry_run: bool = False, minutos_atras: int = 30, auto_gap_recovery: bool = True):
+    def __init__(self, dry_run: bool = False, minutos_atras: int = 30, auto_gap_recovery: bool = True,
+                 reanudar: bool = False):
         """
         Args:
             dry_run: Si True, no carga datos (solo extrae)
             minutos_atras: Minutos hacia atras para extraer (default: 30)
             auto_gap_recovery: Si True, detecta y recupera gaps automáticamente (default: True)
+            reanudar: Si True, en corridas con rango manual (backfills) las
+                tiendas Stellar guardan la marca de extracción por chunk y
+                retoman desde ella cuando cae dentro del rango (default: False;
+                las corridas incrementales y de gaps no leen ni escriben la marca)
         """
         self.dry_run = dry_run
         self.minutos_atras = minutos_atras
         self.auto_gap_recovery = auto_gap_recovery
+        self.reanudar = reanudar
+        self._gaps_lock = threading.Lock()
+        # Los workers de gaps (y la fase KLK) suman a self.stats en paralelo
+        self._stats_lock = threading.Lock()
         self.logger = self._setup_logger()
 
         # KLK components
@@ -412,7 +436,7 @@ class VentasETLPostgres:
             self.logger.warning(f"Error detectando gaps para {tienda_id}: {e}")
             return []
 
-    def _recuperar_gap(self, config, gap: Dict) -> bool:
+    def _recuperar_gap(self, config, gap: Dict) -> Dict[str, Any]:
         """
         Intenta recuperar un gap de datos específico.
 
@@ -421,12 +445,15 @@ class VentasETLPostgres:
             gap: Dict con hora_inicio y hora_fin
 
         Returns:
-            True si se recuperó exitosamente
+            Resultado de _procesar_tienda_* (success, registros, message)
         """
         tienda_id = config.ubicacion_id
         sistema_pos = self._get_sistema_pos(tienda_id)
 
-        self.logger.info(f"   Recuperando gap: {gap['hora_inicio'].strftime('%H:%M')} - {gap['hora_fin'].strftime('%H:%M')}")
+        self.logger.info(
+            f"   Recuperando gap {config.ubicacion_nombre}: "
+            f"{gap['hora_inicio'].strftime('%H:%M')} - {gap['hora_fin'].strftime('%H:%M')}"
+        )
 
         try:
             if sistema_pos == 'klk':
@@ -435,16 +462,99 @@ class VentasETLPostgres:
                 resultado = self._procesar_tienda_stellar(config, gap['hora_inicio'], gap['hora_fin'])
 
             if resultado['success']:
-                self.stats['gaps_recuperados'] += 1
-                registros = resultado.get('registros', 0)
-                self.logger.info(f"   Gap recuperado: {registros} registros")
-                return True
+                self._sumar_stats(gaps_recuperados=1)
+                self.logger.info(f"   Gap recuperado: {resultado.get('registros', 0)} registros")
             else:
                 self.logger.warning(f"   Error recuperando gap: {resultado.get('message', 'Unknown')}")
-                return False
+            return resultado
         except Exception as e:
             self.logger.warning(f"   Excepción recuperando gap: {e}")
-            return False
+            return {'success': False, 'registros': 0, 'message': str(e)}
+
+    def _recuperar_gaps(self, tiendas: Dict, execution_id: Optional[int], horas_atras: int = 6):
+        """
+        Detecta gaps de las tiendas, los encola en etl_gap_queue y drena la
+        cola (incluye gaps pendientes de corridas anteriores) con un pool de
+        ETL_GAP_WORKERS workers, máximo ETL_GAP_MAX_POR_TIENDA gaps
+        simultáneos por tienda.
+        """
+        if self.dry_run:
+            for tienda_id, config in tiendas.items():
+                gaps = self._detectar_gaps_recientes(tienda_id, horas_atras=horas_atras)
+                if gaps:
+                    self.logger.info(f"DRY RUN {config.ubicacion_nombre}: {len(gaps)} gap(s) detectado(s)")
+            return
+
+        cola = GapQueue(self.klk_loader._get_connection)
+        try:
+            if not cola.disponible():
+                self.logger.warning("Cola de gaps no disponible: falta la migración 040 (etl_gap_queue)")
+                return
+        except Exception as e:
+            self.logger.warning(f"Cola de gaps no disponible: {e}")
+            return
+
+        total_gaps_detectados = 0
+        for tienda_id, config in tiendas.items():
+            gaps = self._detectar_gaps_recientes(tienda_id, horas_atras=horas_atras)
+            if gaps:
+                total_gaps_detectados += len(gaps)
+                encolados = cola.encolar(tienda_id, gaps, execution_id)
+                self.logger.info(f"{config.ubicacion_nombre}: {len(gaps)} gap(s) detectado(s), {encolados} encolado(s)")
+
+        backlog = cola.backlog(list(tiendas))
+        if total_gaps_detectados == 0 and backlog == 0:
+            self.logger.info(f"No se detectaron gaps en las últimas {horas_atras} horas")
+            return
+
+        workers = max(1, min(ETL_GAP_WORKERS, backlog))
+        self.logger.info(f"Gaps detectados: {total_gaps_detectados} | En cola: {backlog} | Workers: {workers}")
+
+        # Los gaps se registran en etl_gap_queue, no como tiendas de la ejecución
+        # (el tracker lleva una sola tienda en curso)
+        tracker, self.tracker = self.tracker, None
+        inicio = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Gaps') as executor:
+                futures = [
+                    executor.submit(self._worker_gaps, cola, tiendas, execution_id)
+                    for _ in range(workers)
+                ]
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.logger.error(f"   ❌ Worker de gaps falló: {e}")
+        finally:
+            self.tracker = tracker
+
+        self.logger.info(
+            f"Gaps recuperados: {self.stats['gaps_recuperados']} en {time.time() - inicio:.1f}s "
+            f"| Pendientes: {cola.backlog(list(tiendas))}"
+        )
+
+    def _sumar_stats(self, **incrementos: int):
+        """Suma contadores de self.stats (thread-safe)"""
+        with self._stats_lock:
+            for clave, valor in incrementos.items():
+                self.stats[clave] += valor
+
+    def _worker_gaps(self, cola: GapQueue, tiendas: Dict, execution_id: Optional[int]):
+        """Reclama y procesa gaps hasta que no quede ninguno disponible para este worker"""
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        while True:
+            # Claims serializados en el proceso: el límite por tienda se evalúa
+            # contra los claims ya confirmados de los otros workers
+            with self._gaps_lock:
+                gap = cola.reclamar(list(tiendas), worker_id, execution_id, ETL_GAP_MAX_POR_TIENDA)
+            if gap is None:
+                return
+            resultado = self._recuperar_gap(tiendas[gap['tienda_id']], gap)
+            cola.completar(
+                gap, worker_id, resultado['success'],
+                registros=resultado.get('registros', 0),
+                error=None if resultado['success'] else resultado.get('message')
+            )
 
     def _procesar_tienda_klk(self, config, fecha_desde: datetime, fecha_hasta: datetime) -> Dict[str, Any]:
         """Procesa tienda KLK usando API REST"""
@@ -507,7 +617,7 @@ class VentasETLPostgres:
 
             ventas_data = response.get('ventas', [])
             registros_extraidos = len(ventas_data)
-            self.stats['total_ventas_extraidas'] += registros_extraidos
+            self._sumar_stats(total_ventas_extraidas=registros_extraidos)
 
             if self.tracker:
                 self.tracker.finish_phase(ETLPhase.EXTRACT, records=registros_extraidos)
@@ -544,9 +654,13 @@ class VentasETLPostgres:
                 if result['success']:
                     registros_cargados = result.get('records_loaded', 0)
                     duplicados = result.get('duplicates_skipped', 0)
-                    self.stats['total_ventas_cargadas'] += registros_cargados
-                    self.stats['total_duplicados_omitidos'] += duplicados
+                    self._sumar_stats(total_ventas_cargadas=registros_cargados,
+                                      total_duplicados_omitidos=duplicados)
                     self.logger.info(f"   Cargadas: {registros_cargados:,} | Duplicados: {duplicados:,}")
+                    if self.tracker and 'load_seconds' in result:
+                        self.tracker.record_load_throughput(
+                            registros_cargados, result['load_seconds'], result.get('load_mode')
+                        )
                 else:
                     raise Exception(result.get('message'))
 
@@ -597,8 +711,15 @@ class VentasETLPostgres:
                 'message': str(e)
             }
 
-    def _procesar_tienda_stellar(self, config, fecha_desde: datetime, fecha_hasta: datetime) -> Dict[str, Any]:
-        """Procesa tienda Stellar usando SQL Server"""
+    def _procesar_tienda_stellar(self, config, fecha_desde: datetime, fecha_hasta: datetime,
+                                 reanudable: bool = False) -> Dict[str, Any]:
+        """
+        Procesa tienda Stellar usando SQL Server
+
+        Con `reanudable` (backfill con --reanudar) retoma desde la marca de
+        extracción y la avanza tras cada chunk; el resto de las corridas no
+        la tocan, para no pisar la marca de un backfill interrumpido.
+        """
         tienda_id = config.ubicacion_id
         tienda_nombre = config.ubicacion_nombre
         tiempo_inicio = datetime.now()
@@ -618,15 +739,53 @@ class VentasETLPostgres:
                 port=config.port
             )
 
-            # Extraer - pasamos datetime completo para filtrar por hora
-            raw_data = self.stellar_extractor.extract_ventas_data(
+            # Reanudar desde la marca guardada si cae dentro del rango pedido
+            desde_clave = None
+            if reanudable and not self.dry_run:
+                marca = self.stellar_loader.get_marca_extraccion(tienda_id)
+                if marca and fecha_desde <= marca[0] <= fecha_hasta:
+                    desde_clave = marca
+
+            # Extraer por chunks (keyset) - cada chunk se transforma y carga
+            # antes de pedir el siguiente; pasamos datetime completo para filtrar por hora
+            registros_extraidos = 0
+            registros_cargados = 0
+            chunks = self.stellar_extractor.iterar_ventas_chunks(
                 config=db_config,
                 fecha_inicio=fecha_desde,
                 fecha_fin=fecha_hasta,
-                limite_registros=None
+                desde_clave=desde_clave
             )
+            for raw_data, clave in chunks:
+                registros_extraidos += len(raw_data)
+                self._sumar_stats(total_ventas_extraidas=len(raw_data))
+
+                # Transformar
+                transformed_data = self.stellar_transformer.transform_ventas_data(raw_data)
+                if transformed_data.empty:
+                    raise Exception(f'Error en transformacion (chunk hasta {clave[0]})')
+
+                registros_transformados = len(transformed_data)
+
+                # Cargar
+                if self.dry_run:
+                    self.logger.info(f"   DRY RUN: {registros_transformados:,} ventas")
+                    registros_cargados += registros_transformados
+                    continue
+
+                result = self.stellar_loader.load_ventas_postgresql(transformed_data, refrescar_vistas=False)
+                # Un chunk ya cargado (overlap) no es un error: 0 insertados sin errores
+                if not result['success'] and result.get('errors', 1) > 0:
+                    raise Exception(result.get('message'))
+                cargados = result.get('records_loaded', 0)
+                duplicados = result.get('duplicates_skipped', 0)
+                registros_cargados += cargados
+                self._sumar_stats(total_ventas_cargadas=cargados, total_duplicados_omitidos=duplicados)
+                self.logger.info(f"   Cargadas: {cargados:,} | Duplicados: {duplicados:,}")
+                if reanudable:
+                    self.stellar_loader.guardar_marca_extraccion(tienda_id, clave, len(raw_data))
 
-            if raw_data is None or raw_data.empty:
+            if registros_extraidos == 0:
                 tiempo_proceso = (datetime.now() - tiempo_inicio).total_seconds()
                 return {
                     'tienda_id': tienda_id,
@@ -638,39 +797,8 @@ class VentasETLPostgres:
                     'message': 'Sin ventas en el rango'
                 }
 
-            registros_extraidos = len(raw_data)
-            self.stats['total_ventas_extraidas'] += registros_extraidos
-
-            # Transformar
-            transformed_data = self.stellar_transformer.transform_ventas_data(raw_data)
-            if transformed_data.empty:
-                tiempo_proceso = (datetime.now() - tiempo_inicio).total_seconds()
-                return {
-                    'tienda_id': tienda_id,
-                    'tienda_nombre': tienda_nombre,
-                    'sistema': 'Stellar',
-                    'success': False,
-                    'registros': 0,
-                    'tiempo_proceso': tiempo_proceso,
-                    'message': 'Error en transformacion'
-                }
-
-            registros_transformados = len(transformed_data)
-
-            # Cargar
-            if self.dry_run:
-                self.logger.info(f"   DRY RUN: {registros_transformados:,} ventas")
-                registros_cargados = registros_transformados
-            else:
-                result = self.stellar_loader.load_ventas_postgresql(transformed_data)
-                if result['success']:
-                    registros_cargados = result.get('records_loaded', 0)
-                    duplicados = result.get('duplicates_skipped', 0)
-                    self.stats['total_ventas_cargadas'] += registros_cargados
-                    self.stats['total_duplicados_omitidos'] += duplicados
-                    self.logger.info(f"   Cargadas: {registros_cargados:,} | Duplicados: {duplicados:,}")
-                else:
-                    raise Exception(result.get('message'))
+            if registros_cargados > 0 and not self.dry_run:
+                self.stellar_loader.refresh_materialized_views()
 
             tiempo_proceso = (datetime.now() - tiempo_inicio).total_seconds()
             return {
@@ -696,7 +824,8 @@ class VentasETLPostgres:
                 'message': str(e)
             }
 
-    def procesar_tienda(self, config, fecha_desde: datetime, fecha_hasta: datetime) -> Dict[str, Any]:
+    def procesar_tienda(self, config, fecha_desde: datetime, fecha_hasta: datetime,
+                        reanudable: bool = False) -> Dict[str, Any]:
         """Procesa una tienda detectando automaticamente el sistema POS"""
         tienda_id = config.ubicacion_id
         tienda_nombre = config.ubicacion_nombre
@@ -708,11 +837,11 @@ class VentasETLPostgres:
         self.logger.info(f"{'='*70}")
 
         if sistema_pos == 'klk':
-            self.stats['tiendas_klk'] += 1
+            self._sumar_stats(tiendas_klk=1)
             return self._procesar_tienda_klk(config, fecha_desde, fecha_hasta)
         else:
-            self.stats['tiendas_stellar'] += 1
-            return self._procesar_tienda_stellar(config, fecha_desde, fecha_hasta)
+            self._sumar_stats(tiendas_stellar=1)
+            return self._procesar_tienda_stellar(config, fecha_desde, fecha_hasta, reanudable)
 
     def ejecutar(self, tienda_ids: List[str] = None, fecha_desde: datetime = None, fecha_hasta: datetime = None) -> bool:
         """
@@ -747,6 +876,7 @@ class VentasETLPostgres:
             return True
 
         # Calcular rango de fechas
+        modo_incremental = fecha_desde is None
         if fecha_hasta is None:
             fecha_hasta = datetime.now()
         if fecha_desde is None:
@@ -786,26 +916,11 @@ class VentasETLPostgres:
             self.logger.info(f"   - {config.ubicacion_nombre} ({tienda_id}) - {sistema.upper()}")
 
         # Auto-recuperación de gaps (si está habilitada y no es modo manual con fechas)
-        if self.auto_gap_recovery and fecha_desde is None:
+        if self.auto_gap_recovery and modo_incremental:
             self.logger.info(f"\n{'='*70}")
-            self.logger.info(f"DETECCIÓN AUTOMÁTICA DE GAPS (últimas 6 horas)")
+            self.logger.info(f"RECUPERACIÓN DE GAPS (últimas 6 horas + cola pendiente)")
             self.logger.info(f"{'='*70}")
-
-            total_gaps_detectados = 0
-            for tienda_id, config in tiendas.items():
-                gaps = self._detectar_gaps_recientes(tienda_id, horas_atras=6)
-                if gaps:
-                    total_gaps_detectados += len(gaps)
-                    self.logger.info(f"\n{config.ubicacion_nombre}: {len(gaps)} gap(s) detectado(s)")
-                    for gap in gaps:
-                        self._recuperar_gap(config, gap)
-
-            if total_gaps_detectados == 0:
-                self.logger.info("No se detectaron gaps en las últimas 6 horas")
-            else:
-                self.logger.info(f"\nTotal gaps detectados: {total_gaps_detectados}")
-                self.logger.info(f"Gaps recuperados: {self.stats['gaps_recuperados']}")
-
+            self._recuperar_gaps(tiendas, execution_id, horas_atras=6)
             self.logger.info(f"{'='*70}\n")
 
         # Separar tiendas por sistema POS
@@ -867,10 +982,12 @@ class VentasETLPostgres:
         if tiendas_stellar:
             self.logger.info(f"\n📦 FASE 2: Procesando {len(tiendas_stellar)} tiendas Stellar (secuencial)...")
             stellar_start = time.time()
+            # La marca de extracción es de los backfills (rango manual) con --reanudar
+            reanudable = self.reanudar and not modo_incremental
 
             for tienda_id, config in tiendas_stellar.items():
                 self.stats['tiendas_procesadas'] += 1
-                resultado = self.procesar_tienda(config, fecha_desde, fecha_hasta)
+                resultado = self.procesar_tienda(config, fecha_desde, fecha_hasta, reanudable)
                 tiendas_results.append(resultado)
 
                 if resultado['success']:
@@ -956,6 +1073,10 @@ def main():
                        help='Detecta y recupera gaps automaticamente en ultimas 6 horas (default: activado)')
     parser.add_argument('--no-gap-recovery', action='store_true',
                        help='Desactiva la recuperacion automatica de gaps')
+    parser.add_argument('--reanudar', action='store_true',
+                       help='Stellar, rango manual: guardar la ultima clave cargada y retomar desde ella si cae dentro del rango (backfills interrumpidos)')
+    parser.add_argument('--abc-incremental', action='store_true',
+                       help='Al terminar, recalcular el ABC incremental (recalcular_abc_cache.py --incremental)')
 
     args = parser.parse_args()
 
@@ -1046,7 +1167,8 @@ def main():
 
         # IMPORTANTE: Crear UNA sola instancia del ETL y reutilizarla para todos los chunks
         # Esto evita memory leak al no crear nuevos extractors/loaders en cada iteración
-        etl = VentasETLPostgres(dry_run=args.dry_run, minutos_atras=args.minutos, auto_gap_recovery=False)
+        etl = VentasETLPostgres(dry_run=args.dry_run, minutos_atras=args.minutos, auto_gap_recovery=False,
+                                reanudar=args.reanudar)
 
         for i, (chunk_start, chunk_end) in enumerate(chunks, 1):
             print(f"\n{'#'*70}")
@@ -1086,8 +1208,18 @@ def main():
     else:
         # Modo normal: ejecutar una sola vez
         # auto_gap_recovery solo aplica si no hay fechas manuales especificadas
-        etl = VentasETLPostgres(dry_run=args.dry_run, minutos_atras=args.minutos, auto_gap_recovery=auto_gap_recovery)
+        etl = VentasETLPostgres(dry_run=args.dry_run, minutos_atras=args.minutos, auto_gap_recovery=auto_gap_recovery,
+                                reanudar=args.reanudar)
         exitoso = etl.ejecutar(tienda_ids=tiendas_a_procesar, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta)
+
+        if exitoso and args.abc_incremental and not args.dry_run:
+            # El ABC no debe marcar como fallida una carga que sí terminó
+            try:
+                from recalcular_abc_cache import recalcular_abc_cache
+                recalcular_abc_cache(incremental=True)
+            except Exception as e:
+                print(f"⚠️ Error en el recálculo ABC incremental: {e}")
+
         sys.exit(0 if exitoso else 1)
 
 
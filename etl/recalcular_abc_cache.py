@@ -6,10 +6,19 @@ Ejecuta las funciones SQL:
 - recalcular_abc_cache() - ABC global por cantidad vendida
 - recalcular_abc_por_tienda() - ABC por cada tienda
 
+y, en la misma transacción, recalcula las sugerencias de generadores de
+tráfico sobre el GAP recién calculado (core/generadores_trafico.py).
+
+Con --incremental no llama a esas funciones: mantiene agregados rodantes por
+tienda (core/abc_incremental.py), recalcula solo los días recargados, nuevos
+o vencidos y re-rankea las tiendas afectadas. Pensado para correr después de
+cada ETL de ventas; la corrida completa nocturna sigue igual.
+
 Se recomienda ejecutar diariamente a las 4:00 AM (después de que terminen los ETLs de ventas del día anterior).
 
 Uso:
-    python recalcular_abc_cache.py [--dias 30] [--solo-global]
+    python recalcular_abc_cache.py [--dias 30] [--solo-global] [--sin-generadores]
+    python recalcular_abc_cache.py --incremental [--reconstruir]
 
 Diciembre 2025
 """
@@ -21,8 +30,12 @@ import logging
 from datetime import datetime
 
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 
+from core.abc_incremental import recalcular_abc_incremental
+from core.generadores_trafico import recalcular_sugerencias_generadores
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -46,13 +59,22 @@ def get_postgres_connection():
     )
 
 
-def recalcular_abc_cache(dias: int = 30, incluir_por_tienda: bool = True):
+def recalcular_abc_cache(
+    dias: int = 30,
+    incluir_por_tienda: bool = True,
+    incluir_generadores: bool = True,
+    incremental: bool = False,
+    reconstruir: bool = False
+):
     """
     Recalcular las tablas cache de clasificación ABC.
 
     Args:
         dias: Período de análisis en días (default: 30)
         incluir_por_tienda: Si True, también recalcula ABC por tienda
+        incluir_generadores: Si True, recalcula las sugerencias de generadores de tráfico
+        incremental: Si True, usa los agregados rodantes (siempre global + por tienda)
+        reconstruir: Con incremental, reconstruye los agregados desde ventas
     """
     conn = None
     try:
@@ -101,48 +123,86 @@ def recalcular_abc_cache(dias: int = 30, incluir_por_tienda: bool = True):
             f"pareto={pareto_a_pct}/{pareto_b_pct}%, modelo={modelo_activo}, excluido={producto_excluido}"
         )
 
-        # 1. Recalcular ABC GLOBAL
-        logger.info("Recalculando ABC cache global...")
-        inicio_global = datetime.now()
-
-        cursor.execute(
-            "SELECT * FROM recalcular_abc_cache(%s, %s, %s, %s, %s, %s, %s, %s)",
-            (dias, producto_excluido, umbral_a, umbral_b, umbral_c,
-             pareto_a_pct, pareto_b_pct, modelo_activo)
-        )
-        result_global = cursor.fetchone()
-
-        tiempo_global = (datetime.now() - inicio_global).total_seconds()
-        logger.info(
-            f"ABC GLOBAL completado: {result_global['productos_procesados']} productos "
-            f"(A:{result_global['productos_a']}, B:{result_global['productos_b']}, "
-            f"C:{result_global['productos_c']}, D:{result_global['productos_d']}) "
-            f"en {tiempo_global:.1f}s"
-        )
-
-        # 2. Recalcular ABC POR TIENDA
         tiendas_procesadas = 0
         productos_por_tienda = 0
 
-        if incluir_por_tienda:
-            logger.info("Recalculando ABC cache por tienda...")
-            inicio_tienda = datetime.now()
+        if incremental:
+            # 1+2. ABC global y por tienda desde los agregados rodantes
+            logger.info("Recalculando ABC cache (incremental)...")
+            inicio_incremental = datetime.now()
+
+            cursor_tuplas = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            result_global = recalcular_abc_incremental(
+                cursor_tuplas, dias, producto_excluido, umbral_a, umbral_b, umbral_c,
+                pareto_a_pct, pareto_b_pct, modelo_activo, reconstruir=reconstruir
+            )
+            cursor_tuplas.close()
+
+            tiendas_procesadas = result_global['tiendas_procesadas']
+            productos_por_tienda = result_global['productos_por_tienda']
+            tiempo_incremental = (datetime.now() - inicio_incremental).total_seconds()
+            logger.info(
+                f"ABC {result_global['modo'].upper()} completado: "
+                f"{result_global['dias_recalculados']} días tienda recalculados, "
+                f"{result_global['dias_vencidos']} vencidos, {tiendas_procesadas} tiendas re-rankeadas, "
+                f"{result_global['productos_procesados']} productos globales "
+                f"(A:{result_global['productos_a']}, B:{result_global['productos_b']}, "
+                f"C:{result_global['productos_c']}, D:{result_global['productos_d']}) "
+                f"en {tiempo_incremental:.1f}s"
+            )
+        else:
+            # 1. Recalcular ABC GLOBAL
+            logger.info("Recalculando ABC cache global...")
+            inicio_global = datetime.now()
 
             cursor.execute(
-                "SELECT * FROM recalcular_abc_por_tienda(%s, %s, %s, %s, %s, %s, %s, %s)",
+                "SELECT * FROM recalcular_abc_cache(%s, %s, %s, %s, %s, %s, %s, %s)",
                 (dias, producto_excluido, umbral_a, umbral_b, umbral_c,
                  pareto_a_pct, pareto_b_pct, modelo_activo)
             )
-            result_tienda = cursor.fetchone()
+            result_global = cursor.fetchone()
 
-            tiendas_procesadas = result_tienda['tiendas_procesadas']
-            productos_por_tienda = result_tienda['productos_procesados']
-            tiempo_tienda = (datetime.now() - inicio_tienda).total_seconds()
+            tiempo_global = (datetime.now() - inicio_global).total_seconds()
+            logger.info(
+                f"ABC GLOBAL completado: {result_global['productos_procesados']} productos "
+                f"(A:{result_global['productos_a']}, B:{result_global['productos_b']}, "
+                f"C:{result_global['productos_c']}, D:{result_global['productos_d']}) "
+                f"en {tiempo_global:.1f}s"
+            )
 
+            # 2. Recalcular ABC POR TIENDA
+            if incluir_por_tienda:
+                logger.info("Recalculando ABC cache por tienda...")
+                inicio_tienda = datetime.now()
+
+                cursor.execute(
+                    "SELECT * FROM recalcular_abc_por_tienda(%s, %s, %s, %s, %s, %s, %s, %s)",
+                    (dias, producto_excluido, umbral_a, umbral_b, umbral_c,
+                     pareto_a_pct, pareto_b_pct, modelo_activo)
+                )
+                result_tienda = cursor.fetchone()
+
+                tiendas_procesadas = result_tienda['tiendas_procesadas']
+                productos_por_tienda = result_tienda['productos_procesados']
+                tiempo_tienda = (datetime.now() - inicio_tienda).total_seconds()
+
+                logger.info(
+                    f"ABC POR TIENDA completado: {productos_por_tienda} productos "
+                    f"en {tiendas_procesadas} tiendas en {tiempo_tienda:.1f}s"
+                )
+
+        # 3. Sugerencias de generadores de tráfico con el GAP recién calculado
+        if incluir_generadores:
+            diff = recalcular_sugerencias_generadores(cursor)
             logger.info(
-                f"ABC POR TIENDA completado: {productos_por_tienda} productos "
-                f"en {tiendas_procesadas} tiendas en {tiempo_tienda:.1f}s"
+                f"Generadores de tráfico (gap >= {diff['gap_minimo']}): "
+                f"{diff['productos_analizados']} candidatos, "
+                f"{len(diff['sugeridos'])} nuevas sugerencias, {len(diff['removidos'])} removidas"
             )
+            if diff['sugeridos']:
+                logger.info(f"  + sugeridos: {', '.join(diff['sugeridos'][:50])}")
+            if diff['removidos']:
+                logger.info(f"  - removidos: {', '.join(diff['removidos'][:50])}")
 
         conn.commit()
         cursor.close()
@@ -183,6 +243,21 @@ def main():
         action='store_true',
         help='Solo recalcular ABC global, no por tienda'
     )
+    parser.add_argument(
+        '--sin-generadores',
+        action='store_true',
+        help='No recalcular las sugerencias de generadores de tráfico'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Recalcular desde agregados rodantes (solo días recargados, nuevos o vencidos)'
+    )
+    parser.add_argument(
+        '--reconstruir',
+        action='store_true',
+        help='Con --incremental: reconstruir los agregados desde ventas'
+    )
 
     args = parser.parse_args()
 
@@ -191,12 +266,17 @@ def main():
     logger.info(f"Fecha: {datetime.now().isoformat()}")
     logger.info(f"Días de análisis: {args.dias}")
     logger.info(f"Incluir por tienda: {not args.solo_global}")
+    logger.info(f"Incluir generadores de tráfico: {not args.sin_generadores}")
+    logger.info(f"Modo: {'incremental' if args.incremental else 'completo'}")
     logger.info("=" * 60)
 
     try:
         recalcular_abc_cache(
             dias=args.dias,
-            incluir_por_tienda=not args.solo_global
+            incluir_por_tienda=not args.solo_global,
+            incluir_generadores=not args.sin_generadores,
+            incremental=args.incremental,
+            reconstruir=args.reconstruir
         )
         sys.exit(0)
     except Exception as e:
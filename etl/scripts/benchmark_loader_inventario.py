@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark: preparación de filas del loader de inventario, iterrows vs columnar.
+
+Compara la preparación anterior (iterrows + de-duplicado con dicts + csv.writer
+fila por fila) contra preparar_productos(), preparar_stock_klk() y
+preparar_inventario_stellar() de core/loader_inventario_postgres.py sobre
+DataFrames sintéticos con la forma del transformer, y verifica que ambos
+produzcan los mismos registros. No requiere base de datos.
+
+Usage:
+    python etl/scripts/benchmark_loader_inventario.py --filas 50000
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.loader_inventario_postgres import (  # noqa: E402
+    preparar_inventario_stellar,
+    preparar_productos,
+    preparar_stock_klk,
+)
+
+
+def generar_dataframes(n: int, seed: int = 42):
+    """
+    (df_productos KLK, df_stock KLK, df_inventario Stellar) con ~10% de códigos
+    repetidos. Columnas object con None para faltantes, como las entrega el
+    transformer con pandas 2.x.
+    """
+    rng = random.Random(seed)
+    fecha = datetime(2026, 10, 17, 6, 30)
+    codigos = [f"{rng.randint(0, int(n * 0.9)):06d}" for _ in range(n)]
+
+    productos = pd.DataFrame({
+        'codigo': codigos,
+        'codigo_barras': [rng.choice([None, f"759{rng.randint(10**9, 10**10 - 1)}"]) for _ in range(n)],
+        'descripcion': [rng.choice([None, f"PRODUCTO {c}"]) for c in codigos],
+        'categoria': [rng.choice([None, 'VIVERES', 'CHARCUTERIA']) for _ in range(n)],
+        'grupo': [rng.choice(['G1', 'G2']) for _ in range(n)],
+        'subgrupo': [rng.choice([None, 'S1']) for _ in range(n)],
+        'marca': [rng.choice([None, 'MARCA']) for _ in range(n)],
+        'modelo': None,
+        'activo': True,
+        'updated_at': fecha,
+    }, dtype=object)
+    stock = pd.DataFrame({
+        'ubicacion_id': 'tienda_01',
+        'almacen_codigo': [rng.choice(['APP-TPF', 'APP-PPF']) for _ in range(n)],
+        'codigo_producto': codigos,
+        'cantidad_actual': [round(rng.uniform(-5, 500), 3) for _ in range(n)],
+        'fecha_extraccion': fecha,
+    })
+    stellar = pd.DataFrame({
+        'ubicacion_id': 'tienda_08',
+        'codigo_producto': [rng.choice([c, c, c, None, '']) for c in codigos],
+        'descripcion_producto': [rng.choice([None, '', f"PRODUCTO {c}"]) for c in codigos],
+        'categoria': [rng.choice([None, 'VIVERES']) for _ in range(n)],
+        'marca': [rng.choice([None, 'MARCA']) for _ in range(n)],
+        'cantidad_actual': [rng.choice([None, 0, round(rng.uniform(0, 300), 2)]) for _ in range(n)],
+        'fecha_extraccion': fecha,
+    }, dtype=object)
+    return productos, stock, stellar
+
+
+# Implementación anterior (iterrows), como referencia
+
+def productos_iterrows(df):
+    batch_data = []
+    for _, row in df.iterrows():
+        nombre = row.get('nombre') or row.get('descripcion', '')
+        codigo = row.get('codigo')
+        batch_data.append((
+            codigo, codigo, row.get('codigo_barras'), nombre, row.get('descripcion'),
+            row.get('marca'), row.get('modelo'), row.get('categoria'), row.get('grupo'),
+            row.get('subgrupo'), row.get('activo', True), row.get('updated_at', datetime.now())
+        ))
+    seen = {}
+    for record in batch_data:
+        seen[record[1]] = record
+    return list(seen.values())
+
+
+def stock_klk_iterrows(df):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for ordinal, (_, row) in enumerate(df.iterrows()):
+        writer.writerow([
+            ordinal, row.get('almacen_codigo'), row['codigo_producto'],
+            row['cantidad_actual'], row.get('fecha_extraccion', datetime.now())
+        ])
+    return buffer.getvalue()
+
+
+def stellar_iterrows(df, almacen_codigo):
+    productos_data, stock_data = [], []
+    for _, row in df.iterrows():
+        codigo_producto = row.get('codigo_producto')
+        if not codigo_producto:
+            continue
+        nombre_producto = row.get('descripcion_producto') or f'Producto {codigo_producto}'
+        productos_data.append((
+            codigo_producto, codigo_producto, nombre_producto, nombre_producto,
+            row.get('categoria'), row.get('marca')
+        ))
+        stock_data.append((
+            almacen_codigo, codigo_producto, row.get('cantidad_actual', 0) or 0,
+            row.get('fecha_extraccion', datetime.now())
+        ))
+    seen_productos = {p[0]: p for p in productos_data}
+    seen_stock = {s[1]: s for s in stock_data}
+    return list(seen_productos.values()), list(seen_stock.values())
+
+
+# Implementación columnar (la del loader)
+
+def stock_klk_columnar(df):
+    staging = preparar_stock_klk(df)
+    staging.insert(0, 'ordinal', range(len(staging)))
+    buffer = io.StringIO()
+    staging.to_csv(buffer, header=False, index=False, na_rep='\\N')
+    return buffer.getvalue()
+
+
+def ultima_por_clave_csv(contenido):
+    """(almacen, producto) -> (cantidad, fecha) de la última fila, como la carga (DISTINCT ON ordinal DESC)"""
+    filas = {}
+    for _, almacen, producto, cantidad, fecha in csv.reader(io.StringIO(contenido)):
+        filas[(almacen, producto)] = (float(cantidad), pd.Timestamp(fecha))
+    return filas
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, min(tiempos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preparación de filas loader inventario")
+    parser.add_argument("--filas", type=int, default=50000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    df_productos, df_stock, df_stellar = generar_dataframes(args.filas)
+    casos = [
+        ("load_productos", lambda: productos_iterrows(df_productos), lambda: preparar_productos(df_productos),
+         lambda viejo, nuevo: {r[1]: r for r in viejo} == {r[1]: r for r in nuevo}),
+        ("load_stock (CSV para COPY)", lambda: stock_klk_iterrows(df_stock), lambda: stock_klk_columnar(df_stock),
+         lambda viejo, nuevo: ultima_por_clave_csv(viejo) == ultima_por_clave_csv(nuevo)),
+        ("load_inventory_data (Stellar)", lambda: stellar_iterrows(df_stellar, 'STELLAR'),
+         lambda: preparar_inventario_stellar(df_stellar, 'STELLAR'),
+         lambda viejo, nuevo: (
+             {p[0]: p for p in viejo[0]} == {p[0]: p for p in nuevo[0]}
+             and {s[1]: s for s in viejo[1]} == {s[1]: s for s in nuevo[1].itertuples(index=False, name=None)}
+         )),
+    ]
+
+    print(f"\n📊 Loader inventario - {args.filas:,} filas (mejor de {args.repeticiones})")
+    for nombre, anterior, columnar, iguales in casos:
+        viejo, t_anterior = medir(anterior, args.repeticiones)
+        nuevo, t_columnar = medir(columnar, args.repeticiones)
+        print(f"  {nombre}")
+        print(f"    iterrows: {t_anterior:9.1f} ms")
+        print(f"    columnar: {t_columnar:9.1f} ms   speedup {t_anterior / t_columnar:.1f}x")
+        print(f"    Mismos registros: {'✅' if iguales(viejo, nuevo) else '❌'}")
+
+
+if __name__ == "__main__":
+    main()
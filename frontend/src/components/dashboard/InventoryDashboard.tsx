@@ -72,6 +72,7 @@ interface PaginationMetadata {
   anomalias?: number;
   dormidos?: number;
   activos?: number;
+  next_cursor?: string | null;
 }
 
 interface PaginatedStockResponse {
@@ -320,7 +321,7 @@ export default function InventoryDashboard() {
   const exportToExcel = async () => {
     setExporting(true);
     try {
-      const params: Record<string, string | number> = { page: 1, page_size: 50000 };
+      const params: Record<string, string | number> = { page: 1, page_size: 5000 };
       if (selectedUbicacion !== 'all') params.ubicacion_id = selectedUbicacion;
       if (selectedAlmacen) params.almacen_codigo = selectedAlmacen;
       if (selectedCategoria !== 'all') params.categoria = selectedCategoria;
@@ -334,8 +335,15 @@ export default function InventoryDashboard() {
       if (selectedStockCediFilter !== 'all') params.stock_cedi_filter = selectedStockCediFilter;
       if (selectedStockFilter !== 'all') params.stock_filter = selectedStockFilter;
 
-      const response = await http.get('/api/stock', { params });
-      const { data } = response.data as PaginatedStockResponse;
+      // /api/stock limita page_size: se recorre todo con el cursor de la paginación
+      const data: StockItem[] = [];
+      let cursor: string | null | undefined;
+      do {
+        const response = await http.get('/api/stock', { params: cursor ? { ...params, cursor } : params });
+        const pagina = response.data as PaginatedStockResponse;
+        data.push(...pagina.data);
+        cursor = pagina.pagination.next_cursor;
+      } while (cursor);
 
       const excelData = data.map((item) => {
         const base: Record<string, string | number> = {
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cálculo de inventario ABC escalar vs batch (NumPy).
+
+Compara calcular_inventario_simple() por SKU contra
+calcular_inventario_batch() sobre un surtido sintético y verifica que
+ambos produzcan las mismas cantidades sugeridas.
+
+Usage:
+    python scripts/benchmark_calculo_inventario.py --skus 10000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from services.calculo_inventario_abc import ConfigTiendaABC, calcular_inventario_simple  # noqa: E402
+from services.calculo_inventario_batch import calcular_inventario_batch  # noqa: E402
+
+
+def generar_surtido(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    columnas = {
+        'demanda_p75': [], 'sigma_demanda': [], 'demanda_maxima': [],
+        'unidades_por_bulto': [], 'stock_actual': [], 'stock_cedi': [],
+        'clase_abc': [], 'es_generador_trafico': [], 'dias_cobertura_override': [],
+    }
+    for _ in range(n):
+        p75 = rng.uniform(0, 100)
+        columnas['demanda_p75'].append(p75)
+        columnas['sigma_demanda'].append(rng.uniform(0, p75))
+        columnas['demanda_maxima'].append(p75 * rng.uniform(1, 3))
+        columnas['unidades_por_bulto'].append(rng.choice([1, 6, 12, 24]))
+        columnas['stock_actual'].append(rng.uniform(0, 2000))
+        columnas['stock_cedi'].append(rng.uniform(0, 10000))
+        columnas['clase_abc'].append(rng.choice(['A', 'B', 'C', 'D']))
+        columnas['es_generador_trafico'].append(rng.random() < 0.05)
+        columnas['dias_cobertura_override'].append(rng.choice([None, None, None, 1]))
+    return columnas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cálculo inventario escalar vs batch")
+    parser.add_argument("--skus", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    columnas = generar_surtido(args.skus)
+    config = ConfigTiendaABC()
+    filas = [dict(zip(columnas, valores)) for valores in zip(*columnas.values())]
+
+    tiempos_escalar = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        escalar = [calcular_inventario_simple(**fila, config_tienda=config) for fila in filas]
+        tiempos_escalar.append(time.perf_counter() - inicio)
+
+    tiempos_batch = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        batch = calcular_inventario_batch(**columnas, config_tienda=config)
+        tiempos_batch.append(time.perf_counter() - inicio)
+
+    diferencias = sum(
+        1 for i, r in enumerate(escalar)
+        if r.cantidad_sugerida_bultos != batch.cantidad_sugerida_bultos[i]
+        or r.stock_maximo_unid != batch.stock_maximo_unid[i]
+    )
+
+    t_escalar = min(tiempos_escalar) * 1000
+    t_batch = min(tiempos_batch) * 1000
+    print(f"\n📊 Cálculo inventario ABC - {args.skus:,} SKUs (mejor de {args.repeticiones})")
+    print(f"  Escalar (calcular_inventario_simple): {t_escalar:9.1f} ms")
+    print(f"  Batch   (calcular_inventario_batch):  {t_batch:9.1f} ms")
+    print(f"  Speedup: {t_escalar / t_batch:.1f}x")
+    print(f"  Diferencias: {diferencias}")
+
+
+if __name__ == "__main__":
+    main()
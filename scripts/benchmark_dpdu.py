@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: distribución DPD+U por producto vs batch (NumPy).
+
+Compara calcular_distribucion_dpdu() llamado producto por producto contra
+calcular_distribucion_dpdu_batch() sobre un set sintético de productos en
+conflicto y verifica que ambos produzcan las mismas asignaciones.
+
+Usage:
+    python scripts/benchmark_dpdu.py --productos 500 --tiendas 19
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from dataclasses import asdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from services.algoritmo_dpdu import ConfigDPDU, DatosTiendaProducto, calcular_distribucion_dpdu  # noqa: E402
+from services.algoritmo_dpdu_batch import calcular_distribucion_dpdu_batch  # noqa: E402
+
+
+def generar_conflictos(n: int, max_tiendas: int, seed: int = 42):
+    rng = random.Random(seed)
+    stocks, bultos, tiendas = [], [], []
+    for _ in range(n):
+        datos = []
+        for t in range(rng.randint(2, max_tiendas)):
+            demanda = rng.uniform(0, 200)
+            stock = rng.uniform(0, 1500)
+            datos.append(DatosTiendaProducto(
+                tienda_id=f"tienda_{t:02d}",
+                tienda_nombre=f"TIENDA {t}",
+                demanda_p75=demanda,
+                stock_actual=stock,
+                dias_stock=stock / demanda if demanda > 0 else 999,
+                cantidad_necesaria=rng.uniform(1, 600),
+            ))
+        stocks.append(rng.uniform(0, 5000))
+        bultos.append(rng.choice([1, 6, 12, 24]))
+        tiendas.append(datos)
+    return stocks, bultos, tiendas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DPD+U por producto vs batch")
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--tiendas", type=int, default=19)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    stocks, bultos, tiendas = generar_conflictos(args.productos, args.tiendas)
+    config = ConfigDPDU()
+
+    tiempos_escalar = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        escalar = [
+            calcular_distribucion_dpdu(stocks[i], bultos[i], tiendas[i], config)
+            for i in range(args.productos)
+        ]
+        tiempos_escalar.append(time.perf_counter() - inicio)
+
+    tiempos_batch = []
+    tiempos_batch_total = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        resultado = calcular_distribucion_dpdu_batch(stocks, bultos, tiendas, config)
+        tiempos_batch.append(time.perf_counter() - inicio)
+        batch = [resultado.asignaciones(i) for i in range(args.productos)]
+        tiempos_batch_total.append(time.perf_counter() - inicio)
+
+    diferencias = sum(
+        1 for i in range(args.productos)
+        if [asdict(a) for a in escalar[i]] != [asdict(a) for a in batch[i]]
+    )
+
+    celdas = sum(len(t) for t in tiendas)
+    t_escalar = min(tiempos_escalar) * 1000
+    t_batch = min(tiempos_batch) * 1000
+    t_batch_total = min(tiempos_batch_total) * 1000
+    print(f"\n📊 DPD+U - {args.productos:,} productos x hasta {args.tiendas} tiendas "
+          f"({celdas:,} asignaciones, mejor de {args.repeticiones})")
+    print(f"  Por producto (calcular_distribucion_dpdu):        {t_escalar:9.1f} ms")
+    print(f"  Batch solo matriz (calcular_distribucion_dpdu_batch): {t_batch:9.1f} ms")
+    print(f"  Batch + AsignacionTienda por tienda:              {t_batch_total:9.1f} ms")
+    print(f"  Speedup (matriz): {t_escalar / t_batch:.1f}x  |  (con asignaciones): {t_escalar / t_batch_total:.1f}x")
+    print(f"  Diferencias: {diferencias}")
+
+
+if __name__ == "__main__":
+    main()
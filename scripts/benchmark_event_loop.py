@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Load test: latencia del health check mientras corren queries pesadas.
+
+Lanza N requests concurrentes a endpoints pesados (/api/stock,
+/api/ventas/ventas-perdidas-v3) y en paralelo mide la latencia de "/".
+Si el event loop está bloqueado por psycopg2 síncrono, el health check
+sube a la duración de la query pesada; con db_offload debe mantenerse
+en milisegundos.
+
+Usage:
+    python scripts/benchmark_event_loop.py --base-url http://localhost:8001 --token <JWT>
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import requests
+
+# ventas-perdidas-v3 exige el rango: última semana hasta hoy
+FECHA_FIN = date.today()
+FECHA_INICIO = FECHA_FIN - timedelta(days=7)
+
+HEAVY_ENDPOINTS = [
+    "/api/stock?ubicacion_id=tienda_08&page=1&page_size=500",
+    f"/api/ventas/ventas-perdidas-v3/tienda_08?fecha_inicio={FECHA_INICIO}&fecha_fin={FECHA_FIN}",
+]
+
+
+def run_heavy(base_url: str, url: str, headers: Dict[str, str], stop: threading.Event, timings: List[float]):
+    """Ejecuta requests pesados en loop hasta que se active stop."""
+    while not stop.is_set():
+        start = time.time()
+        try:
+            requests.get(f"{base_url}{url}", headers=headers, timeout=300)
+        except requests.RequestException:
+            pass
+        timings.append((time.time() - start) * 1000)
+
+
+def run_health(base_url: str, duration: float, interval: float) -> List[float]:
+    """Mide la latencia de "/" cada `interval` segundos durante `duration`."""
+    latencies = []
+    end = time.time() + duration
+    while time.time() < end:
+        start = time.time()
+        try:
+            requests.get(f"{base_url}/", timeout=60)
+            latencies.append((time.time() - start) * 1000)
+        except requests.RequestException:
+            latencies.append(60_000)
+        time.sleep(interval)
+    return latencies
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Health check latency under heavy query load")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--token", default=None, help="JWT para endpoints autenticados")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests pesados concurrentes por endpoint")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de medición")
+    parser.add_argument("--interval", type=float, default=0.2, help="Segundos entre health checks")
+    args = parser.parse_args()
+
+    headers: Dict[str, str] = {}
+    if args.token:
+        headers["Authorization"] = f"Bearer {args.token}"
+
+    baseline = run_health(args.base_url, duration=3, interval=args.interval)
+
+    stop = threading.Event()
+    heavy_timings: List[float] = []
+    threads = [
+        threading.Thread(target=run_heavy, args=(args.base_url, url, headers, stop, heavy_timings), daemon=True)
+        for url in HEAVY_ENDPOINTS
+        for _ in range(args.concurrency)
+    ]
+    for t in threads:
+        t.start()
+
+    under_load = run_health(args.base_url, duration=args.duration, interval=args.interval)
+    stop.set()
+
+    def summary(name: str, values: Optional[List[float]]):
+        if not values:
+            print(f"  {name:28} sin datos")
+            return
+        print(
+            f"  {name:28} n={len(values):4}  p50={statistics.median(values):8.1f}ms  "
+            f"p95={percentile(values, 95):8.1f}ms  max={max(values):8.1f}ms"
+        )
+
+    print(f"\n🔍 Event loop benchmark - {args.base_url}")
+    print(f"   {len(threads)} requests pesados concurrentes durante {args.duration:.0f}s\n")
+    summary("Health (sin carga)", baseline)
+    summary("Health (con carga)", under_load)
+    summary("Endpoints pesados", heavy_timings)
+
+
+if __name__ == "__main__":
+    main()